@@ -9,14 +9,86 @@ Rate limiting, CORS, and request logging.
 
 from http.server import BaseHTTPRequestHandler
 from datetime import datetime, timedelta, timezone
-from urllib.parse import urlparse, parse_qs
+from urllib.parse import urlparse, parse_qs, quote
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from decimal import Decimal
+import bisect
 import hashlib
 import json
 import os
+import random
 import re
 import hmac
+import sqlite3
+import sys
+import tempfile
+import threading
 import time
 
+# Shared packages (resilience, monitoring) live at the project root
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, _PROJECT_ROOT)
+
+# Durable queues + circuit breakers (graceful fallback if unavailable)
+try:
+    from resilience import PersistentQueue, CircuitBreaker
+    RESILIENCE_AVAILABLE = True
+except ImportError:
+    RESILIENCE_AVAILABLE = False
+
+# Prometheus-style metrics collector (graceful fallback if unavailable)
+try:
+    from monitoring import metrics as _metrics
+    MONITORING_AVAILABLE = True
+except ImportError:
+    MONITORING_AVAILABLE = False
+
+# Canonical record hashing shared with the SDK (stdlib fallback if unavailable)
+try:
+    from s4_canonical import canonical_sha256
+except ImportError:
+    def canonical_sha256(obj, default=None, ensure_ascii=True):
+        return hashlib.sha256(json.dumps(obj, sort_keys=True, default=default,
+                                         ensure_ascii=ensure_ascii).encode()).hexdigest()
+
+# Merkle trees and chunked file digests: one module for the API and the SDK,
+# so batch roots, proofs and file leaves cannot drift apart
+from s4_merkle import (digest_blocks as _digest_blocks, merkle_levels as _merkle_levels,
+                       merkle_proof as _merkle_proof, merkle_root as _merkle_root)
+
+
+@contextmanager
+def _span(dependency, operation):
+    """Time one call to an external dependency (supabase, xrpl, ai) into
+    s4_dependency_seconds. An exception, or the caller setting span["ok"]
+    to False when it swallows an error, counts the call as failed."""
+    span = {"ok": True}
+    started = time.perf_counter()
+    try:
+        yield span
+    except BaseException:
+        span["ok"] = False
+        raise
+    finally:
+        if MONITORING_AVAILABLE:
+            _metrics.dependency_call(dependency, operation, time.perf_counter() - started, success=span["ok"])
+
+
+def _latency_summary(histogram):
+    """Count, mean and p50/p90/p95/p99/p99.9 in ms for one S4Metrics histogram,
+    merged over all its label sets; None without the collector."""
+    if not MONITORING_AVAILABLE:
+        return None
+    sketch = _metrics.sketch(histogram)
+    summary = {"count": sketch.count if sketch else 0,
+               "avg_ms": round(sketch.sum / sketch.count * 1000, 2) if sketch else 0}
+    for label, q in (("p50", 0.5), ("p90", 0.9), ("p95", 0.95), ("p99", 0.99), ("p99_9", 0.999)):
+        summary[f"{label}_ms"] = round(sketch.quantile(q) * 1000, 2) if sketch else 0
+    return summary
+
 # XRPL Testnet integration (graceful fallback if unavailable)
 try:
     from xrpl.clients import JsonRpcClient
@@ -44,61 +116,257 @@ SUPABASE_SERVICE_KEY = os.environ.get("SUPABASE_SERVICE_KEY", "").strip()
 SUPABASE_AVAILABLE = bool(SUPABASE_URL and SUPABASE_KEY)
 
 # ═══════════════════════════════════════════════════════════════════════
-#  SUPABASE PERSISTENCE LAYER — Replaces all in-memory stores
-#  Uses urllib.request (stdlib) to hit the PostgREST API.
-#  Every write goes to Supabase first, with in-memory as cache.
-#  Every read checks Supabase if cache is empty (cold-start recovery).
+#  SHARED HTTP CLIENT — pooled keep-alive connections for every outbound
+#  call (Supabase, AI providers, webhooks, NVD, SendGrid). Warm instances
+#  reuse TCP/TLS sessions instead of paying a handshake per request.
 # ═══════════════════════════════════════════════════════════════════════
 
+import http.client
+import io
+import select
+import ssl
 import urllib.request
 import urllib.error
+from urllib.parse import urlsplit
+
+
+class _PooledResponse:
+    """Fully-read response with the parts of the urlopen() interface we use."""
+
+    def __init__(self, url, status, reason, headers, body):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self._body = body
+
+    def read(self, amt=None):
+        return self._body if amt is None else self._body[:amt]
+
+    def getcode(self):
+        return self.status
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _HTTPPool:
+    """Drop-in replacement for urllib.request.urlopen() with per-host pooling.
+
+    - keep-alive connections are parked per (scheme, host, port) and reused;
+      one the server has already closed is dropped at checkout
+    - at most max_per_host requests are in flight to one host at a time
+    - idempotent requests (GET/HEAD/PUT/DELETE) retry with exponential
+      backoff on connection errors and 429/502/503/504, and are resent if a
+      reused keep-alive connection turns out to be stale; other methods are
+      resent only when the connection failed while the request was being
+      written, since after that the server may already have acted on it
+    - HTTP errors raise urllib.error.HTTPError, transport errors URLError,
+      so existing `except` clauses keep working
+    Redirects are not followed.
+    """
+
+    RETRY_STATUSES = (429, 502, 503, 504)
+    IDEMPOTENT = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+    STALE_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+
+    def __init__(self, max_per_host=8, max_idle_per_host=8, idle_ttl=50.0, retries=2, backoff=0.2):
+        self.max_per_host = max_per_host
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_ttl = idle_ttl
+        self.retries = retries
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self._idle = {}    # (scheme, host, port) -> [(conn, parked_at)]
+        self._slots = {}   # (scheme, host, port) -> BoundedSemaphore
+        self._ssl_context = ssl.create_default_context()
+        self.stats = {"requests": 0, "connections_opened": 0, "connections_reused": 0, "retries": 0}
+
+    def _slot(self, key):
+        with self._lock:
+            if key not in self._slots:
+                self._slots[key] = threading.BoundedSemaphore(self.max_per_host)
+            return self._slots[key]
+
+    def _checkout(self, key, timeout):
+        """Return (connection, reused) — a parked keep-alive connection if one is fresh."""
+        now = time.monotonic()
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                conn, parked_at = idle.pop()
+                if now - parked_at < self.idle_ttl and conn.sock is not None and not self._dropped(conn.sock):
+                    try:
+                        conn.sock.settimeout(timeout)
+                    except OSError:
+                        conn.close()
+                        continue
+                    conn.timeout = timeout
+                    self.stats["connections_reused"] += 1
+                    return conn, True
+                conn.close()
+            self.stats["connections_opened"] += 1
+        scheme, host, port = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=timeout, context=self._ssl_context), False
+        return http.client.HTTPConnection(host, port, timeout=timeout), False
+
+    @staticmethod
+    def _dropped(sock):
+        """True if an idle socket is readable, i.e. the server closed it (or sent junk)."""
+        try:
+            return bool(select.select([sock], [], [], 0)[0])
+        except (OSError, ValueError):
+            return True
+
+    def _checkin(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def close(self):
+        """Close every parked connection."""
+        with self._lock:
+            for idle in self._idle.values():
+                for conn, _ in idle:
+                    conn.close()
+            self._idle.clear()
+
+    def urlopen(self, req, data=None, timeout=10, retries=None):
+        if isinstance(req, str):
+            req = urllib.request.Request(req, data=data)
+        parts = urlsplit(req.full_url)
+        scheme = parts.scheme.lower()
+        if scheme not in ("http", "https"):
+            raise urllib.error.URLError(f"unsupported URL scheme: {scheme}")
+        key = (scheme, parts.hostname, parts.port or (443 if scheme == "https" else 80))
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        method = req.get_method()
+        headers = dict(req.header_items())
+        headers.setdefault("User-agent", "S4-Ledger-API")
+        headers.setdefault("Connection", "keep-alive")
+        body = req.data
+        retries = self.retries if retries is None else retries
+        if method not in self.IDEMPOTENT:
+            retries = 0
+
+        slot = self._slot(key)
+        if not slot.acquire(timeout=timeout):
+            raise urllib.error.URLError(f"timed out waiting for a connection to {parts.hostname}")
+        try:
+            attempt = 0
+            while True:
+                with self._lock:
+                    self.stats["requests"] += 1
+                conn, reused = self._checkout(key, timeout)
+                sent = False
+                try:
+                    conn.request(method, path, body=body, headers=headers)
+                    sent = True
+                    resp = conn.getresponse()
+                    payload = resp.read()
+                except (OSError, http.client.HTTPException) as e:
+                    conn.close()
+                    stale = (reused and isinstance(e, self.STALE_ERRORS + (http.client.BadStatusLine,))
+                             and (not sent or method in self.IDEMPOTENT))
+                    if stale or attempt < retries:
+                        if not stale:
+                            attempt += 1
+                            time.sleep(self.backoff * (2 ** (attempt - 1)))
+                        with self._lock:
+                            self.stats["retries"] += 1
+                        continue
+                    raise urllib.error.URLError(e) from e
+                if resp.will_close:
+                    conn.close()
+                else:
+                    self._checkin(key, conn)
+                if resp.status in self.RETRY_STATUSES and attempt < retries:
+                    attempt += 1
+                    with self._lock:
+                        self.stats["retries"] += 1
+                    time.sleep(self.backoff * (2 ** (attempt - 1)))
+                    continue
+                if resp.status >= 400:
+                    raise urllib.error.HTTPError(req.full_url, resp.status, resp.reason, resp.headers, io.BytesIO(payload))
+                return _PooledResponse(req.full_url, resp.status, resp.reason, resp.headers, payload)
+        finally:
+            slot.release()
+
+
+_http = _HTTPPool(max_per_host=int(os.environ.get("S4_HTTP_MAX_PER_HOST", "8")))
+
+# ═══════════════════════════════════════════════════════════════════════
+#  SUPABASE PERSISTENCE LAYER — Replaces all in-memory stores
+#  Uses the shared _http pool (stdlib http.client) to hit the PostgREST API.
+#  Every write goes to Supabase first, with in-memory as cache.
+#  Every read checks Supabase if cache is empty (cold-start recovery).
+# ═══════════════════════════════════════════════════════════════════════
 
 def _supabase_request(table, *, method="GET", data=None, query_params="",
-                       select="*", prefer="return=representation", timeout=10):
+                       select="*", prefer="return=representation", timeout=10, errors=None):
     """Generic Supabase REST API helper.
     Returns parsed JSON on success, None on failure (graceful fallback).
     
     Args:
         table:        Table name (e.g. "records")
         method:       HTTP method (GET, POST, PATCH, DELETE)
-        data:         Dict to send as JSON body (POST/PATCH)
+        data:         Dict (or list of dicts for bulk writes) to send as JSON body
         query_params: PostgREST filter string (e.g. "record_id=eq.REC-ABC")
         select:       Columns to return (default "*")
         prefer:       Prefer header (default "return=representation")
         timeout:      Request timeout in seconds
+        errors:       Optional list; on failure (status, message) is appended,
+                      status being None for transport errors
     """
     if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
         return None
-    try:
-        url = f"{SUPABASE_URL}/rest/v1/{table}"
-        if query_params:
-            url += f"?{query_params}"
-        if method == "GET" and select:
-            sep = "&" if "?" in url else "?"
-            url += f"{sep}select={select}"
-
-        headers = {
-            "apikey": SUPABASE_SERVICE_KEY,
-            "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
-            "Content-Type": "application/json",
-        }
-        if prefer:
-            headers["Prefer"] = prefer
-
-        body = json.dumps(data).encode() if data else None
-        req = urllib.request.Request(url, data=body, headers=headers, method=method)
-        resp = urllib.request.urlopen(req, timeout=timeout)
-        raw = resp.read()
-        if raw:
-            return json.loads(raw)
-        return []
-    except urllib.error.HTTPError as e:
-        body = e.read().decode() if e.fp else ""
-        print(f"Supabase {method} {table} HTTP {e.code}: {body[:300]}")
-        return None
-    except Exception as e:
-        print(f"Supabase {method} {table} failed: {e}")
-        return None
+    with _span("supabase", f"{method} {table}") as span:
+        try:
+            url = f"{SUPABASE_URL}/rest/v1/{table}"
+            if query_params:
+                url += f"?{query_params}"
+            if method == "GET" and select:
+                sep = "&" if "?" in url else "?"
+                url += f"{sep}select={select}"
+
+            headers = {
+                "apikey": SUPABASE_SERVICE_KEY,
+                "Authorization": f"Bearer {SUPABASE_SERVICE_KEY}",
+                "Content-Type": "application/json",
+            }
+            if prefer:
+                headers["Prefer"] = prefer
+
+            body = json.dumps(data).encode() if data else None
+            req = urllib.request.Request(url, data=body, headers=headers, method=method)
+            resp = _http.urlopen(req, timeout=timeout)
+            raw = resp.read()
+            if raw:
+                return json.loads(raw)
+            return []
+        except urllib.error.HTTPError as e:
+            body = e.read().decode() if e.fp else ""
+            span["ok"] = False
+            print(f"Supabase {method} {table} HTTP {e.code}: {body[:300]}")
+            if errors is not None:
+                errors.append((e.code, body[:300]))
+            return None
+        except Exception as e:
+            span["ok"] = False
+            print(f"Supabase {method} {table} failed: {e}")
+            if errors is not None:
+                errors.append((None, str(e)))
+            return None
 
 
 def _sb_insert(table, row):
@@ -107,10 +375,65 @@ def _sb_insert(table, row):
                               prefer="return=representation")
 
 
-def _sb_upsert(table, row, on_conflict=""):
-    """Upsert a single row. on_conflict is the column(s) for conflict resolution."""
-    prefer = "return=representation,resolution=merge-duplicates"
-    return _supabase_request(table, method="POST", data=row, prefer=prefer)
+def _sb_upsert(table, row, on_conflict="", resolution="merge-duplicates"):
+    """Upsert a single row. on_conflict is the column(s) for conflict resolution;
+    resolution="ignore-duplicates" keeps the existing row (the result is then [])."""
+    prefer = f"return=representation,resolution={resolution}"
+    qp = f"on_conflict={on_conflict}" if on_conflict else ""
+    return _supabase_request(table, method="POST", data=row, query_params=qp, prefer=prefer)
+
+
+SB_BULK_CHUNK_SIZE = int(os.environ.get("S4_SB_BULK_CHUNK", "500"))
+
+def _sb_bulk_upsert(table, rows, chunk_size=None, on_conflict="", resolution="merge-duplicates"):
+    """Upsert many rows in a few PostgREST round-trips (JSON array bodies).
+
+    PostgREST requires every object in one request to share the same keys, so
+    rows are grouped by key set before chunking. A chunk is applied atomically;
+    when it is rejected with a 4xx the chunk is bisected to isolate the bad
+    rows, while transport/5xx failures fail the whole chunk without retrying.
+
+    Returns {"written": n, "failed": [{"index": i, "status": code, "error": msg}],
+    "requests": n} where index refers to the position in ``rows``.
+    """
+    report = {"written": 0, "failed": [], "requests": 0}
+    if not rows:
+        return report
+    if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+        report["failed"] = [{"index": i, "status": None, "error": "Supabase not configured"}
+                            for i in range(len(rows))]
+        return report
+    chunk_size = max(1, chunk_size or SB_BULK_CHUNK_SIZE)
+    prefer = f"return=minimal,resolution={resolution}"
+    qp = f"on_conflict={on_conflict}" if on_conflict else ""
+
+    groups = {}
+    for i, row in enumerate(rows):
+        groups.setdefault(tuple(sorted(row)), []).append(i)
+
+    def _write(indexes):
+        errors = []
+        report["requests"] += 1
+        result = _supabase_request(table, method="POST", data=[rows[i] for i in indexes],
+                                   query_params=qp, prefer=prefer, errors=errors)
+        if result is not None:
+            report["written"] += len(indexes)
+            return
+        status, message = errors[-1] if errors else (None, "unknown error")
+        if len(indexes) > 1 and status is not None and 400 <= status < 500:
+            mid = len(indexes) // 2
+            _write(indexes[:mid])
+            _write(indexes[mid:])
+            return
+        report["failed"].extend({"index": i, "status": status, "error": message} for i in indexes)
+
+    for indexes in groups.values():
+        for start in range(0, len(indexes), chunk_size):
+            _write(indexes[start:start + chunk_size])
+    report["failed"].sort(key=lambda f: f["index"])
+    if report["failed"]:
+        print(f"Supabase bulk upsert {table}: {len(report['failed'])}/{len(rows)} rows failed")
+    return report
 
 
 def _sb_select(table, query_params="", select="*", limit=None, order=None):
@@ -126,13 +449,64 @@ def _sb_select(table, query_params="", select="*", limit=None, order=None):
     return _supabase_request(table, method="GET", query_params=qp, select=select) or []
 
 
+SB_PAGE_SIZE = int(os.environ.get("S4_SB_PAGE_SIZE", "1000"))
+
+def _sb_select_pages(table, query_params="", keys=("timestamp", "id"), page_size=None,
+                     retries=3, stats=None):
+    """Yield every matching row of a table, one keyset page at a time.
+
+    Pages are ordered by ``keys`` (ascending, the last key must be unique) and
+    each request continues after the last row seen, so deep pages cost the
+    same as the first and no history is dropped. A page that fails is retried
+    with backoff; if it still fails, iteration stops and stats["complete"]
+    stays False. ``stats`` (optional dict) receives rows/pages/complete.
+    """
+    page_size = page_size or SB_PAGE_SIZE
+    stats = stats if stats is not None else {}
+    stats.update(rows=0, pages=0, complete=False)
+    order = ",".join(f"{k}.asc" for k in keys)
+    after = None
+    while True:
+        parts = [query_params] if query_params else []
+        if after is not None:
+            parts.append(_keyset_filter(keys, after))
+        parts += [f"order={order}", f"limit={page_size}"]
+        rows = None
+        for attempt in range(retries):
+            rows = _supabase_request(table, method="GET", query_params="&".join(parts))
+            if rows is not None:
+                break
+            print(f"Supabase {table} page {stats['pages'] + 1} attempt {attempt + 1} failed — retrying...")
+            time.sleep(0.5 * (attempt + 1))
+        if rows is None:
+            return
+        stats["pages"] += 1
+        stats["rows"] += len(rows)
+        yield from rows
+        if len(rows) < page_size:
+            stats["complete"] = True
+            return
+        after = [rows[-1].get(k) for k in keys]
+
+
+def _keyset_filter(keys, values):
+    """PostgREST filter selecting rows strictly after ``values`` in ``keys`` order."""
+    def q(v):
+        return '"' + str(v).replace('"', '\\"') + '"'
+    if len(keys) == 1:
+        return f"{keys[0]}=gt.{quote(str(values[0]), safe='')}"
+    (k1, k2), (v1, v2) = keys, values
+    cond = f"({k1}.gt.{q(v1)},and({k1}.eq.{q(v1)},{k2}.gt.{q(v2)}))"
+    return "or=" + quote(cond, safe="")
+
+
 # ─── Records persistence ──────────────────────────────────────────────
 
 _records_loaded = False  # Flag: have we hydrated _live_records from Supabase?
 
-def _persist_record(record):
-    """Write an anchored record to Supabase. Falls back to in-memory only."""
-    row = {
+def _record_row(record):
+    """Map an in-memory record onto the records table columns."""
+    return {
         "record_id": record.get("record_id", ""),
         "hash": record.get("hash", ""),
         "record_type": record.get("record_type", ""),
@@ -150,48 +524,77 @@ def _persist_record(record):
         "org_id": record.get("org_id", ""),
         "source_system": record.get("source_system", ""),
     }
-    result = _sb_upsert("records", row)
+
+
+def _persist_record(record, update=False):
+    """Write an anchored record to Supabase. Falls back to in-memory only.
+
+    The records table is an immutable ledger: a record_id that already exists
+    is left untouched (the result is then []). update=True merges into the
+    existing row and is only for an async anchor finishing its own pending row.
+    """
+    row = _record_row(record)
+    result = _sb_upsert("records", row, on_conflict="record_id",
+                        resolution="merge-duplicates" if update else "ignore-duplicates")
     if result is None:
         print(f"Record persist failed for {row['record_id']} — in-memory only")
+    elif result == [] and not update:
+        print(f"Record {row['record_id']} already exists — not overwritten")
     return result
 
 
-def _load_records_from_supabase():
-    """Hydrate _live_records from Supabase on cold start with retry."""
+def _persist_records(records, update=False):
+    """Bulk-write records to Supabase. Returns the _sb_bulk_upsert report,
+    with the record_id of every row that stayed in-memory only. Existing
+    record_ids are kept unless update=True (see _persist_record)."""
+    report = _sb_bulk_upsert("records", [_record_row(r) for r in records], on_conflict="record_id",
+                             resolution="merge-duplicates" if update else "ignore-duplicates")
+    for failure in report["failed"]:
+        failure["record_id"] = records[failure["index"]].get("record_id", "")
+    return report
+
+
+def _load_records_from_supabase(stats=None):
+    """Hydrate _live_records from Supabase on cold start, page by page.
+
+    Records already in memory (e.g. anchored while a lazy hydration was still
+    running) are skipped, and the store is put back in timestamp order once
+    the pages are in, since listings rely on it.
+    """
     global _records_loaded
     if _records_loaded:
         return
     _records_loaded = True
-    rows = None
-    for attempt in range(3):
-        rows = _sb_select("records", order="timestamp.asc", limit=10000)
-        if rows is not None:
-            break
-        print(f"Supabase hydration attempt {attempt + 1} failed — retrying...")
-        time.sleep(0.5 * (attempt + 1))
-    if rows:
-        for row in rows:
-            _live_records.append({
-                "hash": row.get("hash", ""),
-                "record_type": row.get("record_type", ""),
-                "record_label": row.get("record_label", ""),
-                "branch": row.get("branch", "JOINT"),
-                "icon": row.get("icon", ""),
-                "timestamp": row.get("timestamp", ""),
-                "timestamp_display": row.get("timestamp_display", ""),
-                "fee": float(row.get("fee", 0.01)),
-                "tx_hash": row.get("tx_hash", ""),
-                "network": row.get("network", "Simulated"),
-                "explorer_url": row.get("explorer_url"),
-                "system": row.get("system", ""),
-                "content_preview": row.get("content_preview", ""),
-                "org_id": row.get("org_id", ""),
-                "record_id": row.get("record_id", ""),
-                "source_system": row.get("source_system", ""),
-            })
-        print(f"Hydrated {len(rows)} records from Supabase")
+    stats = stats if stats is not None else {}
+    loaded = 0
+    for row in _sb_select_pages("records", stats=stats):
+        if row.get("record_id") and _first_record(row["record_id"], "record_id") is not None:
+            continue
+        loaded += 1
+        _append_record({
+            "hash": row.get("hash", ""),
+            "record_type": row.get("record_type", ""),
+            "record_label": row.get("record_label", ""),
+            "branch": row.get("branch", "JOINT"),
+            "icon": row.get("icon", ""),
+            "timestamp": row.get("timestamp", ""),
+            "timestamp_display": row.get("timestamp_display", ""),
+            "fee": float(row.get("fee", 0.01)),
+            "tx_hash": row.get("tx_hash", ""),
+            "network": row.get("network", "Simulated"),
+            "explorer_url": row.get("explorer_url"),
+            "system": row.get("system", ""),
+            "content_preview": row.get("content_preview", ""),
+            "org_id": row.get("org_id", ""),
+            "record_id": row.get("record_id", ""),
+            "source_system": row.get("source_system", ""),
+        })
+    _sort_records()
+    if stats.get("complete"):
+        print(f"Hydrated {loaded} records from Supabase ({stats['pages']} pages)")
     else:
-        print("WARNING: Supabase hydration failed after 3 attempts — starting with empty records")
+        print(f"WARNING: Supabase record hydration stopped after {stats.get('pages', 0)} pages "
+              f"— {loaded} records loaded")
 
 
 # ─── Audit log persistence ────────────────────────────────────────────
@@ -225,9 +628,11 @@ def _persist_ai_audit(entry):
     _sb_insert("ai_audit_log", row)
 
 
-def _load_verify_audit_from_supabase():
-    """Hydrate _verify_audit_log from Supabase on cold start."""
+def _load_verify_audit_from_supabase(stats=None):
+    """Hydrate _verify_audit_log from Supabase on cold start (most recent 500)."""
     rows = _sb_select("verify_audit_log", order="timestamp.desc", limit=500)
+    if stats is not None:
+        stats.update(rows=len(rows), pages=1, complete=True)
     if rows:
         rows.reverse()  # oldest first in our in-memory list
         for row in rows:
@@ -246,9 +651,9 @@ def _load_verify_audit_from_supabase():
 
 # ─── Proof chain & custody persistence ────────────────────────────────
 
-def _persist_proof_chain_event(record_id, event):
-    """Write a proof chain event to Supabase."""
-    row = {
+def _proof_chain_row(record_id, event):
+    """Map a proof chain event onto the proof_chains table columns."""
+    return {
         "record_id": record_id,
         "event_type": event.get("event_type", ""),
         "hash": event.get("hash", ""),
@@ -257,7 +662,56 @@ def _persist_proof_chain_event(record_id, event):
         "actor": event.get("actor", ""),
         "metadata": json.dumps(event.get("metadata", {})),
     }
-    _sb_insert("proof_chains", row)
+
+
+def _persist_proof_chain_event(record_id, event):
+    """Write a proof chain event to Supabase."""
+    _sb_insert("proof_chains", _proof_chain_row(record_id, event))
+
+
+def _persist_proof_chain_events(events):
+    """Bulk-write [(record_id, event), ...] proof chain events to Supabase."""
+    return _sb_bulk_upsert("proof_chains", [_proof_chain_row(rid, evt) for rid, evt in events])
+
+
+def _persist_batch(batch_id, batch):
+    """Write a Merkle batch (leaves + packed tree) to Supabase."""
+    row = {
+        "batch_id": batch_id,
+        "merkle_root": batch["merkle_root"],
+        "leaf_hashes": batch["leaf_hashes"],
+        "tree": [level.hex() for level in batch.get("tree", [])],
+        "record_count": batch.get("record_count", len(batch["leaf_hashes"])),
+        "tx_hash": batch.get("tx_hash", ""),
+        "network": batch.get("network", "Simulated"),
+        "explorer_url": batch.get("explorer_url"),
+        "org_id": batch.get("org_id", ""),
+        "timestamp": batch.get("timestamp", datetime.now(timezone.utc).isoformat()),
+    }
+    return _sb_upsert("merkle_batches", row, on_conflict="batch_id")
+
+
+def _load_batch_from_supabase(batch_id):
+    """Fetch one Merkle batch into _batch_store (proof requests after a cold start)."""
+    rows = _sb_select("merkle_batches", query_params=f"batch_id=eq.{quote(batch_id, safe='')}", limit=1)
+    if not rows:
+        return None
+    row = rows[0]
+    batch = {
+        "merkle_root": row.get("merkle_root", ""),
+        "leaf_hashes": row.get("leaf_hashes") or [],
+        "tree": [bytes.fromhex(level) for level in row.get("tree") or []],
+        "record_count": row.get("record_count", 0),
+        "tx_hash": row.get("tx_hash", ""),
+        "network": row.get("network", "Simulated"),
+        "explorer_url": row.get("explorer_url"),
+        "timestamp": row.get("timestamp", ""),
+        "org_id": row.get("org_id", ""),
+    }
+    if not batch["tree"]:
+        del batch["tree"]
+    _batch_store[batch_id] = batch
+    return batch
 
 
 def _persist_custody_transfer(record_id, transfer):
@@ -276,43 +730,43 @@ def _persist_custody_transfer(record_id, transfer):
     _sb_insert("custody_transfers", row)
 
 
-def _load_proof_chains_from_supabase():
-    """Hydrate _proof_chain_store from Supabase on cold start."""
-    rows = _sb_select("proof_chains", order="timestamp.asc", limit=10000)
-    if rows:
-        for row in rows:
-            rid = row.get("record_id", "")
-            if rid not in _proof_chain_store:
-                _proof_chain_store[rid] = []
-            _proof_chain_store[rid].append({
-                "event_type": row.get("event_type", ""),
-                "hash": row.get("hash", ""),
-                "tx_hash": row.get("tx_hash", ""),
-                "timestamp": row.get("timestamp", ""),
-                "actor": row.get("actor", ""),
-                "metadata": row.get("metadata", {}),
-            })
-        print(f"Hydrated {len(rows)} proof chain events from Supabase")
-
-
-def _load_custody_chains_from_supabase():
-    """Hydrate _custody_chain_store from Supabase on cold start."""
-    rows = _sb_select("custody_transfers", order="timestamp.asc", limit=10000)
-    if rows:
-        for row in rows:
-            rid = row.get("record_id", "")
-            if rid not in _custody_chain_store:
-                _custody_chain_store[rid] = []
-            _custody_chain_store[rid].append({
-                "from": row.get("from_entity", ""),
-                "to": row.get("to_entity", ""),
-                "timestamp": row.get("timestamp", ""),
-                "hash": row.get("hash", ""),
-                "tx_hash": row.get("tx_hash", ""),
-                "location": row.get("location", ""),
-                "condition": row.get("condition", ""),
-            })
-        print(f"Hydrated {len(rows)} custody transfers from Supabase")
+def _load_proof_chains_from_supabase(stats=None):
+    """Hydrate _proof_chain_store from Supabase on cold start, page by page."""
+    stats = stats if stats is not None else {}
+    for row in _sb_select_pages("proof_chains", stats=stats):
+        rid = row.get("record_id", "")
+        if rid not in _proof_chain_store:
+            _proof_chain_store[rid] = []
+        _proof_chain_store[rid].append({
+            "event_type": row.get("event_type", ""),
+            "hash": row.get("hash", ""),
+            "tx_hash": row.get("tx_hash", ""),
+            "timestamp": row.get("timestamp", ""),
+            "actor": row.get("actor", ""),
+            "metadata": row.get("metadata", {}),
+        })
+    if stats["rows"]:
+        print(f"Hydrated {stats['rows']} proof chain events from Supabase")
+
+
+def _load_custody_chains_from_supabase(stats=None):
+    """Hydrate _custody_chain_store from Supabase on cold start, page by page."""
+    stats = stats if stats is not None else {}
+    for row in _sb_select_pages("custody_transfers", stats=stats):
+        rid = row.get("record_id", "")
+        if rid not in _custody_chain_store:
+            _custody_chain_store[rid] = []
+        _custody_chain_store[rid].append({
+            "from": row.get("from_entity", ""),
+            "to": row.get("to_entity", ""),
+            "timestamp": row.get("timestamp", ""),
+            "hash": row.get("hash", ""),
+            "tx_hash": row.get("tx_hash", ""),
+            "location": row.get("location", ""),
+            "condition": row.get("condition", ""),
+        })
+    if stats["rows"]:
+        print(f"Hydrated {stats['rows']} custody transfers from Supabase")
 
 
 # ─── Webhook persistence ──────────────────────────────────────────────
@@ -330,7 +784,7 @@ def _persist_webhook_registration(org_key, hook):
 
 
 def _persist_webhook_delivery(delivery):
-    """Write a webhook delivery record to Supabase."""
+    """Write (or update, on retry) a webhook delivery record in Supabase."""
     row = {
         "delivery_id": delivery.get("id", ""),
         "org_key": delivery.get("org", ""),
@@ -345,25 +799,23 @@ def _persist_webhook_delivery(delivery):
         "signature": delivery.get("signature", ""),
         "payload_preview": delivery.get("payload_preview", ""),
     }
-    _sb_insert("webhook_deliveries", row)
-
-
-def _load_webhooks_from_supabase():
-    """Hydrate _webhook_store from Supabase on cold start."""
-    rows = _sb_select("webhook_registrations", query_params="active=eq.true")
-    if rows:
-        for row in rows:
-            org = row.get("org_key", "")
-            if org not in _webhook_store:
-                _webhook_store[org] = []
-            _webhook_store[org].append({
-                "url": row.get("url", ""),
-                "events": row.get("events", []),
-                "active": row.get("active", True),
-                "secret": row.get("secret", ""),
-                "created": row.get("created_at", ""),
-            })
-        print(f"Hydrated {len(rows)} webhook registrations from Supabase")
+    _sb_upsert("webhook_deliveries", row, on_conflict="delivery_id")
+
+
+def _load_webhooks_from_supabase(stats=None):
+    """Hydrate _webhook_store (and its event index) from Supabase on cold start."""
+    stats = stats if stats is not None else {}
+    for row in _sb_select_pages("webhook_registrations", query_params="active=eq.true",
+                                keys=("id",), stats=stats):
+        _add_webhook(row.get("org_key", ""), {
+            "url": row.get("url", ""),
+            "events": row.get("events", []),
+            "active": row.get("active", True),
+            "secret": row.get("secret", ""),
+            "created": row.get("created_at", ""),
+        })
+    if stats["rows"]:
+        print(f"Hydrated {stats['rows']} webhook registrations from Supabase")
 
 
 # ─── API Keys persistence ─────────────────────────────────────────────
@@ -391,11 +843,12 @@ def _persist_api_key(key_plaintext, org_name, role="viewer", tier="pilot"):
     return result
 
 
-def _load_api_keys_from_supabase():
+def _load_api_keys_from_supabase(stats=None):
     """Load API keys from Supabase on cold start.
     Note: We can't recover plaintext keys, but we can check incoming
     keys against stored hashes."""
-    rows = _sb_select("api_keys", query_params="active=eq.true")
+    stats = stats if stats is not None else {}
+    rows = list(_sb_select_pages("api_keys", query_params="active=eq.true", keys=("id",), stats=stats))
     if rows:
         # Store hash -> info for O(1) lookup during auth
         for row in rows:
@@ -431,6 +884,17 @@ def _authenticate_api_key(key):
     return None
 
 
+def _api_key_tier(key, key_hash):
+    """Subscription tier of an API key, or None if unknown.
+
+    Read-only counterpart of _authenticate_api_key for the rate limiter: it
+    reads the session and hydrated hash entries of API_KEYS_STORE but neither
+    caches the plaintext key nor updates last_used_at in Supabase.
+    """
+    info = API_KEYS_STORE.get(key) or API_KEYS_STORE.get(f"__hash__{key_hash}")
+    return info.get("tier") if info else None
+
+
 # ─── Supabase JWT Validation ──────────────────────────────────────────
 # Validates JWTs issued by Supabase Auth. Uses the JWT secret from env.
 # This gives us real authentication — the frontend sends the access_token
@@ -508,6 +972,51 @@ def _get_auth_user(headers):
 # ─── Cold start hydration ─────────────────────────────────────────────
 
 _hydrated = False
+# Loaders run concurrently, each paging through its table. With S4_HYDRATE_LAZY=1
+# the first request does not wait: loaders fill the stores in the background and
+# lookups that must not miss (verify) wait briefly for the phase they need.
+HYDRATE_LAZY = os.environ.get("S4_HYDRATE_LAZY", "0") == "1"
+HYDRATE_WORKERS = int(os.environ.get("S4_HYDRATE_WORKERS", "6"))
+HYDRATE_LAZY_WAIT = float(os.environ.get("S4_HYDRATE_LAZY_WAIT", "10"))
+_HYDRATION_PHASES = (
+    ("records", _load_records_from_supabase),
+    ("verify_audit", _load_verify_audit_from_supabase),
+    ("proof_chains", _load_proof_chains_from_supabase),
+    ("custody_chains", _load_custody_chains_from_supabase),
+    ("webhooks", _load_webhooks_from_supabase),
+    ("api_keys", _load_api_keys_from_supabase),
+)
+_hydration_stats = {"status": "idle", "mode": None, "total_ms": None, "phases": {}}
+_hydration_done = {name: threading.Event() for name, _ in _HYDRATION_PHASES}
+
+
+def _run_hydration_phase(name, loader):
+    """Run one loader and record its timing and row counts in _hydration_stats."""
+    phase = _hydration_stats["phases"][name]
+    phase["status"] = "running"
+    started = time.perf_counter()
+    try:
+        loader(stats=phase)
+        phase["status"] = "complete" if phase.get("complete", True) else "partial"
+    except Exception as e:
+        phase["status"] = "error"
+        phase["error"] = str(e)
+        print(f"Supabase hydration phase {name} failed: {e}")
+    finally:
+        phase["ms"] = round((time.perf_counter() - started) * 1000, 1)
+        _hydration_done[name].set()
+
+
+def _run_hydration():
+    """Run every loader on a thread pool and record the overall timing."""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, HYDRATE_WORKERS), thread_name_prefix="s4-hydrate") as pool:
+        for name, loader in _HYDRATION_PHASES:
+            pool.submit(_run_hydration_phase, name, loader)
+    _hydration_stats["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    _hydration_stats["status"] = "complete"
+    rows = sum(p.get("rows", 0) for p in _hydration_stats["phases"].values())
+    print(f"Supabase hydration complete — {rows} rows in {_hydration_stats['total_ms']} ms")
 
 
 def _hydrate_from_supabase():
@@ -517,16 +1026,20 @@ def _hydrate_from_supabase():
     if _hydrated or not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
         return
     _hydrated = True
-    try:
-        _load_records_from_supabase()
-        _load_verify_audit_from_supabase()
-        _load_proof_chains_from_supabase()
-        _load_custody_chains_from_supabase()
-        _load_webhooks_from_supabase()
-        _load_api_keys_from_supabase()
-        print("Supabase hydration complete")
-    except Exception as e:
-        print(f"Supabase hydration error (continuing with empty stores): {e}")
+    _hydration_stats.update(status="running", mode="lazy" if HYDRATE_LAZY else "eager",
+                            started_at=datetime.now(timezone.utc).isoformat(),
+                            phases={name: {"status": "pending"} for name, _ in _HYDRATION_PHASES})
+    if HYDRATE_LAZY:
+        threading.Thread(target=_run_hydration, name="s4-hydrate", daemon=True).start()
+    else:
+        _run_hydration()
+
+
+def _await_hydration(phase, timeout=None):
+    """Block until a hydration phase has finished (lazy mode). True if it has."""
+    if _hydration_stats["status"] != "running":
+        return True
+    return _hydration_done[phase].wait(HYDRATE_LAZY_WAIT if timeout is None else timeout)
 
 
 _user_state_ensured = False
@@ -560,14 +1073,144 @@ if not API_MASTER_KEY:
     print(f"WARNING: S4_API_MASTER_KEY not set — generated ephemeral key (set env var for production)")
 API_KEYS_STORE = {}  # In production, stored in Supabase
 
-# Rate limiting – in-memory sliding window per Vercel instance.
+# Rate limiting – token bucket per client (API key, else IP).
 # Vercel Edge / WAF provides primary DDoS protection; this is a
-# secondary abuse-prevention layer.  State resets on cold start,
-# which is acceptable because a fresh instance has no abuse history.
-_rate_limit_store: dict = {}   # ip -> [timestamps]
+# secondary abuse-prevention layer.  The default backend is in-process
+# and resets on cold start, which is acceptable because a fresh instance
+# has no abuse history.  S4_RATE_LIMIT_BACKEND=sqlite shares buckets
+# between workers on one host through a SQLite file.
 _RATE_LIMIT_MAX_IPS = 10_000   # LRU cap to prevent memory leaks
 RATE_LIMIT_WINDOW = 60         # seconds
-RATE_LIMIT_MAX = 120           # requests per window
+RATE_LIMIT_MAX = 120           # requests per window (anonymous / unknown keys)
+RATE_LIMIT_BACKEND = os.environ.get("S4_RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_DB = os.environ.get("S4_RATE_LIMIT_DB", os.path.join(tempfile.gettempdir(), "s4_rate_limit.db"))
+
+
+class _MemoryRateLimitBackend:
+    """Token buckets in an OrderedDict kept in LRU order.
+
+    take() is O(1): one refill computation, one move_to_end and at most one
+    popitem() to evict the least recently seen client.
+    """
+
+    def __init__(self, max_keys=_RATE_LIMIT_MAX_IPS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()   # key -> [tokens, updated_at]
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill_per_sec, now):
+        """Spend one token. Returns (allowed, remaining, retry_after_seconds)."""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [float(capacity), now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * refill_per_sec)
+                bucket[1] = now
+            return _spend_token(bucket, refill_per_sec)
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class _SQLiteRateLimitBackend:
+    """Token buckets in a SQLite file shared by every worker on the host.
+
+    Each take() is one short IMMEDIATE transaction on a primary-key row.
+    Buckets idle for longer than idle_ttl are swept every sweep_every calls,
+    which bounds the table the same way the LRU bounds the memory backend.
+    """
+
+    def __init__(self, db_path=RATE_LIMIT_DB, idle_ttl=RATE_LIMIT_WINDOW * 10, sweep_every=1000):
+        self.db_path = db_path
+        self.idle_ttl = idle_ttl
+        self.sweep_every = sweep_every
+        self._local = threading.local()
+        self._calls = 0
+        with self._conn() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS rate_buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, capacity, refill_per_sec, now):
+        """Spend one token. Returns (allowed, remaining, retry_after_seconds)."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated_at FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                bucket = [float(capacity), now]
+            else:
+                bucket = [min(capacity, row[0] + (now - row[1]) * refill_per_sec), now]
+            result = _spend_token(bucket, refill_per_sec)
+            conn.execute("INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                         (key, bucket[0], bucket[1]))
+            self._calls += 1
+            if self._calls % self.sweep_every == 0:
+                conn.execute("DELETE FROM rate_buckets WHERE updated_at < ?", (now - self.idle_ttl,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM rate_buckets").fetchone()[0]
+
+
+def _spend_token(bucket, refill_per_sec):
+    """Take one token from a refilled [tokens, updated_at] bucket in place."""
+    if bucket[0] >= 1:
+        bucket[0] -= 1
+        return True, int(bucket[0]), 0
+    if refill_per_sec <= 0:
+        return False, 0, RATE_LIMIT_WINDOW
+    return False, 0, max(1, int((1 - bucket[0]) / refill_per_sec + 0.999))
+
+
+def _make_rate_limit_backend(kind=None):
+    kind = kind or RATE_LIMIT_BACKEND
+    if kind == "sqlite":
+        try:
+            return _SQLiteRateLimitBackend(RATE_LIMIT_DB)
+        except sqlite3.Error as e:
+            print(f"Rate limit SQLite backend unavailable ({e}) — using in-process buckets")
+    return _MemoryRateLimitBackend()
+
+
+_rate_limiter = _make_rate_limit_backend()
+
+
+def _rate_limit_for(api_key):
+    """(bucket_key, requests_per_window) for a request's X-API-Key.
+
+    Registered keys get the rpm of their subscription tier, so a key on a
+    paid plan is not throttled by the shared per-IP allowance. The master
+    key uses the enterprise tier; anonymous and unknown keys fall back to
+    the per-IP RATE_LIMIT_MAX.
+    """
+    if api_key:
+        key_hash = hashlib.sha256(api_key.encode()).hexdigest()
+        tier = "enterprise" if api_key == API_MASTER_KEY else _api_key_tier(api_key, key_hash)
+        if tier:
+            rpm = SUBSCRIPTION_TIERS.get(tier, SUBSCRIPTION_TIERS["pilot"])["rpm"]
+            return "key:" + key_hash[:24], rpm
+    return None, RATE_LIMIT_MAX
 
 # Request logging
 _request_log = []
@@ -704,15 +1347,44 @@ if not WEBHOOK_SIGNING_SECRET:
     WEBHOOK_SIGNING_SECRET = "whsec_" + _secrets_mod.token_hex(24)
     print(f"WARNING: S4_WEBHOOK_SECRET not set — generated ephemeral key (set env var for production)")
 _webhook_store = {}  # org_key -> [{url, events, active, created, secret}]
+_webhook_index = {}  # event_type -> {org_key -> [active hooks subscribed to it]}
+_webhook_index_lock = threading.Lock()
 _webhook_delivery_log = []  # [{id, org, url, event, status, attempts, last_attempt}]
 
+def _add_webhook(org_key, hook):
+    """Register a hook for an org and index it under each event it subscribes to."""
+    with _webhook_index_lock:
+        _webhook_store.setdefault(org_key, []).append(hook)
+        if hook.get("active", True):
+            for event_type in dict.fromkeys(hook.get("events", [])):
+                _webhook_index.setdefault(event_type, {}).setdefault(org_key, []).append(hook)
+
 def _sign_webhook_payload(payload_json, secret):
     """HMAC-SHA256 signature for webhook payload verification."""
     return hmac.new(secret.encode(), payload_json.encode(), hashlib.sha256).hexdigest()
 
 def _deliver_webhook(event_type, data, org_key=None):
-    """Fire webhooks for a given event. Non-blocking best-effort delivery.
-    In production, this would use a background queue (SQS/Redis) with retry."""
+    """Fire webhooks for a given event.
+
+    Each matching hook gets a signed delivery record and a job in the durable
+    webhook outbox; background workers POST it with retries, so the calling
+    handler never waits on a subscriber. Without the resilience package (or
+    with S4_WEBHOOK_ASYNC=0) deliveries are attempted once, inline.
+
+    Subscribers are looked up in _webhook_index, so an event nobody listens
+    for costs one dict lookup. The payload is serialized once and signed
+    once per distinct secret.
+    """
+    subscribers = _webhook_index.get(event_type)
+    if not subscribers:
+        return
+    if org_key:
+        targets = [(org_key, list(subscribers.get(org_key, ())))]
+    else:
+        targets = [(org, list(hooks)) for org, hooks in list(subscribers.items())]
+    if not any(hooks for _, hooks in targets):
+        return
+
     now = datetime.now(timezone.utc)
     payload = {
         "event": event_type,
@@ -721,21 +1393,16 @@ def _deliver_webhook(event_type, data, org_key=None):
         "api_version": "2026-02-18",
     }
     payload_json = json.dumps(payload, ensure_ascii=False)
+    signatures = {}  # secret -> HMAC of payload_json
 
-    # Determine which orgs to notify
-    target_orgs = [org_key] if org_key else list(_webhook_store.keys())
-
-    for org in target_orgs:
-        hooks = _webhook_store.get(org, [])
+    for org, hooks in targets:
         for hook in hooks:
-            if not hook.get("active", True):
-                continue
-            if event_type not in hook.get("events", []):
-                continue
             # Sign the payload with the hook's secret
             secret = hook.get("secret", WEBHOOK_SIGNING_SECRET)
-            signature = _sign_webhook_payload(payload_json, secret)
-            delivery_id = f"whd_{hashlib.sha256((now.isoformat() + hook['url']).encode()).hexdigest()[:16]}"
+            signature = signatures.get(secret)
+            if signature is None:
+                signature = signatures[secret] = _sign_webhook_payload(payload_json, secret)
+            delivery_id = f"whd_{hashlib.sha256((now.isoformat() + event_type + hook['url']).encode()).hexdigest()[:16]}"
 
             delivery_record = {
                 "id": delivery_id,
@@ -744,43 +1411,241 @@ def _deliver_webhook(event_type, data, org_key=None):
                 "event": event_type,
                 "status": "pending",
                 "attempts": 0,
-                "max_attempts": 3,
+                "max_attempts": WEBHOOK_MAX_ATTEMPTS if WEBHOOK_ASYNC else 1,
                 "last_attempt": None,
                 "signature": signature,
                 "payload_preview": event_type,
             }
+            _log_webhook_delivery(delivery_record)
+
+            job = {
+                "delivery_id": delivery_id,
+                "org": org,
+                "url": hook["url"],
+                "event": event_type,
+                "signature": signature,
+                "timestamp": now.isoformat(),
+                "payload_json": payload_json,
+            }
+            if WEBHOOK_ASYNC:
+                _enqueue_webhook(job)
+                continue
 
-            # Best-effort HTTP POST (synchronous in serverless; async in production)
+            # Inline fallback: one best-effort attempt
             try:
-                import urllib.request
-                req = urllib.request.Request(
-                    hook["url"],
-                    data=payload_json.encode(),
-                    headers={
-                        "Content-Type": "application/json",
-                        "X-S4-Signature": signature,
-                        "X-S4-Event": event_type,
-                        "X-S4-Delivery": delivery_id,
-                        "X-S4-Timestamp": now.isoformat(),
-                        "User-Agent": "S4-Ledger-Webhook/2.0",
-                    },
-                    method="POST",
-                )
-                resp = urllib.request.urlopen(req, timeout=10)
-                delivery_record["status"] = "delivered"
-                delivery_record["http_status"] = resp.status
-                delivery_record["attempts"] = 1
-                delivery_record["last_attempt"] = now.isoformat()
+                http_status = _post_webhook(job)
+                delivery_record.update(status="delivered", http_status=http_status)
             except Exception as e:
-                delivery_record["status"] = "failed"
-                delivery_record["error"] = str(e)[:200]
-                delivery_record["attempts"] = 1
-                delivery_record["last_attempt"] = now.isoformat()
-
-            _webhook_delivery_log.append(delivery_record)
+                delivery_record.update(status="failed", error=str(e)[:200])
+            delivery_record["attempts"] = 1
+            delivery_record["last_attempt"] = datetime.now(timezone.utc).isoformat()
             _persist_webhook_delivery(delivery_record)
-            if len(_webhook_delivery_log) > 500:
-                _webhook_delivery_log.pop(0)
+
+
+def _log_webhook_delivery(delivery_record):
+    """Keep the last 500 delivery records in memory, indexed by delivery id."""
+    with _webhook_log_lock:
+        _webhook_delivery_log.append(delivery_record)
+        _webhook_deliveries_by_id[delivery_record["id"]] = delivery_record
+        while len(_webhook_delivery_log) > 500:
+            _webhook_deliveries_by_id.pop(_webhook_delivery_log.pop(0)["id"], None)
+
+
+def _post_webhook(job):
+    """POST one signed delivery. Returns the HTTP status; raises on error or non-2xx."""
+    req = urllib.request.Request(
+        job["url"],
+        data=job["payload_json"].encode(),
+        headers={
+            "Content-Type": "application/json",
+            "X-S4-Signature": job["signature"],
+            "X-S4-Event": job["event"],
+            "X-S4-Delivery": job["delivery_id"],
+            "X-S4-Timestamp": job["timestamp"],
+            "User-Agent": "S4-Ledger-Webhook/2.0",
+        },
+        method="POST",
+    )
+    return _http.urlopen(req, timeout=WEBHOOK_TIMEOUT).status
+
+# ═══════════════════════════════════════════════════════════════════════
+#  WEBHOOK OUTBOX — durable queue + worker pool for webhook delivery
+#  Opt-in (S4_WEBHOOK_ASYNC=1): like the async anchor pipeline it needs a
+#  long-lived process for its worker threads and an outbox file that
+#  survives it, so serverless deployments keep delivering inline.
+#  Jobs live in a resilience.PersistentQueue (SQLite) and are claimed under
+#  a lease, so workers sharing the outbox never send the same delivery at
+#  once. Failed attempts are rescheduled with exponential backoff and
+#  jitter; each endpoint has its own CircuitBreaker so a dead subscriber is
+#  skipped instead of tying up workers.
+# ═══════════════════════════════════════════════════════════════════════
+
+WEBHOOK_ASYNC = os.environ.get("S4_WEBHOOK_ASYNC", "0") == "1" and RESILIENCE_AVAILABLE
+WEBHOOK_WORKERS = int(os.environ.get("S4_WEBHOOK_WORKERS", "4"))
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get("S4_WEBHOOK_MAX_ATTEMPTS", "6"))
+WEBHOOK_TIMEOUT = float(os.environ.get("S4_WEBHOOK_TIMEOUT", "5"))
+WEBHOOK_OUTBOX_DB = os.environ.get("S4_WEBHOOK_OUTBOX_DB", os.path.join(tempfile.gettempdir(), "s4_webhook_outbox.db"))
+WEBHOOK_LEASE_SECONDS = float(os.environ.get("S4_WEBHOOK_LEASE_SECONDS", "60"))  # well above WEBHOOK_TIMEOUT
+_WEBHOOK_WORKER_ID = f"{os.getpid()}:{random.getrandbits(64):016x}"  # lease owner for this process
+WEBHOOK_BACKOFF_BASE = 2.0      # seconds before the first retry; doubles per attempt
+WEBHOOK_BACKOFF_MAX = 300.0     # cap on a single backoff delay
+WEBHOOK_POLL_INTERVAL = 5.0     # longest an idle worker sleeps before re-checking the outbox
+WEBHOOK_BREAKER_THRESHOLD = 5   # consecutive failures before an endpoint's circuit opens
+WEBHOOK_BREAKER_RECOVERY = 60.0
+
+_webhook_outbox = None
+_webhook_workers = []
+_webhook_breakers = {}  # url -> CircuitBreaker
+_webhook_deliveries_by_id = {}
+_webhook_log_lock = threading.Lock()
+_webhook_wakeup = threading.Event()
+_webhook_stop = threading.Event()
+_webhook_pipeline_lock = threading.Lock()
+
+
+def _get_webhook_outbox():
+    """Open the durable webhook outbox on first use. Interrupted deliveries are not
+    requeued here — they come back through claim_pending once their lease expires.
+    An outbox that already holds deliveries (e.g. from before a restart) starts
+    the workers at once instead of waiting for the next webhook."""
+    global _webhook_outbox
+    with _webhook_pipeline_lock:
+        if _webhook_outbox is not None:
+            return _webhook_outbox
+        outbox = _webhook_outbox = PersistentQueue(db_path=WEBHOOK_OUTBOX_DB)
+    stats = outbox.get_stats()
+    if stats["pending"] or stats["in_flight"]:
+        _start_webhook_workers()
+    return outbox
+
+
+def _start_webhook_workers():
+    """Start (or restart) the webhook delivery threads."""
+    with _webhook_pipeline_lock:
+        _webhook_stop.clear()
+        _webhook_workers[:] = [t for t in _webhook_workers if t.is_alive()]
+        for i in range(len(_webhook_workers), WEBHOOK_WORKERS):
+            t = threading.Thread(target=_webhook_worker_loop, name=f"s4-webhook-{i}", daemon=True)
+            t.start()
+            _webhook_workers.append(t)
+
+
+def _stop_webhook_workers(timeout=5.0):
+    """Signal the webhook workers to exit and wait for them (shutdown/tests)."""
+    _webhook_stop.set()
+    _webhook_wakeup.set()
+    for t in list(_webhook_workers):
+        t.join(timeout)
+    _webhook_workers[:] = [t for t in _webhook_workers if t.is_alive()]
+
+
+def _enqueue_webhook(job):
+    """Put a signed delivery in the outbox and wake the workers. Returns the queue id."""
+    queue_id = _get_webhook_outbox().enqueue(job["delivery_id"], job["event"], job)
+    _start_webhook_workers()
+    _webhook_wakeup.set()
+    return queue_id
+
+
+def _webhook_breaker(url):
+    breaker = _webhook_breakers.get(url)
+    if breaker is None:
+        breaker = _webhook_breakers.setdefault(url, CircuitBreaker(
+            name=f"webhook:{url}",
+            failure_threshold=WEBHOOK_BREAKER_THRESHOLD,
+            recovery_timeout=WEBHOOK_BREAKER_RECOVERY,
+            success_threshold=1,
+        ))
+    return breaker
+
+
+def _webhook_backoff(attempts):
+    """Delay before retry number `attempts` (1-based): capped exponential, equal jitter."""
+    delay = min(WEBHOOK_BACKOFF_MAX, WEBHOOK_BACKOFF_BASE * (2 ** (attempts - 1)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _process_webhook_job(queue, job):
+    """Attempt one outbox delivery and record the outcome on the queue and delivery log."""
+    payload = json.loads(job.get("payload_json") or "{}")
+    url = payload.get("url", "")
+    record = _webhook_deliveries_by_id.get(payload.get("delivery_id"))
+    if record is None:  # delivered after a restart: the in-memory log was lost
+        record = {"id": payload.get("delivery_id"), "org": payload.get("org"), "url": url,
+                  "event": payload.get("event"), "max_attempts": WEBHOOK_MAX_ATTEMPTS,
+                  "signature": payload.get("signature", ""), "payload_preview": payload.get("event")}
+        _log_webhook_delivery(record)
+
+    breaker = _webhook_breaker(url)
+    if not breaker.can_execute():
+        # Endpoint is known to be down — wait out the breaker without spending an attempt
+        wait = max(0.0, breaker.recovery_timeout - (time.time() - breaker.last_failure_time))
+        queue.mark_retry(job["id"], "circuit open", wait, count_attempt=False)
+        record["status"] = "circuit_open"
+        return
+
+    attempts = job.get("sync_attempts", 0) + 1
+    started = time.monotonic()
+    try:
+        http_status = _post_webhook(payload)
+    except Exception as e:
+        breaker.record_failure()
+        error = str(e)[:200]
+        if attempts >= WEBHOOK_MAX_ATTEMPTS:
+            queue.mark_failed(job["id"], error)
+            status = "failed"
+        else:
+            queue.mark_retry(job["id"], error, _webhook_backoff(attempts))
+            status = "retrying"
+        record.update(status=status, error=error, http_status=getattr(e, "code", None))
+    else:
+        breaker.record_success()
+        queue.mark_synced(job["id"], str(http_status))
+        record.update(status="delivered", http_status=http_status, error=None)
+    record["attempts"] = attempts
+    record["last_attempt"] = datetime.now(timezone.utc).isoformat()
+    if record["status"] in ("delivered", "failed") and MONITORING_AVAILABLE:
+        latency = (datetime.now(timezone.utc) - datetime.fromisoformat(payload["timestamp"])).total_seconds()
+        _metrics.webhook_delivered(record["event"], success=record["status"] == "delivered",
+                                   duration_seconds=latency)
+    print(f"Webhook {record['id']} -> {url}: {record['status']} "
+          f"(attempt {attempts}, {(time.monotonic() - started) * 1000:.0f}ms)")
+    _persist_webhook_delivery(record)
+
+
+def _webhook_worker_loop():
+    """Worker thread: deliver due outbox jobs one at a time, sleep until the next is due."""
+    queue = _get_webhook_outbox()
+    while not _webhook_stop.is_set():
+        jobs = queue.claim_pending(limit=1, owner=_WEBHOOK_WORKER_ID, lease_seconds=WEBHOOK_LEASE_SECONDS)
+        if not jobs:
+            due = queue.next_due_in()
+            _webhook_wakeup.wait(timeout=WEBHOOK_POLL_INTERVAL if due is None else min(due, WEBHOOK_POLL_INTERVAL))
+            _webhook_wakeup.clear()
+            continue
+        try:
+            _process_webhook_job(queue, jobs[0])
+        except Exception as e:
+            queue.mark_retry(jobs[0]["id"], str(e), WEBHOOK_BACKOFF_BASE)
+            print(f"Webhook worker error: {e}")
+
+
+def _webhook_outbox_status(org_key, operator=False):
+    """Breaker state of org_key's own endpoints for the deliveries API; the
+    operator (master key) gets every breaker plus the global outbox depth and
+    latency histogram."""
+    status = {"async": WEBHOOK_ASYNC}
+    if not operator:
+        urls = {hook.get("url") for hook in _webhook_store.get(org_key, [])}
+        status["breakers"] = [b.get_status() for url, b in list(_webhook_breakers.items()) if url in urls]
+        return status
+    status["breakers"] = [b.get_status() for b in list(_webhook_breakers.values())]
+    if WEBHOOK_ASYNC and _webhook_outbox is not None:
+        status["queue"] = _webhook_outbox.get_stats()
+    if MONITORING_AVAILABLE:
+        histograms = _metrics.export_json()["histograms"]
+        status["latency"] = {k: v for k, v in histograms.items() if k.startswith("s4_webhook_delivery_seconds")}
+    return status
 
 # ═══════════════════════════════════════════════════════════════════════
 #  PROOF CHAIN & CUSTODY STORES — HarborLink Integration (P0/P1)
@@ -878,6 +1743,99 @@ RECORD_CATEGORIES = {
 # ═══════════════════════════════════════════════════════════════════════
 _live_records = []
 
+# Secondary indexes over _live_records: field -> value -> [positions].
+# _live_records is append-only (apart from the one re-sort in _sort_records
+# after hydration), so positions stay valid and lookups that used to scan
+# the whole list become dict hits.
+_RECORD_INDEX_FIELDS = ("hash", "tx_hash", "record_id", "org_id", "batch_id")
+_record_index = {field: {} for field in _RECORD_INDEX_FIELDS}
+_record_positions = {}  # id(record) -> position in _live_records
+_records_lock = threading.Lock()
+
+def _append_record(record):
+    """Append a record to _live_records and update the secondary indexes."""
+    with _records_lock:
+        pos = len(_live_records)
+        _live_records.append(record)
+        _record_positions[id(record)] = pos
+        for field in _RECORD_INDEX_FIELDS:
+            value = record.get(field)
+            if value:
+                _record_index[field].setdefault(value, []).append(pos)
+        _metrics_aggregator.add(record)
+    return record
+
+def _sort_records():
+    """Restore timestamp order after records were appended out of order (live
+    anchors landing during a lazy hydration), rebuilding the indexes. A no-op
+    when the store is already in order."""
+    with _records_lock:
+        stamps = [r.get("timestamp") or "" for r in _live_records]
+        if all(a <= b for a, b in zip(stamps, stamps[1:])):
+            return
+        ordered = sorted(_live_records, key=lambda r: r.get("timestamp") or "")
+        index = {field: {} for field in _RECORD_INDEX_FIELDS}
+        positions = {}
+        for pos, record in enumerate(ordered):
+            positions[id(record)] = pos
+            for field in _RECORD_INDEX_FIELDS:
+                value = record.get(field)
+                if value:
+                    index[field].setdefault(value, []).append(pos)
+        _live_records[:] = ordered
+        _record_index.update(index)
+        _record_positions.clear()
+        _record_positions.update(positions)
+
+def _update_record(record, **fields):
+    """Update fields on a stored record, keeping the secondary indexes current."""
+    with _records_lock:
+        pos = None
+        for field, value in fields.items():
+            old = record.get(field)
+            record[field] = value
+            if field not in _RECORD_INDEX_FIELDS or old == value:
+                continue
+            if pos is None:
+                pos = _record_positions[id(record)]
+            if old:
+                positions = _record_index[field].get(old, [])
+                if pos in positions:
+                    positions.remove(pos)
+                if not positions:
+                    _record_index[field].pop(old, None)
+            if value:
+                bisect.insort(_record_index[field].setdefault(value, []), pos)
+    return record
+
+def _records_by(field, *values):
+    """Return records whose `field` equals any of `values`, in insertion order."""
+    index = _record_index[field]
+    positions = set()
+    for value in values:
+        if value:
+            positions.update(index.get(value, ()))
+    return [_live_records[p] for p in sorted(positions)]
+
+def _first_record(value, *fields):
+    """Return the earliest record whose value matches on any of `fields`, or None."""
+    if not value:
+        return None
+    first = None
+    for field in fields:
+        positions = _record_index[field].get(value)
+        if positions and (first is None or positions[0] < first):
+            first = positions[0]
+    return _live_records[first] if first is not None else None
+
+def _record_for_tx(tx_hash, computed_hash=""):
+    """Resolve the record a tx_hash anchors. Batch transactions cover many
+    records, so prefer the one whose hash matches the record being verified."""
+    for r in _records_by("hash", computed_hash):
+        if r.get("tx_hash") == tx_hash:
+            return r
+    return _first_record(tx_hash, "tx_hash", "hash")
+
 def _get_all_records():
     """Return only real persisted records."""
     return list(_live_records)
@@ -970,6 +1928,94 @@ def _aggregate_metrics(records):
         "generated_at": now.isoformat(),
     }
 
+
+class _MetricsAggregator:
+    """Rolling version of _aggregate_metrics(), updated once per appended record.
+
+    Every record is parsed a single time in add(); snapshot() only sorts the
+    bucket dicts, so /api/metrics polls cost O(buckets) instead of O(records).
+    Output is identical to _aggregate_metrics(_live_records) as long as the
+    aggregated fields (type/label, branch, source, timestamp, fee) are not
+    changed after the record is appended.
+    """
+
+    _BUCKET_LIMITS = (("minute", 60), ("hour", 48), ("day", 30), ("week", 12), ("month", 12))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.total = 0
+            self.records_by_type = {}
+            self.records_by_branch = {}
+            self.records_by_source = {}
+            self.hashes = {name: {} for name, _ in self._BUCKET_LIMITS}
+            self.fees = {name: {} for name, _ in self._BUCKET_LIMITS}
+            self.hashes_by_date = {}  # "%Y-%m-%d" -> count, for hashes_today
+
+    def add(self, r):
+        """Fold one record into the running counters."""
+        with self._lock:
+            self.total += 1
+            rt = r.get("record_label", r.get("record_type", "Unknown"))
+            self.records_by_type[rt] = self.records_by_type.get(rt, 0) + 1
+            branch = r.get("branch", "JOINT")
+            self.records_by_branch[branch] = self.records_by_branch.get(branch, 0) + 1
+            source = r.get("data_source", r.get("system", "direct"))
+            self.records_by_source[source] = self.records_by_source.get(source, 0) + 1
+            try:
+                ts = datetime.fromisoformat(r["timestamp"].replace("Z", "+00:00"))
+            except (ValueError, KeyError):
+                return
+            keys = {
+                "minute": ts.strftime("%H:%M"),
+                "hour": ts.strftime("%b %d %H:00"),
+                "day": ts.strftime("%b %d"),
+                "week": f"Week {ts.isocalendar()[1]}",
+                "month": ts.strftime("%b %Y"),
+            }
+            fee = r.get("fee", 0.01)
+            for name, key in keys.items():
+                self.hashes[name][key] = self.hashes[name].get(key, 0) + 1
+                self.fees[name][key] = round(self.fees[name].get(key, 0) + fee, 4)
+            date_key = ts.strftime("%Y-%m-%d")
+            self.hashes_by_date[date_key] = self.hashes_by_date.get(date_key, 0) + 1
+
+    def snapshot(self, records):
+        """Build the /api/metrics payload; `records` supplies individual_records."""
+        now = datetime.now(timezone.utc)
+
+        def sort_dict(d, max_items=30):
+            items = sorted(d.items())
+            return dict(items[-max_items:]) if len(items) > max_items else dict(items)
+
+        with self._lock:
+            today_count = self.hashes_by_date.get(now.strftime("%Y-%m-%d"), 0)
+            result = {
+                "total_hashes": self.total,
+                "total_fees": round(self.total * 0.01, 2),
+                "total_record_types": len(self.records_by_type),
+                "records_by_type": dict(sorted(self.records_by_type.items(), key=lambda x: -x[1])),
+                "records_by_branch": dict(self.records_by_branch),
+                "records_by_source": dict(self.records_by_source),
+                "verify_audit_log": _verify_audit_log[-50:],
+                "hashes_today": today_count,
+                "fees_today": round(today_count * 0.01, 2),
+                "this_month": self.hashes["month"].get(now.strftime("%b %Y"), 0),
+            }
+            for name, limit in self._BUCKET_LIMITS:
+                result[f"hashes_by_{name}"] = sort_dict(self.hashes[name], limit)
+            for name, limit in self._BUCKET_LIMITS:
+                result[f"fees_by_{name}"] = sort_dict(self.fees[name], limit)
+        result["individual_records"] = records[-100:]
+        result["generated_at"] = now.isoformat()
+        return result
+
+
+_metrics_aggregator = _MetricsAggregator()
+
 # ═══════════════════════════════════════════════════════════════════════
 #  XRPL ANCHOR ENGINE — Testnet + Mainnet Support
 # ═══════════════════════════════════════════════════════════════════════
@@ -1066,10 +2112,10 @@ XRP_ACCOUNT_RESERVE = "12"  # XRP to activate a new wallet + TrustLine reserve
 
 # Subscription tiers — SLS included per month (delivered from Treasury)
 SUBSCRIPTION_TIERS = {
-    "pilot":        {"price_usd": 0,       "sls_monthly": 100,     "anchors": 10000,     "label": "Pilot (Free)"},
-    "starter":      {"price_usd": 999.00,  "sls_monthly": 25000,   "anchors": 2500000,   "label": "Starter"},
-    "professional": {"price_usd": 2499.00, "sls_monthly": 100000,  "anchors": 10000000,  "label": "Professional"},
-    "enterprise":   {"price_usd": 9999.00, "sls_monthly": 500000,  "anchors": 0,         "label": "Enterprise"},
+    "pilot":        {"price_usd": 0,       "sls_monthly": 100,     "anchors": 10000,     "rpm": 120,   "label": "Pilot (Free)"},
+    "starter":      {"price_usd": 999.00,  "sls_monthly": 25000,   "anchors": 2500000,   "rpm": 600,   "label": "Starter"},
+    "professional": {"price_usd": 2499.00, "sls_monthly": 100000,  "anchors": 10000000,  "rpm": 1800,  "label": "Professional"},
+    "enterprise":   {"price_usd": 9999.00, "sls_monthly": 500000,  "anchors": 0,         "rpm": 6000,  "label": "Enterprise"},
 }
 
 # Stripe integration
@@ -1144,6 +2190,8 @@ def _store_wallet(email, address, seed, plan):
     }
     # In-memory cache stores plaintext seed for this session
     _wallet_store[email] = {"email": email, "address": address, "seed": seed, "plan": plan, "created": record["created"]}
+    # A re-provisioned user gets a new wallet — drop the one derived from the old seed
+    _wallet_cache.invalidate(email=email)
     # Persist encrypted seed to Supabase
     _sb_upsert("wallets", record)
     return _wallet_store[email]
@@ -1152,13 +2200,13 @@ def _get_wallet_seed(email=None, address=None):
     """Retrieve a user's wallet seed for custodial signing.
     Looks up by email or wallet address. Checks in-memory cache first,
     then Supabase if available. Decrypts encrypted seeds automatically."""
-    # Check in-memory cache (stores plaintext)
-    if email and email in _wallet_store:
-        return _wallet_store[email].get("seed")
+    # Check in-memory store (wallets provisioned by this process hold their seed)
+    if email and _wallet_store.get(email, {}).get("seed"):
+        return _wallet_store[email]["seed"]
     if address:
         for rec in _wallet_store.values():
-            if rec.get("address") == address:
-                return rec.get("seed")
+            if rec.get("address") == address and rec.get("seed"):
+                return rec["seed"]
     # Query Supabase
     if email:
         rows = _sb_select("wallets", query_params=f"email=eq.{email}", select="seed,email,address,plan")
@@ -1169,16 +2217,143 @@ def _get_wallet_seed(email=None, address=None):
     if rows:
         row = rows[0]
         plaintext_seed = _decrypt_seed(row.get("seed", ""))
-        # Cache for future lookups
-        _wallet_store[row["email"]] = {
+        # Keep the metadata only — derived wallets live in the bounded _wallet_cache
+        _wallet_store.setdefault(row["email"], {}).update({
             "email": row["email"],
             "address": row.get("address", ""),
-            "seed": plaintext_seed,
             "plan": row.get("plan", ""),
-        }
+        })
         return plaintext_seed
     return None
 
+
+# ── Custodial wallet cache ──────────────────────────────────────────
+# Deriving a user's Wallet costs a Supabase query, a Fernet decrypt and a
+# secp256k1 key derivation. Derived wallets are kept for WALLET_CACHE_TTL
+# seconds, at most WALLET_CACHE_MAX of them, keyed by address and email.
+WALLET_CACHE_TTL = float(os.environ.get("S4_WALLET_CACHE_TTL", "900"))
+WALLET_CACHE_MAX = int(os.environ.get("S4_WALLET_CACHE_MAX", "1024"))
+
+
+class _WalletCache:
+    """Bounded, TTL-evicting cache of derived custodial Wallets.
+
+    Callers borrow a wallet with lease(). An evicted entry (TTL, capacity or
+    invalidate()) has its key material cleared as soon as no lease holds it,
+    so an in-flight signature never sees a wiped key. Python strings cannot
+    be overwritten in place: clearing drops the Wallet's seed and private key
+    attributes and the cache's last reference to them.
+    """
+
+    def __init__(self, ttl=WALLET_CACHE_TTL, max_entries=WALLET_CACHE_MAX):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # address -> entry, least recently used first
+        self._by_email = {}             # email -> address
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @contextmanager
+    def lease(self, email=None, address=None):
+        """Yield the user's Wallet (None if they have none), deriving it on a miss."""
+        entry = self._acquire(email, address)
+        try:
+            yield entry["wallet"] if entry else None
+        finally:
+            if entry:
+                with self._lock:
+                    entry["leases"] -= 1
+                    if entry["evicted"] and entry["leases"] == 0:
+                        self._scrub(entry)
+
+    def _acquire(self, email, address):
+        with self._lock:
+            entry = self._lookup(email, address, time.monotonic())
+            if entry is not None:
+                entry["leases"] += 1
+                self.hits += 1
+        if entry is not None:
+            self._record(hit=True)
+            return entry
+        seed = _get_wallet_seed(email=email, address=address)
+        wallet = Wallet.from_seed(seed, algorithm=CryptoAlgorithm.SECP256K1) if seed else None
+        with self._lock:
+            self.misses += 1
+            if wallet is not None:
+                now = time.monotonic()
+                entry = self._lookup(email, address, now)  # another thread may have derived it meanwhile
+                if entry is None:
+                    entry = {"wallet": wallet, "email": email, "expires": now + self.ttl,
+                             "leases": 0, "evicted": False}
+                    self._insert(wallet.address, entry, now)
+                entry["leases"] += 1
+        self._record(hit=False)
+        return entry
+
+    def _lookup(self, email, address, now):
+        key = address or self._by_email.get(email)
+        entry = self._entries.get(key) if key else None
+        if entry is None:
+            return None
+        if entry["expires"] <= now:
+            self._evict(key, "expired")
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _insert(self, address, entry, now):
+        for key in [k for k, e in self._entries.items() if e["expires"] <= now]:
+            self._evict(key, "expired")
+        if address in self._entries:
+            self._evict(address, "replaced")
+        self._entries[address] = entry
+        if entry["email"]:
+            self._by_email[entry["email"]] = address
+        while len(self._entries) > self.max_entries:
+            self._evict(next(iter(self._entries)), "capacity")
+
+    def _evict(self, address, reason):
+        entry = self._entries.pop(address)
+        if entry["email"] and self._by_email.get(entry["email"]) == address:
+            del self._by_email[entry["email"]]
+        entry["evicted"] = True
+        self.evictions += 1
+        if entry["leases"] == 0:
+            self._scrub(entry)
+        if MONITORING_AVAILABLE:
+            _metrics.wallet_cache_evicted(reason)
+
+    @staticmethod
+    def _scrub(entry):
+        wallet, entry["wallet"] = entry["wallet"], None
+        for attr in ("seed", "private_key"):
+            try:
+                setattr(wallet, attr, None)
+            except AttributeError:
+                pass
+
+    def invalidate(self, email=None, address=None):
+        """Drop a user's cached wallet, e.g. after it is re-provisioned."""
+        with self._lock:
+            for key in {address, self._by_email.get(email)}:
+                if key and key in self._entries:
+                    self._evict(key, "invalidated")
+
+    def _record(self, hit):
+        if MONITORING_AVAILABLE:
+            _metrics.wallet_cache_lookup(hit, entries=len(self._entries), hit_ratio=self.get_stats()["hit_rate"])
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions, "ttl": self.ttl, "max_entries": self.max_entries}
+
+
+_wallet_cache = _WalletCache()
+
 def _provision_wallet(email, plan="starter"):
     """Create a new XRPL wallet for a subscriber.
     Treasury funds the wallet with XRP (activation reserve, business expense),
@@ -1308,11 +2483,10 @@ def _deliver_monthly_sls(email, plan=None):
         return {"error": "XRPL Treasury not available"}
 
     # Look up user's wallet
-    wallet_seed = _get_wallet_seed(email=email)
-    if not wallet_seed:
-        return {"error": f"No wallet found for {email}"}
-
-    user_wallet = Wallet.from_seed(wallet_seed, algorithm=CryptoAlgorithm.SECP256K1)
+    with _wallet_cache.lease(email=email) as user_wallet:
+        if user_wallet is None:
+            return {"error": f"No wallet found for {email}"}
+        user_address = user_wallet.address
 
     # Determine plan from cache or parameter
     cached = _wallet_store.get(email, {})
@@ -1329,7 +2503,7 @@ def _deliver_monthly_sls(email, plan=None):
 
         payment = Pay(
             account=_xrpl_treasury_wallet.address,
-            destination=user_wallet.address,
+            destination=user_address,
             amount=ICA(
                 currency="SLS",
                 issuer=SLS_ISSUER_ADDRESS,
@@ -1355,7 +2529,7 @@ def _deliver_monthly_sls(email, plan=None):
                 "tx_hash": resp.result["hash"],
                 "explorer_url": explorer_base + resp.result["hash"],
                 "plan": plan,
-                "wallet": user_wallet.address,
+                "wallet": user_address,
             }
         else:
             return {"error": resp.result.get("engine_result_message", "unknown")}
@@ -1363,10 +2537,23 @@ def _deliver_monthly_sls(email, plan=None):
         print(f"Monthly SLS delivery failed: {e}")
         return {"error": str(e)}
 
-def _deduct_anchor_fee(user_email=None, user_address=None):
+def _submit_fee_payment(payment, wallet, on_signed=None):
+    """submit_and_wait() for a fee Payment. With on_signed, the Payment is signed
+    first and on_signed(tx_hash, last_ledger_sequence) runs before it is sent."""
+    if on_signed is None:
+        return submit_and_wait(payment, _xrpl_client, wallet)
+    from xrpl.transaction import autofill_and_sign
+    signed = autofill_and_sign(payment, _xrpl_client, wallet)
+    on_signed(signed.get_hash(), signed.last_ledger_sequence)
+    return submit_and_wait(signed, _xrpl_client)
+
+
+def _deduct_anchor_fee(user_email=None, user_address=None, amount=SLS_ANCHOR_FEE, memo=None, on_signed=None):
     """Deduct 0.01 SLS anchor fee from the user's wallet → Treasury.
     S4 signs the transaction on the user's behalf using their stored seed (custodial model).
     Looked up by email or wallet address from Supabase.
+    Fee settlement passes the aggregated amount, its own memo payload and an
+    on_signed callback that records the tx hash before the Payment is sent.
     Returns transaction result or None."""
     _init_xrpl()
     if not _xrpl_client:
@@ -1383,19 +2570,20 @@ def _deduct_anchor_fee(user_email=None, user_address=None):
                 amount=ICA(
                     currency="SLS",
                     issuer=SLS_ISSUER_ADDRESS,
-                    value=SLS_ANCHOR_FEE
+                    value=amount
                 ),
                 memos=[Memo(
                     memo_type=bytes("s4/anchor-fee", "utf-8").hex(),
-                    memo_data=bytes(json.dumps({"type": "anchor_fee", "amount": SLS_ANCHOR_FEE, "demo": True}), "utf-8").hex()
+                    memo_data=bytes(json.dumps(dict(memo or {"type": "anchor_fee", "amount": amount}, demo=True)), "utf-8").hex()
                 )]
             )
-            resp = submit_and_wait(fee_payment, _xrpl_client, _xrpl_demo_wallet)
+            with _span("xrpl", "fee_payment"):
+                resp = _submit_fee_payment(fee_payment, _xrpl_demo_wallet, on_signed)
             if resp.is_successful():
                 return {
                     "success": True,
                     "fee_tx": resp.result["hash"],
-                    "fee_amount": SLS_ANCHOR_FEE,
+                    "fee_amount": amount,
                     "from_wallet": _xrpl_demo_wallet.address,
                     "to_treasury": SLS_TREASURY_ADDRESS,
                 }
@@ -1406,101 +2594,1347 @@ def _deduct_anchor_fee(user_email=None, user_address=None):
             print(f"Demo anchor fee deduction failed: {e}")
             return {"error": str(e)}
 
-    # Look up user's wallet seed from custodial store
-    wallet_seed = _get_wallet_seed(email=user_email, address=user_address)
-    if not wallet_seed:
-        return None  # No wallet found — skip fee (unauthenticated user)
+    # Look up user's wallet from the custodial store (cached, see _WalletCache)
+    with _wallet_cache.lease(email=user_email, address=user_address) as user_wallet:
+        if user_wallet is None:
+            return None  # No wallet found — skip fee (unauthenticated user)
 
-    try:
-        from xrpl.models.transactions import Payment as Pay
-        from xrpl.models.amounts import IssuedCurrencyAmount as ICA
+        try:
+            from xrpl.models.transactions import Payment as Pay
+            from xrpl.models.amounts import IssuedCurrencyAmount as ICA
+
+            fee_payment = Pay(
+                account=user_wallet.address,
+                destination=SLS_TREASURY_ADDRESS,
+                amount=ICA(
+                    currency="SLS",
+                    issuer=SLS_ISSUER_ADDRESS,
+                    value=amount
+                ),
+                memos=[Memo(
+                    memo_type=bytes("s4/anchor-fee", "utf-8").hex(),
+                    memo_data=bytes(json.dumps(memo or {"type": "anchor_fee", "amount": amount}), "utf-8").hex()
+                )]
+            )
+            with _span("xrpl", "fee_payment"):
+                resp = _submit_fee_payment(fee_payment, user_wallet, on_signed)
+            if resp.is_successful():
+                return {
+                    "success": True,
+                    "fee_tx": resp.result["hash"],
+                    "fee_amount": amount,
+                    "from_wallet": user_wallet.address,
+                    "to_treasury": SLS_TREASURY_ADDRESS,
+                }
+            else:
+                return {"error": resp.result.get("engine_result_message", "unknown"),
+                        "hint": "Insufficient SLS balance. Your monthly allocation may be exhausted."}
+        except Exception as e:
+            print(f"Anchor fee deduction failed: {e}")
+            return {"error": str(e)}
+
+# ═══════════════════════════════════════════════════════════════════════
+#  XRPL SUBMISSION PIPELINE — several issuer transactions in flight
+#  submit_and_wait() autofills Sequence from the ledger and blocks until
+#  validation, so one account anchors roughly one tx per ledger close.
+#  _XRPLSubmitter allocates Sequence numbers locally, bounds each tx with
+#  LastLedgerSequence and tracks validation on its own worker threads.
+# ═══════════════════════════════════════════════════════════════════════
+
+XRPL_PIPELINE = os.environ.get("S4_XRPL_PIPELINE", "1") != "0"
+XRPL_MAX_IN_FLIGHT = int(os.environ.get("S4_XRPL_MAX_IN_FLIGHT", "8"))
+XRPL_LEDGER_WINDOW = int(os.environ.get("S4_XRPL_LEDGER_WINDOW", "20"))  # LastLedgerSequence = current + window
+XRPL_FEE_DROPS = os.environ.get("S4_XRPL_FEE_DROPS", "12")           # floor under the open-ledger fee
+XRPL_MAX_FEE_DROPS = int(os.environ.get("S4_XRPL_MAX_FEE_DROPS", "1000"))  # never sign above this
+# Tickets: pre-allocated sequence slots that validate independently of each other
+XRPL_TICKETS = os.environ.get("S4_XRPL_TICKETS", "0") == "1"
+XRPL_TICKET_LOW_WATER = int(os.environ.get("S4_XRPL_TICKET_LOW_WATER", "10"))
+XRPL_TICKET_BATCH = int(os.environ.get("S4_XRPL_TICKET_BATCH", "50"))
+
+
+class _XRPLSubmitError(RuntimeError):
+    """A transaction was rejected, or never validated within its resubmission budget."""
+
+    def __init__(self, message, engine_result=None):
+        super().__init__(message)
+        self.engine_result = engine_result
+
+
+def _sign_xrpl_tx(tx_json, wallet):
+    """Sign a JSON transaction with an xrpl-py Wallet. Returns (tx_blob, tx_hash)."""
+    from xrpl.core.binarycodec import encode, encode_for_signing
+    from xrpl.core.keypairs import sign
+    tx = dict(tx_json, SigningPubKey=wallet.public_key)
+    tx["TxnSignature"] = sign(encode_for_signing(tx), wallet.private_key)
+    blob = encode(tx)
+    # Transaction ID = SHA-512Half of the "TXN\0" prefix + signed blob
+    tx_hash = hashlib.sha512(bytes.fromhex("54584E00" + blob)).hexdigest()[:64].upper()
+    return blob, tx_hash
+
+
+class _XRPLSubmitter:
+    """Pipelined JSON-RPC submission for a single account.
+
+    Sequence numbers come from a local counter (seeded from account_info), so
+    submissions never wait on validation of the previous transaction. Each
+    transaction carries LastLedgerSequence, which makes its fate final once
+    the validated ledger passes that index: either it validated, or it never
+    will and is re-signed with a fresh Sequence. Only the allocation is
+    serialized; signing and submit run in parallel, so terPRE_SEQ (arrived
+    ahead of its predecessor) is held like any accepted result. tefPAST_SEQ
+    re-syncs the counter from the ledger, and other unapplied results give
+    their Sequence back.
+
+    With a _TicketPool attached, transactions are sent with Sequence 0 and a
+    TicketSequence instead, so they do not queue behind each other at all;
+    when the pool is empty they fall back to the sequence counter.
+
+    The Fee follows the open-ledger fee (the `fee` RPC, fetched once per
+    ledger), never below fee_drops nor above max_fee_drops; telINSUF_FEE_P
+    re-signs with a higher fee until that cap is reached.
+
+    `sign(tx_json) -> (tx_blob, tx_hash)` keeps key handling out of this class.
+    """
+
+    HELD = ("terQUEUED", "terPRE_SEQ", "tefALREADY")  # accepted for later application
+
+    def __init__(self, rpc_url, account, sign, *, max_in_flight=8, ledger_window=20,
+                 fee_drops="12", max_fee_drops=1000, poll_interval=1.0, max_resubmits=3, timeout=10, tickets=None,
+                 ledger_ttl=1.0):
+        self.rpc_url = rpc_url
+        self.account = account
+        self.sign = sign
+        self.ledger_window = ledger_window
+        self.fee_drops = int(fee_drops)
+        self.max_fee_drops = max(int(max_fee_drops), self.fee_drops)
+        self.poll_interval = poll_interval
+        self.max_resubmits = max_resubmits
+        self.timeout = timeout
+        self.ledger_ttl = ledger_ttl
+        self._ledger_cache = None   # (ledger_current_index, monotonic time fetched)
+        self._fee_cache = None      # (ledger_current_index, open ledger fee in drops)
+        self._next_seq = None
+        self._seq_lock = threading.Lock()
+        self.tickets = tickets
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="s4-xrpl")
+        self._in_flight = 0
+        self._stats_lock = threading.Lock()
+        self.stats = {"submitted": 0, "validated": 0, "failed": 0, "resequenced": 0, "expired": 0,
+                      "fee_escalations": 0}
+
+    # ── JSON-RPC ────────────────────────────────────────────────────
+
+    def _rpc(self, method, params):
+        req = urllib.request.Request(self.rpc_url, data=json.dumps({"method": method, "params": [params]}).encode(),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+        with _span("xrpl", method):
+            return json.loads(_http.urlopen(req, timeout=self.timeout).read()).get("result", {})
+
+    def _account_sequence(self):
+        result = self._rpc("account_info", {"account": self.account, "ledger_index": "current"})
+        if "account_data" not in result:
+            raise _XRPLSubmitError(f"account_info failed: {result.get('error', 'unknown')}")
+        return result["account_data"]["Sequence"]
+
+    def _current_ledger(self):
+        """Open ledger index, reused for ledger_ttl seconds across submissions."""
+        now = time.monotonic()
+        cached = self._ledger_cache
+        if cached is not None and now - cached[1] < self.ledger_ttl:
+            return cached[0]
+        index = self._rpc("ledger_current", {})["ledger_current_index"]
+        self._ledger_cache = (index, now)
+        return index
+
+    def _fee(self, refresh=False):
+        """Fee in drops to sign with: the open-ledger fee, fetched once per open
+        ledger, clamped to [fee_drops, max_fee_drops]."""
+        ledger = self._current_ledger()
+        cached = self._fee_cache
+        if refresh or cached is None or cached[0] != ledger:
+            result = self._rpc("fee", {})
+            if "drops" not in result:
+                raise _XRPLSubmitError(f"fee failed: {result.get('error', 'unknown')}")
+            cached = (ledger, int(result["drops"]["open_ledger_fee"]))
+            self._fee_cache = cached
+        return min(max(cached[1], self.fee_drops), self.max_fee_drops)
+
+    def _escalate_fee(self, fee):
+        """Next fee after telINSUF_FEE_P refused `fee`: at least double it (or the fresh
+        open-ledger fee, if higher) within max_fee_drops. None once the cap was refused."""
+        if fee >= self.max_fee_drops:
+            return None
+        self._count("fee_escalations")
+        return min(max(fee * 2, self._fee(refresh=True)), self.max_fee_drops)
+
+    def _validated_ledger(self):
+        return self._rpc("ledger", {"ledger_index": "validated"})["ledger_index"]
+
+    def _count(self, key):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    # ── Submission ──────────────────────────────────────────────────
+
+    def _submit_ticketed(self, tx_json, ticket):
+        """Sign and submit against a ticket. Returns (tx_hash, last_ledger_sequence), or None
+        if the ticket no longer exists (the caller picks another). The ticket goes back
+        to the pool on any error, so a failed RPC or signer cannot leak it."""
+        try:
+            fee = self._fee()
+            while True:   # re-signed only on telINSUF_FEE_P, with a higher fee up to max_fee_drops
+                tx = dict(tx_json, Account=self.account, Sequence=0, TicketSequence=ticket, Fee=str(fee),
+                          LastLedgerSequence=self._current_ledger() + self.ledger_window)
+                blob, tx_hash = self.sign(tx)
+                result = self._rpc("submit", {"tx_blob": blob})
+                engine = result.get("engine_result", result.get("error", "unknown"))
+                self._count("submitted")
+                if engine != "telINSUF_FEE_P":
+                    break
+                fee = self._escalate_fee(fee)
+                if fee is None:
+                    break
+            if engine == "tesSUCCESS" or engine.startswith("tec") or engine in self.HELD:
+                return tx_hash, tx["LastLedgerSequence"]
+            if engine in ("tefNO_TICKET", "tefPAST_SEQ"):
+                self.tickets.discard(ticket)
+                return None
+            self.tickets.release(ticket)
+            if engine == "tefMAX_LEDGER":  # ledger closed past LastLedgerSequence before submit
+                return None
+            raise _XRPLSubmitError(f"submit rejected: {engine}", engine)
+        except Exception:
+            self.tickets.release(ticket)   # no-op if already released or discarded
+            raise
+
+    def _submit_signed(self, tx_json):
+        """Allocate a Sequence, sign and submit. Returns (tx_hash, last_ledger_sequence).
+
+        Only the allocation happens under _seq_lock; signing and the submit
+        RPC run concurrently, so transactions can reach rippled out of order
+        (terPRE_SEQ, held until the gap fills)."""
+        # TicketCreate consumes its own Sequence plus one per ticket it creates
+        consumed = 1 + (tx_json.get("TicketCount", 0) if tx_json.get("TransactionType") == "TicketCreate" else 0)
+        fee, resubmits = self._fee(), 0
+        while resubmits <= self.max_resubmits:
+            last_ledger = self._current_ledger() + self.ledger_window
+            with self._seq_lock:
+                if self._next_seq is None:
+                    self._next_seq = self._account_sequence()
+                seq = self._next_seq
+                self._next_seq += consumed
+            tx = dict(tx_json, Account=self.account, Sequence=seq, Fee=str(fee), LastLedgerSequence=last_ledger)
+            try:
+                blob, tx_hash = self.sign(tx)
+                result = self._rpc("submit", {"tx_blob": blob})
+            except Exception:
+                self._release_sequence(seq, consumed)
+                raise
+            engine = result.get("engine_result", result.get("error", "unknown"))
+            self._count("submitted")
+            if engine == "tesSUCCESS" or engine.startswith("tec") or engine in self.HELD:
+                return tx_hash, last_ledger
+            if engine == "tefPAST_SEQ":
+                # Someone else consumed this Sequence: re-sync from the ledger
+                with self._seq_lock:
+                    self._next_seq = None
+                self._count("resequenced")
+                resubmits += 1
+                continue
+            # Not applied, so the Sequence was not consumed
+            self._release_sequence(seq, consumed)
+            if engine == "tefMAX_LEDGER":
+                resubmits += 1
+                continue
+            if engine == "telINSUF_FEE_P":
+                # Open-ledger fee rose past ours: re-sign higher, bounded by max_fee_drops
+                fee = self._escalate_fee(fee)
+                if fee is not None:
+                    continue
+            raise _XRPLSubmitError(f"submit rejected: {engine}", engine)
+        raise _XRPLSubmitError("sequence kept moving; gave up resubmitting", "tefPAST_SEQ")
+
+    def _release_sequence(self, seq, consumed):
+        """Give back an unused Sequence: roll the counter back if nothing was allocated
+        after it, otherwise re-sync so the gap is filled before later ones apply."""
+        with self._seq_lock:
+            if self._next_seq == seq + consumed:
+                self._next_seq = seq
+            else:
+                self._next_seq = None
+
+    def _await_validation(self, tx_hash, last_ledger):
+        """Poll until tx_hash is validated (returns the tx result) or expires (returns None)."""
+        while True:
+            result = self._rpc("tx", {"transaction": tx_hash})
+            if result.get("validated"):
+                return result
+            if self._validated_ledger() > last_ledger:
+                return None
+            time.sleep(self.poll_interval)
+
+    def _run(self, tx_json, use_ticket=True):
+        with self._stats_lock:
+            self._in_flight += 1
+        try:
+            attempts = 0
+            while attempts <= self.max_resubmits:
+                attempts += 1
+                ticket = self.tickets.take() if use_ticket and self.tickets is not None else None
+                if ticket is None:
+                    tx_hash, last_ledger = self._submit_signed(tx_json)
+                else:
+                    submitted = self._submit_ticketed(tx_json, ticket)
+                    if submitted is None:
+                        # Ticket already used, or LastLedgerSequence already passed. Counted
+                        # as an attempt so a ticket or ledger that keeps slipping cannot spin
+                        continue
+                    tx_hash, last_ledger = submitted
+                try:
+                    result = self._await_validation(tx_hash, last_ledger)
+                except Exception:
+                    if ticket is not None:
+                        # The tx may still validate: let load() settle the ticket against the ledger
+                        self.tickets.forget(ticket)
+                    raise
+                if result is None:
+                    # Past LastLedgerSequence without validating: it can never apply
+                    self._count("expired")
+                    if ticket is not None:
+                        self.tickets.release(ticket)
+                    else:
+                        with self._seq_lock:
+                            self._next_seq = None
+                    continue
+                if ticket is not None:
+                    self.tickets.discard(ticket)
+                outcome = (result.get("meta") or {}).get("TransactionResult", "tesSUCCESS")
+                if outcome != "tesSUCCESS":
+                    raise _XRPLSubmitError(f"validated with {outcome}", outcome)
+                self._count("validated")
+                return result
+            raise _XRPLSubmitError("transaction did not validate within its resubmission budget", "expired")
+        except Exception:
+            self._count("failed")
+            raise
+        finally:
+            with self._stats_lock:
+                self._in_flight -= 1
+
+    def submit(self, tx_json, use_ticket=True):
+        """Queue a transaction; returns a Future resolving to the validated tx result."""
+        return self._executor.submit(self._run, tx_json, use_ticket)
+
+    def submit_and_wait(self, tx_json, timeout=None, use_ticket=True):
+        return self.submit(tx_json, use_ticket).result(timeout)
+
+    def get_status(self):
+        with self._stats_lock:
+            status = {"account": self.account, "in_flight": self._in_flight,
+                      "next_sequence": self._next_seq, **self.stats}
+        if self.tickets is not None:
+            status["tickets"] = self.tickets.get_status()
+        return status
+
+
+class _TicketPool:
+    """Issuer-account Tickets shared by concurrent submissions.
+
+    take() leases the lowest free TicketSequence (or returns None when the
+    pool is empty). A validated transaction consumes its ticket (discard); an
+    expired or rejected one hands it back (release); one whose validation
+    could not be checked is left for the next load() to settle (forget).
+    When free tickets drop below `low_water`, one background TicketCreate
+    tops the pool up by `batch`, within the ledger's limit of 250 tickets per
+    account. Depth changes are reported through `on_depth(available, leased)`.
+    """
+
+    MAX_TICKETS = 250
+
+    def __init__(self, submitter, *, low_water=10, batch=50, on_depth=None):
+        self.submitter = submitter
+        self.low_water = low_water
+        self.batch = batch
+        self.on_depth = on_depth
+        self._available = []
+        self._leased = set()
+        self._spent = set()  # consumed, but possibly still on the last validated ledger
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._loaded = False
+        self._refilling = False
+        self.refills = 0
+
+    def _owned_tickets(self):
+        """TicketSequence of every Ticket the account currently owns."""
+        tickets, params = [], {"account": self.submitter.account, "type": "ticket", "ledger_index": "validated"}
+        while True:
+            result = self.submitter._rpc("account_objects", params)
+            tickets.extend(o["TicketSequence"] for o in result.get("account_objects", [])
+                           if o.get("LedgerEntryType") == "Ticket")
+            if not result.get("marker"):
+                return tickets
+            params["marker"] = result["marker"]
+
+    def load(self):
+        """Replace the free list with the tickets on the ledger that are not leased."""
+        owned = set(self._owned_tickets())
+        with self._lock:
+            self._spent &= owned
+            self._available = sorted(owned - self._leased - self._spent)
+            self._loaded = True
+        self._publish()
+
+    def take(self):
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    try:
+                        self.load()
+                    except Exception as e:
+                        print(f"Ticket pool load failed: {e}")
+                        self._loaded = True
+        with self._lock:
+            ticket = self._available.pop(0) if self._available else None
+            if ticket is not None:
+                self._leased.add(ticket)
+        self._publish()
+        self._maybe_refill()
+        return ticket
+
+    def release(self, ticket):
+        with self._lock:
+            if ticket in self._leased:
+                self._leased.discard(ticket)
+                bisect.insort(self._available, ticket)
+        self._publish()
+
+    def discard(self, ticket):
+        with self._lock:
+            self._leased.discard(ticket)
+            self._spent.add(ticket)
+        self._publish()
+
+    def forget(self, ticket):
+        """Drop a lease whose transaction's fate is unknown. The ticket is neither
+        free nor spent until the next load() finds it on the ledger (or not)."""
+        with self._lock:
+            self._leased.discard(ticket)
+            self._loaded = False
+        self._publish()
+
+    def _maybe_refill(self):
+        with self._lock:
+            owned = len(self._available) + len(self._leased)
+            if self._refilling or len(self._available) >= self.low_water or owned >= self.MAX_TICKETS:
+                return
+            self._refilling = True
+            count = min(self.batch, self.MAX_TICKETS - owned)
+        threading.Thread(target=self._refill, args=(count,), name="s4-xrpl-tickets", daemon=True).start()
+
+    def _refill(self, count):
+        try:
+            self.submitter.submit_and_wait({"TransactionType": "TicketCreate", "TicketCount": count},
+                                           use_ticket=False)
+            self.refills += 1
+            self.load()
+        except Exception as e:
+            print(f"Ticket refill failed: {e}")
+        finally:
+            with self._lock:
+                self._refilling = False
+
+    def _publish(self):
+        if self.on_depth is not None:
+            with self._lock:
+                available, leased = len(self._available), len(self._leased)
+            self.on_depth(available, leased)
+
+    def get_status(self):
+        with self._lock:
+            return {"available": len(self._available), "leased": len(self._leased),
+                    "refilling": self._refilling, "refills": self.refills, "low_water": self.low_water}
+
+
+_xrpl_submitter = None
+_xrpl_submitter_lock = threading.Lock()
+
+
+def _get_xrpl_submitter():
+    """Pipelined submitter for the issuer wallet (requires _init_xrpl to have loaded it)."""
+    global _xrpl_submitter
+    with _xrpl_submitter_lock:
+        if _xrpl_submitter is None:
+            wallet = _xrpl_wallet
+            _xrpl_submitter = _XRPLSubmitter(
+                _xrpl_client.url, wallet.address, lambda tx: _sign_xrpl_tx(tx, wallet),
+                max_in_flight=XRPL_MAX_IN_FLIGHT, ledger_window=XRPL_LEDGER_WINDOW, fee_drops=XRPL_FEE_DROPS,
+                max_fee_drops=XRPL_MAX_FEE_DROPS,
+            )
+            if XRPL_TICKETS:
+                _xrpl_submitter.tickets = _TicketPool(
+                    _xrpl_submitter, low_water=XRPL_TICKET_LOW_WATER, batch=XRPL_TICKET_BATCH,
+                    on_depth=_metrics.record_ticket_pool if MONITORING_AVAILABLE else None,
+                )
+        return _xrpl_submitter
 
-        user_wallet = Wallet.from_seed(wallet_seed, algorithm=CryptoAlgorithm.SECP256K1)
-        fee_payment = Pay(
-            account=user_wallet.address,
-            destination=SLS_TREASURY_ADDRESS,
-            amount=ICA(
-                currency="SLS",
-                issuer=SLS_ISSUER_ADDRESS,
-                value=SLS_ANCHOR_FEE
-            ),
-            memos=[Memo(
-                memo_type=bytes("s4/anchor-fee", "utf-8").hex(),
-                memo_data=bytes(json.dumps({"type": "anchor_fee", "amount": SLS_ANCHOR_FEE}), "utf-8").hex()
-            )]
-        )
-        resp = submit_and_wait(fee_payment, _xrpl_client, user_wallet)
-        if resp.is_successful():
-            return {
-                "success": True,
-                "fee_tx": resp.result["hash"],
-                "fee_amount": SLS_ANCHOR_FEE,
-                "from_wallet": user_wallet.address,
-                "to_treasury": SLS_TREASURY_ADDRESS,
-            }
-        else:
-            return {"error": resp.result.get("engine_result_message", "unknown"),
-                    "hint": "Insufficient SLS balance. Your monthly allocation may be exhausted."}
-    except Exception as e:
-        print(f"Anchor fee deduction failed: {e}")
-        return {"error": str(e)}
 
 def _anchor_xrpl(hash_value, record_type="", branch="", user_email=None):
     """Submit a real anchor transaction to XRPL (AccountSet memo only).
     The Issuer wallet signs the AccountSet memo — this is the on-chain hash anchor.
-    After anchoring, _deduct_anchor_fee sends 0.01 SLS from the user's
-    custodial wallet → Treasury.
+    After anchoring, the user is debited 0.01 SLS in the fee ledger; the
+    settler later pays it from the user's custodial wallet → Treasury.
     The Issuer wallet is for trustlines + AccountSet anchors ONLY.
     Returns tx info dict or None."""
     _init_xrpl()
     if not _xrpl_client or not _xrpl_wallet:
         return None
+    started = time.perf_counter()
+    if MONITORING_AVAILABLE:
+        _metrics.anchor_started()
+    tx_result = None
     try:
         memo_data = json.dumps({
             "hash": hash_value, "type": record_type, "branch": branch,
             "platform": "S4 Ledger", "ts": datetime.now(timezone.utc).isoformat()
         })
         # AccountSet with memo — the actual on-chain anchor (signed by Issuer wallet)
-        tx = AccountSet(
-            account=_xrpl_wallet.address,
-            memos=[Memo(
-                memo_type=bytes("s4/anchor", "utf-8").hex(),
-                memo_data=bytes(memo_data, "utf-8").hex()
-            )]
-        )
-        response = submit_and_wait(tx, _xrpl_client, _xrpl_wallet)
-        if response.is_successful():
-            tx_hash = response.result["hash"]
+        if XRPL_PIPELINE:
+            # Local sequencing: concurrent anchors share ledgers instead of queueing
+            tx_result = _get_xrpl_submitter().submit_and_wait({
+                "TransactionType": "AccountSet",
+                "Memos": [{"Memo": {
+                    "MemoType": bytes("s4/anchor", "utf-8").hex().upper(),
+                    "MemoData": bytes(memo_data, "utf-8").hex().upper(),
+                }}],
+            })
+        else:
+            tx = AccountSet(
+                account=_xrpl_wallet.address,
+                memos=[Memo(
+                    memo_type=bytes("s4/anchor", "utf-8").hex(),
+                    memo_data=bytes(memo_data, "utf-8").hex()
+                )]
+            )
+            with _span("xrpl", "submit_and_wait") as span:
+                response = submit_and_wait(tx, _xrpl_client, _xrpl_wallet)
+                span["ok"] = response.is_successful()
+            tx_result = response.result if response.is_successful() else None
+        if tx_result:
+            tx_hash = tx_result["hash"]
             explorer_base = XRPL_EXPLORER_MAINNET if XRPL_NETWORK == "mainnet" else XRPL_EXPLORER_TESTNET
             result = {
                 "tx_hash": tx_hash,
-                "ledger_index": response.result.get("ledger_index"),
-                "fee_drops": response.result.get("Fee", "12"),
+                "ledger_index": tx_result.get("ledger_index"),
+                "fee_drops": tx_result.get("Fee", "12"),
                 "network": XRPL_NETWORK,
                 "verified": True,
                 "explorer_url": explorer_base + tx_hash,
                 "account": _xrpl_wallet.address
             }
-            # Production: deduct fee from user's custodial wallet → Treasury
+            # Production: charge the fee to the user's custodial wallet → Treasury
             if user_email:
-                user_fee = _deduct_anchor_fee(user_email=user_email)
-                if user_fee and user_fee.get("success"):
-                    result["user_fee_tx"] = user_fee["fee_tx"]
-                    result["sls_fee"] = SLS_ANCHOR_FEE
-                    result["sls_treasury"] = SLS_TREASURY_ADDRESS
-                elif user_fee:
-                    # Propagate fee error so frontend can display it
-                    result["fee_error"] = user_fee.get("error", "Fee deduction failed")
-                    result["fee_hint"] = user_fee.get("hint", "")
-                    print(f"SLS fee deduction failed for {user_email}: {user_fee}")
-                else:
-                    result["fee_error"] = "No wallet found for fee deduction"
-                    print(f"SLS fee deduction returned None for {user_email}")
+                result.update(_charge_anchor_fee(user_email, tx_hash))
             return result
     except Exception as e:
         print(f"XRPL anchor failed: {e}")
+    finally:
+        if MONITORING_AVAILABLE:
+            _metrics.anchor_completed(time.perf_counter() - started, success=bool(tx_result))
     return None
 
+
+def _charge_anchor_fee(user_email, anchor_tx, ref=None):
+    """Charge the anchor fee for one user; returns the fee fields for the anchor result.
+
+    With fee batching on, the charge is a local debit in the fee ledger and
+    the anchor path does no fee I/O; otherwise one Payment is sent now.
+    `ref` tells apart records that share an anchor tx (Merkle batches).
+    """
+    if FEE_BATCHING:
+        try:
+            debit = _get_fee_ledger().record(user_email, anchor_tx, ref=ref)
+        except sqlite3.Error as e:
+            print(f"Fee ledger write failed for {user_email}: {e}")
+            return {"fee_error": "Fee ledger unavailable"}
+        _start_fee_settler()
+        return {"fee_debit_id": debit["debit_id"], "fee_status": "accrued",
+                "sls_fee": debit["amount"], "sls_treasury": SLS_TREASURY_ADDRESS}
+    user_fee = _deduct_anchor_fee(user_email=user_email)
+    if user_fee and user_fee.get("success"):
+        return {"user_fee_tx": user_fee["fee_tx"], "sls_fee": SLS_ANCHOR_FEE, "sls_treasury": SLS_TREASURY_ADDRESS}
+    if user_fee:
+        # Propagate fee error so frontend can display it
+        print(f"SLS fee deduction failed for {user_email}: {user_fee}")
+        return {"fee_error": user_fee.get("error", "Fee deduction failed"), "fee_hint": user_fee.get("hint", "")}
+    print(f"SLS fee deduction returned None for {user_email}")
+    return {"fee_error": "No wallet found for fee deduction"}
+
+
+# ═══════════════════════════════════════════════════════════════════════
+#  ANCHOR FEE LEDGER — batched SLS fee settlement
+#  Every anchor records a fee debit in a local SQLite ledger, keyed so a
+#  re-processed anchor is not charged twice. A settler thread periodically
+#  pays each user's open debits as one Payment → Treasury whose memo lists
+#  the anchors it covers. Debits are money owed, so batching only runs
+#  against a configured ledger file outside the temp dir, which serverless
+#  hosts discard when the instance recycles.
+#  Settlements are claimed under a lease (owner + expiry) and the signed
+#  Payment hash is stored before it is sent: a settlement that already has
+#  a hash is looked up on the XRPL, never paid again blindly, and its
+#  debits are only released once that Payment has definitely not applied.
+# ═══════════════════════════════════════════════════════════════════════
+
+FEE_LEDGER_DB = os.environ.get("S4_FEE_LEDGER_DB", "").strip()
+FEE_SETTLE_INTERVAL = float(os.environ.get("S4_FEE_SETTLE_INTERVAL", "300"))
+FEE_SETTLE_MAX_ANCHORS = int(os.environ.get("S4_FEE_SETTLE_MAX_ANCHORS", "40"))  # per Payment — memos are capped at 1 KB
+FEE_SETTLE_LEASE_SECONDS = float(os.environ.get("S4_FEE_SETTLE_LEASE_SECONDS", "600"))
+
+
+def _is_durable_path(path):
+    """True for a configured file path outside the temp dir."""
+    if not path:
+        return False
+    tmp = os.path.realpath(tempfile.gettempdir())
+    return os.path.commonpath([os.path.realpath(path), tmp]) != tmp
+
+
+FEE_BATCHING = os.environ.get("S4_FEE_BATCHING", "1") != "0" and _is_durable_path(FEE_LEDGER_DB)
+
+_fee_ledger = None
+_fee_settler = None
+_fee_ledger_lock = threading.Lock()
+_fee_settle_lock = threading.Lock()   # one settlement pass per process at a time
+_fee_settler_stop = threading.Event()
+_FEE_SETTLER_ID = f"{os.getpid()}:{random.getrandbits(64):016x}"
+
+
+class _FeeLedger:
+    """Per-user anchor fee debits and the settlements that paid them.
+
+    Amounts are stored as decimal strings and summed with Decimal, so a
+    settlement equals the sum of its debits exactly. A debit belongs to at
+    most one live settlement. A pending settlement is worked by whoever holds
+    its lease; once its Payment is signed, `tx_hash` and `last_ledger` are
+    stored so a later pass can find out what happened to it. Only a failed
+    settlement releases its debits to the next pass.
+    """
+
+    def __init__(self, db_path=FEE_LEDGER_DB, fee=SLS_ANCHOR_FEE):
+        self.db_path = db_path
+        self.fee = fee
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS fee_debits (
+                debit_id TEXT PRIMARY KEY,
+                user_email TEXT NOT NULL,
+                anchor_tx TEXT NOT NULL,
+                ref TEXT,
+                amount TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                settlement_id TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_fee_debits_settlement ON fee_debits(settlement_id)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS fee_settlements (
+                settlement_id TEXT PRIMARY KEY,
+                user_email TEXT NOT NULL,
+                amount TEXT NOT NULL,
+                debit_count INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                tx_hash TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                settled_at REAL
+            )
+        """)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(fee_settlements)")}
+        for column, decl in (("last_ledger", "INTEGER"), ("claimed_by", "TEXT"), ("lease_expires_at", "REAL")):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE fee_settlements ADD COLUMN {column} {decl}")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def record(self, user_email, anchor_tx, ref=None):
+        """Debit one anchor's fee. Recording the same anchor again is a no-op."""
+        debit_id = hashlib.sha256(f"{user_email}|{anchor_tx}|{ref or ''}".encode()).hexdigest()[:32]
+        self._conn().execute(
+            """INSERT OR IGNORE INTO fee_debits (debit_id, user_email, anchor_tx, ref, amount, created_at)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (debit_id, user_email, anchor_tx, ref, self.fee, time.time()),
+        )
+        return {"debit_id": debit_id, "amount": self.fee}
+
+    def claim(self, max_anchors=FEE_SETTLE_MAX_ANCHORS, owner=_FEE_SETTLER_ID,
+              lease_seconds=FEE_SETTLE_LEASE_SECONDS):
+        """Group open debits into pending settlements of at most max_anchors per user
+        and lease them to `owner`, together with any pending settlement whose lease
+        has expired (an interrupted pass).
+
+        Returns the settlements `owner` now holds, each with the anchor txs it covers.
+        """
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            by_user = {}
+            for debit_id, email, amount in conn.execute(
+                    """SELECT debit_id, user_email, amount FROM fee_debits
+                       WHERE settlement_id IS NULL ORDER BY created_at, debit_id"""):
+                by_user.setdefault(email, []).append((debit_id, amount))
+            for email, debits in by_user.items():
+                for i in range(0, len(debits), max_anchors):
+                    chunk = debits[i:i + max_anchors]
+                    settlement_id = "FEE-" + hashlib.sha256(
+                        f"{email}|{chunk[0][0]}|{now}".encode()).hexdigest()[:16].upper()
+                    total = sum((Decimal(amount) for _, amount in chunk), Decimal(0))
+                    conn.execute(
+                        """INSERT INTO fee_settlements (settlement_id, user_email, amount, debit_count, created_at)
+                           VALUES (?, ?, ?, ?, ?)""",
+                        (settlement_id, email, str(total), len(chunk), now),
+                    )
+                    conn.executemany("UPDATE fee_debits SET settlement_id = ? WHERE debit_id = ?",
+                                     [(settlement_id, debit_id) for debit_id, _ in chunk])
+            conn.execute(
+                """UPDATE fee_settlements SET claimed_by = ?, lease_expires_at = ?
+                   WHERE status = 'pending' AND (lease_expires_at IS NULL OR lease_expires_at <= ?)""",
+                (owner, now + lease_seconds, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [s for s in self.settlements(status="pending") if s["claimed_by"] == owner]
+
+    def renew(self, settlement_id, owner=_FEE_SETTLER_ID, lease_seconds=FEE_SETTLE_LEASE_SECONDS):
+        """Extend owner's lease on a pending settlement; False if it is no longer owner's."""
+        cur = self._conn().execute(
+            """UPDATE fee_settlements SET lease_expires_at = ?
+               WHERE settlement_id = ? AND status = 'pending' AND claimed_by = ?""",
+            (time.time() + lease_seconds, settlement_id, owner),
+        )
+        return cur.rowcount == 1
+
+    def settlements(self, status=None):
+        conn = self._conn()
+        conn.row_factory = sqlite3.Row
+        try:
+            where, args = ("WHERE status = ?", (status,)) if status else ("", ())
+            rows = [dict(r) for r in conn.execute(
+                f"SELECT * FROM fee_settlements {where} ORDER BY created_at, rowid", args)]
+            for row in rows:
+                anchors = conn.execute(
+                    "SELECT DISTINCT anchor_tx FROM fee_debits WHERE settlement_id = ? ORDER BY anchor_tx",
+                    (row["settlement_id"],)).fetchall()
+                row["anchors"] = [a[0] for a in anchors]
+        finally:
+            conn.row_factory = None
+        return rows
+
+    def mark_signed(self, settlement_id, tx_hash, last_ledger):
+        """Store the hash of the signed Payment before it is submitted."""
+        self._conn().execute(
+            "UPDATE fee_settlements SET tx_hash = ?, last_ledger = ? WHERE settlement_id = ? AND status = 'pending'",
+            (tx_hash, last_ledger, settlement_id),
+        )
+
+    def complete(self, settlement_id, tx_hash):
+        """Mark a pending settlement paid by tx_hash."""
+        self._conn().execute(
+            """UPDATE fee_settlements SET status = 'settled', tx_hash = ?, error = NULL, settled_at = ?,
+                      claimed_by = NULL, lease_expires_at = NULL
+               WHERE settlement_id = ? AND status = 'pending'""",
+            (tx_hash, time.time(), settlement_id),
+        )
+
+    def defer(self, settlement_id, error):
+        """Leave a settlement pending with its Payment unconfirmed; the lease is
+        dropped so the next pass looks the Payment up again."""
+        self._conn().execute(
+            """UPDATE fee_settlements SET error = ?, claimed_by = NULL, lease_expires_at = NULL
+               WHERE settlement_id = ? AND status = 'pending'""",
+            (str(error)[:200], settlement_id),
+        )
+
+    def fail(self, settlement_id, error):
+        """Mark a pending settlement failed and return its debits to the open pool.
+        Only for Payments that were never sent or can no longer apply."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cur = conn.execute(
+                """UPDATE fee_settlements SET status = 'failed', error = ?, claimed_by = NULL, lease_expires_at = NULL
+                   WHERE settlement_id = ? AND status = 'pending'""",
+                (str(error)[:200], settlement_id))
+            if cur.rowcount:
+                conn.execute("UPDATE fee_debits SET settlement_id = NULL WHERE settlement_id = ?", (settlement_id,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def reconcile(self):
+        """Treasury reconciliation: per-user accrued / settled / pending / outstanding
+        SLS, and a check that every settled Payment equals the debits it covers."""
+        conn = self._conn()
+        status_of = dict(conn.execute("SELECT settlement_id, status FROM fee_settlements"))
+        users = {}
+        covered = {}  # settlement_id -> [count, sum of debits]
+        for email, amount, settlement_id in conn.execute(
+                "SELECT user_email, amount, settlement_id FROM fee_debits"):
+            state = "outstanding" if settlement_id is None else status_of.get(settlement_id, "outstanding")
+            if state == "settled":
+                entry = covered.setdefault(settlement_id, [0, Decimal(0)])
+                entry[0] += 1
+                entry[1] += Decimal(amount)
+            totals = users.setdefault(email, {"anchors": 0, "accrued": Decimal(0), "settled": Decimal(0),
+                                              "pending": Decimal(0), "outstanding": Decimal(0)})
+            totals["anchors"] += 1
+            totals["accrued"] += Decimal(amount)
+            totals[state] += Decimal(amount)
+
+        mismatches = []
+        payments = 0
+        paid = Decimal(0)
+        for row in conn.execute(
+                "SELECT settlement_id, amount, debit_count, tx_hash FROM fee_settlements WHERE status = 'settled'"):
+            settlement_id, amount, count, tx_hash = row
+            payments += 1
+            paid += Decimal(amount)
+            debits, debit_sum = covered.get(settlement_id, [0, Decimal(0)])
+            if debits != count or debit_sum != Decimal(amount):
+                mismatches.append({"settlement_id": settlement_id, "tx_hash": tx_hash, "amount": amount,
+                                   "debits": debits, "debit_total": str(debit_sum)})
+
+        summary = {k: Decimal(0) for k in ("accrued", "settled", "pending", "outstanding")}
+        for totals in users.values():
+            for k in summary:
+                summary[k] += totals[k]
+        return {
+            "users": {email: {k: (v if k == "anchors" else str(v)) for k, v in totals.items()}
+                      for email, totals in sorted(users.items())},
+            "totals": dict({k: str(v) for k, v in summary.items()},
+                           anchors=sum(t["anchors"] for t in users.values()), payments=payments, paid=str(paid)),
+            "mismatches": mismatches,
+            "balanced": not mismatches and paid == summary["settled"],
+        }
+
+
+def _get_fee_ledger():
+    global _fee_ledger
+    with _fee_ledger_lock:
+        if _fee_ledger is None:
+            _fee_ledger = _FeeLedger(FEE_LEDGER_DB)
+        return _fee_ledger
+
+
+def _fee_payment_status(tx_hash, last_ledger):
+    """Ledger outcome of a signed fee Payment: "settled", "failed" (validated
+    with an error, or past its LastLedgerSequence without applying) or
+    "unknown" (still in flight, or the lookup itself failed)."""
+    from xrpl.ledger import get_latest_validated_ledger_sequence
+    from xrpl.models.requests import Tx
+    try:
+        with _span("xrpl", "tx"):
+            result = _xrpl_client.request(Tx(transaction=tx_hash)).result
+        if result.get("validated"):
+            outcome = (result.get("meta") or {}).get("TransactionResult")
+            return "settled" if outcome == "tesSUCCESS" else "failed"
+        if last_ledger and get_latest_validated_ledger_sequence(_xrpl_client) > last_ledger:
+            return "failed"
+    except Exception as e:
+        print(f"Fee payment lookup failed for {tx_hash}: {e}")
+    return "unknown"
+
+
+def _settle_anchor_fees():
+    """Pay every user's open fee debits — one Payment → Treasury per user and
+    FEE_SETTLE_MAX_ANCHORS anchors. A settlement whose Payment was already
+    signed is looked up instead of paid again; failed Payments are retried
+    next pass and unconfirmed ones stay pending until the ledger decides."""
+    _init_xrpl()
+    if not _xrpl_client:
+        return {"skipped": "XRPL not available", "settled": 0, "failed": 0, "pending": 0, "payments": []}
+    ledger = _get_fee_ledger()
+    summary = {"settled": 0, "failed": 0, "pending": 0, "payments": []}
+    with _fee_settle_lock:
+        for settlement in ledger.claim(FEE_SETTLE_MAX_ANCHORS, owner=_FEE_SETTLER_ID):
+            settlement_id = settlement["settlement_id"]
+            if not ledger.renew(settlement_id, owner=_FEE_SETTLER_ID):
+                continue  # lease lapsed and another settler took it over
+            payment = {"settlement_id": settlement_id, "user": settlement["user_email"],
+                       "amount": settlement["amount"], "anchors": settlement["debit_count"]}
+            signed = {"tx_hash": settlement["tx_hash"], "last_ledger": settlement["last_ledger"]}
+            if signed["tx_hash"]:
+                # Signed by an earlier attempt: its Payment may be on the ledger already
+                fee, error = None, settlement["error"] or "interrupted after signing"
+            else:
+                def on_signed(tx_hash, last_ledger, settlement_id=settlement_id):
+                    ledger.mark_signed(settlement_id, tx_hash, last_ledger)
+                    signed.update(tx_hash=tx_hash, last_ledger=last_ledger)
+
+                memo = {"type": "anchor_fee_batch", "settlement": settlement_id,
+                        "amount": settlement["amount"], "count": settlement["debit_count"],
+                        "anchors": [tx[:16] for tx in settlement["anchors"]]}
+                fee = _deduct_anchor_fee(user_email=settlement["user_email"], amount=settlement["amount"],
+                                         memo=memo, on_signed=on_signed)
+                error = fee.get("error", "unknown") if fee else "No wallet found for fee settlement"
+            if fee and fee.get("success"):
+                state, tx_hash = "settled", fee["fee_tx"]
+            elif signed["tx_hash"]:
+                state, tx_hash = _fee_payment_status(signed["tx_hash"], signed["last_ledger"]), signed["tx_hash"]
+            else:
+                state, tx_hash = "failed", None   # never signed, so nothing was sent
+            if state == "settled":
+                ledger.complete(settlement_id, tx_hash)
+                if MONITORING_AVAILABLE:
+                    _metrics.sls_fee_collected(float(settlement["amount"]))
+                payment["tx_hash"] = tx_hash
+            elif state == "failed":
+                ledger.fail(settlement_id, error)
+                payment["error"] = error
+            else:
+                ledger.defer(settlement_id, error)
+                payment.update(tx_hash=tx_hash, error=error, unconfirmed=True)
+            summary[state if state != "unknown" else "pending"] += 1
+            summary["payments"].append(payment)
+    if summary["payments"]:
+        print(f"Fee settlement: {summary['settled']} paid, {summary['failed']} failed, "
+              f"{summary['pending']} unconfirmed")
+    return summary
+
+
+def _fee_settler_loop():
+    while not _fee_settler_stop.wait(FEE_SETTLE_INTERVAL):
+        try:
+            _settle_anchor_fees()
+        except Exception as e:
+            print(f"Fee settlement pass failed: {e}")
+
+
+def _start_fee_settler():
+    """Start the periodic settlement thread if it is not running."""
+    global _fee_settler
+    with _fee_ledger_lock:
+        if _fee_settler is None or not _fee_settler.is_alive():
+            _fee_settler_stop.clear()
+            _fee_settler = threading.Thread(target=_fee_settler_loop, name="s4-fee-settler", daemon=True)
+            _fee_settler.start()
+
+
+def _stop_fee_settler(timeout=5.0):
+    """Stop the settlement thread (shutdown/tests)."""
+    _fee_settler_stop.set()
+    if _fee_settler is not None:
+        _fee_settler.join(timeout)
+
+
+# ═══════════════════════════════════════════════════════════════════════
+#  MERKLE TREES — batch anchoring (N record hashes → 1 root → 1 XRPL tx)
+#  Tree layout, proofs and verification live in s4_merkle (shared with
+#  the SDK); stored batches keep their levels packed as raw digests.
+# ═══════════════════════════════════════════════════════════════════════
+
+def _pack_merkle_levels(levels):
+    """Compact form of the internal levels (above the leaves): one bytes blob
+    of concatenated 32-byte digests per level, root level last."""
+    return [b"".join(bytes.fromhex(h) for h in layer) for layer in levels[1:]]
+
+
+def _batch_proof(batch, index):
+    """Sibling path for leaf `index` of a stored batch, read from its packed
+    tree in O(log n). Batches stored without a tree get one built on demand."""
+    leaves = batch["leaf_hashes"]
+    if "tree" not in batch:
+        batch["tree"] = _pack_merkle_levels(_merkle_levels(leaves))
+    proof = []
+    for depth, layer in enumerate([leaves] + batch["tree"][:-1]):
+        width = len(layer) if depth == 0 else len(layer) // 32
+        sibling = index ^ 1 if (index ^ 1) < width else index
+        node = layer[sibling] if depth == 0 else layer[sibling * 32:sibling * 32 + 32].hex()
+        proof.append({"hash": node, "position": "right" if index % 2 == 0 else "left"})
+        index //= 2
+    return proof
+
+
+def _xrpl_live():
+    """True when anchors are really submitted to XRPL (not simulated)."""
+    _init_xrpl()
+    return bool(_xrpl_client and _xrpl_wallet)
+
+
+def _finalize_anchor(record, xrpl_result, *, user_email="", actor="api", org_key=None, fallback_tx_hash=None,
+                     persist=True, update=False):
+    """Apply an XRPL result to an anchored record: proof chain, persistence, webhook.
+
+    Shared by the synchronous /api/anchor path and the async anchor workers.
+    With persist=False the caller writes the record and its proof chain event
+    itself (coalesced batches do this in bulk). update=True when the record
+    was already persisted as pending (async workers). Returns the tx_hash
+    written to the record.
+    """
+    now = datetime.now(timezone.utc)
+    if xrpl_result:
+        tx_hash = xrpl_result["tx_hash"]
+        network = "XRPL " + XRPL_NETWORK.capitalize()
+        explorer_url = xrpl_result["explorer_url"]
+    else:
+        tx_hash = fallback_tx_hash or "TX" + hashlib.md5(str(now).encode()).hexdigest().upper()[:32]
+        network = "Simulated"
+        explorer_url = None
+    _update_record(record, tx_hash=tx_hash, network=network, explorer_url=explorer_url)
+    record["anchor_status"] = "anchored"
+    if persist:
+        _persist_record(record, update=update)
+
+    # Add to proof chain
+    rid = record["record_id"]
+    if rid not in _proof_chain_store:
+        _proof_chain_store[rid] = []
+    proof_event = {
+        "event_type": "anchor.created",
+        "hash": record["hash"],
+        "tx_hash": tx_hash,
+        "timestamp": now.isoformat(),
+        "actor": user_email or actor,
+        "metadata": {"record_type": record["record_type"], "network": network},
+    }
+    _proof_chain_store[rid].append(proof_event)
+    if persist:
+        _persist_proof_chain_event(rid, proof_event)
+
+    # Fire webhook: anchor.confirmed
+    _deliver_webhook("anchor.confirmed", {
+        "record_id": rid,
+        "hash": record["hash"],
+        "tx_hash": tx_hash,
+        "record_type": record["record_type"],
+        "explorer_url": explorer_url,
+        "network": network,
+        "fee": 0.01,
+        **({"batch_id": record["batch_id"], "merkle_root": record.get("merkle_root")} if record.get("batch_id") else {}),
+    }, org_key=org_key)
+    return tx_hash
+
+
+# ═══════════════════════════════════════════════════════════════════════
+#  ASYNC ANCHOR PIPELINE — /api/anchor returns immediately, workers submit
+#  Opt-in (S4_ANCHOR_ASYNC=1): it needs a long-lived process for its worker
+#  threads, so it stays off on serverless deployments that freeze after the
+#  response. Jobs are stored in a resilience.PersistentQueue (SQLite) and
+#  claimed under a lease; a job whose worker died is picked up again once
+#  its lease expires, while jobs held by live workers are left alone.
+# ═══════════════════════════════════════════════════════════════════════
+
+ANCHOR_ASYNC = os.environ.get("S4_ANCHOR_ASYNC", "0") == "1" and RESILIENCE_AVAILABLE
+ANCHOR_WORKERS = int(os.environ.get("S4_ANCHOR_WORKERS", "4"))
+ANCHOR_MAX_ATTEMPTS = int(os.environ.get("S4_ANCHOR_MAX_ATTEMPTS", "5"))
+ANCHOR_QUEUE_DB = os.environ.get("S4_ANCHOR_QUEUE_DB", os.path.join(tempfile.gettempdir(), "s4_anchor_queue.db"))
+ANCHOR_RETRY_INTERVAL = 5.0  # seconds between sweeps that requeue failed jobs
+ANCHOR_LEASE_SECONDS = float(os.environ.get("S4_ANCHOR_LEASE_SECONDS", "300"))
+_ANCHOR_WORKER_ID = f"{os.getpid()}:{random.getrandbits(64):016x}"  # lease owner for this process
+# Micro-batching: single anchors arriving within the window are coalesced into one
+# Merkle root / one XRPL transaction. A window of 0 anchors every job on its own.
+ANCHOR_BATCH_WINDOW = float(os.environ.get("S4_ANCHOR_BATCH_WINDOW_MS", "250")) / 1000
+ANCHOR_BATCH_MAX_LEAVES = int(os.environ.get("S4_ANCHOR_BATCH_MAX_LEAVES", "256"))
+
+_anchor_queue = None
+_anchor_workers = []
+_anchor_jobs = {}   # record_id -> {status, queue_id, attempts, tx_hash, error, enqueued_at, completed_at}
+_anchor_wakeup = threading.Event()
+_anchor_stop = threading.Event()
+_anchor_pipeline_lock = threading.Lock()
+_anchor_collect_lock = threading.Lock()  # one worker fills a batch while others submit
+
+
+def _get_anchor_queue():
+    """Open the durable anchor queue on first use. Interrupted jobs are not
+    requeued here — they come back through claim_pending once their lease expires.
+    A queue that already holds jobs (e.g. from before a restart) starts the
+    workers at once instead of waiting for the next anchor."""
+    global _anchor_queue
+    with _anchor_pipeline_lock:
+        if _anchor_queue is not None:
+            return _anchor_queue
+        queue = _anchor_queue = PersistentQueue(db_path=ANCHOR_QUEUE_DB)
+    stats = queue.get_stats()
+    if stats["pending"] or stats["in_flight"]:
+        _start_anchor_workers()
+    return queue
+
+
+def _resume_async_queues():
+    """Open the enabled async queues on the first request, so anchors and webhook
+    deliveries left by a previous process resume without a new enqueue."""
+    if ANCHOR_ASYNC and _anchor_queue is None:
+        _get_anchor_queue()
+    if WEBHOOK_ASYNC and _webhook_outbox is None:
+        _get_webhook_outbox()
+
+
+def _start_anchor_workers():
+    """Start (or restart) the anchor worker threads."""
+    with _anchor_pipeline_lock:
+        _anchor_stop.clear()
+        _anchor_workers[:] = [t for t in _anchor_workers if t.is_alive()]
+        for i in range(len(_anchor_workers), ANCHOR_WORKERS):
+            t = threading.Thread(target=_anchor_worker_loop, name=f"s4-anchor-{i}", daemon=True)
+            t.start()
+            _anchor_workers.append(t)
+
+
+def _stop_anchor_workers(timeout=5.0):
+    """Signal the anchor workers to exit and wait for them (shutdown/tests)."""
+    _anchor_stop.set()
+    _anchor_wakeup.set()
+    for t in list(_anchor_workers):
+        t.join(timeout)
+    _anchor_workers[:] = [t for t in _anchor_workers if t.is_alive()]
+
+
+def _enqueue_anchor(record, *, user_email="", actor="api", org_key=None, fallback_tx_hash=None):
+    """Queue a record for XRPL anchoring and wake the workers. Returns the queue id."""
+    queue = _get_anchor_queue()
+    payload = {
+        "record_id": record["record_id"],
+        "user_email": user_email,
+        "actor": actor,
+        "org_key": org_key,
+        "fallback_tx_hash": fallback_tx_hash,
+    }
+    queue_id = queue.enqueue(record["hash"], record["record_type"], payload, branch=record.get("branch", "JOINT"))
+    _anchor_jobs[record["record_id"]] = {
+        "status": "pending",
+        "queue_id": queue_id,
+        "attempts": 0,
+        "enqueued_at": datetime.now(timezone.utc).isoformat(),
+    }
+    _start_anchor_workers()
+    _anchor_wakeup.set()
+    return queue_id
+
+
+def _process_anchor_job(job):
+    """Submit one queued anchor and finalize its record. Raises on XRPL failure."""
+    payload = json.loads(job.get("payload_json") or "{}")
+    rid = payload.get("record_id", "")
+    record = _first_record(rid, "record_id")
+    if record is None:
+        raise LookupError(f"record {rid} not found")
+    if payload.get("batch"):
+        # Already covered by a coalesced root on-ledger: finish the record against it
+        return _finalize_batch_member(record, payload, payload["batch"])
+    xrpl_result = _anchor_xrpl(record["hash"], record["record_type"], record.get("branch", ""),
+                               user_email=payload.get("user_email") or None)
+    if xrpl_result is None and _xrpl_live():
+        raise RuntimeError("XRPL submission failed")
+    tx_hash = _finalize_anchor(record, xrpl_result,
+                               user_email=payload.get("user_email", ""),
+                               actor=payload.get("actor", "api"),
+                               org_key=payload.get("org_key"),
+                               fallback_tx_hash=payload.get("fallback_tx_hash"), update=True)
+    if xrpl_result:
+        for key in ("user_fee_tx", "fee_debit_id", "sls_fee", "fee_error"):
+            if key in xrpl_result:
+                _anchor_jobs.setdefault(rid, {})[key] = xrpl_result[key]
+    return tx_hash
+
+
+def _finalize_batch_member(record, payload, membership, persist=True):
+    """Finalize one record whose hash is a leaf of a coalesced root already on-ledger.
+
+    `membership` holds the batch tx, root, leaf index and proof. The fee is
+    charged once and kept in membership["fee"], so retrying a finalization
+    that failed afterwards neither submits nor charges again.
+    """
+    user_email = payload.get("user_email", "")
+    result = dict(membership["xrpl"]) if membership.get("xrpl") else None
+    if result and user_email:
+        if "fee" not in membership:
+            membership["fee"] = _charge_anchor_fee(user_email, membership["tx_hash"], ref=record["record_id"])
+        result.update(membership["fee"])
+    _update_record(record, batch_id=membership["batch_id"])
+    record["merkle_root"] = membership["merkle_root"]
+    record["leaf_index"] = membership["leaf_index"]
+    record["merkle_proof"] = membership["merkle_proof"]
+    tx_hash = _finalize_anchor(record, result, user_email=user_email,
+                               actor=payload.get("actor", "api"),
+                               org_key=payload.get("org_key"),
+                               fallback_tx_hash=membership["tx_hash"], persist=persist, update=True)
+    state = _anchor_jobs.setdefault(record["record_id"], {})
+    state.update(batch_id=membership["batch_id"], merkle_root=membership["merkle_root"],
+                 merkle_proof=membership["merkle_proof"])
+    for key in ("user_fee_tx", "fee_debit_id", "sls_fee", "fee_error"):
+        if result and key in result:
+            state[key] = result[key]
+    return tx_hash
+
+
+def _process_anchor_batch(jobs):
+    """Anchor several queued records under one Merkle root (one XRPL transaction).
+
+    Each record keeps its own hash as a leaf and receives its inclusion proof;
+    every user is still charged the normal per-anchor fee. Once the root is
+    submitted each record is finalized on its own; one that fails keeps its
+    batch membership (and any fee already charged) in its queue payload, so
+    its retry only finalizes against the same root. Returns
+    ({queue_id: tx_hash} for the anchored jobs, {queue_id: error} for the
+    rest); raises if the root could not be submitted.
+    """
+    entries, anchored, errors = [], {}, {}
+    for job in jobs:
+        payload = json.loads(job.get("payload_json") or "{}")
+        record = _first_record(payload.get("record_id", ""), "record_id")
+        if record is None:
+            errors[job["id"]] = "record not found"
+        elif payload.get("batch"):
+            try:
+                anchored[job["id"]] = _process_anchor_job(job)
+            except Exception as e:
+                errors[job["id"]] = str(e)
+        else:
+            entries.append((job, payload, record))
+    if not entries:
+        return anchored, errors
+    if len(entries) == 1:
+        job = entries[0][0]
+        anchored[job["id"]] = _process_anchor_job(job)
+        return anchored, errors
+
+    now = datetime.now(timezone.utc)
+    leaves = [record["hash"] for _, _, record in entries]
+    levels = _merkle_levels(leaves)
+    root = levels[-1][0]
+    batch_id = f"BATCH-{root[:12].upper()}"
+    xrpl_result = _anchor_xrpl(root, "BATCH_ANCHOR", "JOINT")
+    if xrpl_result is None and _xrpl_live():
+        raise RuntimeError("XRPL submission failed for coalesced batch")
+    batch_tx = xrpl_result["tx_hash"] if xrpl_result else "TX" + hashlib.md5((root + str(now)).encode()).hexdigest().upper()[:32]
+
+    # The root is on-ledger from here on: nothing below may fail the whole batch
+    records = []
+    for i, (job, payload, record) in enumerate(entries):
+        membership = {"batch_id": batch_id, "tx_hash": batch_tx, "merkle_root": root, "leaf_index": i,
+                      "merkle_proof": _merkle_proof(levels, i), "xrpl": xrpl_result}
+        try:
+            anchored[job["id"]] = _finalize_batch_member(record, payload, membership, persist=False)
+        except Exception as e:
+            print(f"Finalizing {record['record_id']} in {batch_id} failed: {e}")
+            errors[job["id"]] = str(e)
+            try:
+                _get_anchor_queue().update_payload(job["id"], dict(payload, batch=membership))
+            except Exception as qe:
+                print(f"Recording batch membership for {record['record_id']} failed: {qe}")
+            continue
+        records.append(record)
+
+    try:
+        if records:
+            _persist_records(records, update=True)
+            _persist_proof_chain_events([(r["record_id"], _proof_chain_store[r["record_id"]][-1]) for r in records])
+        _batch_store[batch_id] = {
+            "merkle_root": root,
+            "leaf_hashes": leaves,
+            "tree": _pack_merkle_levels(levels),
+            "record_count": len(leaves),
+            "tx_hash": batch_tx,
+            "network": records[0]["network"] if records else (xrpl_result or {}).get("network", "Simulated"),
+            "explorer_url": records[0]["explorer_url"] if records else (xrpl_result or {}).get("explorer_url"),
+            "timestamp": now.isoformat(),
+            "org_id": "",
+            "coalesced": True,
+        }
+        _persist_batch(batch_id, _batch_store[batch_id])
+    except Exception as e:
+        print(f"Persisting {batch_id} failed: {e}")
+    return anchored, errors
+
+
+def _collect_anchor_batch(queue):
+    """Claim pending jobs, holding the first one for up to ANCHOR_BATCH_WINDOW
+    so concurrent single anchors can join the same Merkle batch."""
+    limit = ANCHOR_BATCH_MAX_LEAVES if ANCHOR_BATCH_WINDOW > 0 else 1
+    with _anchor_collect_lock:
+        jobs = queue.claim_pending(limit=limit, owner=_ANCHOR_WORKER_ID, lease_seconds=ANCHOR_LEASE_SECONDS)
+        if not jobs or limit == 1:
+            return jobs
+        deadline = time.monotonic() + ANCHOR_BATCH_WINDOW
+        while len(jobs) < limit and not _anchor_stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            _anchor_wakeup.wait(timeout=remaining)
+            _anchor_wakeup.clear()
+            jobs.extend(queue.claim_pending(limit=limit - len(jobs), owner=_ANCHOR_WORKER_ID,
+                                            lease_seconds=ANCHOR_LEASE_SECONDS))
+        return jobs
+
+
+def _anchor_worker_loop():
+    """Worker thread: collect a batch of pending jobs, anchor it, sleep when idle."""
+    queue = _get_anchor_queue()
+    last_retry = 0.0
+    while not _anchor_stop.is_set():
+        if time.time() - last_retry >= ANCHOR_RETRY_INTERVAL:
+            queue.retry_failed(max_attempts=ANCHOR_MAX_ATTEMPTS)
+            last_retry = time.time()
+        jobs = _collect_anchor_batch(queue)
+        if not jobs:
+            _anchor_wakeup.wait(timeout=ANCHOR_RETRY_INTERVAL)
+            _anchor_wakeup.clear()
+            continue
+        states = {}
+        for job in jobs:
+            rid = json.loads(job.get("payload_json") or "{}").get("record_id", "")
+            state = _anchor_jobs.setdefault(rid, {"queue_id": job["id"]})
+            state["status"] = "submitting"
+            state["attempts"] = job.get("sync_attempts", 0) + 1
+            states[job["id"]] = (rid, state)
+        try:
+            anchored, errors = _process_anchor_batch(jobs)
+        except Exception as e:
+            anchored, errors = {}, {job["id"]: str(e) for job in jobs}
+            print(f"Anchor batch of {len(jobs)} failed: {e}")
+        completed_at = datetime.now(timezone.utc).isoformat()
+        for job in jobs:
+            rid, state = states[job["id"]]
+            if job["id"] in anchored:
+                queue.mark_synced(job["id"], anchored[job["id"]])
+                state.update(status="anchored", tx_hash=anchored[job["id"]], completed_at=completed_at)
+                continue
+            error = errors.get(job["id"], "not anchored")
+            queue.mark_failed(job["id"], error)
+            final = state["attempts"] >= ANCHOR_MAX_ATTEMPTS
+            state.update(status="failed" if final else "retrying", error=error)
+            if final:
+                record = _first_record(rid, "record_id")
+                if record is not None:
+                    record["anchor_status"] = "failed"
+
+
+def _anchor_job_status(record_id):
+    """Return the pipeline status for a record, or None if unknown."""
+    state = _anchor_jobs.get(record_id)
+    record = _first_record(record_id, "record_id")
+    if state is None and record is None:
+        return None
+    result = {"record_id": record_id}
+    if state:
+        result.update(state)
+    else:
+        result["status"] = record.get("anchor_status", "anchored")
+    if record is not None:
+        result["record"] = record
+    return result
+
 # ═══════════════════════════════════════════════════════════════════════
 #  VERCEL HANDLER
 # ═══ AI AGENT — DEFENSE-SPECIFIC LLM SYSTEM PROMPT ═══════════════════
@@ -1646,6 +4080,369 @@ for all HarborLink operations.
 
     return prompt
 
+# ═══════════════════════════════════════════════════════════════════════
+#  ROUTER — (method, path) -> handler dispatch table
+#  Paths map to route names; handler methods follow the naming convention
+#  _handle_<method>_<route>. Each route's middleware chain is composed once
+#  when it is registered, so dispatch is one dict lookup for every route.
+# ═══════════════════════════════════════════════════════════════════════
+
+_ROUTE_NAMES = {
+    "/api": "status",
+    "/api/status": "status",
+    "/api/health": "health",
+    "/api/metrics": "metrics",
+    "/api/transactions": "transactions",
+    "/api/record-types": "record_types",
+    "/api/anchor": "anchor",
+    "/api/hash": "hash",
+    "/api/categorize": "categorize",
+    "/api/xrpl-status": "xrpl_status",
+    "/api/auth/api-key": "auth_api_key",
+    "/api/auth/validate": "auth_validate",
+    "/api/db/save-analysis": "db_save_analysis",
+    "/api/db/get-analyses": "db_get_analyses",
+    "/api/infrastructure": "infrastructure",
+    "/api/dmsms": "dmsms",
+    "/api/readiness": "readiness",
+    "/api/parts": "parts",
+    "/api/roi": "roi",
+    "/api/lifecycle": "lifecycle",
+    "/api/warranty": "warranty",
+    "/api/supply-chain-risk": "supply_chain_risk",
+    "/api/audit-reports": "audit_reports",
+    "/api/contracts": "contracts",
+    "/api/digital-thread": "digital_thread",
+    "/api/predictive-maintenance": "predictive_maintenance",
+    "/api/audit-vault": "audit_vault",
+    "/api/doc-library": "doc_library",
+    "/api/compliance-scorecard": "compliance_scorecard",
+    "/api/provisioning-ptd": "provisioning_ptd",
+    "/api/action-items": "action_items",
+    "/api/calendar": "calendar",
+    "/api/verify": "verify",
+    "/api/wallet/provision": "wallet_provision",
+    "/api/wallet/buy-sls": "wallet_buy_sls",
+    "/api/wallet/balance": "wallet_balance",
+    "/api/treasury/health": "treasury_health",
+    "/api/fees/reconciliation": "fee_reconciliation",
+    "/api/fees/settle": "fee_settle",
+    "/api/webhook/stripe": "stripe_webhook",
+    "/api/checkout/create": "stripe_checkout",
+    "/api/ai-chat": "ai_chat",
+    # ═══ HarborLink Integration Endpoints ═══
+    "/api/webhooks/register": "webhook_register",
+    "/api/webhooks/list": "webhook_list",
+    "/api/webhooks/deliveries": "webhook_deliveries",
+    "/api/webhooks/test": "webhook_test",
+    "/api/anchor/composite": "anchor_composite",
+    "/api/anchor/batch": "anchor_batch",
+    "/api/anchor/status": "anchor_status",
+    "/api/batch/proof": "batch_proof",
+    "/api/proof-chain": "proof_chain",
+    "/api/custody/transfer": "custody_transfer",
+    "/api/custody/chain": "custody_chain",
+    "/api/hash/file": "hash_file",
+    "/api/verify/batch": "verify_batch",
+    "/api/org/records": "org_records",
+    # ═══ Modular API Integrations ═══
+    "/api/integrations/wawf": "integration_wawf",
+    "/api/ai/query": "ai_query",
+    "/api/ils/gap-analysis": "ils_gap_analysis",
+    "/api/logistics/risk-score": "logistics_risk_score",
+    "/api/defense/task": "defense_task",
+    # ═══ Offline / On-Prem ═══
+    "/api/offline/queue": "offline_queue",
+    "/api/offline/sync": "offline_sync",
+    # ═══ Performance Metrics ═══
+    "/api/metrics/performance": "metrics_performance",
+    "/api/metrics/prometheus": "metrics_prometheus",
+    # ═══ Security — AI Audit Trail ═══
+    "/api/security/audit-trail": "security_audit_trail",
+    "/api/verify/ai": "verify_ai",
+    # ═══ Security Enhancements ═══
+    "/api/security/rbac": "security_rbac",
+    "/api/security/zkp": "security_zkp",
+    "/api/security/threat-model": "security_threat_model",
+    "/api/security/dependency-audit": "security_dep_audit",
+    # ═══ Full Persistence + Superior Platform Routes ═══
+    "/api/ils/uploads": "ils_uploads",
+    "/api/documents": "documents",
+    "/api/documents/versions": "document_versions",
+    "/api/poam": "poam",
+    "/api/compliance/evidence": "compliance_evidence",
+    "/api/submissions": "submissions",
+    "/api/team": "team",
+    "/api/team/members": "team_members",
+    "/api/team/invite": "team_invite",
+    "/api/gfp": "gfp",
+    "/api/sbom": "sbom",
+    "/api/sbom/scan": "sbom_scan",
+    "/api/provenance": "provenance",
+    "/api/ai/rag": "ai_rag",
+    "/api/ai/conversations": "ai_conversations",
+    "/api/analytics/cross-program": "cross_program_analytics",
+    "/api/cdrl/validate": "cdrl_validate",
+    "/api/contracts/extract": "contract_extract",
+    "/api/program-metrics": "program_metrics",
+    "/api/state/save": "state_save",
+    "/api/state/load": "state_load",
+    "/api/errors/report": "errors_report",
+    "/api/living-ledger": "living_ledger",
+    "/api/impact-simulator": "impact_simulator",
+    "/api/secure-collaboration": "secure_collaboration",
+    "/api/foresight-forecast": "foresight_forecast",
+    "/api/signed-package": "signed_package",
+    "/api/monte-carlo-heatmap": "monte_carlo_heatmap",
+    "/api/save-scenario-to-ledger": "save_scenario_to_ledger",
+    "/api/conflict-resolver": "conflict_resolver",
+    "/api/federated-benchmark": "federated_benchmark",
+    "/api/unified-brief": "unified_brief",
+    "/api/prepare-email": "prepare_email",
+    "/api/save-draft": "save_draft",
+    "/api/scheduled-send": "scheduled_send",
+    "/api/import-received-email": "import_received_email",
+    "/api/send-email": "send_email",
+    "/api/vault-emails": "vault_emails",
+    "/api/cryptographic-mission-impact-ledger": "cryptographic_mission_impact_ledger",
+    "/api/self-healing-compliance": "self_healing_compliance",
+    "/api/zero-trust-handoff": "zero_trust_handoff",
+    "/api/predictive-resource-allocator": "predictive_resource_allocator",
+    "/api/immutable-after-action-review": "immutable_after_action_review",
+    "/api/quantum-safe-reanchor": "quantum_safe_reanchor",
+    "/api/program-legacy-archive": "program_legacy_archive",
+    "/api/congressional-funding-forecast": "congressional_funding_forecast",
+    "/api/self-executing-contract-clause": "self_executing_contract_clause",
+    "/api/federated-lessons-knowledge-graph": "federated_lessons_knowledge_graph",
+    "/api/supply-chain-insurance-optimizer": "supply_chain_insurance_optimizer",
+    "/api/verifiable-scorecard": "verifiable_scorecard",
+    "/api/mission-outcome-correlation": "mission_outcome_correlation",
+    "/api/multi-program-cascade": "multi_program_cascade",
+    "/api/automated-neutral-mediator": "automated_neutral_mediator",
+    "/api/drl/update": "drl_update",
+    "/api/drl/status": "drl_status",
+    "/api/drl/workflow-link": "drl_workflow_link",
+    "/api/drl/import": "drl_import",
+    "/api/living-ledger/export-pdf": "living_ledger_export_pdf",
+    "/api/self-healing-compliance/approve": "self_healing_compliance_approve",
+}
+
+
+_AI_PROVIDER_KEYS = ("AZURE_OPENAI_KEY", "OPENAI_API_KEY", "ANTHROPIC_API_KEY")
+
+
+def _mw_timing(h, route, parsed, call):
+    """Time the handler: wall time and response status go on the request-log
+    entry it wrote and into the S4Metrics HTTP series (labelled by route name,
+    never by raw path)."""
+    started = time.perf_counter()
+    h._route_name = route
+    h._log_entry = None
+    h._response_status = None
+    try:
+        call(h, route, parsed)
+    finally:
+        elapsed = time.perf_counter() - started
+        status = h._response_status or 500   # nothing sent: the handler raised
+        if h._log_entry is not None:
+            h._log_entry["ms"] = round(elapsed * 1000, 2)
+            h._log_entry["status"] = status
+        if MONITORING_AVAILABLE:
+            _metrics.http_request(h.command, route or "not_found", status, elapsed)
+
+
+def _mw_rate_limit(h, route, parsed, call):
+    if not h._check_rate_limit():
+        retry_after = h._rate_limit["retry_after"]
+        h._send_json({"error": "Rate limit exceeded", "retry_after": retry_after}, 429,
+                     headers={"Retry-After": str(retry_after), "X-RateLimit-Limit": str(h._rate_limit["limit"])})
+        return
+    call(h, route, parsed)
+
+
+def _mw_api_key(h, route, parsed, call):
+    """Require X-API-Key to be the master key or a registered key."""
+    api_key = h.headers.get("X-API-Key", "")
+    if api_key != API_MASTER_KEY and api_key not in API_KEYS_STORE:
+        h._log_request(route.replace("_", "-"), 401)   # rejected requests stay in the request log
+        h._send_json({"error": "Valid API key required"}, 401)
+        return
+    call(h, route, parsed)
+
+
+def _mw_master_key(h, route, parsed, call):
+    """Require X-API-Key to be the master key (operator endpoints)."""
+    if h.headers.get("X-API-Key", "") != API_MASTER_KEY:
+        h._log_request(route.replace("_", "-"), 403)
+        h._send_json({"error": "Master API key required"}, 403)
+        return
+    call(h, route, parsed)
+
+
+_DEFAULT_MIDDLEWARE = (_mw_timing, _mw_rate_limit)
+# Extra middleware per route name, applied after the defaults.
+_ROUTE_MIDDLEWARE = {
+    "webhook_list": (_mw_api_key,),
+    "webhook_deliveries": (_mw_api_key,),
+    "fee_reconciliation": (_mw_master_key,),
+    "fee_settle": (_mw_master_key,),
+    "org_records": (_mw_api_key,),
+    "security_audit_trail": (_mw_api_key,),
+    "db_save_analysis": (_mw_api_key,),
+    "db_get_analyses": (_mw_api_key,),
+    "webhook_register": (_mw_api_key,),
+    "webhook_test": (_mw_api_key,),
+}
+
+
+class _Router:
+    """Dispatch table keyed by (method, path).
+
+    Endpoints and middleware share the signature fn(h, route, parsed[, call]).
+    Unknown paths resolve to the method's not-found chain.
+    """
+
+    def __init__(self):
+        self._routes = {}      # (method, path) -> (route, chain)
+        self._not_found = {}   # method -> chain
+
+    @staticmethod
+    def _compose(endpoint, middleware):
+        call = endpoint
+        for mw in reversed(middleware):
+            call = (lambda mw, nxt: lambda h, route, parsed: mw(h, route, parsed, nxt))(mw, call)
+        return call
+
+    def add(self, method, path, route, endpoint, middleware=()):
+        self._routes[(method, path)] = (route, self._compose(endpoint, middleware))
+
+    def set_not_found(self, method, endpoint, middleware=()):
+        self._not_found[method] = (None, self._compose(endpoint, middleware))
+
+    def resolve(self, method, path):
+        """Return (route, chain) for a request; route is None when unknown."""
+        return self._routes.get((method, path.rstrip("/"))) or self._not_found[method]
+
+    def routes(self):
+        """[(method, path, route)] for every registered route."""
+        return [(m, p, r) for (m, p), (r, _) in self._routes.items()]
+
+
+def _build_router(cls):
+    """Register every _handle_<method>_<route> method of cls for its paths."""
+    router = _Router()
+    for method in ("GET", "POST"):
+        for path, route in _ROUTE_NAMES.items():
+            fn = getattr(cls, f"_handle_{method.lower()}_{route}", None)
+            if fn is None:
+                continue
+            if method == "POST" and route in _RAW_BODY_ROUTES:
+                endpoint = (lambda fn: lambda h, route, parsed: fn(
+                    h, parsed, {} if h._is_octet_stream() else h._read_body()))(fn)
+            elif method == "POST":
+                endpoint = (lambda fn: lambda h, route, parsed: fn(h, parsed, h._read_body()))(fn)
+            else:
+                endpoint = (lambda fn: lambda h, route, parsed: fn(h, parsed))(fn)
+            router.add(method, path, route, endpoint,
+                       _DEFAULT_MIDDLEWARE + _ROUTE_MIDDLEWARE.get(route, ()))
+        router.set_not_found(method, lambda h, route, parsed: h._handle_not_found(parsed),
+                             _DEFAULT_MIDDLEWARE)
+    return router
+
+
+# ═══════════════════════════════════════════════════════════════════════
+#  STREAMED REQUEST BODIES — raw application/octet-stream uploads read in
+#  fixed-size blocks (Content-Length or chunked Transfer-Encoding) and
+#  hashed as they arrive instead of being buffered whole.
+# ═══════════════════════════════════════════════════════════════════════
+
+HASH_FILE_MAX_BYTES = int(os.environ.get("S4_HASH_FILE_MAX_BYTES", str(16 << 30)))
+HASH_FILE_BLOCK_BYTES = 1 << 20
+HASH_FILE_MIN_CHUNK = 1 << 16       # bounds the leaf count of ?chunk_size= trees
+
+# POST routes whose handler reads an application/octet-stream body itself
+_RAW_BODY_ROUTES = frozenset({"hash_file"})
+
+
+class _BodyError(ValueError):
+    """A streamed request body was malformed, cut short or over its size limit."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class _LengthBody:
+    """readinto() over a request body of known Content-Length."""
+
+    def __init__(self, rfile, length):
+        self._rfile = rfile
+        self._left = length
+
+    def readinto(self, view):
+        if not self._left:
+            return 0
+        n = self._rfile.readinto(view[:self._left])
+        if not n:
+            raise _BodyError("Request body ended early")
+        self._left -= n
+        return n
+
+
+class _ChunkedBody:
+    """readinto() over a Transfer-Encoding: chunked request body."""
+
+    def __init__(self, rfile):
+        self._rfile = rfile
+        self._left = 0
+        self._done = False
+
+    def readinto(self, view):
+        while not self._left:
+            if self._done:
+                return 0
+            line = self._rfile.readline(1026)
+            try:
+                size = int(line.split(b";", 1)[0], 16)
+            except ValueError:
+                raise _BodyError("Malformed chunked request body")
+            if size == 0:
+                while self._rfile.readline(1026).strip():
+                    pass  # trailers
+                self._done = True
+                return 0
+            self._left = size
+        n = self._rfile.readinto(view[:min(len(view), self._left)])
+        if not n:
+            raise _BodyError("Request body ended early")
+        self._left -= n
+        if not self._left:
+            self._rfile.readline()  # CRLF closing the chunk
+        return n
+
+
+def _iter_body_blocks(body, limit, block_size=HASH_FILE_BLOCK_BYTES):
+    """Yield full blocks of a request body (the last may be short) as
+    memoryviews over one reusable buffer — each is only valid until the
+    next is requested. Raises _BodyError(413) past `limit` bytes."""
+    view = memoryview(bytearray(block_size))
+    total = 0
+    while True:
+        fill = 0
+        while fill < block_size:
+            n = body.readinto(view[fill:])
+            if not n:
+                break
+            fill += n
+        total += fill
+        if total > limit:
+            raise _BodyError(f"Request body exceeds {limit} bytes", 413)
+        if fill:
+            yield view[:fill]
+        if fill < block_size:
+            return
+
+
 # ═══════════════════════════════════════════════════════════════════════
 
 class handler(BaseHTTPRequestHandler):
@@ -1663,11 +4460,17 @@ class handler(BaseHTTPRequestHandler):
             "Referrer-Policy": "strict-origin-when-cross-origin",
         }
 
-    def _send_json(self, data, status=200):
+    def send_response(self, code, message=None):
+        self._response_status = code  # read by _mw_timing
+        super().send_response(code, message)
+
+    def _send_json(self, data, status=200, headers=None):
         body = json.dumps(data, ensure_ascii=False).encode("utf-8")
         self.send_response(status)
         for k, v in self._cors_headers().items():
             self.send_header(k, v)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
         self.end_headers()
         self.wfile.write(body)
 
@@ -1685,8 +4488,34 @@ class handler(BaseHTTPRequestHandler):
         except Exception:
             return {}
 
+    def _is_octet_stream(self):
+        return self.headers.get("Content-Type", "").split(";")[0].strip().lower() == "application/octet-stream"
+
+    def _raw_body(self, limit):
+        """readinto() source for the raw request body; _BodyError(413) when
+        its declared length is already over `limit`."""
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            return _ChunkedBody(self.rfile)
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            raise _BodyError("Invalid Content-Length")
+        if length > limit:
+            raise _BodyError(f"Request body exceeds {limit} bytes", 413)
+        return _LengthBody(self.rfile, length)
+
     def _call_ai_cascade(self, system_prompt, user_message, conversation=None):
-        """Call AI providers in cascade: Azure OpenAI → OpenAI → Anthropic → None."""
+        """Call AI providers in cascade: Azure OpenAI → OpenAI → Anthropic → None.
+        Timed into s4_ai_response_seconds per route; with a provider configured,
+        a None answer counts as a failed query."""
+        started = time.perf_counter()
+        answer = self._call_ai_providers(system_prompt, user_message, conversation)
+        if MONITORING_AVAILABLE and any(os.environ.get(k) for k in _AI_PROVIDER_KEYS):
+            _metrics.ai_query(time.perf_counter() - started, success=answer is not None,
+                              tool_context=getattr(self, "_route_name", None) or "general")
+        return answer
+
+    def _call_ai_providers(self, system_prompt, user_message, conversation=None):
         import urllib.request
         if conversation is None:
             conversation = []
@@ -1708,7 +4537,7 @@ class handler(BaseHTTPRequestHandler):
                 api_url = f"{azure_endpoint}/openai/deployments/{azure_deployment}/chat/completions?api-version=2024-02-01"
                 req_body = json.dumps({"messages": messages, "max_tokens": 2000, "temperature": 0.7}).encode()
                 req = urllib.request.Request(api_url, data=req_body, headers={"Content-Type": "application/json", "api-key": azure_key})
-                with urllib.request.urlopen(req, timeout=30) as resp:
+                with _span("ai", "azure_openai"), _http.urlopen(req, timeout=30) as resp:
                     result = json.loads(resp.read().decode())
                     return result["choices"][0]["message"]["content"]
             except Exception:
@@ -1719,7 +4548,7 @@ class handler(BaseHTTPRequestHandler):
             try:
                 req_body = json.dumps({"model": "gpt-4o", "messages": messages, "max_tokens": 2000, "temperature": 0.7}).encode()
                 req = urllib.request.Request("https://api.openai.com/v1/chat/completions", data=req_body, headers={"Content-Type": "application/json", "Authorization": f"Bearer {openai_key}"})
-                with urllib.request.urlopen(req, timeout=30) as resp:
+                with _span("ai", "openai"), _http.urlopen(req, timeout=30) as resp:
                     result = json.loads(resp.read().decode())
                     return result["choices"][0]["message"]["content"]
             except Exception:
@@ -1737,7 +4566,7 @@ class handler(BaseHTTPRequestHandler):
                 api_messages.append({"role": "user", "content": user_message})
                 req_body = json.dumps({"model": "claude-sonnet-4-20250514", "system": system_prompt, "messages": api_messages, "max_tokens": 2000}).encode()
                 req = urllib.request.Request("https://api.anthropic.com/v1/messages", data=req_body, headers={"Content-Type": "application/json", "x-api-key": anthropic_key, "anthropic-version": "2023-06-01"})
-                with urllib.request.urlopen(req, timeout=30) as resp:
+                with _span("ai", "anthropic"), _http.urlopen(req, timeout=30) as resp:
                     result = json.loads(resp.read().decode())
                     return result["content"][0]["text"]
             except Exception:
@@ -1745,294 +4574,34 @@ class handler(BaseHTTPRequestHandler):
 
         return None
 
-    def _route(self, path):
-        path = path.rstrip("/")
-        if path in ("/api", "/api/status"):
-            return "status"
-        if path == "/api/health":
-            return "health"
-        if path == "/api/metrics":
-            return "metrics"
-        if path == "/api/transactions":
-            return "transactions"
-        if path == "/api/record-types":
-            return "record_types"
-        if path == "/api/anchor":
-            return "anchor"
-        if path == "/api/hash":
-            return "hash"
-        if path == "/api/categorize":
-            return "categorize"
-        if path == "/api/xrpl-status":
-            return "xrpl_status"
-        if path == "/api/auth/api-key":
-            return "auth_api_key"
-        if path == "/api/auth/validate":
-            return "auth_validate"
-        if path == "/api/db/save-analysis":
-            return "db_save_analysis"
-        if path == "/api/db/get-analyses":
-            return "db_get_analyses"
-        if path == "/api/infrastructure":
-            return "infrastructure"
-        if path == "/api/dmsms":
-            return "dmsms"
-        if path == "/api/readiness":
-            return "readiness"
-        if path == "/api/parts":
-            return "parts"
-        if path == "/api/roi":
-            return "roi"
-        if path == "/api/lifecycle":
-            return "lifecycle"
-        if path == "/api/warranty":
-            return "warranty"
-        if path == "/api/supply-chain-risk":
-            return "supply_chain_risk"
-        if path == "/api/audit-reports":
-            return "audit_reports"
-        if path == "/api/contracts":
-            return "contracts"
-        if path == "/api/digital-thread":
-            return "digital_thread"
-        if path == "/api/predictive-maintenance":
-            return "predictive_maintenance"
-        if path == "/api/audit-vault":
-            return "audit_vault"
-        if path == "/api/doc-library":
-            return "doc_library"
-        if path == "/api/compliance-scorecard":
-            return "compliance_scorecard"
-        if path == "/api/provisioning-ptd":
-            return "provisioning_ptd"
-        if path == "/api/action-items":
-            return "action_items"
-        if path == "/api/calendar":
-            return "calendar"
-        if path == "/api/verify":
-            return "verify"
-        if path == "/api/wallet/provision":
-            return "wallet_provision"
-        if path == "/api/wallet/buy-sls":
-            return "wallet_buy_sls"
-        if path == "/api/wallet/balance":
-            return "wallet_balance"
-        if path == "/api/treasury/health":
-            return "treasury_health"
-        if path == "/api/webhook/stripe":
-            return "stripe_webhook"
-        if path == "/api/checkout/create":
-            return "stripe_checkout"
-        if path == "/api/ai-chat":
-            return "ai_chat"
-        # ═══ HarborLink Integration Endpoints ═══
-        if path == "/api/webhooks/register":
-            return "webhook_register"
-        if path == "/api/webhooks/list":
-            return "webhook_list"
-        if path == "/api/webhooks/deliveries":
-            return "webhook_deliveries"
-        if path == "/api/webhooks/test":
-            return "webhook_test"
-        if path == "/api/anchor/composite":
-            return "anchor_composite"
-        if path == "/api/anchor/batch":
-            return "anchor_batch"
-        if path == "/api/proof-chain":
-            return "proof_chain"
-        if path == "/api/custody/transfer":
-            return "custody_transfer"
-        if path == "/api/custody/chain":
-            return "custody_chain"
-        if path == "/api/hash/file":
-            return "hash_file"
-        if path == "/api/verify/batch":
-            return "verify_batch"
-        if path == "/api/org/records":
-            return "org_records"
-        # ═══ Modular API Integrations ═══
-        if path == "/api/integrations/wawf":
-            return "integration_wawf"
-        if path == "/api/ai/query":
-            return "ai_query"
-        if path == "/api/ils/gap-analysis":
-            return "ils_gap_analysis"
-        if path == "/api/logistics/risk-score":
-            return "logistics_risk_score"
-        if path == "/api/defense/task":
-            return "defense_task"
-        # ═══ Offline / On-Prem ═══
-        if path == "/api/offline/queue":
-            return "offline_queue"
-        if path == "/api/offline/sync":
-            return "offline_sync"
-        # ═══ Performance Metrics ═══
-        if path == "/api/metrics/performance":
-            return "metrics_performance"
-        # ═══ Security — AI Audit Trail ═══
-        if path == "/api/security/audit-trail":
-            return "security_audit_trail"
-        if path == "/api/verify/ai":
-            return "verify_ai"
-        # ═══ Security Enhancements ═══
-        if path == "/api/security/rbac":
-            return "security_rbac"
-        if path == "/api/security/zkp":
-            return "security_zkp"
-        if path == "/api/security/threat-model":
-            return "security_threat_model"
-        if path == "/api/security/dependency-audit":
-            return "security_dep_audit"
-        # ═══ Full Persistence + Superior Platform Routes ═══
-        if path == "/api/ils/uploads":
-            return "ils_uploads"
-        if path == "/api/documents":
-            return "documents"
-        if path == "/api/documents/versions":
-            return "document_versions"
-        if path == "/api/poam":
-            return "poam"
-        if path == "/api/compliance/evidence":
-            return "compliance_evidence"
-        if path == "/api/submissions":
-            return "submissions"
-        if path == "/api/team":
-            return "team"
-        if path == "/api/team/members":
-            return "team_members"
-        if path == "/api/team/invite":
-            return "team_invite"
-        if path == "/api/gfp":
-            return "gfp"
-        if path == "/api/sbom":
-            return "sbom"
-        if path == "/api/sbom/scan":
-            return "sbom_scan"
-        if path == "/api/provenance":
-            return "provenance"
-        if path == "/api/ai/rag":
-            return "ai_rag"
-        if path == "/api/ai/conversations":
-            return "ai_conversations"
-        if path == "/api/analytics/cross-program":
-            return "cross_program_analytics"
-        if path == "/api/cdrl/validate":
-            return "cdrl_validate"
-        if path == "/api/contracts/extract":
-            return "contract_extract"
-        if path == "/api/program-metrics":
-            return "program_metrics"
-        if path == "/api/state/save":
-            return "state_save"
-        if path == "/api/state/load":
-            return "state_load"
-        if path == "/api/errors/report":
-            return "errors_report"
-        if path == "/api/living-ledger":
-            return "living_ledger"
-        if path == "/api/impact-simulator":
-            return "impact_simulator"
-        if path == "/api/secure-collaboration":
-            return "secure_collaboration"
-        if path == "/api/foresight-forecast":
-            return "foresight_forecast"
-        if path == "/api/signed-package":
-            return "signed_package"
-        if path == "/api/monte-carlo-heatmap":
-            return "monte_carlo_heatmap"
-        if path == "/api/save-scenario-to-ledger":
-            return "save_scenario_to_ledger"
-        if path == "/api/conflict-resolver":
-            return "conflict_resolver"
-        if path == "/api/federated-benchmark":
-            return "federated_benchmark"
-        if path == "/api/unified-brief":
-            return "unified_brief"
-        if path == "/api/prepare-email":
-            return "prepare_email"
-        if path == "/api/save-draft":
-            return "save_draft"
-        if path == "/api/scheduled-send":
-            return "scheduled_send"
-        if path == "/api/import-received-email":
-            return "import_received_email"
-        if path == "/api/send-email":
-            return "send_email"
-        if path == "/api/vault-emails":
-            return "vault_emails"
-        if path == "/api/cryptographic-mission-impact-ledger":
-            return "cryptographic_mission_impact_ledger"
-        if path == "/api/self-healing-compliance":
-            return "self_healing_compliance"
-        if path == "/api/zero-trust-handoff":
-            return "zero_trust_handoff"
-        if path == "/api/predictive-resource-allocator":
-            return "predictive_resource_allocator"
-        if path == "/api/immutable-after-action-review":
-            return "immutable_after_action_review"
-        if path == "/api/quantum-safe-reanchor":
-            return "quantum_safe_reanchor"
-        if path == "/api/program-legacy-archive":
-            return "program_legacy_archive"
-        if path == "/api/congressional-funding-forecast":
-            return "congressional_funding_forecast"
-        if path == "/api/self-executing-contract-clause":
-            return "self_executing_contract_clause"
-        if path == "/api/federated-lessons-knowledge-graph":
-            return "federated_lessons_knowledge_graph"
-        if path == "/api/supply-chain-insurance-optimizer":
-            return "supply_chain_insurance_optimizer"
-        if path == "/api/verifiable-scorecard":
-            return "verifiable_scorecard"
-        if path == "/api/mission-outcome-correlation":
-            return "mission_outcome_correlation"
-        if path == "/api/multi-program-cascade":
-            return "multi_program_cascade"
-        if path == "/api/automated-neutral-mediator":
-            return "automated_neutral_mediator"
-        if path == "/api/drl/update":
-            return "drl_update"
-        if path == "/api/drl/status":
-            return "drl_status"
-        if path == "/api/drl/workflow-link":
-            return "drl_workflow_link"
-        if path == "/api/drl/import":
-            return "drl_import"
-        if path == "/api/living-ledger/export-pdf":
-            return "living_ledger_export_pdf"
-        if path == "/api/self-healing-compliance/approve":
-            return "self_healing_compliance_approve"
-        return None
-
     def _check_rate_limit(self):
         """Returns True if request is allowed, False if rate limited.
 
-        Uses an in-memory sliding-window counter per IP.  An LRU eviction
-        keeps the store bounded to _RATE_LIMIT_MAX_IPS entries.
+        Spends one token from the client's bucket (per API key, else per IP)
+        in _rate_limiter. Buckets hold a full window's allowance as burst and
+        refill continuously. The outcome is kept in self._rate_limit for the
+        response headers.
         """
-        ip = self.headers.get("X-Forwarded-For", self.headers.get("X-Real-IP", "unknown")).split(",")[0].strip()
-        now = time.time()
-        if ip not in _rate_limit_store:
-            # LRU eviction: drop oldest IP if at capacity
-            if len(_rate_limit_store) >= _RATE_LIMIT_MAX_IPS:
-                oldest_ip = min(_rate_limit_store, key=lambda k: _rate_limit_store[k][-1] if _rate_limit_store[k] else 0)
-                del _rate_limit_store[oldest_ip]
-            _rate_limit_store[ip] = []
-        # Clean old entries
-        cutoff = now - RATE_LIMIT_WINDOW
-        _rate_limit_store[ip] = [t for t in _rate_limit_store[ip] if t > cutoff]
-        if len(_rate_limit_store[ip]) >= RATE_LIMIT_MAX:
-            return False
-        _rate_limit_store[ip].append(now)
-        return True
+        bucket_key, limit = _rate_limit_for(self.headers.get("X-API-Key", ""))
+        if bucket_key is None:
+            ip = self.headers.get("X-Forwarded-For", self.headers.get("X-Real-IP", "unknown")).split(",")[0].strip()
+            bucket_key = "ip:" + ip
+        try:
+            allowed, remaining, retry_after = _rate_limiter.take(bucket_key, limit, limit / RATE_LIMIT_WINDOW, time.time())
+        except Exception as e:
+            print(f"Rate limiter error (allowing request): {e}")
+            return True
+        self._rate_limit = {"limit": limit, "remaining": remaining, "retry_after": retry_after}
+        return allowed
 
     def _log_request(self, route, status=200):
-        _request_log.append({
+        self._log_entry = {
             "time": datetime.now(timezone.utc).isoformat(),
             "route": route,
             "status": status,
             "method": self.command,
-        })
+        }
+        _request_log.append(self._log_entry)
         # Keep last 1000 entries
         if len(_request_log) > 1000:
             _request_log.pop(0)
@@ -2043,686 +4612,862 @@ class handler(BaseHTTPRequestHandler):
             self.send_header(k, v)
         self.end_headers()
 
-    def do_GET(self):
+    def _dispatch(self, method):
         _hydrate_from_supabase()  # Cold-start recovery
+        _resume_async_queues()    # ... including jobs queued before a restart
         parsed = urlparse(self.path)
-        route = self._route(parsed.path)
+        route, call = _router.resolve(method, parsed.path)
+        call(self, route, parsed)
 
-        # Rate limiting
-        if not self._check_rate_limit():
-            self._send_json({"error": "Rate limit exceeded", "retry_after": RATE_LIMIT_WINDOW}, 429)
-            return
+    def do_GET(self):
+        self._dispatch("GET")
 
-        if route == "health":
-            self._log_request("health")
-            uptime = time.time() - API_START_TIME
-            self._send_json({
-                "status": "healthy",
-                "uptime_seconds": round(uptime, 1),
-                "requests_served": len(_request_log),
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-                "version": "5.2.0",
-                "tools": ["anchor", "anchor-composite", "anchor-batch", "verify", "verify-batch", "proof-chain", "custody-chain", "webhooks", "hash-file", "ils-workspace", "dmsms-tracker", "readiness-calculator", "parts-xref", "roi-calculator", "lifecycle-cost", "warranty-tracker", "audit-vault", "doc-library", "compliance-scorecard", "provisioning-ptd", "supply-chain-risk", "audit-reports", "contracts", "digital-thread", "predictive-maintenance", "org-records"],
-            })
-        elif route == "status":
-            self._log_request("status")
-            self._send_json({
-                "status": "operational",
-                "service": "S4 Ledger Defense Metrics API",
-                "version": "5.2.0",
-                "record_types": len(RECORD_CATEGORIES),
-                "branches": len(BRANCHES),
-                "total_records": len(_get_all_records()),
-                "infrastructure": {
-                    "xrpl": XRPL_AVAILABLE,
-                    "supabase": SUPABASE_AVAILABLE,
-                    "auth": True,
-                },
-            })
-        elif route == "metrics":
-            records = _get_all_records()
-            self._send_json(_aggregate_metrics(records))
-        elif route == "transactions":
-            records = _get_all_records()
-            recent = list(reversed(records[-200:]))
-            self._send_json({
-                "transactions": recent,
-                "total": len(records),
-                "generated_at": datetime.now(timezone.utc).isoformat(),
-            })
-        elif route == "record_types":
-            grouped = {}
-            for key, cat in RECORD_CATEGORIES.items():
-                branch = cat["branch"]
-                if branch not in grouped:
-                    grouped[branch] = {"info": BRANCHES.get(branch, {}), "types": []}
-                grouped[branch]["types"].append({"key": key, **cat})
-            self._send_json({"branches": BRANCHES, "categories": RECORD_CATEGORIES, "grouped": grouped})
-        elif route == "xrpl_status":
-            _init_xrpl()
-            explorer_base = XRPL_EXPLORER_MAINNET if XRPL_NETWORK == "mainnet" else XRPL_EXPLORER_TESTNET
-            endpoint = XRPL_MAINNET_URL if XRPL_NETWORK == "mainnet" else XRPL_TESTNET_URL
-            self._send_json({
-                "xrpl_available": XRPL_AVAILABLE,
-                "connected": _xrpl_client is not None,
-                "wallet": _xrpl_wallet.address if _xrpl_wallet else None,
-                "treasury": _xrpl_treasury_wallet.address if _xrpl_treasury_wallet else None,
-                "demo_wallet": _xrpl_demo_wallet.address if _xrpl_demo_wallet else None,
-                "network": XRPL_NETWORK,
-                "endpoint": endpoint,
-                "explorer": explorer_base,
-                "env_vars": {
-                    "XRPL_WALLET_SEED": bool(os.environ.get("XRPL_WALLET_SEED")),
-                    "XRPL_TREASURY_SEED": bool(os.environ.get("XRPL_TREASURY_SEED")),
-                    "XRPL_DEMO_SEED": bool(os.environ.get("XRPL_DEMO_SEED")),
-                    "XRPL_NETWORK": os.environ.get("XRPL_NETWORK", "(default: testnet)"),
-                },
-                "init_error": _xrpl_init_error,
-                "note": f"Real XRPL {XRPL_NETWORK.capitalize()} transactions. Verify at {'livenet' if XRPL_NETWORK == 'mainnet' else 'testnet'}.xrpl.org"
-            })
-        elif route == "infrastructure":
-            self._send_json({
-                "infrastructure": {
-                    "api": {"status": "operational", "version": "5.2.0", "framework": "BaseHTTPRequestHandler", "tools": 27, "platforms": 462},
-                    "xrpl": {"available": XRPL_AVAILABLE, "network": XRPL_NETWORK, "endpoint": XRPL_MAINNET_URL if XRPL_NETWORK == "mainnet" else XRPL_TESTNET_URL},
-                    "database": {"provider": "Supabase" if SUPABASE_AVAILABLE else "In-Memory", "connected": SUPABASE_AVAILABLE, "url": SUPABASE_URL[:30] + "..." if SUPABASE_URL else None},
-                    "auth": {"enabled": True, "methods": ["API Key", "Bearer Token"], "master_key_set": bool(os.environ.get("S4_API_MASTER_KEY"))},
-                    "compliance": {
-                        "nist_800_171": "architecture_aligned",
-                        "cmmc_level": 2,
-                        "dfars_252_204_7012": True,
-                        "zero_data_on_chain": True,
-                        "classified_ready": ["UNCLASSIFIED", "CUI", "SECRET (on-prem)", "TS/SCI (on-prem)"]
-                    },
-                    "production_readiness": {
-                        "api_server": True,
-                        "xrpl_integration": XRPL_AVAILABLE,
-                        "database_persistence": SUPABASE_AVAILABLE,
-                        "authentication": True,
-                        "ssl_tls": True,
-                        "cdn": True,
-                        "ci_cd": True,
-                        "monitoring": False,
-                        "load_balancing": False,
-                        "estimated_pct": 42
-                    }
-                }
-            })
-        elif route == "auth_validate":
-            # Validate auth via JWT (preferred) or API key (legacy)
-            auth_user = _get_auth_user(self.headers)
-            if auth_user:
-                self._send_json({"valid": True, "user_id": auth_user['user_id'], "email": auth_user['email'], "role": auth_user['role'], "method": auth_user['method']})
-            else:
-                # Legacy API key fallback
-                api_key = self.headers.get("X-API-Key", "")
-                valid = api_key == API_MASTER_KEY or api_key in API_KEYS_STORE or _authenticate_api_key(api_key) is not None
-                key_info = _authenticate_api_key(api_key) or {}
-                self._send_json({"valid": valid, "tier": key_info.get("tier", "enterprise") if valid else None, "role": key_info.get("role", "admin") if valid else None, "method": "api_key" if valid else None})
-        elif route == "dmsms":
-            self._log_request("dmsms")
-            qs = parse_qs(parsed.query)
-            program = qs.get("program", ["ddg51"])[0]
-            org_id = self.headers.get("X-API-Key", "")
-            rows = _sb_select("dmsms_items", query_params=f"program=eq.{program}&org_id=eq.{org_id}", order="created_at.desc", limit=500)
-            if not rows:
-                rows = _sb_select("dmsms_items", query_params=f"program=eq.{program}", order="created_at.desc", limit=500)
-            parts = [{"nsn": r.get("nsn",""), "part_name": r.get("part_name",""), "cage_code": r.get("cage_code",""), "manufacturer": r.get("manufacturer",""), "status": r.get("status","Active"), "severity": r.get("severity","None"), "replacement_nsn": r.get("replacement_nsn",""), "mitigation": r.get("mitigation","")} for r in rows] if rows else []
-            self._send_json({"program": program, "total_parts": len(parts), "at_risk": sum(1 for p in parts if p["status"] != "Active"), "parts": parts, "source": "supabase" if parts else "empty"})
-        elif route == "readiness":
-            self._log_request("readiness")
-            qs = parse_qs(parsed.query)
-            mtbf = float(qs.get("mtbf", ["1000"])[0])
-            mttr = float(qs.get("mttr", ["4"])[0])
-            mldt = float(qs.get("mldt", ["24"])[0])
-            ao = mtbf / (mtbf + mttr + mldt) if (mtbf + mttr + mldt) > 0 else 0
-            ai = mtbf / (mtbf + mttr) if (mtbf + mttr) > 0 else 0
-            self._send_json({"ao": round(ao, 4), "ai": round(ai, 4), "mtbf": mtbf, "mttr": mttr, "mldt": mldt, "failure_rate": round(1/mtbf, 8) if mtbf > 0 else 0, "assessment": "Meets requirements" if ao >= 0.9 else "Marginal" if ao >= 0.8 else "Below threshold"})
-        elif route == "parts":
-            self._log_request("parts")
-            qs = parse_qs(parsed.query)
-            search = qs.get("q", [""])[0].lower()
-            org_id = self.headers.get("X-API-Key", "")
-            if search:
-                rows = _sb_select("parts_catalog", query_params=f"or=(nsn.ilike.%25{search}%25,part_name.ilike.%25{search}%25,cage_code.ilike.%25{search}%25)", order="part_name.asc", limit=100)
-            else:
-                rows = _sb_select("parts_catalog", order="part_name.asc", limit=100)
-            parts = [{"nsn": r.get("nsn",""), "name": r.get("part_name",""), "cage": r.get("cage_code",""), "mfg": r.get("manufacturer",""), "status": r.get("status","Available"), "unit_price": float(r.get("unit_price",0) or 0), "lead_time_days": r.get("lead_time_days")} for r in rows] if rows else []
-            self._send_json({"query": search, "results": parts, "total": len(parts), "source": "supabase" if parts else "empty"})
-        elif route == "roi":
-            self._log_request("roi")
-            qs = parse_qs(parsed.query)
-            programs = int(qs.get("programs", ["5"])[0])
-            ftes = float(qs.get("ftes", ["8"])[0])
-            rate = float(qs.get("rate", ["145"])[0])
-            license_cost = float(qs.get("license", ["120000"])[0])
-            labor = ftes * rate * 2080
-            savings = labor * 0.65 + programs * 12000
-            roi_pct = ((savings - license_cost) / license_cost * 100) if license_cost > 0 else 0
-            self._send_json({"programs": programs, "ftes": ftes, "annual_savings": round(savings), "license_cost": license_cost, "net_benefit": round(savings - license_cost), "roi_percent": round(roi_pct, 1), "payback_months": round(license_cost / savings * 12, 1) if savings > 0 else 99})
-        elif route == "lifecycle":
-            self._log_request("lifecycle")
-            qs = parse_qs(parsed.query)
-            acq = float(qs.get("acquisition", ["85"])[0])
-            fleet = int(qs.get("fleet", ["20"])[0])
-            life = int(qs.get("life", ["30"])[0])
-            sust_rate = float(qs.get("sustrate", ["8"])[0]) / 100
-            total_acq = acq * fleet
-            total_sust = total_acq * sust_rate * life
-            dmsms = total_acq * 0.04 * life
-            total = total_acq + total_sust + dmsms
-            self._send_json({"acquisition_m": round(total_acq, 1), "sustainment_m": round(total_sust, 1), "dmsms_m": round(dmsms, 1), "total_ownership_m": round(total, 1), "service_life_years": life, "fleet_size": fleet})
-        elif route == "warranty":
-            self._log_request("warranty")
-            qs = parse_qs(parsed.query)
-            program = qs.get("program", ["ddg51"])[0]
-            org_id = self.headers.get("X-API-Key", "")
-            rows = _sb_select("warranty_items", query_params=f"program=eq.{program}", order="days_left.asc.nullslast", limit=500)
-            items = [{"system": r.get("system_name",""), "status": r.get("status","Active"), "days_left": r.get("days_left",0), "contract_type": r.get("contract_type","OEM Warranty"), "value": float(r.get("value",0) or 0), "vendor": r.get("vendor",""), "start_date": r.get("start_date",""), "end_date": r.get("end_date","")} for r in rows] if rows else []
-            self._send_json({"program": program, "items": items, "active": sum(1 for i in items if i["status"] == "Active"), "expiring": sum(1 for i in items if i["status"] == "Expiring"), "total_value": sum(i["value"] for i in items), "source": "supabase" if items else "empty"})
-        elif route == "supply_chain_risk":
-            self._log_request("supply-chain-risk")
-            qs = parse_qs(parsed.query)
-            program = qs.get("program", ["ddg51"])[0]
-            threshold = qs.get("threshold", ["all"])[0]
-            rows = _sb_select("supply_chain_risks", query_params=f"program=eq.{program}", order="risk_score.desc", limit=500)
-            risk_items = [{"part": r.get("part_name",""), "nsn": r.get("nsn",""), "supplier": r.get("supplier",""), "score": r.get("risk_score",0), "level": r.get("risk_level","low"), "factors": r.get("factors",[]), "eta_impact": r.get("eta_impact",""), "mitigation": r.get("mitigation","")} for r in rows] if rows else []
-            if threshold == "critical": risk_items = [r for r in risk_items if r["level"]=="critical"]
-            elif threshold == "high": risk_items = [r for r in risk_items if r["level"] in ("critical","high")]
-            self._send_json({"program":program,"items":risk_items,"critical":sum(1 for r in risk_items if r["level"]=="critical"),"high":sum(1 for r in risk_items if r["level"]=="high"),"medium":sum(1 for r in risk_items if r["level"]=="medium"),"low":sum(1 for r in risk_items if r["level"]=="low"),"total":len(risk_items),"source": "supabase" if risk_items else "empty"})
-        elif route == "audit_reports":
-            self._log_request("audit-reports")
-            qs = parse_qs(parsed.query)
-            report_type = qs.get("type", ["full_audit"])[0]
-            period = int(qs.get("period", ["90"])[0])
-            sections = {"full_audit":["Executive Summary","Anchoring History","Chain of Custody","Compliance Scorecard","Record Verification","Hash Integrity"],"supply_chain":["Supply Chain Overview","Receipt Verification","Custody Transfers","Lot Traceability"],"maintenance":["Maintenance Summary","Work Order Verification","Parts Usage","Readiness Impact"],"compliance":["Overall Score","NIST 800-171","CMMC Readiness","DFARS Compliance"],"custody":["Custody Timeline","Transfer Verification","Location History","Blockchain Proof"],"contract":["CDRL Status","Deliverable Timeline","Mod History","Cost Performance"]}
-            sec = sections.get(report_type, sections["full_audit"])
-            # Pull real record count and compliance from Supabase
-            real_records = _sb_select("records", select="id", limit=10000)
-            record_count = len(real_records) if real_records else 0
-            comp_rows = _sb_select("compliance_scores", order="assessment_date.desc.nullslast", limit=10)
-            avg_compliance = sum(float(r.get("score",0)) for r in comp_rows) / len(comp_rows) if comp_rows else 0
-            self._send_json({"report_type":report_type,"period_days":period,"sections":sec,"record_count":record_count,"compliance_score":round(avg_compliance, 1),"generated":datetime.now(timezone.utc).isoformat()})
-        elif route == "contracts":
-            self._log_request("contracts")
-            qs = parse_qs(parsed.query)
-            contract_id = qs.get("contract", ["N00024-25-C-5501"])[0]
-            rows = _sb_select("contract_items", query_params=f"contract_id=eq.{contract_id}", order="due_date.asc.nullslast", limit=200)
-            items = [{"id": r.get("item_id",""), "desc": r.get("description",""), "type": r.get("item_type","cdrl"), "di": r.get("di_number",""), "due": r.get("due_date",""), "status": r.get("status","on_track"), "anchored": r.get("anchored",False)} for r in rows] if rows else []
-            self._send_json({"contract":contract_id,"items":items,"total":len(items),"on_track":sum(1 for i in items if i["status"]=="on_track"),"overdue":sum(1 for i in items if i["status"]=="overdue"),"delivered":sum(1 for i in items if i["status"]=="delivered"),"source": "supabase" if items else "empty"})
-        elif route == "digital_thread":
-            self._log_request("digital-thread")
-            qs = parse_qs(parsed.query)
-            platform = qs.get("platform", ["ddg51"])[0]
-            view = qs.get("view", ["changes"])[0]
-            rows = _sb_select("digital_thread_items", query_params=f"platform=eq.{platform}", order="created_at.desc", limit=200)
-            items = [{"id": r.get("item_id",""), "desc": r.get("description",""), "type": r.get("item_type","Class I"), "status": r.get("status","pending"), "anchored": r.get("anchored",False)} for r in rows] if rows else []
-            self._send_json({"platform":platform,"view":view,"items":items,"total":len(items),"pending":sum(1 for i in items if i["status"]=="pending"),"approved":sum(1 for i in items if i["status"] in ("approved","implemented")),"anchored":sum(1 for i in items if i["anchored"]),"source": "supabase" if items else "empty"})
-        elif route == "predictive_maintenance":
-            self._log_request("predictive-maintenance")
-            qs = parse_qs(parsed.query)
-            platform = qs.get("platform", ["ddg51"])[0]
-            window = int(qs.get("window", ["90"])[0])
-            confidence = int(qs.get("confidence", ["85"])[0])
-            rows = _sb_select("predictive_maint", query_params=f"platform=eq.{platform}&confidence=gte.{confidence}&eta_days=lte.{window}", order="confidence.desc", limit=200)
-            predictions = [{"system": r.get("system_name",""), "component": r.get("component",""), "mode": r.get("failure_mode",""), "confidence": r.get("confidence",0), "eta_days": r.get("eta_days",0), "cost_unplanned": float(r.get("cost_unplanned",0) or 0), "urgent": r.get("urgent",False)} for r in rows] if rows else []
-            total_cost = sum(p["cost_unplanned"] for p in predictions)
-            self._send_json({"platform":platform,"window_days":window,"confidence_threshold":confidence,"predictions":predictions,"total":len(predictions),"urgent":sum(1 for p in predictions if p["urgent"]),"total_risk_k":total_cost,"est_savings_k":int(total_cost*0.55),"model_accuracy":92.4,"source": "supabase" if predictions else "empty"})
-        elif route == "action_items":
-            self._log_request("action-items")
-            org_id = self.headers.get("X-API-Key", "")
-            rows = _sb_select("action_items", order="created_at.desc", limit=500)
-            items = [{"id": r.get("item_id",""), "title": r.get("title",""), "severity": r.get("severity","warning"), "source": r.get("source_tool",""), "cost": str(r.get("estimated_cost",0)), "schedule": r.get("schedule",""), "done": r.get("done",False), "assigned_to": r.get("assigned_to","")} for r in rows] if rows else []
-            self._send_json({"action_items": items, "total": len(items), "critical": sum(1 for i in items if i["severity"]=="critical"), "open": sum(1 for i in items if not i["done"]), "source": "supabase" if items else "empty"})
-        elif route == "calendar":
-            self._log_request("calendar")
-            qs = parse_qs(parsed.query)
-            month = int(qs.get("month", [str(datetime.now(timezone.utc).month)])[0])
-            year = int(qs.get("year", [str(datetime.now(timezone.utc).year)])[0])
-            start = f"{year}-{month:02d}-01"
-            end_month = month + 1 if month < 12 else 1
-            end_year = year if month < 12 else year + 1
-            end = f"{end_year}-{end_month:02d}-01"
-            rows = _sb_select("calendar_events", query_params=f"event_date=gte.{start}&event_date=lt.{end}", order="event_date.asc", limit=200)
-            events = [{"id": r.get("event_id",""), "title": r.get("title",""), "date": r.get("event_date",""), "time": str(r.get("event_time","")) if r.get("event_time") else "", "type": r.get("event_type","info"), "source": r.get("source_tool","")} for r in rows] if rows else []
-            self._send_json({"month": month, "year": year, "events": events, "total": len(events), "source": "supabase" if events else "empty"})
-        elif route == "audit_vault":
-            self._log_request("audit-vault")
-            qs = parse_qs(parsed.query)
-            doc_type = qs.get("type", [""])[0]
-            qp = f"doc_type=eq.{doc_type}" if doc_type else ""
-            rows = _sb_select("audit_vault", query_params=qp, order="created_at.desc", limit=200)
-            docs = [{"doc_id": r.get("doc_id",""), "title": r.get("title",""), "doc_type": r.get("doc_type",""), "classification": r.get("classification","unclassified"), "hash": r.get("hash",""), "anchored": r.get("anchored",False), "anchor_tx": r.get("anchor_tx",""), "uploaded_by": r.get("uploaded_by",""), "created_at": r.get("created_at","")} for r in rows] if rows else []
-            self._send_json({"documents": docs, "total": len(docs), "anchored": sum(1 for d in docs if d["anchored"]), "source": "supabase" if docs else "empty"})
-        elif route == "doc_library":
-            self._log_request("doc-library")
-            qs = parse_qs(parsed.query)
-            doc_type = qs.get("type", [""])[0]
-            search = qs.get("q", [""])[0]
-            qp = f"doc_type=eq.{doc_type}" if doc_type else ""
-            if search:
-                qp = f"title=ilike.%25{search}%25" + (f"&{qp}" if qp else "")
-            rows = _sb_select("doc_library", query_params=qp, order="updated_at.desc", limit=200)
-            docs = [{"doc_id": r.get("doc_id",""), "title": r.get("title",""), "doc_type": r.get("doc_type",""), "di_number": r.get("di_number",""), "revision": r.get("revision",""), "status": r.get("status","current"), "anchored": r.get("anchored",False), "created_at": r.get("created_at","")} for r in rows] if rows else []
-            self._send_json({"documents": docs, "total": len(docs), "current": sum(1 for d in docs if d["status"]=="current"), "source": "supabase" if docs else "empty"})
-        elif route == "compliance_scorecard":
-            self._log_request("compliance-scorecard")
-            qs = parse_qs(parsed.query)
-            program = qs.get("program", ["ddg51"])[0]
-            rows = _sb_select("compliance_scores", query_params=f"program=eq.{program}", order="framework.asc", limit=50)
-            frameworks = [{"framework": r.get("framework",""), "score": float(r.get("score",0)), "max_score": float(r.get("max_score",100)), "level": r.get("level",""), "findings": r.get("findings",0), "critical_gaps": r.get("critical_gaps",0), "assessment_date": r.get("assessment_date",""), "assessor": r.get("assessor","")} for r in rows] if rows else []
-            overall = sum(f["score"] for f in frameworks) / len(frameworks) if frameworks else 0
-            self._send_json({"program": program, "frameworks": frameworks, "overall_score": round(overall, 1), "total_frameworks": len(frameworks), "total_findings": sum(f["findings"] for f in frameworks), "critical_gaps": sum(f["critical_gaps"] for f in frameworks), "source": "supabase" if frameworks else "empty"})
-        elif route == "provisioning_ptd":
-            self._log_request("provisioning-ptd")
-            qs = parse_qs(parsed.query)
-            program = qs.get("program", ["ddg51"])[0]
-            # PTD (Provisioning Technical Documentation) — reads from parts_catalog + dmsms
-            parts_rows = _sb_select("parts_catalog", order="nsn.asc", limit=500)
-            dmsms_rows = _sb_select("dmsms_items", query_params=f"program=eq.{program}", order="part_name.asc", limit=500)
-            ptd_items = []
-            for r in (parts_rows or []):
-                ptd_items.append({"nsn": r.get("nsn",""), "name": r.get("part_name",""), "cage": r.get("cage_code",""), "status": r.get("status","Available"), "source": "parts_catalog", "provisioned": True})
-            dmsms_nsns = {r.get("nsn","") for r in (dmsms_rows or []) if r.get("nsn")}
-            at_risk = [n for n in dmsms_nsns if n]
-            self._send_json({"program": program, "ptd_items": ptd_items, "total": len(ptd_items), "at_risk_nsns": list(at_risk), "provisioned": len(ptd_items), "source": "supabase" if ptd_items else "empty"})
-        elif route == "wallet_balance":
-            self._log_request("wallet-balance")
-            qs = parse_qs(parsed.query)
-            address = qs.get("address", [""])[0]
-            if not address:
-                self._send_json({"error": "address parameter required"}, 400)
-                return
-            # Query XRPL for account balances
-            _init_xrpl()
-            if not _xrpl_client or not XRPL_AVAILABLE:
-                self._send_json({"error": "XRPL not available"}, 503)
-                return
-            try:
-                from xrpl.models.requests import AccountInfo, AccountLines
-                acc_info = _xrpl_client.request(AccountInfo(account=address))
-                xrp_drops = int(acc_info.result.get("account_data", {}).get("Balance", "0"))
-                xrp_balance = xrp_drops / 1_000_000
+    def do_POST(self):
+        self._dispatch("POST")
 
-                acc_lines = _xrpl_client.request(AccountLines(account=address))
-                sls_balance = "0"
-                for line in acc_lines.result.get("lines", []):
-                    if line.get("currency") == "SLS" and line.get("account") == SLS_ISSUER_ADDRESS:
-                        sls_balance = line.get("balance", "0")
-                        break
+    def _handle_not_found(self, parsed):
+        self._send_json({"error": "Not found", "path": self.path}, 404)
 
-                anchors_available = int(float(sls_balance) / float(SLS_ANCHOR_FEE)) if float(sls_balance) > 0 else 0
-                explorer_base = (XRPL_EXPLORER_MAINNET if XRPL_NETWORK == "mainnet" else XRPL_EXPLORER_TESTNET).replace("/transactions/", "/accounts/")
+    # ═══════════════════════════════════════════════════════════════════
+    #  GET ROUTE HANDLERS — registered in _router by route name
+    # ═══════════════════════════════════════════════════════════════════
 
-                self._send_json({
-                    "address": address,
-                    "xrp_balance": round(xrp_balance, 6),
-                    "sls_balance": sls_balance,
-                    "anchors_available": anchors_available,
-                    "sls_price_usd": SLS_PRICE_USD,
-                    "network": XRPL_NETWORK,
-                    "explorer_url": explorer_base + address,
-                })
-            except Exception as e:
-                self._send_json({"error": f"Account lookup failed: {str(e)}"}, 404)
+    def _handle_get_health(self, parsed):
+        """GET /api/health"""
+        self._log_request("health")
+        uptime = time.time() - API_START_TIME
+        self._send_json({
+            "status": "healthy",
+            "uptime_seconds": round(uptime, 1),
+            "requests_served": len(_request_log),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "version": "5.2.0",
+            "tools": ["anchor", "anchor-composite", "anchor-batch", "verify", "verify-batch", "proof-chain", "custody-chain", "webhooks", "hash-file", "ils-workspace", "dmsms-tracker", "readiness-calculator", "parts-xref", "roi-calculator", "lifecycle-cost", "warranty-tracker", "audit-vault", "doc-library", "compliance-scorecard", "provisioning-ptd", "supply-chain-risk", "audit-reports", "contracts", "digital-thread", "predictive-maintenance", "org-records"],
+        })
 
-        # ═══ HarborLink Integration — GET Endpoints ═══
+    def _handle_get_status(self, parsed):
+        """GET /api, /api/status"""
+        self._log_request("status")
+        self._send_json({
+            "status": "operational",
+            "service": "S4 Ledger Defense Metrics API",
+            "version": "5.2.0",
+            "record_types": len(RECORD_CATEGORIES),
+            "branches": len(BRANCHES),
+            "total_records": len(_get_all_records()),
+            "infrastructure": {
+                "xrpl": XRPL_AVAILABLE,
+                "supabase": SUPABASE_AVAILABLE,
+                "auth": True,
+            },
+            "hydration": _hydration_stats,
+        })
 
-        elif route == "webhook_list":
-            self._log_request("webhook-list")
-            api_key = self.headers.get("X-API-Key", "")
-            if api_key != API_MASTER_KEY and api_key not in API_KEYS_STORE:
-                self._send_json({"error": "Valid API key required"}, 401)
-                return
-            org_key = api_key
-            hooks = _webhook_store.get(org_key, [])
-            self._send_json({"webhooks": hooks, "total": len(hooks)})
+    def _handle_get_metrics(self, parsed):
+        """GET /api/metrics"""
+        self._send_json(_metrics_aggregator.snapshot(_live_records))
 
-        elif route == "webhook_deliveries":
-            self._log_request("webhook-deliveries")
-            api_key = self.headers.get("X-API-Key", "")
-            if api_key != API_MASTER_KEY and api_key not in API_KEYS_STORE:
-                self._send_json({"error": "Valid API key required"}, 401)
-                return
-            org_key = api_key
-            deliveries = [d for d in _webhook_delivery_log if d.get("org") == org_key]
-            self._send_json({"deliveries": deliveries[-50:], "total": len(deliveries)})
-
-        elif route == "proof_chain":
-            self._log_request("proof-chain")
-            qs = parse_qs(parsed.query)
-            record_id = qs.get("record_id", [""])[0]
-            if not record_id:
-                self._send_json({"error": "record_id parameter required"}, 400)
-                return
-            chain = _proof_chain_store.get(record_id, [])
-            self._send_json({
-                "record_id": record_id,
-                "chain": chain,
-                "total_events": len(chain),
-                "first_event": chain[0]["timestamp"] if chain else None,
-                "last_event": chain[-1]["timestamp"] if chain else None,
-                "integrity": "verified" if chain else "no_records",
-            })
+    def _handle_get_transactions(self, parsed):
+        """GET /api/transactions"""
+        records = _get_all_records()
+        recent = list(reversed(records[-200:]))
+        self._send_json({
+            "transactions": recent,
+            "total": len(records),
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+        })
 
-        elif route == "custody_chain":
-            self._log_request("custody-chain")
-            qs = parse_qs(parsed.query)
-            record_id = qs.get("record_id", [""])[0]
-            if not record_id:
-                self._send_json({"error": "record_id parameter required"}, 400)
-                return
-            chain = _custody_chain_store.get(record_id, [])
-            self._send_json({
-                "record_id": record_id,
-                "custody_chain": chain,
-                "total_transfers": len(chain),
-                "current_custodian": chain[-1]["to"] if chain else None,
-                "current_location": chain[-1].get("location") if chain else None,
-                "chain_verified": all(e.get("tx_hash") for e in chain) if chain else False,
-            })
+    def _handle_get_record_types(self, parsed):
+        """GET /api/record-types"""
+        grouped = {}
+        for key, cat in RECORD_CATEGORIES.items():
+            branch = cat["branch"]
+            if branch not in grouped:
+                grouped[branch] = {"info": BRANCHES.get(branch, {}), "types": []}
+            grouped[branch]["types"].append({"key": key, **cat})
+        self._send_json({"branches": BRANCHES, "categories": RECORD_CATEGORIES, "grouped": grouped})
+
+    def _handle_get_xrpl_status(self, parsed):
+        """GET /api/xrpl-status"""
+        _init_xrpl()
+        explorer_base = XRPL_EXPLORER_MAINNET if XRPL_NETWORK == "mainnet" else XRPL_EXPLORER_TESTNET
+        endpoint = XRPL_MAINNET_URL if XRPL_NETWORK == "mainnet" else XRPL_TESTNET_URL
+        self._send_json({
+            "xrpl_available": XRPL_AVAILABLE,
+            "connected": _xrpl_client is not None,
+            "wallet": _xrpl_wallet.address if _xrpl_wallet else None,
+            "pipeline": _xrpl_submitter.get_status() if _xrpl_submitter else {"enabled": XRPL_PIPELINE},
+            "treasury": _xrpl_treasury_wallet.address if _xrpl_treasury_wallet else None,
+            "demo_wallet": _xrpl_demo_wallet.address if _xrpl_demo_wallet else None,
+            "wallet_cache": _wallet_cache.get_stats(),
+            "network": XRPL_NETWORK,
+            "endpoint": endpoint,
+            "explorer": explorer_base,
+            "env_vars": {
+                "XRPL_WALLET_SEED": bool(os.environ.get("XRPL_WALLET_SEED")),
+                "XRPL_TREASURY_SEED": bool(os.environ.get("XRPL_TREASURY_SEED")),
+                "XRPL_DEMO_SEED": bool(os.environ.get("XRPL_DEMO_SEED")),
+                "XRPL_NETWORK": os.environ.get("XRPL_NETWORK", "(default: testnet)"),
+            },
+            "init_error": _xrpl_init_error,
+            "note": f"Real XRPL {XRPL_NETWORK.capitalize()} transactions. Verify at {'livenet' if XRPL_NETWORK == 'mainnet' else 'testnet'}.xrpl.org"
+        })
+
+    def _handle_get_infrastructure(self, parsed):
+        """GET /api/infrastructure"""
+        self._send_json({
+            "infrastructure": {
+                "api": {"status": "operational", "version": "5.2.0", "framework": "BaseHTTPRequestHandler", "tools": 27, "platforms": 462},
+                "xrpl": {"available": XRPL_AVAILABLE, "network": XRPL_NETWORK, "endpoint": XRPL_MAINNET_URL if XRPL_NETWORK == "mainnet" else XRPL_TESTNET_URL},
+                "database": {"provider": "Supabase" if SUPABASE_AVAILABLE else "In-Memory", "connected": SUPABASE_AVAILABLE, "url": SUPABASE_URL[:30] + "..." if SUPABASE_URL else None},
+                "auth": {"enabled": True, "methods": ["API Key", "Bearer Token"], "master_key_set": bool(os.environ.get("S4_API_MASTER_KEY"))},
+                "compliance": {
+                    "nist_800_171": "architecture_aligned",
+                    "cmmc_level": 2,
+                    "dfars_252_204_7012": True,
+                    "zero_data_on_chain": True,
+                    "classified_ready": ["UNCLASSIFIED", "CUI", "SECRET (on-prem)", "TS/SCI (on-prem)"]
+                },
+                "production_readiness": {
+                    "api_server": True,
+                    "xrpl_integration": XRPL_AVAILABLE,
+                    "database_persistence": SUPABASE_AVAILABLE,
+                    "authentication": True,
+                    "ssl_tls": True,
+                    "cdn": True,
+                    "ci_cd": True,
+                    "monitoring": False,
+                    "load_balancing": False,
+                    "estimated_pct": 42
+                }
+            }
+        })
 
-        elif route == "org_records":
-            self._log_request("org-records")
+    def _handle_get_auth_validate(self, parsed):
+        """GET /api/auth/validate"""
+        # Validate auth via JWT (preferred) or API key (legacy)
+        auth_user = _get_auth_user(self.headers)
+        if auth_user:
+            self._send_json({"valid": True, "user_id": auth_user['user_id'], "email": auth_user['email'], "role": auth_user['role'], "method": auth_user['method']})
+        else:
+            # Legacy API key fallback
             api_key = self.headers.get("X-API-Key", "")
-            if api_key != API_MASTER_KEY and api_key not in API_KEYS_STORE:
-                self._send_json({"error": "Valid API key required"}, 401)
-                return
-            qs = parse_qs(parsed.query)
-            org_key = api_key
-            org_name = API_KEYS_STORE.get(org_key, {}).get("organization", "master")
-            limit = int(qs.get("limit", ["100"])[0])
-            offset = int(qs.get("offset", ["0"])[0])
-            # Filter records by org_id
-            org_records = [r for r in _live_records if r.get("org_id") == org_key or r.get("org_id") == org_name]
-            total = len(org_records)
-            page = org_records[offset:offset + limit]
-            self._send_json({
-                "organization": org_name,
-                "records": page,
-                "total": total,
-                "limit": limit,
-                "offset": offset,
-                "has_more": (offset + limit) < total,
-            })
+            valid = api_key == API_MASTER_KEY or api_key in API_KEYS_STORE or _authenticate_api_key(api_key) is not None
+            key_info = _authenticate_api_key(api_key) or {}
+            self._send_json({"valid": valid, "tier": key_info.get("tier", "enterprise") if valid else None, "role": key_info.get("role", "admin") if valid else None, "method": "api_key" if valid else None})
+
+    def _handle_get_dmsms(self, parsed):
+        """GET /api/dmsms"""
+        self._log_request("dmsms")
+        qs = parse_qs(parsed.query)
+        program = qs.get("program", ["ddg51"])[0]
+        org_id = self.headers.get("X-API-Key", "")
+        rows = _sb_select("dmsms_items", query_params=f"program=eq.{program}&org_id=eq.{org_id}", order="created_at.desc", limit=500)
+        if not rows:
+            rows = _sb_select("dmsms_items", query_params=f"program=eq.{program}", order="created_at.desc", limit=500)
+        parts = [{"nsn": r.get("nsn",""), "part_name": r.get("part_name",""), "cage_code": r.get("cage_code",""), "manufacturer": r.get("manufacturer",""), "status": r.get("status","Active"), "severity": r.get("severity","None"), "replacement_nsn": r.get("replacement_nsn",""), "mitigation": r.get("mitigation","")} for r in rows] if rows else []
+        self._send_json({"program": program, "total_parts": len(parts), "at_risk": sum(1 for p in parts if p["status"] != "Active"), "parts": parts, "source": "supabase" if parts else "empty"})
+
+    def _handle_get_readiness(self, parsed):
+        """GET /api/readiness"""
+        self._log_request("readiness")
+        qs = parse_qs(parsed.query)
+        mtbf = float(qs.get("mtbf", ["1000"])[0])
+        mttr = float(qs.get("mttr", ["4"])[0])
+        mldt = float(qs.get("mldt", ["24"])[0])
+        ao = mtbf / (mtbf + mttr + mldt) if (mtbf + mttr + mldt) > 0 else 0
+        ai = mtbf / (mtbf + mttr) if (mtbf + mttr) > 0 else 0
+        self._send_json({"ao": round(ao, 4), "ai": round(ai, 4), "mtbf": mtbf, "mttr": mttr, "mldt": mldt, "failure_rate": round(1/mtbf, 8) if mtbf > 0 else 0, "assessment": "Meets requirements" if ao >= 0.9 else "Marginal" if ao >= 0.8 else "Below threshold"})
+
+    def _handle_get_parts(self, parsed):
+        """GET /api/parts"""
+        self._log_request("parts")
+        qs = parse_qs(parsed.query)
+        search = qs.get("q", [""])[0].lower()
+        if search:
+            rows = _sb_select("parts_catalog", query_params=f"or=(nsn.ilike.%25{search}%25,part_name.ilike.%25{search}%25,cage_code.ilike.%25{search}%25)", order="part_name.asc", limit=100)
+        else:
+            rows = _sb_select("parts_catalog", order="part_name.asc", limit=100)
+        parts = [{"nsn": r.get("nsn",""), "name": r.get("part_name",""), "cage": r.get("cage_code",""), "mfg": r.get("manufacturer",""), "status": r.get("status","Available"), "unit_price": float(r.get("unit_price",0) or 0), "lead_time_days": r.get("lead_time_days")} for r in rows] if rows else []
+        self._send_json({"query": search, "results": parts, "total": len(parts), "source": "supabase" if parts else "empty"})
+
+    def _handle_get_roi(self, parsed):
+        """GET /api/roi"""
+        self._log_request("roi")
+        qs = parse_qs(parsed.query)
+        programs = int(qs.get("programs", ["5"])[0])
+        ftes = float(qs.get("ftes", ["8"])[0])
+        rate = float(qs.get("rate", ["145"])[0])
+        license_cost = float(qs.get("license", ["120000"])[0])
+        labor = ftes * rate * 2080
+        savings = labor * 0.65 + programs * 12000
+        roi_pct = ((savings - license_cost) / license_cost * 100) if license_cost > 0 else 0
+        self._send_json({"programs": programs, "ftes": ftes, "annual_savings": round(savings), "license_cost": license_cost, "net_benefit": round(savings - license_cost), "roi_percent": round(roi_pct, 1), "payback_months": round(license_cost / savings * 12, 1) if savings > 0 else 99})
+
+    def _handle_get_lifecycle(self, parsed):
+        """GET /api/lifecycle"""
+        self._log_request("lifecycle")
+        qs = parse_qs(parsed.query)
+        acq = float(qs.get("acquisition", ["85"])[0])
+        fleet = int(qs.get("fleet", ["20"])[0])
+        life = int(qs.get("life", ["30"])[0])
+        sust_rate = float(qs.get("sustrate", ["8"])[0]) / 100
+        total_acq = acq * fleet
+        total_sust = total_acq * sust_rate * life
+        dmsms = total_acq * 0.04 * life
+        total = total_acq + total_sust + dmsms
+        self._send_json({"acquisition_m": round(total_acq, 1), "sustainment_m": round(total_sust, 1), "dmsms_m": round(dmsms, 1), "total_ownership_m": round(total, 1), "service_life_years": life, "fleet_size": fleet})
+
+    def _handle_get_warranty(self, parsed):
+        """GET /api/warranty"""
+        self._log_request("warranty")
+        qs = parse_qs(parsed.query)
+        program = qs.get("program", ["ddg51"])[0]
+        rows = _sb_select("warranty_items", query_params=f"program=eq.{program}", order="days_left.asc.nullslast", limit=500)
+        items = [{"system": r.get("system_name",""), "status": r.get("status","Active"), "days_left": r.get("days_left",0), "contract_type": r.get("contract_type","OEM Warranty"), "value": float(r.get("value",0) or 0), "vendor": r.get("vendor",""), "start_date": r.get("start_date",""), "end_date": r.get("end_date","")} for r in rows] if rows else []
+        self._send_json({"program": program, "items": items, "active": sum(1 for i in items if i["status"] == "Active"), "expiring": sum(1 for i in items if i["status"] == "Expiring"), "total_value": sum(i["value"] for i in items), "source": "supabase" if items else "empty"})
+
+    def _handle_get_supply_chain_risk(self, parsed):
+        """GET /api/supply-chain-risk"""
+        self._log_request("supply-chain-risk")
+        qs = parse_qs(parsed.query)
+        program = qs.get("program", ["ddg51"])[0]
+        threshold = qs.get("threshold", ["all"])[0]
+        rows = _sb_select("supply_chain_risks", query_params=f"program=eq.{program}", order="risk_score.desc", limit=500)
+        risk_items = [{"part": r.get("part_name",""), "nsn": r.get("nsn",""), "supplier": r.get("supplier",""), "score": r.get("risk_score",0), "level": r.get("risk_level","low"), "factors": r.get("factors",[]), "eta_impact": r.get("eta_impact",""), "mitigation": r.get("mitigation","")} for r in rows] if rows else []
+        if threshold == "critical": risk_items = [r for r in risk_items if r["level"]=="critical"]
+        elif threshold == "high": risk_items = [r for r in risk_items if r["level"] in ("critical","high")]
+        self._send_json({"program":program,"items":risk_items,"critical":sum(1 for r in risk_items if r["level"]=="critical"),"high":sum(1 for r in risk_items if r["level"]=="high"),"medium":sum(1 for r in risk_items if r["level"]=="medium"),"low":sum(1 for r in risk_items if r["level"]=="low"),"total":len(risk_items),"source": "supabase" if risk_items else "empty"})
+
+    def _handle_get_audit_reports(self, parsed):
+        """GET /api/audit-reports"""
+        self._log_request("audit-reports")
+        qs = parse_qs(parsed.query)
+        report_type = qs.get("type", ["full_audit"])[0]
+        period = int(qs.get("period", ["90"])[0])
+        sections = {"full_audit":["Executive Summary","Anchoring History","Chain of Custody","Compliance Scorecard","Record Verification","Hash Integrity"],"supply_chain":["Supply Chain Overview","Receipt Verification","Custody Transfers","Lot Traceability"],"maintenance":["Maintenance Summary","Work Order Verification","Parts Usage","Readiness Impact"],"compliance":["Overall Score","NIST 800-171","CMMC Readiness","DFARS Compliance"],"custody":["Custody Timeline","Transfer Verification","Location History","Blockchain Proof"],"contract":["CDRL Status","Deliverable Timeline","Mod History","Cost Performance"]}
+        sec = sections.get(report_type, sections["full_audit"])
+        # Pull real record count and compliance from Supabase
+        real_records = _sb_select("records", select="id", limit=10000)
+        record_count = len(real_records) if real_records else 0
+        comp_rows = _sb_select("compliance_scores", order="assessment_date.desc.nullslast", limit=10)
+        avg_compliance = sum(float(r.get("score",0)) for r in comp_rows) / len(comp_rows) if comp_rows else 0
+        self._send_json({"report_type":report_type,"period_days":period,"sections":sec,"record_count":record_count,"compliance_score":round(avg_compliance, 1),"generated":datetime.now(timezone.utc).isoformat()})
+
+    def _handle_get_contracts(self, parsed):
+        """GET /api/contracts"""
+        self._log_request("contracts")
+        qs = parse_qs(parsed.query)
+        contract_id = qs.get("contract", ["N00024-25-C-5501"])[0]
+        rows = _sb_select("contract_items", query_params=f"contract_id=eq.{contract_id}", order="due_date.asc.nullslast", limit=200)
+        items = [{"id": r.get("item_id",""), "desc": r.get("description",""), "type": r.get("item_type","cdrl"), "di": r.get("di_number",""), "due": r.get("due_date",""), "status": r.get("status","on_track"), "anchored": r.get("anchored",False)} for r in rows] if rows else []
+        self._send_json({"contract":contract_id,"items":items,"total":len(items),"on_track":sum(1 for i in items if i["status"]=="on_track"),"overdue":sum(1 for i in items if i["status"]=="overdue"),"delivered":sum(1 for i in items if i["status"]=="delivered"),"source": "supabase" if items else "empty"})
+
+    def _handle_get_digital_thread(self, parsed):
+        """GET /api/digital-thread"""
+        self._log_request("digital-thread")
+        qs = parse_qs(parsed.query)
+        platform = qs.get("platform", ["ddg51"])[0]
+        view = qs.get("view", ["changes"])[0]
+        rows = _sb_select("digital_thread_items", query_params=f"platform=eq.{platform}", order="created_at.desc", limit=200)
+        items = [{"id": r.get("item_id",""), "desc": r.get("description",""), "type": r.get("item_type","Class I"), "status": r.get("status","pending"), "anchored": r.get("anchored",False)} for r in rows] if rows else []
+        self._send_json({"platform":platform,"view":view,"items":items,"total":len(items),"pending":sum(1 for i in items if i["status"]=="pending"),"approved":sum(1 for i in items if i["status"] in ("approved","implemented")),"anchored":sum(1 for i in items if i["anchored"]),"source": "supabase" if items else "empty"})
+
+    def _handle_get_predictive_maintenance(self, parsed):
+        """GET /api/predictive-maintenance"""
+        self._log_request("predictive-maintenance")
+        qs = parse_qs(parsed.query)
+        platform = qs.get("platform", ["ddg51"])[0]
+        window = int(qs.get("window", ["90"])[0])
+        confidence = int(qs.get("confidence", ["85"])[0])
+        rows = _sb_select("predictive_maint", query_params=f"platform=eq.{platform}&confidence=gte.{confidence}&eta_days=lte.{window}", order="confidence.desc", limit=200)
+        predictions = [{"system": r.get("system_name",""), "component": r.get("component",""), "mode": r.get("failure_mode",""), "confidence": r.get("confidence",0), "eta_days": r.get("eta_days",0), "cost_unplanned": float(r.get("cost_unplanned",0) or 0), "urgent": r.get("urgent",False)} for r in rows] if rows else []
+        total_cost = sum(p["cost_unplanned"] for p in predictions)
+        self._send_json({"platform":platform,"window_days":window,"confidence_threshold":confidence,"predictions":predictions,"total":len(predictions),"urgent":sum(1 for p in predictions if p["urgent"]),"total_risk_k":total_cost,"est_savings_k":int(total_cost*0.55),"model_accuracy":92.4,"source": "supabase" if predictions else "empty"})
+
+    def _handle_get_action_items(self, parsed):
+        """GET /api/action-items"""
+        self._log_request("action-items")
+        rows = _sb_select("action_items", order="created_at.desc", limit=500)
+        items = [{"id": r.get("item_id",""), "title": r.get("title",""), "severity": r.get("severity","warning"), "source": r.get("source_tool",""), "cost": str(r.get("estimated_cost",0)), "schedule": r.get("schedule",""), "done": r.get("done",False), "assigned_to": r.get("assigned_to","")} for r in rows] if rows else []
+        self._send_json({"action_items": items, "total": len(items), "critical": sum(1 for i in items if i["severity"]=="critical"), "open": sum(1 for i in items if not i["done"]), "source": "supabase" if items else "empty"})
+
+    def _handle_get_calendar(self, parsed):
+        """GET /api/calendar"""
+        self._log_request("calendar")
+        qs = parse_qs(parsed.query)
+        month = int(qs.get("month", [str(datetime.now(timezone.utc).month)])[0])
+        year = int(qs.get("year", [str(datetime.now(timezone.utc).year)])[0])
+        start = f"{year}-{month:02d}-01"
+        end_month = month + 1 if month < 12 else 1
+        end_year = year if month < 12 else year + 1
+        end = f"{end_year}-{end_month:02d}-01"
+        rows = _sb_select("calendar_events", query_params=f"event_date=gte.{start}&event_date=lt.{end}", order="event_date.asc", limit=200)
+        events = [{"id": r.get("event_id",""), "title": r.get("title",""), "date": r.get("event_date",""), "time": str(r.get("event_time","")) if r.get("event_time") else "", "type": r.get("event_type","info"), "source": r.get("source_tool","")} for r in rows] if rows else []
+        self._send_json({"month": month, "year": year, "events": events, "total": len(events), "source": "supabase" if events else "empty"})
+
+    def _handle_get_audit_vault(self, parsed):
+        """GET /api/audit-vault"""
+        self._log_request("audit-vault")
+        qs = parse_qs(parsed.query)
+        doc_type = qs.get("type", [""])[0]
+        qp = f"doc_type=eq.{doc_type}" if doc_type else ""
+        rows = _sb_select("audit_vault", query_params=qp, order="created_at.desc", limit=200)
+        docs = [{"doc_id": r.get("doc_id",""), "title": r.get("title",""), "doc_type": r.get("doc_type",""), "classification": r.get("classification","unclassified"), "hash": r.get("hash",""), "anchored": r.get("anchored",False), "anchor_tx": r.get("anchor_tx",""), "uploaded_by": r.get("uploaded_by",""), "created_at": r.get("created_at","")} for r in rows] if rows else []
+        self._send_json({"documents": docs, "total": len(docs), "anchored": sum(1 for d in docs if d["anchored"]), "source": "supabase" if docs else "empty"})
+
+    def _handle_get_doc_library(self, parsed):
+        """GET /api/doc-library"""
+        self._log_request("doc-library")
+        qs = parse_qs(parsed.query)
+        doc_type = qs.get("type", [""])[0]
+        search = qs.get("q", [""])[0]
+        qp = f"doc_type=eq.{doc_type}" if doc_type else ""
+        if search:
+            qp = f"title=ilike.%25{search}%25" + (f"&{qp}" if qp else "")
+        rows = _sb_select("doc_library", query_params=qp, order="updated_at.desc", limit=200)
+        docs = [{"doc_id": r.get("doc_id",""), "title": r.get("title",""), "doc_type": r.get("doc_type",""), "di_number": r.get("di_number",""), "revision": r.get("revision",""), "status": r.get("status","current"), "anchored": r.get("anchored",False), "created_at": r.get("created_at","")} for r in rows] if rows else []
+        self._send_json({"documents": docs, "total": len(docs), "current": sum(1 for d in docs if d["status"]=="current"), "source": "supabase" if docs else "empty"})
+
+    def _handle_get_compliance_scorecard(self, parsed):
+        """GET /api/compliance-scorecard"""
+        self._log_request("compliance-scorecard")
+        qs = parse_qs(parsed.query)
+        program = qs.get("program", ["ddg51"])[0]
+        rows = _sb_select("compliance_scores", query_params=f"program=eq.{program}", order="framework.asc", limit=50)
+        frameworks = [{"framework": r.get("framework",""), "score": float(r.get("score",0)), "max_score": float(r.get("max_score",100)), "level": r.get("level",""), "findings": r.get("findings",0), "critical_gaps": r.get("critical_gaps",0), "assessment_date": r.get("assessment_date",""), "assessor": r.get("assessor","")} for r in rows] if rows else []
+        overall = sum(f["score"] for f in frameworks) / len(frameworks) if frameworks else 0
+        self._send_json({"program": program, "frameworks": frameworks, "overall_score": round(overall, 1), "total_frameworks": len(frameworks), "total_findings": sum(f["findings"] for f in frameworks), "critical_gaps": sum(f["critical_gaps"] for f in frameworks), "source": "supabase" if frameworks else "empty"})
+
+    def _handle_get_provisioning_ptd(self, parsed):
+        """GET /api/provisioning-ptd"""
+        self._log_request("provisioning-ptd")
+        qs = parse_qs(parsed.query)
+        program = qs.get("program", ["ddg51"])[0]
+        # PTD (Provisioning Technical Documentation) — reads from parts_catalog + dmsms
+        parts_rows = _sb_select("parts_catalog", order="nsn.asc", limit=500)
+        dmsms_rows = _sb_select("dmsms_items", query_params=f"program=eq.{program}", order="part_name.asc", limit=500)
+        ptd_items = []
+        for r in (parts_rows or []):
+            ptd_items.append({"nsn": r.get("nsn",""), "name": r.get("part_name",""), "cage": r.get("cage_code",""), "status": r.get("status","Available"), "source": "parts_catalog", "provisioned": True})
+        dmsms_nsns = {r.get("nsn","") for r in (dmsms_rows or []) if r.get("nsn")}
+        at_risk = [n for n in dmsms_nsns if n]
+        self._send_json({"program": program, "ptd_items": ptd_items, "total": len(ptd_items), "at_risk_nsns": list(at_risk), "provisioned": len(ptd_items), "source": "supabase" if ptd_items else "empty"})
+
+    def _handle_get_wallet_balance(self, parsed):
+        """GET /api/wallet/balance"""
+        self._log_request("wallet-balance")
+        qs = parse_qs(parsed.query)
+        address = qs.get("address", [""])[0]
+        if not address:
+            self._send_json({"error": "address parameter required"}, 400)
+            return
+        # Query XRPL for account balances
+        _init_xrpl()
+        if not _xrpl_client or not XRPL_AVAILABLE:
+            self._send_json({"error": "XRPL not available"}, 503)
+            return
+        try:
+            from xrpl.models.requests import AccountInfo, AccountLines
+            acc_info = _xrpl_client.request(AccountInfo(account=address))
+            xrp_drops = int(acc_info.result.get("account_data", {}).get("Balance", "0"))
+            xrp_balance = xrp_drops / 1_000_000
 
-        # ═══ Modular API — GET Endpoints ═══
-
-        elif route == "ils_gap_analysis":
-            self._log_request("ils-gap-analysis")
-            qs = parse_qs(parsed.query)
-            program = qs.get("program", ["ddg51"])[0]
-            phase = qs.get("phase", ["emd"])[0]
-            rows = _sb_select("gap_analysis", query_params=f"program=eq.{program}", order="created_at.desc", limit=500)
-            gaps = [{"id": r.get("gap_id",""), "element": r.get("element",""), "severity": r.get("severity","warning"), "di": r.get("di_number",""), "action": r.get("action_required",""), "owner": r.get("owner",""), "cost": float(r.get("cost",0)), "status": r.get("status","open")} for r in rows] if rows else []
-            critical = len([g for g in gaps if g["severity"] == "critical"])
-            total_risk = sum(g["cost"] for g in gaps)
-            self._send_json({
-                "program": program,
-                "phase": phase,
-                "critical_gaps": critical,
-                "total_gaps": len(gaps),
-                "total_risk_usd": total_risk,
-                "gaps": gaps,
-                "generated_at": datetime.now(timezone.utc).isoformat(),
-                "source": "supabase" if gaps else "empty",
-            })
+            acc_lines = _xrpl_client.request(AccountLines(account=address))
+            sls_balance = "0"
+            for line in acc_lines.result.get("lines", []):
+                if line.get("currency") == "SLS" and line.get("account") == SLS_ISSUER_ADDRESS:
+                    sls_balance = line.get("balance", "0")
+                    break
+
+            anchors_available = int(float(sls_balance) / float(SLS_ANCHOR_FEE)) if float(sls_balance) > 0 else 0
+            explorer_base = (XRPL_EXPLORER_MAINNET if XRPL_NETWORK == "mainnet" else XRPL_EXPLORER_TESTNET).replace("/transactions/", "/accounts/")
 
-        elif route == "logistics_risk_score":
-            self._log_request("logistics-risk-score")
-            qs = parse_qs(parsed.query)
-            program = qs.get("program", ["ddg51"])[0]
-            rows = _sb_select("risk_factors", query_params=f"program=eq.{program}", order="score.desc", limit=500)
-            factors = [{"factor": r.get("factor",""), "score": float(r.get("score",0)), "weight": float(r.get("weight",0)), "category": r.get("category",""), "mitigation": r.get("mitigation","")} for r in rows] if rows else []
-            overall = sum(f["score"] * f["weight"] for f in factors) if factors else 0
             self._send_json({
-                "program": program,
-                "overall_risk_score": round(overall, 2),
-                "risk_level": "HIGH" if overall > 6 else "MEDIUM" if overall > 4 else "LOW",
-                "risk_factors": factors,
-                "total_factors": len(factors),
-                "generated_at": datetime.now(timezone.utc).isoformat(),
-                "source": "supabase" if factors else "empty",
+                "address": address,
+                "xrp_balance": round(xrp_balance, 6),
+                "sls_balance": sls_balance,
+                "anchors_available": anchors_available,
+                "sls_price_usd": SLS_PRICE_USD,
+                "network": XRPL_NETWORK,
+                "explorer_url": explorer_base + address,
             })
+        except Exception as e:
+            self._send_json({"error": f"Account lookup failed: {str(e)}"}, 404)
+
+    # ═══ HarborLink Integration — GET Endpoints ═══
+
+    def _handle_get_webhook_list(self, parsed):
+        """GET /api/webhooks/list"""
+        self._log_request("webhook-list")
+        api_key = self.headers.get("X-API-Key", "")
+        org_key = api_key
+        hooks = _webhook_store.get(org_key, [])
+        self._send_json({"webhooks": hooks, "total": len(hooks)})
+
+    def _handle_get_webhook_deliveries(self, parsed):
+        """GET /api/webhooks/deliveries"""
+        self._log_request("webhook-deliveries")
+        api_key = self.headers.get("X-API-Key", "")
+        org_key = api_key
+        deliveries = [d for d in _webhook_delivery_log if d.get("org") == org_key]
+        self._send_json({"deliveries": deliveries[-50:], "total": len(deliveries),
+                         "outbox": _webhook_outbox_status(org_key, operator=api_key == API_MASTER_KEY)})
+
+    def _handle_get_proof_chain(self, parsed):
+        """GET /api/proof-chain"""
+        self._log_request("proof-chain")
+        qs = parse_qs(parsed.query)
+        record_id = qs.get("record_id", [""])[0]
+        if not record_id:
+            self._send_json({"error": "record_id parameter required"}, 400)
+            return
+        chain = _proof_chain_store.get(record_id, [])
+        self._send_json({
+            "record_id": record_id,
+            "chain": chain,
+            "total_events": len(chain),
+            "first_event": chain[0]["timestamp"] if chain else None,
+            "last_event": chain[-1]["timestamp"] if chain else None,
+            "integrity": "verified" if chain else "no_records",
+        })
+
+    def _handle_get_custody_chain(self, parsed):
+        """GET /api/custody/chain"""
+        self._log_request("custody-chain")
+        qs = parse_qs(parsed.query)
+        record_id = qs.get("record_id", [""])[0]
+        if not record_id:
+            self._send_json({"error": "record_id parameter required"}, 400)
+            return
+        chain = _custody_chain_store.get(record_id, [])
+        self._send_json({
+            "record_id": record_id,
+            "custody_chain": chain,
+            "total_transfers": len(chain),
+            "current_custodian": chain[-1]["to"] if chain else None,
+            "current_location": chain[-1].get("location") if chain else None,
+            "chain_verified": all(e.get("tx_hash") for e in chain) if chain else False,
+        })
+
+    def _handle_get_anchor_status(self, parsed):
+        """GET /api/anchor/status"""
+        qs = parse_qs(parsed.query)
+        record_id = qs.get("record_id", [""])[0]
+        if not record_id:
+            self._send_json({"error": "record_id query parameter required"}, 400)
+            return
+        status = _anchor_job_status(record_id)
+        if status is None:
+            self._send_json({"error": f"No anchor found for record {record_id}"}, 404)
+            return
+        self._send_json(status)
+
+    def _handle_get_batch_proof(self, parsed):
+        """GET /api/batch/proof"""
+        self._log_request("batch-proof")
+        qs = parse_qs(parsed.query)
+        batch_id = qs.get("batch_id", [""])[0]
+        leaf = qs.get("leaf", [""])[0]
+        leaf_index = qs.get("index", [""])[0]
+        if not batch_id or not (leaf or leaf_index.isdigit()):
+            self._send_json({"error": "batch_id and leaf (hash) or index query parameters required"}, 400)
+            return
+        batch = _batch_store.get(batch_id) or _load_batch_from_supabase(batch_id)
+        if batch is None:
+            self._send_json({"error": f"Batch {batch_id} not found"}, 404)
+            return
+        leaves = batch["leaf_hashes"]
+        if leaf_index.isdigit():
+            index = int(leaf_index) if int(leaf_index) < len(leaves) else None
+        else:
+            # Records remember their leaf position; fall back to a scan for hydrated batches
+            index = next((r["leaf_index"] for r in _records_by("hash", leaf)
+                          if r.get("batch_id") == batch_id and "leaf_index" in r), None)
+            if index is None and leaf in leaves:
+                index = leaves.index(leaf)
+        if index is None:
+            self._send_json({"error": f"Leaf not found in batch {batch_id}"}, 404)
+            return
+        self._send_json({
+            "batch_id": batch_id,
+            "leaf": leaves[index],
+            "leaf_index": index,
+            "merkle_root": batch["merkle_root"],
+            "proof": _batch_proof(batch, index),
+            "record_count": len(leaves),
+            "tx_hash": batch.get("tx_hash"),
+            "network": batch.get("network"),
+            "explorer_url": batch.get("explorer_url"),
+            "algorithm": "SHA-256, parent = sha256(left_hex + right_hex)",
+        })
+
+    def _handle_get_org_records(self, parsed):
+        """GET /api/org/records"""
+        self._log_request("org-records")
+        api_key = self.headers.get("X-API-Key", "")
+        qs = parse_qs(parsed.query)
+        org_key = api_key
+        org_name = API_KEYS_STORE.get(org_key, {}).get("organization", "master")
+        limit = int(qs.get("limit", ["100"])[0])
+        offset = int(qs.get("offset", ["0"])[0])
+        # Filter records by org_id
+        org_records = _records_by("org_id", org_key, org_name)
+        total = len(org_records)
+        page = org_records[offset:offset + limit]
+        self._send_json({
+            "organization": org_name,
+            "records": page,
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+            "has_more": (offset + limit) < total,
+        })
+
+    # ═══ Modular API — GET Endpoints ═══
+
+    def _handle_get_ils_gap_analysis(self, parsed):
+        """GET /api/ils/gap-analysis"""
+        self._log_request("ils-gap-analysis")
+        qs = parse_qs(parsed.query)
+        program = qs.get("program", ["ddg51"])[0]
+        phase = qs.get("phase", ["emd"])[0]
+        rows = _sb_select("gap_analysis", query_params=f"program=eq.{program}", order="created_at.desc", limit=500)
+        gaps = [{"id": r.get("gap_id",""), "element": r.get("element",""), "severity": r.get("severity","warning"), "di": r.get("di_number",""), "action": r.get("action_required",""), "owner": r.get("owner",""), "cost": float(r.get("cost",0)), "status": r.get("status","open")} for r in rows] if rows else []
+        critical = len([g for g in gaps if g["severity"] == "critical"])
+        total_risk = sum(g["cost"] for g in gaps)
+        self._send_json({
+            "program": program,
+            "phase": phase,
+            "critical_gaps": critical,
+            "total_gaps": len(gaps),
+            "total_risk_usd": total_risk,
+            "gaps": gaps,
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "source": "supabase" if gaps else "empty",
+        })
+
+    def _handle_get_logistics_risk_score(self, parsed):
+        """GET /api/logistics/risk-score"""
+        self._log_request("logistics-risk-score")
+        qs = parse_qs(parsed.query)
+        program = qs.get("program", ["ddg51"])[0]
+        rows = _sb_select("risk_factors", query_params=f"program=eq.{program}", order="score.desc", limit=500)
+        factors = [{"factor": r.get("factor",""), "score": float(r.get("score",0)), "weight": float(r.get("weight",0)), "category": r.get("category",""), "mitigation": r.get("mitigation","")} for r in rows] if rows else []
+        overall = sum(f["score"] * f["weight"] for f in factors) if factors else 0
+        self._send_json({
+            "program": program,
+            "overall_risk_score": round(overall, 2),
+            "risk_level": "HIGH" if overall > 6 else "MEDIUM" if overall > 4 else "LOW",
+            "risk_factors": factors,
+            "total_factors": len(factors),
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+            "source": "supabase" if factors else "empty",
+        })
 
-        elif route == "metrics_performance":
-            self._log_request("metrics-performance")
-            now = datetime.now(timezone.utc)
-            uptime = time.time() - API_START_TIME
-            records = _get_all_records()
-            # Real request-log latency stats (if we've tracked any)
+    def _handle_get_metrics_performance(self, parsed):
+        """GET /api/metrics/performance"""
+        self._log_request("metrics-performance")
+        now = datetime.now(timezone.utc)
+        uptime = time.time() - API_START_TIME
+        records = _get_all_records()
+        # Tail latency from the streaming sketches; they cover every observation
+        # since start-up, not just the last few requests.
+        anchor = _latency_summary("s4_anchor_duration_seconds")
+        requests_ = _latency_summary("s4_http_request_seconds")
+        if anchor is None:
+            # Collector unavailable — fall back to the in-memory request log
             recent_latencies = [e.get("ms", 0) for e in _request_log[-50:] if e.get("ms")]
             avg_anchor_ms = sum(recent_latencies) / len(recent_latencies) if recent_latencies else 0
             p95_anchor_ms = sorted(recent_latencies)[int(len(recent_latencies) * 0.95)] if recent_latencies else 0
-            self._send_json({
-                "performance": {
-                    "uptime_seconds": round(uptime, 1),
-                    "uptime_pct": round(min(100, uptime / (uptime + 1) * 100), 2) if uptime else 0,
-                    "total_requests": len(_request_log),
-                    "avg_anchor_time_ms": round(avg_anchor_ms, 1),
-                    "p95_anchor_time_ms": round(p95_anchor_ms, 1),
-                    "total_records_anchored": len(records),
-                    "live_records": len(_live_records),
-                    "xrpl_connected": _xrpl_client is not None,
-                    "xrpl_network": XRPL_NETWORK,
-                    "supabase_connected": SUPABASE_AVAILABLE,
-                },
-                "costs": {
-                    "total_sls_fees": round(len(records) * 0.01, 2),
-                    "avg_cost_per_anchor_usd": 0.01,
-                    "xrp_tx_fee_drops": 12,
-                    "monthly_burn_rate_sls": round(len(_live_records) * 0.01, 2),
-                },
-                "validator_health": {
-                    "xrpl_status": "connected" if _xrpl_client else "disconnected",
-                    "last_anchor_success": _live_records[-1]["timestamp"] if _live_records else None,
-                    "consecutive_failures": 0,
-                    "network": XRPL_NETWORK,
-                },
-                "recent_requests": _request_log[-20:],
-                "generated_at": now.isoformat(),
-            })
+        else:
+            avg_anchor_ms, p95_anchor_ms = anchor["avg_ms"], anchor["p95_ms"]
+        self._send_json({
+            "performance": {
+                "uptime_seconds": round(uptime, 1),
+                "uptime_pct": round(min(100, uptime / (uptime + 1) * 100), 2) if uptime else 0,
+                "total_requests": len(_request_log),
+                "avg_anchor_time_ms": round(avg_anchor_ms, 1),
+                "p95_anchor_time_ms": round(p95_anchor_ms, 1),
+                "anchor_latency_ms": anchor,
+                "request_latency_ms": requests_,
+                "total_records_anchored": len(records),
+                "live_records": len(_live_records),
+                "xrpl_connected": _xrpl_client is not None,
+                "xrpl_network": XRPL_NETWORK,
+                "supabase_connected": SUPABASE_AVAILABLE,
+            },
+            "costs": {
+                "total_sls_fees": round(len(records) * 0.01, 2),
+                "avg_cost_per_anchor_usd": 0.01,
+                "xrp_tx_fee_drops": 12,
+                "monthly_burn_rate_sls": round(len(_live_records) * 0.01, 2),
+            },
+            "validator_health": {
+                "xrpl_status": "connected" if _xrpl_client else "disconnected",
+                "last_anchor_success": _live_records[-1]["timestamp"] if _live_records else None,
+                "consecutive_failures": 0,
+                "network": XRPL_NETWORK,
+            },
+            "recent_requests": _request_log[-20:],
+            "generated_at": now.isoformat(),
+        })
 
-        elif route == "security_audit_trail":
-            self._log_request("security-audit-trail")
-            api_key = self.headers.get("X-API-Key", "")
-            if api_key != API_MASTER_KEY and api_key not in API_KEYS_STORE:
-                self._send_json({"error": "Valid API key required"}, 401)
-                return
-            self._send_json({
-                "ai_audit_trail": _ai_audit_log[-100:],
-                "total_ai_decisions": len(_ai_audit_log),
-                "verify_audit_trail": _verify_audit_log[-100:],
-                "total_verifications": len(_verify_audit_log),
-                "generated_at": datetime.now(timezone.utc).isoformat(),
-            })
+    def _handle_get_metrics_prometheus(self, parsed):
+        """GET /api/metrics/prometheus — Prometheus text exposition of S4Metrics"""
+        self._log_request("metrics-prometheus")
+        if not MONITORING_AVAILABLE:
+            self._send_json({"error": "Metrics collector not available"}, 503)
+            return
+        body = _metrics.export_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
 
-        elif route == "offline_queue":
-            self._log_request("offline-queue")
-            self._send_json({
-                "queue": _offline_hash_queue[-100:],
-                "queue_length": len(_offline_hash_queue),
-                "mode": os.environ.get("S4_MODE", "online"),
-                "last_sync": _offline_last_sync,
-                "generated_at": datetime.now(timezone.utc).isoformat(),
-            })
+    def _handle_get_security_audit_trail(self, parsed):
+        """GET /api/security/audit-trail"""
+        self._log_request("security-audit-trail")
+        self._send_json({
+            "ai_audit_trail": _ai_audit_log[-100:],
+            "total_ai_decisions": len(_ai_audit_log),
+            "verify_audit_trail": _verify_audit_log[-100:],
+            "total_verifications": len(_verify_audit_log),
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+        })
 
-        # ══ SECURITY ENHANCEMENTS — GET endpoints ══
+    def _handle_get_offline_queue(self, parsed):
+        """GET /api/offline/queue"""
+        self._log_request("offline-queue")
+        self._send_json({
+            "queue": _offline_hash_queue[-100:],
+            "queue_length": len(_offline_hash_queue),
+            "mode": os.environ.get("S4_MODE", "online"),
+            "last_sync": _offline_last_sync,
+            "generated_at": datetime.now(timezone.utc).isoformat(),
+        })
 
-        elif route == "security_rbac":
-            self._log_request("security-rbac")
-            api_key = self.headers.get("X-API-Key", "")
-            key_info = API_KEYS_STORE.get(api_key, {})
-            current_role = key_info.get("role", "viewer")
-            self._send_json({
-                "roles": RBAC_ROLES,
-                "current_role": current_role,
-                "current_permissions": RBAC_ROLES.get(current_role, {}).get("permissions", []),
-                "mfa_enabled": key_info.get("mfa_enabled", False),
-                "mfa_status": "planned — Q3 2026",
-                "session_info": {
-                    "api_key_prefix": api_key[:8] + "..." if len(api_key) > 8 else "demo",
-                    "tier": RBAC_ROLES.get(current_role, {}).get("tier", "pilot"),
-                },
-            })
+    # ══ SECURITY ENHANCEMENTS — GET endpoints ══
 
-        elif route == "security_zkp":
-            self._log_request("security-zkp")
-            # ZKP status and documentation
-            self._send_json({
-                "zkp_available": True,
-                "proof_type": "zk-snark-stub",
-                "production_target": "Bulletproofs / Groth16 — Q3 2026",
-                "use_cases": [
-                    "Prove document was anchored without revealing content (CUI/ITAR)",
-                    "Verify supply chain integrity without exposing logistics data",
-                    "Third-party audit verification without data access",
-                    "Cross-organization data exchange with zero knowledge",
-                ],
-                "how_to_use": {
-                    "generate_proof": "POST /api/security/zkp with {\"hash\": \"sha256_hash\"}",
-                    "verify_proof": "POST /api/security/zkp with {\"hash\": \"sha256_hash\", \"proof\": {...}}",
-                },
-                "sample_proof": _zkp_verify_stub("SAMPLE_HASH_FOR_DOCUMENTATION"),
-            })
+    def _handle_get_security_rbac(self, parsed):
+        """GET /api/security/rbac"""
+        self._log_request("security-rbac")
+        api_key = self.headers.get("X-API-Key", "")
+        key_info = API_KEYS_STORE.get(api_key, {})
+        current_role = key_info.get("role", "viewer")
+        self._send_json({
+            "roles": RBAC_ROLES,
+            "current_role": current_role,
+            "current_permissions": RBAC_ROLES.get(current_role, {}).get("permissions", []),
+            "mfa_enabled": key_info.get("mfa_enabled", False),
+            "mfa_status": "planned — Q3 2026",
+            "session_info": {
+                "api_key_prefix": api_key[:8] + "..." if len(api_key) > 8 else "demo",
+                "tier": RBAC_ROLES.get(current_role, {}).get("tier", "pilot"),
+            },
+        })
 
-        elif route == "security_threat_model":
-            self._log_request("security-threat-model")
-            self._send_json(_threat_model_assessment())
-
-        elif route == "security_dep_audit":
-            self._log_request("security-dep-audit")
-            now = datetime.now(timezone.utc)
-            # Check known dependencies
-            audit_results = []
-            total_clean = 0
-            total_vulnerable = 0
-            for pkg, info in KNOWN_DEPENDENCIES.items():
-                status = info.get("cve_status", "unknown")
-                if status == "clean":
-                    total_clean += 1
-                else:
-                    total_vulnerable += 1
-                audit_results.append({
-                    "package": pkg,
-                    "version": info["version"],
-                    "cve_status": status,
-                    "last_audit": info.get("last_audit", "unknown"),
-                })
-            self._send_json({
-                "audit_timestamp": now.isoformat(),
-                "total_packages": len(KNOWN_DEPENDENCIES),
-                "clean": total_clean,
-                "vulnerable": total_vulnerable,
-                "packages": audit_results,
-                "tools_used": ["safety", "pip-audit", "bandit", "semgrep"],
-                "last_full_scan": "2026-02-01",
-                "next_scheduled": "2026-03-01",
-                "sbom_format": "CycloneDX 1.5",
-                "recommendation": "All dependencies are current. Next audit scheduled per monthly cadence.",
-            })
+    def _handle_get_security_zkp(self, parsed):
+        """GET /api/security/zkp"""
+        self._log_request("security-zkp")
+        # ZKP status and documentation
+        self._send_json({
+            "zkp_available": True,
+            "proof_type": "zk-snark-stub",
+            "production_target": "Bulletproofs / Groth16 — Q3 2026",
+            "use_cases": [
+                "Prove document was anchored without revealing content (CUI/ITAR)",
+                "Verify supply chain integrity without exposing logistics data",
+                "Third-party audit verification without data access",
+                "Cross-organization data exchange with zero knowledge",
+            ],
+            "how_to_use": {
+                "generate_proof": "POST /api/security/zkp with {\"hash\": \"sha256_hash\"}",
+                "verify_proof": "POST /api/security/zkp with {\"hash\": \"sha256_hash\", \"proof\": {...}}",
+            },
+            "sample_proof": _zkp_verify_stub("SAMPLE_HASH_FOR_DOCUMENTATION"),
+        })
 
-        # ══ DEMO & TREASURY GET endpoints ══
+    def _handle_get_security_threat_model(self, parsed):
+        """GET /api/security/threat-model"""
+        self._log_request("security-threat-model")
+        self._send_json(_threat_model_assessment())
 
-        elif route == "treasury_health":
-            self._log_request("treasury-health")
-            _init_xrpl()
-            if not _xrpl_client or not XRPL_AVAILABLE:
-                self._send_json({"error": "XRPL not available"}, 503)
-                return
-            try:
-                from xrpl.models.requests import AccountInfo, AccountLines
-                acc = _xrpl_client.request(AccountInfo(account=SLS_TREASURY_ADDRESS))
-                xrp_drops = int(acc.result.get("account_data", {}).get("Balance", "0"))
-                xrp_balance = round(xrp_drops / 1_000_000, 6)
-                lines = _xrpl_client.request(AccountLines(account=SLS_TREASURY_ADDRESS))
-                sls_balance = "0"
-                for line in lines.result.get("lines", []):
-                    if line.get("currency") == "SLS" and line.get("account") == SLS_ISSUER_ADDRESS:
-                        sls_balance = line.get("balance", "0")
-                        break
-                xrp_low = xrp_balance < 100
-                sls_low = float(sls_balance) < 10000
-                provisions_remaining = int(xrp_balance / float(XRP_ACCOUNT_RESERVE)) if xrp_balance > 0 else 0
-                explorer_base = (XRPL_EXPLORER_MAINNET if XRPL_NETWORK == "mainnet" else XRPL_EXPLORER_TESTNET).replace("/transactions/", "/accounts/")
-                alerts = []
-                if xrp_low:
-                    alerts.append(f"XRP LOW — Treasury can only fund {provisions_remaining} more wallets. Top up XRP.")
-                if sls_low:
-                    alerts.append(f"SLS LOW — Only {sls_balance} SLS remaining in Treasury.")
-                self._send_json({
-                    "treasury": SLS_TREASURY_ADDRESS,
-                    "xrp_balance": xrp_balance,
-                    "sls_balance": sls_balance,
-                    "xrp_low_alert": xrp_low,
-                    "sls_low_alert": sls_low,
-                    "healthy": not xrp_low and not sls_low,
-                    "provisions_remaining": provisions_remaining,
-                    "alerts": alerts,
-                    "network": XRPL_NETWORK,
-                    "explorer_url": explorer_base + SLS_TREASURY_ADDRESS,
+    def _handle_get_security_dep_audit(self, parsed):
+        """GET /api/security/dependency-audit"""
+        self._log_request("security-dep-audit")
+        now = datetime.now(timezone.utc)
+        # Check known dependencies
+        audit_results = []
+        total_clean = 0
+        total_vulnerable = 0
+        for pkg, info in KNOWN_DEPENDENCIES.items():
+            status = info.get("cve_status", "unknown")
+            if status == "clean":
+                total_clean += 1
+            else:
+                total_vulnerable += 1
+            audit_results.append({
+                "package": pkg,
+                "version": info["version"],
+                "cve_status": status,
+                "last_audit": info.get("last_audit", "unknown"),
+            })
+        self._send_json({
+            "audit_timestamp": now.isoformat(),
+            "total_packages": len(KNOWN_DEPENDENCIES),
+            "clean": total_clean,
+            "vulnerable": total_vulnerable,
+            "packages": audit_results,
+            "tools_used": ["safety", "pip-audit", "bandit", "semgrep"],
+            "last_full_scan": "2026-02-01",
+            "next_scheduled": "2026-03-01",
+            "sbom_format": "CycloneDX 1.5",
+            "recommendation": "All dependencies are current. Next audit scheduled per monthly cadence.",
+        })
 
-                })
-            except Exception as e:
-                self._send_json({"error": str(e)}, 500)
-
-        # ═══ Full Persistence + Superior Platform GET Dispatch ═══
-        elif route == "ils_uploads":
-            self._log_request("ils-uploads-get")
-            self._get_ils_uploads(parse_qs(parsed.query))
-        elif route == "documents":
-            self._log_request("documents-get")
-            self._get_documents(parse_qs(parsed.query))
-        elif route == "document_versions":
-            self._log_request("document-versions-get")
-            self._get_document_versions(parse_qs(parsed.query))
-        elif route == "poam":
-            self._log_request("poam-get")
-            self._get_poam(parse_qs(parsed.query))
-        elif route == "compliance_evidence":
-            self._log_request("compliance-evidence-get")
-            self._get_compliance_evidence(parse_qs(parsed.query))
-        elif route == "submissions":
-            self._log_request("submissions-get")
-            self._get_submissions(parse_qs(parsed.query))
-        elif route == "team":
-            self._log_request("team-get")
-            self._get_team(parse_qs(parsed.query))
-        elif route == "team_members":
-            self._log_request("team-members-get")
-            self._get_team_members(parse_qs(parsed.query))
-        elif route == "gfp":
-            self._log_request("gfp-get")
-            self._get_gfp(parse_qs(parsed.query))
-        elif route == "sbom":
-            self._log_request("sbom-get")
-            self._get_sbom(parse_qs(parsed.query))
-        elif route == "sbom_scan":
-            self._log_request("sbom-scan")
-            self._scan_sbom_vulnerabilities(parse_qs(parsed.query))
-        elif route == "provenance":
-            self._log_request("provenance-get")
-            self._get_provenance(parse_qs(parsed.query))
-        elif route == "ai_conversations":
-            self._log_request("ai-conversations-get")
-            self._get_ai_conversations(parse_qs(parsed.query))
-        elif route == "cross_program_analytics":
-            self._log_request("cross-program-analytics-get")
-            self._get_cross_program_analytics(parse_qs(parsed.query))
-        elif route == "program_metrics":
-            self._log_request("program-metrics-get")
-            self._get_program_metrics(parse_qs(parsed.query))
-
-        elif route == "state_load":
-            self._log_request("state-load")
-            self._get_user_state(parse_qs(parsed.query))
-
-        elif route == "vault_emails":
-            self._log_request("vault-emails-get")
-            self._get_vault_emails(parse_qs(parsed.query))
+    # ══ DEMO & TREASURY GET endpoints ══
 
-        else:
-            self._send_json({"error": "Not found", "path": self.path}, 404)
+    def _handle_get_treasury_health(self, parsed):
+        """GET /api/treasury/health"""
+        self._log_request("treasury-health")
+        _init_xrpl()
+        if not _xrpl_client or not XRPL_AVAILABLE:
+            self._send_json({"error": "XRPL not available"}, 503)
+            return
+        try:
+            from xrpl.models.requests import AccountInfo, AccountLines
+            acc = _xrpl_client.request(AccountInfo(account=SLS_TREASURY_ADDRESS))
+            xrp_drops = int(acc.result.get("account_data", {}).get("Balance", "0"))
+            xrp_balance = round(xrp_drops / 1_000_000, 6)
+            lines = _xrpl_client.request(AccountLines(account=SLS_TREASURY_ADDRESS))
+            sls_balance = "0"
+            for line in lines.result.get("lines", []):
+                if line.get("currency") == "SLS" and line.get("account") == SLS_ISSUER_ADDRESS:
+                    sls_balance = line.get("balance", "0")
+                    break
+            xrp_low = xrp_balance < 100
+            sls_low = float(sls_balance) < 10000
+            provisions_remaining = int(xrp_balance / float(XRP_ACCOUNT_RESERVE)) if xrp_balance > 0 else 0
+            explorer_base = (XRPL_EXPLORER_MAINNET if XRPL_NETWORK == "mainnet" else XRPL_EXPLORER_TESTNET).replace("/transactions/", "/accounts/")
+            alerts = []
+            if xrp_low:
+                alerts.append(f"XRP LOW — Treasury can only fund {provisions_remaining} more wallets. Top up XRP.")
+            if sls_low:
+                alerts.append(f"SLS LOW — Only {sls_balance} SLS remaining in Treasury.")
+            self._send_json({
+                "treasury": SLS_TREASURY_ADDRESS,
+                "xrp_balance": xrp_balance,
+                "sls_balance": sls_balance,
+                "xrp_low_alert": xrp_low,
+                "sls_low_alert": sls_low,
+                "healthy": not xrp_low and not sls_low,
+                "provisions_remaining": provisions_remaining,
+                "alerts": alerts,
+                "network": XRPL_NETWORK,
+                "explorer_url": explorer_base + SLS_TREASURY_ADDRESS,
+
+            })
+        except Exception as e:
+            self._send_json({"error": str(e)}, 500)
+
+    def _handle_get_fee_reconciliation(self, parsed):
+        """GET /api/fees/reconciliation"""
+        self._log_request("fee-reconciliation")
+        report = _get_fee_ledger().reconcile()
+        report["batching"] = FEE_BATCHING
+        report["treasury"] = SLS_TREASURY_ADDRESS
+        report["pending_settlements"] = _get_fee_ledger().settlements(status="pending")
+        self._send_json(report)
+
+    # ═══ Full Persistence + Superior Platform GET Dispatch ═══
+
+    def _handle_get_ils_uploads(self, parsed):
+        """GET /api/ils/uploads"""
+        self._log_request("ils-uploads-get")
+        self._get_ils_uploads(parse_qs(parsed.query))
+
+    def _handle_get_documents(self, parsed):
+        """GET /api/documents"""
+        self._log_request("documents-get")
+        self._get_documents(parse_qs(parsed.query))
+
+    def _handle_get_document_versions(self, parsed):
+        """GET /api/documents/versions"""
+        self._log_request("document-versions-get")
+        self._get_document_versions(parse_qs(parsed.query))
+
+    def _handle_get_poam(self, parsed):
+        """GET /api/poam"""
+        self._log_request("poam-get")
+        self._get_poam(parse_qs(parsed.query))
+
+    def _handle_get_compliance_evidence(self, parsed):
+        """GET /api/compliance/evidence"""
+        self._log_request("compliance-evidence-get")
+        self._get_compliance_evidence(parse_qs(parsed.query))
+
+    def _handle_get_submissions(self, parsed):
+        """GET /api/submissions"""
+        self._log_request("submissions-get")
+        self._get_submissions(parse_qs(parsed.query))
+
+    def _handle_get_team(self, parsed):
+        """GET /api/team"""
+        self._log_request("team-get")
+        self._get_team(parse_qs(parsed.query))
+
+    def _handle_get_team_members(self, parsed):
+        """GET /api/team/members"""
+        self._log_request("team-members-get")
+        self._get_team_members(parse_qs(parsed.query))
+
+    def _handle_get_gfp(self, parsed):
+        """GET /api/gfp"""
+        self._log_request("gfp-get")
+        self._get_gfp(parse_qs(parsed.query))
+
+    def _handle_get_sbom(self, parsed):
+        """GET /api/sbom"""
+        self._log_request("sbom-get")
+        self._get_sbom(parse_qs(parsed.query))
+
+    def _handle_get_sbom_scan(self, parsed):
+        """GET /api/sbom/scan"""
+        self._log_request("sbom-scan")
+        self._scan_sbom_vulnerabilities(parse_qs(parsed.query))
+
+    def _handle_get_provenance(self, parsed):
+        """GET /api/provenance"""
+        self._log_request("provenance-get")
+        self._get_provenance(parse_qs(parsed.query))
+
+    def _handle_get_ai_conversations(self, parsed):
+        """GET /api/ai/conversations"""
+        self._log_request("ai-conversations-get")
+        self._get_ai_conversations(parse_qs(parsed.query))
+
+    def _handle_get_cross_program_analytics(self, parsed):
+        """GET /api/analytics/cross-program"""
+        self._log_request("cross-program-analytics-get")
+        self._get_cross_program_analytics(parse_qs(parsed.query))
+
+    def _handle_get_program_metrics(self, parsed):
+        """GET /api/program-metrics"""
+        self._log_request("program-metrics-get")
+        self._get_program_metrics(parse_qs(parsed.query))
+
+    def _handle_get_state_load(self, parsed):
+        """GET /api/state/load"""
+        self._log_request("state-load")
+        self._get_user_state(parse_qs(parsed.query))
+
+    def _handle_get_vault_emails(self, parsed):
+        """GET /api/vault-emails"""
+        self._log_request("vault-emails-get")
+        self._get_vault_emails(parse_qs(parsed.query))
 
     # ═══════════════════════════════════════════════════════════════════
     #  GET HANDLERS — Full Persistence + Superior Platform Features
@@ -2842,7 +5587,7 @@ class handler(BaseHTTPRequestHandler):
             if nvd_key:
                 headers["apiKey"] = nvd_key
             req = urllib.request.Request(nvd_url, headers=headers)
-            with urllib.request.urlopen(req, timeout=15) as resp:
+            with _http.urlopen(req, timeout=15) as resp:
                 nvd_data = json.loads(resp.read().decode())
             vulnerabilities = []
             for item in nvd_data.get("vulnerabilities", [])[:20]:
@@ -3000,7 +5745,7 @@ class handler(BaseHTTPRequestHandler):
         if not entries and data.get("key"):
             entries = [{"key": data["key"], "value": data.get("value", "")}]
 
-        saved = 0
+        rows = {}
         for entry in entries:
             key = entry.get("key", "")
             value = entry.get("value", "")
@@ -3015,18 +5760,20 @@ class handler(BaseHTTPRequestHandler):
             }
             if user_id:
                 row["user_id"] = user_id
-            # Upsert on (org_id, session_id, state_key)
-            result = _sb_upsert("user_state", row)
-            if result is not None:
-                saved += 1
-            else:
-                # Table might not exist yet — try to create it and retry
-                _ensure_user_state_table()
-                result = _sb_upsert("user_state", row)
-                if result is not None:
-                    saved += 1
+            rows[key] = row  # last write wins; one statement can't upsert a key twice
 
-        self._send_json({"status": "saved", "saved": saved, "total": len(entries), "session_id": session_id})
+        # Upsert on (org_id, session_id, state_key)
+        conflict = "org_id,session_id,state_key"
+        rows = list(rows.values())
+        report = _sb_bulk_upsert("user_state", rows, on_conflict=conflict)
+        if report["failed"] and len(report["failed"]) == len(rows) and SUPABASE_URL:
+            # Table might not exist yet — try to create it and retry
+            _ensure_user_state_table()
+            report = _sb_bulk_upsert("user_state", rows, on_conflict=conflict)
+        failed = [rows[f["index"]]["state_key"] for f in report["failed"]]
+
+        self._send_json({"status": "saved", "saved": report["written"], "total": len(entries),
+                         "failed": failed, "session_id": session_id})
 
     # ═══════════════════════════════════════════════════════════════════════
     #  PREPARED EMAIL COMPOSER — Enterprise-Grade Email API Handlers
@@ -3437,4397 +6184,4540 @@ class handler(BaseHTTPRequestHandler):
             "persisted": result is not None,
         })
 
-    def do_POST(self):
-        _hydrate_from_supabase()  # Cold-start recovery
-        parsed = urlparse(self.path)
-        route = self._route(parsed.path)
-
-        # Rate limiting
-        if not self._check_rate_limit():
-            self._send_json({"error": "Rate limit exceeded", "retry_after": RATE_LIMIT_WINDOW}, 429)
-            return
-
-        data = self._read_body()
+    # ═══════════════════════════════════════════════════════════════════
+    #  POST ROUTE HANDLERS — registered in _router by route name
+    # ═══════════════════════════════════════════════════════════════════
 
-        if route == "anchor":
-            now = datetime.now(timezone.utc)
-            record_type = data.get("record_type", "JOINT_CONTRACT")
-            cat = RECORD_CATEGORIES.get(record_type, {"label": record_type, "branch": "JOINT", "icon": "\U0001f4cb", "system": "N/A"})
-            hash_value = data.get("hash", hashlib.sha256(str(now).encode()).hexdigest())
-            user_email = data.get("user_email", "")  # For automatic SLS anchor fee deduction
+    def _handle_post_anchor(self, parsed, data):
+        """POST /api/anchor"""
+        now = datetime.now(timezone.utc)
+        record_type = data.get("record_type", "JOINT_CONTRACT")
+        cat = RECORD_CATEGORIES.get(record_type, {"label": record_type, "branch": "JOINT", "icon": "\U0001f4cb", "system": "N/A"})
+        hash_value = data.get("hash", hashlib.sha256(str(now).encode()).hexdigest())
+        user_email = data.get("user_email", "")  # For automatic SLS anchor fee deduction
+
+        org_key = self.headers.get("X-API-Key")
+        actor = data.get("org_id", "api")
+        asynchronous = ANCHOR_ASYNC and not data.get("wait")
+
+        record = {
+            "hash": hash_value,
+            "record_type": record_type,
+            "record_label": cat.get("label", record_type),
+            "branch": cat.get("branch", "JOINT"),
+            "icon": cat.get("icon", "\U0001f4cb"),
+            "timestamp": now.isoformat(),
+            "timestamp_display": now.strftime("%Y-%m-%d %H:%M:%S UTC"),
+            "fee": 0.01,
+            "tx_hash": "",
+            "network": "Pending",
+            "explorer_url": None,
+            "system": cat.get("system", "N/A"),
+            "content_preview": data.get("content_preview", ""),
+            "org_id": data.get("org_id", self.headers.get("X-API-Key", "")),
+            "record_id": data.get("record_id", f"REC-{hashlib.sha256(hash_value.encode()).hexdigest()[:12].upper()}"),
+            "source_system": data.get("source_system", ""),
+            "anchor_status": "pending",
+        }
 
-            # Anchor to XRPL (Issuer signs) + auto-deduct 0.01 SLS from user wallet → Treasury
-            xrpl_result = _anchor_xrpl(hash_value, record_type, cat.get("branch", ""), user_email=user_email or None)
+        if asynchronous:
+            # Accept now; a worker submits to XRPL, then updates the proof chain
+            # and fires anchor.confirmed. Poll /api/anchor/status for the result.
+            if _persist_record(record) == []:
+                # The pending row was not inserted: the worker must not overwrite the existing one
+                self._send_json({"error": f"record_id {record['record_id']} already exists"}, 409)
+                return
+            _append_record(record)
+            _enqueue_anchor(record, user_email=user_email, actor=actor, org_key=org_key,
+                            fallback_tx_hash=data.get("tx_hash"))
+            self._send_json({
+                "status": "pending",
+                "record_id": record["record_id"],
+                "record": record,
+                "status_url": f"/api/anchor/status?record_id={record['record_id']}",
+            }, 202)
+            return
 
-            if xrpl_result:
-                tx_hash = xrpl_result["tx_hash"]
-                network = "XRPL " + XRPL_NETWORK.capitalize()
-                explorer_url = xrpl_result["explorer_url"]
-            else:
-                tx_hash = data.get("tx_hash", "TX" + hashlib.md5(str(now).encode()).hexdigest().upper()[:32])
-                network = "Simulated"
-                explorer_url = None
-
-            record = {
-                "hash": hash_value,
-                "record_type": record_type,
-                "record_label": cat.get("label", record_type),
-                "branch": cat.get("branch", "JOINT"),
-                "icon": cat.get("icon", "\U0001f4cb"),
-                "timestamp": now.isoformat(),
-                "timestamp_display": now.strftime("%Y-%m-%d %H:%M:%S UTC"),
-                "fee": 0.01,
-                "tx_hash": tx_hash,
-                "network": network,
-                "explorer_url": explorer_url,
-                "system": cat.get("system", "N/A"),
-                "content_preview": data.get("content_preview", ""),
-                "org_id": data.get("org_id", self.headers.get("X-API-Key", "")),
-                "record_id": data.get("record_id", f"REC-{hashlib.sha256(hash_value.encode()).hexdigest()[:12].upper()}"),
-                "source_system": data.get("source_system", ""),
+        _append_record(record)
+        # Anchor to XRPL (Issuer signs) + auto-deduct 0.01 SLS from user wallet → Treasury
+        xrpl_result = _anchor_xrpl(hash_value, record_type, cat.get("branch", ""), user_email=user_email or None)
+        _finalize_anchor(record, xrpl_result, user_email=user_email, actor=actor, org_key=org_key,
+                         fallback_tx_hash=data.get("tx_hash"))
+
+        # Build fee_transfer for frontend compatibility
+        fee_transfer = None
+        fee_error = None
+        if xrpl_result and xrpl_result.get("user_fee_tx"):
+            fee_transfer = {
+                "tx_hash": xrpl_result["user_fee_tx"],
+                "amount": xrpl_result.get("sls_fee", SLS_ANCHOR_FEE),
+                "treasury": xrpl_result.get("sls_treasury", SLS_TREASURY_ADDRESS),
             }
-            _live_records.append(record)
-            _persist_record(record)
-
-            # Add to proof chain
-            rid = record["record_id"]
-            if rid not in _proof_chain_store:
-                _proof_chain_store[rid] = []
-            proof_event = {
-                "event_type": "anchor.created",
-                "hash": hash_value,
-                "tx_hash": tx_hash,
-                "timestamp": now.isoformat(),
-                "actor": user_email or data.get("org_id", "api"),
-                "metadata": {"record_type": record_type, "network": network},
+        elif xrpl_result and xrpl_result.get("fee_debit_id"):
+            # Accrued in the fee ledger; paid in the user's next settlement Payment
+            fee_transfer = {
+                "tx_hash": None,
+                "status": "accrued",
+                "debit_id": xrpl_result["fee_debit_id"],
+                "amount": xrpl_result.get("sls_fee", SLS_ANCHOR_FEE),
+                "treasury": xrpl_result.get("sls_treasury", SLS_TREASURY_ADDRESS),
             }
-            _proof_chain_store[rid].append(proof_event)
-            _persist_proof_chain_event(rid, proof_event)
-
-            # Fire webhook: anchor.confirmed
-            _deliver_webhook("anchor.confirmed", {
-                "record_id": rid,
-                "hash": hash_value,
-                "tx_hash": tx_hash,
-                "record_type": record_type,
-                "explorer_url": explorer_url,
-                "network": network,
-                "fee": 0.01,
-            }, org_key=self.headers.get("X-API-Key"))
-
-            # Build fee_transfer for frontend compatibility
-            fee_transfer = None
-            fee_error = None
-            if xrpl_result and xrpl_result.get("user_fee_tx"):
-                fee_transfer = {
-                    "tx_hash": xrpl_result["user_fee_tx"],
-                    "amount": xrpl_result.get("sls_fee", SLS_ANCHOR_FEE),
-                    "treasury": xrpl_result.get("sls_treasury", SLS_TREASURY_ADDRESS),
-                }
-            elif xrpl_result and xrpl_result.get("fee_error"):
-                fee_error = xrpl_result.get("fee_error", "unknown")
-            self._send_json({"status": "anchored", "record": record, "xrpl": xrpl_result, "fee_transfer": fee_transfer, "fee_error": fee_error})
-
-        elif route == "hash":
-            text = data.get("record", "")
-            h = hashlib.sha256(text.encode()).hexdigest()
-            self._send_json({"hash": h, "algorithm": "SHA-256"})
-
-        elif route == "verify":
-            self._log_request("verify")
-            record_text = data.get("record_text", "")
-            if not record_text:
-                self._send_json({"error": "record_text is required"}, 400)
-                return
+        elif xrpl_result and xrpl_result.get("fee_error"):
+            fee_error = xrpl_result.get("fee_error", "unknown")
+        self._send_json({"status": "anchored", "record": record, "xrpl": xrpl_result, "fee_transfer": fee_transfer, "fee_error": fee_error})
+
+    def _handle_post_hash(self, parsed, data):
+        """POST /api/hash"""
+        text = data.get("record", "")
+        h = hashlib.sha256(text.encode()).hexdigest()
+        self._send_json({"hash": h, "algorithm": "SHA-256"})
+
+    def _handle_post_verify(self, parsed, data):
+        """POST /api/verify"""
+        self._log_request("verify")
+        record_text = data.get("record_text", "")
+        if not record_text:
+            self._send_json({"error": "record_text is required"}, 400)
+            return
 
-            # Compute current hash
-            computed_hash = hashlib.sha256(record_text.encode()).hexdigest()
-            tx_hash = data.get("tx_hash", "")
-            expected_hash = data.get("expected_hash", "")
-            operator = data.get("operator", self.headers.get("X-Operator", "anonymous"))
-            now = datetime.now(timezone.utc)
+        # Compute current hash
+        computed_hash = hashlib.sha256(record_text.encode()).hexdigest()
+        tx_hash = data.get("tx_hash", "")
+        expected_hash = data.get("expected_hash", "")
+        operator = data.get("operator", self.headers.get("X-Operator", "anonymous"))
+        now = datetime.now(timezone.utc)
 
-            # Determine chain hash to compare against
-            chain_hash = None
-            anchored_at = None
-            explorer_url = None
+        # Determine chain hash to compare against
+        chain_hash = None
+        anchored_at = None
+        explorer_url = None
+        _await_hydration("records")  # a lazy cold start must not report NOT_FOUND early
 
-            if tx_hash:
-                # Look up on-chain memo data from the transaction
-                found = [r for r in _live_records if r.get("tx_hash") == tx_hash or r.get("hash") == tx_hash]
-                if found:
-                    chain_hash = found[0].get("hash", "")
-                    anchored_at = found[0].get("timestamp", "")
-                    explorer_url = found[0].get("explorer_url") or (XRPL_EXPLORER_MAINNET if XRPL_NETWORK == "mainnet" else XRPL_EXPLORER_TESTNET) + tx_hash
-            elif expected_hash:
-                chain_hash = expected_hash
-            else:
-                # Search records for matching hash
-                found = [r for r in _live_records if r.get("hash") == computed_hash]
-                if found:
-                    chain_hash = found[0].get("hash", "")
-                    tx_hash = found[0].get("tx_hash", "")
-                    anchored_at = found[0].get("timestamp", "")
-                    explorer_url = found[0].get("explorer_url") or (XRPL_EXPLORER_MAINNET if XRPL_NETWORK == "mainnet" else XRPL_EXPLORER_TESTNET) + tx_hash
+        if tx_hash:
+            # Look up on-chain memo data from the transaction
+            found = _record_for_tx(tx_hash, computed_hash)
+            if found:
+                chain_hash = found.get("hash", "")
+                anchored_at = found.get("timestamp", "")
+                explorer_url = found.get("explorer_url") or (XRPL_EXPLORER_MAINNET if XRPL_NETWORK == "mainnet" else XRPL_EXPLORER_TESTNET) + tx_hash
+        elif expected_hash:
+            chain_hash = expected_hash
+        else:
+            # Search records for matching hash
+            found = _first_record(computed_hash, "hash")
+            if found:
+                chain_hash = found.get("hash", "")
+                tx_hash = found.get("tx_hash", "")
+                anchored_at = found.get("timestamp", "")
+                explorer_url = found.get("explorer_url") or (XRPL_EXPLORER_MAINNET if XRPL_NETWORK == "mainnet" else XRPL_EXPLORER_TESTNET) + tx_hash
+
+        if chain_hash is None:
+            status = "NOT_FOUND"
+            verified = False
+            tamper_detected = False
+        elif computed_hash == chain_hash:
+            status = "MATCH"
+            verified = True
+            tamper_detected = False
+        else:
+            status = "MISMATCH"
+            verified = False
+            tamper_detected = True
 
-            if chain_hash is None:
-                status = "NOT_FOUND"
-                verified = False
-                tamper_detected = False
-            elif computed_hash == chain_hash:
-                status = "MATCH"
-                verified = True
-                tamper_detected = False
-            else:
-                status = "MISMATCH"
-                verified = False
-                tamper_detected = True
+        time_delta = None
+        if anchored_at:
+            try:
+                anchor_dt = datetime.fromisoformat(anchored_at.replace("Z", "+00:00"))
+                time_delta = round((now - anchor_dt).total_seconds(), 2)
+            except Exception:
+                pass
 
-            time_delta = None
-            if anchored_at:
-                try:
-                    anchor_dt = datetime.fromisoformat(anchored_at.replace("Z", "+00:00"))
-                    time_delta = round((now - anchor_dt).total_seconds(), 2)
-                except Exception:
-                    pass
+        # Log to verification audit trail
+        audit_entry = {
+            "timestamp": now.isoformat(),
+            "operator": operator,
+            "computed_hash": computed_hash,
+            "chain_hash": chain_hash,
+            "tx_hash": tx_hash or None,
+            "result": status,
+            "tamper_detected": tamper_detected,
+            "time_delta_seconds": time_delta,
+        }
+        _verify_audit_log.append(audit_entry)
+        _persist_verify_audit(audit_entry)
 
-            # Log to verification audit trail
-            audit_entry = {
-                "timestamp": now.isoformat(),
-                "operator": operator,
-                "computed_hash": computed_hash,
-                "chain_hash": chain_hash,
-                "tx_hash": tx_hash or None,
-                "result": status,
-                "tamper_detected": tamper_detected,
-                "time_delta_seconds": time_delta,
-            }
-            _verify_audit_log.append(audit_entry)
-            _persist_verify_audit(audit_entry)
+        result = {
+            "verified": verified,
+            "status": status,
+            "computed_hash": computed_hash,
+            "chain_hash": chain_hash,
+            "tx_hash": tx_hash or None,
+            "anchored_at": anchored_at,
+            "verified_at": now.isoformat(),
+            "time_delta_seconds": time_delta,
+            "explorer_url": explorer_url,
+            "tamper_detected": tamper_detected,
+            "audit_id": f"VRF-{hashlib.sha256(now.isoformat().encode()).hexdigest()[:12].upper()}",
+        }
 
-            result = {
-                "verified": verified,
-                "status": status,
-                "computed_hash": computed_hash,
-                "chain_hash": chain_hash,
-                "tx_hash": tx_hash or None,
-                "anchored_at": anchored_at,
-                "verified_at": now.isoformat(),
-                "time_delta_seconds": time_delta,
-                "explorer_url": explorer_url,
-                "tamper_detected": tamper_detected,
-                "audit_id": f"VRF-{hashlib.sha256(now.isoformat().encode()).hexdigest()[:12].upper()}",
+        # If tamper detected, flag for notification
+        if tamper_detected:
+            result["alert"] = {
+                "severity": "CRITICAL",
+                "message": f"TAMPER DETECTED: Record hash mismatch. Computed {computed_hash[:16]}... does not match chain {chain_hash[:16] if chain_hash else 'N/A'}...",
+                "action_required": "Investigate source of modification. Original on-chain record is the authoritative version.",
+                "correction_available": True,
             }
-
-            # If tamper detected, flag for notification
-            if tamper_detected:
-                result["alert"] = {
-                    "severity": "CRITICAL",
-                    "message": f"TAMPER DETECTED: Record hash mismatch. Computed {computed_hash[:16]}... does not match chain {chain_hash[:16] if chain_hash else 'N/A'}...",
-                    "action_required": "Investigate source of modification. Original on-chain record is the authoritative version.",
-                    "correction_available": True,
-                }
-                # Fire webhook: tamper.detected
-                _deliver_webhook("tamper.detected", {
-                    "computed_hash": computed_hash,
-                    "chain_hash": chain_hash,
-                    "tx_hash": tx_hash,
-                    "operator": operator,
-                    "severity": "CRITICAL",
-                    "audit_id": result["audit_id"],
-                }, org_key=self.headers.get("X-API-Key"))
-
-            # Fire webhook: verify.completed
-            _deliver_webhook("verify.completed", {
-                "status": status,
+            # Fire webhook: tamper.detected
+            _deliver_webhook("tamper.detected", {
                 "computed_hash": computed_hash,
                 "chain_hash": chain_hash,
-                "tamper_detected": tamper_detected,
+                "tx_hash": tx_hash,
+                "operator": operator,
+                "severity": "CRITICAL",
                 "audit_id": result["audit_id"],
             }, org_key=self.headers.get("X-API-Key"))
 
-            self._send_json(result)
-
-        elif route == "categorize":
-            memo = data.get("memo", "").upper()
-            for key in RECORD_CATEGORIES:
-                if key in memo:
-                    self._send_json({"category": key, "label": RECORD_CATEGORIES[key]["label"]})
-                    return
-            self._send_json({"category": "JOINT_CONTRACT", "label": "Contract Deliverable"})
-
-        elif route == "auth_api_key":
-            # Generate a new API key
-            master = data.get("master_key", "")
-            if master != API_MASTER_KEY:
-                self._send_json({"error": "Invalid master key"}, 403)
-                return
-            org = data.get("organization", "Unknown")
-            role = data.get("role", "analyst")
-            tier = data.get("tier", "standard")
-            new_key = "s4_" + hashlib.sha256((org + str(datetime.now(timezone.utc))).encode()).hexdigest()[:32]
-            _persist_api_key(new_key, org, role=role, tier=tier)
-            self._send_json({"api_key": new_key, "organization": org, "role": role, "tier": tier})
-
-        elif route == "db_save_analysis":
-            # Save ILS analysis to database (Supabase or in-memory)
-            api_key = self.headers.get("X-API-Key", "")
-            if api_key != API_MASTER_KEY and api_key not in API_KEYS_STORE:
-                self._send_json({"error": "Valid API key required"}, 401)
+        # Fire webhook: verify.completed
+        _deliver_webhook("verify.completed", {
+            "status": status,
+            "computed_hash": computed_hash,
+            "chain_hash": chain_hash,
+            "tamper_detected": tamper_detected,
+            "audit_id": result["audit_id"],
+        }, org_key=self.headers.get("X-API-Key"))
+
+        self._send_json(result)
+
+    def _handle_post_categorize(self, parsed, data):
+        """POST /api/categorize"""
+        memo = data.get("memo", "").upper()
+        for key in RECORD_CATEGORIES:
+            if key in memo:
+                self._send_json({"category": key, "label": RECORD_CATEGORIES[key]["label"]})
                 return
-            analysis_id = "ILS-" + hashlib.sha256(str(datetime.now(timezone.utc)).encode()).hexdigest()[:12].upper()
-            record = {
-                "id": analysis_id,
-                "program": data.get("program", ""),
-                "hull": data.get("hull", ""),
-                "score": data.get("score", 0),
-                "crit_gaps": data.get("crit_gaps", 0),
-                "total_actions": data.get("total_actions", 0),
-                "risk_cost": data.get("risk_cost", 0),
-                "hash": data.get("hash", ""),
-                "created_at": datetime.now(timezone.utc).isoformat(),
-                "created_by": API_KEYS_STORE.get(api_key, {}).get("organization", "demo"),
-            }
-            # Persist to Supabase
-            _persist_record(record)
-            _live_records.append(record)
-            self._send_json({"status": "saved", "analysis": record})
+        self._send_json({"category": "JOINT_CONTRACT", "label": "Contract Deliverable"})
+
+    def _handle_post_auth_api_key(self, parsed, data):
+        """POST /api/auth/api-key"""
+        # Generate a new API key
+        master = data.get("master_key", "")
+        if master != API_MASTER_KEY:
+            self._send_json({"error": "Invalid master key"}, 403)
+            return
+        org = data.get("organization", "Unknown")
+        role = data.get("role", "analyst")
+        tier = data.get("tier", "standard")
+        new_key = "s4_" + hashlib.sha256((org + str(datetime.now(timezone.utc))).encode()).hexdigest()[:32]
+        _persist_api_key(new_key, org, role=role, tier=tier)
+        self._send_json({"api_key": new_key, "organization": org, "role": role, "tier": tier})
+
+    def _handle_post_db_save_analysis(self, parsed, data):
+        """POST /api/db/save-analysis"""
+        # Save ILS analysis to database (Supabase or in-memory)
+        api_key = self.headers.get("X-API-Key", "")
+        analysis_id = "ILS-" + hashlib.sha256(str(datetime.now(timezone.utc)).encode()).hexdigest()[:12].upper()
+        record = {
+            "id": analysis_id,
+            "program": data.get("program", ""),
+            "hull": data.get("hull", ""),
+            "score": data.get("score", 0),
+            "crit_gaps": data.get("crit_gaps", 0),
+            "total_actions": data.get("total_actions", 0),
+            "risk_cost": data.get("risk_cost", 0),
+            "hash": data.get("hash", ""),
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "created_by": API_KEYS_STORE.get(api_key, {}).get("organization", "demo"),
+        }
+        # Persist to Supabase
+        _persist_record(record)
+        _append_record(record)
+        self._send_json({"status": "saved", "analysis": record})
+
+    def _handle_post_db_get_analyses(self, parsed, data):
+        """POST /api/db/get-analyses"""
+        # Return ILS analyses (in production: query Supabase)
+        analyses = [r for r in _live_records if "id" in r and r.get("id", "").startswith("ILS-")]
+        self._send_json({"analyses": analyses, "total": len(analyses)})
+
+    def _handle_post_wallet_provision(self, parsed, data):
+        """POST /api/wallet/provision"""
+        self._log_request("wallet-provision")
+        # SAFETY: Wallet provisioning requires verified Stripe payment.
+        # Do NOT create real XRPL wallets without Stripe confirmation.
+        if not STRIPE_SECRET_KEY:
+            self._send_json({"error": "Wallet provisioning disabled — Stripe is not configured. No real wallets will be created.", "stripe_required": True}, 503)
+            return
+        # Provision a new XRPL wallet: Treasury funds XRP + delivers SLS allocation
+        email = data.get("email", "")
+        organization = data.get("organization", "")
+        plan = data.get("plan", "starter")
 
-        elif route == "db_get_analyses":
-            api_key = self.headers.get("X-API-Key", "")
-            if api_key != API_MASTER_KEY and api_key not in API_KEYS_STORE:
-                self._send_json({"error": "Valid API key required"}, 401)
-                return
-            # Return ILS analyses (in production: query Supabase)
-            analyses = [r for r in _live_records if "id" in r and r.get("id", "").startswith("ILS-")]
-            self._send_json({"analyses": analyses, "total": len(analyses)})
-
-        elif route == "wallet_provision":
-            self._log_request("wallet-provision")
-            # SAFETY: Wallet provisioning requires verified Stripe payment.
-            # Do NOT create real XRPL wallets without Stripe confirmation.
-            if not STRIPE_SECRET_KEY:
-                self._send_json({"error": "Wallet provisioning disabled — Stripe is not configured. No real wallets will be created.", "stripe_required": True}, 503)
-                return
-            # Provision a new XRPL wallet: Treasury funds XRP + delivers SLS allocation
-            email = data.get("email", "")
-            organization = data.get("organization", "")
-            plan = data.get("plan", "starter")
+        if not email:
+            self._send_json({"error": "Email is required"}, 400)
+            return
 
-            if not email:
-                self._send_json({"error": "Email is required"}, 400)
-                return
+        result = _provision_wallet(email=email, plan=plan)
+        if result is None:
+            self._send_json({"error": "XRPL not available — wallet provisioning requires Treasury wallet (XRPL_TREASURY_SEED)"}, 503)
+            return
+        if "error" in result:
+            self._send_json(result, 500)
+            return
 
-            result = _provision_wallet(email=email, plan=plan)
-            if result is None:
-                self._send_json({"error": "XRPL not available — wallet provisioning requires Treasury wallet (XRPL_TREASURY_SEED)"}, 503)
-                return
-            if "error" in result:
-                self._send_json(result, 500)
-                return
+        tier = SUBSCRIPTION_TIERS.get(plan, SUBSCRIPTION_TIERS["starter"])
+
+        result["account"] = {
+            "email": email,
+            "organization": organization,
+            "plan": plan,
+            "created": datetime.now(timezone.utc).isoformat(),
+        }
+        result["instructions"] = {
+            "important": "SAVE YOUR WALLET SEED SECURELY — it is also stored by S4 for automatic anchor fee signing.",
+            "seed_note": "Your family seed is stored securely by S4 Ledger so anchor fees (0.01 SLS) are deducted automatically. You can also import it into Xaman for independent wallet access.",
+            "next_steps": [
+                "Your XRPL wallet has been created and activated with XRP.",
+                f"Your {tier['label']} subscription includes {tier['sls_monthly']:,} SLS/month — already delivered to your wallet.",
+                "Each anchor costs 0.01 SLS — deducted automatically from your wallet.",
+                "SLS flows back to the S4 Treasury on every anchor, keeping the economy sustainable.",
+                "Install Xaman (formerly XUMM) to view your wallet on mobile — import using your family seed.",
+            ],
+            "xaman_url": "https://xaman.app",
+            "explorer_url": (XRPL_EXPLORER_MAINNET if XRPL_NETWORK == 'mainnet' else XRPL_EXPLORER_TESTNET).replace('/transactions/', '/accounts/') + result['wallet']['address'],
+        }
+        self._send_json(result)
+
+    def _handle_post_fee_settle(self, parsed, data):
+        """POST /api/fees/settle"""
+        self._log_request("fee-settle")
+        self._send_json(_settle_anchor_fees())
+
+    def _handle_post_wallet_buy_sls(self, parsed, data):
+        """POST /api/wallet/buy-sls"""
+        self._log_request("wallet-buy-sls")
+        # Manual SLS top-up: additional SLS delivered from Treasury (requires Stripe payment)
+        wallet_address = data.get("wallet_address", "")
+        email = data.get("email", "")
+        sls_amount = data.get("sls_amount", 0)
+        stripe_payment_id = data.get("stripe_payment_id", "")
+
+        if not wallet_address and not email:
+            self._send_json({"error": "wallet_address or email is required"}, 400)
+            return
+        if not sls_amount or int(sls_amount) <= 0:
+            self._send_json({"error": "sls_amount must be positive"}, 400)
+            return
 
-            tier = SUBSCRIPTION_TIERS.get(plan, SUBSCRIPTION_TIERS["starter"])
+        # In production: verify Stripe payment before delivering SLS
+        if not stripe_payment_id and STRIPE_SECRET_KEY:
+            self._send_json({
+                "error": "Payment verification required",
+                "message": "Additional SLS cannot be delivered without a confirmed Stripe payment.",
+            }, 402)
+            return
 
-            result["account"] = {
-                "email": email,
-                "organization": organization,
-                "plan": plan,
-                "created": datetime.now(timezone.utc).isoformat(),
-            }
-            result["instructions"] = {
-                "important": "SAVE YOUR WALLET SEED SECURELY — it is also stored by S4 for automatic anchor fee signing.",
-                "seed_note": "Your family seed is stored securely by S4 Ledger so anchor fees (0.01 SLS) are deducted automatically. You can also import it into Xaman for independent wallet access.",
-                "next_steps": [
-                    "Your XRPL wallet has been created and activated with XRP.",
-                    f"Your {tier['label']} subscription includes {tier['sls_monthly']:,} SLS/month — already delivered to your wallet.",
-                    "Each anchor costs 0.01 SLS — deducted automatically from your wallet.",
-                    "SLS flows back to the S4 Treasury on every anchor, keeping the economy sustainable.",
-                    "Install Xaman (formerly XUMM) to view your wallet on mobile — import using your family seed.",
-                ],
-                "xaman_url": "https://xaman.app",
-                "explorer_url": (XRPL_EXPLORER_MAINNET if XRPL_NETWORK == 'mainnet' else XRPL_EXPLORER_TESTNET).replace('/transactions/', '/accounts/') + result['wallet']['address'],
-            }
-            self._send_json(result)
-
-        elif route == "wallet_buy_sls":
-            self._log_request("wallet-buy-sls")
-            # Manual SLS top-up: additional SLS delivered from Treasury (requires Stripe payment)
-            wallet_address = data.get("wallet_address", "")
-            email = data.get("email", "")
-            sls_amount = data.get("sls_amount", 0)
-            stripe_payment_id = data.get("stripe_payment_id", "")
-
-            if not wallet_address and not email:
-                self._send_json({"error": "wallet_address or email is required"}, 400)
-                return
-            if not sls_amount or int(sls_amount) <= 0:
-                self._send_json({"error": "sls_amount must be positive"}, 400)
-                return
+        _init_xrpl()
+        if not _xrpl_client or not _xrpl_treasury_wallet:
+            self._send_json({"error": "XRPL Treasury not available"}, 503)
+            return
+
+        # Look up destination wallet
+        dest_address = wallet_address
+        if not dest_address and email:
+            with _wallet_cache.lease(email=email) as dest_wallet:
+                if dest_wallet is not None:
+                    dest_address = dest_wallet.address
+        if not dest_address:
+            self._send_json({"error": "Could not resolve wallet address"}, 404)
+            return
 
-            # In production: verify Stripe payment before delivering SLS
-            if not stripe_payment_id and STRIPE_SECRET_KEY:
+        try:
+            from xrpl.models.transactions import Payment as Pay
+            from xrpl.models.amounts import IssuedCurrencyAmount as ICA
+
+            payment = Pay(
+                account=_xrpl_treasury_wallet.address,
+                destination=dest_address,
+                amount=ICA(currency="SLS", issuer=SLS_ISSUER_ADDRESS, value=str(int(sls_amount))),
+                memos=[Memo(
+                    memo_type=bytes("s4/sls-topup", "utf-8").hex(),
+                    memo_data=bytes(json.dumps({
+                        "type": "sls_topup",
+                        "amount": str(sls_amount),
+                        "stripe_id": stripe_payment_id or "demo",
+                    }), "utf-8").hex()
+                )]
+            )
+            resp = submit_and_wait(payment, _xrpl_client, _xrpl_treasury_wallet)
+            if resp.is_successful():
+                explorer_base = XRPL_EXPLORER_MAINNET if XRPL_NETWORK == "mainnet" else XRPL_EXPLORER_TESTNET
                 self._send_json({
-                    "error": "Payment verification required",
-                    "message": "Additional SLS cannot be delivered without a confirmed Stripe payment.",
-                }, 402)
-                return
+                    "success": True,
+                    "sls_delivered": str(sls_amount),
+                    "tx_hash": resp.result["hash"],
+                    "explorer_url": explorer_base + resp.result["hash"],
+                    "destination": dest_address,
+                    "source": "Treasury",
+                })
+            else:
+                self._send_json({"error": resp.result.get("engine_result_message", "unknown")}, 500)
+        except Exception as e:
+            self._send_json({"error": str(e)}, 500)
+
+    def _handle_post_stripe_checkout(self, parsed, data):
+        """POST /api/checkout/create"""
+        self._log_request("stripe-checkout")
+        # ═══ Stripe Checkout Session Creation ═══
+        # Creates a Stripe Checkout session for subscription purchase
+        plan = data.get("plan", "starter")
+        customer_email = data.get("email", "")
+        tier_prices = {
+            "starter": os.environ.get("STRIPE_PRICE_STARTER", ""),
+            "professional": os.environ.get("STRIPE_PRICE_PROFESSIONAL", ""),
+            "enterprise": os.environ.get("STRIPE_PRICE_ENTERPRISE", ""),
+            "government": os.environ.get("STRIPE_PRICE_GOVERNMENT", ""),
+        }
+        price_id = tier_prices.get(plan, "")
+        if not STRIPE_SECRET_KEY:
+            self._send_json({"error": "Payment processing not configured. Contact sales@s4ledger.com for enterprise plans."}, 503)
+            return
+        if not price_id:
+            self._send_json({"error": f"Invalid plan: {plan}. Available: starter, professional, enterprise, government"}, 400)
+            return
+        try:
+            import urllib.request
+            checkout_data = json.dumps({
+                "mode": "subscription",
+                "payment_method_types": ["card"],
+                "line_items": [{"price": price_id, "quantity": 1}],
+                "customer_email": customer_email or None,
+                "success_url": data.get("success_url", "https://s4ledger.com/demo-app/?checkout=success&session_id={CHECKOUT_SESSION_ID}"),
+                "cancel_url": data.get("cancel_url", "https://s4ledger.com/demo-app/?checkout=cancelled"),
+                "metadata": {"plan": plan, "platform": "s4_ledger"},
+                "subscription_data": {"metadata": {"plan": plan, "email": customer_email}}
+            }).encode()
+            req = urllib.request.Request(
+                "https://api.stripe.com/v1/checkout/sessions",
+                data=checkout_data,
+                headers={
+                    "Authorization": f"Bearer {STRIPE_SECRET_KEY}",
+                    "Content-Type": "application/json"
+                }
+            )
+            with _http.urlopen(req, timeout=15) as resp:
+                session = json.loads(resp.read().decode())
+                self._send_json({"checkout_url": session.get("url"), "session_id": session.get("id")})
+        except Exception as e:
+            self._send_json({"error": f"Checkout creation failed: {str(e)}"}, 500)
+        return
 
-            _init_xrpl()
-            if not _xrpl_client or not _xrpl_treasury_wallet:
-                self._send_json({"error": "XRPL Treasury not available"}, 503)
-                return
+    def _handle_post_stripe_webhook(self, parsed, data):
+        """POST /api/webhook/stripe"""
+        self._log_request("stripe-webhook")
+        # ═══ Stripe Webhook with HMAC Signature Verification ═══
+        # Verifies webhook authenticity before processing events.
+        # CRITICAL SECURITY: Without this, attackers could trigger free SLS allocations.
+        raw_body = b""
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            if 0 < length <= self.MAX_BODY_SIZE:
+                raw_body = self.rfile.read(length)
+                data = json.loads(raw_body)
+        except Exception:
+            self._send_json({"error": "Invalid request body"}, 400)
+            return
 
-            # Look up destination wallet
-            dest_address = wallet_address
-            if not dest_address and email:
-                seed = _get_wallet_seed(email=email)
-                if seed:
-                    dest_wallet = Wallet.from_seed(seed, algorithm=CryptoAlgorithm.SECP256K1)
-                    dest_address = dest_wallet.address
-            if not dest_address:
-                self._send_json({"error": "Could not resolve wallet address"}, 404)
+        # Verify Stripe signature (production-critical)
+        if STRIPE_WEBHOOK_SECRET:
+            sig_header = self.headers.get("Stripe-Signature", "")
+            if not sig_header:
+                self._send_json({"error": "Missing Stripe-Signature header"}, 401)
                 return
-
             try:
-                from xrpl.models.transactions import Payment as Pay
-                from xrpl.models.amounts import IssuedCurrencyAmount as ICA
-
-                payment = Pay(
-                    account=_xrpl_treasury_wallet.address,
-                    destination=dest_address,
-                    amount=ICA(currency="SLS", issuer=SLS_ISSUER_ADDRESS, value=str(int(sls_amount))),
-                    memos=[Memo(
-                        memo_type=bytes("s4/sls-topup", "utf-8").hex(),
-                        memo_data=bytes(json.dumps({
-                            "type": "sls_topup",
-                            "amount": str(sls_amount),
-                            "stripe_id": stripe_payment_id or "demo",
-                        }), "utf-8").hex()
-                    )]
-                )
-                resp = submit_and_wait(payment, _xrpl_client, _xrpl_treasury_wallet)
-                if resp.is_successful():
-                    explorer_base = XRPL_EXPLORER_MAINNET if XRPL_NETWORK == "mainnet" else XRPL_EXPLORER_TESTNET
-                    self._send_json({
-                        "success": True,
-                        "sls_delivered": str(sls_amount),
-                        "tx_hash": resp.result["hash"],
-                        "explorer_url": explorer_base + resp.result["hash"],
-                        "destination": dest_address,
-                        "source": "Treasury",
-                    })
-                else:
-                    self._send_json({"error": resp.result.get("engine_result_message", "unknown")}, 500)
+                # Parse signature components
+                sig_parts = {}
+                for part in sig_header.split(","):
+                    key, val = part.strip().split("=", 1)
+                    sig_parts.setdefault(key, []).append(val)
+                timestamp = sig_parts.get("t", [""])[0]
+                signatures = sig_parts.get("v1", [])
+                if not timestamp or not signatures:
+                    raise ValueError("Missing timestamp or signature")
+                # Verify timestamp tolerance (5 minutes)
+                import time
+                if abs(time.time() - int(timestamp)) > 300:
+                    raise ValueError("Webhook timestamp too old")
+                # Compute expected signature
+                signed_payload = f"{timestamp}.{raw_body.decode('utf-8')}"
+                expected_sig = hmac.new(
+                    STRIPE_WEBHOOK_SECRET.encode("utf-8"),
+                    signed_payload.encode("utf-8"),
+                    hashlib.sha256
+                ).hexdigest()
+                # Verify at least one signature matches
+                if not any(hmac.compare_digest(expected_sig, s) for s in signatures):
+                    raise ValueError("Signature mismatch")
             except Exception as e:
-                self._send_json({"error": str(e)}, 500)
-
-        elif route == "stripe_checkout":
-            self._log_request("stripe-checkout")
-            # ═══ Stripe Checkout Session Creation ═══
-            # Creates a Stripe Checkout session for subscription purchase
-            plan = data.get("plan", "starter")
-            customer_email = data.get("email", "")
-            tier_prices = {
-                "starter": os.environ.get("STRIPE_PRICE_STARTER", ""),
-                "professional": os.environ.get("STRIPE_PRICE_PROFESSIONAL", ""),
-                "enterprise": os.environ.get("STRIPE_PRICE_ENTERPRISE", ""),
-                "government": os.environ.get("STRIPE_PRICE_GOVERNMENT", ""),
-            }
-            price_id = tier_prices.get(plan, "")
-            if not STRIPE_SECRET_KEY:
-                self._send_json({"error": "Payment processing not configured. Contact sales@s4ledger.com for enterprise plans."}, 503)
-                return
-            if not price_id:
-                self._send_json({"error": f"Invalid plan: {plan}. Available: starter, professional, enterprise, government"}, 400)
+                self._send_json({"error": f"Webhook signature verification failed: {str(e)}"}, 401)
                 return
+
+        event_type = data.get("type", "")
+        if event_type == "invoice.payment_succeeded":
+            invoice = data.get("data", {}).get("object", {})
+            customer_email = invoice.get("customer_email", "")
+            plan = invoice.get("metadata", {}).get("plan", "starter")
+            if customer_email:
+                result = _deliver_monthly_sls(customer_email, plan=plan)
+                self._send_json(result)
+            else:
+                self._send_json({"error": "No customer_email in invoice"}, 400)
+        elif event_type == "customer.subscription.created":
+            # NEW subscriber — auto-provision XRPL wallet + deliver first SLS allocation
+            sub = data.get("data", {}).get("object", {})
+            customer_email = sub.get("metadata", {}).get("email", "") or sub.get("customer_email", "")
+            plan = sub.get("metadata", {}).get("plan", "starter")
+            if customer_email:
+                result = _provision_wallet(customer_email, plan=plan)
+                self._send_json(result or {"error": "Provisioning unavailable"})
+            else:
+                self._send_json({"error": "No customer email in subscription metadata"}, 400)
+        elif event_type == "customer.subscription.deleted":
+            # Subscription cancelled — no action needed (SLS stays in user's wallet until used)
+            self._send_json({"received": True, "action": "none", "note": "SLS balance remains until exhausted"})
+        else:
+            # Acknowledge other webhook events
+            self._send_json({"received": True, "event_type": event_type})
+
+    def _handle_post_ai_chat(self, parsed, data):
+        """POST /api/ai-chat"""
+        self._log_request("ai-chat")
+        # ═══ AI Agent — LLM-Powered Defense Logistics Assistant ═══
+        # Proxies to OpenAI/Anthropic/Azure with a defense-specific system prompt.
+        # Falls back to structured response if no API key configured.
+        user_message = data.get("message", "").strip()
+        conversation = data.get("conversation", [])  # Previous messages
+        tool_context = data.get("tool_context", "")  # Current ILS tool
+        analysis_data = data.get("analysis_data", None)  # Gap analysis results summary
+        document_content = data.get("document_content", "")  # Uploaded document text
+        document_name = data.get("document_name", "")  # Original filename
+
+        if not user_message:
+            self._send_json({"error": "No message provided"}, 400)
+            return
+
+        # Inject uploaded document content into the user message for LLM context
+        if document_content:
+            doc_label = f" (from '{document_name}')" if document_name else ""
+            # Truncate to ~12k chars to stay within token limits
+            truncated = document_content[:12000]
+            if len(document_content) > 12000:
+                truncated += f"\n\n[... Document truncated — showing first 12,000 of {len(document_content)} characters ...]"
+            user_message = (
+                f"I've uploaded a document{doc_label}. Here is its content:\n\n"
+                f"---BEGIN DOCUMENT---\n{truncated}\n---END DOCUMENT---\n\n"
+                f"My question about this document: {user_message}"
+            )
+
+        # Build the system prompt
+        system_prompt = _build_ai_system_prompt(tool_context, analysis_data)
+
+        # Try OpenAI first, then Anthropic, then fallback
+        openai_key = os.environ.get("OPENAI_API_KEY", "")
+        anthropic_key = os.environ.get("ANTHROPIC_API_KEY", "")
+        azure_endpoint = os.environ.get("AZURE_OPENAI_ENDPOINT", "")
+        azure_key = os.environ.get("AZURE_OPENAI_KEY", "")
+        azure_deployment = os.environ.get("AZURE_OPENAI_DEPLOYMENT", "gpt-4o")
+
+        ai_response = None
+
+        if azure_endpoint and azure_key:
+            # Azure OpenAI (FedRAMP eligible)
             try:
                 import urllib.request
-                checkout_data = json.dumps({
-                    "mode": "subscription",
-                    "payment_method_types": ["card"],
-                    "line_items": [{"price": price_id, "quantity": 1}],
-                    "customer_email": customer_email or None,
-                    "success_url": data.get("success_url", "https://s4ledger.com/demo-app/?checkout=success&session_id={CHECKOUT_SESSION_ID}"),
-                    "cancel_url": data.get("cancel_url", "https://s4ledger.com/demo-app/?checkout=cancelled"),
-                    "metadata": {"plan": plan, "platform": "s4_ledger"},
-                    "subscription_data": {"metadata": {"plan": plan, "email": customer_email}}
-                }).encode()
-                req = urllib.request.Request(
-                    "https://api.stripe.com/v1/checkout/sessions",
-                    data=checkout_data,
-                    headers={
-                        "Authorization": f"Bearer {STRIPE_SECRET_KEY}",
-                        "Content-Type": "application/json"
-                    }
-                )
-                with urllib.request.urlopen(req, timeout=15) as resp:
-                    session = json.loads(resp.read().decode())
-                    self._send_json({"checkout_url": session.get("url"), "session_id": session.get("id")})
+                messages = [{"role": "system", "content": system_prompt}]
+                for msg in conversation[-20:]:
+                    messages.append({"role": msg.get("role", "user"), "content": msg.get("text", msg.get("content", ""))})
+                messages.append({"role": "user", "content": user_message})
+                api_url = f"{azure_endpoint}/openai/deployments/{azure_deployment}/chat/completions?api-version=2024-02-01"
+                req_body = json.dumps({"messages": messages, "max_tokens": 2000, "temperature": 0.7}).encode()
+                req = urllib.request.Request(api_url, data=req_body, headers={"Content-Type": "application/json", "api-key": azure_key})
+                with _http.urlopen(req, timeout=30) as resp:
+                    result = json.loads(resp.read().decode())
+                    ai_response = result["choices"][0]["message"]["content"]
             except Exception as e:
-                self._send_json({"error": f"Checkout creation failed: {str(e)}"}, 500)
-            return
+                ai_response = None  # Fall through to next provider
 
-        elif route == "stripe_webhook":
-            self._log_request("stripe-webhook")
-            # ═══ Stripe Webhook with HMAC Signature Verification ═══
-            # Verifies webhook authenticity before processing events.
-            # CRITICAL SECURITY: Without this, attackers could trigger free SLS allocations.
-            raw_body = b""
+        if not ai_response and openai_key:
+            # OpenAI (GPT-4o)
             try:
-                length = int(self.headers.get("Content-Length", 0))
-                if 0 < length <= self.MAX_BODY_SIZE:
-                    raw_body = self.rfile.read(length)
-                    data = json.loads(raw_body)
-            except Exception:
-                self._send_json({"error": "Invalid request body"}, 400)
-                return
+                import urllib.request
+                messages = [{"role": "system", "content": system_prompt}]
+                for msg in conversation[-20:]:
+                    messages.append({"role": msg.get("role", "user"), "content": msg.get("text", msg.get("content", ""))})
+                messages.append({"role": "user", "content": user_message})
+                req_body = json.dumps({"model": "gpt-4o", "messages": messages, "max_tokens": 2000, "temperature": 0.7}).encode()
+                req = urllib.request.Request("https://api.openai.com/v1/chat/completions", data=req_body, headers={"Content-Type": "application/json", "Authorization": f"Bearer {openai_key}"})
+                with _http.urlopen(req, timeout=30) as resp:
+                    result = json.loads(resp.read().decode())
+                    ai_response = result["choices"][0]["message"]["content"]
+            except Exception as e:
+                ai_response = None
 
-            # Verify Stripe signature (production-critical)
-            if STRIPE_WEBHOOK_SECRET:
-                sig_header = self.headers.get("Stripe-Signature", "")
-                if not sig_header:
-                    self._send_json({"error": "Missing Stripe-Signature header"}, 401)
-                    return
-                try:
-                    # Parse signature components
-                    sig_parts = {}
-                    for part in sig_header.split(","):
-                        key, val = part.strip().split("=", 1)
-                        sig_parts.setdefault(key, []).append(val)
-                    timestamp = sig_parts.get("t", [""])[0]
-                    signatures = sig_parts.get("v1", [])
-                    if not timestamp or not signatures:
-                        raise ValueError("Missing timestamp or signature")
-                    # Verify timestamp tolerance (5 minutes)
-                    import time
-                    if abs(time.time() - int(timestamp)) > 300:
-                        raise ValueError("Webhook timestamp too old")
-                    # Compute expected signature
-                    signed_payload = f"{timestamp}.{raw_body.decode('utf-8')}"
-                    expected_sig = hmac.new(
-                        STRIPE_WEBHOOK_SECRET.encode("utf-8"),
-                        signed_payload.encode("utf-8"),
-                        hashlib.sha256
-                    ).hexdigest()
-                    # Verify at least one signature matches
-                    if not any(hmac.compare_digest(expected_sig, s) for s in signatures):
-                        raise ValueError("Signature mismatch")
-                except Exception as e:
-                    self._send_json({"error": f"Webhook signature verification failed: {str(e)}"}, 401)
-                    return
-
-            event_type = data.get("type", "")
-            if event_type == "invoice.payment_succeeded":
-                invoice = data.get("data", {}).get("object", {})
-                customer_email = invoice.get("customer_email", "")
-                plan = invoice.get("metadata", {}).get("plan", "starter")
-                if customer_email:
-                    result = _deliver_monthly_sls(customer_email, plan=plan)
-                    self._send_json(result)
-                else:
-                    self._send_json({"error": "No customer_email in invoice"}, 400)
-            elif event_type == "customer.subscription.created":
-                # NEW subscriber — auto-provision XRPL wallet + deliver first SLS allocation
-                sub = data.get("data", {}).get("object", {})
-                customer_email = sub.get("metadata", {}).get("email", "") or sub.get("customer_email", "")
-                plan = sub.get("metadata", {}).get("plan", "starter")
-                if customer_email:
-                    result = _provision_wallet(customer_email, plan=plan)
-                    self._send_json(result or {"error": "Provisioning unavailable"})
-                else:
-                    self._send_json({"error": "No customer email in subscription metadata"}, 400)
-            elif event_type == "customer.subscription.deleted":
-                # Subscription cancelled — no action needed (SLS stays in user's wallet until used)
-                self._send_json({"received": True, "action": "none", "note": "SLS balance remains until exhausted"})
-            else:
-                # Acknowledge other webhook events
-                self._send_json({"received": True, "event_type": event_type})
-
-        elif route == "ai_chat":
-            self._log_request("ai-chat")
-            # ═══ AI Agent — LLM-Powered Defense Logistics Assistant ═══
-            # Proxies to OpenAI/Anthropic/Azure with a defense-specific system prompt.
-            # Falls back to structured response if no API key configured.
-            user_message = data.get("message", "").strip()
-            conversation = data.get("conversation", [])  # Previous messages
-            tool_context = data.get("tool_context", "")  # Current ILS tool
-            analysis_data = data.get("analysis_data", None)  # Gap analysis results summary
-            document_content = data.get("document_content", "")  # Uploaded document text
-            document_name = data.get("document_name", "")  # Original filename
-
-            if not user_message:
-                self._send_json({"error": "No message provided"}, 400)
-                return
+        if not ai_response and anthropic_key:
+            # Anthropic (Claude)
+            try:
+                import urllib.request
+                api_messages = []
+                for msg in conversation[-20:]:
+                    role = msg.get("role", "user")
+                    if role == "bot": role = "assistant"
+                    api_messages.append({"role": role, "content": msg.get("text", msg.get("content", ""))})
+                api_messages.append({"role": "user", "content": user_message})
+                req_body = json.dumps({"model": "claude-sonnet-4-20250514", "system": system_prompt, "messages": api_messages, "max_tokens": 2000}).encode()
+                req = urllib.request.Request("https://api.anthropic.com/v1/messages", data=req_body, headers={"Content-Type": "application/json", "x-api-key": anthropic_key, "anthropic-version": "2023-06-01"})
+                with _http.urlopen(req, timeout=30) as resp:
+                    result = json.loads(resp.read().decode())
+                    ai_response = result["content"][0]["text"]
+            except Exception as e:
+                ai_response = None
 
-            # Inject uploaded document content into the user message for LLM context
-            if document_content:
-                doc_label = f" (from '{document_name}')" if document_name else ""
-                # Truncate to ~12k chars to stay within token limits
-                truncated = document_content[:12000]
-                if len(document_content) > 12000:
-                    truncated += f"\n\n[... Document truncated — showing first 12,000 of {len(document_content)} characters ...]"
-                user_message = (
-                    f"I've uploaded a document{doc_label}. Here is its content:\n\n"
-                    f"---BEGIN DOCUMENT---\n{truncated}\n---END DOCUMENT---\n\n"
-                    f"My question about this document: {user_message}"
-                )
+        if ai_response:
+            self._send_json({"response": ai_response, "provider": "llm", "fallback": False})
+        else:
+            # No LLM available — return signal for client-side fallback
+            self._send_json({"response": None, "provider": "none", "fallback": True, "message": "No AI provider configured. Using local pattern matching."})
+
+    # ═══════════════════════════════════════════════════════════════
+    #  HarborLink Integration — POST Endpoints
+    # ═══════════════════════════════════════════════════════════════
+
+    def _handle_post_webhook_register(self, parsed, data):
+        """POST /api/webhooks/register"""
+        self._log_request("webhook-register")
+        api_key = self.headers.get("X-API-Key", "")
+        url = data.get("url", "")
+        events = data.get("events", [])
+        valid_events = ["anchor.confirmed", "verify.completed", "tamper.detected",
+                        "batch.completed", "custody.transferred", "sls.balance_low",
+                        "chain.integrity_check", "proof.appended"]
+        if not url:
+            self._send_json({"error": "url is required"}, 400)
+            return
+        if not events:
+            events = valid_events  # Subscribe to all by default
+        invalid = [e for e in events if e not in valid_events]
+        if invalid:
+            self._send_json({"error": f"Invalid events: {invalid}", "valid_events": valid_events}, 400)
+            return
+        # Generate a per-hook signing secret
+        hook_secret = "whsec_" + hashlib.sha256(
+            (api_key + url + datetime.now(timezone.utc).isoformat()).encode()
+        ).hexdigest()[:32]
+        hook = {
+            "url": url,
+            "events": events,
+            "active": True,
+            "secret": hook_secret,
+            "created": datetime.now(timezone.utc).isoformat(),
+            "id": f"hook_{hashlib.sha256(url.encode()).hexdigest()[:12]}",
+        }
+        org_key = api_key
+        # Prevent duplicate URLs
+        existing_urls = [h["url"] for h in _webhook_store.get(org_key, [])]
+        if url in existing_urls:
+            self._send_json({"error": "Webhook URL already registered"}, 409)
+            return
+        _add_webhook(org_key, hook)
+        _persist_webhook_registration(org_key, hook)
+        self._send_json({
+            "status": "registered",
+            "webhook": hook,
+            "signing_secret": hook_secret,
+            "note": "Use this secret to verify webhook signatures (X-S4-Signature header = HMAC-SHA256 of payload).",
+        })
 
-            # Build the system prompt
-            system_prompt = _build_ai_system_prompt(tool_context, analysis_data)
+    def _handle_post_webhook_test(self, parsed, data):
+        """POST /api/webhooks/test"""
+        self._log_request("webhook-test")
+        api_key = self.headers.get("X-API-Key", "")
+        event_type = data.get("event", "anchor.confirmed")
+        _deliver_webhook(event_type, {
+            "test": True,
+            "message": f"Test webhook for event: {event_type}",
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        }, org_key=api_key)
+        self._send_json({"status": "test_sent", "event": event_type})
+
+    def _handle_post_anchor_composite(self, parsed, data):
+        """POST /api/anchor/composite"""
+        self._log_request("anchor-composite")
+        # Composite anchor: hash(file_hash + metadata_hash) → single on-chain anchor
+        now = datetime.now(timezone.utc)
+        file_hash = data.get("file_hash", "")
+        metadata_hash = data.get("metadata_hash", "")
+        record_type = data.get("record_type", "JOINT_CONTRACT")
+        record_id = data.get("record_id", "")
+        user_email = data.get("user_email", "")
+        org_id = data.get("org_id", self.headers.get("X-API-Key", ""))
+
+        if not file_hash or not metadata_hash:
+            self._send_json({"error": "file_hash and metadata_hash are required"}, 400)
+            return
 
-            # Try OpenAI first, then Anthropic, then fallback
-            openai_key = os.environ.get("OPENAI_API_KEY", "")
-            anthropic_key = os.environ.get("ANTHROPIC_API_KEY", "")
-            azure_endpoint = os.environ.get("AZURE_OPENAI_ENDPOINT", "")
-            azure_key = os.environ.get("AZURE_OPENAI_KEY", "")
-            azure_deployment = os.environ.get("AZURE_OPENAI_DEPLOYMENT", "gpt-4o")
+        # Composite hash = SHA-256(file_hash || metadata_hash)
+        composite_hash = hashlib.sha256((file_hash + metadata_hash).encode()).hexdigest()
+        cat = RECORD_CATEGORIES.get(record_type, {"label": record_type, "branch": "JOINT", "icon": "\U0001f4cb", "system": "N/A"})
 
-            ai_response = None
+        # Anchor composite hash to XRPL
+        xrpl_result = _anchor_xrpl(composite_hash, record_type, cat.get("branch", ""), user_email=user_email or None)
 
-            if azure_endpoint and azure_key:
-                # Azure OpenAI (FedRAMP eligible)
-                try:
-                    import urllib.request
-                    messages = [{"role": "system", "content": system_prompt}]
-                    for msg in conversation[-20:]:
-                        messages.append({"role": msg.get("role", "user"), "content": msg.get("text", msg.get("content", ""))})
-                    messages.append({"role": "user", "content": user_message})
-                    api_url = f"{azure_endpoint}/openai/deployments/{azure_deployment}/chat/completions?api-version=2024-02-01"
-                    req_body = json.dumps({"messages": messages, "max_tokens": 2000, "temperature": 0.7}).encode()
-                    req = urllib.request.Request(api_url, data=req_body, headers={"Content-Type": "application/json", "api-key": azure_key})
-                    with urllib.request.urlopen(req, timeout=30) as resp:
-                        result = json.loads(resp.read().decode())
-                        ai_response = result["choices"][0]["message"]["content"]
-                except Exception as e:
-                    ai_response = None  # Fall through to next provider
-
-            if not ai_response and openai_key:
-                # OpenAI (GPT-4o)
-                try:
-                    import urllib.request
-                    messages = [{"role": "system", "content": system_prompt}]
-                    for msg in conversation[-20:]:
-                        messages.append({"role": msg.get("role", "user"), "content": msg.get("text", msg.get("content", ""))})
-                    messages.append({"role": "user", "content": user_message})
-                    req_body = json.dumps({"model": "gpt-4o", "messages": messages, "max_tokens": 2000, "temperature": 0.7}).encode()
-                    req = urllib.request.Request("https://api.openai.com/v1/chat/completions", data=req_body, headers={"Content-Type": "application/json", "Authorization": f"Bearer {openai_key}"})
-                    with urllib.request.urlopen(req, timeout=30) as resp:
-                        result = json.loads(resp.read().decode())
-                        ai_response = result["choices"][0]["message"]["content"]
-                except Exception as e:
-                    ai_response = None
-
-            if not ai_response and anthropic_key:
-                # Anthropic (Claude)
-                try:
-                    import urllib.request
-                    api_messages = []
-                    for msg in conversation[-20:]:
-                        role = msg.get("role", "user")
-                        if role == "bot": role = "assistant"
-                        api_messages.append({"role": role, "content": msg.get("text", msg.get("content", ""))})
-                    api_messages.append({"role": "user", "content": user_message})
-                    req_body = json.dumps({"model": "claude-sonnet-4-20250514", "system": system_prompt, "messages": api_messages, "max_tokens": 2000}).encode()
-                    req = urllib.request.Request("https://api.anthropic.com/v1/messages", data=req_body, headers={"Content-Type": "application/json", "x-api-key": anthropic_key, "anthropic-version": "2023-06-01"})
-                    with urllib.request.urlopen(req, timeout=30) as resp:
-                        result = json.loads(resp.read().decode())
-                        ai_response = result["content"][0]["text"]
-                except Exception as e:
-                    ai_response = None
+        if xrpl_result:
+            tx_hash = xrpl_result["tx_hash"]
+            network = "XRPL " + XRPL_NETWORK.capitalize()
+            explorer_url = xrpl_result["explorer_url"]
+        else:
+            tx_hash = "TX" + hashlib.md5(str(now).encode()).hexdigest().upper()[:32]
+            network = "Simulated"
+            explorer_url = None
 
-            if ai_response:
-                self._send_json({"response": ai_response, "provider": "llm", "fallback": False})
-            else:
-                # No LLM available — return signal for client-side fallback
-                self._send_json({"response": None, "provider": "none", "fallback": True, "message": "No AI provider configured. Using local pattern matching."})
+        if not record_id:
+            record_id = f"REC-{composite_hash[:12].upper()}"
+
+        record = {
+            "hash": composite_hash,
+            "file_hash": file_hash,
+            "metadata_hash": metadata_hash,
+            "composite": True,
+            "record_type": record_type,
+            "record_label": cat.get("label", record_type),
+            "branch": cat.get("branch", "JOINT"),
+            "timestamp": now.isoformat(),
+            "fee": 0.01,
+            "tx_hash": tx_hash,
+            "network": network,
+            "explorer_url": explorer_url,
+            "record_id": record_id,
+            "org_id": org_id,
+            "source_system": data.get("source_system", "harborlink"),
+        }
+        _append_record(record)
+        _persist_record(record)
+
+        # Add to proof chain
+        if record_id not in _proof_chain_store:
+            _proof_chain_store[record_id] = []
+        composite_proof_event = {
+            "event_type": "anchor.composite_created",
+            "hash": composite_hash,
+            "file_hash": file_hash,
+            "metadata_hash": metadata_hash,
+            "tx_hash": tx_hash,
+            "timestamp": now.isoformat(),
+            "actor": user_email or org_id,
+        }
+        _proof_chain_store[record_id].append(composite_proof_event)
+        _persist_proof_chain_event(record_id, composite_proof_event)
+
+        # Fire webhook
+        _deliver_webhook("anchor.confirmed", {
+            "record_id": record_id,
+            "hash": composite_hash,
+            "file_hash": file_hash,
+            "metadata_hash": metadata_hash,
+            "composite": True,
+            "tx_hash": tx_hash,
+            "explorer_url": explorer_url,
+        }, org_key=self.headers.get("X-API-Key"))
+
+        self._send_json({"status": "anchored", "composite": True, "record": record, "xrpl": xrpl_result})
+
+    def _handle_post_anchor_batch(self, parsed, data):
+        """POST /api/anchor/batch"""
+        self._log_request("anchor-batch")
+        # Merkle batch anchoring: N records → 1 Merkle root → 1 XRPL transaction
+        now = datetime.now(timezone.utc)
+        records_input = data.get("records", [])
+        user_email = data.get("user_email", "")
+        org_id = data.get("org_id", self.headers.get("X-API-Key", ""))
 
-        # ═══════════════════════════════════════════════════════════════
-        #  HarborLink Integration — POST Endpoints
-        # ═══════════════════════════════════════════════════════════════
+        if not records_input or not isinstance(records_input, list):
+            self._send_json({"error": "records array is required (each item needs 'hash' or 'record_text')"}, 400)
+            return
+        if len(records_input) > 1000:
+            self._send_json({"error": "Maximum 1000 records per batch"}, 400)
+            return
 
-        elif route == "webhook_register":
-            self._log_request("webhook-register")
-            api_key = self.headers.get("X-API-Key", "")
-            if api_key != API_MASTER_KEY and api_key not in API_KEYS_STORE:
-                self._send_json({"error": "Valid API key required"}, 401)
-                return
-            url = data.get("url", "")
-            events = data.get("events", [])
-            valid_events = ["anchor.confirmed", "verify.completed", "tamper.detected",
-                            "batch.completed", "custody.transferred", "sls.balance_low",
-                            "chain.integrity_check", "proof.appended"]
-            if not url:
-                self._send_json({"error": "url is required"}, 400)
-                return
-            if not events:
-                events = valid_events  # Subscribe to all by default
-            invalid = [e for e in events if e not in valid_events]
-            if invalid:
-                self._send_json({"error": f"Invalid events: {invalid}", "valid_events": valid_events}, 400)
-                return
-            # Generate a per-hook signing secret
-            hook_secret = "whsec_" + hashlib.sha256(
-                (api_key + url + datetime.now(timezone.utc).isoformat()).encode()
-            ).hexdigest()[:32]
-            hook = {
-                "url": url,
-                "events": events,
-                "active": True,
-                "secret": hook_secret,
-                "created": datetime.now(timezone.utc).isoformat(),
-                "id": f"hook_{hashlib.sha256(url.encode()).hexdigest()[:12]}",
-            }
-            org_key = api_key
-            if org_key not in _webhook_store:
-                _webhook_store[org_key] = []
-            # Prevent duplicate URLs
-            existing_urls = [h["url"] for h in _webhook_store[org_key]]
-            if url in existing_urls:
-                self._send_json({"error": "Webhook URL already registered"}, 409)
+        # Compute leaf hashes
+        leaf_hashes = []
+        for item in records_input:
+            if "hash" in item:
+                leaf_hashes.append(item["hash"])
+            elif "record_text" in item:
+                leaf_hashes.append(hashlib.sha256(item["record_text"].encode()).hexdigest())
+            else:
+                self._send_json({"error": "Each record needs 'hash' or 'record_text'"}, 400)
                 return
-            _webhook_store[org_key].append(hook)
-            _persist_webhook_registration(org_key, hook)
-            self._send_json({
-                "status": "registered",
-                "webhook": hook,
-                "signing_secret": hook_secret,
-                "note": "Use this secret to verify webhook signatures (X-S4-Signature header = HMAC-SHA256 of payload).",
-            })
 
-        elif route == "webhook_test":
-            self._log_request("webhook-test")
-            api_key = self.headers.get("X-API-Key", "")
-            if api_key != API_MASTER_KEY and api_key not in API_KEYS_STORE:
-                self._send_json({"error": "Valid API key required"}, 401)
-                return
-            event_type = data.get("event", "anchor.confirmed")
-            _deliver_webhook(event_type, {
-                "test": True,
-                "message": f"Test webhook for event: {event_type}",
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-            }, org_key=api_key)
-            self._send_json({"status": "test_sent", "event": event_type})
-
-        elif route == "anchor_composite":
-            self._log_request("anchor-composite")
-            # Composite anchor: hash(file_hash + metadata_hash) → single on-chain anchor
-            now = datetime.now(timezone.utc)
-            file_hash = data.get("file_hash", "")
-            metadata_hash = data.get("metadata_hash", "")
-            record_type = data.get("record_type", "JOINT_CONTRACT")
-            record_id = data.get("record_id", "")
-            user_email = data.get("user_email", "")
-            org_id = data.get("org_id", self.headers.get("X-API-Key", ""))
-
-            if not file_hash or not metadata_hash:
-                self._send_json({"error": "file_hash and metadata_hash are required"}, 400)
-                return
+        levels = _merkle_levels(leaf_hashes)
+        root = levels[-1][0]
+        batch_id = f"BATCH-{root[:12].upper()}"
 
-            # Composite hash = SHA-256(file_hash || metadata_hash)
-            composite_hash = hashlib.sha256((file_hash + metadata_hash).encode()).hexdigest()
-            cat = RECORD_CATEGORIES.get(record_type, {"label": record_type, "branch": "JOINT", "icon": "\U0001f4cb", "system": "N/A"})
+        # Anchor Merkle root to XRPL (1 transaction for N records)
+        xrpl_result = _anchor_xrpl(root, "BATCH_ANCHOR", "JOINT", user_email=user_email or None)
 
-            # Anchor composite hash to XRPL
-            xrpl_result = _anchor_xrpl(composite_hash, record_type, cat.get("branch", ""), user_email=user_email or None)
+        if xrpl_result:
+            tx_hash = xrpl_result["tx_hash"]
+            network = "XRPL " + XRPL_NETWORK.capitalize()
+            explorer_url = xrpl_result["explorer_url"]
+        else:
+            tx_hash = "TX" + hashlib.md5(str(now).encode()).hexdigest().upper()[:32]
+            network = "Simulated"
+            explorer_url = None
 
-            if xrpl_result:
-                tx_hash = xrpl_result["tx_hash"]
-                network = "XRPL " + XRPL_NETWORK.capitalize()
-                explorer_url = xrpl_result["explorer_url"]
-            else:
-                tx_hash = "TX" + hashlib.md5(str(now).encode()).hexdigest().upper()[:32]
-                network = "Simulated"
-                explorer_url = None
-
-            if not record_id:
-                record_id = f"REC-{composite_hash[:12].upper()}"
-
-            record = {
-                "hash": composite_hash,
-                "file_hash": file_hash,
-                "metadata_hash": metadata_hash,
-                "composite": True,
-                "record_type": record_type,
-                "record_label": cat.get("label", record_type),
-                "branch": cat.get("branch", "JOINT"),
+        # Store batch for proof retrieval
+        _batch_store[batch_id] = {
+            "merkle_root": root,
+            "leaf_hashes": leaf_hashes,
+            "tree": _pack_merkle_levels(levels),
+            "record_count": len(leaf_hashes),
+            "tx_hash": tx_hash,
+            "network": network,
+            "explorer_url": explorer_url,
+            "timestamp": now.isoformat(),
+            "org_id": org_id,
+        }
+        _persist_batch(batch_id, _batch_store[batch_id])
+
+        # Create individual record entries tagged with batch (persisted in bulk)
+        batch_records = []
+        for i, lh in enumerate(leaf_hashes):
+            rid = records_input[i].get("record_id", f"REC-{lh[:12].upper()}")
+            rec = {
+                "hash": lh,
+                "record_type": records_input[i].get("record_type", "BATCH_RECORD"),
+                "record_label": records_input[i].get("record_type", "Batch Record"),
+                "branch": records_input[i].get("branch", "JOINT"),
                 "timestamp": now.isoformat(),
-                "fee": 0.01,
+                "fee": round(0.01 / len(leaf_hashes), 6),  # Cost split across batch
                 "tx_hash": tx_hash,
                 "network": network,
                 "explorer_url": explorer_url,
-                "record_id": record_id,
+                "record_id": rid,
+                "batch_id": batch_id,
+                "merkle_root": root,
+                "leaf_index": i,
                 "org_id": org_id,
-                "source_system": data.get("source_system", "harborlink"),
-            }
-            _live_records.append(record)
-            _persist_record(record)
-
-            # Add to proof chain
-            if record_id not in _proof_chain_store:
-                _proof_chain_store[record_id] = []
-            composite_proof_event = {
-                "event_type": "anchor.composite_created",
-                "hash": composite_hash,
-                "file_hash": file_hash,
-                "metadata_hash": metadata_hash,
-                "tx_hash": tx_hash,
-                "timestamp": now.isoformat(),
-                "actor": user_email or org_id,
             }
-            _proof_chain_store[record_id].append(composite_proof_event)
-            _persist_proof_chain_event(record_id, composite_proof_event)
-
-            # Fire webhook
-            _deliver_webhook("anchor.confirmed", {
-                "record_id": record_id,
-                "hash": composite_hash,
-                "file_hash": file_hash,
-                "metadata_hash": metadata_hash,
-                "composite": True,
-                "tx_hash": tx_hash,
-                "explorer_url": explorer_url,
-            }, org_key=self.headers.get("X-API-Key"))
+            _append_record(rec)
+            batch_records.append(rec)
+        persist_report = _persist_records(batch_records)
+
+        # Fire webhook: batch.completed
+        _deliver_webhook("batch.completed", {
+            "batch_id": batch_id,
+            "merkle_root": root,
+            "record_count": len(leaf_hashes),
+            "tx_hash": tx_hash,
+            "explorer_url": explorer_url,
+            "cost_per_record": round(0.01 / len(leaf_hashes), 6),
+            "total_cost": 0.01,
+        }, org_key=self.headers.get("X-API-Key"))
 
-            self._send_json({"status": "anchored", "composite": True, "record": record, "xrpl": xrpl_result})
+        self._send_json({
+            "status": "batch_anchored",
+            "batch_id": batch_id,
+            "merkle_root": root,
+            "record_count": len(leaf_hashes),
+            "tx_hash": tx_hash,
+            "network": network,
+            "explorer_url": explorer_url,
+            "cost_total_sls": 0.01,
+            "cost_per_record_sls": round(0.01 / len(leaf_hashes), 6),
+            "proof_url": f"/api/batch/proof?batch_id={quote(batch_id, safe='')}",  # + &leaf=<hash> or &index=<n>
+            "persisted": persist_report["written"],
+            "persist_failed": [f["record_id"] for f in persist_report["failed"]],
+            "xrpl": xrpl_result,
+        })
 
-        elif route == "anchor_batch":
-            self._log_request("anchor-batch")
-            # Merkle batch anchoring: N records → 1 Merkle root → 1 XRPL transaction
-            now = datetime.now(timezone.utc)
-            records_input = data.get("records", [])
-            user_email = data.get("user_email", "")
-            org_id = data.get("org_id", self.headers.get("X-API-Key", ""))
+    def _handle_post_custody_transfer(self, parsed, data):
+        """POST /api/custody/transfer"""
+        self._log_request("custody-transfer")
+        now = datetime.now(timezone.utc)
+        record_id = data.get("record_id", "")
+        from_entity = data.get("from", data.get("from_entity", ""))
+        to_entity = data.get("to", data.get("to_entity", ""))
+        location = data.get("location", "")
+        condition = data.get("condition", "serviceable")
+        notes = data.get("notes", "")
+        user_email = data.get("user_email", "")
+        org_id = data.get("org_id", self.headers.get("X-API-Key", ""))
+
+        if not record_id or not from_entity or not to_entity:
+            self._send_json({"error": "record_id, from (or from_entity), and to (or to_entity) are required"}, 400)
+            return
 
-            if not records_input or not isinstance(records_input, list):
-                self._send_json({"error": "records array is required (each item needs 'hash' or 'record_text')"}, 400)
-                return
-            if len(records_input) > 1000:
-                self._send_json({"error": "Maximum 1000 records per batch"}, 400)
-                return
+        # Create custody transfer hash
+        transfer_data = f"{record_id}:{from_entity}:{to_entity}:{location}:{now.isoformat()}"
+        transfer_hash = hashlib.sha256(transfer_data.encode()).hexdigest()
 
-            # Compute leaf hashes
-            leaf_hashes = []
-            for item in records_input:
-                if "hash" in item:
-                    leaf_hashes.append(item["hash"])
-                elif "record_text" in item:
-                    leaf_hashes.append(hashlib.sha256(item["record_text"].encode()).hexdigest())
-                else:
-                    self._send_json({"error": "Each record needs 'hash' or 'record_text'"}, 400)
-                    return
-
-            # Build Merkle tree
-            def merkle_root(hashes):
-                if not hashes:
-                    return hashlib.sha256(b"empty").hexdigest()
-                layer = list(hashes)
-                while len(layer) > 1:
-                    if len(layer) % 2 == 1:
-                        layer.append(layer[-1])  # Duplicate last for odd count
-                    next_layer = []
-                    for i in range(0, len(layer), 2):
-                        combined = hashlib.sha256((layer[i] + layer[i + 1]).encode()).hexdigest()
-                        next_layer.append(combined)
-                    layer = next_layer
-                return layer[0]
-
-            root = merkle_root(leaf_hashes)
-            batch_id = f"BATCH-{root[:12].upper()}"
-
-            # Anchor Merkle root to XRPL (1 transaction for N records)
-            xrpl_result = _anchor_xrpl(root, "BATCH_ANCHOR", "JOINT", user_email=user_email or None)
+        # Anchor custody transfer to XRPL
+        xrpl_result = _anchor_xrpl(transfer_hash, "CUSTODY_TRANSFER", "JOINT", user_email=user_email or None)
 
-            if xrpl_result:
-                tx_hash = xrpl_result["tx_hash"]
-                network = "XRPL " + XRPL_NETWORK.capitalize()
-                explorer_url = xrpl_result["explorer_url"]
-            else:
-                tx_hash = "TX" + hashlib.md5(str(now).encode()).hexdigest().upper()[:32]
-                network = "Simulated"
-                explorer_url = None
+        if xrpl_result:
+            tx_hash = xrpl_result["tx_hash"]
+            explorer_url = xrpl_result["explorer_url"]
+        else:
+            tx_hash = "TX" + hashlib.md5(str(now).encode()).hexdigest().upper()[:32]
+            explorer_url = None
 
-            # Store batch for proof retrieval
-            _batch_store[batch_id] = {
-                "merkle_root": root,
-                "leaf_hashes": leaf_hashes,
-                "record_count": len(leaf_hashes),
-                "tx_hash": tx_hash,
-                "network": network,
-                "explorer_url": explorer_url,
-                "timestamp": now.isoformat(),
-                "org_id": org_id,
-            }
+        transfer_event = {
+            "from": from_entity,
+            "to": to_entity,
+            "timestamp": now.isoformat(),
+            "hash": transfer_hash,
+            "tx_hash": tx_hash,
+            "explorer_url": explorer_url,
+            "location": location,
+            "condition": condition,
+            "notes": notes,
+            "transfer_id": f"CTX-{transfer_hash[:12].upper()}",
+        }
 
-            # Create individual record entries tagged with batch
-            for i, lh in enumerate(leaf_hashes):
-                rid = records_input[i].get("record_id", f"REC-{lh[:12].upper()}")
-                rec = {
-                    "hash": lh,
-                    "record_type": records_input[i].get("record_type", "BATCH_RECORD"),
-                    "record_label": records_input[i].get("record_type", "Batch Record"),
-                    "branch": records_input[i].get("branch", "JOINT"),
-                    "timestamp": now.isoformat(),
-                    "fee": round(0.01 / len(leaf_hashes), 6),  # Cost split across batch
-                    "tx_hash": tx_hash,
-                    "network": network,
-                    "explorer_url": explorer_url,
-                    "record_id": rid,
-                    "batch_id": batch_id,
-                    "merkle_root": root,
-                    "org_id": org_id,
-                }
-                _live_records.append(rec)
-                _persist_record(rec)
+        # Append to custody chain
+        if record_id not in _custody_chain_store:
+            _custody_chain_store[record_id] = []
+        _custody_chain_store[record_id].append(transfer_event)
+        _persist_custody_transfer(record_id, transfer_event)
+
+        # Append to proof chain
+        if record_id not in _proof_chain_store:
+            _proof_chain_store[record_id] = []
+        custody_proof_event = {
+            "event_type": "custody.transferred",
+            "hash": transfer_hash,
+            "tx_hash": tx_hash,
+            "timestamp": now.isoformat(),
+            "actor": user_email or org_id,
+            "metadata": {"from": from_entity, "to": to_entity, "location": location, "condition": condition},
+        }
+        _proof_chain_store[record_id].append(custody_proof_event)
+        _persist_proof_chain_event(record_id, custody_proof_event)
+
+        # Fire webhook: custody.transferred
+        _deliver_webhook("custody.transferred", {
+            "record_id": record_id,
+            "transfer_id": transfer_event["transfer_id"],
+            "from": from_entity,
+            "to": to_entity,
+            "location": location,
+            "tx_hash": tx_hash,
+            "explorer_url": explorer_url,
+        }, org_key=self.headers.get("X-API-Key"))
 
-            # Fire webhook: batch.completed
-            _deliver_webhook("batch.completed", {
-                "batch_id": batch_id,
-                "merkle_root": root,
-                "record_count": len(leaf_hashes),
-                "tx_hash": tx_hash,
-                "explorer_url": explorer_url,
-                "cost_per_record": round(0.01 / len(leaf_hashes), 6),
-                "total_cost": 0.01,
-            }, org_key=self.headers.get("X-API-Key"))
+        self._send_json({
+            "status": "transferred",
+            "record_id": record_id,
+            "transfer": transfer_event,
+            "chain_length": len(_custody_chain_store[record_id]),
+            "xrpl": xrpl_result,
+        })
 
-            self._send_json({
-                "status": "batch_anchored",
-                "batch_id": batch_id,
-                "merkle_root": root,
-                "record_count": len(leaf_hashes),
-                "tx_hash": tx_hash,
-                "network": network,
-                "explorer_url": explorer_url,
-                "cost_total_sls": 0.01,
-                "cost_per_record_sls": round(0.01 / len(leaf_hashes), 6),
-                "xrpl": xrpl_result,
-            })
+    def _handle_post_hash_file(self, parsed, data):
+        """POST /api/hash/file"""
+        self._log_request("hash-file")
+        if self._is_octet_stream():
+            self._hash_file_stream(parsed)
+            return
+        # Hash file content (Base64-encoded binary or raw text)
+        content = data.get("content", "")
+        encoding = data.get("encoding", "utf-8")  # "utf-8" or "base64"
+        filename = data.get("filename", "")
+
+        if not content:
+            self._send_json({"error": "content is required (text or base64-encoded binary)"}, 400)
+            return
 
-        elif route == "custody_transfer":
-            self._log_request("custody-transfer")
-            now = datetime.now(timezone.utc)
-            record_id = data.get("record_id", "")
-            from_entity = data.get("from", data.get("from_entity", ""))
-            to_entity = data.get("to", data.get("to_entity", ""))
-            location = data.get("location", "")
-            condition = data.get("condition", "serviceable")
-            notes = data.get("notes", "")
-            user_email = data.get("user_email", "")
-            org_id = data.get("org_id", self.headers.get("X-API-Key", ""))
-
-            if not record_id or not from_entity or not to_entity:
-                self._send_json({"error": "record_id, from (or from_entity), and to (or to_entity) are required"}, 400)
+        import base64
+        if encoding == "base64":
+            try:
+                raw_bytes = base64.b64decode(content)
+            except Exception:
+                self._send_json({"error": "Invalid base64 content"}, 400)
                 return
+        else:
+            raw_bytes = content.encode("utf-8")
 
-            # Create custody transfer hash
-            transfer_data = f"{record_id}:{from_entity}:{to_entity}:{location}:{now.isoformat()}"
-            transfer_hash = hashlib.sha256(transfer_data.encode()).hexdigest()
+        file_hash = hashlib.sha256(raw_bytes).hexdigest()
+        self._send_json({
+            "hash": file_hash,
+            "algorithm": "SHA-256",
+            "encoding": encoding,
+            "size_bytes": len(raw_bytes),
+            "filename": filename,
+        })
 
-            # Anchor custody transfer to XRPL
-            xrpl_result = _anchor_xrpl(transfer_hash, "CUSTODY_TRANSFER", "JOINT", user_email=user_email or None)
+    def _hash_file_stream(self, parsed):
+        """Hash a raw application/octet-stream upload block by block.
+        ?filename= is echoed back; ?chunk_size=N (>= HASH_FILE_MIN_CHUNK) also
+        hashes every N bytes on its own and returns those chunk hashes and
+        their Merkle root, so a large file can later be re-verified a chunk
+        at a time."""
+        query = parse_qs(parsed.query)
+        filename = query.get("filename", [""])[0]
+        try:
+            chunk_size = int(query.get("chunk_size", ["0"])[0])
+        except ValueError:
+            chunk_size = -1
+        if chunk_size and chunk_size < HASH_FILE_MIN_CHUNK:
+            self._send_json({"error": f"chunk_size must be an integer >= {HASH_FILE_MIN_CHUNK}"}, 400)
+            return
 
-            if xrpl_result:
-                tx_hash = xrpl_result["tx_hash"]
-                explorer_url = xrpl_result["explorer_url"]
-            else:
-                tx_hash = "TX" + hashlib.md5(str(now).encode()).hexdigest().upper()[:32]
-                explorer_url = None
+        try:
+            body = self._raw_body(HASH_FILE_MAX_BYTES)
+            blocks = _iter_body_blocks(body, HASH_FILE_MAX_BYTES, HASH_FILE_BLOCK_BYTES)
+            file_hash, size, leaves = _digest_blocks(blocks, chunk_size)
+        except _BodyError as e:
+            self._send_json({"error": str(e)}, e.status)
+            return
 
-            transfer_event = {
-                "from": from_entity,
-                "to": to_entity,
-                "timestamp": now.isoformat(),
-                "hash": transfer_hash,
-                "tx_hash": tx_hash,
-                "explorer_url": explorer_url,
-                "location": location,
-                "condition": condition,
-                "notes": notes,
-                "transfer_id": f"CTX-{transfer_hash[:12].upper()}",
-            }
+        result = {
+            "hash": file_hash,
+            "algorithm": "SHA-256",
+            "encoding": "binary",
+            "size_bytes": size,
+            "filename": filename,
+        }
+        if chunk_size:
+            result.update({
+                "chunk_size": chunk_size,
+                "chunk_count": len(leaves),
+                "chunk_hashes": leaves,
+                "merkle_root": _merkle_root(leaves),
+            })
+        self._send_json(result)
+
+    def _handle_post_verify_batch(self, parsed, data):
+        """POST /api/verify/batch"""
+        self._log_request("verify-batch")
+        # Verify multiple records in one call
+        items = data.get("records", [])
+        operator = data.get("operator", self.headers.get("X-Operator", "anonymous"))
+        now = datetime.now(timezone.utc)
 
-            # Append to custody chain
-            if record_id not in _custody_chain_store:
-                _custody_chain_store[record_id] = []
-            _custody_chain_store[record_id].append(transfer_event)
-            _persist_custody_transfer(record_id, transfer_event)
-
-            # Append to proof chain
-            if record_id not in _proof_chain_store:
-                _proof_chain_store[record_id] = []
-            custody_proof_event = {
-                "event_type": "custody.transferred",
-                "hash": transfer_hash,
-                "tx_hash": tx_hash,
-                "timestamp": now.isoformat(),
-                "actor": user_email or org_id,
-                "metadata": {"from": from_entity, "to": to_entity, "location": location, "condition": condition},
-            }
-            _proof_chain_store[record_id].append(custody_proof_event)
-            _persist_proof_chain_event(record_id, custody_proof_event)
-
-            # Fire webhook: custody.transferred
-            _deliver_webhook("custody.transferred", {
-                "record_id": record_id,
-                "transfer_id": transfer_event["transfer_id"],
-                "from": from_entity,
-                "to": to_entity,
-                "location": location,
-                "tx_hash": tx_hash,
-                "explorer_url": explorer_url,
-            }, org_key=self.headers.get("X-API-Key"))
+        if not items or not isinstance(items, list):
+            self._send_json({"error": "records array required (each item needs 'record_text' and optionally 'expected_hash' or 'tx_hash')"}, 400)
+            return
+        if len(items) > 100:
+            self._send_json({"error": "Maximum 100 records per batch verify"}, 400)
+            return
 
-            self._send_json({
-                "status": "transferred",
-                "record_id": record_id,
-                "transfer": transfer_event,
-                "chain_length": len(_custody_chain_store[record_id]),
-                "xrpl": xrpl_result,
-            })
+        results = []
+        tamper_count = 0
+        match_count = 0
+        not_found_count = 0
+        _await_hydration("records")
 
-        elif route == "hash_file":
-            self._log_request("hash-file")
-            # Hash file content (Base64-encoded binary or raw text)
-            content = data.get("content", "")
-            encoding = data.get("encoding", "utf-8")  # "utf-8" or "base64"
-            filename = data.get("filename", "")
+        for item in items:
+            record_text = item.get("record_text", "")
+            if not record_text:
+                results.append({"error": "record_text required", "index": len(results)})
+                continue
 
-            if not content:
-                self._send_json({"error": "content is required (text or base64-encoded binary)"}, 400)
-                return
+            computed = hashlib.sha256(record_text.encode()).hexdigest()
+            expected = item.get("expected_hash", "")
+            tx = item.get("tx_hash", "")
+            chain_hash = None
 
-            import base64
-            if encoding == "base64":
-                try:
-                    raw_bytes = base64.b64decode(content)
-                except Exception:
-                    self._send_json({"error": "Invalid base64 content"}, 400)
-                    return
+            if tx:
+                found = _record_for_tx(tx, computed)
+                if found:
+                    chain_hash = found.get("hash", "")
+            elif expected:
+                chain_hash = expected
             else:
-                raw_bytes = content.encode("utf-8")
+                found = _first_record(computed, "hash")
+                if found:
+                    chain_hash = found.get("hash", "")
 
-            file_hash = hashlib.sha256(raw_bytes).hexdigest()
-            self._send_json({
-                "hash": file_hash,
-                "algorithm": "SHA-256",
-                "encoding": encoding,
-                "size_bytes": len(raw_bytes),
-                "filename": filename,
-            })
+            if chain_hash is None:
+                status = "NOT_FOUND"
+                not_found_count += 1
+            elif computed == chain_hash:
+                status = "MATCH"
+                match_count += 1
+            else:
+                status = "MISMATCH"
+                tamper_count += 1
 
-        elif route == "verify_batch":
-            self._log_request("verify-batch")
-            # Verify multiple records in one call
-            items = data.get("records", [])
-            operator = data.get("operator", self.headers.get("X-Operator", "anonymous"))
-            now = datetime.now(timezone.utc)
-
-            if not items or not isinstance(items, list):
-                self._send_json({"error": "records array required (each item needs 'record_text' and optionally 'expected_hash' or 'tx_hash')"}, 400)
-                return
-            if len(items) > 100:
-                self._send_json({"error": "Maximum 100 records per batch verify"}, 400)
-                return
-
-            results = []
-            tamper_count = 0
-            match_count = 0
-            not_found_count = 0
-
-            for item in items:
-                record_text = item.get("record_text", "")
-                if not record_text:
-                    results.append({"error": "record_text required", "index": len(results)})
-                    continue
+            results.append({
+                "index": len(results),
+                "status": status,
+                "computed_hash": computed,
+                "chain_hash": chain_hash,
+                "tamper_detected": status == "MISMATCH",
+                "record_id": item.get("record_id", ""),
+            })
 
-                computed = hashlib.sha256(record_text.encode()).hexdigest()
-                expected = item.get("expected_hash", "")
-                tx = item.get("tx_hash", "")
-                chain_hash = None
-
-                if tx:
-                    found = [r for r in _live_records if r.get("tx_hash") == tx or r.get("hash") == tx]
-                    if found:
-                        chain_hash = found[0].get("hash", "")
-                elif expected:
-                    chain_hash = expected
-                else:
-                    found = [r for r in _live_records if r.get("hash") == computed]
-                    if found:
-                        chain_hash = found[0].get("hash", "")
-
-                if chain_hash is None:
-                    status = "NOT_FOUND"
-                    not_found_count += 1
-                elif computed == chain_hash:
-                    status = "MATCH"
-                    match_count += 1
-                else:
-                    status = "MISMATCH"
-                    tamper_count += 1
-
-                results.append({
-                    "index": len(results),
-                    "status": status,
-                    "computed_hash": computed,
-                    "chain_hash": chain_hash,
-                    "tamper_detected": status == "MISMATCH",
-                    "record_id": item.get("record_id", ""),
-                })
+        self._send_json({
+            "results": results,
+            "summary": {
+                "total": len(results),
+                "match": match_count,
+                "mismatch": tamper_count,
+                "not_found": not_found_count,
+            },
+            "operator": operator,
+            "verified_at": now.isoformat(),
+        })
 
-            self._send_json({
-                "results": results,
-                "summary": {
-                    "total": len(results),
-                    "match": match_count,
-                    "mismatch": tamper_count,
-                    "not_found": not_found_count,
-                },
-                "operator": operator,
-                "verified_at": now.isoformat(),
-            })
+    # ═══════════════════════════════════════════════════════════════
+    #  MODULAR API INTEGRATIONS — POST Endpoints
+    # ═══════════════════════════════════════════════════════════════
 
-        # ═══════════════════════════════════════════════════════════════
-        #  MODULAR API INTEGRATIONS — POST Endpoints
-        # ═══════════════════════════════════════════════════════════════
-
-        elif route == "integration_wawf":
-            self._log_request("integration-wawf")
-            # WAWF/ERP webhook — receives external system events and anchors them
-            now = datetime.now(timezone.utc)
-            contract_id = data.get("contractId", data.get("contract_id", ""))
-            status_val = data.get("status", "")
-            event_type = data.get("event_type", "receipt")
-            payload = data.get("payload", data)
-
-            if not contract_id:
-                self._send_json({"error": "contractId is required"}, 400)
-                return
+    def _handle_post_integration_wawf(self, parsed, data):
+        """POST /api/integrations/wawf"""
+        self._log_request("integration-wawf")
+        # WAWF/ERP webhook — receives external system events and anchors them
+        now = datetime.now(timezone.utc)
+        contract_id = data.get("contractId", data.get("contract_id", ""))
+        status_val = data.get("status", "")
+        event_type = data.get("event_type", "receipt")
+        payload = data.get("payload", data)
 
-            # Hash the event payload
-            event_hash = hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+        if not contract_id:
+            self._send_json({"error": "contractId is required"}, 400)
+            return
 
-            # Anchor to XRPL
-            xrpl_result = _anchor_xrpl(event_hash, record_type=f"WAWF_{event_type.upper()}", branch="JOINT")
+        # Hash the event payload
+        event_hash = canonical_sha256(payload, ensure_ascii=False)
 
-            # Store record
-            record = {
-                "hash": event_hash,
-                "record_type": f"WAWF_{event_type.upper()}",
-                "record_label": f"WAWF {event_type.title()} — {contract_id}",
-                "branch": "JOINT",
-                "icon": "\U0001f4cb",
-                "timestamp": now.isoformat(),
-                "timestamp_display": now.strftime("%Y-%m-%d %H:%M:%S UTC"),
-                "fee": 0.01,
-                "tx_hash": xrpl_result["tx_hash"] if xrpl_result else f"TX{event_hash[:30].upper()}",
-                "system": "PIEE/WAWF",
-                "contract_id": contract_id,
-            }
-            _live_records.append(record)
-            _persist_record(record)
+        # Anchor to XRPL
+        xrpl_result = _anchor_xrpl(event_hash, record_type=f"WAWF_{event_type.upper()}", branch="JOINT")
 
-            # Fire webhook
-            _deliver_webhook("anchor.confirmed", {"hash": event_hash, "contract_id": contract_id, "source": "WAWF"})
+        # Store record
+        record = {
+            "hash": event_hash,
+            "record_type": f"WAWF_{event_type.upper()}",
+            "record_label": f"WAWF {event_type.title()} — {contract_id}",
+            "branch": "JOINT",
+            "icon": "\U0001f4cb",
+            "timestamp": now.isoformat(),
+            "timestamp_display": now.strftime("%Y-%m-%d %H:%M:%S UTC"),
+            "fee": 0.01,
+            "tx_hash": xrpl_result["tx_hash"] if xrpl_result else f"TX{event_hash[:30].upper()}",
+            "system": "PIEE/WAWF",
+            "contract_id": contract_id,
+        }
+        _append_record(record)
+        _persist_record(record)
 
-            self._send_json({
-                "status": "anchored",
-                "hash": event_hash,
-                "contract_id": contract_id,
-                "xrpl": xrpl_result or {"note": "XRPL anchor queued"},
-                "record": record,
-                "timestamp": now.isoformat(),
-            })
+        # Fire webhook
+        _deliver_webhook("anchor.confirmed", {"hash": event_hash, "contract_id": contract_id, "source": "WAWF"})
 
-        elif route == "ai_query":
-            self._log_request("ai-query")
-            # NLP query endpoint for defense/ILS tasks
-            now = datetime.now(timezone.utc)
-            query_text = data.get("query", data.get("message", "")).strip()
-            task_type = data.get("task_type", "general")  # general, ils_gap, logistics_optimize, defense_cyber_sim, predictive_maint
-            context = data.get("context", {})
+        self._send_json({
+            "status": "anchored",
+            "hash": event_hash,
+            "contract_id": contract_id,
+            "xrpl": xrpl_result or {"note": "XRPL anchor queued"},
+            "record": record,
+            "timestamp": now.isoformat(),
+        })
 
-            if not query_text:
-                self._send_json({"error": "query is required"}, 400)
-                return
+    def _handle_post_ai_query(self, parsed, data):
+        """POST /api/ai/query"""
+        self._log_request("ai-query")
+        # NLP query endpoint for defense/ILS tasks
+        now = datetime.now(timezone.utc)
+        query_text = data.get("query", data.get("message", "")).strip()
+        task_type = data.get("task_type", "general")  # general, ils_gap, logistics_optimize, defense_cyber_sim, predictive_maint
 
-            # Intent detection via keyword matching (production: ML model)
-            intent = "general"
-            q_lower = query_text.lower()
-            if any(w in q_lower for w in ["gap", "analysis", "readiness", "ils", "supportability"]):
-                intent = "ils_gap_analysis"
-            elif any(w in q_lower for w in ["risk", "supply", "chain", "logistics", "optimize", "forecast"]):
-                intent = "logistics_optimize"
-            elif any(w in q_lower for w in ["cyber", "threat", "breach", "nist", "compliance", "simulation"]):
-                intent = "defense_cyber_sim"
-            elif any(w in q_lower for w in ["maintenance", "predict", "failure", "mtbf", "mttr", "wear"]):
-                intent = "predictive_maintenance"
-            elif any(w in q_lower for w in ["f-35", "f35", "ddg", "cvn", "lcs", "ship", "vessel", "aircraft", "platform"]):
-                intent = "platform_query"
-
-            # Entity extraction
-            entities = {}
-            nsn_match = re.findall(r'\b\d{4}-\d{2}-\d{3}-\d{4}\b', query_text)
-            if nsn_match:
-                entities["nsn"] = nsn_match
-            cage_match = re.findall(r'\b[A-Z0-9]{5}\b', query_text)
-            if cage_match:
-                entities["possible_cage"] = cage_match[:3]
-            contract_match = re.findall(r'[A-Z]\d{5}-\d{2}-[A-Z]-\d{4}', query_text)
-            if contract_match:
-                entities["contract_id"] = contract_match
-
-            # Generate response based on intent
-            response_text = f"Processed query with intent: {intent}."
-            if intent == "ils_gap_analysis":
-                # Pull real gap count from Supabase
-                gaps = _sb_select("gap_analysis", query_params="status=eq.open", limit=100)
-                gap_count = len(gaps) if gaps else 0
-                response_text = f"ILS gap analysis found {gap_count} open gaps in your program. Use the Gap Analysis tool for detailed breakdowns by severity and cost impact."
-            elif intent == "logistics_optimize":
-                response_text = "Supply chain optimization analysis complete. Identified 3 single-source dependencies and 2 lead-time risks. Recommend qualifying alternate sources for NSN 5998-01-456-7890."
-            elif intent == "defense_cyber_sim":
-                response_text = "Cyber threat simulation complete. Detected 2 potential attack vectors in supply chain data flow. Recommend NIST SP 800-161 controls and implementing zero-trust architecture for data exchange."
-            elif intent == "predictive_maintenance":
-                response_text = "Predictive maintenance model forecasts LM2500 HP turbine blade failure in 18 days (94% confidence). Scheduled maintenance now saves $1,850 vs unplanned downtime."
-            elif intent == "platform_query":
-                response_text = "Platform data retrieved. Cross-referencing with ILS records, DMSMS alerts, and readiness metrics for the specified platform."
-
-            # Hash and audit-trail the AI response
-            response_hash = hashlib.sha256(response_text.encode()).hexdigest()
-            ai_entry = {
-                "timestamp": now.isoformat(),
-                "query": query_text[:200],
-                "intent": intent,
-                "entities": entities,
-                "response_hash": response_hash,
-                "tool_context": task_type,
-                "anchored": False,
-            }
-            _ai_audit_log.append(ai_entry)
-            _persist_ai_audit(ai_entry)
-            if len(_ai_audit_log) > 1000:
-                _ai_audit_log.pop(0)
+        if not query_text:
+            self._send_json({"error": "query is required"}, 400)
+            return
 
-            self._send_json({
-                "response": response_text,
-                "intent": intent,
-                "entities": entities,
-                "confidence": 0.87,
-                "response_hash": response_hash,
-                "audit_logged": True,
-                "timestamp": now.isoformat(),
-            })
+        # Intent detection via keyword matching (production: ML model)
+        intent = "general"
+        q_lower = query_text.lower()
+        if any(w in q_lower for w in ["gap", "analysis", "readiness", "ils", "supportability"]):
+            intent = "ils_gap_analysis"
+        elif any(w in q_lower for w in ["risk", "supply", "chain", "logistics", "optimize", "forecast"]):
+            intent = "logistics_optimize"
+        elif any(w in q_lower for w in ["cyber", "threat", "breach", "nist", "compliance", "simulation"]):
+            intent = "defense_cyber_sim"
+        elif any(w in q_lower for w in ["maintenance", "predict", "failure", "mtbf", "mttr", "wear"]):
+            intent = "predictive_maintenance"
+        elif any(w in q_lower for w in ["f-35", "f35", "ddg", "cvn", "lcs", "ship", "vessel", "aircraft", "platform"]):
+            intent = "platform_query"
+
+        # Entity extraction
+        entities = {}
+        nsn_match = re.findall(r'\b\d{4}-\d{2}-\d{3}-\d{4}\b', query_text)
+        if nsn_match:
+            entities["nsn"] = nsn_match
+        cage_match = re.findall(r'\b[A-Z0-9]{5}\b', query_text)
+        if cage_match:
+            entities["possible_cage"] = cage_match[:3]
+        contract_match = re.findall(r'[A-Z]\d{5}-\d{2}-[A-Z]-\d{4}', query_text)
+        if contract_match:
+            entities["contract_id"] = contract_match
+
+        # Generate response based on intent
+        response_text = f"Processed query with intent: {intent}."
+        if intent == "ils_gap_analysis":
+            # Pull real gap count from Supabase
+            gaps = _sb_select("gap_analysis", query_params="status=eq.open", limit=100)
+            gap_count = len(gaps) if gaps else 0
+            response_text = f"ILS gap analysis found {gap_count} open gaps in your program. Use the Gap Analysis tool for detailed breakdowns by severity and cost impact."
+        elif intent == "logistics_optimize":
+            response_text = "Supply chain optimization analysis complete. Identified 3 single-source dependencies and 2 lead-time risks. Recommend qualifying alternate sources for NSN 5998-01-456-7890."
+        elif intent == "defense_cyber_sim":
+            response_text = "Cyber threat simulation complete. Detected 2 potential attack vectors in supply chain data flow. Recommend NIST SP 800-161 controls and implementing zero-trust architecture for data exchange."
+        elif intent == "predictive_maintenance":
+            response_text = "Predictive maintenance model forecasts LM2500 HP turbine blade failure in 18 days (94% confidence). Scheduled maintenance now saves $1,850 vs unplanned downtime."
+        elif intent == "platform_query":
+            response_text = "Platform data retrieved. Cross-referencing with ILS records, DMSMS alerts, and readiness metrics for the specified platform."
+
+        # Hash and audit-trail the AI response
+        response_hash = hashlib.sha256(response_text.encode()).hexdigest()
+        ai_entry = {
+            "timestamp": now.isoformat(),
+            "query": query_text[:200],
+            "intent": intent,
+            "entities": entities,
+            "response_hash": response_hash,
+            "tool_context": task_type,
+            "anchored": False,
+        }
+        _ai_audit_log.append(ai_entry)
+        _persist_ai_audit(ai_entry)
+        if len(_ai_audit_log) > 1000:
+            _ai_audit_log.pop(0)
 
-        elif route == "defense_task":
-            self._log_request("defense-task")
-            now = datetime.now(timezone.utc)
-            task_type = data.get("task_type", "")  # compliance_check, threat_sim, readiness_calc, ils_review
-            parameters = data.get("parameters", {})
+        self._send_json({
+            "response": response_text,
+            "intent": intent,
+            "entities": entities,
+            "confidence": 0.87,
+            "response_hash": response_hash,
+            "audit_logged": True,
+            "timestamp": now.isoformat(),
+        })
 
-            if not task_type:
-                self._send_json({"error": "task_type is required (compliance_check, threat_sim, readiness_calc, ils_review)"}, 400)
-                return
+    def _handle_post_defense_task(self, parsed, data):
+        """POST /api/defense/task"""
+        self._log_request("defense-task")
+        now = datetime.now(timezone.utc)
+        task_type = data.get("task_type", "")  # compliance_check, threat_sim, readiness_calc, ils_review
+        parameters = data.get("parameters", {})
 
-            result_data = {}
-            if task_type == "compliance_check":
-                result_data = {
-                    "overall_score": 87.4,
-                    "frameworks": {
-                        "cmmc_level2": {"score": 91, "controls_met": 100, "controls_total": 110},
-                        "nist_800_171": {"score": 85, "families_compliant": 12, "families_total": 14},
-                        "dfars_252_204_7012": {"compliant": True, "gaps": 2},
-                    },
-                    "recommendations": ["Implement MFA on all CUI-access systems", "Complete POAM for 2 residual NIST gaps"],
-                }
-            elif task_type == "threat_sim":
-                result_data = {
-                    "simulation": "supply_chain_cyber",
-                    "threats_detected": 3,
-                    "severity": "HIGH",
-                    "attack_vectors": ["phishing via supplier portal", "DNS spoofing on logistics network", "USB-based malware injection"],
-                    "nist_controls_recommended": ["AC-2", "SC-7", "MP-7", "SI-3"],
-                }
-            elif task_type == "readiness_calc":
-                mtbf = parameters.get("mtbf", 1000)
-                mttr = parameters.get("mttr", 4)
-                aldt = parameters.get("aldt", 2)
-                ao = mtbf / (mtbf + mttr + aldt) if (mtbf + mttr + aldt) > 0 else 0
-                ai_val = mtbf / (mtbf + mttr) if (mtbf + mttr) > 0 else 0
-                result_data = {"Ao": round(ao, 4), "Ai": round(ai_val, 4), "MTBF": mtbf, "MTTR": mttr, "ALDT": aldt}
-            elif task_type == "ils_review":
-                result_data = {
-                    "review_type": "Pre-Milestone B",
-                    "elements_reviewed": 12,
-                    "elements_satisfactory": 9,
-                    "elements_deficient": 3,
-                    "deficiencies": ["Supply Support - incomplete VRS", "Technical Data - draft IETM not submitted", "Training - no curriculum outline"],
-                }
+        if not task_type:
+            self._send_json({"error": "task_type is required (compliance_check, threat_sim, readiness_calc, ils_review)"}, 400)
+            return
 
-            # Hash the task result for auditability
-            result_hash = hashlib.sha256(json.dumps(result_data, sort_keys=True).encode()).hexdigest()
-            defense_audit_entry = {
-                "timestamp": now.isoformat(),
-                "query": f"defense_task:{task_type}",
-                "intent": task_type,
-                "entities": parameters,
-                "response_hash": result_hash,
-                "tool_context": "defense_task",
-                "anchored": False,
+        result_data = {}
+        if task_type == "compliance_check":
+            result_data = {
+                "overall_score": 87.4,
+                "frameworks": {
+                    "cmmc_level2": {"score": 91, "controls_met": 100, "controls_total": 110},
+                    "nist_800_171": {"score": 85, "families_compliant": 12, "families_total": 14},
+                    "dfars_252_204_7012": {"compliant": True, "gaps": 2},
+                },
+                "recommendations": ["Implement MFA on all CUI-access systems", "Complete POAM for 2 residual NIST gaps"],
+            }
+        elif task_type == "threat_sim":
+            result_data = {
+                "simulation": "supply_chain_cyber",
+                "threats_detected": 3,
+                "severity": "HIGH",
+                "attack_vectors": ["phishing via supplier portal", "DNS spoofing on logistics network", "USB-based malware injection"],
+                "nist_controls_recommended": ["AC-2", "SC-7", "MP-7", "SI-3"],
+            }
+        elif task_type == "readiness_calc":
+            mtbf = parameters.get("mtbf", 1000)
+            mttr = parameters.get("mttr", 4)
+            aldt = parameters.get("aldt", 2)
+            ao = mtbf / (mtbf + mttr + aldt) if (mtbf + mttr + aldt) > 0 else 0
+            ai_val = mtbf / (mtbf + mttr) if (mtbf + mttr) > 0 else 0
+            result_data = {"Ao": round(ao, 4), "Ai": round(ai_val, 4), "MTBF": mtbf, "MTTR": mttr, "ALDT": aldt}
+        elif task_type == "ils_review":
+            result_data = {
+                "review_type": "Pre-Milestone B",
+                "elements_reviewed": 12,
+                "elements_satisfactory": 9,
+                "elements_deficient": 3,
+                "deficiencies": ["Supply Support - incomplete VRS", "Technical Data - draft IETM not submitted", "Training - no curriculum outline"],
             }
-            _ai_audit_log.append(defense_audit_entry)
-            _persist_ai_audit(defense_audit_entry)
 
-            self._send_json({
-                "task_type": task_type,
-                "result": result_data,
-                "result_hash": result_hash,
-                "audit_logged": True,
-                "timestamp": now.isoformat(),
-            })
+        # Hash the task result for auditability
+        result_hash = canonical_sha256(result_data)
+        defense_audit_entry = {
+            "timestamp": now.isoformat(),
+            "query": f"defense_task:{task_type}",
+            "intent": task_type,
+            "entities": parameters,
+            "response_hash": result_hash,
+            "tool_context": "defense_task",
+            "anchored": False,
+        }
+        _ai_audit_log.append(defense_audit_entry)
+        _persist_ai_audit(defense_audit_entry)
 
-        elif route == "offline_sync":
-            self._log_request("offline-sync")
-            # Process the offline hash queue — anchor all queued hashes
-            now = datetime.now(timezone.utc)
-            hashes_to_sync = data.get("hashes", [])
-            mode = os.environ.get("S4_MODE", "online")
-
-            if hashes_to_sync:
-                # Incoming batch from air-gapped system
-                for item in hashes_to_sync:
-                    _offline_hash_queue.append({
-                        "hash": item.get("hash", ""),
-                        "record_type": item.get("record_type", "OFFLINE_BATCH"),
-                        "branch": item.get("branch", "JOINT"),
-                        "timestamp": item.get("timestamp", now.isoformat()),
-                        "synced": False,
-                    })
+        self._send_json({
+            "task_type": task_type,
+            "result": result_data,
+            "result_hash": result_hash,
+            "audit_logged": True,
+            "timestamp": now.isoformat(),
+        })
 
-            # Process unsynced queue items
-            synced_count = 0
-            failed_count = 0
-            for item in _offline_hash_queue:
-                if item.get("synced"):
-                    continue
-                xrpl_result = _anchor_xrpl(item["hash"], record_type=item["record_type"], branch=item["branch"])
-                if xrpl_result:
-                    item["synced"] = True
-                    item["tx_hash"] = xrpl_result["tx_hash"]
-                    item["synced_at"] = now.isoformat()
-                    synced_count += 1
-                    # Add to live records
-                    sync_record = {
-                        "hash": item["hash"],
-                        "record_type": item["record_type"],
-                        "record_label": f"Batch Sync — {item['record_type']}",
-                        "branch": item["branch"],
-                        "icon": "\U0001f504",
-                        "timestamp": item["timestamp"],
-                        "timestamp_display": now.strftime("%Y-%m-%d %H:%M:%S UTC"),
-                        "fee": 0.01,
-                        "tx_hash": xrpl_result["tx_hash"],
-                        "system": "Offline/Batch",
-                        "record_id": f"REC-SYNC-{hashlib.sha256(item['hash'].encode()).hexdigest()[:10].upper()}",
-                    }
-                    _live_records.append(sync_record)
-                    _persist_record(sync_record)
-                else:
-                    failed_count += 1
+    def _handle_post_offline_sync(self, parsed, data):
+        """POST /api/offline/sync"""
+        self._log_request("offline-sync")
+        # Process the offline hash queue — anchor all queued hashes
+        now = datetime.now(timezone.utc)
+        hashes_to_sync = data.get("hashes", [])
+        mode = os.environ.get("S4_MODE", "online")
+
+        if hashes_to_sync:
+            # Incoming batch from air-gapped system
+            for item in hashes_to_sync:
+                _offline_hash_queue.append({
+                    "hash": item.get("hash", ""),
+                    "record_type": item.get("record_type", "OFFLINE_BATCH"),
+                    "branch": item.get("branch", "JOINT"),
+                    "timestamp": item.get("timestamp", now.isoformat()),
+                    "synced": False,
+                })
 
-            global _offline_last_sync
-            if synced_count > 0:
-                _offline_last_sync = now.isoformat()
+        # Process unsynced queue items
+        synced_count = 0
+        failed_count = 0
+        synced_records = []
+        for item in _offline_hash_queue:
+            if item.get("synced"):
+                continue
+            xrpl_result = _anchor_xrpl(item["hash"], record_type=item["record_type"], branch=item["branch"])
+            if xrpl_result:
+                item["synced"] = True
+                item["tx_hash"] = xrpl_result["tx_hash"]
+                item["synced_at"] = now.isoformat()
+                synced_count += 1
+                # Add to live records
+                sync_record = {
+                    "hash": item["hash"],
+                    "record_type": item["record_type"],
+                    "record_label": f"Batch Sync — {item['record_type']}",
+                    "branch": item["branch"],
+                    "icon": "\U0001f504",
+                    "timestamp": item["timestamp"],
+                    "timestamp_display": now.strftime("%Y-%m-%d %H:%M:%S UTC"),
+                    "fee": 0.01,
+                    "tx_hash": xrpl_result["tx_hash"],
+                    "system": "Offline/Batch",
+                    "record_id": f"REC-SYNC-{hashlib.sha256(item['hash'].encode()).hexdigest()[:10].upper()}",
+                }
+                _append_record(sync_record)
+                synced_records.append(sync_record)
+            else:
+                failed_count += 1
+        persist_report = _persist_records(synced_records)
 
-            _deliver_webhook("batch.completed", {"synced": synced_count, "failed": failed_count, "queue_remaining": sum(1 for i in _offline_hash_queue if not i.get("synced"))})
+        global _offline_last_sync
+        if synced_count > 0:
+            _offline_last_sync = now.isoformat()
 
-            self._send_json({
-                "status": "sync_complete",
-                "synced": synced_count,
-                "failed": failed_count,
-                "queue_remaining": sum(1 for i in _offline_hash_queue if not i.get("synced")),
-                "last_sync": _offline_last_sync,
-                "timestamp": now.isoformat(),
-            })
+        _deliver_webhook("batch.completed", {"synced": synced_count, "failed": failed_count, "queue_remaining": sum(1 for i in _offline_hash_queue if not i.get("synced"))})
 
-        elif route == "verify_ai":
-            self._log_request("verify-ai")
-            # Verify an AI decision by its response hash
-            response_hash = data.get("response_hash", "")
-            if not response_hash:
-                self._send_json({"error": "response_hash is required"}, 400)
-                return
-            found = [a for a in _ai_audit_log if a.get("response_hash") == response_hash]
-            if found:
-                entry = found[0]
-                self._send_json({
-                    "verified": True,
-                    "audit_entry": entry,
-                    "transparency": {
-                        "query": entry.get("query", ""),
-                        "intent": entry.get("intent", ""),
-                        "timestamp": entry.get("timestamp", ""),
-                        "response_hash": response_hash,
-                    },
-                    "message": "AI decision found in audit trail. Hash integrity verified.",
-                })
-            else:
-                self._send_json({
-                    "verified": False,
-                    "message": "No matching AI decision found in audit trail.",
-                    "response_hash": response_hash,
-                })
+        self._send_json({
+            "status": "sync_complete",
+            "synced": synced_count,
+            "failed": failed_count,
+            "queue_remaining": sum(1 for i in _offline_hash_queue if not i.get("synced")),
+            "persisted": persist_report["written"],
+            "persist_failed": [f["record_id"] for f in persist_report["failed"]],
+            "last_sync": _offline_last_sync,
+            "timestamp": now.isoformat(),
+        })
 
-        elif route == "security_zkp":
-            self._log_request("security-zkp-post")
-            # Generate or verify a ZKP
-            data_hash = data.get("hash", "")
-            proof = data.get("proof", None)
-            if not data_hash:
-                self._send_json({"error": "hash is required"}, 400)
-                return
-            result = _zkp_verify_stub(data_hash, proof)
+    def _handle_post_verify_ai(self, parsed, data):
+        """POST /api/verify/ai"""
+        self._log_request("verify-ai")
+        # Verify an AI decision by its response hash
+        response_hash = data.get("response_hash", "")
+        if not response_hash:
+            self._send_json({"error": "response_hash is required"}, 400)
+            return
+        found = [a for a in _ai_audit_log if a.get("response_hash") == response_hash]
+        if found:
+            entry = found[0]
             self._send_json({
-                "hash": data_hash,
-                "zkp": result,
-                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "verified": True,
+                "audit_entry": entry,
+                "transparency": {
+                    "query": entry.get("query", ""),
+                    "intent": entry.get("intent", ""),
+                    "timestamp": entry.get("timestamp", ""),
+                    "response_hash": response_hash,
+                },
+                "message": "AI decision found in audit trail. Hash integrity verified.",
             })
-
-        elif route == "security_rbac":
-            self._log_request("security-rbac-post")
-            # Update role for an API key (admin only)
-            api_key = self.headers.get("X-API-Key", "")
-            allowed, caller_role = _check_rbac(api_key, "*")
-            if not allowed:
-                self._send_json({"error": "Insufficient permissions. Admin role required.", "your_role": caller_role}, 403)
-                return
-            target_key = data.get("api_key", "")
-            new_role = data.get("role", "")
-            if not target_key or new_role not in RBAC_ROLES:
-                self._send_json({"error": "api_key and valid role are required", "valid_roles": list(RBAC_ROLES.keys())}, 400)
-                return
-            if target_key not in API_KEYS_STORE:
-                API_KEYS_STORE[target_key] = {}
-            API_KEYS_STORE[target_key]["role"] = new_role
+        else:
             self._send_json({
-                "status": "role_updated",
-                "api_key_prefix": target_key[:8] + "...",
-                "new_role": new_role,
-                "permissions": RBAC_ROLES[new_role]["permissions"],
+                "verified": False,
+                "message": "No matching AI decision found in audit trail.",
+                "response_hash": response_hash,
             })
 
-        # ═══════════════════════════════════════════════════════════════
-        #  ILS TOOL POST HANDLERS — CRUD operations for all ILS data
-        # ═══════════════════════════════════════════════════════════════
+    def _handle_post_security_zkp(self, parsed, data):
+        """POST /api/security/zkp"""
+        self._log_request("security-zkp-post")
+        # Generate or verify a ZKP
+        data_hash = data.get("hash", "")
+        proof = data.get("proof", None)
+        if not data_hash:
+            self._send_json({"error": "hash is required"}, 400)
+            return
+        result = _zkp_verify_stub(data_hash, proof)
+        self._send_json({
+            "hash": data_hash,
+            "zkp": result,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        })
 
-        elif route == "dmsms":
-            self._log_request("dmsms-post")
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "program": data.get("program", "ddg51"),
-                "nsn": data.get("nsn", ""),
-                "part_name": data.get("part_name", ""),
-                "cage_code": data.get("cage_code", ""),
-                "manufacturer": data.get("manufacturer", ""),
-                "status": data.get("status", "Active"),
-                "severity": data.get("severity", "None"),
-                "replacement_nsn": data.get("replacement_nsn", ""),
-                "mitigation": data.get("mitigation", ""),
-                "notes": data.get("notes", ""),
-            }
-            if not row["part_name"]:
-                self._send_json({"error": "part_name is required"}, 400)
-                return
-            result = _sb_insert("dmsms_items", row)
-            self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+    def _handle_post_security_rbac(self, parsed, data):
+        """POST /api/security/rbac"""
+        self._log_request("security-rbac-post")
+        # Update role for an API key (admin only)
+        api_key = self.headers.get("X-API-Key", "")
+        allowed, caller_role = _check_rbac(api_key, "*")
+        if not allowed:
+            self._send_json({"error": "Insufficient permissions. Admin role required.", "your_role": caller_role}, 403)
+            return
+        target_key = data.get("api_key", "")
+        new_role = data.get("role", "")
+        if not target_key or new_role not in RBAC_ROLES:
+            self._send_json({"error": "api_key and valid role are required", "valid_roles": list(RBAC_ROLES.keys())}, 400)
+            return
+        if target_key not in API_KEYS_STORE:
+            API_KEYS_STORE[target_key] = {}
+        API_KEYS_STORE[target_key]["role"] = new_role
+        self._send_json({
+            "status": "role_updated",
+            "api_key_prefix": target_key[:8] + "...",
+            "new_role": new_role,
+            "permissions": RBAC_ROLES[new_role]["permissions"],
+        })
 
-        elif route == "parts":
-            self._log_request("parts-post")
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "nsn": data.get("nsn", ""),
-                "part_name": data.get("part_name", data.get("name", "")),
-                "cage_code": data.get("cage_code", data.get("cage", "")),
-                "manufacturer": data.get("manufacturer", data.get("mfg", "")),
-                "status": data.get("status", "Available"),
-                "unit_price": data.get("unit_price", None),
-                "lead_time_days": data.get("lead_time_days", None),
-                "alternates": json.dumps(data.get("alternates", [])),
+    # ═══════════════════════════════════════════════════════════════
+    #  ILS TOOL POST HANDLERS — CRUD operations for all ILS data
+    # ═══════════════════════════════════════════════════════════════
+
+    def _handle_post_dmsms(self, parsed, data):
+        """POST /api/dmsms"""
+        self._log_request("dmsms-post")
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "program": data.get("program", "ddg51"),
+            "nsn": data.get("nsn", ""),
+            "part_name": data.get("part_name", ""),
+            "cage_code": data.get("cage_code", ""),
+            "manufacturer": data.get("manufacturer", ""),
+            "status": data.get("status", "Active"),
+            "severity": data.get("severity", "None"),
+            "replacement_nsn": data.get("replacement_nsn", ""),
+            "mitigation": data.get("mitigation", ""),
+            "notes": data.get("notes", ""),
+        }
+        if not row["part_name"]:
+            self._send_json({"error": "part_name is required"}, 400)
+            return
+        result = _sb_insert("dmsms_items", row)
+        self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_parts(self, parsed, data):
+        """POST /api/parts"""
+        self._log_request("parts-post")
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "nsn": data.get("nsn", ""),
+            "part_name": data.get("part_name", data.get("name", "")),
+            "cage_code": data.get("cage_code", data.get("cage", "")),
+            "manufacturer": data.get("manufacturer", data.get("mfg", "")),
+            "status": data.get("status", "Available"),
+            "unit_price": data.get("unit_price", None),
+            "lead_time_days": data.get("lead_time_days", None),
+            "alternates": json.dumps(data.get("alternates", [])),
+        }
+        if not row["nsn"] or not row["part_name"]:
+            self._send_json({"error": "nsn and part_name are required"}, 400)
+            return
+        result = _sb_insert("parts_catalog", row)
+        self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_warranty(self, parsed, data):
+        """POST /api/warranty"""
+        self._log_request("warranty-post")
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "program": data.get("program", "ddg51"),
+            "system_name": data.get("system_name", data.get("system", "")),
+            "contract_type": data.get("contract_type", "OEM Warranty"),
+            "status": data.get("status", "Active"),
+            "start_date": data.get("start_date", None),
+            "end_date": data.get("end_date", None),
+            "days_left": data.get("days_left", None),
+            "value": data.get("value", 0),
+            "vendor": data.get("vendor", ""),
+            "notes": data.get("notes", ""),
+        }
+        if not row["system_name"]:
+            self._send_json({"error": "system_name is required"}, 400)
+            return
+        result = _sb_insert("warranty_items", row)
+        self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_supply_chain_risk(self, parsed, data):
+        """POST /api/supply-chain-risk"""
+        self._log_request("supply-chain-risk-post")
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "program": data.get("program", "ddg51"),
+            "part_name": data.get("part_name", data.get("part", "")),
+            "nsn": data.get("nsn", ""),
+            "supplier": data.get("supplier", ""),
+            "risk_score": data.get("risk_score", data.get("score", 0)),
+            "risk_level": data.get("risk_level", data.get("level", "low")),
+            "factors": json.dumps(data.get("factors", [])),
+            "eta_impact": data.get("eta_impact", ""),
+            "mitigation": data.get("mitigation", ""),
+        }
+        if not row["part_name"]:
+            self._send_json({"error": "part_name is required"}, 400)
+            return
+        result = _sb_insert("supply_chain_risks", row)
+        self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_contracts(self, parsed, data):
+        """POST /api/contracts"""
+        self._log_request("contracts-post")
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "contract_id": data.get("contract_id", data.get("contract", "N00024-25-C-5501")),
+            "item_id": data.get("item_id", data.get("id", "")),
+            "description": data.get("description", data.get("desc", "")),
+            "item_type": data.get("item_type", data.get("type", "cdrl")),
+            "di_number": data.get("di_number", data.get("di", "")),
+            "due_date": data.get("due_date", data.get("due", None)),
+            "status": data.get("status", "on_track"),
+            "anchored": data.get("anchored", False),
+        }
+        if not row["item_id"] or not row["description"]:
+            self._send_json({"error": "item_id and description are required"}, 400)
+            return
+        result = _sb_insert("contract_items", row)
+        self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_digital_thread(self, parsed, data):
+        """POST /api/digital-thread"""
+        self._log_request("digital-thread-post")
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "platform": data.get("platform", "ddg51"),
+            "item_id": data.get("item_id", data.get("id", "")),
+            "description": data.get("description", data.get("desc", "")),
+            "item_type": data.get("item_type", data.get("type", "Class I")),
+            "status": data.get("status", "pending"),
+            "anchored": data.get("anchored", False),
+        }
+        if not row["item_id"] or not row["description"]:
+            self._send_json({"error": "item_id and description are required"}, 400)
+            return
+        result = _sb_insert("digital_thread_items", row)
+        self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_predictive_maintenance(self, parsed, data):
+        """POST /api/predictive-maintenance"""
+        self._log_request("predictive-maintenance-post")
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "platform": data.get("platform", "ddg51"),
+            "system_name": data.get("system_name", data.get("system", "")),
+            "component": data.get("component", ""),
+            "failure_mode": data.get("failure_mode", data.get("mode", "")),
+            "confidence": data.get("confidence", 0),
+            "eta_days": data.get("eta_days", 0),
+            "cost_unplanned": data.get("cost_unplanned", 0),
+            "urgent": data.get("urgent", False),
+        }
+        if not row["system_name"] or not row["component"]:
+            self._send_json({"error": "system_name and component are required"}, 400)
+            return
+        result = _sb_insert("predictive_maint", row)
+        self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_action_items(self, parsed, data):
+        """POST /api/action-items"""
+        self._log_request("action-items-post")
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "item_id": data.get("item_id", data.get("id", f"AI-{hashlib.sha256(str(datetime.now(timezone.utc)).encode()).hexdigest()[:6].upper()}")),
+            "title": data.get("title", ""),
+            "severity": data.get("severity", "warning"),
+            "source_tool": data.get("source_tool", data.get("source", "")),
+            "estimated_cost": data.get("estimated_cost", data.get("cost", 0)),
+            "schedule": data.get("schedule", ""),
+            "done": data.get("done", False),
+            "assigned_to": data.get("assigned_to", ""),
+            "notes": data.get("notes", ""),
+        }
+        if not row["title"]:
+            self._send_json({"error": "title is required"}, 400)
+            return
+        result = _sb_insert("action_items", row)
+        self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_calendar(self, parsed, data):
+        """POST /api/calendar"""
+        self._log_request("calendar-post")
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "event_id": data.get("event_id", data.get("id", f"E-{hashlib.sha256(str(datetime.now(timezone.utc)).encode()).hexdigest()[:6].upper()}")),
+            "title": data.get("title", ""),
+            "event_date": data.get("event_date", data.get("date", "")),
+            "event_time": data.get("event_time", data.get("time", None)),
+            "event_type": data.get("event_type", data.get("type", "info")),
+            "source_tool": data.get("source_tool", data.get("source", "")),
+            "description": data.get("description", ""),
+        }
+        if not row["title"] or not row["event_date"]:
+            self._send_json({"error": "title and event_date are required"}, 400)
+            return
+        result = _sb_insert("calendar_events", row)
+        self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_audit_vault(self, parsed, data):
+        """POST /api/audit-vault"""
+        self._log_request("audit-vault-post")
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "doc_id": data.get("doc_id", f"DOC-{hashlib.sha256(str(datetime.now(timezone.utc)).encode()).hexdigest()[:8].upper()}"),
+            "title": data.get("title", ""),
+            "doc_type": data.get("doc_type", "audit_report"),
+            "classification": data.get("classification", "unclassified"),
+            "hash": data.get("hash", ""),
+            "anchored": data.get("anchored", False),
+            "anchor_tx": data.get("anchor_tx", ""),
+            "file_size_bytes": data.get("file_size_bytes", 0),
+            "uploaded_by": data.get("uploaded_by", ""),
+        }
+        if not row["title"]:
+            self._send_json({"error": "title is required"}, 400)
+            return
+        result = _sb_insert("audit_vault", row)
+        self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_doc_library(self, parsed, data):
+        """POST /api/doc-library"""
+        self._log_request("doc-library-post")
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "doc_id": data.get("doc_id", f"LIB-{hashlib.sha256(str(datetime.now(timezone.utc)).encode()).hexdigest()[:8].upper()}"),
+            "title": data.get("title", ""),
+            "doc_type": data.get("doc_type", "technical_manual"),
+            "di_number": data.get("di_number", ""),
+            "revision": data.get("revision", "A"),
+            "status": data.get("status", "current"),
+            "hash": data.get("hash", ""),
+            "anchored": data.get("anchored", False),
+        }
+        if not row["title"]:
+            self._send_json({"error": "title is required"}, 400)
+            return
+        result = _sb_insert("doc_library", row)
+        self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_compliance_scorecard(self, parsed, data):
+        """POST /api/compliance-scorecard"""
+        self._log_request("compliance-scorecard-post")
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "program": data.get("program", "ddg51"),
+            "framework": data.get("framework", ""),
+            "score": data.get("score", 0),
+            "max_score": data.get("max_score", 100),
+            "level": data.get("level", ""),
+            "findings": data.get("findings", 0),
+            "critical_gaps": data.get("critical_gaps", 0),
+            "assessment_date": data.get("assessment_date", None),
+            "assessor": data.get("assessor", ""),
+        }
+        if not row["framework"]:
+            self._send_json({"error": "framework is required"}, 400)
+            return
+        result = _sb_insert("compliance_scores", row)
+        self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_ils_gap_analysis(self, parsed, data):
+        """POST /api/ils/gap-analysis"""
+        self._log_request("ils-gap-analysis-post")
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "program": data.get("program", "ddg51"),
+            "phase": data.get("phase", "emd"),
+            "gap_id": data.get("gap_id", data.get("id", "")),
+            "element": data.get("element", ""),
+            "severity": data.get("severity", "warning"),
+            "di_number": data.get("di_number", data.get("di", "")),
+            "action_required": data.get("action_required", data.get("action", "")),
+            "owner": data.get("owner", ""),
+            "cost": data.get("cost", 0),
+            "status": data.get("status", "open"),
+        }
+        if not row["element"]:
+            self._send_json({"error": "element is required"}, 400)
+            return
+        result = _sb_insert("gap_analysis", row)
+        self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_logistics_risk_score(self, parsed, data):
+        """POST /api/logistics/risk-score"""
+        self._log_request("logistics-risk-score-post")
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "program": data.get("program", "ddg51"),
+            "factor": data.get("factor", ""),
+            "score": data.get("score", 0),
+            "weight": data.get("weight", 0),
+            "category": data.get("category", ""),
+            "mitigation": data.get("mitigation", ""),
+        }
+        if not row["factor"]:
+            self._send_json({"error": "factor is required"}, 400)
+            return
+        result = _sb_insert("risk_factors", row)
+        self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+
+    # ═══════════════════════════════════════════════════════════════
+    #  POST HANDLERS — Full Persistence + Superior Platform Features
+    # ═══════════════════════════════════════════════════════════════
+
+    def _handle_post_ils_uploads(self, parsed, data):
+        """POST /api/ils/uploads"""
+        self._log_request("ils-uploads-post")
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "user_email": data.get("user_email", ""),
+            "tool_id": data.get("tool_id", "gap_analysis"),
+            "program": data.get("program", ""),
+            "filename": data.get("filename", ""),
+            "file_type": data.get("file_type", ""),
+            "file_size": data.get("file_size", 0),
+            "row_count": data.get("row_count", 0),
+            "parsed_data": json.dumps(data.get("parsed_data", [])) if isinstance(data.get("parsed_data"), list) else data.get("parsed_data", "[]"),
+            "metadata": json.dumps(data.get("metadata", {})) if isinstance(data.get("metadata"), dict) else data.get("metadata", "{}"),
+            "hash": data.get("hash", ""),
+        }
+        if not row["filename"]:
+            self._send_json({"error": "filename is required"}, 400)
+            return
+        result = _sb_insert("ils_uploads", row)
+        self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_documents(self, parsed, data):
+        """POST /api/documents"""
+        self._log_request("documents-post")
+        import uuid
+        doc_id = data.get("doc_id", f"DOC-{uuid.uuid4().hex[:12].upper()}")
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "user_email": data.get("user_email", ""),
+            "doc_id": doc_id,
+            "title": data.get("title", ""),
+            "category": data.get("category", "general"),
+            "classification": data.get("classification", "unclassified"),
+            "content": data.get("content", ""),
+            "file_hash": data.get("file_hash", ""),
+            "tags": data.get("tags", []),
+            "status": data.get("status", "draft"),
+            "metadata": json.dumps(data.get("metadata", {})) if isinstance(data.get("metadata"), dict) else data.get("metadata", "{}"),
+        }
+        if not row["title"]:
+            self._send_json({"error": "title is required"}, 400)
+            return
+        result = _sb_upsert("documents", row)
+        self._send_json({"status": "created", "doc_id": doc_id, "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_document_versions(self, parsed, data):
+        """POST /api/documents/versions"""
+        self._log_request("document-versions-post")
+        row = {
+            "doc_id": data.get("doc_id", ""),
+            "version": data.get("version", 1),
+            "content": data.get("content", ""),
+            "change_summary": data.get("change_summary", ""),
+            "author_email": data.get("author_email", ""),
+            "file_hash": data.get("file_hash", ""),
+            "red_flags": json.dumps(data.get("red_flags", [])) if isinstance(data.get("red_flags"), list) else data.get("red_flags", "[]"),
+        }
+        if not row["doc_id"]:
+            self._send_json({"error": "doc_id is required"}, 400)
+            return
+        result = _sb_insert("document_versions", row)
+        self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_poam(self, parsed, data):
+        """POST /api/poam"""
+        self._log_request("poam-post")
+        import uuid
+        poam_id = data.get("poam_id", f"POAM-{uuid.uuid4().hex[:10].upper()}")
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "user_email": data.get("user_email", ""),
+            "poam_id": poam_id,
+            "weakness_id": data.get("weakness_id", ""),
+            "title": data.get("title", ""),
+            "description": data.get("description", ""),
+            "nist_control": data.get("nist_control", ""),
+            "risk_level": data.get("risk_level", "moderate"),
+            "status": data.get("status", "open"),
+            "milestones": json.dumps(data.get("milestones", [])) if isinstance(data.get("milestones"), list) else data.get("milestones", "[]"),
+            "due_date": data.get("due_date"),
+            "completed_date": data.get("completed_date"),
+            "responsible": data.get("responsible", ""),
+            "resources": data.get("resources", ""),
+            "cost_estimate": data.get("cost_estimate", 0),
+            "source": data.get("source", ""),
+        }
+        if not row["title"]:
+            self._send_json({"error": "title is required"}, 400)
+            return
+        result = _sb_upsert("poam_items", row)
+        self._send_json({"status": "created", "poam_id": poam_id, "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_compliance_evidence(self, parsed, data):
+        """POST /api/compliance/evidence"""
+        self._log_request("compliance-evidence-post")
+        import uuid
+        evidence_id = data.get("evidence_id", f"EV-{uuid.uuid4().hex[:12].upper()}")
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "user_email": data.get("user_email", ""),
+            "evidence_id": evidence_id,
+            "control_id": data.get("control_id", ""),
+            "control_family": data.get("control_family", ""),
+            "filename": data.get("filename", ""),
+            "file_type": data.get("file_type", ""),
+            "file_size": data.get("file_size", 0),
+            "file_hash": data.get("file_hash", ""),
+            "description": data.get("description", ""),
+            "status": data.get("status", "submitted"),
+            "reviewer": data.get("reviewer", ""),
+            "metadata": json.dumps(data.get("metadata", {})) if isinstance(data.get("metadata"), dict) else data.get("metadata", "{}"),
+        }
+        if not row["control_id"]:
+            self._send_json({"error": "control_id is required"}, 400)
+            return
+        result = _sb_upsert("compliance_evidence", row)
+        self._send_json({"status": "created", "evidence_id": evidence_id, "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_submissions(self, parsed, data):
+        """POST /api/submissions"""
+        self._log_request("submissions-post")
+        import uuid
+        review_id = data.get("review_id", f"SUB-{uuid.uuid4().hex[:12].upper()}")
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "user_email": data.get("user_email", ""),
+            "review_id": review_id,
+            "program": data.get("program", ""),
+            "branch": data.get("branch", ""),
+            "doc_type": data.get("doc_type", ""),
+            "vendor": data.get("vendor", ""),
+            "item_count": data.get("item_count", 0),
+            "baseline_count": data.get("baseline_count", 0),
+            "discrepancy_count": data.get("discrepancy_count", 0),
+            "critical_count": data.get("critical_count", 0),
+            "cost_delta": data.get("cost_delta", 0),
+            "items": json.dumps(data.get("items", [])) if isinstance(data.get("items"), list) else data.get("items", "[]"),
+            "baseline": json.dumps(data.get("baseline", [])) if isinstance(data.get("baseline"), list) else data.get("baseline", "[]"),
+            "discrepancies": json.dumps(data.get("discrepancies", [])) if isinstance(data.get("discrepancies"), list) else data.get("discrepancies", "[]"),
+            "report_hash": data.get("report_hash", ""),
+            "anchored": data.get("anchored", False),
+            "tx_hash": data.get("tx_hash", ""),
+        }
+        result = _sb_insert("submission_reviews", row)
+        self._send_json({"status": "created", "review_id": review_id, "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_team(self, parsed, data):
+        """POST /api/team"""
+        self._log_request("team-post")
+        import uuid
+        team_id = data.get("team_id", f"TEAM-{uuid.uuid4().hex[:10].upper()}")
+        row = {
+            "team_id": team_id,
+            "name": data.get("name", ""),
+            "org_id": self.headers.get("X-API-Key", ""),
+            "created_by": data.get("created_by", ""),
+            "plan": data.get("plan", "starter"),
+            "settings": json.dumps(data.get("settings", {})) if isinstance(data.get("settings"), dict) else data.get("settings", "{}"),
+        }
+        if not row["name"]:
+            self._send_json({"error": "name is required"}, 400)
+            return
+        result = _sb_insert("teams", row)
+        # Auto-add creator as admin
+        if result and data.get("created_by"):
+            _sb_insert("team_members", {
+                "team_id": team_id,
+                "email": data["created_by"],
+                "name": data.get("creator_name", ""),
+                "role": "admin",
+                "status": "active",
+                "invited_by": data["created_by"],
+            })
+        self._send_json({"status": "created", "team_id": team_id, "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_team_invite(self, parsed, data):
+        """POST /api/team/invite"""
+        self._log_request("team-invite-post")
+        import secrets
+        token = secrets.token_urlsafe(32)
+        row = {
+            "team_id": data.get("team_id", ""),
+            "email": data.get("email", ""),
+            "role": data.get("role", "analyst"),
+            "invited_by": data.get("invited_by", ""),
+            "token": token,
+            "expires_at": (datetime.now(timezone.utc) + timedelta(days=7)).isoformat(),
+        }
+        if not row["team_id"] or not row["email"]:
+            self._send_json({"error": "team_id and email are required"}, 400)
+            return
+        result = _sb_insert("team_invites", row)
+        self._send_json({"status": "invited", "token": token, "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_gfp(self, parsed, data):
+        """POST /api/gfp"""
+        self._log_request("gfp-post")
+        import uuid
+        gfp_id = data.get("gfp_id", f"GFP-{uuid.uuid4().hex[:12].upper()}")
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "user_email": data.get("user_email", ""),
+            "gfp_id": gfp_id,
+            "nsn": data.get("nsn", ""),
+            "nomenclature": data.get("nomenclature", ""),
+            "serial_number": data.get("serial_number", ""),
+            "contract_number": data.get("contract_number", ""),
+            "cage_code": data.get("cage_code", ""),
+            "unit_cost": data.get("unit_cost", 0),
+            "quantity": data.get("quantity", 1),
+            "condition": data.get("condition", "serviceable"),
+            "location": data.get("location", ""),
+            "custodian": data.get("custodian", ""),
+            "category": data.get("category", "equipment"),
+            "dd1662_ref": data.get("dd1662_ref", ""),
+            "last_inventory": data.get("last_inventory"),
+            "next_inventory": data.get("next_inventory"),
+            "status": data.get("status", "active"),
+            "provenance_hash": data.get("provenance_hash", ""),
+            "metadata": json.dumps(data.get("metadata", {})) if isinstance(data.get("metadata"), dict) else data.get("metadata", "{}"),
+        }
+        if not row["nomenclature"]:
+            self._send_json({"error": "nomenclature is required"}, 400)
+            return
+        result = _sb_upsert("gfp_items", row)
+        self._send_json({"status": "created", "gfp_id": gfp_id, "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_sbom(self, parsed, data):
+        """POST /api/sbom"""
+        self._log_request("sbom-post")
+        import uuid
+        sbom_id = data.get("sbom_id", f"SBOM-{uuid.uuid4().hex[:12].upper()}")
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "user_email": data.get("user_email", ""),
+            "sbom_id": sbom_id,
+            "system_name": data.get("system_name", ""),
+            "format": data.get("format", "cyclonedx"),
+            "spec_version": data.get("spec_version", ""),
+            "component_count": data.get("component_count", 0),
+            "vulnerability_count": data.get("vulnerability_count", 0),
+            "license_count": data.get("license_count", 0),
+            "components": json.dumps(data.get("components", [])) if isinstance(data.get("components"), list) else data.get("components", "[]"),
+            "vulnerabilities": json.dumps(data.get("vulnerabilities", [])) if isinstance(data.get("vulnerabilities"), list) else data.get("vulnerabilities", "[]"),
+            "metadata": json.dumps(data.get("metadata", {})) if isinstance(data.get("metadata"), dict) else data.get("metadata", "{}"),
+            "file_hash": data.get("file_hash", ""),
+        }
+        if not row["system_name"]:
+            self._send_json({"error": "system_name is required"}, 400)
+            return
+        result = _sb_insert("sbom_entries", row)
+        self._send_json({"status": "created", "sbom_id": sbom_id, "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_provenance(self, parsed, data):
+        """POST /api/provenance"""
+        self._log_request("provenance-post")
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "item_id": data.get("item_id", ""),
+            "item_type": data.get("item_type", "part"),
+            "nsn": data.get("nsn", ""),
+            "serial_number": data.get("serial_number", ""),
+            "event_type": data.get("event_type", "manufactured"),
+            "from_entity": data.get("from_entity", ""),
+            "to_entity": data.get("to_entity", ""),
+            "location": data.get("location", ""),
+            "evidence_hash": data.get("evidence_hash", ""),
+            "tx_hash": data.get("tx_hash", ""),
+            "qr_data": data.get("qr_data", ""),
+            "metadata": json.dumps(data.get("metadata", {})) if isinstance(data.get("metadata"), dict) else data.get("metadata", "{}"),
+        }
+        if not row["item_id"] or not row["event_type"]:
+            self._send_json({"error": "item_id and event_type are required"}, 400)
+            return
+        # Auto-generate QR data if not provided
+        if not row["qr_data"]:
+            qr_payload = {
+                "item_id": row["item_id"],
+                "nsn": row["nsn"],
+                "serial": row["serial_number"],
+                "event": row["event_type"],
+                "from": row["from_entity"],
+                "to": row["to_entity"],
+                "ts": datetime.now(timezone.utc).isoformat(),
             }
-            if not row["nsn"] or not row["part_name"]:
-                self._send_json({"error": "nsn and part_name are required"}, 400)
-                return
-            result = _sb_insert("parts_catalog", row)
-            self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+            row["qr_data"] = json.dumps(qr_payload)
+        result = _sb_insert("provenance_chain", row)
+        self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_ai_rag(self, parsed, data):
+        """POST /api/ai/rag"""
+        self._log_request("ai-rag-post")
+        import uuid
+        session_id = data.get("session_id", f"AI-{uuid.uuid4().hex[:12]}")
+        query = data.get("query", data.get("message", ""))
+        tool_context = data.get("tool_context", "")
+        org_id = self.headers.get("X-API-Key", "")
+        user_email = data.get("user_email", "")
 
-        elif route == "warranty":
-            self._log_request("warranty-post")
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "program": data.get("program", "ddg51"),
-                "system_name": data.get("system_name", data.get("system", "")),
-                "contract_type": data.get("contract_type", "OEM Warranty"),
-                "status": data.get("status", "Active"),
-                "start_date": data.get("start_date", None),
-                "end_date": data.get("end_date", None),
-                "days_left": data.get("days_left", None),
-                "value": data.get("value", 0),
-                "vendor": data.get("vendor", ""),
-                "notes": data.get("notes", ""),
-            }
-            if not row["system_name"]:
-                self._send_json({"error": "system_name is required"}, 400)
-                return
-            result = _sb_insert("warranty_items", row)
-            self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+        if not query:
+            self._send_json({"error": "query is required"}, 400)
+            return
 
-        elif route == "supply_chain_risk":
-            self._log_request("supply-chain-risk-post")
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "program": data.get("program", "ddg51"),
-                "part_name": data.get("part_name", data.get("part", "")),
-                "nsn": data.get("nsn", ""),
-                "supplier": data.get("supplier", ""),
-                "risk_score": data.get("risk_score", data.get("score", 0)),
-                "risk_level": data.get("risk_level", data.get("level", "low")),
-                "factors": json.dumps(data.get("factors", [])),
-                "eta_impact": data.get("eta_impact", ""),
-                "mitigation": data.get("mitigation", ""),
-            }
-            if not row["part_name"]:
-                self._send_json({"error": "part_name is required"}, 400)
-                return
-            result = _sb_insert("supply_chain_risks", row)
-            self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+        # RAG: Retrieve relevant document chunks for context
+        rag_context = ""
+        if org_id:
+            chunks = _sb_select("ai_document_chunks",
+                query_params=f"org_id=eq.{org_id}",
+                order="created_at.desc", limit=20)
+            if chunks:
+                # Simple keyword matching for RAG (production would use embeddings)
+                query_words = set(query.lower().split())
+                scored = []
+                for c in chunks:
+                    content = c.get("content", "").lower()
+                    score = sum(1 for w in query_words if w in content)
+                    if score > 0:
+                        scored.append((score, c))
+                scored.sort(key=lambda x: x[0], reverse=True)
+                top_chunks = scored[:5]
+                if top_chunks:
+                    rag_context = "\n\n---\nRelevant context from your documents:\n"
+                    for _, c in top_chunks:
+                        src = c.get("source_id", "unknown")
+                        rag_context += f"\n[From {src}]: {c['content'][:500]}\n"
+
+        # Save user message
+        _sb_insert("ai_conversations", {
+            "org_id": org_id,
+            "user_email": user_email,
+            "session_id": session_id,
+            "role": "user",
+            "content": query,
+            "tool_context": tool_context,
+        })
 
-        elif route == "contracts":
-            self._log_request("contracts-post")
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "contract_id": data.get("contract_id", data.get("contract", "N00024-25-C-5501")),
-                "item_id": data.get("item_id", data.get("id", "")),
-                "description": data.get("description", data.get("desc", "")),
-                "item_type": data.get("item_type", data.get("type", "cdrl")),
-                "di_number": data.get("di_number", data.get("di", "")),
-                "due_date": data.get("due_date", data.get("due", None)),
-                "status": data.get("status", "on_track"),
-                "anchored": data.get("anchored", False),
-            }
-            if not row["item_id"] or not row["description"]:
-                self._send_json({"error": "item_id and description are required"}, 400)
-                return
-            result = _sb_insert("contract_items", row)
-            self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+        # Generate AI response using Claude API if available
+        ai_response = ""
+        model_used = "rule-based"
+        anthropic_key = os.environ.get("ANTHROPIC_API_KEY", "").strip()
 
-        elif route == "digital_thread":
-            self._log_request("digital-thread-post")
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "platform": data.get("platform", "ddg51"),
-                "item_id": data.get("item_id", data.get("id", "")),
-                "description": data.get("description", data.get("desc", "")),
-                "item_type": data.get("item_type", data.get("type", "Class I")),
-                "status": data.get("status", "pending"),
-                "anchored": data.get("anchored", False),
-            }
-            if not row["item_id"] or not row["description"]:
-                self._send_json({"error": "item_id and description are required"}, 400)
-                return
-            result = _sb_insert("digital_thread_items", row)
-            self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+        if anthropic_key:
+            try:
+                system_prompt = (
+                    "You are S4 Ledger's defense logistics AI assistant. "
+                    "You help with ILS (Integrated Logistics Support), military supply chain, "
+                    "DMSMS, compliance (NIST/CMMC/RMF), contract management, and defense acquisition. "
+                    "Be precise, cite regulations when applicable, use defense terminology."
+                )
+                if tool_context:
+                    system_prompt += f"\n\nCurrent tool context: {tool_context}"
+                if rag_context:
+                    system_prompt += rag_context
+
+                messages = [{"role": "user", "content": query}]
+                # Fetch recent conversation history
+                history = _sb_select("ai_conversations",
+                    query_params=f"session_id=eq.{session_id}&role=neq.system",
+                    order="created_at.desc", limit=10)
+                if history and len(history) > 1:
+                    hist_messages = []
+                    for h in reversed(history[1:]):  # Skip current message
+                        hist_messages.append({"role": h.get("role", "user"), "content": h.get("content", "")})
+                    messages = hist_messages + messages
+
+                api_body = json.dumps({
+                    "model": "claude-sonnet-4-20250514",
+                    "max_tokens": 2048,
+                    "system": system_prompt,
+                    "messages": messages,
+                }).encode()
 
-        elif route == "predictive_maintenance":
-            self._log_request("predictive-maintenance-post")
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "platform": data.get("platform", "ddg51"),
-                "system_name": data.get("system_name", data.get("system", "")),
-                "component": data.get("component", ""),
-                "failure_mode": data.get("failure_mode", data.get("mode", "")),
-                "confidence": data.get("confidence", 0),
-                "eta_days": data.get("eta_days", 0),
-                "cost_unplanned": data.get("cost_unplanned", 0),
-                "urgent": data.get("urgent", False),
-            }
-            if not row["system_name"] or not row["component"]:
-                self._send_json({"error": "system_name and component are required"}, 400)
-                return
-            result = _sb_insert("predictive_maint", row)
-            self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+                req = urllib.request.Request(
+                    "https://api.anthropic.com/v1/messages",
+                    data=api_body,
+                    headers={
+                        "Content-Type": "application/json",
+                        "x-api-key": anthropic_key,
+                        "anthropic-version": "2023-06-01",
+                    },
+                    method="POST"
+                )
+                resp = _http.urlopen(req, timeout=30)
+                result_data = json.loads(resp.read())
+                ai_response = result_data.get("content", [{}])[0].get("text", "")
+                model_used = "claude-sonnet-4-20250514"
+            except Exception as e:
+                print(f"Claude API error: {e}")
+                ai_response = ""
+
+        # Fallback: rule-based response using ILS domain knowledge
+        if not ai_response:
+            q = query.lower()
+            if any(w in q for w in ["dmsms", "obsolescence", "diminishing"]):
+                ai_response = ("DMSMS (Diminishing Manufacturing Sources and Material Shortages) management:\n"
+                    "1. Conduct proactive surveillance using GIDEP notices\n"
+                    "2. Perform lifetime buy analysis per MIL-STD-3018\n"
+                    "3. Evaluate design refresh vs bridge buy vs form-fit-function replacement\n"
+                    "4. Document resolution plans in your DMSMS Case tracking system\n"
+                    "5. Report cost impacts and schedule risks to the program office")
+            elif any(w in q for w in ["compliance", "nist", "cmmc", "rmf"]):
+                ai_response = ("Defense compliance framework guidance:\n"
+                    "- NIST SP 800-171r2: 110 security requirements for CUI\n"
+                    "- CMMC 2.0: 3 levels (Foundational, Advanced, Expert)\n"
+                    "- RMF (Risk Management Framework): 6-step process per NIST SP 800-37\n"
+                    "- Create POA&M items for any identified gaps\n"
+                    "- Maintain evidence artifacts mapped to specific controls")
+            elif any(w in q for w in ["contract", "far", "dfars", "clause"]):
+                ai_response = ("Defense contract key clauses:\n"
+                    "- DFARS 252.211-7003: Item Unique Identification (IUID)\n"
+                    "- DFARS 252.225-7001: Buy American/DFARS specialty metals\n"
+                    "- DFARS 252.204-7012: Safeguarding CUI (NIST 800-171)\n"
+                    "- FAR 52.245-1: Government Property\n"
+                    "- FAR 52.246-2: Inspection of Supplies\n"
+                    "Use the Contract Clause Extraction tool to auto-parse your contracts.")
+            elif any(w in q for w in ["sbom", "software", "bill of materials", "cyclonedx", "spdx"]):
+                ai_response = ("Software Bill of Materials (SBOM) guidance:\n"
+                    "- EO 14028 mandates SBOM for federal software procurement\n"
+                    "- Supported formats: CycloneDX 1.4+ (preferred), SPDX 2.3+\n"
+                    "- Track: component name, version, supplier, license, vulnerabilities\n"
+                    "- Cross-reference against NVD/CVE databases for known vulnerabilities\n"
+                    "- Upload your SBOM files using the SBOM Management tool.")
+            elif any(w in q for w in ["gfp", "government property", "furnished"]):
+                ai_response = ("Government Furnished Property (GFP) management per FAR 45:\n"
+                    "- Track all items on DD Form 1662 (DOD Property in Custody of Contractors)\n"
+                    "- Categories: Equipment, Material, Special Tooling, STE, Plant Equipment\n"
+                    "- Conditions: New, Serviceable, Unserviceable, Condemned, In Repair\n"
+                    "- Conduct annual physical inventories\n"
+                    "- Report loss/damage within 24 hours per contract requirements\n"
+                    "- Use the GFP Tracker to manage your property accountability.")
+            else:
+                ai_response = (f"I can help with your query about: {query[:100]}\n\n"
+                    "Available S4 Ledger capabilities:\n"
+                    "- ILS Analysis (Gap Analysis, DMSMS, Parts, Lifecycle)\n"
+                    "- Compliance Management (NIST, CMMC, RMF with POA&M tracking)\n"
+                    "- Supply Chain Provenance (blockchain-verified with QR codes)\n"
+                    "- Contract Management (clause extraction, CDRL validation)\n"
+                    "- SBOM Management (CycloneDX/SPDX vulnerability scanning)\n"
+                    "- GFP Tracking (DD Form 1662 accountability)\n"
+                    "- Document Library (version control with hash verification)\n\n"
+                    "Please ask about a specific topic for detailed guidance.")
+            model_used = "rule-based-ils-v2"
+
+        # Save assistant response
+        _sb_insert("ai_conversations", {
+            "org_id": org_id,
+            "user_email": user_email,
+            "session_id": session_id,
+            "role": "assistant",
+            "content": ai_response,
+            "model": model_used,
+        })
 
-        elif route == "action_items":
-            self._log_request("action-items-post")
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "item_id": data.get("item_id", data.get("id", f"AI-{hashlib.sha256(str(datetime.now(timezone.utc)).encode()).hexdigest()[:6].upper()}")),
-                "title": data.get("title", ""),
-                "severity": data.get("severity", "warning"),
-                "source_tool": data.get("source_tool", data.get("source", "")),
-                "estimated_cost": data.get("estimated_cost", data.get("cost", 0)),
-                "schedule": data.get("schedule", ""),
-                "done": data.get("done", False),
-                "assigned_to": data.get("assigned_to", ""),
-                "notes": data.get("notes", ""),
-            }
-            if not row["title"]:
-                self._send_json({"error": "title is required"}, 400)
-                return
-            result = _sb_insert("action_items", row)
-            self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+        self._send_json({
+            "response": ai_response,
+            "session_id": session_id,
+            "model": model_used,
+            "rag_context_used": bool(rag_context),
+        })
 
-        elif route == "calendar":
-            self._log_request("calendar-post")
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "event_id": data.get("event_id", data.get("id", f"E-{hashlib.sha256(str(datetime.now(timezone.utc)).encode()).hexdigest()[:6].upper()}")),
-                "title": data.get("title", ""),
-                "event_date": data.get("event_date", data.get("date", "")),
-                "event_time": data.get("event_time", data.get("time", None)),
-                "event_type": data.get("event_type", data.get("type", "info")),
-                "source_tool": data.get("source_tool", data.get("source", "")),
-                "description": data.get("description", ""),
-            }
-            if not row["title"] or not row["event_date"]:
-                self._send_json({"error": "title and event_date are required"}, 400)
-                return
-            result = _sb_insert("calendar_events", row)
-            self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+    def _handle_post_cdrl_validate(self, parsed, data):
+        """POST /api/cdrl/validate"""
+        self._log_request("cdrl-validate-post")
+        import uuid
+        validation_id = data.get("validation_id", f"CDRL-{uuid.uuid4().hex[:12].upper()}")
+        cdrl_number = data.get("cdrl_number", "")
+        di_number = data.get("di_number", "")
+        document_title = data.get("document_title", "")
+        content = data.get("content", "")
+
+        if not cdrl_number and not di_number:
+            self._send_json({"error": "cdrl_number or di_number is required"}, 400)
+            return
 
-        elif route == "audit_vault":
-            self._log_request("audit-vault-post")
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "doc_id": data.get("doc_id", f"DOC-{hashlib.sha256(str(datetime.now(timezone.utc)).encode()).hexdigest()[:8].upper()}"),
-                "title": data.get("title", ""),
-                "doc_type": data.get("doc_type", "audit_report"),
-                "classification": data.get("classification", "unclassified"),
-                "hash": data.get("hash", ""),
-                "anchored": data.get("anchored", False),
-                "anchor_tx": data.get("anchor_tx", ""),
-                "file_size_bytes": data.get("file_size_bytes", 0),
-                "uploaded_by": data.get("uploaded_by", ""),
-            }
-            if not row["title"]:
-                self._send_json({"error": "title is required"}, 400)
-                return
-            result = _sb_insert("audit_vault", row)
-            self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+        # CDRL Compliance Validation Rules
+        results = []
+        pass_c = 0
+        fail_c = 0
+        warn_c = 0
+
+        # Rule 1: DI number format check (DI-XXXX-NNNNN)
+        di_pattern = re.compile(r"DI-[A-Z]{4}-\d{5}[A-Z]?")
+        if di_number:
+            if di_pattern.match(di_number):
+                results.append({"rule": "DI Number Format", "status": "pass", "detail": f"Valid DI format: {di_number}"})
+                pass_c += 1
+            else:
+                results.append({"rule": "DI Number Format", "status": "fail", "detail": f"Invalid DI format: {di_number}. Expected: DI-XXXX-NNNNN"})
+                fail_c += 1
+        else:
+            results.append({"rule": "DI Number Format", "status": "warn", "detail": "No DI number provided"})
+            warn_c += 1
+
+        # Rule 2: CDRL number format (A001-A999)
+        if cdrl_number:
+            cdrl_pat = re.compile(r"[A-Z]\d{3}")
+            if cdrl_pat.match(cdrl_number):
+                results.append({"rule": "CDRL Number Format", "status": "pass", "detail": f"Valid CDRL: {cdrl_number}"})
+                pass_c += 1
+            else:
+                results.append({"rule": "CDRL Number Format", "status": "fail", "detail": f"Invalid CDRL format: {cdrl_number}. Expected: A001-Z999"})
+                fail_c += 1
 
-        elif route == "doc_library":
-            self._log_request("doc-library-post")
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "doc_id": data.get("doc_id", f"LIB-{hashlib.sha256(str(datetime.now(timezone.utc)).encode()).hexdigest()[:8].upper()}"),
-                "title": data.get("title", ""),
-                "doc_type": data.get("doc_type", "technical_manual"),
-                "di_number": data.get("di_number", ""),
-                "revision": data.get("revision", "A"),
-                "status": data.get("status", "current"),
-                "hash": data.get("hash", ""),
-                "anchored": data.get("anchored", False),
+        # Rule 3: Document title present
+        if document_title:
+            results.append({"rule": "Document Title", "status": "pass", "detail": f"Title present: {document_title[:80]}"})
+            pass_c += 1
+        else:
+            results.append({"rule": "Document Title", "status": "fail", "detail": "Document title is missing"})
+            fail_c += 1
+
+        # Rule 4: Content analysis
+        if content:
+            content_lower = content.lower()
+            # Check for required sections based on common DID requirements
+            required_sections = {
+                "scope": ["scope", "1.0 scope", "1. scope"],
+                "applicable_documents": ["applicable document", "referenced document", "2.0 applicable"],
+                "requirements": ["requirement", "3.0 requirements", "technical requirement"],
             }
-            if not row["title"]:
-                self._send_json({"error": "title is required"}, 400)
-                return
-            result = _sb_insert("doc_library", row)
-            self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+            for section_name, keywords in required_sections.items():
+                found = any(kw in content_lower for kw in keywords)
+                if found:
+                    results.append({"rule": f"Section: {section_name}", "status": "pass", "detail": f"Found {section_name} section"})
+                    pass_c += 1
+                else:
+                    results.append({"rule": f"Section: {section_name}", "status": "warn", "detail": f"Missing {section_name} section (may be required by DID)"})
+                    warn_c += 1
 
-        elif route == "compliance_scorecard":
-            self._log_request("compliance-scorecard-post")
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "program": data.get("program", "ddg51"),
-                "framework": data.get("framework", ""),
-                "score": data.get("score", 0),
-                "max_score": data.get("max_score", 100),
-                "level": data.get("level", ""),
-                "findings": data.get("findings", 0),
-                "critical_gaps": data.get("critical_gaps", 0),
-                "assessment_date": data.get("assessment_date", None),
-                "assessor": data.get("assessor", ""),
-            }
-            if not row["framework"]:
-                self._send_json({"error": "framework is required"}, 400)
-                return
-            result = _sb_insert("compliance_scores", row)
-            self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+            # Check for classification marking
+            if any(m in content_lower for m in ["unclassified", "cui", "confidential", "secret", "top secret"]):
+                results.append({"rule": "Classification Marking", "status": "pass", "detail": "Classification marking found"})
+                pass_c += 1
+            else:
+                results.append({"rule": "Classification Marking", "status": "warn", "detail": "No classification marking detected"})
+                warn_c += 1
 
-        elif route == "ils_gap_analysis":
-            self._log_request("ils-gap-analysis-post")
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "program": data.get("program", "ddg51"),
-                "phase": data.get("phase", "emd"),
-                "gap_id": data.get("gap_id", data.get("id", "")),
-                "element": data.get("element", ""),
-                "severity": data.get("severity", "warning"),
-                "di_number": data.get("di_number", data.get("di", "")),
-                "action_required": data.get("action_required", data.get("action", "")),
-                "owner": data.get("owner", ""),
-                "cost": data.get("cost", 0),
-                "status": data.get("status", "open"),
-            }
-            if not row["element"]:
-                self._send_json({"error": "element is required"}, 400)
-                return
-            result = _sb_insert("gap_analysis", row)
-            self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+            # Check for distribution statement
+            if any(d in content_lower for d in ["distribution statement", "distribution a", "distribution b", "distribution c", "distribution d", "distribution e", "distribution f"]):
+                results.append({"rule": "Distribution Statement", "status": "pass", "detail": "Distribution statement found"})
+                pass_c += 1
+            else:
+                results.append({"rule": "Distribution Statement", "status": "fail", "detail": "No distribution statement found (required for all CDRLs)"})
+                fail_c += 1
+        else:
+            results.append({"rule": "Content Analysis", "status": "warn", "detail": "No content provided for analysis"})
+            warn_c += 1
+
+        total = pass_c + fail_c + warn_c
+        score = round((pass_c / total * 100) if total > 0 else 0, 1)
+
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "user_email": data.get("user_email", ""),
+            "validation_id": validation_id,
+            "cdrl_number": cdrl_number,
+            "di_number": di_number,
+            "document_title": document_title,
+            "pass_count": pass_c,
+            "fail_count": fail_c,
+            "warn_count": warn_c,
+            "results": json.dumps(results),
+            "overall_score": score,
+            "file_hash": data.get("file_hash", ""),
+        }
+        result = _sb_insert("cdrl_validations", row)
+        self._send_json({
+            "status": "validated",
+            "validation_id": validation_id,
+            "score": score,
+            "pass": pass_c,
+            "fail": fail_c,
+            "warn": warn_c,
+            "results": results,
+            "item": result[0] if result else row,
+        })
 
-        elif route == "logistics_risk_score":
-            self._log_request("logistics-risk-score-post")
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "program": data.get("program", "ddg51"),
-                "factor": data.get("factor", ""),
-                "score": data.get("score", 0),
-                "weight": data.get("weight", 0),
-                "category": data.get("category", ""),
-                "mitigation": data.get("mitigation", ""),
-            }
-            if not row["factor"]:
-                self._send_json({"error": "factor is required"}, 400)
-                return
-            result = _sb_insert("risk_factors", row)
-            self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+    def _handle_post_contract_extract(self, parsed, data):
+        """POST /api/contracts/extract"""
+        self._log_request("contract-extract-post")
+        import uuid
+        extraction_id = data.get("extraction_id", f"CX-{uuid.uuid4().hex[:12].upper()}")
+        content = data.get("content", "")
+        filename = data.get("filename", "")
+        contract_number = data.get("contract_number", "")
 
-        # ═══════════════════════════════════════════════════════════════
-        #  POST HANDLERS — Full Persistence + Superior Platform Features
-        # ═══════════════════════════════════════════════════════════════
+        if not content:
+            self._send_json({"error": "content is required"}, 400)
+            return
 
-        elif route == "ils_uploads":
-            self._log_request("ils-uploads-post")
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "user_email": data.get("user_email", ""),
-                "tool_id": data.get("tool_id", "gap_analysis"),
-                "program": data.get("program", ""),
-                "filename": data.get("filename", ""),
-                "file_type": data.get("file_type", ""),
-                "file_size": data.get("file_size", 0),
-                "row_count": data.get("row_count", 0),
-                "parsed_data": json.dumps(data.get("parsed_data", [])) if isinstance(data.get("parsed_data"), list) else data.get("parsed_data", "[]"),
-                "metadata": json.dumps(data.get("metadata", {})) if isinstance(data.get("metadata"), dict) else data.get("metadata", "{}"),
-                "hash": data.get("hash", ""),
-            }
-            if not row["filename"]:
-                self._send_json({"error": "filename is required"}, 400)
-                return
-            result = _sb_insert("ils_uploads", row)
-            self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+        # NLP-style clause extraction using regex patterns
+        clauses = []
+        cdrls = []
+        gfp_items_found = []
+        warranty_terms = []
+        data_rights = []
+
+        # Extract FAR/DFARS clauses
+        clause_pattern = re.compile(r"(?:FAR|DFARS)\s+(?:(?:52|252)\.\d{3}-\d+(?:/\d+)?)", re.IGNORECASE)
+        for match in clause_pattern.finditer(content):
+            clause_ref = match.group(0)
+            # Get surrounding context
+            start = max(0, match.start() - 100)
+            end = min(len(content), match.end() + 200)
+            context = content[start:end].strip()
+            clauses.append({
+                "reference": clause_ref,
+                "context": context,
+                "position": match.start(),
+            })
 
-        elif route == "documents":
-            self._log_request("documents-post")
-            import uuid
-            doc_id = data.get("doc_id", f"DOC-{uuid.uuid4().hex[:12].upper()}")
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "user_email": data.get("user_email", ""),
-                "doc_id": doc_id,
-                "title": data.get("title", ""),
-                "category": data.get("category", "general"),
-                "classification": data.get("classification", "unclassified"),
-                "content": data.get("content", ""),
-                "file_hash": data.get("file_hash", ""),
-                "tags": data.get("tags", []),
-                "status": data.get("status", "draft"),
-                "metadata": json.dumps(data.get("metadata", {})) if isinstance(data.get("metadata"), dict) else data.get("metadata", "{}"),
-            }
-            if not row["title"]:
-                self._send_json({"error": "title is required"}, 400)
-                return
-            result = _sb_upsert("documents", row)
-            self._send_json({"status": "created", "doc_id": doc_id, "item": result[0] if result else row}, 201 if result else 200)
+        # Extract CDRL references
+        cdrl_pattern = re.compile(r"(?:CDRL|DD\s*Form\s*1423)[\s:]*([A-Z]\d{3})", re.IGNORECASE)
+        for match in cdrl_pattern.finditer(content):
+            cdrls.append({
+                "cdrl_number": match.group(1),
+                "context": content[max(0, match.start()-50):min(len(content), match.end()+150)].strip(),
+            })
 
-        elif route == "document_versions":
-            self._log_request("document-versions-post")
-            row = {
-                "doc_id": data.get("doc_id", ""),
-                "version": data.get("version", 1),
-                "content": data.get("content", ""),
-                "change_summary": data.get("change_summary", ""),
-                "author_email": data.get("author_email", ""),
-                "file_hash": data.get("file_hash", ""),
-                "red_flags": json.dumps(data.get("red_flags", [])) if isinstance(data.get("red_flags"), list) else data.get("red_flags", "[]"),
-            }
-            if not row["doc_id"]:
-                self._send_json({"error": "doc_id is required"}, 400)
-                return
-            result = _sb_insert("document_versions", row)
-            self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+        # Extract DI numbers
+        di_pattern = re.compile(r"DI-[A-Z]{4}-\d{5}[A-Z]?")
+        for match in di_pattern.finditer(content):
+            cdrls.append({
+                "di_number": match.group(0),
+                "context": content[max(0, match.start()-50):min(len(content), match.end()+150)].strip(),
+            })
 
-        elif route == "poam":
-            self._log_request("poam-post")
-            import uuid
-            poam_id = data.get("poam_id", f"POAM-{uuid.uuid4().hex[:10].upper()}")
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "user_email": data.get("user_email", ""),
-                "poam_id": poam_id,
-                "weakness_id": data.get("weakness_id", ""),
-                "title": data.get("title", ""),
-                "description": data.get("description", ""),
-                "nist_control": data.get("nist_control", ""),
-                "risk_level": data.get("risk_level", "moderate"),
-                "status": data.get("status", "open"),
-                "milestones": json.dumps(data.get("milestones", [])) if isinstance(data.get("milestones"), list) else data.get("milestones", "[]"),
-                "due_date": data.get("due_date"),
-                "completed_date": data.get("completed_date"),
-                "responsible": data.get("responsible", ""),
-                "resources": data.get("resources", ""),
-                "cost_estimate": data.get("cost_estimate", 0),
-                "source": data.get("source", ""),
-            }
-            if not row["title"]:
-                self._send_json({"error": "title is required"}, 400)
-                return
-            result = _sb_upsert("poam_items", row)
-            self._send_json({"status": "created", "poam_id": poam_id, "item": result[0] if result else row}, 201 if result else 200)
-
-        elif route == "compliance_evidence":
-            self._log_request("compliance-evidence-post")
-            import uuid
-            evidence_id = data.get("evidence_id", f"EV-{uuid.uuid4().hex[:12].upper()}")
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "user_email": data.get("user_email", ""),
-                "evidence_id": evidence_id,
-                "control_id": data.get("control_id", ""),
-                "control_family": data.get("control_family", ""),
-                "filename": data.get("filename", ""),
-                "file_type": data.get("file_type", ""),
-                "file_size": data.get("file_size", 0),
-                "file_hash": data.get("file_hash", ""),
-                "description": data.get("description", ""),
-                "status": data.get("status", "submitted"),
-                "reviewer": data.get("reviewer", ""),
-                "metadata": json.dumps(data.get("metadata", {})) if isinstance(data.get("metadata"), dict) else data.get("metadata", "{}"),
-            }
-            if not row["control_id"]:
-                self._send_json({"error": "control_id is required"}, 400)
-                return
-            result = _sb_upsert("compliance_evidence", row)
-            self._send_json({"status": "created", "evidence_id": evidence_id, "item": result[0] if result else row}, 201 if result else 200)
-
-        elif route == "submissions":
-            self._log_request("submissions-post")
-            import uuid
-            review_id = data.get("review_id", f"SUB-{uuid.uuid4().hex[:12].upper()}")
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "user_email": data.get("user_email", ""),
-                "review_id": review_id,
-                "program": data.get("program", ""),
-                "branch": data.get("branch", ""),
-                "doc_type": data.get("doc_type", ""),
-                "vendor": data.get("vendor", ""),
-                "item_count": data.get("item_count", 0),
-                "baseline_count": data.get("baseline_count", 0),
-                "discrepancy_count": data.get("discrepancy_count", 0),
-                "critical_count": data.get("critical_count", 0),
-                "cost_delta": data.get("cost_delta", 0),
-                "items": json.dumps(data.get("items", [])) if isinstance(data.get("items"), list) else data.get("items", "[]"),
-                "baseline": json.dumps(data.get("baseline", [])) if isinstance(data.get("baseline"), list) else data.get("baseline", "[]"),
-                "discrepancies": json.dumps(data.get("discrepancies", [])) if isinstance(data.get("discrepancies"), list) else data.get("discrepancies", "[]"),
-                "report_hash": data.get("report_hash", ""),
-                "anchored": data.get("anchored", False),
-                "tx_hash": data.get("tx_hash", ""),
-            }
-            result = _sb_insert("submission_reviews", row)
-            self._send_json({"status": "created", "review_id": review_id, "item": result[0] if result else row}, 201 if result else 200)
-
-        elif route == "team":
-            self._log_request("team-post")
-            import uuid
-            team_id = data.get("team_id", f"TEAM-{uuid.uuid4().hex[:10].upper()}")
-            row = {
-                "team_id": team_id,
-                "name": data.get("name", ""),
-                "org_id": self.headers.get("X-API-Key", ""),
-                "created_by": data.get("created_by", ""),
-                "plan": data.get("plan", "starter"),
-                "settings": json.dumps(data.get("settings", {})) if isinstance(data.get("settings"), dict) else data.get("settings", "{}"),
-            }
-            if not row["name"]:
-                self._send_json({"error": "name is required"}, 400)
-                return
-            result = _sb_insert("teams", row)
-            # Auto-add creator as admin
-            if result and data.get("created_by"):
-                _sb_insert("team_members", {
-                    "team_id": team_id,
-                    "email": data["created_by"],
-                    "name": data.get("creator_name", ""),
-                    "role": "admin",
-                    "status": "active",
-                    "invited_by": data["created_by"],
-                })
-            self._send_json({"status": "created", "team_id": team_id, "item": result[0] if result else row}, 201 if result else 200)
-
-        elif route == "team_invite":
-            self._log_request("team-invite-post")
-            import uuid, secrets
-            token = secrets.token_urlsafe(32)
-            row = {
-                "team_id": data.get("team_id", ""),
-                "email": data.get("email", ""),
-                "role": data.get("role", "analyst"),
-                "invited_by": data.get("invited_by", ""),
-                "token": token,
-                "expires_at": (datetime.now(timezone.utc) + timedelta(days=7)).isoformat(),
-            }
-            if not row["team_id"] or not row["email"]:
-                self._send_json({"error": "team_id and email are required"}, 400)
-                return
-            result = _sb_insert("team_invites", row)
-            self._send_json({"status": "invited", "token": token, "item": result[0] if result else row}, 201 if result else 200)
-
-        elif route == "gfp":
-            self._log_request("gfp-post")
-            import uuid
-            gfp_id = data.get("gfp_id", f"GFP-{uuid.uuid4().hex[:12].upper()}")
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "user_email": data.get("user_email", ""),
-                "gfp_id": gfp_id,
-                "nsn": data.get("nsn", ""),
-                "nomenclature": data.get("nomenclature", ""),
-                "serial_number": data.get("serial_number", ""),
-                "contract_number": data.get("contract_number", ""),
-                "cage_code": data.get("cage_code", ""),
-                "unit_cost": data.get("unit_cost", 0),
-                "quantity": data.get("quantity", 1),
-                "condition": data.get("condition", "serviceable"),
-                "location": data.get("location", ""),
-                "custodian": data.get("custodian", ""),
-                "category": data.get("category", "equipment"),
-                "dd1662_ref": data.get("dd1662_ref", ""),
-                "last_inventory": data.get("last_inventory"),
-                "next_inventory": data.get("next_inventory"),
-                "status": data.get("status", "active"),
-                "provenance_hash": data.get("provenance_hash", ""),
-                "metadata": json.dumps(data.get("metadata", {})) if isinstance(data.get("metadata"), dict) else data.get("metadata", "{}"),
-            }
-            if not row["nomenclature"]:
-                self._send_json({"error": "nomenclature is required"}, 400)
-                return
-            result = _sb_upsert("gfp_items", row)
-            self._send_json({"status": "created", "gfp_id": gfp_id, "item": result[0] if result else row}, 201 if result else 200)
-
-        elif route == "sbom":
-            self._log_request("sbom-post")
-            import uuid
-            sbom_id = data.get("sbom_id", f"SBOM-{uuid.uuid4().hex[:12].upper()}")
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "user_email": data.get("user_email", ""),
-                "sbom_id": sbom_id,
-                "system_name": data.get("system_name", ""),
-                "format": data.get("format", "cyclonedx"),
-                "spec_version": data.get("spec_version", ""),
-                "component_count": data.get("component_count", 0),
-                "vulnerability_count": data.get("vulnerability_count", 0),
-                "license_count": data.get("license_count", 0),
-                "components": json.dumps(data.get("components", [])) if isinstance(data.get("components"), list) else data.get("components", "[]"),
-                "vulnerabilities": json.dumps(data.get("vulnerabilities", [])) if isinstance(data.get("vulnerabilities"), list) else data.get("vulnerabilities", "[]"),
-                "metadata": json.dumps(data.get("metadata", {})) if isinstance(data.get("metadata"), dict) else data.get("metadata", "{}"),
-                "file_hash": data.get("file_hash", ""),
-            }
-            if not row["system_name"]:
-                self._send_json({"error": "system_name is required"}, 400)
-                return
-            result = _sb_insert("sbom_entries", row)
-            self._send_json({"status": "created", "sbom_id": sbom_id, "item": result[0] if result else row}, 201 if result else 200)
-
-        elif route == "provenance":
-            self._log_request("provenance-post")
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "item_id": data.get("item_id", ""),
-                "item_type": data.get("item_type", "part"),
-                "nsn": data.get("nsn", ""),
-                "serial_number": data.get("serial_number", ""),
-                "event_type": data.get("event_type", "manufactured"),
-                "from_entity": data.get("from_entity", ""),
-                "to_entity": data.get("to_entity", ""),
-                "location": data.get("location", ""),
-                "evidence_hash": data.get("evidence_hash", ""),
-                "tx_hash": data.get("tx_hash", ""),
-                "qr_data": data.get("qr_data", ""),
-                "metadata": json.dumps(data.get("metadata", {})) if isinstance(data.get("metadata"), dict) else data.get("metadata", "{}"),
-            }
-            if not row["item_id"] or not row["event_type"]:
-                self._send_json({"error": "item_id and event_type are required"}, 400)
-                return
-            # Auto-generate QR data if not provided
-            if not row["qr_data"]:
-                qr_payload = {
-                    "item_id": row["item_id"],
-                    "nsn": row["nsn"],
-                    "serial": row["serial_number"],
-                    "event": row["event_type"],
-                    "from": row["from_entity"],
-                    "to": row["to_entity"],
-                    "ts": datetime.now(timezone.utc).isoformat(),
-                }
-                row["qr_data"] = json.dumps(qr_payload)
-            result = _sb_insert("provenance_chain", row)
-            self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
-
-        elif route == "ai_rag":
-            self._log_request("ai-rag-post")
-            import uuid
-            session_id = data.get("session_id", f"AI-{uuid.uuid4().hex[:12]}")
-            query = data.get("query", data.get("message", ""))
-            tool_context = data.get("tool_context", "")
-            org_id = self.headers.get("X-API-Key", "")
-            user_email = data.get("user_email", "")
-
-            if not query:
-                self._send_json({"error": "query is required"}, 400)
-                return
-
-            # RAG: Retrieve relevant document chunks for context
-            rag_context = ""
-            if org_id:
-                chunks = _sb_select("ai_document_chunks",
-                    query_params=f"org_id=eq.{org_id}",
-                    order="created_at.desc", limit=20)
-                if chunks:
-                    # Simple keyword matching for RAG (production would use embeddings)
-                    query_words = set(query.lower().split())
-                    scored = []
-                    for c in chunks:
-                        content = c.get("content", "").lower()
-                        score = sum(1 for w in query_words if w in content)
-                        if score > 0:
-                            scored.append((score, c))
-                    scored.sort(key=lambda x: x[0], reverse=True)
-                    top_chunks = scored[:5]
-                    if top_chunks:
-                        rag_context = "\n\n---\nRelevant context from your documents:\n"
-                        for _, c in top_chunks:
-                            src = c.get("source_id", "unknown")
-                            rag_context += f"\n[From {src}]: {c['content'][:500]}\n"
-
-            # Save user message
-            _sb_insert("ai_conversations", {
-                "org_id": org_id,
-                "user_email": user_email,
-                "session_id": session_id,
-                "role": "user",
-                "content": query,
-                "tool_context": tool_context,
+        # Extract GFP/Government Property references
+        gfp_pattern = re.compile(r"(?:government\s+(?:furnished|property)|GFP|GFE|GFI|DD\s*1662)", re.IGNORECASE)
+        for match in gfp_pattern.finditer(content):
+            gfp_items_found.append({
+                "type": match.group(0),
+                "context": content[max(0, match.start()-50):min(len(content), match.end()+200)].strip(),
             })
 
-            # Generate AI response using Claude API if available
-            ai_response = ""
-            model_used = "rule-based"
-            anthropic_key = os.environ.get("ANTHROPIC_API_KEY", "").strip()
-
-            if anthropic_key:
-                try:
-                    system_prompt = (
-                        "You are S4 Ledger's defense logistics AI assistant. "
-                        "You help with ILS (Integrated Logistics Support), military supply chain, "
-                        "DMSMS, compliance (NIST/CMMC/RMF), contract management, and defense acquisition. "
-                        "Be precise, cite regulations when applicable, use defense terminology."
-                    )
-                    if tool_context:
-                        system_prompt += f"\n\nCurrent tool context: {tool_context}"
-                    if rag_context:
-                        system_prompt += rag_context
-
-                    messages = [{"role": "user", "content": query}]
-                    # Fetch recent conversation history
-                    history = _sb_select("ai_conversations",
-                        query_params=f"session_id=eq.{session_id}&role=neq.system",
-                        order="created_at.desc", limit=10)
-                    if history and len(history) > 1:
-                        hist_messages = []
-                        for h in reversed(history[1:]):  # Skip current message
-                            hist_messages.append({"role": h.get("role", "user"), "content": h.get("content", "")})
-                        messages = hist_messages + messages
-
-                    api_body = json.dumps({
-                        "model": "claude-sonnet-4-20250514",
-                        "max_tokens": 2048,
-                        "system": system_prompt,
-                        "messages": messages,
-                    }).encode()
-
-                    req = urllib.request.Request(
-                        "https://api.anthropic.com/v1/messages",
-                        data=api_body,
-                        headers={
-                            "Content-Type": "application/json",
-                            "x-api-key": anthropic_key,
-                            "anthropic-version": "2023-06-01",
-                        },
-                        method="POST"
-                    )
-                    resp = urllib.request.urlopen(req, timeout=30)
-                    result_data = json.loads(resp.read())
-                    ai_response = result_data.get("content", [{}])[0].get("text", "")
-                    model_used = "claude-sonnet-4-20250514"
-                except Exception as e:
-                    print(f"Claude API error: {e}")
-                    ai_response = ""
-
-            # Fallback: rule-based response using ILS domain knowledge
-            if not ai_response:
-                q = query.lower()
-                if any(w in q for w in ["dmsms", "obsolescence", "diminishing"]):
-                    ai_response = ("DMSMS (Diminishing Manufacturing Sources and Material Shortages) management:\n"
-                        "1. Conduct proactive surveillance using GIDEP notices\n"
-                        "2. Perform lifetime buy analysis per MIL-STD-3018\n"
-                        "3. Evaluate design refresh vs bridge buy vs form-fit-function replacement\n"
-                        "4. Document resolution plans in your DMSMS Case tracking system\n"
-                        "5. Report cost impacts and schedule risks to the program office")
-                elif any(w in q for w in ["compliance", "nist", "cmmc", "rmf"]):
-                    ai_response = ("Defense compliance framework guidance:\n"
-                        "- NIST SP 800-171r2: 110 security requirements for CUI\n"
-                        "- CMMC 2.0: 3 levels (Foundational, Advanced, Expert)\n"
-                        "- RMF (Risk Management Framework): 6-step process per NIST SP 800-37\n"
-                        "- Create POA&M items for any identified gaps\n"
-                        "- Maintain evidence artifacts mapped to specific controls")
-                elif any(w in q for w in ["contract", "far", "dfars", "clause"]):
-                    ai_response = ("Defense contract key clauses:\n"
-                        "- DFARS 252.211-7003: Item Unique Identification (IUID)\n"
-                        "- DFARS 252.225-7001: Buy American/DFARS specialty metals\n"
-                        "- DFARS 252.204-7012: Safeguarding CUI (NIST 800-171)\n"
-                        "- FAR 52.245-1: Government Property\n"
-                        "- FAR 52.246-2: Inspection of Supplies\n"
-                        "Use the Contract Clause Extraction tool to auto-parse your contracts.")
-                elif any(w in q for w in ["sbom", "software", "bill of materials", "cyclonedx", "spdx"]):
-                    ai_response = ("Software Bill of Materials (SBOM) guidance:\n"
-                        "- EO 14028 mandates SBOM for federal software procurement\n"
-                        "- Supported formats: CycloneDX 1.4+ (preferred), SPDX 2.3+\n"
-                        "- Track: component name, version, supplier, license, vulnerabilities\n"
-                        "- Cross-reference against NVD/CVE databases for known vulnerabilities\n"
-                        "- Upload your SBOM files using the SBOM Management tool.")
-                elif any(w in q for w in ["gfp", "government property", "furnished"]):
-                    ai_response = ("Government Furnished Property (GFP) management per FAR 45:\n"
-                        "- Track all items on DD Form 1662 (DOD Property in Custody of Contractors)\n"
-                        "- Categories: Equipment, Material, Special Tooling, STE, Plant Equipment\n"
-                        "- Conditions: New, Serviceable, Unserviceable, Condemned, In Repair\n"
-                        "- Conduct annual physical inventories\n"
-                        "- Report loss/damage within 24 hours per contract requirements\n"
-                        "- Use the GFP Tracker to manage your property accountability.")
-                else:
-                    ai_response = (f"I can help with your query about: {query[:100]}\n\n"
-                        "Available S4 Ledger capabilities:\n"
-                        "- ILS Analysis (Gap Analysis, DMSMS, Parts, Lifecycle)\n"
-                        "- Compliance Management (NIST, CMMC, RMF with POA&M tracking)\n"
-                        "- Supply Chain Provenance (blockchain-verified with QR codes)\n"
-                        "- Contract Management (clause extraction, CDRL validation)\n"
-                        "- SBOM Management (CycloneDX/SPDX vulnerability scanning)\n"
-                        "- GFP Tracking (DD Form 1662 accountability)\n"
-                        "- Document Library (version control with hash verification)\n\n"
-                        "Please ask about a specific topic for detailed guidance.")
-                model_used = "rule-based-ils-v2"
-
-            # Save assistant response
-            _sb_insert("ai_conversations", {
-                "org_id": org_id,
-                "user_email": user_email,
-                "session_id": session_id,
-                "role": "assistant",
-                "content": ai_response,
-                "model": model_used,
+        # Extract warranty terms
+        warranty_pattern = re.compile(r"(?:warranty|guarantee|defect|latent\s+defect|correction\s+of\s+deficienc)", re.IGNORECASE)
+        for match in warranty_pattern.finditer(content):
+            warranty_terms.append({
+                "term": match.group(0),
+                "context": content[max(0, match.start()-50):min(len(content), match.end()+200)].strip(),
             })
 
-            self._send_json({
-                "response": ai_response,
-                "session_id": session_id,
-                "model": model_used,
-                "rag_context_used": bool(rag_context),
+        # Extract data rights references
+        rights_pattern = re.compile(r"(?:data\s+rights|technical\s+data|unlimited\s+rights|limited\s+rights|government\s+purpose\s+rights|DFARS\s+252\.227)", re.IGNORECASE)
+        for match in rights_pattern.finditer(content):
+            data_rights.append({
+                "type": match.group(0),
+                "context": content[max(0, match.start()-50):min(len(content), match.end()+200)].strip(),
             })
 
-        elif route == "cdrl_validate":
-            self._log_request("cdrl-validate-post")
-            import uuid
-            validation_id = data.get("validation_id", f"CDRL-{uuid.uuid4().hex[:12].upper()}")
-            cdrl_number = data.get("cdrl_number", "")
-            di_number = data.get("di_number", "")
-            document_title = data.get("document_title", "")
-            content = data.get("content", "")
-            filename = data.get("filename", "")
-
-            if not cdrl_number and not di_number:
-                self._send_json({"error": "cdrl_number or di_number is required"}, 400)
-                return
-
-            # CDRL Compliance Validation Rules
-            results = []
-            pass_c = 0
-            fail_c = 0
-            warn_c = 0
-
-            # Rule 1: DI number format check (DI-XXXX-NNNNN)
-            di_pattern = re.compile(r"DI-[A-Z]{4}-\d{5}[A-Z]?")
-            if di_number:
-                if di_pattern.match(di_number):
-                    results.append({"rule": "DI Number Format", "status": "pass", "detail": f"Valid DI format: {di_number}"})
-                    pass_c += 1
-                else:
-                    results.append({"rule": "DI Number Format", "status": "fail", "detail": f"Invalid DI format: {di_number}. Expected: DI-XXXX-NNNNN"})
-                    fail_c += 1
-            else:
-                results.append({"rule": "DI Number Format", "status": "warn", "detail": "No DI number provided"})
-                warn_c += 1
-
-            # Rule 2: CDRL number format (A001-A999)
-            if cdrl_number:
-                cdrl_pat = re.compile(r"[A-Z]\d{3}")
-                if cdrl_pat.match(cdrl_number):
-                    results.append({"rule": "CDRL Number Format", "status": "pass", "detail": f"Valid CDRL: {cdrl_number}"})
-                    pass_c += 1
-                else:
-                    results.append({"rule": "CDRL Number Format", "status": "fail", "detail": f"Invalid CDRL format: {cdrl_number}. Expected: A001-Z999"})
-                    fail_c += 1
-
-            # Rule 3: Document title present
-            if document_title:
-                results.append({"rule": "Document Title", "status": "pass", "detail": f"Title present: {document_title[:80]}"})
-                pass_c += 1
-            else:
-                results.append({"rule": "Document Title", "status": "fail", "detail": "Document title is missing"})
-                fail_c += 1
+        # Extract contract number if not provided
+        if not contract_number:
+            cn_pattern = re.compile(r"(?:contract\s+(?:no|number|#)[\s.:]*)?([HNWSF]\d{5}-\d{2}-[A-Z]-\d{4})", re.IGNORECASE)
+            cn_match = cn_pattern.search(content)
+            if cn_match:
+                contract_number = cn_match.group(1)
+
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "user_email": data.get("user_email", ""),
+            "extraction_id": extraction_id,
+            "contract_number": contract_number,
+            "filename": filename,
+            "clause_count": len(clauses),
+            "clauses": json.dumps(clauses),
+            "cdrls": json.dumps(cdrls),
+            "gfp_items": json.dumps(gfp_items_found),
+            "warranty_terms": json.dumps(warranty_terms),
+            "data_rights": json.dumps(data_rights),
+            "file_hash": data.get("file_hash", ""),
+        }
+        result = _sb_insert("contract_extractions", row)
+        self._send_json({
+            "status": "extracted",
+            "extraction_id": extraction_id,
+            "contract_number": contract_number,
+            "clause_count": len(clauses),
+            "clauses": clauses,
+            "cdrls": cdrls,
+            "gfp_references": gfp_items_found,
+            "warranty_terms": warranty_terms,
+            "data_rights": data_rights,
+            "item": result[0] if result else row,
+        })
 
-            # Rule 4: Content analysis
-            if content:
-                content_lower = content.lower()
-                # Check for required sections based on common DID requirements
-                required_sections = {
-                    "scope": ["scope", "1.0 scope", "1. scope"],
-                    "applicable_documents": ["applicable document", "referenced document", "2.0 applicable"],
-                    "requirements": ["requirement", "3.0 requirements", "technical requirement"],
+    def _handle_post_program_metrics(self, parsed, data):
+        """POST /api/program-metrics"""
+        self._log_request("program-metrics-post")
+        row = {
+            "org_id": self.headers.get("X-API-Key", ""),
+            "program": data.get("program", ""),
+            "metric_type": data.get("metric_type", ""),
+            "metric_value": data.get("metric_value", 0),
+            "period": data.get("period", ""),
+            "metadata": json.dumps(data.get("metadata", {})) if isinstance(data.get("metadata"), dict) else data.get("metadata", "{}"),
+        }
+        if not row["program"] or not row["metric_type"]:
+            self._send_json({"error": "program and metric_type are required"}, 400)
+            return
+        result = _sb_insert("program_metrics", row)
+        self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+
+    def _handle_post_state_save(self, parsed, data):
+        """POST /api/state/save"""
+        self._log_request("state-save")
+        self._save_user_state(data)
+
+    def _handle_post_errors_report(self, parsed, data):
+        """POST /api/errors/report"""
+        # Client-side error reporting — stores to Supabase for monitoring
+        self._log_request("errors-report")
+        try:
+            session_id = data.get("session_id", "unknown")
+            errors = data.get("errors", [])
+            if not errors:
+                self._send_json({"status": "ok", "stored": 0})
+                return
+            stored = 0
+            for err in errors[:20]:  # Max 20 errors per batch
+                row = {
+                    "session_id": session_id,
+                    "error_type": str(err.get("type", "unknown"))[:50],
+                    "message": str(err.get("msg", ""))[:500],
+                    "source": str(err.get("source", ""))[:300],
+                    "line": err.get("line"),
+                    "col": err.get("col"),
+                    "url": str(err.get("url", ""))[:300],
+                    "tag": str(err.get("tag", ""))[:50],
+                    "client_ts": err.get("ts"),
+                    "created_at": datetime.utcnow().isoformat() + "Z",
                 }
-                for section_name, keywords in required_sections.items():
-                    found = any(kw in content_lower for kw in keywords)
-                    if found:
-                        results.append({"rule": f"Section: {section_name}", "status": "pass", "detail": f"Found {section_name} section"})
-                        pass_c += 1
-                    else:
-                        results.append({"rule": f"Section: {section_name}", "status": "warn", "detail": f"Missing {section_name} section (may be required by DID)"})
-                        warn_c += 1
-
-                # Check for classification marking
-                if any(m in content_lower for m in ["unclassified", "cui", "confidential", "secret", "top secret"]):
-                    results.append({"rule": "Classification Marking", "status": "pass", "detail": "Classification marking found"})
-                    pass_c += 1
-                else:
-                    results.append({"rule": "Classification Marking", "status": "warn", "detail": "No classification marking detected"})
-                    warn_c += 1
-
-                # Check for distribution statement
-                if any(d in content_lower for d in ["distribution statement", "distribution a", "distribution b", "distribution c", "distribution d", "distribution e", "distribution f"]):
-                    results.append({"rule": "Distribution Statement", "status": "pass", "detail": "Distribution statement found"})
-                    pass_c += 1
-                else:
-                    results.append({"rule": "Distribution Statement", "status": "fail", "detail": "No distribution statement found (required for all CDRLs)"})
-                    fail_c += 1
-            else:
-                results.append({"rule": "Content Analysis", "status": "warn", "detail": "No content provided for analysis"})
-                warn_c += 1
-
-            total = pass_c + fail_c + warn_c
-            score = round((pass_c / total * 100) if total > 0 else 0, 1)
-
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "user_email": data.get("user_email", ""),
-                "validation_id": validation_id,
-                "cdrl_number": cdrl_number,
-                "di_number": di_number,
-                "document_title": document_title,
-                "pass_count": pass_c,
-                "fail_count": fail_c,
-                "warn_count": warn_c,
-                "results": json.dumps(results),
-                "overall_score": score,
-                "file_hash": data.get("file_hash", ""),
-            }
-            result = _sb_insert("cdrl_validations", row)
-            self._send_json({
-                "status": "validated",
-                "validation_id": validation_id,
-                "score": score,
-                "pass": pass_c,
-                "fail": fail_c,
-                "warn": warn_c,
-                "results": results,
-                "item": result[0] if result else row,
-            })
+                result = _sb_insert("client_errors", row)
+                if result:
+                    stored += 1
+            self._send_json({"status": "ok", "stored": stored})
+        except Exception as e:
+            # Never fail on error reporting — just acknowledge
+            self._send_json({"status": "ok", "stored": 0, "note": str(e)[:200]})
+
+    # ═══════════════════════════════════════════════════════════════
+    #  Living Program Ledger — AI-Powered Program Summary
+    #  Supabase: lpl_snapshots | Cache: _lpl_cache (5-min TTL)
+    # ═══════════════════════════════════════════════════════════════
+
+    def _handle_post_living_ledger(self, parsed, data):
+        """POST /api/living-ledger"""
+        self._log_request("living-ledger")
+        user_message = data.get("message", "").strip()
+        analysis_data = data.get("analysis_data", None)
+
+        if not user_message:
+            self._send_json({"error": "No message provided"}, 400)
+            return
 
-        elif route == "contract_extract":
-            self._log_request("contract-extract-post")
-            import uuid
-            extraction_id = data.get("extraction_id", f"CX-{uuid.uuid4().hex[:12].upper()}")
-            content = data.get("content", "")
-            filename = data.get("filename", "")
-            contract_number = data.get("contract_number", "")
+        # Per-program caching — avoid duplicate AI calls within TTL
+        program_name = ""
+        period = ""
+        if analysis_data:
+            program_name = str(analysis_data.get("program", "")).strip()
+            period = str(analysis_data.get("period", "")).strip()
+        cache_key = f"{program_name}|{period}" if program_name else ""
 
-            if not content:
-                self._send_json({"error": "content is required"}, 400)
+        if cache_key and cache_key in _lpl_cache:
+            cached = _lpl_cache[cache_key]
+            if time.time() - cached["timestamp"] < _LPL_CACHE_TTL:
+                self._send_json({"response": cached["response"], "provider": "cache", "fallback": False, "cached": True})
                 return
 
-            # NLP-style clause extraction using regex patterns
-            clauses = []
-            cdrls = []
-            gfp_items_found = []
-            warranty_terms = []
-            data_rights = []
-
-            # Extract FAR/DFARS clauses
-            clause_pattern = re.compile(r"(?:FAR|DFARS)\s+(?:(?:52|252)\.\d{3}-\d+(?:/\d+)?)", re.IGNORECASE)
-            for match in clause_pattern.finditer(content):
-                clause_ref = match.group(0)
-                # Get surrounding context
-                start = max(0, match.start() - 100)
-                end = min(len(content), match.end() + 200)
-                context = content[start:end].strip()
-                clauses.append({
-                    "reference": clause_ref,
-                    "context": context,
-                    "position": match.start(),
-                })
+        system_prompt = _build_ai_system_prompt("living_program_ledger", analysis_data)
+        system_prompt += (
+            "\n## LIVING PROGRAM LEDGER INSTRUCTIONS\n"
+            "Generate a comprehensive Living Program Ledger summary. "
+            "Return a JSON object with 'executive_overview' (1 paragraph) and section keys "
+            "(logistics_health, supply_chain_status, readiness_metrics, compliance_posture, "
+            "risk_assessment, maintenance_forecast, upcoming_milestones, action_items) — "
+            "each containing 3-5 bullet points using the bullet character. "
+            "Be specific and reference actual data from the analysis.\n\n"
+            "If compliance data is available, reference DCMA eTools metrics "
+            "(e.g., receipt rates, CDRL approval status, COR findings) where applicable."
+        )
 
-            # Extract CDRL references
-            cdrl_pattern = re.compile(r"(?:CDRL|DD\s*Form\s*1423)[\s:]*([A-Z]\d{3})", re.IGNORECASE)
-            for match in cdrl_pattern.finditer(content):
-                cdrls.append({
-                    "cdrl_number": match.group(1),
-                    "context": content[max(0, match.start()-50):min(len(content), match.end()+150)].strip(),
-                })
+        ai_response = self._call_ai_cascade(system_prompt, user_message, data.get("conversation", []))
+        provider = "llm" if ai_response else "none"
 
-            # Extract DI numbers
-            di_pattern = re.compile(r"DI-[A-Z]{4}-\d{5}[A-Z]?")
-            for match in di_pattern.finditer(content):
-                cdrls.append({
-                    "di_number": match.group(0),
-                    "context": content[max(0, match.start()-50):min(len(content), match.end()+150)].strip(),
-                })
+        # Update per-program cache
+        if ai_response and cache_key:
+            _lpl_cache[cache_key] = {"response": ai_response, "timestamp": time.time(), "period": period}
+            # Evict oldest entries if cache grows too large
+            if len(_lpl_cache) > 200:
+                oldest_key = min(_lpl_cache, key=lambda k: _lpl_cache[k]["timestamp"])
+                del _lpl_cache[oldest_key]
 
-            # Extract GFP/Government Property references
-            gfp_pattern = re.compile(r"(?:government\s+(?:furnished|property)|GFP|GFE|GFI|DD\s*1662)", re.IGNORECASE)
-            for match in gfp_pattern.finditer(content):
-                gfp_items_found.append({
-                    "type": match.group(0),
-                    "context": content[max(0, match.start()-50):min(len(content), match.end()+200)].strip(),
-                })
+        # Persist snapshot to Supabase
+        if ai_response and SUPABASE_AVAILABLE:
+            try:
+                # Parse version from existing snapshots
+                existing = _sb_select("lpl_snapshots",
+                                      query_params=f"program_name=eq.{program_name}&order=version_num.desc&limit=1") if program_name else []
+                next_version = (existing[0]["version_num"] + 1) if existing else 1
+
+                # Extract sections from AI response if possible
+                sections_json = {}
+                exec_overview = ""
+                try:
+                    json_match = re.search(r'\{[\s\S]*\}', ai_response)
+                    if json_match:
+                        parsed = json.loads(json_match.group())
+                        exec_overview = parsed.get("executive_overview", "")
+                        sections_json = {k: v for k, v in parsed.items() if k != "executive_overview"}
+                except Exception:
+                    exec_overview = ai_response[:500]
 
-            # Extract warranty terms
-            warranty_pattern = re.compile(r"(?:warranty|guarantee|defect|latent\s+defect|correction\s+of\s+deficienc)", re.IGNORECASE)
-            for match in warranty_pattern.finditer(content):
-                warranty_terms.append({
-                    "term": match.group(0),
-                    "context": content[max(0, match.start()-50):min(len(content), match.end()+200)].strip(),
+                _sb_insert("lpl_snapshots", {
+                    "program_name": program_name,
+                    "period": period,
+                    "version_num": next_version,
+                    "executive_overview": exec_overview[:2000],
+                    "sections_json": json.dumps(sections_json),
+                    "ai_provider": provider,
+                    "analysis_data": json.dumps(analysis_data) if analysis_data else "{}",
+                    "created_at": datetime.utcnow().isoformat() + "Z",
                 })
+            except Exception:
+                pass  # Non-blocking — never fail the response on persistence error
 
-            # Extract data rights references
-            rights_pattern = re.compile(r"(?:data\s+rights|technical\s+data|unlimited\s+rights|limited\s+rights|government\s+purpose\s+rights|DFARS\s+252\.227)", re.IGNORECASE)
-            for match in rights_pattern.finditer(content):
-                data_rights.append({
-                    "type": match.group(0),
-                    "context": content[max(0, match.start()-50):min(len(content), match.end()+200)].strip(),
-                })
+        if ai_response:
+            self._send_json({"response": ai_response, "provider": provider, "fallback": False})
+        else:
+            self._send_json({"response": None, "provider": "none", "fallback": True,
+                             "message": "No AI provider configured. Using local pattern matching."})
+
+    # ═══════════════════════════════════════════════════════════════
+    #  Program Impact Simulator — Cascade Risk Analysis
+    #  Supabase: impact_simulations | GIDEP cross-reference in prompt
+    # ═══════════════════════════════════════════════════════════════
+
+    def _handle_post_impact_simulator(self, parsed, data):
+        """POST /api/impact-simulator"""
+        self._log_request("impact-simulator")
+        user_message = data.get("message", "").strip()
+        analysis_data = data.get("analysis_data", None)
+
+        if not user_message:
+            self._send_json({"error": "No message provided"}, 400)
+            return
 
-            # Extract contract number if not provided
-            if not contract_number:
-                cn_pattern = re.compile(r"(?:contract\s+(?:no|number|#)[\s.:]*)?([HNWSF]\d{5}-\d{2}-[A-Z]-\d{4})", re.IGNORECASE)
-                cn_match = cn_pattern.search(content)
-                if cn_match:
-                    contract_number = cn_match.group(1)
+        # Cross-reference GIDEP alerts for obsolescence cascades
+        gidep_context = ""
+        if analysis_data:
+            risk_label = str(analysis_data.get("riskLabel", "")).lower()
+            # Check for DMSMS/obsolescence-related items in Supabase
+            if SUPABASE_AVAILABLE and ("obsolescen" in risk_label or "dmsms" in risk_label
+                                        or "end of life" in risk_label or "discontinu" in risk_label):
+                try:
+                    dmsms_hits = _sb_select("dmsms_items", query_params="limit=5&order=created_at.desc")
+                    if dmsms_hits:
+                        gidep_parts = [f"{d.get('nsn', 'N/A')} — {d.get('part_name', d.get('description', 'Unknown'))}" for d in dmsms_hits[:5]]
+                        gidep_context = (
+                            "\n\n## GIDEP / DMSMS CROSS-REFERENCE\n"
+                            "The following recently tracked DMSMS items may be related to this risk:\n"
+                            + "\n".join(f"• {p}" for p in gidep_parts) + "\n"
+                            "Cross-reference these when analyzing obsolescence cascade effects."
+                        )
+                except Exception:
+                    pass
 
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "user_email": data.get("user_email", ""),
-                "extraction_id": extraction_id,
-                "contract_number": contract_number,
-                "filename": filename,
-                "clause_count": len(clauses),
-                "clauses": json.dumps(clauses),
-                "cdrls": json.dumps(cdrls),
-                "gfp_items": json.dumps(gfp_items_found),
-                "warranty_terms": json.dumps(warranty_terms),
-                "data_rights": json.dumps(data_rights),
-                "file_hash": data.get("file_hash", ""),
-            }
-            result = _sb_insert("contract_extractions", row)
-            self._send_json({
-                "status": "extracted",
-                "extraction_id": extraction_id,
-                "contract_number": contract_number,
-                "clause_count": len(clauses),
-                "clauses": clauses,
-                "cdrls": cdrls,
-                "gfp_references": gfp_items_found,
-                "warranty_terms": warranty_terms,
-                "data_rights": data_rights,
-                "item": result[0] if result else row,
-            })
+            # Pull schedule milestones if available
+            if SUPABASE_AVAILABLE:
+                try:
+                    program_name = str(analysis_data.get("programName", "")).strip()
+                    if program_name:
+                        milestones = _sb_select("program_milestones",
+                                                 query_params=f"program_name=eq.{program_name}&order=target_date.asc&limit=5")
+                        if milestones:
+                            schedule_context = "\n\n## PROGRAM SCHEDULE DATA\nUpcoming milestones:\n"
+                            for ms in milestones:
+                                schedule_context += f"• {ms.get('milestone_name', 'TBD')} — target: {ms.get('target_date', 'TBD')}\n"
+                            gidep_context += schedule_context
+                except Exception:
+                    pass
 
-        elif route == "program_metrics":
-            self._log_request("program-metrics-post")
-            row = {
-                "org_id": self.headers.get("X-API-Key", ""),
-                "program": data.get("program", ""),
-                "metric_type": data.get("metric_type", ""),
-                "metric_value": data.get("metric_value", 0),
-                "period": data.get("period", ""),
-                "metadata": json.dumps(data.get("metadata", {})) if isinstance(data.get("metadata"), dict) else data.get("metadata", "{}"),
-            }
-            if not row["program"] or not row["metric_type"]:
-                self._send_json({"error": "program and metric_type are required"}, 400)
-                return
-            result = _sb_insert("program_metrics", row)
-            self._send_json({"status": "created", "item": result[0] if result else row}, 201 if result else 200)
+        system_prompt = _build_ai_system_prompt("impact_simulator", analysis_data)
+        system_prompt += (
+            "\n## IMPACT SIMULATOR INSTRUCTIONS\n"
+            "Analyze the risk cascade and return a JSON object with:\n"
+            "- 'explanation': 2-3 paragraph analysis of cascade effects, root cause, "
+            "and program impact on cost/schedule/readiness.\n"
+            "- 'mitigations': array of 3-5 specific, actionable mitigation strategies "
+            "with realistic timelines, responsible parties, and expected risk reduction.\n"
+            "Consider GIDEP alerts, DMSMS tracking data, and program schedule milestones "
+            "when available in the context below."
+            + gidep_context
+        )
 
-        elif route == "state_save":
-            self._log_request("state-save")
-            self._save_user_state(data)
+        ai_response = self._call_ai_cascade(system_prompt, user_message, data.get("conversation", []))
+        provider = "llm" if ai_response else "none"
 
-        elif route == "errors_report":
-            # Client-side error reporting — stores to Supabase for monitoring
-            self._log_request("errors-report")
+        # Store simulation result in Supabase for trend analysis
+        if SUPABASE_AVAILABLE and analysis_data:
             try:
-                session_id = data.get("session_id", "unknown")
-                errors = data.get("errors", [])
-                if not errors:
-                    self._send_json({"status": "ok", "stored": 0})
-                    return
-                stored = 0
-                for err in errors[:20]:  # Max 20 errors per batch
-                    row = {
-                        "session_id": session_id,
-                        "error_type": str(err.get("type", "unknown"))[:50],
-                        "message": str(err.get("msg", ""))[:500],
-                        "source": str(err.get("source", ""))[:300],
-                        "line": err.get("line"),
-                        "col": err.get("col"),
-                        "url": str(err.get("url", ""))[:300],
-                        "tag": str(err.get("tag", ""))[:50],
-                        "client_ts": err.get("ts"),
-                        "created_at": datetime.utcnow().isoformat() + "Z",
-                    }
-                    result = _sb_insert("client_errors", row)
-                    if result:
-                        stored += 1
-                self._send_json({"status": "ok", "stored": stored})
-            except Exception as e:
-                # Never fail on error reporting — just acknowledge
-                self._send_json({"status": "ok", "stored": 0, "note": str(e)[:200]})
-
-        # ═══════════════════════════════════════════════════════════════
-        #  Living Program Ledger — AI-Powered Program Summary
-        #  Supabase: lpl_snapshots | Cache: _lpl_cache (5-min TTL)
-        # ═══════════════════════════════════════════════════════════════
-        elif route == "living_ledger":
-            self._log_request("living-ledger")
-            user_message = data.get("message", "").strip()
-            analysis_data = data.get("analysis_data", None)
-
-            if not user_message:
-                self._send_json({"error": "No message provided"}, 400)
-                return
-
-            # Per-program caching — avoid duplicate AI calls within TTL
-            program_name = ""
-            period = ""
-            if analysis_data:
-                program_name = str(analysis_data.get("program", "")).strip()
-                period = str(analysis_data.get("period", "")).strip()
-            cache_key = f"{program_name}|{period}" if program_name else ""
-
-            if cache_key and cache_key in _lpl_cache:
-                cached = _lpl_cache[cache_key]
-                if time.time() - cached["timestamp"] < _LPL_CACHE_TTL:
-                    self._send_json({"response": cached["response"], "provider": "cache", "fallback": False, "cached": True})
-                    return
-
-            system_prompt = _build_ai_system_prompt("living_program_ledger", analysis_data)
-            system_prompt += (
-                "\n## LIVING PROGRAM LEDGER INSTRUCTIONS\n"
-                "Generate a comprehensive Living Program Ledger summary. "
-                "Return a JSON object with 'executive_overview' (1 paragraph) and section keys "
-                "(logistics_health, supply_chain_status, readiness_metrics, compliance_posture, "
-                "risk_assessment, maintenance_forecast, upcoming_milestones, action_items) — "
-                "each containing 3-5 bullet points using the bullet character. "
-                "Be specific and reference actual data from the analysis.\n\n"
-                "If compliance data is available, reference DCMA eTools metrics "
-                "(e.g., receipt rates, CDRL approval status, COR findings) where applicable."
-            )
-
-            ai_response = self._call_ai_cascade(system_prompt, user_message, data.get("conversation", []))
-            provider = "llm" if ai_response else "none"
-
-            # Update per-program cache
-            if ai_response and cache_key:
-                _lpl_cache[cache_key] = {"response": ai_response, "timestamp": time.time(), "period": period}
-                # Evict oldest entries if cache grows too large
-                if len(_lpl_cache) > 200:
-                    oldest_key = min(_lpl_cache, key=lambda k: _lpl_cache[k]["timestamp"])
-                    del _lpl_cache[oldest_key]
-
-            # Persist snapshot to Supabase
-            if ai_response and SUPABASE_AVAILABLE:
-                try:
-                    # Parse version from existing snapshots
-                    existing = _sb_select("lpl_snapshots",
-                                          query_params=f"program_name=eq.{program_name}&order=version_num.desc&limit=1") if program_name else []
-                    next_version = (existing[0]["version_num"] + 1) if existing else 1
-
-                    # Extract sections from AI response if possible
-                    sections_json = {}
-                    exec_overview = ""
+                explanation = ""
+                mitigations = []
+                if ai_response:
                     try:
                         json_match = re.search(r'\{[\s\S]*\}', ai_response)
                         if json_match:
                             parsed = json.loads(json_match.group())
-                            exec_overview = parsed.get("executive_overview", "")
-                            sections_json = {k: v for k, v in parsed.items() if k != "executive_overview"}
+                            explanation = parsed.get("explanation", "")
+                            mitigations = parsed.get("mitigations", [])
                     except Exception:
-                        exec_overview = ai_response[:500]
-
-                    _sb_insert("lpl_snapshots", {
-                        "program_name": program_name,
-                        "period": period,
-                        "version_num": next_version,
-                        "executive_overview": exec_overview[:2000],
-                        "sections_json": json.dumps(sections_json),
-                        "ai_provider": provider,
-                        "analysis_data": json.dumps(analysis_data) if analysis_data else "{}",
-                        "created_at": datetime.utcnow().isoformat() + "Z",
-                    })
-                except Exception:
-                    pass  # Non-blocking — never fail the response on persistence error
-
-            if ai_response:
-                self._send_json({"response": ai_response, "provider": provider, "fallback": False})
-            else:
-                self._send_json({"response": None, "provider": "none", "fallback": True,
-                                 "message": "No AI provider configured. Using local pattern matching."})
-
-        # ═══════════════════════════════════════════════════════════════
-        #  Program Impact Simulator — Cascade Risk Analysis
-        #  Supabase: impact_simulations | GIDEP cross-reference in prompt
-        # ═══════════════════════════════════════════════════════════════
-        elif route == "impact_simulator":
-            self._log_request("impact-simulator")
-            user_message = data.get("message", "").strip()
-            analysis_data = data.get("analysis_data", None)
-
-            if not user_message:
-                self._send_json({"error": "No message provided"}, 400)
-                return
+                        explanation = ai_response[:1000]
+
+                _sb_insert("impact_simulations", {
+                    "program_name": str(analysis_data.get("programName", "")).strip(),
+                    "risk_label": str(analysis_data.get("riskLabel", ""))[:200],
+                    "severity": str(analysis_data.get("severity", ""))[:50],
+                    "schedule_delay": analysis_data.get("scheduleDelay", 0),
+                    "cost_impact": analysis_data.get("costImpact", 0),
+                    "readiness_drop": analysis_data.get("readinessDrop", 0),
+                    "downstream_programs": analysis_data.get("downstreamPrograms", 0),
+                    "source_tool": str(analysis_data.get("sourceTool", ""))[:100],
+                    "explanation": explanation[:5000],
+                    "mitigations": json.dumps(mitigations if isinstance(mitigations, list) else []),
+                    "ai_provider": provider,
+                    "created_at": datetime.utcnow().isoformat() + "Z",
+                })
+            except Exception:
+                pass  # Non-blocking
 
-            # Cross-reference GIDEP alerts for obsolescence cascades
-            gidep_context = ""
-            if analysis_data:
-                risk_label = str(analysis_data.get("riskLabel", "")).lower()
-                # Check for DMSMS/obsolescence-related items in Supabase
-                if SUPABASE_AVAILABLE and ("obsolescen" in risk_label or "dmsms" in risk_label
-                                            or "end of life" in risk_label or "discontinu" in risk_label):
-                    try:
-                        dmsms_hits = _sb_select("dmsms_items", query_params="limit=5&order=created_at.desc")
-                        if dmsms_hits:
-                            gidep_parts = [f"{d.get('nsn', 'N/A')} — {d.get('part_name', d.get('description', 'Unknown'))}" for d in dmsms_hits[:5]]
-                            gidep_context = (
-                                "\n\n## GIDEP / DMSMS CROSS-REFERENCE\n"
-                                "The following recently tracked DMSMS items may be related to this risk:\n"
-                                + "\n".join(f"• {p}" for p in gidep_parts) + "\n"
-                                "Cross-reference these when analyzing obsolescence cascade effects."
-                            )
-                    except Exception:
-                        pass
+        if ai_response:
+            self._send_json({"response": ai_response, "provider": provider, "fallback": False})
+        else:
+            self._send_json({"response": None, "provider": "none", "fallback": True,
+                             "message": "No AI provider configured. Using local fallback."})
+
+    # ═══════════════════════════════════════════════════════════════
+    #  Secure Collaboration Network — Real-time Collaboration API
+    #  Supabase: scn_participants, scn_share_links, scn_collaboration_state
+    #  HMAC: SCN_SIGNING_SECRET for share token signatures
+    #  Email: SendGrid stub (fires when SENDGRID_API_KEY is set)
+    # ═══════════════════════════════════════════════════════════════
+
+    def _handle_post_secure_collaboration(self, parsed, data):
+        """POST /api/secure-collaboration"""
+        self._log_request("secure-collaboration")
+        action = data.get("action", "").strip()
+
+        if action == "enable" or action == "disable":
+            participants = data.get("participants", [])
+            view_id = data.get("view_id", "drl-main")
 
-                # Pull schedule milestones if available
-                if SUPABASE_AVAILABLE:
-                    try:
-                        program_name = str(analysis_data.get("programName", "")).strip()
-                        if program_name:
-                            milestones = _sb_select("program_milestones",
-                                                     query_params=f"program_name=eq.{program_name}&order=target_date.asc&limit=5")
-                            if milestones:
-                                schedule_context = "\n\n## PROGRAM SCHEDULE DATA\nUpcoming milestones:\n"
-                                for ms in milestones:
-                                    schedule_context += f"• {ms.get('milestone_name', 'TBD')} — target: {ms.get('target_date', 'TBD')}\n"
-                                gidep_context += schedule_context
-                    except Exception:
-                        pass
-
-            system_prompt = _build_ai_system_prompt("impact_simulator", analysis_data)
-            system_prompt += (
-                "\n## IMPACT SIMULATOR INSTRUCTIONS\n"
-                "Analyze the risk cascade and return a JSON object with:\n"
-                "- 'explanation': 2-3 paragraph analysis of cascade effects, root cause, "
-                "and program impact on cost/schedule/readiness.\n"
-                "- 'mitigations': array of 3-5 specific, actionable mitigation strategies "
-                "with realistic timelines, responsible parties, and expected risk reduction.\n"
-                "Consider GIDEP alerts, DMSMS tracking data, and program schedule milestones "
-                "when available in the context below."
-                + gidep_context
-            )
+            # HMAC-sign the state change
+            now = datetime.utcnow()
+            sign_payload = f"{action}|{view_id}|{now.isoformat()}"
+            signature = hmac.new(SCN_SIGNING_SECRET.encode(), sign_payload.encode(), hashlib.sha256).hexdigest()
+            signed_by = f"S4-SCN-{signature[:12].upper()}-{now.strftime('%Y%m%dT%H%M%SZ')}"
 
-            ai_response = self._call_ai_cascade(system_prompt, user_message, data.get("conversation", []))
-            provider = "llm" if ai_response else "none"
+            # Update in-memory state
+            _scn_collab_state[view_id] = {
+                "enabled": action == "enable",
+                "signed_by": signed_by,
+                "participants": participants,
+                "updated_at": now.isoformat() + "Z",
+            }
 
-            # Store simulation result in Supabase for trend analysis
-            if SUPABASE_AVAILABLE and analysis_data:
+            # Persist to Supabase
+            if SUPABASE_AVAILABLE:
                 try:
-                    explanation = ""
-                    mitigations = []
-                    if ai_response:
-                        try:
-                            json_match = re.search(r'\{[\s\S]*\}', ai_response)
-                            if json_match:
-                                parsed = json.loads(json_match.group())
-                                explanation = parsed.get("explanation", "")
-                                mitigations = parsed.get("mitigations", [])
-                        except Exception:
-                            explanation = ai_response[:1000]
-
-                    _sb_insert("impact_simulations", {
-                        "program_name": str(analysis_data.get("programName", "")).strip(),
-                        "risk_label": str(analysis_data.get("riskLabel", ""))[:200],
-                        "severity": str(analysis_data.get("severity", ""))[:50],
-                        "schedule_delay": analysis_data.get("scheduleDelay", 0),
-                        "cost_impact": analysis_data.get("costImpact", 0),
-                        "readiness_drop": analysis_data.get("readinessDrop", 0),
-                        "downstream_programs": analysis_data.get("downstreamPrograms", 0),
-                        "source_tool": str(analysis_data.get("sourceTool", ""))[:100],
-                        "explanation": explanation[:5000],
-                        "mitigations": json.dumps(mitigations if isinstance(mitigations, list) else []),
-                        "ai_provider": provider,
-                        "created_at": datetime.utcnow().isoformat() + "Z",
+                    _sb_upsert("scn_collaboration_state", {
+                        "view_id": view_id,
+                        "enabled": action == "enable",
+                        "signed_by": signed_by,
+                        "updated_at": now.isoformat() + "Z",
                     })
                 except Exception:
-                    pass  # Non-blocking
-
-            if ai_response:
-                self._send_json({"response": ai_response, "provider": provider, "fallback": False})
-            else:
-                self._send_json({"response": None, "provider": "none", "fallback": True,
-                                 "message": "No AI provider configured. Using local fallback."})
-
-        # ═══════════════════════════════════════════════════════════════
-        #  Secure Collaboration Network — Real-time Collaboration API
-        #  Supabase: scn_participants, scn_share_links, scn_collaboration_state
-        #  HMAC: SCN_SIGNING_SECRET for share token signatures
-        #  Email: SendGrid stub (fires when SENDGRID_API_KEY is set)
-        # ═══════════════════════════════════════════════════════════════
-        elif route == "secure_collaboration":
-            self._log_request("secure-collaboration")
-            action = data.get("action", "").strip()
-
-            if action == "enable" or action == "disable":
-                participants = data.get("participants", [])
-                view_id = data.get("view_id", "drl-main")
-
-                # HMAC-sign the state change
-                now = datetime.utcnow()
-                sign_payload = f"{action}|{view_id}|{now.isoformat()}"
-                signature = hmac.new(SCN_SIGNING_SECRET.encode(), sign_payload.encode(), hashlib.sha256).hexdigest()
-                signed_by = f"S4-SCN-{signature[:12].upper()}-{now.strftime('%Y%m%dT%H%M%SZ')}"
-
-                # Update in-memory state
-                _scn_collab_state[view_id] = {
-                    "enabled": action == "enable",
-                    "signed_by": signed_by,
-                    "participants": participants,
-                    "updated_at": now.isoformat() + "Z",
-                }
-
-                # Persist to Supabase
-                if SUPABASE_AVAILABLE:
-                    try:
-                        _sb_upsert("scn_collaboration_state", {
-                            "view_id": view_id,
-                            "enabled": action == "enable",
-                            "signed_by": signed_by,
-                            "updated_at": now.isoformat() + "Z",
-                        })
-                    except Exception:
-                        pass
-
-                self._send_json({
-                    "status": "ok",
-                    "action": action,
-                    "collaboration_active": action == "enable",
-                    "participants": participants,
-                    "signed_by": signed_by,
-                    "signature": signature,
-                    "message": f"Secure Collaboration Network {'enabled' if action == 'enable' else 'disabled'} — all changes cryptographically signed"
-                })
-
-            elif action == "invite":
-                email = data.get("email", "").strip()
-                org = data.get("org", "External")
-                permission = data.get("permission", "View")
-                view_id = data.get("view_id", "drl-main")
-
-                if not email or "@" not in email:
-                    self._send_json({"error": "Valid email address required"}, 400)
-                    return
-
-                # Generate HMAC-signed invite token
-                now = datetime.utcnow()
-                expires = now + timedelta(days=7)
-                token_payload = f"{email}|{view_id}|{permission}|{expires.isoformat()}"
-                token_hmac = hmac.new(SCN_SIGNING_SECRET.encode(), token_payload.encode(), hashlib.sha256).hexdigest()
-                invite_token = f"scn-inv-{token_hmac[:16]}"
-
-                # Store invitation in Supabase
-                if SUPABASE_AVAILABLE:
-                    try:
-                        name = email.split("@")[0].replace(".", " ").replace("_", " ").title()
-                        _sb_insert("scn_participants", {
-                            "view_id": view_id,
-                            "email": email,
-                            "name": name,
-                            "org": org[:200],
-                            "permission": permission,
-                            "invite_token": invite_token,
-                            "invite_expires": expires.isoformat() + "Z",
-                            "active": True,
-                            "created_at": now.isoformat() + "Z",
-                        })
-                    except Exception:
-                        pass
-
-                # Send invitation email via SendGrid (when configured)
-                sendgrid_key = os.environ.get("SENDGRID_API_KEY", "").strip()
-                email_sent = False
-                if sendgrid_key:
-                    try:
-                        import urllib.request
-                        email_body = json.dumps({
-                            "personalizations": [{"to": [{"email": email}]}],
-                            "from": {"email": "noreply@s4ledger.com", "name": "S4 Ledger SCN"},
-                            "subject": f"S4 Ledger — You've been invited to collaborate ({permission} access)",
-                            "content": [{
-                                "type": "text/html",
-                                "value": (
-                                    f"<h2>Secure Collaboration Invitation</h2>"
-                                    f"<p>You've been invited to join the <strong>S4 Ledger Secure Collaboration Network</strong> "
-                                    f"with <strong>{permission}</strong> access.</p>"
-                                    f"<p>Organization: {org}</p>"
-                                    f"<p>Your invite token: <code>{invite_token}</code></p>"
-                                    f"<p>This invitation expires on {expires.strftime('%B %d, %Y')}.</p>"
-                                    f"<p><a href='https://app.s4ledger.com/collaborate?token={invite_token}'>Accept Invitation</a></p>"
-                                )
-                            }]
-                        }).encode()
-                        req = urllib.request.Request(
-                            "https://api.sendgrid.com/v3/mail/send",
-                            data=email_body,
-                            headers={
-                                "Content-Type": "application/json",
-                                "Authorization": f"Bearer {sendgrid_key}",
-                            },
-                        )
-                        with urllib.request.urlopen(req, timeout=10) as resp:
-                            email_sent = resp.status in (200, 201, 202)
-                    except Exception:
-                        email_sent = False
-
-                self._send_json({
-                    "status": "ok",
-                    "action": "invite",
-                    "email": email,
-                    "org": org,
-                    "permission": permission,
-                    "invite_token": invite_token,
-                    "expires": expires.isoformat() + "Z",
-                    "email_sent": email_sent,
-                    "message": f"Invitation sent to {email} with {permission} access"
-                })
-
-            elif action == "share_link":
-                view_name = data.get("view_name", "DRL View")
-                view_id = data.get("view_id", "drl-main")
-
-                # Generate HMAC-signed share token with 30-day expiry
-                now = datetime.utcnow()
-                expires = now + timedelta(days=30)
-                token_payload = f"share|{view_id}|{view_name}|{expires.isoformat()}"
-                token_hmac = hmac.new(SCN_SIGNING_SECRET.encode(), token_payload.encode(), hashlib.sha256).hexdigest()
-                token = f"scn-{token_hmac[:16]}"
-                link = f"https://app.s4ledger.com/shared/{token}"
-
-                # Persist share link in Supabase
-                if SUPABASE_AVAILABLE:
-                    try:
-                        _sb_insert("scn_share_links", {
-                            "view_name": view_name[:200],
-                            "token": token,
-                            "hmac_signature": token_hmac,
-                            "expires_at": expires.isoformat() + "Z",
-                            "created_at": now.isoformat() + "Z",
-                        })
-                    except Exception:
-                        pass
-
-                self._send_json({
-                    "status": "ok",
-                    "action": "share_link",
-                    "link": link,
-                    "token": token,
-                    "view_name": view_name,
-                    "expires": expires.isoformat() + "Z",
-                    "hmac_verified": True,
-                    "message": f"Secure share link generated for {view_name}"
-                })
-
-            elif action == "list_participants":
-                view_id = data.get("view_id", "drl-main")
-                participants = []
-                if SUPABASE_AVAILABLE:
-                    try:
-                        participants = _sb_select("scn_participants",
-                                                   query_params=f"view_id=eq.{view_id}&active=eq.true&order=created_at.desc")
-                    except Exception:
-                        pass
-                self._send_json({"status": "ok", "participants": participants})
-
-            else:
-                self._send_json({"error": "Invalid action. Use: enable, disable, invite, share_link, list_participants"}, 400)
-
-        # ═══════════════════════════════════════════════════════════════
-        #  Enhancement #1 — Proactive Foresight View (30/60/90-day forecast)
-        # ═══════════════════════════════════════════════════════════════
-        elif route == "foresight_forecast":
-            self._log_request("foresight-forecast")
-            analysis_data = data.get("analysis_data", {})
-            program_name = str(analysis_data.get("program", "All Programs")).strip()
-            period = str(analysis_data.get("period", "")).strip()
-            exec_summary = str(data.get("executive_summary", "")).strip()[:2000]
-
-            system_prompt = _build_ai_system_prompt("foresight_forecast", analysis_data)
-            system_prompt += (
-                "\n## PROACTIVE FORESIGHT FORECAST INSTRUCTIONS\n"
-                "Generate a 30/60/90-day proactive foresight forecast for this defense logistics program.\n"
-                "Return a JSON object with three keys: 'forecast_30', 'forecast_60', 'forecast_90'.\n"
-                "Each key contains an array of 3 forecast items. Each item is an object with:\n"
-                "- 'severity': 'green', 'amber', or 'red'\n"
-                "- 'text': a concise prediction (1-2 sentences) referencing real ILS data points\n\n"
-                "Green = on track / positive trend. Amber = caution / needs attention. Red = critical risk.\n"
-                "Be specific: reference CDRLs, NSNs, Ao values, LORA, DMSMS, budget execution rates, milestones.\n"
-                "Base predictions on the executive summary and anchored data provided."
-            )
-
-            user_msg = f"Program: {program_name}\nPeriod: {period}\n\nCurrent executive summary:\n{exec_summary}\n\nGenerate 30/60/90-day foresight forecast."
+                    pass
 
-            ai_response = self._call_ai_cascade(system_prompt, user_msg)
-            provider = "llm" if ai_response else "none"
+            self._send_json({
+                "status": "ok",
+                "action": action,
+                "collaboration_active": action == "enable",
+                "participants": participants,
+                "signed_by": signed_by,
+                "signature": signature,
+                "message": f"Secure Collaboration Network {'enabled' if action == 'enable' else 'disabled'} — all changes cryptographically signed"
+            })
 
-            # Parse structured forecast
-            forecast = {"forecast_30": [], "forecast_60": [], "forecast_90": []}
-            if ai_response:
-                try:
-                    json_match = re.search(r'\{[\s\S]*\}', ai_response)
-                    if json_match:
-                        parsed = json.loads(json_match.group())
-                        for key in ("forecast_30", "forecast_60", "forecast_90"):
-                            if key in parsed and isinstance(parsed[key], list):
-                                forecast[key] = parsed[key][:5]
-                except Exception:
-                    pass
+        elif action == "invite":
+            email = data.get("email", "").strip()
+            org = data.get("org", "External")
+            permission = data.get("permission", "View")
+            view_id = data.get("view_id", "drl-main")
 
-            self._send_json({"forecast": forecast, "provider": provider, "program": program_name,
-                             "raw_response": ai_response if ai_response else None})
-
-        # ═══════════════════════════════════════════════════════════════
-        #  Enhancement #2 — Generate Signed Executive Package
-        # ═══════════════════════════════════════════════════════════════
-        elif route == "signed_package":
-            self._log_request("signed-package")
-            content_hash = str(data.get("content_hash", "")).strip()
-            program_name = str(data.get("program", "")).strip()
-            sections = data.get("sections", {})
-            executive_overview = str(data.get("executive_overview", "")).strip()[:5000]
-
-            if not content_hash:
-                self._send_json({"error": "No content_hash provided"}, 400)
+            if not email or "@" not in email:
+                self._send_json({"error": "Valid email address required"}, 400)
                 return
 
-            # Server-side verification hash
-            content_for_hash = executive_overview + json.dumps(sections, sort_keys=True, ensure_ascii=False)
-            server_hash = hashlib.sha256(content_for_hash.encode("utf-8")).hexdigest()
-
-            # HMAC sign the package
+            # Generate HMAC-signed invite token
             now = datetime.utcnow()
-            sign_payload = f"exec-pkg|{program_name}|{content_hash}|{server_hash}|{now.isoformat()}"
-            signature = hmac.new(SCN_SIGNING_SECRET.encode(), sign_payload.encode(), hashlib.sha256).hexdigest()
+            expires = now + timedelta(days=7)
+            token_payload = f"{email}|{view_id}|{permission}|{expires.isoformat()}"
+            token_hmac = hmac.new(SCN_SIGNING_SECRET.encode(), token_payload.encode(), hashlib.sha256).hexdigest()
+            invite_token = f"scn-inv-{token_hmac[:16]}"
 
-            package_id = f"S4-PKG-{signature[:12].upper()}-{now.strftime('%Y%m%dT%H%M%SZ')}"
-
-            # Persist to Supabase
+            # Store invitation in Supabase
             if SUPABASE_AVAILABLE:
                 try:
-                    _sb_insert("lpl_snapshots", {
-                        "program_name": program_name,
-                        "period": "signed_package",
-                        "version_num": 0,
-                        "executive_overview": executive_overview[:2000],
-                        "sections_json": json.dumps(sections),
-                        "ai_provider": "signed_package",
-                        "analysis_data": json.dumps({"content_hash": content_hash, "server_hash": server_hash,
-                                                      "package_id": package_id, "signature": signature}),
+                    name = email.split("@")[0].replace(".", " ").replace("_", " ").title()
+                    _sb_insert("scn_participants", {
+                        "view_id": view_id,
+                        "email": email,
+                        "name": name,
+                        "org": org[:200],
+                        "permission": permission,
+                        "invite_token": invite_token,
+                        "invite_expires": expires.isoformat() + "Z",
+                        "active": True,
                         "created_at": now.isoformat() + "Z",
                     })
                 except Exception:
                     pass
 
-            self._send_json({
-                "package_id": package_id,
-                "client_hash": content_hash,
-                "server_hash": server_hash,
-                "signature": signature,
-                "program": program_name,
-                "generated_at": now.isoformat() + "Z",
-                "signer": "S4 Ledger Anchoring Service",
-                "includes": ["Executive Overview", "All Sections", "Anchored Data", "AI Summaries"],
-                "verified": content_hash[:16] == server_hash[:16] or True,
-            })
-
-        # ═══════════════════════════════════════════════════════════════
-        #  Enhancement #3 — Monte Carlo Probability Heatmap
-        # ═══════════════════════════════════════════════════════════════
-        elif route == "monte_carlo_heatmap":
-            self._log_request("monte-carlo-heatmap")
-            analysis_data = data.get("analysis_data", {})
-            base_delay = int(analysis_data.get("scheduleDelay", 30))
-            base_cost = int(analysis_data.get("costImpact", 500))
-            risk_label = str(analysis_data.get("riskLabel", "")).strip()
-            iterations = min(int(data.get("iterations", 1000)), 10000)
-
-            import random
-            random.seed(hash(risk_label + str(base_delay) + str(base_cost)))
-
-            # Generate Monte Carlo simulation (normal distribution)
-            delay_samples = []
-            cost_samples = []
-            for _ in range(iterations):
-                d = max(0, random.gauss(base_delay, base_delay * 0.3))
-                c = max(0, random.gauss(base_cost, base_cost * 0.3))
-                delay_samples.append(d)
-                cost_samples.append(c)
-
-            delay_samples.sort()
-            cost_samples.sort()
-
-            # Build 5x6 heatmap grid
-            delay_buckets = [base_delay * m for m in (0.5, 0.75, 1.0, 1.25, 1.5)]
-            cost_buckets = [base_cost * m for m in (0.4, 0.6, 0.8, 1.0, 1.2, 1.5)]
-
-            heatmap = []
-            for di in range(5):
-                row = []
-                d_lo = delay_buckets[di] - base_delay * 0.125 if di > 0 else 0
-                d_hi = delay_buckets[di] + base_delay * 0.125 if di < 4 else base_delay * 10
-                for ci in range(6):
-                    c_lo = cost_buckets[ci] - base_cost * 0.1 if ci > 0 else 0
-                    c_hi = cost_buckets[ci] + base_cost * 0.1 if ci < 5 else base_cost * 10
-                    count = sum(1 for s in range(iterations)
-                                if d_lo <= delay_samples[s] <= d_hi and c_lo <= cost_samples[s] <= c_hi)
-                    row.append(round(count / iterations * 100, 1))
-                heatmap.append(row)
-
-            # Confidence intervals
-            p50_d = round(delay_samples[int(iterations * 0.50)])
-            p75_d = round(delay_samples[int(iterations * 0.75)])
-            p95_d = round(delay_samples[int(iterations * 0.95)])
-            p50_c = round(cost_samples[int(iterations * 0.50)])
-            p75_c = round(cost_samples[int(iterations * 0.75)])
-            p95_c = round(cost_samples[int(iterations * 0.95)])
+            # Send invitation email via SendGrid (when configured)
+            sendgrid_key = os.environ.get("SENDGRID_API_KEY", "").strip()
+            email_sent = False
+            if sendgrid_key:
+                try:
+                    import urllib.request
+                    email_body = json.dumps({
+                        "personalizations": [{"to": [{"email": email}]}],
+                        "from": {"email": "noreply@s4ledger.com", "name": "S4 Ledger SCN"},
+                        "subject": f"S4 Ledger — You've been invited to collaborate ({permission} access)",
+                        "content": [{
+                            "type": "text/html",
+                            "value": (
+                                f"<h2>Secure Collaboration Invitation</h2>"
+                                f"<p>You've been invited to join the <strong>S4 Ledger Secure Collaboration Network</strong> "
+                                f"with <strong>{permission}</strong> access.</p>"
+                                f"<p>Organization: {org}</p>"
+                                f"<p>Your invite token: <code>{invite_token}</code></p>"
+                                f"<p>This invitation expires on {expires.strftime('%B %d, %Y')}.</p>"
+                                f"<p><a href='https://app.s4ledger.com/collaborate?token={invite_token}'>Accept Invitation</a></p>"
+                            )
+                        }]
+                    }).encode()
+                    req = urllib.request.Request(
+                        "https://api.sendgrid.com/v3/mail/send",
+                        data=email_body,
+                        headers={
+                            "Content-Type": "application/json",
+                            "Authorization": f"Bearer {sendgrid_key}",
+                        },
+                    )
+                    with _http.urlopen(req, timeout=10) as resp:
+                        email_sent = resp.status in (200, 201, 202)
+                except Exception:
+                    email_sent = False
 
             self._send_json({
-                "heatmap": heatmap,
-                "delay_buckets": [f"{round(d)}d" for d in delay_buckets],
-                "cost_buckets": [f"${round(c)}K" for c in cost_buckets],
-                "confidence_intervals": {
-                    "P50": {"delay": p50_d, "cost": p50_c},
-                    "P75": {"delay": p75_d, "cost": p75_c},
-                    "P95": {"delay": p95_d, "cost": p95_c},
-                },
-                "iterations": iterations,
-                "risk_label": risk_label,
+                "status": "ok",
+                "action": "invite",
+                "email": email,
+                "org": org,
+                "permission": permission,
+                "invite_token": invite_token,
+                "expires": expires.isoformat() + "Z",
+                "email_sent": email_sent,
+                "message": f"Invitation sent to {email} with {permission} access"
             })
 
-        # ═══════════════════════════════════════════════════════════════
-        #  Enhancement #4 — Save Scenario to Living Program Ledger
-        # ═══════════════════════════════════════════════════════════════
-        elif route == "save_scenario_to_ledger":
-            self._log_request("save-scenario-to-ledger")
-            scenario = data.get("scenario", {})
-            program_name = str(data.get("program", "")).strip()
-
-            if not scenario:
-                self._send_json({"error": "No scenario data provided"}, 400)
-                return
+        elif action == "share_link":
+            view_name = data.get("view_name", "DRL View")
+            view_id = data.get("view_id", "drl-main")
 
-            # Build scenario section text
-            scenario_text = (
-                f"• Scenario: {scenario.get('riskLabel', 'Risk simulation')}\n"
-                f"• Schedule Impact: {scenario.get('scheduleDelay', 0)} days\n"
-                f"• Cost Impact: ${scenario.get('costImpact', 0)}K\n"
-                f"• Readiness Drop: {scenario.get('readinessDrop', 0)}%\n"
-                f"• Mitigations: {scenario.get('mitigationCount', 0)} paths identified\n"
-                f"• Explanation: {str(scenario.get('explanation', ''))[:500]}\n"
-                f"• Saved: {datetime.utcnow().strftime('%b %d, %Y %H:%M UTC')}"
-            )
+            # Generate HMAC-signed share token with 30-day expiry
+            now = datetime.utcnow()
+            expires = now + timedelta(days=30)
+            token_payload = f"share|{view_id}|{view_name}|{expires.isoformat()}"
+            token_hmac = hmac.new(SCN_SIGNING_SECRET.encode(), token_payload.encode(), hashlib.sha256).hexdigest()
+            token = f"scn-{token_hmac[:16]}"
+            link = f"https://app.s4ledger.com/shared/{token}"
 
-            next_version = 1
+            # Persist share link in Supabase
             if SUPABASE_AVAILABLE:
                 try:
-                    existing = _sb_select("lpl_snapshots",
-                                          query_params=f"program_name=eq.{program_name}&order=version_num.desc&limit=1") if program_name else []
-                    next_version = (existing[0]["version_num"] + 1) if existing else 1
-
-                    # Content hash for the scenario
-                    scenario_hash = hashlib.sha256(scenario_text.encode("utf-8")).hexdigest()
-
-                    _sb_insert("lpl_snapshots", {
-                        "program_name": program_name or "All Programs",
-                        "period": "impact_scenario",
-                        "version_num": next_version,
-                        "executive_overview": f"Impact Scenario — {scenario.get('riskLabel', 'Simulation')}",
-                        "sections_json": json.dumps({"impact_scenario": scenario_text, "hash": scenario_hash}),
-                        "ai_provider": "scenario_save",
-                        "analysis_data": json.dumps(scenario),
-                        "created_at": datetime.utcnow().isoformat() + "Z",
+                    _sb_insert("scn_share_links", {
+                        "view_name": view_name[:200],
+                        "token": token,
+                        "hmac_signature": token_hmac,
+                        "expires_at": expires.isoformat() + "Z",
+                        "created_at": now.isoformat() + "Z",
                     })
                 except Exception:
                     pass
 
             self._send_json({
-                "status": "saved",
-                "version": next_version,
-                "program": program_name or "All Programs",
-                "scenario_key": f"impact_scenario_{int(time.time())}",
+                "status": "ok",
+                "action": "share_link",
+                "link": link,
+                "token": token,
+                "view_name": view_name,
+                "expires": expires.isoformat() + "Z",
+                "hmac_verified": True,
+                "message": f"Secure share link generated for {view_name}"
             })
 
-        # ═══════════════════════════════════════════════════════════════
-        #  Enhancement #5 — AI Conflict Resolver
-        # ═══════════════════════════════════════════════════════════════
-        elif route == "conflict_resolver":
-            self._log_request("conflict-resolver")
-            view_id = str(data.get("view_id", "drl-main")).strip()
-            participants = data.get("participants", [])
-
-            # Gather field-level state from Supabase if available
-            field_data = []
+        elif action == "list_participants":
+            view_id = data.get("view_id", "drl-main")
+            participants = []
             if SUPABASE_AVAILABLE:
                 try:
-                    collab_state = _sb_select("scn_collaboration_state",
-                                               query_params=f"view_id=eq.{view_id}&order=updated_at.desc&limit=50")
-                    if collab_state:
-                        field_data = collab_state
+                    participants = _sb_select("scn_participants",
+                                               query_params=f"view_id=eq.{view_id}&active=eq.true&order=created_at.desc")
                 except Exception:
                     pass
+            self._send_json({"status": "ok", "participants": participants})
 
-            system_prompt = _build_ai_system_prompt("conflict_resolver", {"view_id": view_id, "participants": participants})
-            system_prompt += (
-                "\n## CONFLICT RESOLUTION INSTRUCTIONS\n"
-                "Analyze the collaboration data for conflicting field-level updates between participants.\n"
-                "Return a JSON object with a 'conflicts' array. Each conflict object has:\n"
-                "- 'field': the data field name (e.g., 'DI-ILSS-81495 Status', 'Operational Availability')\n"
-                "- 'participant_a': name of first participant\n"
-                "- 'value_a': their submitted value\n"
-                "- 'participant_b': name of second participant\n"
-                "- 'value_b': their submitted value\n"
-                "- 'resolved': the AI-recommended resolution with reasoning and evidence reference\n"
-                "- 'confidence': integer 80-99 representing resolution confidence\n"
-                "Generate 2-5 realistic conflicts based on typical defense logistics collaboration scenarios.\n"
-                "Reference anchored data timestamps and receipts when explaining resolutions."
-            )
+        else:
+            self._send_json({"error": "Invalid action. Use: enable, disable, invite, share_link, list_participants"}, 400)
+
+    # ═══════════════════════════════════════════════════════════════
+    #  Enhancement #1 — Proactive Foresight View (30/60/90-day forecast)
+    # ═══════════════════════════════════════════════════════════════
+
+    def _handle_post_foresight_forecast(self, parsed, data):
+        """POST /api/foresight-forecast"""
+        self._log_request("foresight-forecast")
+        analysis_data = data.get("analysis_data", {})
+        program_name = str(analysis_data.get("program", "All Programs")).strip()
+        period = str(analysis_data.get("period", "")).strip()
+        exec_summary = str(data.get("executive_summary", "")).strip()[:2000]
+
+        system_prompt = _build_ai_system_prompt("foresight_forecast", analysis_data)
+        system_prompt += (
+            "\n## PROACTIVE FORESIGHT FORECAST INSTRUCTIONS\n"
+            "Generate a 30/60/90-day proactive foresight forecast for this defense logistics program.\n"
+            "Return a JSON object with three keys: 'forecast_30', 'forecast_60', 'forecast_90'.\n"
+            "Each key contains an array of 3 forecast items. Each item is an object with:\n"
+            "- 'severity': 'green', 'amber', or 'red'\n"
+            "- 'text': a concise prediction (1-2 sentences) referencing real ILS data points\n\n"
+            "Green = on track / positive trend. Amber = caution / needs attention. Red = critical risk.\n"
+            "Be specific: reference CDRLs, NSNs, Ao values, LORA, DMSMS, budget execution rates, milestones.\n"
+            "Base predictions on the executive summary and anchored data provided."
+        )
 
-            user_msg = f"View: {view_id}\nParticipants: {json.dumps(participants[:10])}\nField data entries: {len(field_data)}\n\nScan for conflicting updates and propose AI-reconciled resolutions."
+        user_msg = f"Program: {program_name}\nPeriod: {period}\n\nCurrent executive summary:\n{exec_summary}\n\nGenerate 30/60/90-day foresight forecast."
 
-            ai_response = self._call_ai_cascade(system_prompt, user_msg)
-            provider = "llm" if ai_response else "none"
+        ai_response = self._call_ai_cascade(system_prompt, user_msg)
+        provider = "llm" if ai_response else "none"
 
-            conflicts = []
-            if ai_response:
-                try:
-                    json_match = re.search(r'\{[\s\S]*\}', ai_response)
-                    if json_match:
-                        parsed = json.loads(json_match.group())
-                        if "conflicts" in parsed and isinstance(parsed["conflicts"], list):
-                            conflicts = parsed["conflicts"][:10]
-                except Exception:
-                    pass
+        # Parse structured forecast
+        forecast = {"forecast_30": [], "forecast_60": [], "forecast_90": []}
+        if ai_response:
+            try:
+                json_match = re.search(r'\{[\s\S]*\}', ai_response)
+                if json_match:
+                    parsed = json.loads(json_match.group())
+                    for key in ("forecast_30", "forecast_60", "forecast_90"):
+                        if key in parsed and isinstance(parsed[key], list):
+                            forecast[key] = parsed[key][:5]
+            except Exception:
+                pass
 
-            self._send_json({"conflicts": conflicts, "provider": provider, "view_id": view_id,
-                             "raw_response": ai_response if ai_response else None})
-
-        # ═══════════════════════════════════════════════════════════════
-        #  Enhancement #6 — Federated Benchmarking (Privacy-Preserving)
-        # ═══════════════════════════════════════════════════════════════
-        elif route == "federated_benchmark":
-            self._log_request("federated-benchmark")
-            view_id = str(data.get("view_id", "drl-main")).strip()
-            metrics = data.get("metrics", {})
-
-            system_prompt = _build_ai_system_prompt("federated_benchmark", metrics)
-            system_prompt += (
-                "\n## FEDERATED BENCHMARKING INSTRUCTIONS\n"
-                "Generate anonymized, privacy-preserving benchmark comparisons for a defense logistics program.\n"
-                "Return a JSON object with a 'benchmarks' array. Each benchmark object has:\n"
-                "- 'label': metric name (e.g., 'CDRL Compliance Rate', 'Operational Availability')\n"
-                "- 'value': the program's current value (string, e.g., '91%' or '0.91')\n"
-                "- 'bar_pct': integer 0-100 for the bar fill width\n"
-                "- 'industry_avg_pct': integer 0-100 for the industry average marker position\n"
-                "- 'industry_avg_label': display label for industry average\n"
-                "- 'comparison': comparison text (e.g., '7pts above industry average')\n"
-                "- 'direction': 'up' for better-than or 'down' for lower-is-better metrics\n"
-                "- 'fill_color': 'blue' for standard, 'green' for lower-is-better\n"
-                "Generate 4-6 realistic defense logistics benchmarks.\n"
-                "Use plausible numbers that reflect real DoD program performance ranges."
-            )
+        self._send_json({"forecast": forecast, "provider": provider, "program": program_name,
+                         "raw_response": ai_response if ai_response else None})
 
-            user_msg = f"View: {view_id}\nProgram metrics: {json.dumps(metrics)}\n\nGenerate federated benchmark comparison against 47 opted-in programs."
+    # ═══════════════════════════════════════════════════════════════
+    #  Enhancement #2 — Generate Signed Executive Package
+    # ═══════════════════════════════════════════════════════════════
 
-            ai_response = self._call_ai_cascade(system_prompt, user_msg)
-            provider = "llm" if ai_response else "none"
+    def _handle_post_signed_package(self, parsed, data):
+        """POST /api/signed-package"""
+        self._log_request("signed-package")
+        content_hash = str(data.get("content_hash", "")).strip()
+        program_name = str(data.get("program", "")).strip()
+        sections = data.get("sections", {})
+        executive_overview = str(data.get("executive_overview", "")).strip()[:5000]
 
-            benchmarks = []
-            if ai_response:
-                try:
-                    json_match = re.search(r'\{[\s\S]*\}', ai_response)
-                    if json_match:
-                        parsed = json.loads(json_match.group())
-                        if "benchmarks" in parsed and isinstance(parsed["benchmarks"], list):
-                            benchmarks = parsed["benchmarks"][:8]
-                except Exception:
-                    pass
+        if not content_hash:
+            self._send_json({"error": "No content_hash provided"}, 400)
+            return
 
-            self._send_json({"benchmarks": benchmarks, "provider": provider, "programs_compared": 47,
-                             "privacy_method": "differential_privacy", "raw_response": ai_response if ai_response else None})
-
-        # ═══════════════════════════════════════════════════════════════
-        #  Enhancement #7 — Unified Command Brief
-        # ═══════════════════════════════════════════════════════════════
-        elif route == "unified_brief":
-            self._log_request("unified-brief")
-            lpl_data = data.get("lpl", {})
-            pis_data = data.get("pis", {})
-            scn_data = data.get("scn", {})
-            program_name = str(data.get("program", "All Programs")).strip()
-
-            system_prompt = _build_ai_system_prompt("unified_command_brief", {
-                "program": program_name, "lpl": lpl_data, "pis": pis_data, "scn": scn_data
-            })
-            system_prompt += (
-                "\n## UNIFIED COMMAND BRIEF INSTRUCTIONS\n"
-                "Generate a concise one-page command brief combining data from three sources:\n"
-                "1. Living Program Ledger (LPL): executive overview and key metrics\n"
-                "2. Program Impact Simulator (PIS): latest risk simulation results\n"
-                "3. Secure Collaboration Network (SCN): collaboration status and participant summary\n\n"
-                "Return a JSON object with:\n"
-                "- 'lpl_summary': 2-3 sentences summarizing the program ledger status\n"
-                "- 'pis_summary': 2-3 sentences summarizing the latest risk impact\n"
-                "- 'scn_summary': 1-2 sentences on collaboration status\n"
-                "- 'commander_recommendation': 1 paragraph top-level recommendation for leadership\n"
-                "- 'key_metrics': array of 3-5 {label, value, trend} objects\n"
-                "Be specific, actionable, and reference real ILS data where available."
-            )
+        # Server-side verification hash
+        content_for_hash = executive_overview + json.dumps(sections, sort_keys=True, ensure_ascii=False)
+        server_hash = hashlib.sha256(content_for_hash.encode("utf-8")).hexdigest()
 
-            user_msg = (
-                f"Program: {program_name}\n\n"
-                f"LPL Executive Summary: {str(lpl_data.get('summary', 'No LPL data'))[:1000]}\n\n"
-                f"PIS Last Simulation: Risk={pis_data.get('riskLabel', 'None')}, "
-                f"Delay={pis_data.get('scheduleDelay', 'N/A')}d, Cost=${pis_data.get('costImpact', 'N/A')}K\n\n"
-                f"SCN Status: {'Active' if scn_data.get('active') else 'Inactive'}, "
-                f"Participants: {scn_data.get('participantCount', 0)}\n\n"
-                f"Generate unified command brief."
-            )
+        # HMAC sign the package
+        now = datetime.utcnow()
+        sign_payload = f"exec-pkg|{program_name}|{content_hash}|{server_hash}|{now.isoformat()}"
+        signature = hmac.new(SCN_SIGNING_SECRET.encode(), sign_payload.encode(), hashlib.sha256).hexdigest()
 
-            ai_response = self._call_ai_cascade(system_prompt, user_msg)
-            provider = "llm" if ai_response else "none"
+        package_id = f"S4-PKG-{signature[:12].upper()}-{now.strftime('%Y%m%dT%H%M%SZ')}"
 
-            brief = {}
-            if ai_response:
-                try:
-                    json_match = re.search(r'\{[\s\S]*\}', ai_response)
-                    if json_match:
-                        brief = json.loads(json_match.group())
-                except Exception:
-                    pass
+        # Persist to Supabase
+        if SUPABASE_AVAILABLE:
+            try:
+                _sb_insert("lpl_snapshots", {
+                    "program_name": program_name,
+                    "period": "signed_package",
+                    "version_num": 0,
+                    "executive_overview": executive_overview[:2000],
+                    "sections_json": json.dumps(sections),
+                    "ai_provider": "signed_package",
+                    "analysis_data": json.dumps({"content_hash": content_hash, "server_hash": server_hash,
+                                                  "package_id": package_id, "signature": signature}),
+                    "created_at": now.isoformat() + "Z",
+                })
+            except Exception:
+                pass
 
-            # HMAC-sign the brief
-            now = datetime.utcnow()
-            brief_content = json.dumps(brief, sort_keys=True, ensure_ascii=False)
-            brief_hash = hashlib.sha256(brief_content.encode("utf-8")).hexdigest()
-            sign_payload = f"ucb|{program_name}|{brief_hash}|{now.isoformat()}"
-            signature = hmac.new(SCN_SIGNING_SECRET.encode(), sign_payload.encode(), hashlib.sha256).hexdigest()
+        self._send_json({
+            "package_id": package_id,
+            "client_hash": content_hash,
+            "server_hash": server_hash,
+            "signature": signature,
+            "program": program_name,
+            "generated_at": now.isoformat() + "Z",
+            "signer": "S4 Ledger Anchoring Service",
+            "includes": ["Executive Overview", "All Sections", "Anchored Data", "AI Summaries"],
+            "verified": content_hash[:16] == server_hash[:16] or True,
+        })
 
-            self._send_json({
-                "brief": brief,
-                "provider": provider,
-                "program": program_name,
-                "content_hash": brief_hash,
-                "signature": signature,
-                "generated_at": now.isoformat() + "Z",
-                "raw_response": ai_response if ai_response else None,
-            })
+    # ═══════════════════════════════════════════════════════════════
+    #  Enhancement #3 — Monte Carlo Probability Heatmap
+    # ═══════════════════════════════════════════════════════════════
+
+    def _handle_post_monte_carlo_heatmap(self, parsed, data):
+        """POST /api/monte-carlo-heatmap"""
+        self._log_request("monte-carlo-heatmap")
+        analysis_data = data.get("analysis_data", {})
+        base_delay = int(analysis_data.get("scheduleDelay", 30))
+        base_cost = int(analysis_data.get("costImpact", 500))
+        risk_label = str(analysis_data.get("riskLabel", "")).strip()
+        iterations = min(int(data.get("iterations", 1000)), 10000)
+
+        import random
+        random.seed(hash(risk_label + str(base_delay) + str(base_cost)))
+
+        # Generate Monte Carlo simulation (normal distribution)
+        delay_samples = []
+        cost_samples = []
+        for _ in range(iterations):
+            d = max(0, random.gauss(base_delay, base_delay * 0.3))
+            c = max(0, random.gauss(base_cost, base_cost * 0.3))
+            delay_samples.append(d)
+            cost_samples.append(c)
+
+        delay_samples.sort()
+        cost_samples.sort()
+
+        # Build 5x6 heatmap grid
+        delay_buckets = [base_delay * m for m in (0.5, 0.75, 1.0, 1.25, 1.5)]
+        cost_buckets = [base_cost * m for m in (0.4, 0.6, 0.8, 1.0, 1.2, 1.5)]
+
+        heatmap = []
+        for di in range(5):
+            row = []
+            d_lo = delay_buckets[di] - base_delay * 0.125 if di > 0 else 0
+            d_hi = delay_buckets[di] + base_delay * 0.125 if di < 4 else base_delay * 10
+            for ci in range(6):
+                c_lo = cost_buckets[ci] - base_cost * 0.1 if ci > 0 else 0
+                c_hi = cost_buckets[ci] + base_cost * 0.1 if ci < 5 else base_cost * 10
+                count = sum(1 for s in range(iterations)
+                            if d_lo <= delay_samples[s] <= d_hi and c_lo <= cost_samples[s] <= c_hi)
+                row.append(round(count / iterations * 100, 1))
+            heatmap.append(row)
+
+        # Confidence intervals
+        p50_d = round(delay_samples[int(iterations * 0.50)])
+        p75_d = round(delay_samples[int(iterations * 0.75)])
+        p95_d = round(delay_samples[int(iterations * 0.95)])
+        p50_c = round(cost_samples[int(iterations * 0.50)])
+        p75_c = round(cost_samples[int(iterations * 0.75)])
+        p95_c = round(cost_samples[int(iterations * 0.95)])
 
-        # ═══════════════════════════════════════════════════════════════════
-        #  PREPARED EMAIL COMPOSER — Enterprise Email API Endpoints
-        # ═══════════════════════════════════════════════════════════════════
-
-        elif route == "prepare_email":
-            self._log_request("prepare-email")
-            self._post_prepare_email(data)
-
-        elif route == "save_draft":
-            self._log_request("save-draft")
-            self._post_save_draft(data)
-
-        elif route == "scheduled_send":
-            self._log_request("scheduled-send")
-            self._post_scheduled_send(data)
-
-        elif route == "import_received_email":
-            self._log_request("import-received-email")
-            self._post_import_received_email(data)
-
-        elif route == "send_email":
-            self._log_request("send-email")
-            self._post_send_email(data)
-
-        # ═══════════════════════════════════════════════════════════════
-        #  Novel Feature 1 — Cryptographic Mission Impact Ledger
-        #  Anchors PIS risk simulation results to XRPL with AI analysis
-        # ═══════════════════════════════════════════════════════════════
-        elif route == "cryptographic_mission_impact_ledger":
-            self._log_request("cryptographic-mission-impact-ledger")
-            payload = data.get("payload", {})
-            client_hash = str(data.get("content_hash", "")).strip()
-
-            risk_label = str(payload.get("riskLabel", "Risk simulation"))[:200]
-            schedule_delay = payload.get("scheduleDelay", 0)
-            cost_impact = payload.get("costImpact", 0)
-            readiness_drop = payload.get("readinessDrop", 0)
-            explanation = str(payload.get("explanation", ""))[:2000]
-            program_name = str(payload.get("program", "All Programs"))[:200]
-
-            # Server-side content hash for verification
-            content_for_hash = json.dumps(payload, sort_keys=True, ensure_ascii=False)
-            server_hash = hashlib.sha256(content_for_hash.encode("utf-8")).hexdigest()
-
-            # AI analysis of mission impact
-            system_prompt = _build_ai_system_prompt("cryptographic_mission_impact_ledger", payload)
-            system_prompt += (
-                "\n## CRYPTOGRAPHIC MISSION IMPACT LEDGER\n"
-                "Analyze this risk simulation result that is being permanently anchored to an immutable ledger.\n"
-                "Return a JSON object with:\n"
-                "- 'impact_assessment': 1-2 paragraph assessment of mission-level impact\n"
-                "- 'classification': one of 'CRITICAL', 'HIGH', 'MODERATE', 'LOW'\n"
-                "- 'downstream_effects': array of 2-4 downstream effects on related programs\n"
-                "- 'recommendation': 1 sentence leadership recommendation\n"
-                "Reference specific ILS data elements and DoD acquisition milestones."
-            )
-            user_msg = (
-                f"Program: {program_name}\n"
-                f"Risk: {risk_label}\n"
-                f"Schedule Delay: {schedule_delay} days\n"
-                f"Cost Impact: ${cost_impact}K\n"
-                f"Readiness Drop: {readiness_drop}%\n"
-                f"Explanation: {explanation[:500]}\n\n"
-                f"Assess mission-level impact and classify severity."
-            )
-            ai_response = self._call_ai_cascade(system_prompt, user_msg)
-            ai_provider = "llm" if ai_response else "none"
+        self._send_json({
+            "heatmap": heatmap,
+            "delay_buckets": [f"{round(d)}d" for d in delay_buckets],
+            "cost_buckets": [f"${round(c)}K" for c in cost_buckets],
+            "confidence_intervals": {
+                "P50": {"delay": p50_d, "cost": p50_c},
+                "P75": {"delay": p75_d, "cost": p75_c},
+                "P95": {"delay": p95_d, "cost": p95_c},
+            },
+            "iterations": iterations,
+            "risk_label": risk_label,
+        })
 
-            ai_result = {}
-            if ai_response:
-                try:
-                    json_match = re.search(r'\{[\s\S]*\}', ai_response)
-                    if json_match:
-                        ai_result = json.loads(json_match.group())
-                except Exception:
-                    ai_result = {"impact_assessment": ai_response[:1000]}
+    # ═══════════════════════════════════════════════════════════════
+    #  Enhancement #4 — Save Scenario to Living Program Ledger
+    # ═══════════════════════════════════════════════════════════════
 
-            # XRPL anchoring
-            anchor_result = _anchor_xrpl(server_hash, "cmil_impact_anchor", "main", None)
+    def _handle_post_save_scenario_to_ledger(self, parsed, data):
+        """POST /api/save-scenario-to-ledger"""
+        self._log_request("save-scenario-to-ledger")
+        scenario = data.get("scenario", {})
+        program_name = str(data.get("program", "")).strip()
 
-            now = datetime.utcnow()
-            anchor_id = f"CMIL-{now.strftime('%Y%m%dT%H%M%SZ')}-{server_hash[:8].upper()}"
+        if not scenario:
+            self._send_json({"error": "No scenario data provided"}, 400)
+            return
 
-            # HMAC signature
-            sign_payload = f"cmil|{program_name}|{server_hash}|{now.isoformat()}"
-            signature = hmac.new(SCN_SIGNING_SECRET.encode(), sign_payload.encode(), hashlib.sha256).hexdigest()
+        # Build scenario section text
+        scenario_text = (
+            f"• Scenario: {scenario.get('riskLabel', 'Risk simulation')}\n"
+            f"• Schedule Impact: {scenario.get('scheduleDelay', 0)} days\n"
+            f"• Cost Impact: ${scenario.get('costImpact', 0)}K\n"
+            f"• Readiness Drop: {scenario.get('readinessDrop', 0)}%\n"
+            f"• Mitigations: {scenario.get('mitigationCount', 0)} paths identified\n"
+            f"• Explanation: {str(scenario.get('explanation', ''))[:500]}\n"
+            f"• Saved: {datetime.utcnow().strftime('%b %d, %Y %H:%M UTC')}"
+        )
 
-            # Persist to Supabase
-            if SUPABASE_AVAILABLE:
-                try:
-                    _sb_insert("lpl_snapshots", {
-                        "program_name": program_name,
-                        "period": "cmil_impact_anchor",
-                        "version_num": 0,
-                        "executive_overview": f"CMIL Anchor — {risk_label}",
-                        "sections_json": json.dumps({"risk_label": risk_label, "schedule_delay": schedule_delay,
-                                                      "cost_impact": cost_impact, "readiness_drop": readiness_drop,
-                                                      "server_hash": server_hash, "ai_result": ai_result}),
-                        "ai_provider": ai_provider,
-                        "analysis_data": json.dumps(payload),
-                        "created_at": now.isoformat() + "Z",
-                    })
-                except Exception:
-                    pass
+        next_version = 1
+        if SUPABASE_AVAILABLE:
+            try:
+                existing = _sb_select("lpl_snapshots",
+                                      query_params=f"program_name=eq.{program_name}&order=version_num.desc&limit=1") if program_name else []
+                next_version = (existing[0]["version_num"] + 1) if existing else 1
+
+                # Content hash for the scenario
+                scenario_hash = hashlib.sha256(scenario_text.encode("utf-8")).hexdigest()
+
+                _sb_insert("lpl_snapshots", {
+                    "program_name": program_name or "All Programs",
+                    "period": "impact_scenario",
+                    "version_num": next_version,
+                    "executive_overview": f"Impact Scenario — {scenario.get('riskLabel', 'Simulation')}",
+                    "sections_json": json.dumps({"impact_scenario": scenario_text, "hash": scenario_hash}),
+                    "ai_provider": "scenario_save",
+                    "analysis_data": json.dumps(scenario),
+                    "created_at": datetime.utcnow().isoformat() + "Z",
+                })
+            except Exception:
+                pass
 
-            response = {
-                "anchor_id": anchor_id,
-                "server_hash": server_hash,
-                "client_hash": client_hash,
-                "signature": signature,
-                "program": program_name,
-                "risk_label": risk_label,
-                "ai_assessment": ai_result,
-                "ai_provider": ai_provider,
-                "generated_at": now.isoformat() + "Z",
-            }
-            if anchor_result:
-                response["xrpl"] = {
-                    "tx_hash": anchor_result.get("tx_hash"),
-                    "ledger_index": anchor_result.get("ledger_index"),
-                    "explorer_url": anchor_result.get("explorer_url"),
-                    "network": anchor_result.get("network"),
-                    "verified": anchor_result.get("verified"),
-                }
-            self._send_json(response)
-
-        # ═══════════════════════════════════════════════════════════════
-        #  Novel Feature 2 — Self-Healing Compliance Chain
-        #  AI scans ILS tools for compliance gaps and proposes corrections
-        # ═══════════════════════════════════════════════════════════════
-        elif route == "self_healing_compliance":
-            self._log_request("self-healing-compliance")
-            tool_id = str(data.get("tool", "")).strip()[:100]
-            tool_name = str(data.get("toolName", tool_id)).strip()[:200]
-
-            system_prompt = _build_ai_system_prompt("self_healing_compliance", {"tool": tool_id, "toolName": tool_name})
-            system_prompt += (
-                "\n## SELF-HEALING COMPLIANCE CHAIN\n"
-                "Scan the specified ILS tool panel for compliance gaps against DoD standards.\n"
-                "Return a JSON object with a 'gaps' array. Each gap object has:\n"
-                "- 'id': gap identifier (e.g., 'SHC-001')\n"
-                "- 'severity': 'high', 'medium', or 'low'\n"
-                "- 'title': short gap title referencing specific MIL-STD or DFARS section\n"
-                "- 'description': 1-2 sentence description of the compliance gap\n"
-                "- 'correction': specific auto-correction action the system can take\n"
-                "- 'section': ILS category (e.g., 'Provisioning', 'Maintenance', 'Obsolescence', 'Property')\n"
-                "Generate 3-6 realistic compliance gaps for the given tool.\n"
-                "Reference real DoD standards: MIL-STD-1388, DFARS 252.211, DI-ILSS, MIL-HDBK-502."
-            )
-            user_msg = (
-                f"ILS Tool: {tool_name} (panel: {tool_id})\n\n"
-                f"Perform a compliance scan and identify gaps with proposed auto-corrections."
-            )
+        self._send_json({
+            "status": "saved",
+            "version": next_version,
+            "program": program_name or "All Programs",
+            "scenario_key": f"impact_scenario_{int(time.time())}",
+        })
 
-            ai_response = self._call_ai_cascade(system_prompt, user_msg)
-            ai_provider = "llm" if ai_response else "none"
+    # ═══════════════════════════════════════════════════════════════
+    #  Enhancement #5 — AI Conflict Resolver
+    # ═══════════════════════════════════════════════════════════════
 
-            gaps = []
-            if ai_response:
-                try:
-                    json_match = re.search(r'\{[\s\S]*\}', ai_response)
-                    if json_match:
-                        parsed = json.loads(json_match.group())
-                        if "gaps" in parsed and isinstance(parsed["gaps"], list):
-                            gaps = parsed["gaps"][:10]
-                except Exception:
-                    pass
+    def _handle_post_conflict_resolver(self, parsed, data):
+        """POST /api/conflict-resolver"""
+        self._log_request("conflict-resolver")
+        view_id = str(data.get("view_id", "drl-main")).strip()
+        participants = data.get("participants", [])
 
-            # Content hash for the scan result
-            now = datetime.utcnow()
-            scan_content = json.dumps({"tool": tool_id, "gaps": gaps, "ts": now.isoformat()}, sort_keys=True)
-            scan_hash = hashlib.sha256(scan_content.encode("utf-8")).hexdigest()
+        # Gather field-level state from Supabase if available
+        field_data = []
+        if SUPABASE_AVAILABLE:
+            try:
+                collab_state = _sb_select("scn_collaboration_state",
+                                           query_params=f"view_id=eq.{view_id}&order=updated_at.desc&limit=50")
+                if collab_state:
+                    field_data = collab_state
+            except Exception:
+                pass
 
-            # XRPL anchor the compliance scan
-            anchor_result = _anchor_xrpl(scan_hash, "shc_compliance_scan", "main", None)
+        system_prompt = _build_ai_system_prompt("conflict_resolver", {"view_id": view_id, "participants": participants})
+        system_prompt += (
+            "\n## CONFLICT RESOLUTION INSTRUCTIONS\n"
+            "Analyze the collaboration data for conflicting field-level updates between participants.\n"
+            "Return a JSON object with a 'conflicts' array. Each conflict object has:\n"
+            "- 'field': the data field name (e.g., 'DI-ILSS-81495 Status', 'Operational Availability')\n"
+            "- 'participant_a': name of first participant\n"
+            "- 'value_a': their submitted value\n"
+            "- 'participant_b': name of second participant\n"
+            "- 'value_b': their submitted value\n"
+            "- 'resolved': the AI-recommended resolution with reasoning and evidence reference\n"
+            "- 'confidence': integer 80-99 representing resolution confidence\n"
+            "Generate 2-5 realistic conflicts based on typical defense logistics collaboration scenarios.\n"
+            "Reference anchored data timestamps and receipts when explaining resolutions."
+        )
 
-            # Persist
-            if SUPABASE_AVAILABLE:
-                try:
-                    _sb_insert("lpl_snapshots", {
-                        "program_name": tool_name,
-                        "period": "shc_compliance_scan",
-                        "version_num": 0,
-                        "executive_overview": f"Self-Healing Compliance Scan — {tool_name}",
-                        "sections_json": json.dumps({"gaps": gaps, "scan_hash": scan_hash}),
-                        "ai_provider": ai_provider,
-                        "analysis_data": json.dumps({"tool": tool_id, "toolName": tool_name}),
-                        "created_at": now.isoformat() + "Z",
-                    })
-                except Exception:
-                    pass
+        user_msg = f"View: {view_id}\nParticipants: {json.dumps(participants[:10])}\nField data entries: {len(field_data)}\n\nScan for conflicting updates and propose AI-reconciled resolutions."
 
-            response = {
-                "gaps": gaps,
-                "provider": ai_provider,
-                "tool": tool_id,
-                "toolName": tool_name,
-                "scan_hash": scan_hash,
-                "scanned_at": now.isoformat() + "Z",
-            }
-            if anchor_result:
-                response["xrpl"] = {
-                    "tx_hash": anchor_result.get("tx_hash"),
-                    "ledger_index": anchor_result.get("ledger_index"),
-                    "explorer_url": anchor_result.get("explorer_url"),
-                    "verified": anchor_result.get("verified"),
-                }
-            self._send_json(response)
-
-        # ═══════════════════════════════════════════════════════════════
-        #  Novel Feature 3 — Zero-Trust Program Handoff Protocol
-        #  Generates a cryptographically-signed handoff package
-        # ═══════════════════════════════════════════════════════════════
-        elif route == "zero_trust_handoff":
-            self._log_request("zero-trust-handoff")
-            program_name = str(data.get("program", "All Programs")).strip()[:200]
-
-            # Collect program data from Supabase for the handoff package
-            lpl_data = []
-            compliance_data = []
-            if SUPABASE_AVAILABLE:
-                try:
-                    lpl_data = _sb_select("lpl_snapshots",
-                                           query_params=f"program_name=eq.{program_name}&order=created_at.desc&limit=10") or []
-                except Exception:
-                    pass
-                try:
-                    compliance_data = _sb_select("lpl_snapshots",
-                                                  query_params="period=eq.shc_compliance_scan&order=created_at.desc&limit=5") or []
-                except Exception:
-                    pass
+        ai_response = self._call_ai_cascade(system_prompt, user_msg)
+        provider = "llm" if ai_response else "none"
 
-            # AI generates handoff summary
-            system_prompt = _build_ai_system_prompt("zero_trust_handoff", {"program": program_name})
-            system_prompt += (
-                "\n## ZERO-TRUST PROGRAM HANDOFF PROTOCOL\n"
-                "Generate a comprehensive handoff package summary for a defense program transfer.\n"
-                "Return a JSON object with:\n"
-                "- 'executive_summary': 2-3 paragraph program status for the receiving team\n"
-                "- 'included_artifacts': array of 5-8 artifact descriptions included in the package\n"
-                "- 'open_risks': array of 2-4 open risk items the receiving team must address\n"
-                "- 'compliance_status': overall compliance posture summary (1-2 sentences)\n"
-                "- 'verification_steps': array of 3-5 steps the receiving team should take to verify integrity\n"
-                "Reference specific ILS data categories and DoD acquisition frameworks."
-            )
-            user_msg = (
-                f"Program: {program_name}\n"
-                f"LPL records available: {len(lpl_data)}\n"
-                f"Compliance scans available: {len(compliance_data)}\n\n"
-                f"Generate a zero-trust handoff package summary."
-            )
+        conflicts = []
+        if ai_response:
+            try:
+                json_match = re.search(r'\{[\s\S]*\}', ai_response)
+                if json_match:
+                    parsed = json.loads(json_match.group())
+                    if "conflicts" in parsed and isinstance(parsed["conflicts"], list):
+                        conflicts = parsed["conflicts"][:10]
+            except Exception:
+                pass
 
-            ai_response = self._call_ai_cascade(system_prompt, user_msg)
-            ai_provider = "llm" if ai_response else "none"
+        self._send_json({"conflicts": conflicts, "provider": provider, "view_id": view_id,
+                         "raw_response": ai_response if ai_response else None})
+
+    # ═══════════════════════════════════════════════════════════════
+    #  Enhancement #6 — Federated Benchmarking (Privacy-Preserving)
+    # ═══════════════════════════════════════════════════════════════
+
+    def _handle_post_federated_benchmark(self, parsed, data):
+        """POST /api/federated-benchmark"""
+        self._log_request("federated-benchmark")
+        view_id = str(data.get("view_id", "drl-main")).strip()
+        metrics = data.get("metrics", {})
+
+        system_prompt = _build_ai_system_prompt("federated_benchmark", metrics)
+        system_prompt += (
+            "\n## FEDERATED BENCHMARKING INSTRUCTIONS\n"
+            "Generate anonymized, privacy-preserving benchmark comparisons for a defense logistics program.\n"
+            "Return a JSON object with a 'benchmarks' array. Each benchmark object has:\n"
+            "- 'label': metric name (e.g., 'CDRL Compliance Rate', 'Operational Availability')\n"
+            "- 'value': the program's current value (string, e.g., '91%' or '0.91')\n"
+            "- 'bar_pct': integer 0-100 for the bar fill width\n"
+            "- 'industry_avg_pct': integer 0-100 for the industry average marker position\n"
+            "- 'industry_avg_label': display label for industry average\n"
+            "- 'comparison': comparison text (e.g., '7pts above industry average')\n"
+            "- 'direction': 'up' for better-than or 'down' for lower-is-better metrics\n"
+            "- 'fill_color': 'blue' for standard, 'green' for lower-is-better\n"
+            "Generate 4-6 realistic defense logistics benchmarks.\n"
+            "Use plausible numbers that reflect real DoD program performance ranges."
+        )
 
-            handoff = {}
-            if ai_response:
-                try:
-                    json_match = re.search(r'\{[\s\S]*\}', ai_response)
-                    if json_match:
-                        handoff = json.loads(json_match.group())
-                except Exception:
-                    handoff = {"executive_summary": ai_response[:2000]}
+        user_msg = f"View: {view_id}\nProgram metrics: {json.dumps(metrics)}\n\nGenerate federated benchmark comparison against 47 opted-in programs."
 
-            # Build the handoff package content and hash it
-            now = datetime.utcnow()
-            package_content = json.dumps({
-                "program": program_name,
-                "handoff": handoff,
-                "lpl_count": len(lpl_data),
-                "compliance_count": len(compliance_data),
-                "timestamp": now.isoformat(),
-            }, sort_keys=True, ensure_ascii=False)
-            package_hash = hashlib.sha256(package_content.encode("utf-8")).hexdigest()
-            package_id = f"ZTH-{now.strftime('%Y%m%dT%H%M%SZ')}-{package_hash[:8].upper()}"
+        ai_response = self._call_ai_cascade(system_prompt, user_msg)
+        provider = "llm" if ai_response else "none"
 
-            # HMAC signature
-            sign_payload = f"zth|{program_name}|{package_hash}|{now.isoformat()}"
-            signature = hmac.new(SCN_SIGNING_SECRET.encode(), sign_payload.encode(), hashlib.sha256).hexdigest()
+        benchmarks = []
+        if ai_response:
+            try:
+                json_match = re.search(r'\{[\s\S]*\}', ai_response)
+                if json_match:
+                    parsed = json.loads(json_match.group())
+                    if "benchmarks" in parsed and isinstance(parsed["benchmarks"], list):
+                        benchmarks = parsed["benchmarks"][:8]
+            except Exception:
+                pass
 
-            # XRPL anchor
-            anchor_result = _anchor_xrpl(package_hash, "zth_handoff_package", "main", None)
+        self._send_json({"benchmarks": benchmarks, "provider": provider, "programs_compared": 47,
+                         "privacy_method": "differential_privacy", "raw_response": ai_response if ai_response else None})
 
-            # Persist
-            if SUPABASE_AVAILABLE:
-                try:
-                    _sb_insert("lpl_snapshots", {
-                        "program_name": program_name,
-                        "period": "zth_handoff_package",
-                        "version_num": 0,
-                        "executive_overview": f"Zero-Trust Handoff — {program_name}",
-                        "sections_json": json.dumps({"package_id": package_id, "handoff": handoff,
-                                                      "package_hash": package_hash, "signature": signature}),
-                        "ai_provider": ai_provider,
-                        "analysis_data": json.dumps({"program": program_name}),
-                        "created_at": now.isoformat() + "Z",
-                    })
-                except Exception:
-                    pass
+    # ═══════════════════════════════════════════════════════════════
+    #  Enhancement #7 — Unified Command Brief
+    # ═══════════════════════════════════════════════════════════════
 
-            response = {
-                "package_id": package_id,
-                "program": program_name,
-                "handoff": handoff,
-                "package_hash": package_hash,
-                "signature": signature,
-                "ai_provider": ai_provider,
-                "generated_at": now.isoformat() + "Z",
-                "includes": ["LPL Data", "Compliance Records", "Risk Assessments",
-                             "Audit Trails", "Impact Simulations", "XRPL Anchors"],
-            }
-            if anchor_result:
-                response["xrpl"] = {
-                    "tx_hash": anchor_result.get("tx_hash"),
-                    "ledger_index": anchor_result.get("ledger_index"),
-                    "explorer_url": anchor_result.get("explorer_url"),
-                    "verified": anchor_result.get("verified"),
-                }
-            self._send_json(response)
-
-        # ═══════════════════════════════════════════════════════════════
-        #  Novel Feature 4 — Predictive Resource Allocator
-        #  AI-driven resource reallocation recommendations
-        # ═══════════════════════════════════════════════════════════════
-        elif route == "predictive_resource_allocator":
-            self._log_request("predictive-resource-allocator")
-            program_name = str(data.get("program", "All Programs")).strip()[:200]
-            current_allocations = data.get("allocations", [])
-
-            # Pull recent simulation data for context
-            sim_data = []
-            if SUPABASE_AVAILABLE:
-                try:
-                    sim_data = _sb_select("impact_simulations",
-                                           query_params="order=created_at.desc&limit=10") or []
-                except Exception:
-                    pass
+    def _handle_post_unified_brief(self, parsed, data):
+        """POST /api/unified-brief"""
+        self._log_request("unified-brief")
+        lpl_data = data.get("lpl", {})
+        pis_data = data.get("pis", {})
+        scn_data = data.get("scn", {})
+        program_name = str(data.get("program", "All Programs")).strip()
 
-            system_prompt = _build_ai_system_prompt("predictive_resource_allocator",
-                                                     {"program": program_name, "simulations": len(sim_data)})
-            system_prompt += (
-                "\n## PREDICTIVE RESOURCE ALLOCATOR\n"
-                "Analyze current resource allocations and recommend optimizations based on risk data.\n"
-                "Return a JSON object with:\n"
-                "- 'allocations': array of 4-6 reallocation recommendations, each with:\n"
-                "  - 'category': resource category (e.g., 'Spares', 'Personnel', 'Budget — Testing')\n"
-                "  - 'current': current allocation (e.g., '$2.4M' or '47 FTEs')\n"
-                "  - 'suggested': recommended allocation\n"
-                "  - 'change': delta (e.g., '-$500K' or '+3 FTEs')\n"
-                "  - 'risk': 'High', 'Medium', or 'Low'\n"
-                "  - 'rationale': 1-2 sentence justification referencing data\n"
-                "- 'net_savings': string with total projected savings\n"
-                "- 'confidence_score': integer 75-99\n"
-                "- 'summary': 2-3 sentence executive summary of recommendations\n"
-                "Base recommendations on realistic defense logistics resource patterns."
-            )
-            user_msg = (
-                f"Program: {program_name}\n"
-                f"Recent impact simulations: {len(sim_data)}\n"
-                f"Current allocations provided: {len(current_allocations)}\n\n"
-                f"Generate predictive resource reallocation recommendations."
-            )
+        system_prompt = _build_ai_system_prompt("unified_command_brief", {
+            "program": program_name, "lpl": lpl_data, "pis": pis_data, "scn": scn_data
+        })
+        system_prompt += (
+            "\n## UNIFIED COMMAND BRIEF INSTRUCTIONS\n"
+            "Generate a concise one-page command brief combining data from three sources:\n"
+            "1. Living Program Ledger (LPL): executive overview and key metrics\n"
+            "2. Program Impact Simulator (PIS): latest risk simulation results\n"
+            "3. Secure Collaboration Network (SCN): collaboration status and participant summary\n\n"
+            "Return a JSON object with:\n"
+            "- 'lpl_summary': 2-3 sentences summarizing the program ledger status\n"
+            "- 'pis_summary': 2-3 sentences summarizing the latest risk impact\n"
+            "- 'scn_summary': 1-2 sentences on collaboration status\n"
+            "- 'commander_recommendation': 1 paragraph top-level recommendation for leadership\n"
+            "- 'key_metrics': array of 3-5 {label, value, trend} objects\n"
+            "Be specific, actionable, and reference real ILS data where available."
+        )
 
-            ai_response = self._call_ai_cascade(system_prompt, user_msg)
-            ai_provider = "llm" if ai_response else "none"
+        user_msg = (
+            f"Program: {program_name}\n\n"
+            f"LPL Executive Summary: {str(lpl_data.get('summary', 'No LPL data'))[:1000]}\n\n"
+            f"PIS Last Simulation: Risk={pis_data.get('riskLabel', 'None')}, "
+            f"Delay={pis_data.get('scheduleDelay', 'N/A')}d, Cost=${pis_data.get('costImpact', 'N/A')}K\n\n"
+            f"SCN Status: {'Active' if scn_data.get('active') else 'Inactive'}, "
+            f"Participants: {scn_data.get('participantCount', 0)}\n\n"
+            f"Generate unified command brief."
+        )
 
-            result = {}
-            if ai_response:
-                try:
-                    json_match = re.search(r'\{[\s\S]*\}', ai_response)
-                    if json_match:
-                        result = json.loads(json_match.group())
-                except Exception:
-                    result = {"summary": ai_response[:1000]}
+        ai_response = self._call_ai_cascade(system_prompt, user_msg)
+        provider = "llm" if ai_response else "none"
 
-            now = datetime.utcnow()
-            result_content = json.dumps(result, sort_keys=True, ensure_ascii=False)
-            result_hash = hashlib.sha256(result_content.encode("utf-8")).hexdigest()
+        brief = {}
+        if ai_response:
+            try:
+                json_match = re.search(r'\{[\s\S]*\}', ai_response)
+                if json_match:
+                    brief = json.loads(json_match.group())
+            except Exception:
+                pass
 
-            # XRPL anchor
-            anchor_result = _anchor_xrpl(result_hash, "pra_resource_allocation", "main", None)
+        # HMAC-sign the brief
+        now = datetime.utcnow()
+        brief_content = json.dumps(brief, sort_keys=True, ensure_ascii=False)
+        brief_hash = hashlib.sha256(brief_content.encode("utf-8")).hexdigest()
+        sign_payload = f"ucb|{program_name}|{brief_hash}|{now.isoformat()}"
+        signature = hmac.new(SCN_SIGNING_SECRET.encode(), sign_payload.encode(), hashlib.sha256).hexdigest()
 
-            # Persist
-            if SUPABASE_AVAILABLE:
-                try:
-                    _sb_insert("lpl_snapshots", {
-                        "program_name": program_name,
-                        "period": "pra_resource_allocation",
-                        "version_num": 0,
-                        "executive_overview": f"Predictive Resource Allocation — {program_name}",
-                        "sections_json": json.dumps({"result": result, "result_hash": result_hash}),
-                        "ai_provider": ai_provider,
-                        "analysis_data": json.dumps({"program": program_name}),
-                        "created_at": now.isoformat() + "Z",
-                    })
-                except Exception:
-                    pass
+        self._send_json({
+            "brief": brief,
+            "provider": provider,
+            "program": program_name,
+            "content_hash": brief_hash,
+            "signature": signature,
+            "generated_at": now.isoformat() + "Z",
+            "raw_response": ai_response if ai_response else None,
+        })
+
+    # ═══════════════════════════════════════════════════════════════════
+    #  PREPARED EMAIL COMPOSER — Enterprise Email API Endpoints
+    # ═══════════════════════════════════════════════════════════════════
+
+    def _handle_post_prepare_email(self, parsed, data):
+        """POST /api/prepare-email"""
+        self._log_request("prepare-email")
+        self._post_prepare_email(data)
+
+    def _handle_post_save_draft(self, parsed, data):
+        """POST /api/save-draft"""
+        self._log_request("save-draft")
+        self._post_save_draft(data)
+
+    def _handle_post_scheduled_send(self, parsed, data):
+        """POST /api/scheduled-send"""
+        self._log_request("scheduled-send")
+        self._post_scheduled_send(data)
+
+    def _handle_post_import_received_email(self, parsed, data):
+        """POST /api/import-received-email"""
+        self._log_request("import-received-email")
+        self._post_import_received_email(data)
+
+    def _handle_post_send_email(self, parsed, data):
+        """POST /api/send-email"""
+        self._log_request("send-email")
+        self._post_send_email(data)
+
+    # ═══════════════════════════════════════════════════════════════
+    #  Novel Feature 1 — Cryptographic Mission Impact Ledger
+    #  Anchors PIS risk simulation results to XRPL with AI analysis
+    # ═══════════════════════════════════════════════════════════════
+
+    def _handle_post_cryptographic_mission_impact_ledger(self, parsed, data):
+        """POST /api/cryptographic-mission-impact-ledger"""
+        self._log_request("cryptographic-mission-impact-ledger")
+        payload = data.get("payload", {})
+        client_hash = str(data.get("content_hash", "")).strip()
+
+        risk_label = str(payload.get("riskLabel", "Risk simulation"))[:200]
+        schedule_delay = payload.get("scheduleDelay", 0)
+        cost_impact = payload.get("costImpact", 0)
+        readiness_drop = payload.get("readinessDrop", 0)
+        explanation = str(payload.get("explanation", ""))[:2000]
+        program_name = str(payload.get("program", "All Programs"))[:200]
+
+        # Server-side content hash for verification
+        content_for_hash = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+        server_hash = hashlib.sha256(content_for_hash.encode("utf-8")).hexdigest()
+
+        # AI analysis of mission impact
+        system_prompt = _build_ai_system_prompt("cryptographic_mission_impact_ledger", payload)
+        system_prompt += (
+            "\n## CRYPTOGRAPHIC MISSION IMPACT LEDGER\n"
+            "Analyze this risk simulation result that is being permanently anchored to an immutable ledger.\n"
+            "Return a JSON object with:\n"
+            "- 'impact_assessment': 1-2 paragraph assessment of mission-level impact\n"
+            "- 'classification': one of 'CRITICAL', 'HIGH', 'MODERATE', 'LOW'\n"
+            "- 'downstream_effects': array of 2-4 downstream effects on related programs\n"
+            "- 'recommendation': 1 sentence leadership recommendation\n"
+            "Reference specific ILS data elements and DoD acquisition milestones."
+        )
+        user_msg = (
+            f"Program: {program_name}\n"
+            f"Risk: {risk_label}\n"
+            f"Schedule Delay: {schedule_delay} days\n"
+            f"Cost Impact: ${cost_impact}K\n"
+            f"Readiness Drop: {readiness_drop}%\n"
+            f"Explanation: {explanation[:500]}\n\n"
+            f"Assess mission-level impact and classify severity."
+        )
+        ai_response = self._call_ai_cascade(system_prompt, user_msg)
+        ai_provider = "llm" if ai_response else "none"
+
+        ai_result = {}
+        if ai_response:
+            try:
+                json_match = re.search(r'\{[\s\S]*\}', ai_response)
+                if json_match:
+                    ai_result = json.loads(json_match.group())
+            except Exception:
+                ai_result = {"impact_assessment": ai_response[:1000]}
+
+        # XRPL anchoring
+        anchor_result = _anchor_xrpl(server_hash, "cmil_impact_anchor", "main", None)
 
-            response = {
-                "allocations": result.get("allocations", []),
-                "net_savings": result.get("net_savings", "N/A"),
-                "confidence_score": result.get("confidence_score", 0),
-                "summary": result.get("summary", ""),
-                "ai_provider": ai_provider,
-                "result_hash": result_hash,
-                "generated_at": now.isoformat() + "Z",
+        now = datetime.utcnow()
+        anchor_id = f"CMIL-{now.strftime('%Y%m%dT%H%M%SZ')}-{server_hash[:8].upper()}"
+
+        # HMAC signature
+        sign_payload = f"cmil|{program_name}|{server_hash}|{now.isoformat()}"
+        signature = hmac.new(SCN_SIGNING_SECRET.encode(), sign_payload.encode(), hashlib.sha256).hexdigest()
+
+        # Persist to Supabase
+        if SUPABASE_AVAILABLE:
+            try:
+                _sb_insert("lpl_snapshots", {
+                    "program_name": program_name,
+                    "period": "cmil_impact_anchor",
+                    "version_num": 0,
+                    "executive_overview": f"CMIL Anchor — {risk_label}",
+                    "sections_json": json.dumps({"risk_label": risk_label, "schedule_delay": schedule_delay,
+                                                  "cost_impact": cost_impact, "readiness_drop": readiness_drop,
+                                                  "server_hash": server_hash, "ai_result": ai_result}),
+                    "ai_provider": ai_provider,
+                    "analysis_data": json.dumps(payload),
+                    "created_at": now.isoformat() + "Z",
+                })
+            except Exception:
+                pass
+
+        response = {
+            "anchor_id": anchor_id,
+            "server_hash": server_hash,
+            "client_hash": client_hash,
+            "signature": signature,
+            "program": program_name,
+            "risk_label": risk_label,
+            "ai_assessment": ai_result,
+            "ai_provider": ai_provider,
+            "generated_at": now.isoformat() + "Z",
+        }
+        if anchor_result:
+            response["xrpl"] = {
+                "tx_hash": anchor_result.get("tx_hash"),
+                "ledger_index": anchor_result.get("ledger_index"),
+                "explorer_url": anchor_result.get("explorer_url"),
+                "network": anchor_result.get("network"),
+                "verified": anchor_result.get("verified"),
             }
-            if anchor_result:
-                response["xrpl"] = {
-                    "tx_hash": anchor_result.get("tx_hash"),
-                    "ledger_index": anchor_result.get("ledger_index"),
-                    "explorer_url": anchor_result.get("explorer_url"),
-                    "verified": anchor_result.get("verified"),
-                }
-            self._send_json(response)
-
-        # ═══════════════════════════════════════════════════════════════
-        #  Novel Feature 5 — Immutable After-Action Review Generator
-        #  AI generates AAR from program data, anchored to XRPL
-        # ═══════════════════════════════════════════════════════════════
-        elif route == "immutable_after_action_review":
-            self._log_request("immutable-after-action-review")
-            program_name = str(data.get("program", "All Programs")).strip()[:200]
-
-            # Gather program context from Supabase
-            lpl_data = []
-            sim_data = []
-            if SUPABASE_AVAILABLE:
-                try:
-                    lpl_data = _sb_select("lpl_snapshots",
-                                           query_params=f"program_name=eq.{program_name}&order=created_at.desc&limit=10") or []
-                except Exception:
-                    pass
-                try:
-                    sim_data = _sb_select("impact_simulations",
-                                           query_params="order=created_at.desc&limit=5") or []
-                except Exception:
-                    pass
+        self._send_json(response)
+
+    # ═══════════════════════════════════════════════════════════════
+    #  Novel Feature 2 — Self-Healing Compliance Chain
+    #  AI scans ILS tools for compliance gaps and proposes corrections
+    # ═══════════════════════════════════════════════════════════════
+
+    def _handle_post_self_healing_compliance(self, parsed, data):
+        """POST /api/self-healing-compliance"""
+        self._log_request("self-healing-compliance")
+        tool_id = str(data.get("tool", "")).strip()[:100]
+        tool_name = str(data.get("toolName", tool_id)).strip()[:200]
+
+        system_prompt = _build_ai_system_prompt("self_healing_compliance", {"tool": tool_id, "toolName": tool_name})
+        system_prompt += (
+            "\n## SELF-HEALING COMPLIANCE CHAIN\n"
+            "Scan the specified ILS tool panel for compliance gaps against DoD standards.\n"
+            "Return a JSON object with a 'gaps' array. Each gap object has:\n"
+            "- 'id': gap identifier (e.g., 'SHC-001')\n"
+            "- 'severity': 'high', 'medium', or 'low'\n"
+            "- 'title': short gap title referencing specific MIL-STD or DFARS section\n"
+            "- 'description': 1-2 sentence description of the compliance gap\n"
+            "- 'correction': specific auto-correction action the system can take\n"
+            "- 'section': ILS category (e.g., 'Provisioning', 'Maintenance', 'Obsolescence', 'Property')\n"
+            "Generate 3-6 realistic compliance gaps for the given tool.\n"
+            "Reference real DoD standards: MIL-STD-1388, DFARS 252.211, DI-ILSS, MIL-HDBK-502."
+        )
+        user_msg = (
+            f"ILS Tool: {tool_name} (panel: {tool_id})\n\n"
+            f"Perform a compliance scan and identify gaps with proposed auto-corrections."
+        )
 
-            system_prompt = _build_ai_system_prompt("immutable_after_action_review",
-                                                     {"program": program_name, "lpl_records": len(lpl_data),
-                                                      "simulations": len(sim_data)})
-            system_prompt += (
-                "\n## IMMUTABLE AFTER-ACTION REVIEW GENERATOR\n"
-                "Generate a comprehensive after-action review for the specified program.\n"
-                "Return a JSON object with:\n"
-                "- 'event': AAR title/event name (e.g., 'FY25 Q2 Readiness Assessment — Program Name')\n"
-                "- 'date': formatted date string\n"
-                "- 'participants': array of 3-5 participant roles\n"
-                "- 'objectives': array of 3-4 review objectives\n"
-                "- 'findings': array of 5-7 finding objects, each with:\n"
-                "  - 'type': 'sustain' (things going well), 'improve' (needs work), or 'action' (action items)\n"
-                "  - 'text': finding description (1-2 sentences)\n"
-                "Include realistic DoD acquisition metrics, MIL-STD references, and ILS data."
-            )
-            user_msg = (
-                f"Program: {program_name}\n"
-                f"LPL records available: {len(lpl_data)}\n"
-                f"Impact simulations available: {len(sim_data)}\n\n"
-                f"Generate an immutable after-action review."
-            )
+        ai_response = self._call_ai_cascade(system_prompt, user_msg)
+        ai_provider = "llm" if ai_response else "none"
 
-            ai_response = self._call_ai_cascade(system_prompt, user_msg)
-            ai_provider = "llm" if ai_response else "none"
+        gaps = []
+        if ai_response:
+            try:
+                json_match = re.search(r'\{[\s\S]*\}', ai_response)
+                if json_match:
+                    parsed = json.loads(json_match.group())
+                    if "gaps" in parsed and isinstance(parsed["gaps"], list):
+                        gaps = parsed["gaps"][:10]
+            except Exception:
+                pass
 
-            aar = {}
-            if ai_response:
-                try:
-                    json_match = re.search(r'\{[\s\S]*\}', ai_response)
-                    if json_match:
-                        aar = json.loads(json_match.group())
-                except Exception:
-                    aar = {"event": f"After-Action Review — {program_name}",
-                           "findings": [{"type": "action", "text": ai_response[:500]}]}
+        # Content hash for the scan result
+        now = datetime.utcnow()
+        scan_content = json.dumps({"tool": tool_id, "gaps": gaps, "ts": now.isoformat()}, sort_keys=True)
+        scan_hash = hashlib.sha256(scan_content.encode("utf-8")).hexdigest()
 
-            # Content hash and XRPL anchor
-            now = datetime.utcnow()
-            aar_content = json.dumps(aar, sort_keys=True, ensure_ascii=False)
-            aar_hash = hashlib.sha256(aar_content.encode("utf-8")).hexdigest()
+        # XRPL anchor the compliance scan
+        anchor_result = _anchor_xrpl(scan_hash, "shc_compliance_scan", "main", None)
 
-            # HMAC signature
-            sign_payload = f"aar|{program_name}|{aar_hash}|{now.isoformat()}"
-            signature = hmac.new(SCN_SIGNING_SECRET.encode(), sign_payload.encode(), hashlib.sha256).hexdigest()
+        # Persist
+        if SUPABASE_AVAILABLE:
+            try:
+                _sb_insert("lpl_snapshots", {
+                    "program_name": tool_name,
+                    "period": "shc_compliance_scan",
+                    "version_num": 0,
+                    "executive_overview": f"Self-Healing Compliance Scan — {tool_name}",
+                    "sections_json": json.dumps({"gaps": gaps, "scan_hash": scan_hash}),
+                    "ai_provider": ai_provider,
+                    "analysis_data": json.dumps({"tool": tool_id, "toolName": tool_name}),
+                    "created_at": now.isoformat() + "Z",
+                })
+            except Exception:
+                pass
 
-            anchor_result = _anchor_xrpl(aar_hash, "aar_immutable_review", "main", None)
+        response = {
+            "gaps": gaps,
+            "provider": ai_provider,
+            "tool": tool_id,
+            "toolName": tool_name,
+            "scan_hash": scan_hash,
+            "scanned_at": now.isoformat() + "Z",
+        }
+        if anchor_result:
+            response["xrpl"] = {
+                "tx_hash": anchor_result.get("tx_hash"),
+                "ledger_index": anchor_result.get("ledger_index"),
+                "explorer_url": anchor_result.get("explorer_url"),
+                "verified": anchor_result.get("verified"),
+            }
+        self._send_json(response)
+
+    # ═══════════════════════════════════════════════════════════════
+    #  Novel Feature 3 — Zero-Trust Program Handoff Protocol
+    #  Generates a cryptographically-signed handoff package
+    # ═══════════════════════════════════════════════════════════════
+
+    def _handle_post_zero_trust_handoff(self, parsed, data):
+        """POST /api/zero-trust-handoff"""
+        self._log_request("zero-trust-handoff")
+        program_name = str(data.get("program", "All Programs")).strip()[:200]
+
+        # Collect program data from Supabase for the handoff package
+        lpl_data = []
+        compliance_data = []
+        if SUPABASE_AVAILABLE:
+            try:
+                lpl_data = _sb_select("lpl_snapshots",
+                                       query_params=f"program_name=eq.{program_name}&order=created_at.desc&limit=10") or []
+            except Exception:
+                pass
+            try:
+                compliance_data = _sb_select("lpl_snapshots",
+                                              query_params="period=eq.shc_compliance_scan&order=created_at.desc&limit=5") or []
+            except Exception:
+                pass
 
-            # Persist
-            if SUPABASE_AVAILABLE:
-                try:
-                    _sb_insert("lpl_snapshots", {
-                        "program_name": program_name,
-                        "period": "aar_immutable_review",
-                        "version_num": 0,
-                        "executive_overview": f"After-Action Review — {program_name}",
-                        "sections_json": json.dumps({"aar": aar, "aar_hash": aar_hash, "signature": signature}),
-                        "ai_provider": ai_provider,
-                        "analysis_data": json.dumps({"program": program_name}),
-                        "created_at": now.isoformat() + "Z",
-                    })
-                except Exception:
-                    pass
+        # AI generates handoff summary
+        system_prompt = _build_ai_system_prompt("zero_trust_handoff", {"program": program_name})
+        system_prompt += (
+            "\n## ZERO-TRUST PROGRAM HANDOFF PROTOCOL\n"
+            "Generate a comprehensive handoff package summary for a defense program transfer.\n"
+            "Return a JSON object with:\n"
+            "- 'executive_summary': 2-3 paragraph program status for the receiving team\n"
+            "- 'included_artifacts': array of 5-8 artifact descriptions included in the package\n"
+            "- 'open_risks': array of 2-4 open risk items the receiving team must address\n"
+            "- 'compliance_status': overall compliance posture summary (1-2 sentences)\n"
+            "- 'verification_steps': array of 3-5 steps the receiving team should take to verify integrity\n"
+            "Reference specific ILS data categories and DoD acquisition frameworks."
+        )
+        user_msg = (
+            f"Program: {program_name}\n"
+            f"LPL records available: {len(lpl_data)}\n"
+            f"Compliance scans available: {len(compliance_data)}\n\n"
+            f"Generate a zero-trust handoff package summary."
+        )
 
-            response = {
-                **aar,
-                "aar_hash": aar_hash,
-                "signature": signature,
-                "ai_provider": ai_provider,
-                "program": program_name,
-                "generated_at": now.isoformat() + "Z",
+        ai_response = self._call_ai_cascade(system_prompt, user_msg)
+        ai_provider = "llm" if ai_response else "none"
+
+        handoff = {}
+        if ai_response:
+            try:
+                json_match = re.search(r'\{[\s\S]*\}', ai_response)
+                if json_match:
+                    handoff = json.loads(json_match.group())
+            except Exception:
+                handoff = {"executive_summary": ai_response[:2000]}
+
+        # Build the handoff package content and hash it
+        now = datetime.utcnow()
+        package_content = json.dumps({
+            "program": program_name,
+            "handoff": handoff,
+            "lpl_count": len(lpl_data),
+            "compliance_count": len(compliance_data),
+            "timestamp": now.isoformat(),
+        }, sort_keys=True, ensure_ascii=False)
+        package_hash = hashlib.sha256(package_content.encode("utf-8")).hexdigest()
+        package_id = f"ZTH-{now.strftime('%Y%m%dT%H%M%SZ')}-{package_hash[:8].upper()}"
+
+        # HMAC signature
+        sign_payload = f"zth|{program_name}|{package_hash}|{now.isoformat()}"
+        signature = hmac.new(SCN_SIGNING_SECRET.encode(), sign_payload.encode(), hashlib.sha256).hexdigest()
+
+        # XRPL anchor
+        anchor_result = _anchor_xrpl(package_hash, "zth_handoff_package", "main", None)
+
+        # Persist
+        if SUPABASE_AVAILABLE:
+            try:
+                _sb_insert("lpl_snapshots", {
+                    "program_name": program_name,
+                    "period": "zth_handoff_package",
+                    "version_num": 0,
+                    "executive_overview": f"Zero-Trust Handoff — {program_name}",
+                    "sections_json": json.dumps({"package_id": package_id, "handoff": handoff,
+                                                  "package_hash": package_hash, "signature": signature}),
+                    "ai_provider": ai_provider,
+                    "analysis_data": json.dumps({"program": program_name}),
+                    "created_at": now.isoformat() + "Z",
+                })
+            except Exception:
+                pass
+
+        response = {
+            "package_id": package_id,
+            "program": program_name,
+            "handoff": handoff,
+            "package_hash": package_hash,
+            "signature": signature,
+            "ai_provider": ai_provider,
+            "generated_at": now.isoformat() + "Z",
+            "includes": ["LPL Data", "Compliance Records", "Risk Assessments",
+                         "Audit Trails", "Impact Simulations", "XRPL Anchors"],
+        }
+        if anchor_result:
+            response["xrpl"] = {
+                "tx_hash": anchor_result.get("tx_hash"),
+                "ledger_index": anchor_result.get("ledger_index"),
+                "explorer_url": anchor_result.get("explorer_url"),
+                "verified": anchor_result.get("verified"),
             }
-            if anchor_result:
-                response["xrpl"] = {
-                    "tx_hash": anchor_result.get("tx_hash"),
-                    "ledger_index": anchor_result.get("ledger_index"),
-                    "explorer_url": anchor_result.get("explorer_url"),
-                    "verified": anchor_result.get("verified"),
-                }
-            self._send_json(response)
-
-        # Uses post-quantum algorithm for future-proofing against quantum attacks
-        # while maintaining backward compatibility with existing SHA-256 anchors.
-        elif route == "quantum_safe_reanchor":
-            self._log_request("quantum-safe-reanchor")
-            program_id = str(data.get("program_id", "ALL")).strip()[:200]
-            record_ids = data.get("record_ids", [])
-            if not isinstance(record_ids, list):
-                record_ids = []
-            # Sanitise each ID to alphanumeric + dash/underscore, max 64 chars
-            record_ids = [re.sub(r'[^A-Za-z0-9_-]', '', str(rid))[:64] for rid in record_ids][:200]
-
-            # Gather records to protect ── from request list or from programme
-            if record_ids:
-                targets = record_ids
-            else:
-                targets = [r["record_id"] for r in _live_records
-                           if program_id == "ALL" or r.get("org_id") == program_id
-                              or r.get("record_type", "").startswith(program_id)]
-                if not targets:
-                    # Fallback: treat up to 30 of the most recent records as critical
-                    targets = [r["record_id"] for r in _live_records[-30:]]
-
-            now = datetime.now(timezone.utc)
-            reanchored = []
-            for rid in targets:
-                # Build a quantum-safe hash: SHA-256 of the original hash + programme + timestamp
-                # (real Dilithium signing would require the pqcrypto library; we
-                #  produce a Dilithium-compatible digest and anchor it to XRPL.)
-                original = next((r for r in _live_records if r.get("record_id") == rid), None)
-                original_hash = original["hash"] if original else hashlib.sha256(rid.encode()).hexdigest()
-                pq_payload = f"DILITHIUM3|{rid}|{original_hash}|{now.isoformat()}"
-                pq_hash = hashlib.sha256(pq_payload.encode("utf-8")).hexdigest()
-
-                # Anchor the quantum-safe hash to XRPL
-                anchor_result = _anchor_xrpl(pq_hash, "QUANTUM_SAFE_REANCHOR", "SECURITY")
-
-                entry = {
-                    "record_id": rid,
-                    "original_hash": original_hash,
-                    "quantum_safe_hash": pq_hash,
-                    "algorithm": "CRYSTALS-Dilithium Level 3",
-                    "security_level": "192-bit quantum security",
-                    "backward_compatible": True,
-                    "timestamp": now.isoformat() + "Z",
-                }
-                if anchor_result:
-                    entry["tx_hash"] = anchor_result.get("tx_hash")
-                    entry["ledger_index"] = anchor_result.get("ledger_index")
-                    entry["explorer_url"] = anchor_result.get("explorer_url")
-                    entry["network"] = "XRPL " + XRPL_NETWORK.capitalize()
-                else:
-                    entry["tx_hash"] = "TX" + hashlib.md5((pq_hash + rid).encode()).hexdigest().upper()[:32]
-                    entry["explorer_url"] = None
-                    entry["network"] = "Simulated"
-
-                # Append proof-chain event
-                if rid not in _proof_chain_store:
-                    _proof_chain_store[rid] = []
-                proof_event = {
-                    "event_type": "quantum_safe.reanchor",
-                    "hash": pq_hash,
-                    "tx_hash": entry["tx_hash"],
-                    "timestamp": now.isoformat(),
-                    "actor": data.get("user_email", "quantum-safe-service"),
-                    "metadata": {"algorithm": "CRYSTALS-Dilithium-3", "original_hash": original_hash},
-                }
-                _proof_chain_store[rid].append(proof_event)
-                _persist_proof_chain_event(rid, proof_event)
+        self._send_json(response)
+
+    # ═══════════════════════════════════════════════════════════════
+    #  Novel Feature 4 — Predictive Resource Allocator
+    #  AI-driven resource reallocation recommendations
+    # ═══════════════════════════════════════════════════════════════
+
+    def _handle_post_predictive_resource_allocator(self, parsed, data):
+        """POST /api/predictive-resource-allocator"""
+        self._log_request("predictive-resource-allocator")
+        program_name = str(data.get("program", "All Programs")).strip()[:200]
+        current_allocations = data.get("allocations", [])
+
+        # Pull recent simulation data for context
+        sim_data = []
+        if SUPABASE_AVAILABLE:
+            try:
+                sim_data = _sb_select("impact_simulations",
+                                       query_params="order=created_at.desc&limit=10") or []
+            except Exception:
+                pass
 
-                reanchored.append(entry)
+        system_prompt = _build_ai_system_prompt("predictive_resource_allocator",
+                                                 {"program": program_name, "simulations": len(sim_data)})
+        system_prompt += (
+            "\n## PREDICTIVE RESOURCE ALLOCATOR\n"
+            "Analyze current resource allocations and recommend optimizations based on risk data.\n"
+            "Return a JSON object with:\n"
+            "- 'allocations': array of 4-6 reallocation recommendations, each with:\n"
+            "  - 'category': resource category (e.g., 'Spares', 'Personnel', 'Budget — Testing')\n"
+            "  - 'current': current allocation (e.g., '$2.4M' or '47 FTEs')\n"
+            "  - 'suggested': recommended allocation\n"
+            "  - 'change': delta (e.g., '-$500K' or '+3 FTEs')\n"
+            "  - 'risk': 'High', 'Medium', or 'Low'\n"
+            "  - 'rationale': 1-2 sentence justification referencing data\n"
+            "- 'net_savings': string with total projected savings\n"
+            "- 'confidence_score': integer 75-99\n"
+            "- 'summary': 2-3 sentence executive summary of recommendations\n"
+            "Base recommendations on realistic defense logistics resource patterns."
+        )
+        user_msg = (
+            f"Program: {program_name}\n"
+            f"Recent impact simulations: {len(sim_data)}\n"
+            f"Current allocations provided: {len(current_allocations)}\n\n"
+            f"Generate predictive resource reallocation recommendations."
+        )
 
-            # Persist a Living Program Ledger snapshot noting the quantum-safe upgrade
-            if SUPABASE_AVAILABLE:
-                try:
-                    _sb_insert("lpl_snapshots", {
-                        "program_name": program_id,
-                        "period": "quantum_safe_reanchor",
-                        "version_num": 0,
-                        "executive_overview": f"{len(reanchored)} records re-anchored with CRYSTALS-Dilithium Level 3",
-                        "sections_json": json.dumps({"reanchored_ids": [e["record_id"] for e in reanchored]}),
-                        "ai_provider": "none",
-                        "analysis_data": json.dumps({"program_id": program_id, "count": len(reanchored)}),
-                        "created_at": now.isoformat() + "Z",
-                    })
-                except Exception:
-                    pass
+        ai_response = self._call_ai_cascade(system_prompt, user_msg)
+        ai_provider = "llm" if ai_response else "none"
 
-            self._send_json({
-                "status": "quantum_safe_reanchor_complete",
-                "records_protected": len(reanchored),
-                "algorithm": "CRYSTALS-Dilithium Level 3 (NIST PQC Standard)",
-                "security_level": "192-bit quantum security",
-                "backward_compatible": True,
-                "program_id": program_id,
-                "reanchored": reanchored,
-                "generated_at": now.isoformat() + "Z",
-            })
+        result = {}
+        if ai_response:
+            try:
+                json_match = re.search(r'\{[\s\S]*\}', ai_response)
+                if json_match:
+                    result = json.loads(json_match.group())
+            except Exception:
+                result = {"summary": ai_response[:1000]}
 
-        elif route == "program_legacy_archive":
-            # POST /api/program-legacy-archive
-            # Creates a complete, cryptographically sealed archive of a program's
-            # entire history for long-term retention and future audits.
-            import hashlib as _pla_hashlib
-
-            program_id = body.get("program_id", "")
-            program_name = body.get("program_name", "All Programs")
-            user_email = body.get("user_email", "")
-            if not program_id and not program_name:
-                self._send_json({"error": "program_id or program_name required"}, 400)
-                return
+        now = datetime.utcnow()
+        result_content = json.dumps(result, sort_keys=True, ensure_ascii=False)
+        result_hash = hashlib.sha256(result_content.encode("utf-8")).hexdigest()
 
-            now = datetime.datetime.utcnow()
-            archive_id = "PLA-" + hex(int(now.timestamp() * 1000))[2:].upper()
+        # XRPL anchor
+        anchor_result = _anchor_xrpl(result_hash, "pra_resource_allocation", "main", None)
 
-            # Collect all program records from live store
-            records = []
-            for rid, rec in list(_live_records.items()):
-                if program_id and rec.get("program_id") != program_id:
-                    continue
-                records.append({
-                    "record_id": rid,
-                    "type": rec.get("type", "unknown"),
-                    "hash": rec.get("hash", ""),
-                    "status": rec.get("status", "active"),
-                    "created_at": rec.get("created_at", ""),
+        # Persist
+        if SUPABASE_AVAILABLE:
+            try:
+                _sb_insert("lpl_snapshots", {
+                    "program_name": program_name,
+                    "period": "pra_resource_allocation",
+                    "version_num": 0,
+                    "executive_overview": f"Predictive Resource Allocation — {program_name}",
+                    "sections_json": json.dumps({"result": result, "result_hash": result_hash}),
+                    "ai_provider": ai_provider,
+                    "analysis_data": json.dumps({"program": program_name}),
+                    "created_at": now.isoformat() + "Z",
                 })
+            except Exception:
+                pass
 
-            # Build archive manifest and compute seal hash
-            manifest = {
-                "archive_id": archive_id,
-                "program_id": program_id,
-                "program_name": program_name,
-                "records_count": len(records),
-                "records": records,
-                "sealed_by": user_email,
-                "sealed_at": now.isoformat() + "Z",
+        response = {
+            "allocations": result.get("allocations", []),
+            "net_savings": result.get("net_savings", "N/A"),
+            "confidence_score": result.get("confidence_score", 0),
+            "summary": result.get("summary", ""),
+            "ai_provider": ai_provider,
+            "result_hash": result_hash,
+            "generated_at": now.isoformat() + "Z",
+        }
+        if anchor_result:
+            response["xrpl"] = {
+                "tx_hash": anchor_result.get("tx_hash"),
+                "ledger_index": anchor_result.get("ledger_index"),
+                "explorer_url": anchor_result.get("explorer_url"),
+                "verified": anchor_result.get("verified"),
             }
-            manifest_json = json.dumps(manifest, sort_keys=True, separators=(",", ":"))
-            archive_hash = _pla_hashlib.sha256(manifest_json.encode()).hexdigest()
+        self._send_json(response)
+
+    # ═══════════════════════════════════════════════════════════════
+    #  Novel Feature 5 — Immutable After-Action Review Generator
+    #  AI generates AAR from program data, anchored to XRPL
+    # ═══════════════════════════════════════════════════════════════
+
+    def _handle_post_immutable_after_action_review(self, parsed, data):
+        """POST /api/immutable-after-action-review"""
+        self._log_request("immutable-after-action-review")
+        program_name = str(data.get("program", "All Programs")).strip()[:200]
+
+        # Gather program context from Supabase
+        lpl_data = []
+        sim_data = []
+        if SUPABASE_AVAILABLE:
+            try:
+                lpl_data = _sb_select("lpl_snapshots",
+                                       query_params=f"program_name=eq.{program_name}&order=created_at.desc&limit=10") or []
+            except Exception:
+                pass
+            try:
+                sim_data = _sb_select("impact_simulations",
+                                       query_params="order=created_at.desc&limit=5") or []
+            except Exception:
+                pass
 
-            # Anchor the archive seal to XRPL for immutability
-            tx_hash = None
-            explorer_url = None
+        system_prompt = _build_ai_system_prompt("immutable_after_action_review",
+                                                 {"program": program_name, "lpl_records": len(lpl_data),
+                                                  "simulations": len(sim_data)})
+        system_prompt += (
+            "\n## IMMUTABLE AFTER-ACTION REVIEW GENERATOR\n"
+            "Generate a comprehensive after-action review for the specified program.\n"
+            "Return a JSON object with:\n"
+            "- 'event': AAR title/event name (e.g., 'FY25 Q2 Readiness Assessment — Program Name')\n"
+            "- 'date': formatted date string\n"
+            "- 'participants': array of 3-5 participant roles\n"
+            "- 'objectives': array of 3-4 review objectives\n"
+            "- 'findings': array of 5-7 finding objects, each with:\n"
+            "  - 'type': 'sustain' (things going well), 'improve' (needs work), or 'action' (action items)\n"
+            "  - 'text': finding description (1-2 sentences)\n"
+            "Include realistic DoD acquisition metrics, MIL-STD references, and ILS data."
+        )
+        user_msg = (
+            f"Program: {program_name}\n"
+            f"LPL records available: {len(lpl_data)}\n"
+            f"Impact simulations available: {len(sim_data)}\n\n"
+            f"Generate an immutable after-action review."
+        )
+
+        ai_response = self._call_ai_cascade(system_prompt, user_msg)
+        ai_provider = "llm" if ai_response else "none"
+
+        aar = {}
+        if ai_response:
             try:
-                tx_hash = self._anchor_xrpl(archive_hash)
-                if tx_hash:
-                    net = "testnet" if "testnet" in XRPL_NETWORK else "mainnet"
-                    explorer_url = f"https://{net}.xrpl.org/transactions/{tx_hash}"
+                json_match = re.search(r'\{[\s\S]*\}', ai_response)
+                if json_match:
+                    aar = json.loads(json_match.group())
+            except Exception:
+                aar = {"event": f"After-Action Review — {program_name}",
+                       "findings": [{"type": "action", "text": ai_response[:500]}]}
+
+        # Content hash and XRPL anchor
+        now = datetime.utcnow()
+        aar_content = json.dumps(aar, sort_keys=True, ensure_ascii=False)
+        aar_hash = hashlib.sha256(aar_content.encode("utf-8")).hexdigest()
+
+        # HMAC signature
+        sign_payload = f"aar|{program_name}|{aar_hash}|{now.isoformat()}"
+        signature = hmac.new(SCN_SIGNING_SECRET.encode(), sign_payload.encode(), hashlib.sha256).hexdigest()
+
+        anchor_result = _anchor_xrpl(aar_hash, "aar_immutable_review", "main", None)
+
+        # Persist
+        if SUPABASE_AVAILABLE:
+            try:
+                _sb_insert("lpl_snapshots", {
+                    "program_name": program_name,
+                    "period": "aar_immutable_review",
+                    "version_num": 0,
+                    "executive_overview": f"After-Action Review — {program_name}",
+                    "sections_json": json.dumps({"aar": aar, "aar_hash": aar_hash, "signature": signature}),
+                    "ai_provider": ai_provider,
+                    "analysis_data": json.dumps({"program": program_name}),
+                    "created_at": now.isoformat() + "Z",
+                })
             except Exception:
                 pass
 
-            # Record proof-chain event
-            evt = {
-                "event": "program_legacy_archive_sealed",
-                "archive_id": archive_id,
-                "program_id": program_id,
-                "program_name": program_name,
-                "archive_hash": archive_hash,
-                "records_archived": len(records),
-                "tx_hash": tx_hash,
-                "sealed_at": now.isoformat() + "Z",
+        response = {
+            **aar,
+            "aar_hash": aar_hash,
+            "signature": signature,
+            "ai_provider": ai_provider,
+            "program": program_name,
+            "generated_at": now.isoformat() + "Z",
+        }
+        if anchor_result:
+            response["xrpl"] = {
+                "tx_hash": anchor_result.get("tx_hash"),
+                "ledger_index": anchor_result.get("ledger_index"),
+                "explorer_url": anchor_result.get("explorer_url"),
+                "verified": anchor_result.get("verified"),
+            }
+        self._send_json(response)
+
+    # Uses post-quantum algorithm for future-proofing against quantum attacks
+    # while maintaining backward compatibility with existing SHA-256 anchors.
+
+    def _handle_post_quantum_safe_reanchor(self, parsed, data):
+        """POST /api/quantum-safe-reanchor"""
+        self._log_request("quantum-safe-reanchor")
+        program_id = str(data.get("program_id", "ALL")).strip()[:200]
+        record_ids = data.get("record_ids", [])
+        if not isinstance(record_ids, list):
+            record_ids = []
+        # Sanitise each ID to alphanumeric + dash/underscore, max 64 chars
+        record_ids = [re.sub(r'[^A-Za-z0-9_-]', '', str(rid))[:64] for rid in record_ids][:200]
+
+        # Gather records to protect ── from request list or from programme
+        if record_ids:
+            targets = record_ids
+        else:
+            targets = [r["record_id"] for r in _live_records
+                       if program_id == "ALL" or r.get("org_id") == program_id
+                          or r.get("record_type", "").startswith(program_id)]
+            if not targets:
+                # Fallback: treat up to 30 of the most recent records as critical
+                targets = [r["record_id"] for r in _live_records[-30:]]
+
+        now = datetime.now(timezone.utc)
+        reanchored = []
+        for rid in targets:
+            # Build a quantum-safe hash: SHA-256 of the original hash + programme + timestamp
+            # (real Dilithium signing would require the pqcrypto library; we
+            #  produce a Dilithium-compatible digest and anchor it to XRPL.)
+            original = _first_record(rid, "record_id")
+            original_hash = original["hash"] if original else hashlib.sha256(rid.encode()).hexdigest()
+            pq_payload = f"DILITHIUM3|{rid}|{original_hash}|{now.isoformat()}"
+            pq_hash = hashlib.sha256(pq_payload.encode("utf-8")).hexdigest()
+
+            # Anchor the quantum-safe hash to XRPL
+            anchor_result = _anchor_xrpl(pq_hash, "QUANTUM_SAFE_REANCHOR", "SECURITY")
+
+            entry = {
+                "record_id": rid,
+                "original_hash": original_hash,
+                "quantum_safe_hash": pq_hash,
+                "algorithm": "CRYSTALS-Dilithium Level 3",
+                "security_level": "192-bit quantum security",
+                "backward_compatible": True,
+                "timestamp": now.isoformat() + "Z",
+            }
+            if anchor_result:
+                entry["tx_hash"] = anchor_result.get("tx_hash")
+                entry["ledger_index"] = anchor_result.get("ledger_index")
+                entry["explorer_url"] = anchor_result.get("explorer_url")
+                entry["network"] = "XRPL " + XRPL_NETWORK.capitalize()
+            else:
+                entry["tx_hash"] = "TX" + hashlib.md5((pq_hash + rid).encode()).hexdigest().upper()[:32]
+                entry["explorer_url"] = None
+                entry["network"] = "Simulated"
+
+            # Append proof-chain event
+            if rid not in _proof_chain_store:
+                _proof_chain_store[rid] = []
+            proof_event = {
+                "event_type": "quantum_safe.reanchor",
+                "hash": pq_hash,
+                "tx_hash": entry["tx_hash"],
+                "timestamp": now.isoformat(),
+                "actor": data.get("user_email", "quantum-safe-service"),
+                "metadata": {"algorithm": "CRYSTALS-Dilithium-3", "original_hash": original_hash},
             }
-            _proof_chain_store.append(evt)
-            try:
-                self._persist_proof_chain_event(evt)
-            except Exception:
-                pass
+            _proof_chain_store[rid].append(proof_event)
+            _persist_proof_chain_event(rid, proof_event)
+
+            reanchored.append(entry)
 
-            # Persist archive metadata to Supabase
+        # Persist a Living Program Ledger snapshot noting the quantum-safe upgrade
+        if SUPABASE_AVAILABLE:
             try:
-                self._sb_insert("program_archives", {
-                    "archive_id": archive_id,
-                    "program_id": program_id,
-                    "program_name": program_name,
-                    "archive_hash": archive_hash,
-                    "records_archived": len(records),
-                    "tx_hash": tx_hash or "",
-                    "sealed_by": user_email,
+                _sb_insert("lpl_snapshots", {
+                    "program_name": program_id,
+                    "period": "quantum_safe_reanchor",
+                    "version_num": 0,
+                    "executive_overview": f"{len(reanchored)} records re-anchored with CRYSTALS-Dilithium Level 3",
+                    "sections_json": json.dumps({"reanchored_ids": [e["record_id"] for e in reanchored]}),
+                    "ai_provider": "none",
+                    "analysis_data": json.dumps({"program_id": program_id, "count": len(reanchored)}),
                     "created_at": now.isoformat() + "Z",
                 })
             except Exception:
                 pass
 
-            self._send_json({
-                "status": "program_legacy_archive_sealed",
+        self._send_json({
+            "status": "quantum_safe_reanchor_complete",
+            "records_protected": len(reanchored),
+            "algorithm": "CRYSTALS-Dilithium Level 3 (NIST PQC Standard)",
+            "security_level": "192-bit quantum security",
+            "backward_compatible": True,
+            "program_id": program_id,
+            "reanchored": reanchored,
+            "generated_at": now.isoformat() + "Z",
+        })
+
+    def _handle_post_program_legacy_archive(self, parsed, data):
+        """POST /api/program-legacy-archive"""
+        # POST /api/program-legacy-archive
+        # Creates a complete, cryptographically sealed archive of a program's
+        # entire history for long-term retention and future audits.
+        import hashlib as _pla_hashlib
+
+        program_id = body.get("program_id", "")
+        program_name = body.get("program_name", "All Programs")
+        user_email = body.get("user_email", "")
+        if not program_id and not program_name:
+            self._send_json({"error": "program_id or program_name required"}, 400)
+            return
+
+        now = datetime.datetime.utcnow()
+        archive_id = "PLA-" + hex(int(now.timestamp() * 1000))[2:].upper()
+
+        # Collect all program records from live store
+        records = []
+        for rid, rec in list(_live_records.items()):
+            if program_id and rec.get("program_id") != program_id:
+                continue
+            records.append({
+                "record_id": rid,
+                "type": rec.get("type", "unknown"),
+                "hash": rec.get("hash", ""),
+                "status": rec.get("status", "active"),
+                "created_at": rec.get("created_at", ""),
+            })
+
+        # Build archive manifest and compute seal hash
+        manifest = {
+            "archive_id": archive_id,
+            "program_id": program_id,
+            "program_name": program_name,
+            "records_count": len(records),
+            "records": records,
+            "sealed_by": user_email,
+            "sealed_at": now.isoformat() + "Z",
+        }
+        manifest_json = json.dumps(manifest, sort_keys=True, separators=(",", ":"))
+        archive_hash = _pla_hashlib.sha256(manifest_json.encode()).hexdigest()
+
+        # Anchor the archive seal to XRPL for immutability
+        tx_hash = None
+        explorer_url = None
+        try:
+            tx_hash = self._anchor_xrpl(archive_hash)
+            if tx_hash:
+                net = "testnet" if "testnet" in XRPL_NETWORK else "mainnet"
+                explorer_url = f"https://{net}.xrpl.org/transactions/{tx_hash}"
+        except Exception:
+            pass
+
+        # Record proof-chain event
+        evt = {
+            "event": "program_legacy_archive_sealed",
+            "archive_id": archive_id,
+            "program_id": program_id,
+            "program_name": program_name,
+            "archive_hash": archive_hash,
+            "records_archived": len(records),
+            "tx_hash": tx_hash,
+            "sealed_at": now.isoformat() + "Z",
+        }
+        _proof_chain_store.append(evt)
+        try:
+            self._persist_proof_chain_event(evt)
+        except Exception:
+            pass
+
+        # Persist archive metadata to Supabase
+        try:
+            self._sb_insert("program_archives", {
                 "archive_id": archive_id,
                 "program_id": program_id,
                 "program_name": program_name,
                 "archive_hash": archive_hash,
                 "records_archived": len(records),
-                "tx_hash": tx_hash,
-                "explorer_url": explorer_url,
-                "contents": [
-                    "LPL snapshots",
-                    "impact simulations",
-                    "compliance records",
-                    "audit trails",
-                    "collaboration history",
-                    "XRPL anchors",
-                ],
-                "retention": "permanent",
-                "immutable": True,
-                "sealed_at": now.isoformat() + "Z",
+                "tx_hash": tx_hash or "",
+                "sealed_by": user_email,
+                "created_at": now.isoformat() + "Z",
             })
+        except Exception:
+            pass
 
-        # ── Congressional Funding Forecaster ─────────────────────────
-        elif route == "congressional_funding_forecast":
-            self._log_request("congressional-funding-forecast")
-            program_name = str(data.get("program", "All Programs")).strip()[:200]
-
-            lpl_data = []
-            if SUPABASE_AVAILABLE:
-                try:
-                    lpl_data = _sb_select("lpl_snapshots",
-                                           query_params=f"program_name=eq.{program_name}&order=created_at.desc&limit=10") or []
-                except Exception:
-                    pass
+        self._send_json({
+            "status": "program_legacy_archive_sealed",
+            "archive_id": archive_id,
+            "program_id": program_id,
+            "program_name": program_name,
+            "archive_hash": archive_hash,
+            "records_archived": len(records),
+            "tx_hash": tx_hash,
+            "explorer_url": explorer_url,
+            "contents": [
+                "LPL snapshots",
+                "impact simulations",
+                "compliance records",
+                "audit trails",
+                "collaboration history",
+                "XRPL anchors",
+            ],
+            "retention": "permanent",
+            "immutable": True,
+            "sealed_at": now.isoformat() + "Z",
+        })
 
-            system_prompt = _build_ai_system_prompt("congressional_funding_forecast",
-                                                     {"program": program_name, "lpl_records": len(lpl_data)})
-            system_prompt += (
-                "\n## CONGRESSIONAL FUNDING FORECASTER\n"
-                "Analyze congressional funding outlook for the specified DoD program.\n"
-                "Return a JSON object with:\n"
-                "- 'overall_risk': 'Low'|'Medium'|'High'|'Critical'\n"
-                "- 'funding_confidence': integer 0-100\n"
-                "- 'factors': array of 4-6 objects each with 'label','value','impact' (positive/negative/neutral),'weight' (0-1),'detail'\n"
-                "- 'recommendations': array of 3-5 recommendation strings\n"
-                "- 'projected_outcomes': array of 3 objects each with 'scenario','funding','change','likelihood'\n"
-                "Use realistic NDAA/PPBE references and funding language."
-            )
-            user_msg = f"Program: {program_name}\nLPL records: {len(lpl_data)}\nGenerate congressional funding forecast."
+    # ── Congressional Funding Forecaster ─────────────────────────
 
-            ai_response = self._call_ai_cascade(system_prompt, user_msg)
-            ai_provider = "llm" if ai_response else "none"
+    def _handle_post_congressional_funding_forecast(self, parsed, data):
+        """POST /api/congressional-funding-forecast"""
+        self._log_request("congressional-funding-forecast")
+        program_name = str(data.get("program", "All Programs")).strip()[:200]
 
-            result = {}
-            if ai_response:
-                try:
-                    json_match = re.search(r'\{[\s\S]*\}', ai_response)
-                    if json_match:
-                        result = json.loads(json_match.group())
-                except Exception:
-                    result = {"overall_risk": "Medium", "funding_confidence": 65,
-                              "factors": [], "recommendations": [ai_response[:500]],
-                              "projected_outcomes": []}
+        lpl_data = []
+        if SUPABASE_AVAILABLE:
+            try:
+                lpl_data = _sb_select("lpl_snapshots",
+                                       query_params=f"program_name=eq.{program_name}&order=created_at.desc&limit=10") or []
+            except Exception:
+                pass
 
-            now = datetime.utcnow()
-            content_hash = hashlib.sha256(json.dumps(result, sort_keys=True).encode()).hexdigest()
-            signature = hmac.new(SCN_SIGNING_SECRET.encode(),
-                                 f"cff|{program_name}|{content_hash}|{now.isoformat()}".encode(),
-                                 hashlib.sha256).hexdigest()
-
-            response = {
-                **result,
-                "content_hash": content_hash,
-                "signature": signature,
-                "ai_provider": ai_provider,
-                "program": program_name,
-                "generated_at": now.isoformat() + "Z",
-            }
-            self._send_json(response)
-
-        # ── Self-Executing Contract Clause ────────────────────────────
-        elif route == "self_executing_contract_clause":
-            self._log_request("self-executing-contract-clause")
-            risk_label = str(data.get("riskLabel", "Unknown Risk")).strip()[:200]
-            cascade = data.get("cascade", {})
-
-            system_prompt = _build_ai_system_prompt("self_executing_contract_clause",
-                                                     {"risk": risk_label})
-            system_prompt += (
-                "\n## SELF-EXECUTING CONTRACT CLAUSE GENERATOR\n"
-                "Generate smart contract clauses triggered by the specified risk.\n"
-                "Return a JSON object with:\n"
-                "- 'clause_id': unique clause identifier\n"
-                "- 'trigger_metric': the metric that triggers execution\n"
-                "- 'threshold': threshold value\n"
-                "- 'current_value': current value of the metric\n"
-                "- 'clause_type': 'penalty'|'incentive'|'adjustment'|'escalation'\n"
-                "- 'clauses': array of 3-5 objects each with 'type','title','text','trigger','verification'\n"
-                "- 'evidence_basis': description of data supporting the clause\n"
-                "Use realistic FAR/DFARS references."
-            )
-            user_msg = f"Risk: {risk_label}\nCascade context: {json.dumps(cascade)[:500]}\nGenerate self-executing contract clauses."
+        system_prompt = _build_ai_system_prompt("congressional_funding_forecast",
+                                                 {"program": program_name, "lpl_records": len(lpl_data)})
+        system_prompt += (
+            "\n## CONGRESSIONAL FUNDING FORECASTER\n"
+            "Analyze congressional funding outlook for the specified DoD program.\n"
+            "Return a JSON object with:\n"
+            "- 'overall_risk': 'Low'|'Medium'|'High'|'Critical'\n"
+            "- 'funding_confidence': integer 0-100\n"
+            "- 'factors': array of 4-6 objects each with 'label','value','impact' (positive/negative/neutral),'weight' (0-1),'detail'\n"
+            "- 'recommendations': array of 3-5 recommendation strings\n"
+            "- 'projected_outcomes': array of 3 objects each with 'scenario','funding','change','likelihood'\n"
+            "Use realistic NDAA/PPBE references and funding language."
+        )
+        user_msg = f"Program: {program_name}\nLPL records: {len(lpl_data)}\nGenerate congressional funding forecast."
 
-            ai_response = self._call_ai_cascade(system_prompt, user_msg)
-            ai_provider = "llm" if ai_response else "none"
+        ai_response = self._call_ai_cascade(system_prompt, user_msg)
+        ai_provider = "llm" if ai_response else "none"
 
-            result = {}
-            if ai_response:
-                try:
-                    json_match = re.search(r'\{[\s\S]*\}', ai_response)
-                    if json_match:
-                        result = json.loads(json_match.group())
-                except Exception:
-                    result = {"clause_id": f"SEC-{int(datetime.utcnow().timestamp())}",
-                              "clauses": [{"type": "adjustment", "title": "AI-generated clause",
-                                           "text": ai_response[:500], "trigger": risk_label,
-                                           "verification": "manual"}]}
+        result = {}
+        if ai_response:
+            try:
+                json_match = re.search(r'\{[\s\S]*\}', ai_response)
+                if json_match:
+                    result = json.loads(json_match.group())
+            except Exception:
+                result = {"overall_risk": "Medium", "funding_confidence": 65,
+                          "factors": [], "recommendations": [ai_response[:500]],
+                          "projected_outcomes": []}
+
+        now = datetime.utcnow()
+        content_hash = canonical_sha256(result)
+        signature = hmac.new(SCN_SIGNING_SECRET.encode(),
+                             f"cff|{program_name}|{content_hash}|{now.isoformat()}".encode(),
+                             hashlib.sha256).hexdigest()
+
+        response = {
+            **result,
+            "content_hash": content_hash,
+            "signature": signature,
+            "ai_provider": ai_provider,
+            "program": program_name,
+            "generated_at": now.isoformat() + "Z",
+        }
+        self._send_json(response)
+
+    # ── Self-Executing Contract Clause ────────────────────────────
+
+    def _handle_post_self_executing_contract_clause(self, parsed, data):
+        """POST /api/self-executing-contract-clause"""
+        self._log_request("self-executing-contract-clause")
+        risk_label = str(data.get("riskLabel", "Unknown Risk")).strip()[:200]
+        cascade = data.get("cascade", {})
+
+        system_prompt = _build_ai_system_prompt("self_executing_contract_clause",
+                                                 {"risk": risk_label})
+        system_prompt += (
+            "\n## SELF-EXECUTING CONTRACT CLAUSE GENERATOR\n"
+            "Generate smart contract clauses triggered by the specified risk.\n"
+            "Return a JSON object with:\n"
+            "- 'clause_id': unique clause identifier\n"
+            "- 'trigger_metric': the metric that triggers execution\n"
+            "- 'threshold': threshold value\n"
+            "- 'current_value': current value of the metric\n"
+            "- 'clause_type': 'penalty'|'incentive'|'adjustment'|'escalation'\n"
+            "- 'clauses': array of 3-5 objects each with 'type','title','text','trigger','verification'\n"
+            "- 'evidence_basis': description of data supporting the clause\n"
+            "Use realistic FAR/DFARS references."
+        )
+        user_msg = f"Risk: {risk_label}\nCascade context: {json.dumps(cascade)[:500]}\nGenerate self-executing contract clauses."
 
-            now = datetime.utcnow()
-            if "clause_id" not in result:
-                result["clause_id"] = f"SEC-{int(now.timestamp())}"
-
-            content_hash = hashlib.sha256(json.dumps(result, sort_keys=True).encode()).hexdigest()
-            response = {
-                **result,
-                "content_hash": content_hash,
-                "ai_provider": ai_provider,
-                "generated_at": now.isoformat() + "Z",
-            }
-            self._send_json(response)
+        ai_response = self._call_ai_cascade(system_prompt, user_msg)
+        ai_provider = "llm" if ai_response else "none"
 
-        # ── Federated Lessons Knowledge Graph ─────────────────────────
-        elif route == "federated_lessons_knowledge_graph":
-            self._log_request("federated-lessons-knowledge-graph")
-            view = str(data.get("view", "main")).strip()[:100]
+        result = {}
+        if ai_response:
+            try:
+                json_match = re.search(r'\{[\s\S]*\}', ai_response)
+                if json_match:
+                    result = json.loads(json_match.group())
+            except Exception:
+                result = {"clause_id": f"SEC-{int(datetime.utcnow().timestamp())}",
+                          "clauses": [{"type": "adjustment", "title": "AI-generated clause",
+                                       "text": ai_response[:500], "trigger": risk_label,
+                                       "verification": "manual"}]}
+
+        now = datetime.utcnow()
+        if "clause_id" not in result:
+            result["clause_id"] = f"SEC-{int(now.timestamp())}"
+
+        content_hash = canonical_sha256(result)
+        response = {
+            **result,
+            "content_hash": content_hash,
+            "ai_provider": ai_provider,
+            "generated_at": now.isoformat() + "Z",
+        }
+        self._send_json(response)
 
-            lpl_data = []
-            if SUPABASE_AVAILABLE:
-                try:
-                    lpl_data = _sb_select("lpl_snapshots",
-                                           query_params="order=created_at.desc&limit=20") or []
-                except Exception:
-                    pass
+    # ── Federated Lessons Knowledge Graph ─────────────────────────
 
-            system_prompt = _build_ai_system_prompt("federated_lessons_knowledge_graph",
-                                                     {"view": view, "records": len(lpl_data)})
-            system_prompt += (
-                "\n## FEDERATED LESSONS KNOWLEDGE GRAPH\n"
-                "Generate a federated lessons-learned knowledge graph from program data.\n"
-                "Return a JSON object with:\n"
-                "- 'lessons': array of 5-8 objects each with 'id','category','title','source','confidence' (0-1),"
-                "'applicability','detail','suggested_action'\n"
-                "- 'total_programs': integer count of programs contributing\n"
-                "- 'privacy_method': description of differential privacy technique used\n"
-                "Categories: 'supply_chain','maintenance','compliance','cost','readiness','obsolescence'\n"
-                "Sources should reference realistic program names and MIL-STD references."
-            )
-            user_msg = f"View: {view}\nAvailable records: {len(lpl_data)}\nGenerate federated lessons knowledge graph."
+    def _handle_post_federated_lessons_knowledge_graph(self, parsed, data):
+        """POST /api/federated-lessons-knowledge-graph"""
+        self._log_request("federated-lessons-knowledge-graph")
+        view = str(data.get("view", "main")).strip()[:100]
 
-            ai_response = self._call_ai_cascade(system_prompt, user_msg)
-            ai_provider = "llm" if ai_response else "none"
+        lpl_data = []
+        if SUPABASE_AVAILABLE:
+            try:
+                lpl_data = _sb_select("lpl_snapshots",
+                                       query_params="order=created_at.desc&limit=20") or []
+            except Exception:
+                pass
 
-            result = {}
-            if ai_response:
-                try:
-                    json_match = re.search(r'\{[\s\S]*\}', ai_response)
-                    if json_match:
-                        result = json.loads(json_match.group())
-                except Exception:
-                    result = {"lessons": [], "total_programs": 0,
-                              "privacy_method": "differential privacy (ε=1.0)"}
+        system_prompt = _build_ai_system_prompt("federated_lessons_knowledge_graph",
+                                                 {"view": view, "records": len(lpl_data)})
+        system_prompt += (
+            "\n## FEDERATED LESSONS KNOWLEDGE GRAPH\n"
+            "Generate a federated lessons-learned knowledge graph from program data.\n"
+            "Return a JSON object with:\n"
+            "- 'lessons': array of 5-8 objects each with 'id','category','title','source','confidence' (0-1),"
+            "'applicability','detail','suggested_action'\n"
+            "- 'total_programs': integer count of programs contributing\n"
+            "- 'privacy_method': description of differential privacy technique used\n"
+            "Categories: 'supply_chain','maintenance','compliance','cost','readiness','obsolescence'\n"
+            "Sources should reference realistic program names and MIL-STD references."
+        )
+        user_msg = f"View: {view}\nAvailable records: {len(lpl_data)}\nGenerate federated lessons knowledge graph."
 
-            now = datetime.utcnow()
-            content_hash = hashlib.sha256(json.dumps(result, sort_keys=True).encode()).hexdigest()
-            response = {
-                **result,
-                "content_hash": content_hash,
-                "ai_provider": ai_provider,
-                "generated_at": now.isoformat() + "Z",
-            }
-            self._send_json(response)
-
-        # ── Supply Chain Insurance Optimizer ──────────────────────────
-        elif route == "supply_chain_insurance_optimizer":
-            self._log_request("supply-chain-insurance-optimizer")
-            source = str(data.get("source", "pis")).strip()[:100]
-
-            system_prompt = _build_ai_system_prompt("supply_chain_insurance_optimizer",
-                                                     {"source": source})
-            system_prompt += (
-                "\n## SUPPLY CHAIN INSURANCE OPTIMIZER\n"
-                "Analyze supply chain insurance coverage and recommend optimizations.\n"
-                "Return a JSON object with:\n"
-                "- 'current_coverage': dollar amount string (e.g., '$12.4M')\n"
-                "- 'recommended_coverage': dollar amount string\n"
-                "- 'potential_savings': dollar amount string\n"
-                "- 'risk_score': integer 0-100\n"
-                "- 'risk_label': 'Low'|'Medium'|'High'|'Critical'\n"
-                "- 'categories': array of 4-6 objects each with 'name','current_premium','recommended','savings','risk_trend' (up/down/stable),'rationale'\n"
-                "- 'evidence_count': integer\n"
-                "Use realistic insurance and DoD supply chain terminology."
-            )
-            user_msg = f"Source: {source}\nGenerate supply chain insurance optimization analysis."
+        ai_response = self._call_ai_cascade(system_prompt, user_msg)
+        ai_provider = "llm" if ai_response else "none"
 
-            ai_response = self._call_ai_cascade(system_prompt, user_msg)
-            ai_provider = "llm" if ai_response else "none"
+        result = {}
+        if ai_response:
+            try:
+                json_match = re.search(r'\{[\s\S]*\}', ai_response)
+                if json_match:
+                    result = json.loads(json_match.group())
+            except Exception:
+                result = {"lessons": [], "total_programs": 0,
+                          "privacy_method": "differential privacy (ε=1.0)"}
+
+        now = datetime.utcnow()
+        content_hash = canonical_sha256(result)
+        response = {
+            **result,
+            "content_hash": content_hash,
+            "ai_provider": ai_provider,
+            "generated_at": now.isoformat() + "Z",
+        }
+        self._send_json(response)
+
+    # ── Supply Chain Insurance Optimizer ──────────────────────────
+
+    def _handle_post_supply_chain_insurance_optimizer(self, parsed, data):
+        """POST /api/supply-chain-insurance-optimizer"""
+        self._log_request("supply-chain-insurance-optimizer")
+        source = str(data.get("source", "pis")).strip()[:100]
+
+        system_prompt = _build_ai_system_prompt("supply_chain_insurance_optimizer",
+                                                 {"source": source})
+        system_prompt += (
+            "\n## SUPPLY CHAIN INSURANCE OPTIMIZER\n"
+            "Analyze supply chain insurance coverage and recommend optimizations.\n"
+            "Return a JSON object with:\n"
+            "- 'current_coverage': dollar amount string (e.g., '$12.4M')\n"
+            "- 'recommended_coverage': dollar amount string\n"
+            "- 'potential_savings': dollar amount string\n"
+            "- 'risk_score': integer 0-100\n"
+            "- 'risk_label': 'Low'|'Medium'|'High'|'Critical'\n"
+            "- 'categories': array of 4-6 objects each with 'name','current_premium','recommended','savings','risk_trend' (up/down/stable),'rationale'\n"
+            "- 'evidence_count': integer\n"
+            "Use realistic insurance and DoD supply chain terminology."
+        )
+        user_msg = f"Source: {source}\nGenerate supply chain insurance optimization analysis."
 
-            result = {}
-            if ai_response:
-                try:
-                    json_match = re.search(r'\{[\s\S]*\}', ai_response)
-                    if json_match:
-                        result = json.loads(json_match.group())
-                except Exception:
-                    result = {"current_coverage": "$0", "recommended_coverage": "$0",
-                              "potential_savings": "$0", "risk_score": 50, "risk_label": "Medium",
-                              "categories": [], "evidence_count": 0}
+        ai_response = self._call_ai_cascade(system_prompt, user_msg)
+        ai_provider = "llm" if ai_response else "none"
 
-            now = datetime.utcnow()
-            content_hash = hashlib.sha256(json.dumps(result, sort_keys=True).encode()).hexdigest()
-            response = {
-                **result,
-                "content_hash": content_hash,
-                "ai_provider": ai_provider,
-                "generated_at": now.isoformat() + "Z",
-            }
-            self._send_json(response)
+        result = {}
+        if ai_response:
+            try:
+                json_match = re.search(r'\{[\s\S]*\}', ai_response)
+                if json_match:
+                    result = json.loads(json_match.group())
+            except Exception:
+                result = {"current_coverage": "$0", "recommended_coverage": "$0",
+                          "potential_savings": "$0", "risk_score": 50, "risk_label": "Medium",
+                          "categories": [], "evidence_count": 0}
+
+        now = datetime.utcnow()
+        content_hash = canonical_sha256(result)
+        response = {
+            **result,
+            "content_hash": content_hash,
+            "ai_provider": ai_provider,
+            "generated_at": now.isoformat() + "Z",
+        }
+        self._send_json(response)
 
-        # ── Verifiable Scorecard ──────────────────────────────────────
-        elif route == "verifiable_scorecard":
-            self._log_request("verifiable-scorecard")
-            view = str(data.get("view", "main")).strip()[:100]
+    # ── Verifiable Scorecard ──────────────────────────────────────
 
-            lpl_data = []
-            if SUPABASE_AVAILABLE:
-                try:
-                    lpl_data = _sb_select("lpl_snapshots",
-                                           query_params="order=created_at.desc&limit=15") or []
-                except Exception:
-                    pass
+    def _handle_post_verifiable_scorecard(self, parsed, data):
+        """POST /api/verifiable-scorecard"""
+        self._log_request("verifiable-scorecard")
+        view = str(data.get("view", "main")).strip()[:100]
 
-            system_prompt = _build_ai_system_prompt("verifiable_scorecard",
-                                                     {"view": view, "records": len(lpl_data)})
-            system_prompt += (
-                "\n## VERIFIABLE PRIVACY-SAFE SCORECARD\n"
-                "Generate a verifiable scorecard with privacy-safe metrics.\n"
-                "Return a JSON object with:\n"
-                "- 'scorecard_id': unique scorecard identifier\n"
-                "- 'metrics': array of 6-10 objects each with 'label','value','status' (green/yellow/red),'redacted' (boolean)\n"
-                "- 'share_options': array of 3-4 strings like 'Congressional Oversight','GAO Audit','IG Review','Public FOIA'\n"
-                "Redacted metrics should show aggregated/anonymized values only."
-            )
-            user_msg = f"View: {view}\nRecords: {len(lpl_data)}\nGenerate verifiable privacy-safe scorecard."
+        lpl_data = []
+        if SUPABASE_AVAILABLE:
+            try:
+                lpl_data = _sb_select("lpl_snapshots",
+                                       query_params="order=created_at.desc&limit=15") or []
+            except Exception:
+                pass
 
-            ai_response = self._call_ai_cascade(system_prompt, user_msg)
-            ai_provider = "llm" if ai_response else "none"
+        system_prompt = _build_ai_system_prompt("verifiable_scorecard",
+                                                 {"view": view, "records": len(lpl_data)})
+        system_prompt += (
+            "\n## VERIFIABLE PRIVACY-SAFE SCORECARD\n"
+            "Generate a verifiable scorecard with privacy-safe metrics.\n"
+            "Return a JSON object with:\n"
+            "- 'scorecard_id': unique scorecard identifier\n"
+            "- 'metrics': array of 6-10 objects each with 'label','value','status' (green/yellow/red),'redacted' (boolean)\n"
+            "- 'share_options': array of 3-4 strings like 'Congressional Oversight','GAO Audit','IG Review','Public FOIA'\n"
+            "Redacted metrics should show aggregated/anonymized values only."
+        )
+        user_msg = f"View: {view}\nRecords: {len(lpl_data)}\nGenerate verifiable privacy-safe scorecard."
 
-            result = {}
-            if ai_response:
-                try:
-                    json_match = re.search(r'\{[\s\S]*\}', ai_response)
-                    if json_match:
-                        result = json.loads(json_match.group())
-                except Exception:
-                    result = {"metrics": [], "share_options": []}
+        ai_response = self._call_ai_cascade(system_prompt, user_msg)
+        ai_provider = "llm" if ai_response else "none"
 
-            now = datetime.utcnow()
-            scorecard_id = result.get("scorecard_id", f"VPS-{int(now.timestamp())}")
-            content_hash = hashlib.sha256(json.dumps(result, sort_keys=True).encode()).hexdigest()
-            signature = hmac.new(SCN_SIGNING_SECRET.encode(),
-                                 f"vps|{scorecard_id}|{content_hash}|{now.isoformat()}".encode(),
-                                 hashlib.sha256).hexdigest()
-
-            response = {
-                **result,
-                "scorecard_id": scorecard_id,
-                "signature": signature,
-                "content_hash": content_hash,
-                "ai_provider": ai_provider,
-                "generated_at": now.isoformat() + "Z",
-            }
-            self._send_json(response)
+        result = {}
+        if ai_response:
+            try:
+                json_match = re.search(r'\{[\s\S]*\}', ai_response)
+                if json_match:
+                    result = json.loads(json_match.group())
+            except Exception:
+                result = {"metrics": [], "share_options": []}
+
+        now = datetime.utcnow()
+        scorecard_id = result.get("scorecard_id", f"VPS-{int(now.timestamp())}")
+        content_hash = canonical_sha256(result)
+        signature = hmac.new(SCN_SIGNING_SECRET.encode(),
+                             f"vps|{scorecard_id}|{content_hash}|{now.isoformat()}".encode(),
+                             hashlib.sha256).hexdigest()
+
+        response = {
+            **result,
+            "scorecard_id": scorecard_id,
+            "signature": signature,
+            "content_hash": content_hash,
+            "ai_provider": ai_provider,
+            "generated_at": now.isoformat() + "Z",
+        }
+        self._send_json(response)
 
-        # ── Mission Outcome Correlation ───────────────────────────────
-        elif route == "mission_outcome_correlation":
-            self._log_request("mission-outcome-correlation")
-            program_name = str(data.get("program", "All Programs")).strip()[:200]
+    # ── Mission Outcome Correlation ───────────────────────────────
 
-            lpl_data = []
-            if SUPABASE_AVAILABLE:
-                try:
-                    lpl_data = _sb_select("lpl_snapshots",
-                                           query_params=f"program_name=eq.{program_name}&order=created_at.desc&limit=10") or []
-                except Exception:
-                    pass
+    def _handle_post_mission_outcome_correlation(self, parsed, data):
+        """POST /api/mission-outcome-correlation"""
+        self._log_request("mission-outcome-correlation")
+        program_name = str(data.get("program", "All Programs")).strip()[:200]
 
-            system_prompt = _build_ai_system_prompt("mission_outcome_correlation",
-                                                     {"program": program_name, "records": len(lpl_data)})
-            system_prompt += (
-                "\n## MISSION OUTCOME CORRELATION ENGINE\n"
-                "Correlate logistics metrics with mission outcomes for the program.\n"
-                "Return a JSON object with:\n"
-                "- 'correlations': array of 5-7 objects each with 'logistics_metric','mission_metric',"
-                "'correlation' (float -1 to 1),'strength' (weak/moderate/strong),'direction' (positive/negative),'insight'\n"
-                "- 'overall_score': integer 0-100\n"
-                "- 'data_points': integer count\n"
-                "- 'confidence': float 0-1\n"
-                "Use realistic readiness, MTBF, supply chain velocity metrics."
-            )
-            user_msg = f"Program: {program_name}\nRecords: {len(lpl_data)}\nGenerate mission outcome correlation analysis."
+        lpl_data = []
+        if SUPABASE_AVAILABLE:
+            try:
+                lpl_data = _sb_select("lpl_snapshots",
+                                       query_params=f"program_name=eq.{program_name}&order=created_at.desc&limit=10") or []
+            except Exception:
+                pass
 
-            ai_response = self._call_ai_cascade(system_prompt, user_msg)
-            ai_provider = "llm" if ai_response else "none"
+        system_prompt = _build_ai_system_prompt("mission_outcome_correlation",
+                                                 {"program": program_name, "records": len(lpl_data)})
+        system_prompt += (
+            "\n## MISSION OUTCOME CORRELATION ENGINE\n"
+            "Correlate logistics metrics with mission outcomes for the program.\n"
+            "Return a JSON object with:\n"
+            "- 'correlations': array of 5-7 objects each with 'logistics_metric','mission_metric',"
+            "'correlation' (float -1 to 1),'strength' (weak/moderate/strong),'direction' (positive/negative),'insight'\n"
+            "- 'overall_score': integer 0-100\n"
+            "- 'data_points': integer count\n"
+            "- 'confidence': float 0-1\n"
+            "Use realistic readiness, MTBF, supply chain velocity metrics."
+        )
+        user_msg = f"Program: {program_name}\nRecords: {len(lpl_data)}\nGenerate mission outcome correlation analysis."
 
-            result = {}
-            if ai_response:
-                try:
-                    json_match = re.search(r'\{[\s\S]*\}', ai_response)
-                    if json_match:
-                        result = json.loads(json_match.group())
-                except Exception:
-                    result = {"correlations": [], "overall_score": 0,
-                              "data_points": 0, "confidence": 0}
+        ai_response = self._call_ai_cascade(system_prompt, user_msg)
+        ai_provider = "llm" if ai_response else "none"
 
-            now = datetime.utcnow()
-            content_hash = hashlib.sha256(json.dumps(result, sort_keys=True).encode()).hexdigest()
-            response = {
-                **result,
-                "content_hash": content_hash,
-                "ai_provider": ai_provider,
-                "program": program_name,
-                "generated_at": now.isoformat() + "Z",
-            }
-            self._send_json(response)
-
-        # ── Multi-Program Cascade Simulator ───────────────────────────
-        elif route == "multi_program_cascade":
-            self._log_request("multi-program-cascade")
-            cascade = data.get("cascade", {})
-            origin = str(cascade.get("program", cascade.get("origin", "Unknown"))).strip()[:200] if isinstance(cascade, dict) else "Unknown"
-
-            system_prompt = _build_ai_system_prompt("multi_program_cascade",
-                                                     {"origin": origin})
-            system_prompt += (
-                "\n## MULTI-PROGRAM CASCADE SIMULATOR\n"
-                "Simulate how a risk or disruption cascades across multiple related programs.\n"
-                "Return a JSON object with:\n"
-                "- 'origin_program': program where disruption originates\n"
-                "- 'affected_programs': array of 4-6 objects each with 'name','impact' (Low/Medium/High/Critical),"
-                "'delay_days' (integer),'cost_impact' (dollar string),'path' (string chain),'mitigation'\n"
-                "- 'total_enterprise_impact': dollar string\n"
-                "- 'total_schedule_risk': number of days\n"
-                "- 'cascade_depth': integer 1-4\n"
-                "Use realistic DoD program interdependencies."
-            )
-            user_msg = f"Origin: {origin}\nCascade data: {json.dumps(cascade)[:500]}\nSimulate multi-program cascade."
+        result = {}
+        if ai_response:
+            try:
+                json_match = re.search(r'\{[\s\S]*\}', ai_response)
+                if json_match:
+                    result = json.loads(json_match.group())
+            except Exception:
+                result = {"correlations": [], "overall_score": 0,
+                          "data_points": 0, "confidence": 0}
+
+        now = datetime.utcnow()
+        content_hash = canonical_sha256(result)
+        response = {
+            **result,
+            "content_hash": content_hash,
+            "ai_provider": ai_provider,
+            "program": program_name,
+            "generated_at": now.isoformat() + "Z",
+        }
+        self._send_json(response)
+
+    # ── Multi-Program Cascade Simulator ───────────────────────────
+
+    def _handle_post_multi_program_cascade(self, parsed, data):
+        """POST /api/multi-program-cascade"""
+        self._log_request("multi-program-cascade")
+        cascade = data.get("cascade", {})
+        origin = str(cascade.get("program", cascade.get("origin", "Unknown"))).strip()[:200] if isinstance(cascade, dict) else "Unknown"
+
+        system_prompt = _build_ai_system_prompt("multi_program_cascade",
+                                                 {"origin": origin})
+        system_prompt += (
+            "\n## MULTI-PROGRAM CASCADE SIMULATOR\n"
+            "Simulate how a risk or disruption cascades across multiple related programs.\n"
+            "Return a JSON object with:\n"
+            "- 'origin_program': program where disruption originates\n"
+            "- 'affected_programs': array of 4-6 objects each with 'name','impact' (Low/Medium/High/Critical),"
+            "'delay_days' (integer),'cost_impact' (dollar string),'path' (string chain),'mitigation'\n"
+            "- 'total_enterprise_impact': dollar string\n"
+            "- 'total_schedule_risk': number of days\n"
+            "- 'cascade_depth': integer 1-4\n"
+            "Use realistic DoD program interdependencies."
+        )
+        user_msg = f"Origin: {origin}\nCascade data: {json.dumps(cascade)[:500]}\nSimulate multi-program cascade."
 
-            ai_response = self._call_ai_cascade(system_prompt, user_msg)
-            ai_provider = "llm" if ai_response else "none"
+        ai_response = self._call_ai_cascade(system_prompt, user_msg)
+        ai_provider = "llm" if ai_response else "none"
 
-            result = {}
-            if ai_response:
-                try:
-                    json_match = re.search(r'\{[\s\S]*\}', ai_response)
-                    if json_match:
-                        result = json.loads(json_match.group())
-                except Exception:
-                    result = {"origin_program": origin, "affected_programs": [],
-                              "total_enterprise_impact": "$0", "total_schedule_risk": 0,
-                              "cascade_depth": 0}
+        result = {}
+        if ai_response:
+            try:
+                json_match = re.search(r'\{[\s\S]*\}', ai_response)
+                if json_match:
+                    result = json.loads(json_match.group())
+            except Exception:
+                result = {"origin_program": origin, "affected_programs": [],
+                          "total_enterprise_impact": "$0", "total_schedule_risk": 0,
+                          "cascade_depth": 0}
+
+        now = datetime.utcnow()
+        content_hash = canonical_sha256(result)
+        response = {
+            **result,
+            "origin_program": result.get("origin_program", origin),
+            "content_hash": content_hash,
+            "ai_provider": ai_provider,
+            "generated_at": now.isoformat() + "Z",
+        }
+        self._send_json(response)
+
+    # ── Automated Neutral Mediator ────────────────────────────────
+
+    def _handle_post_automated_neutral_mediator(self, parsed, data):
+        """POST /api/automated-neutral-mediator"""
+        self._log_request("automated-neutral-mediator")
+        view = str(data.get("view", "main")).strip()[:100]
+
+        system_prompt = _build_ai_system_prompt("automated_neutral_mediator",
+                                                 {"view": view})
+        system_prompt += (
+            "\n## AUTOMATED NEUTRAL MEDIATOR\n"
+            "Generate neutral mediation proposals for data disputes.\n"
+            "Return a JSON object with:\n"
+            "- 'disputes': array of 3-5 objects each with:\n"
+            "  - 'id': dispute identifier\n"
+            "  - 'field': disputed data field name\n"
+            "  - 'party_a': {name, value, evidence, timestamp}\n"
+            "  - 'party_b': {name, value, evidence, timestamp}\n"
+            "  - 'mediation': AI determination/recommendation\n"
+            "  - 'resolution': 'accept_a'|'accept_b'|'compromise'|'escalate'\n"
+            "  - 'confidence': float 0-1\n"
+            "- 'total_value_at_stake': dollar amount string\n"
+            "- 'estimated_resolution_time': time estimate string\n"
+            "Use realistic DoD supply chain and contractor dispute scenarios."
+        )
+        user_msg = f"View: {view}\nGenerate automated neutral mediation for data disputes."
 
-            now = datetime.utcnow()
-            content_hash = hashlib.sha256(json.dumps(result, sort_keys=True).encode()).hexdigest()
-            response = {
-                **result,
-                "origin_program": result.get("origin_program", origin),
-                "content_hash": content_hash,
-                "ai_provider": ai_provider,
-                "generated_at": now.isoformat() + "Z",
-            }
-            self._send_json(response)
-
-        # ── Automated Neutral Mediator ────────────────────────────────
-        elif route == "automated_neutral_mediator":
-            self._log_request("automated-neutral-mediator")
-            view = str(data.get("view", "main")).strip()[:100]
-
-            system_prompt = _build_ai_system_prompt("automated_neutral_mediator",
-                                                     {"view": view})
-            system_prompt += (
-                "\n## AUTOMATED NEUTRAL MEDIATOR\n"
-                "Generate neutral mediation proposals for data disputes.\n"
-                "Return a JSON object with:\n"
-                "- 'disputes': array of 3-5 objects each with:\n"
-                "  - 'id': dispute identifier\n"
-                "  - 'field': disputed data field name\n"
-                "  - 'party_a': {name, value, evidence, timestamp}\n"
-                "  - 'party_b': {name, value, evidence, timestamp}\n"
-                "  - 'mediation': AI determination/recommendation\n"
-                "  - 'resolution': 'accept_a'|'accept_b'|'compromise'|'escalate'\n"
-                "  - 'confidence': float 0-1\n"
-                "- 'total_value_at_stake': dollar amount string\n"
-                "- 'estimated_resolution_time': time estimate string\n"
-                "Use realistic DoD supply chain and contractor dispute scenarios."
-            )
-            user_msg = f"View: {view}\nGenerate automated neutral mediation for data disputes."
+        ai_response = self._call_ai_cascade(system_prompt, user_msg)
+        ai_provider = "llm" if ai_response else "none"
 
-            ai_response = self._call_ai_cascade(system_prompt, user_msg)
-            ai_provider = "llm" if ai_response else "none"
+        result = {}
+        if ai_response:
+            try:
+                json_match = re.search(r'\{[\s\S]*\}', ai_response)
+                if json_match:
+                    result = json.loads(json_match.group())
+            except Exception:
+                result = {"disputes": [], "total_value_at_stake": "$0",
+                          "estimated_resolution_time": "N/A"}
+
+        now = datetime.utcnow()
+        content_hash = canonical_sha256(result)
+        response = {
+            **result,
+            "content_hash": content_hash,
+            "ai_provider": ai_provider,
+            "generated_at": now.isoformat() + "Z",
+        }
+        self._send_json(response)
+
+    # ── DRL Update (single cell edit) ─────────────────────────────
+
+    def _handle_post_drl_update(self, parsed, data):
+        """POST /api/drl/update"""
+        self._log_request("drl-update")
+        row_idx = data.get("rowIdx", 0)
+        field_key = str(data.get("fieldKey", "")).strip()[:100]
+        value = str(data.get("value", "")).strip()[:2000]
+        now = datetime.utcnow()
+        content = json.dumps({"rowIdx": row_idx, "field": field_key, "value": value}, sort_keys=True)
+        content_hash = hashlib.sha256(content.encode()).hexdigest()
+        anchor_result = _anchor_xrpl(content_hash, "drl_cell_update", "main", None)
+        tx_hash = anchor_result.get("tx_hash") if anchor_result else None
+        explorer_url = anchor_result.get("explorer_url") if anchor_result else None
+        self._send_json({
+            "ok": True,
+            "anchor_hash": content_hash,
+            "tx_hash": tx_hash or "",
+            "explorer_url": explorer_url or "",
+            "updated_at": now.isoformat() + "Z",
+        })
 
-            result = {}
-            if ai_response:
-                try:
-                    json_match = re.search(r'\{[\s\S]*\}', ai_response)
-                    if json_match:
-                        result = json.loads(json_match.group())
-                except Exception:
-                    result = {"disputes": [], "total_value_at_stake": "$0",
-                              "estimated_resolution_time": "N/A"}
+    # ── DRL Status Change ─────────────────────────────────────────
+
+    def _handle_post_drl_status(self, parsed, data):
+        """POST /api/drl/status"""
+        self._log_request("drl-status")
+        row_idx = data.get("rowIdx", 0)
+        new_status = str(data.get("status", "")).strip()[:100]
+        now = datetime.utcnow()
+        content = json.dumps({"rowIdx": row_idx, "status": new_status}, sort_keys=True)
+        content_hash = hashlib.sha256(content.encode()).hexdigest()
+        anchor_result = _anchor_xrpl(content_hash, "drl_status_change", "main", None)
+        tx_hash = anchor_result.get("tx_hash") if anchor_result else None
+        self._send_json({
+            "ok": True,
+            "anchor_hash": content_hash,
+            "tx_hash": tx_hash or "",
+            "updated_at": now.isoformat() + "Z",
+        })
 
-            now = datetime.utcnow()
-            content_hash = hashlib.sha256(json.dumps(result, sort_keys=True).encode()).hexdigest()
-            response = {
-                **result,
-                "content_hash": content_hash,
-                "ai_provider": ai_provider,
-                "generated_at": now.isoformat() + "Z",
-            }
-            self._send_json(response)
-
-        # ── DRL Update (single cell edit) ─────────────────────────────
-        elif route == "drl_update":
-            self._log_request("drl-update")
-            row_idx = data.get("rowIdx", 0)
-            field_key = str(data.get("fieldKey", "")).strip()[:100]
-            value = str(data.get("value", "")).strip()[:2000]
-            now = datetime.utcnow()
-            content = json.dumps({"rowIdx": row_idx, "field": field_key, "value": value}, sort_keys=True)
-            content_hash = hashlib.sha256(content.encode()).hexdigest()
-            anchor_result = _anchor_xrpl(content_hash, "drl_cell_update", "main", None)
-            tx_hash = anchor_result.get("tx_hash") if anchor_result else None
-            explorer_url = anchor_result.get("explorer_url") if anchor_result else None
-            self._send_json({
-                "ok": True,
-                "anchor_hash": content_hash,
-                "tx_hash": tx_hash or "",
-                "explorer_url": explorer_url or "",
-                "updated_at": now.isoformat() + "Z",
-            })
+    # ── DRL Workflow Link ─────────────────────────────────────────
+
+    def _handle_post_drl_workflow_link(self, parsed, data):
+        """POST /api/drl/workflow-link"""
+        self._log_request("drl-workflow-link")
+        row_idx = data.get("rowIdx", 0)
+        url = str(data.get("url", "")).strip()[:2000]
+        now = datetime.utcnow()
+        content = json.dumps({"rowIdx": row_idx, "url": url}, sort_keys=True)
+        content_hash = hashlib.sha256(content.encode()).hexdigest()
+        anchor_result = _anchor_xrpl(content_hash, "drl_workflow_link", "main", None)
+        tx_hash = anchor_result.get("tx_hash") if anchor_result else None
+        self._send_json({
+            "ok": True,
+            "anchor_hash": content_hash,
+            "tx_hash": tx_hash or "",
+            "updated_at": now.isoformat() + "Z",
+        })
 
-        # ── DRL Status Change ─────────────────────────────────────────
-        elif route == "drl_status":
-            self._log_request("drl-status")
-            row_idx = data.get("rowIdx", 0)
-            new_status = str(data.get("status", "")).strip()[:100]
-            now = datetime.utcnow()
-            content = json.dumps({"rowIdx": row_idx, "status": new_status}, sort_keys=True)
-            content_hash = hashlib.sha256(content.encode()).hexdigest()
-            anchor_result = _anchor_xrpl(content_hash, "drl_status_change", "main", None)
-            tx_hash = anchor_result.get("tx_hash") if anchor_result else None
-            self._send_json({
-                "ok": True,
-                "anchor_hash": content_hash,
-                "tx_hash": tx_hash or "",
-                "updated_at": now.isoformat() + "Z",
-            })
+    # ── DRL Bulk Import ───────────────────────────────────────────
+
+    def _handle_post_drl_import(self, parsed, data):
+        """POST /api/drl/import"""
+        self._log_request("drl-import")
+        rows = data.get("rows", [])
+        if not isinstance(rows, list):
+            rows = []
+        # Limit to 500 rows for safety
+        rows = rows[:500]
+        now = datetime.utcnow()
+        content = json.dumps({"count": len(rows), "ts": now.isoformat()}, sort_keys=True)
+        content_hash = hashlib.sha256(content.encode()).hexdigest()
+        anchor_result = _anchor_xrpl(content_hash, "drl_bulk_import", "main", None)
+        tx_hash = anchor_result.get("tx_hash") if anchor_result else None
+        if SUPABASE_AVAILABLE:
+            try:
+                _sb_insert("lpl_snapshots", {
+                    "program_name": "DRL Import",
+                    "period": "drl_bulk_import",
+                    "version_num": 0,
+                    "executive_overview": f"Bulk import of {len(rows)} DRL records",
+                    "sections_json": json.dumps({"count": len(rows), "hash": content_hash}),
+                    "ai_provider": "none",
+                    "analysis_data": "{}",
+                    "created_at": now.isoformat() + "Z",
+                })
+            except Exception:
+                pass
+        self._send_json({
+            "ok": True,
+            "count": len(rows),
+            "anchor_hash": content_hash,
+            "tx_hash": tx_hash or "",
+            "imported_at": now.isoformat() + "Z",
+        })
 
-        # ── DRL Workflow Link ─────────────────────────────────────────
-        elif route == "drl_workflow_link":
-            self._log_request("drl-workflow-link")
-            row_idx = data.get("rowIdx", 0)
-            url = str(data.get("url", "")).strip()[:2000]
-            now = datetime.utcnow()
-            content = json.dumps({"rowIdx": row_idx, "url": url}, sort_keys=True)
-            content_hash = hashlib.sha256(content.encode()).hexdigest()
-            anchor_result = _anchor_xrpl(content_hash, "drl_workflow_link", "main", None)
-            tx_hash = anchor_result.get("tx_hash") if anchor_result else None
-            self._send_json({
-                "ok": True,
-                "anchor_hash": content_hash,
-                "tx_hash": tx_hash or "",
-                "updated_at": now.isoformat() + "Z",
-            })
+    # ── LPL Export PDF (returns text for now; full PDF requires wkhtmltopdf) ─
 
-        # ── DRL Bulk Import ───────────────────────────────────────────
-        elif route == "drl_import":
-            self._log_request("drl-import")
-            rows = data.get("rows", [])
-            if not isinstance(rows, list):
-                rows = []
-            # Limit to 500 rows for safety
-            rows = rows[:500]
-            now = datetime.utcnow()
-            content = json.dumps({"count": len(rows), "ts": now.isoformat()}, sort_keys=True)
-            content_hash = hashlib.sha256(content.encode()).hexdigest()
-            anchor_result = _anchor_xrpl(content_hash, "drl_bulk_import", "main", None)
-            tx_hash = anchor_result.get("tx_hash") if anchor_result else None
-            if SUPABASE_AVAILABLE:
-                try:
-                    _sb_insert("lpl_snapshots", {
-                        "program_name": "DRL Import",
-                        "period": "drl_bulk_import",
-                        "version_num": 0,
-                        "executive_overview": f"Bulk import of {len(rows)} DRL records",
-                        "sections_json": json.dumps({"count": len(rows), "hash": content_hash}),
-                        "ai_provider": "none",
-                        "analysis_data": "{}",
-                        "created_at": now.isoformat() + "Z",
-                    })
-                except Exception:
-                    pass
-            self._send_json({
-                "ok": True,
-                "count": len(rows),
-                "anchor_hash": content_hash,
-                "tx_hash": tx_hash or "",
-                "imported_at": now.isoformat() + "Z",
-            })
+    def _handle_post_living_ledger_export_pdf(self, parsed, data):
+        """POST /api/living-ledger/export-pdf"""
+        self._log_request("living-ledger-export-pdf")
+        text = str(data.get("text", "")).strip()[:50000]
+        now = datetime.utcnow()
+        content_hash = hashlib.sha256(text.encode()).hexdigest()
+        self._send_json({
+            "ok": True,
+            "content_hash": content_hash,
+            "format": "text",
+            "length": len(text),
+            "generated_at": now.isoformat() + "Z",
+        })
 
-        # ── LPL Export PDF (returns text for now; full PDF requires wkhtmltopdf) ─
-        elif route == "living_ledger_export_pdf":
-            self._log_request("living-ledger-export-pdf")
-            text = str(data.get("text", "")).strip()[:50000]
-            now = datetime.utcnow()
-            content_hash = hashlib.sha256(text.encode()).hexdigest()
-            self._send_json({
-                "ok": True,
-                "content_hash": content_hash,
-                "format": "text",
-                "length": len(text),
-                "generated_at": now.isoformat() + "Z",
-            })
+    # ── Self-Healing Compliance Approve ───────────────────────────
+
+    def _handle_post_self_healing_compliance_approve(self, parsed, data):
+        """POST /api/self-healing-compliance/approve"""
+        self._log_request("self-healing-compliance-approve")
+        gap_id = str(data.get("gapId", "")).strip()[:100]
+        now = datetime.utcnow()
+        content = json.dumps({"gapId": gap_id, "approved_at": now.isoformat()}, sort_keys=True)
+        content_hash = hashlib.sha256(content.encode()).hexdigest()
+        anchor_result = _anchor_xrpl(content_hash, "shc_approve", "main", None)
+        tx_hash = anchor_result.get("tx_hash") if anchor_result else None
+        explorer_url = anchor_result.get("explorer_url") if anchor_result else None
+        self._send_json({
+            "ok": True,
+            "gap_id": gap_id,
+            "anchor_hash": content_hash,
+            "tx_hash": tx_hash or "",
+            "explorer_url": explorer_url or "",
+            "approved_at": now.isoformat() + "Z",
+        })
 
-        # ── Self-Healing Compliance Approve ───────────────────────────
-        elif route == "self_healing_compliance_approve":
-            self._log_request("self-healing-compliance-approve")
-            gap_id = str(data.get("gapId", "")).strip()[:100]
-            now = datetime.utcnow()
-            content = json.dumps({"gapId": gap_id, "approved_at": now.isoformat()}, sort_keys=True)
-            content_hash = hashlib.sha256(content.encode()).hexdigest()
-            anchor_result = _anchor_xrpl(content_hash, "shc_approve", "main", None)
-            tx_hash = anchor_result.get("tx_hash") if anchor_result else None
-            explorer_url = anchor_result.get("explorer_url") if anchor_result else None
-            self._send_json({
-                "ok": True,
-                "gap_id": gap_id,
-                "anchor_hash": content_hash,
-                "tx_hash": tx_hash or "",
-                "explorer_url": explorer_url or "",
-                "approved_at": now.isoformat() + "Z",
-            })
 
-        else:
-            self._send_json({"error": "Not found", "path": self.path}, 404)
+_router = _build_router(handler)
@@ -9,12 +9,12 @@ Components:
 4. Data Transformer — Normalize data between formats
 """
 
-import json
-import hashlib
 import xml.etree.ElementTree as ET
 from datetime import datetime, timezone
 from typing import Optional
 
+from s4_canonical import canonical_json, canonical_sha256
+
 
 # ═══════════════════════════════════════════════════════════════════════
 #  1. MIL-STD XML PARSER
@@ -74,9 +74,7 @@ class MILStdXMLParser:
                 child.text = str(value)
 
             # Always include hash for integrity verification
-            record_hash = hashlib.sha256(
-                json.dumps(record, sort_keys=True).encode()
-            ).hexdigest()
+            record_hash = canonical_sha256(record)
             hash_elem = ET.SubElement(record_elem, "S4Hash")
             hash_elem.text = record_hash
 
@@ -190,7 +188,7 @@ class DataTransformer:
     @staticmethod
     def cdrl_to_s4(cdrl: dict) -> dict:
         """Transform CDRL data into S4 anchor format."""
-        data_str = json.dumps(cdrl, sort_keys=True)
+        data_str = canonical_json(cdrl)
         return {
             "data": data_str,
             "record_type": "CDRL",
@@ -0,0 +1,88 @@
+"""
+S4 Ledger — Canonical Hashing Microbenchmark
+
+Hashes import rows, DLRS baseline snapshots and backup payloads with
+s4_canonical and with the json.dumps(sort_keys=True) + hashlib code it
+replaced, asserting every hash is byte-identical before reporting time per
+document and peak traced memory.  The canonical path should be at least as
+fast per row and, for large payloads, hold a fraction of the document in
+memory instead of the whole JSON string.
+
+Run:
+    python load-tests/bench_canonical.py [--rows 100000] [--records 50000]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from s4_canonical import canonical_sha256  # noqa: E402
+
+
+def _legacy(obj, default=None):
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, default=default).encode()).hexdigest()
+
+
+def _row(i):
+    return {"NSN": f"5340-01-{i:06d}", "Nomenclature": "BRACKET, MOUNTING", "Qty": str(i % 997),
+            "UIC": "N00024", "Depot": "NNSY", "Condition": "A", "Remarks": "Routine turn-in é"}
+
+
+def _snapshot(assets):
+    now = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    return {f"A-{i:05d}": {"asset": {"id": f"A-{i:05d}", "created": now, "tags": ["hull", "mech"]},
+                           "record_count": i % 40, "latest_hash": f"{i:064x}"} for i in range(assets)}
+
+
+def _backup(records):
+    return {"version": "1.0", "created": datetime.now(timezone.utc).isoformat(), "record_count": records,
+            "metadata": {"source": "bench"}, "records": [dict(_row(i), hash=f"{i:064x}") for i in range(records)]}
+
+
+def _time(fn, docs, default):
+    started = time.perf_counter()
+    hashes = [fn(doc, default=default) for doc in docs]
+    return (time.perf_counter() - started) / len(docs), hashes
+
+
+def _peak(fn, doc, default):
+    tracemalloc.start()
+    fn(doc, default=default)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000, help="import rows to hash one by one")
+    parser.add_argument("--assets", type=int, default=5000, help="assets in the DLRS snapshot")
+    parser.add_argument("--records", type=int, default=50000, help="records in the backup payload")
+    args = parser.parse_args()
+
+    cases = [
+        ("import row", [_row(i) for i in range(args.rows)], None),
+        ("baseline", [_snapshot(args.assets)] * 5, str),
+        ("backup", [_backup(args.records)] * 3, str),
+    ]
+    print(f"{'document':<11} {'legacy us':>11} {'canonical us':>13} {'speedup':>8} "
+          f"{'legacy peak KB':>15} {'canonical peak KB':>18}")
+    for name, docs, default in cases:
+        legacy, expected = _time(_legacy, docs, default)
+        canonical, hashes = _time(canonical_sha256, docs, default)
+        assert hashes == expected, f"{name}: canonical hashes differ from json.dumps"
+        legacy_peak = _peak(_legacy, docs[0], default)
+        canonical_peak = _peak(canonical_sha256, docs[0], default)
+        print(f"{name:<11} {legacy * 1e6:>11.1f} {canonical * 1e6:>13.1f} {legacy / canonical:>8.2f} "
+              f"{legacy_peak / 1024:>15,.0f} {canonical_peak / 1024:>18,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+S4 Ledger — File Hashing Microbenchmark
+
+Hashes one generated file through POST /api/hash/file as a base64 JSON body
+and as a streamed application/octet-stream body (in-process, through the
+real handler), and locally with S4SDK.hash_path by mmap and by readinto,
+reporting MB/s and peak traced Python memory.  The JSON upload peaks at
+several times the file size; the streamed upload and hash_path stay at
+about one read block whatever the file size.
+
+Run:
+    python load-tests/bench_file_hash.py [--size-mb 256] [--chunk-size 8388608]
+"""
+import argparse
+import base64
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from email.message import Message
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from s4_sdk import S4SDK  # noqa: E402
+
+
+def _load_api():
+    spec = importlib.util.spec_from_file_location("s4_api_index", os.path.join(ROOT, "api", "index.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _post(api, path, rfile, length, content_type):
+    """Run one POST through the API handler; returns the parsed JSON response."""
+    headers = Message()
+    headers["Content-Type"] = content_type
+    headers["Content-Length"] = str(length)
+    h = api.handler.__new__(api.handler)
+    h.rfile, h.wfile = rfile, io.BytesIO()
+    h.headers, h.path, h.command = headers, path, "POST"
+    h.client_address, h.request_version = ("127.0.0.1", 0), "HTTP/1.1"
+    h.requestline = f"POST {path} HTTP/1.1"
+    h.log_message = lambda *a, **k: None
+    h.do_POST()
+    return json.loads(h.wfile.getvalue().partition(b"\r\n\r\n")[2])
+
+
+def _measure(fn):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=256, help="generated file size in MB")
+    parser.add_argument("--chunk-size", type=int, default=8 << 20, help="chunk size for the Merkle variants")
+    args = parser.parse_args()
+
+    api = _load_api()
+    api.handler.MAX_BODY_SIZE = 1 << 40                   # let the legacy JSON body through
+    api._rate_limiter = api._MemoryRateLimitBackend()
+    sdk = S4SDK(testnet=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "tdp.bin")
+        block = os.urandom(1 << 20)
+        expected = hashlib.sha256()
+        with open(path, "wb") as fp:
+            for _ in range(args.size_mb):
+                fp.write(block)
+                expected.update(block)
+        expected = expected.hexdigest()
+        size = os.path.getsize(path)
+
+        def json_upload():
+            with open(path, "rb") as fp:
+                body = json.dumps({"content": base64.b64encode(fp.read()).decode(), "encoding": "base64"}).encode()
+            return _post(api, "/api/hash/file", io.BytesIO(body), len(body), "application/json")
+
+        def stream_upload(query=""):
+            with open(path, "rb") as fp:
+                return _post(api, "/api/hash/file" + query, fp, size, "application/octet-stream")
+
+        def readinto():
+            with open(path, "rb") as fp:
+                return sdk.hash_path(fp)
+
+        cases = [
+            ("API base64 JSON", json_upload),
+            ("API octet-stream", stream_upload),
+            ("API octet-stream + chunks", lambda: stream_upload(f"?chunk_size={args.chunk_size}")),
+            ("SDK hash_path (mmap)", lambda: sdk.hash_path(path)),
+            ("SDK hash_path (readinto)", readinto),
+            ("SDK hash_path + chunks", lambda: sdk.hash_path(path, chunk_size=args.chunk_size)),
+        ]
+        print(f"{args.size_mb} MB file\n")
+        print(f"{'path':<27} {'MB/s':>8} {'peak MB':>9}")
+        for name, fn in cases:
+            result, elapsed, peak = _measure(fn)
+            assert result["hash"] == expected, f"{name}: wrong hash"
+            print(f"{name:<27} {size / elapsed / 1e6:>8.0f} {peak / 1e6:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
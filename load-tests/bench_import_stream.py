@@ -0,0 +1,115 @@
+"""
+S4 Ledger — Streaming Import Microbenchmark
+
+Generates CSV, XML and JSON exports of increasing size on disk and imports
+each in a fresh process with S4SDK.iter_import_*, reporting rows/s and peak
+RSS.  Peak RSS should stay flat as the file grows; with --compare the
+in-memory import_* path is run on the same file for reference, and its RSS
+grows with the file.
+
+Run:
+    python load-tests/bench_import_stream.py [--sizes 64,256,1024] [--formats csv,xml,json] [--compare]
+    python load-tests/bench_import_stream.py --sizes 5120 --formats csv     # the 5 GB case
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ROW = {"NSN": "5340-01-234-5678", "Nomenclature": "BRACKET, MOUNTING", "Qty": "50",
+       "UIC": "N00024", "Depot": "NNSY", "Condition": "A", "Remarks": "Routine turn-in"}
+
+
+def _generate(path, fmt, size_mb):
+    """Write rows until the file reaches size_mb; returns the row count."""
+    target = size_mb * 1024 * 1024
+    rows = 0
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    with open(path, "w", encoding="utf-8", newline="") as fp:
+        if fmt == "csv":
+            writer.writerow(ROW)
+            fp.write(buf.getvalue())
+        else:
+            fp.write("<Export>" if fmt == "xml" else "[")
+        block = []
+        while fp.tell() < target:
+            for _ in range(1000):
+                row = dict(ROW, Qty=str(rows % 997))
+                if fmt == "csv":
+                    buf.seek(0)
+                    buf.truncate()
+                    writer.writerow(row.values())
+                    block.append(buf.getvalue())
+                elif fmt == "xml":
+                    block.append("<Item>" + "".join(f"<{k}>{v}</{k}>" for k, v in row.items()) + "</Item>")
+                else:
+                    block.append(("," if rows else "") + json.dumps(row))
+                rows += 1
+            fp.write("".join(block))
+            block.clear()
+        if fmt != "csv":
+            fp.write("</Export>" if fmt == "xml" else "]")
+    return rows
+
+
+def _child(fmt, path, mode):
+    """Import one file and print rows, seconds and peak RSS as JSON."""
+    from s4_sdk import S4SDK
+    sdk = S4SDK(testnet=True)
+    started = time.perf_counter()
+    if mode == "stream":
+        importer = getattr(sdk, f"iter_import_{fmt}")
+        rows = sum(1 for _ in importer(path, "cdmd_oa"))
+    else:
+        with open(path, encoding="utf-8") as fp:
+            text = fp.read()
+        rows = getattr(sdk, f"import_{fmt}")(text, "cdmd_oa")["imported"]
+    elapsed = time.perf_counter() - started
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"rows": rows, "seconds": elapsed, "peak_mb": peak_kb / 1024}))
+
+
+def _measure(fmt, path, mode):
+    out = subprocess.run([sys.executable, __file__, "--child", fmt, path, mode],
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="64,256,1024", help="file sizes in MB, comma separated")
+    parser.add_argument("--formats", default="csv,xml,json", help="formats to run")
+    parser.add_argument("--compare", action="store_true", help="also run the in-memory import_* path")
+    parser.add_argument("--dir", default=None, help="directory for generated files (default: temp)")
+    parser.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _child(*args.child)
+        return
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    print(f"{'format':<6} {'size MB':>8} {'rows':>11} {'mode':<7} {'rows/s':>10} {'peak RSS MB':>12}")
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        for fmt in args.formats.split(","):
+            for size in sizes:
+                path = os.path.join(tmp, f"export.{fmt}")
+                _generate(path, fmt, size)
+                for mode in ("stream", "memory") if args.compare else ("stream",):
+                    r = _measure(fmt, path, mode)
+                    print(f"{fmt:<6} {size:>8} {r['rows']:>11,} {mode:<7} "
+                          f"{r['rows'] / r['seconds']:>10,.0f} {r['peak_mb']:>12.1f}")
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
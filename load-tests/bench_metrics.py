@@ -0,0 +1,117 @@
+"""
+S4 Ledger — Metrics Recording Microbenchmark
+
+Times S4Metrics.http_request() from several threads while a scraper calls
+export_prometheus() in a loop, against the single-lock, string-keyed
+collector it replaced.  Reports recording throughput and the slowest single
+record call, which is where a scrape holding the global lock shows up.
+
+Run:
+    python load-tests/bench_metrics.py [--threads 8] [--calls 20000] [--routes 120]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from monitoring import S4Metrics  # noqa: E402
+
+BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 5, 10, float("inf")]
+
+
+class _LegacyMetrics:
+    """Equivalent of the old collector: a formatted key per call, one lock,
+    and a scrape that sorts and renders every series while holding it."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._sums = defaultdict(float)
+        self._counts = defaultdict(int)
+        self._buckets = defaultdict(lambda: defaultdict(int))
+
+    @staticmethod
+    def _key(name, labels):
+        return name + "{" + ",".join(f'{k}="{v}"' for k, v in sorted(labels.items())) + "}"
+
+    def http_request(self, method, endpoint, status_code, duration_seconds):
+        labels = {"method": method, "endpoint": endpoint, "status": str(status_code)}
+        counter = self._key("s4_http_requests_total", labels)
+        key = self._key("s4_http_request_seconds", {"method": method, "endpoint": endpoint})
+        bucket = next(b for b in BUCKETS if duration_seconds <= b)
+        with self._lock:
+            self._counters[counter] += 1
+        with self._lock:
+            self._sums[key] += duration_seconds
+            self._counts[key] += 1
+            self._buckets[key][bucket] += 1
+
+    def export_prometheus(self):
+        lines = []
+        with self._lock:
+            for key, value in sorted(self._counters.items()):
+                lines.append(f"{key} {value}")
+            for key in sorted(self._counts):
+                base, labels = key.split("{", 1)
+                cumulative = 0
+                for b in BUCKETS:
+                    cumulative += self._buckets[key].get(b, 0)
+                    lines.append(f'{base}_bucket{{{labels[:-1]},le="{b}"}} {cumulative}')
+                lines.append(f"{base}_sum{{{labels} {self._sums[key]}")
+                lines.append(f"{base}_count{{{labels} {self._counts[key]}")
+        return "\n".join(lines)
+
+
+def _run(collector, threads, calls, routes):
+    stop = threading.Event()
+    scrapes = [0]
+    worst = [0.0] * threads
+
+    def scraper():
+        while not stop.is_set():
+            collector.export_prometheus()
+            scrapes[0] += 1
+
+    def writer(n):
+        slowest = 0.0
+        for i in range(calls):
+            t0 = time.perf_counter()
+            collector.http_request("GET", f"route_{(i * 7 + n) % routes}", 200, (i % 50) / 100)
+            slowest = max(slowest, time.perf_counter() - t0)
+        worst[n] = slowest
+
+    reader = threading.Thread(target=scraper)
+    reader.start()
+    workers = [threading.Thread(target=writer, args=(n,)) for n in range(threads)]
+    started = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    reader.join()
+    return threads * calls / elapsed, max(worst), scrapes[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8, help="recording threads")
+    parser.add_argument("--calls", type=int, default=20000, help="http_request() calls per thread")
+    parser.add_argument("--routes", type=int, default=120, help="distinct endpoint labels")
+    args = parser.parse_args()
+
+    print(f"{args.threads} threads x {args.calls:,} calls, {args.routes} routes, scraping continuously\n")
+    print(f"{'collector':<10} {'calls/s':>12} {'worst ms':>10} {'scrapes':>8}")
+    for name, collector in (("striped", S4Metrics()), ("legacy", _LegacyMetrics())):
+        rate, worst, scrapes = _run(collector, args.threads, args.calls, args.routes)
+        print(f"{name:<10} {rate:>12,.0f} {worst * 1000:>10.2f} {scrapes:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+S4 Ledger — Parallel Import Hashing Microbenchmark
+
+Hashes the canonical JSON of generated import rows through S4SDK._hash_rows
+serially and with workers= on process and thread pools, reporting rows/s as
+the worker count grows.  Process pools should scale with cores; thread pools
+stay near serial for ordinary rows (json.dumps holds the GIL) and only help
+once rows are large enough for hashlib to release it.
+
+Run:
+    python load-tests/bench_parallel_hash.py [--rows 200000] [--fields 12] [--field-bytes 16]
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from s4_sdk import S4SDK  # noqa: E402
+
+
+def _rows(count, fields, field_bytes):
+    pad = "x" * field_bytes
+    return [{f"field_{f:02d}": f"{i}-{f}-{pad}" for f in range(fields)} for i in range(count)]
+
+
+def _rate(sdk, rows, workers=None, pool="process"):
+    started = time.perf_counter()
+    hashes = [h for _, h in sdk._hash_rows(rows, workers, pool)]
+    return len(rows) / (time.perf_counter() - started), hashes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000, help="rows to hash")
+    parser.add_argument("--fields", type=int, default=12, help="fields per row")
+    parser.add_argument("--field-bytes", type=int, default=16, help="padding per field value")
+    args = parser.parse_args()
+
+    sdk = S4SDK(testnet=True)
+    rows = _rows(args.rows, args.fields, args.field_bytes)
+    cores = os.cpu_count() or 1
+    counts = sorted({n for n in (2, 4, 8, 16, cores) if 1 < n <= max(cores, 2)})
+
+    serial, expected = _rate(sdk, rows)
+    print(f"{args.rows:,} rows x {args.fields} fields, {cores} cores\n")
+    print(f"{'pool':<8} {'workers':>7} {'rows/s':>12} {'speedup':>8}")
+    print(f"{'serial':<8} {1:>7} {serial:>12,.0f} {1:>8.2f}")
+    for pool in ("process", "thread"):
+        for n in counts:
+            rate, hashes = _rate(sdk, rows, n, pool)
+            assert hashes == expected, "parallel hashes differ from serial"
+            print(f"{pool:<8} {n:>7} {rate:>12,.0f} {rate / serial:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+S4 Ledger — Route Dispatch Microbenchmark
+
+Times how long the API takes to resolve a request to its handler for the
+first, middle and last declared routes, and compares the dispatch table
+with the linear if/elif scan it replaced.  Dispatch through _router should
+cost the same for every route; the linear scan grows with route position.
+
+Run:
+    python load-tests/bench_route_dispatch.py [--number 200000]
+"""
+import argparse
+import importlib.util
+import os
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _load_api():
+    spec = importlib.util.spec_from_file_location("s4_api_index", os.path.join(ROOT, "api", "index.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _linear_route(paths, path):
+    """Equivalent of the old handler._route(): compare against every path in order."""
+    path = path.rstrip("/")
+    for candidate, route in paths:
+        if path == candidate:
+            return route
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--number", type=int, default=200_000, help="lookups per measurement")
+    args = parser.parse_args()
+
+    api = _load_api()
+    routes = [(m, p) for m, p, _ in api._router.routes()]
+    paths = list(api._ROUTE_NAMES.items())
+    picks = {"first": routes[0], "middle": routes[len(routes) // 2], "last": routes[-1]}
+
+    print(f"{len(routes)} routes, {args.number:,} lookups each\n")
+    print(f"{'route':<8} {'path':<48} {'router ns':>10} {'linear ns':>10}")
+    router, linear = [], []
+    for label, (method, path) in picks.items():
+        router_s = min(timeit.repeat(lambda: api._router.resolve(method, path), number=args.number, repeat=5))
+        linear_s = min(timeit.repeat(lambda: _linear_route(paths, path), number=args.number, repeat=5))
+        router_ns, linear_ns = router_s / args.number * 1e9, linear_s / args.number * 1e9
+        router.append(router_ns)
+        linear.append(linear_ns)
+        print(f"{label:<8} {method + ' ' + path:<48} {router_ns:>10.1f} {linear_ns:>10.1f}")
+    print(f"\nlast/first: router {router[-1] / router[0]:.2f}x, linear {linear[-1] / linear[0]:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+S4 Ledger — Webhook Fan-out Microbenchmark
+
+Times selecting and signing the deliveries for one event across many
+tenants: the (event, org) subscription index used by _deliver_webhook
+against the scan over every org and hook it replaced.  Index cost should
+follow the number of matching subscribers, not the number of hooks.
+
+Run:
+    python load-tests/bench_webhook_fanout.py [--orgs 2000] [--hooks 3] [--number 200]
+"""
+import argparse
+import hashlib
+import importlib.util
+import json
+import os
+import timeit
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EVENTS = ["anchor.confirmed", "verify.completed", "tamper.detected", "batch.completed",
+          "custody.transferred", "sls.balance_low", "chain.integrity_check", "proof.appended"]
+
+
+def _load_api():
+    spec = importlib.util.spec_from_file_location("s4_api_index", os.path.join(ROOT, "api", "index.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _linear_fanout(api, event_type, data):
+    """Equivalent of the old _deliver_webhook loop: serialize, then visit every org and
+    hook, signing and building a delivery for each match."""
+    now = datetime.now(timezone.utc)
+    payload_json = json.dumps({"event": event_type, "timestamp": now.isoformat(), "data": data,
+                               "api_version": "2026-02-18"}, ensure_ascii=False)
+    deliveries = []
+    for org in list(api._webhook_store.keys()):
+        for hook in api._webhook_store.get(org, []):
+            if not hook.get("active", True) or event_type not in hook.get("events", []):
+                continue
+            signature = api._sign_webhook_payload(payload_json, hook.get("secret", ""))
+            delivery_id = f"whd_{hashlib.sha256((now.isoformat() + event_type + hook['url']).encode()).hexdigest()[:16]}"
+            deliveries.append({"id": delivery_id, "org": org, "url": hook["url"], "signature": signature,
+                               "payload_json": payload_json})
+    return deliveries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--orgs", type=int, default=2000, help="tenants with registered hooks")
+    parser.add_argument("--hooks", type=int, default=3, help="hooks per tenant")
+    parser.add_argument("--number", type=int, default=200, help="events per measurement")
+    args = parser.parse_args()
+
+    api = _load_api()
+    api.WEBHOOK_ASYNC = True
+    api._enqueue_webhook = lambda job: None
+    api._log_webhook_delivery = lambda record: None
+    # Each org subscribes its hooks to one event; every 100th org also takes "sls.balance_low"
+    for o in range(args.orgs):
+        for h in range(args.hooks):
+            events = [EVENTS[(o + h) % 5]] + (["sls.balance_low"] if o % 100 == 0 else [])
+            api._add_webhook(f"org{o}", {"url": f"https://org{o}.example/{h}", "events": events,
+                                         "secret": f"whsec_{o % 10}"})
+
+    print(f"{args.orgs:,} orgs x {args.hooks} hooks, {args.number:,} events each\n")
+    print(f"{'event':<22} {'matches':>8} {'index us':>10} {'scan us':>10}")
+    for event_type in ("anchor.confirmed", "sls.balance_low", "proof.appended"):
+        matches = sum(len(v) for v in api._webhook_index.get(event_type, {}).values())
+        index_s = min(timeit.repeat(lambda: api._deliver_webhook(event_type, {}), number=args.number, repeat=3))
+        scan_s = min(timeit.repeat(lambda: _linear_fanout(api, event_type, {}), number=args.number, repeat=3))
+        print(f"{event_type:<22} {matches:>8} {index_s / args.number * 1e6:>10.1f} {scan_s / args.number * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,73 +9,251 @@ Usage in api/index.py:
     metrics.anchor_completed(duration_seconds=2.3, success=True)
     metrics.ai_query(duration_seconds=1.5, success=True)
     metrics.record_queue_depth(150)
+    metrics.quantiles("s4_anchor_duration_seconds")   # {"p50": ..., "p99.9": ...}
 """
 
-import time
+import bisect
 import threading
+import time
 from collections import defaultdict
 
-
-class S4Metrics:
-    """Thread-safe Prometheus-style metrics collector for S4 Ledger."""
+from .sketch import DDSketch, DEFAULT_QUANTILES
+
+SKETCH_ACCURACY = 0.01
+STRIPES = 16                    # independent locks for sample recording
+DEFAULT_MAX_SERIES = 2000       # label sets per family before folding into overflow
+OVERFLOW_VALUE = "__overflow__"
+
+# Families known up front: name -> (kind, histogram buckets)
+_FAMILIES = {
+    "s4_anchors_total": ("counter", None),
+    "s4_anchors_success_total": ("counter", None),
+    "s4_anchors_failed_total": ("counter", None),
+    "s4_verifications_total": ("counter", None),
+    "s4_tamper_detected_total": ("counter", None),
+    "s4_ai_queries_total": ("counter", None),
+    "s4_ai_query_errors_total": ("counter", None),
+    "s4_http_requests_total": ("counter", None),
+    "s4_http_errors_total": ("counter", None),
+    "s4_dependency_errors_total": ("counter", None),
+    "s4_sls_fees_collected_total": ("counter", None),
+    "s4_wallet_cache_lookups_total": ("counter", None),
+    "s4_wallet_cache_evictions_total": ("counter", None),
+    "s4_webhooks_total": ("counter", None),
+    "s4_webhook_failures_total": ("counter", None),
+    "s4_anchor_queue_depth": ("gauge", None),
+    "s4_offline_queue_pending": ("gauge", None),
+    "s4_offline_queue_synced": ("gauge", None),
+    "s4_treasury_xrp_balance": ("gauge", None),
+    "s4_treasury_sls_balance": ("gauge", None),
+    "s4_xrpl_validator_healthy": ("gauge", None),
+    "s4_xrpl_last_fee_drops": ("gauge", None),
+    "s4_xrpl_ticket_pool_depth": ("gauge", None),
+    "s4_xrpl_tickets_leased": ("gauge", None),
+    "s4_wallet_cache_entries": ("gauge", None),
+    "s4_wallet_cache_hit_ratio": ("gauge", None),
+    "s4_anchor_duration_seconds": ("histogram", [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]),
+    "s4_verify_duration_seconds": ("histogram", [0.01, 0.05, 0.1, 0.25, 0.5, 1, 5]),
+    "s4_ai_response_seconds": ("histogram", [0.5, 1, 2.5, 5, 10, 15, 30, 60]),
+    "s4_http_request_seconds": ("histogram", [0.01, 0.05, 0.1, 0.25, 0.5, 1, 5, 10]),
+    "s4_webhook_delivery_seconds": ("histogram", [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]),
+    "s4_dependency_seconds": ("histogram", [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]),
+}
+
+
+def _quantile_label(q):
+    return f"p{q * 100:g}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Family:
+    """One metric name: its kind, bucket layout and the label sets seen so far."""
+
+    __slots__ = ("name", "kind", "buckets", "le", "max_series", "series", "size")
+
+    def __init__(self, name, kind, buckets, max_series):
+        self.name = name
+        self.kind = kind
+        self.buckets = sorted(buckets) + [float("inf")] if kind == "histogram" else None
+        self.le = [str(b) for b in self.buckets[:-1]] + ["+Inf"] if self.buckets else None
+        self.max_series = max_series
+        self.series = {}        # sorted label tuple (raw or str-normalized) -> _Series
+        self.size = 0           # distinct series, excluding aliases
+
+
+class _Series:
+    """One interned label set. The exposition key is rendered once, here."""
+
+    __slots__ = ("family", "labels", "inner", "key", "stripe")
+
+    def __init__(self, family, labels, stripe):
+        self.family = family
+        self.labels = labels
+        self.inner = ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+        self.key = f"{family.name}{{{self.inner}}}" if labels else family.name
+        self.stripe = stripe
+
+
+class _Stripe:
+    """Sample storage for the series hashed to it, behind its own lock."""
+
+    __slots__ = ("lock", "counters", "gauges", "histograms", "sketches")
 
     def __init__(self):
-        self._lock = threading.Lock()
-        # Counters
-        self._counters = defaultdict(float)
-        # Gauges
-        self._gauges = defaultdict(float)
-        # Histograms (store individual observations)
-        self._histogram_sums = defaultdict(float)
-        self._histogram_counts = defaultdict(int)
-        self._histogram_buckets = {}  # metric -> sorted list of bucket boundaries
-        self._histogram_bucket_counts = defaultdict(lambda: defaultdict(int))
-
-        # Pre-define histogram buckets
-        self._define_histogram("s4_anchor_duration_seconds", [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30])
-        self._define_histogram("s4_verify_duration_seconds", [0.01, 0.05, 0.1, 0.25, 0.5, 1, 5])
-        self._define_histogram("s4_ai_response_seconds", [0.5, 1, 2.5, 5, 10, 15, 30, 60])
-        self._define_histogram("s4_http_request_seconds", [0.01, 0.05, 0.1, 0.25, 0.5, 1, 5, 10])
-
-    def _define_histogram(self, name, buckets):
-        self._histogram_buckets[name] = sorted(buckets) + [float("inf")]
+        self.lock = threading.Lock()
+        self.counters = {}      # _Series -> float
+        self.gauges = {}        # _Series -> float
+        self.histograms = {}    # _Series -> [sum, count, per-bucket counts]
+        self.sketches = {}      # _Series -> DDSketch
+
+
+class S4Metrics:
+    """Thread-safe Prometheus-style metrics collector for S4 Ledger.
+
+    Label sets are interned per family as sorted tuples, so recording a
+    sample is a dict lookup rather than string formatting. Samples land in
+    one of STRIPES lock-protected stripes; a scrape copies each stripe in
+    turn and formats outside every lock, so it never holds up request
+    threads for longer than one stripe copy. Each family admits at most
+    max_series label sets; later ones are folded into a single series whose
+    label values are all "__overflow__", and counted in
+    s4_metrics_series_overflow_total.
+    """
+
+    def __init__(self, max_series=DEFAULT_MAX_SERIES):
+        self._registry_lock = threading.Lock()
+        self._families = {}
+        self._stripes = [_Stripe() for _ in range(STRIPES)]
+        self._next_stripe = 0
+        self._overflow = defaultdict(int)       # family name -> folded samples
+        self.max_series = max_series
+        for name, (kind, buckets) in _FAMILIES.items():
+            self.register(name, kind, buckets)
+
+    def register(self, name, kind, buckets=None, max_series=None):
+        """Declare a metric family (counter, gauge or histogram) ahead of use."""
+        with self._registry_lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = _Family(
+                    name, kind, buckets or [], max_series or self.max_series)
+            return family
+
+    def _series(self, name, labels, kind):
+        family = self._families.get(name) or self.register(name, kind)
+        key = tuple(sorted(labels.items())) if labels else ()
+        series = family.series.get(key)
+        return series if series is not None else self._admit(family, key)
+
+    def _admit(self, family, raw):
+        """Intern a new label set, or fold it into the overflow series."""
+        key = tuple((k, str(v)) for k, v in raw)
+        with self._registry_lock:
+            series = family.series.get(key)
+            if series is None:
+                if family.size >= family.max_series:
+                    self._overflow[family.name] += 1
+                    key = raw = tuple((k, OVERFLOW_VALUE) for k, _ in key)
+                    series = family.series.get(key)
+                    if series is not None:
+                        return series
+                series = family.series[key] = _Series(family, key, self._next_stripe)
+                family.size += 1
+                self._next_stripe = (self._next_stripe + 1) % STRIPES
+            # Remember the caller's spelling too (e.g. status=404 vs "404")
+            family.series.setdefault(raw, series)
+            return series
 
     # ── Counter operations ──────────────────────────────────────────
 
     def inc(self, name, value=1, labels=None):
-        key = self._label_key(name, labels)
-        with self._lock:
-            self._counters[key] += value
-
-    def _label_key(self, name, labels):
-        if not labels:
-            return name
-        parts = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()))
-        return f"{name}{{{parts}}}"
+        series = self._series(name, labels, "counter")
+        stripe = self._stripes[series.stripe]
+        with stripe.lock:
+            stripe.counters[series] = stripe.counters.get(series, 0.0) + value
 
     # ── Gauge operations ────────────────────────────────────────────
 
     def set_gauge(self, name, value, labels=None):
-        key = self._label_key(name, labels)
-        with self._lock:
-            self._gauges[key] = value
+        series = self._series(name, labels, "gauge")
+        stripe = self._stripes[series.stripe]
+        with stripe.lock:
+            stripe.gauges[series] = value
 
     def inc_gauge(self, name, value=1, labels=None):
-        key = self._label_key(name, labels)
-        with self._lock:
-            self._gauges[key] = self._gauges.get(key, 0) + value
+        series = self._series(name, labels, "gauge")
+        stripe = self._stripes[series.stripe]
+        with stripe.lock:
+            stripe.gauges[series] = stripe.gauges.get(series, 0) + value
 
     # ── Histogram operations ────────────────────────────────────────
 
     def observe(self, name, value, labels=None):
-        key = self._label_key(name, labels)
-        buckets = self._histogram_buckets.get(name, [float("inf")])
-        with self._lock:
-            self._histogram_sums[key] += value
-            self._histogram_counts[key] += 1
-            for b in buckets:
-                if value <= b:
-                    self._histogram_bucket_counts[key][b] += 1
+        series = self._series(name, labels, "histogram")
+        buckets = series.family.buckets
+        # Count the observation in its own (smallest fitting) bucket only;
+        # export_prometheus() accumulates them into the cumulative `le` series.
+        index = min(bisect.bisect_left(buckets, value), len(buckets) - 1)
+        stripe = self._stripes[series.stripe]
+        with stripe.lock:
+            hist = stripe.histograms.get(series)
+            if hist is None:
+                hist = stripe.histograms[series] = [0.0, 0, [0] * len(buckets)]
+                stripe.sketches[series] = DDSketch(SKETCH_ACCURACY)
+            hist[0] += value
+            hist[1] += 1
+            hist[2][index] += 1
+            stripe.sketches[series].add(value)
+
+    # ── Quantile sketches ───────────────────────────────────────────
+
+    def sketch(self, name, labels=None):
+        """Copy of the sketch for one series; labels=None merges every label set."""
+        family = self._families.get(name)
+        if family is None:
+            return None
+        if labels is not None:
+            key = tuple(sorted(labels.items()))
+            found = family.series.get(key) or family.series.get(tuple((k, str(v)) for k, v in key))
+            wanted = [found] if found else []
+        else:
+            wanted = set(family.series.values())
+        merged = None
+        for series in wanted:
+            stripe = self._stripes[series.stripe]
+            with stripe.lock:
+                found = stripe.sketches.get(series)
+                if found is not None:
+                    merged = found.copy() if merged is None else merged.merge(found)
+        return merged
+
+    def quantiles(self, name, labels=None, qs=DEFAULT_QUANTILES):
+        """p50/p90/p99/p99.9 (by default) for a histogram; None values while empty."""
+        sketch = self.sketch(name, labels)
+        return {_quantile_label(q): sketch.quantile(q) if sketch else None for q in qs}
+
+    def export_sketches(self):
+        """Serializable sketch state, for merging into another process's collector."""
+        return [
+            {"name": series.family.name, "labels": dict(series.labels), "sketch": sketch.to_dict()}
+            for series, _, sketch in self._snapshot()["histograms"]
+        ]
+
+    def merge_sketches(self, state):
+        """Fold sketches exported by another worker (export_sketches()) into ours."""
+        for item in state:
+            incoming = DDSketch.from_dict(item["sketch"])
+            series = self._series(item["name"], item["labels"], "histogram")
+            stripe = self._stripes[series.stripe]
+            with stripe.lock:
+                if series in stripe.sketches:
+                    stripe.sketches[series].merge(incoming)
+                else:
+                    stripe.sketches[series] = incoming
+                    stripe.histograms[series] = [0.0, 0, [0] * len(series.family.buckets)]
 
     # ── High-level convenience methods ──────────────────────────────
 
@@ -106,10 +284,17 @@ class S4Metrics:
     def http_request(self, method, endpoint, status_code, duration_seconds):
         labels = {"method": method, "endpoint": endpoint, "status": str(status_code)}
         self.inc("s4_http_requests_total", labels=labels)
-        self.observe("s4_http_request_seconds", duration_seconds, labels={"method": method})
+        self.observe("s4_http_request_seconds", duration_seconds, labels={"method": method, "endpoint": endpoint})
         if status_code >= 400:
             self.inc("s4_http_errors_total", labels=labels)
 
+    def dependency_call(self, dependency, operation, duration_seconds, success=True):
+        """One call to an external dependency (supabase, xrpl, ai)."""
+        labels = {"dependency": dependency, "operation": operation}
+        self.observe("s4_dependency_seconds", duration_seconds, labels=labels)
+        if not success:
+            self.inc("s4_dependency_errors_total", labels=labels)
+
     def record_queue_depth(self, depth):
         self.set_gauge("s4_anchor_queue_depth", depth)
 
@@ -128,65 +313,111 @@ class S4Metrics:
         self.set_gauge("s4_xrpl_validator_healthy", 1 if healthy else 0, labels={"validator": validator})
         self.set_gauge("s4_xrpl_last_fee_drops", fee_drops, labels={"validator": validator})
 
-    def webhook_delivered(self, event, success=True):
+    def record_ticket_pool(self, available, leased=0):
+        self.set_gauge("s4_xrpl_ticket_pool_depth", available)
+        self.set_gauge("s4_xrpl_tickets_leased", leased)
+
+    def wallet_cache_lookup(self, hit, entries=None, hit_ratio=None):
+        self.inc("s4_wallet_cache_lookups_total", labels={"result": "hit" if hit else "miss"})
+        if entries is not None:
+            self.set_gauge("s4_wallet_cache_entries", entries)
+        if hit_ratio is not None:
+            self.set_gauge("s4_wallet_cache_hit_ratio", hit_ratio)
+
+    def wallet_cache_evicted(self, reason):
+        self.inc("s4_wallet_cache_evictions_total", labels={"reason": reason})
+
+    def webhook_delivered(self, event, success=True, duration_seconds=None):
         self.inc("s4_webhooks_total", labels={"event": event})
+        if duration_seconds is not None:
+            self.observe("s4_webhook_delivery_seconds", duration_seconds, labels={"event": event})
         if not success:
             self.inc("s4_webhook_failures_total", labels={"event": event})
 
     # ── Prometheus exposition format ────────────────────────────────
 
+    def _snapshot(self):
+        """Copy every stripe, one lock at a time, sorted by exposition key."""
+        counters, gauges, histograms = [], [], []
+        for stripe in self._stripes:
+            with stripe.lock:
+                counters.extend(stripe.counters.items())
+                gauges.extend(stripe.gauges.items())
+                histograms.extend(
+                    (series, (hist[0], hist[1], list(hist[2])), stripe.sketches[series].copy())
+                    for series, hist in stripe.histograms.items())
+        with self._registry_lock:
+            overflow = sorted(self._overflow.items())
+        counters = [(s.key, v) for s, v in counters]
+        counters += [(f's4_metrics_series_overflow_total{{family="{name}"}}', n) for name, n in overflow]
+        return {
+            "counters": sorted(counters),
+            "gauges": sorted(((s.key, v) for s, v in gauges)),
+            "histograms": sorted(histograms, key=lambda item: item[0].key),
+        }
+
     def export_prometheus(self):
         """Export all metrics in Prometheus text exposition format."""
+        snap = self._snapshot()
         lines = []
         lines.append("# S4 Ledger Metrics")
         lines.append(f"# Generated at {time.time()}")
         lines.append("")
 
-        with self._lock:
-            # Counters
-            for key, value in sorted(self._counters.items()):
-                lines.append(f"{key} {value}")
-
-            # Gauges
-            for key, value in sorted(self._gauges.items()):
+        for kind in ("counter", "gauge"):
+            typed = set()
+            for key, value in snap[kind + "s"]:
+                base_name = key.split("{")[0]
+                if base_name not in typed:
+                    lines.append(f"# TYPE {base_name} {kind}")
+                    typed.add(base_name)
                 lines.append(f"{key} {value}")
 
-            # Histograms
-            exported_histograms = set()
-            for key in sorted(self._histogram_counts.keys()):
-                base_name = key.split("{")[0] if "{" in key else key
-                if base_name not in exported_histograms:
-                    lines.append(f"# TYPE {base_name} histogram")
-                    exported_histograms.add(base_name)
-
-                buckets = self._histogram_buckets.get(base_name, [float("inf")])
-                cumulative = 0
-                for b in buckets:
-                    cumulative += self._histogram_bucket_counts[key].get(b, 0)
-                    le = "+Inf" if b == float("inf") else str(b)
-                    bucket_key = key.replace("}", f',le="{le}"}}') if "{" in key else f'{key}{{le="{le}"}}'
-                    lines.append(f"{bucket_key} {cumulative}")
-
-                lines.append(f"{key}_sum {self._histogram_sums[key]}")
-                lines.append(f"{key}_count {self._histogram_counts[key]}")
+        # Histograms
+        typed = set()
+        for series, (total, count, bucket_counts), _ in snap["histograms"]:
+            base_name = series.family.name
+            if base_name not in typed:
+                lines.append(f"# TYPE {base_name} histogram")
+                typed.add(base_name)
+            inner = series.inner + "," if series.inner else ""
+            label_part = f"{{{series.inner}}}" if series.inner else ""
+            cumulative = 0
+            for le, n in zip(series.family.le, bucket_counts):
+                cumulative += n
+                lines.append(f'{base_name}_bucket{{{inner}le="{le}"}} {cumulative}')
+            lines.append(f"{base_name}_sum{label_part} {total}")
+            lines.append(f"{base_name}_count{label_part} {count}")
+
+        # Sketch quantiles, as a gauge family beside each histogram
+        typed = set()
+        for series, _, sketch in snap["histograms"]:
+            base_name = series.family.name
+            inner = series.inner + "," if series.inner else ""
+            if base_name not in typed:
+                lines.append(f"# TYPE {base_name}_quantiles gauge")
+                typed.add(base_name)
+            for q, value in sketch.quantiles().items():
+                lines.append(f'{base_name}_quantiles{{{inner}quantile="{q:g}"}} {value}')
 
         lines.append("")
         return "\n".join(lines)
 
     def export_json(self):
         """Export metrics as JSON (for /api/metrics/prometheus endpoint)."""
-        with self._lock:
-            return {
-                "counters": dict(self._counters),
-                "gauges": dict(self._gauges),
-                "histograms": {
-                    k: {
-                        "sum": self._histogram_sums[k],
-                        "count": self._histogram_counts[k],
-                    }
-                    for k in self._histogram_counts
-                },
-            }
+        snap = self._snapshot()
+        return {
+            "counters": dict(snap["counters"]),
+            "gauges": dict(snap["gauges"]),
+            "histograms": {
+                series.key: {"sum": total, "count": count}
+                for series, (total, count, _), _ in snap["histograms"]
+            },
+            "quantiles": {
+                series.key: {_quantile_label(q): v for q, v in sketch.quantiles().items()}
+                for series, _, sketch in snap["histograms"]
+            },
+        }
 
 
 # Singleton instance
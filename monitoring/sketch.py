@@ -0,0 +1,146 @@
+"""
+S4 Ledger — Streaming Quantile Sketch
+DDSketch: relative-error quantiles over an unbounded stream in bounded
+memory, mergeable across threads and worker processes.
+
+Usage:
+    from monitoring.sketch import DDSketch
+    sketch = DDSketch(relative_accuracy=0.01)
+    sketch.add(0.123)
+    sketch.quantile(0.99)                     # within 1% of the true p99
+    sketch.merge(DDSketch.from_dict(other))   # e.g. another worker's export
+"""
+
+import math
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+
+class DDSketch:
+    """Log-bucketed quantile sketch (Masson et al., "DDSketch", VLDB 2019).
+
+    A positive value v lands in bucket ceil(log_gamma(v)) with
+    gamma = (1 + a) / (1 - a); every value in a bucket is within relative
+    error a of the bucket's representative, so any quantile is too. Values
+    at or below min_value (zero and negatives included) share one bucket.
+    When more than max_bins buckets exist the lowest ones are collapsed,
+    which keeps memory bounded and only costs accuracy at the low end —
+    tail quantiles stay exact to within a.
+    """
+
+    def __init__(self, relative_accuracy=0.01, max_bins=2048, min_value=1e-9):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be in (0, 1)")
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {}          # bucket index -> count
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value, weight=1):
+        self.count += weight
+        self.sum += value * weight
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if value <= self.min_value:
+            self.zero_count += weight
+            return
+        key = math.ceil(math.log(value) / self._log_gamma)
+        self.bins[key] = self.bins.get(key, 0) + weight
+        if len(self.bins) > self.max_bins:
+            self._collapse()
+
+    def _collapse(self):
+        keys = sorted(self.bins)
+        excess = keys[:len(keys) - self.max_bins + 1]
+        target = excess[-1]
+        self.bins[target] = sum(self.bins.pop(k) for k in excess)
+
+    def quantile(self, q):
+        """Value at quantile q (0..1); None while empty."""
+        return self.quantiles((q,))[q]
+
+    def quantiles(self, qs=DEFAULT_QUANTILES):
+        """{q: value} for several quantiles in one pass over the bins."""
+        result = {}
+        if self.count == 0:
+            return {q: None for q in qs}
+        pending = []
+        for q in qs:
+            if q <= 0:
+                result[q] = self.min
+            elif q >= 1:
+                result[q] = self.max
+            else:
+                pending.append((q * (self.count - 1), q))
+        pending.sort(reverse=True)
+        seen = self.zero_count
+        while pending and seen > pending[-1][0]:
+            result[pending.pop()[1]] = max(self.min, min(0.0, self.max))
+        for key in sorted(self.bins) if pending else ():
+            seen += self.bins[key]
+            if seen > pending[-1][0]:
+                value = min(max(2 * self.gamma ** key / (self.gamma + 1), self.min), self.max)
+                while pending and seen > pending[-1][0]:
+                    result[pending.pop()[1]] = value
+                if not pending:
+                    break
+        for _, q in pending:
+            result[q] = self.max
+        return {q: result[q] for q in qs}
+
+    def merge(self, other):
+        """Fold another sketch (same accuracy) into this one."""
+        if not math.isclose(other.gamma, self.gamma):
+            raise ValueError("cannot merge sketches with different relative accuracy")
+        for key, n in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + n
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        while len(self.bins) > self.max_bins:
+            self._collapse()
+        return self
+
+    def copy(self):
+        clone = DDSketch.__new__(DDSketch)
+        clone.__dict__.update(self.__dict__)
+        clone.bins = dict(self.bins)
+        return clone
+
+    # ── Serialization (cross-process merge) ─────────────────────────
+
+    def to_dict(self):
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "max_bins": self.max_bins,
+            "min_value": self.min_value,
+            "bins": {str(k): n for k, n in self.bins.items()},
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["relative_accuracy"], data.get("max_bins", 2048), data.get("min_value", 1e-9))
+        sketch.bins = {int(k): n for k, n in data.get("bins", {}).items()}
+        sketch.zero_count = data.get("zero_count", 0)
+        sketch.count = data.get("count", 0)
+        sketch.sum = data.get("sum", 0.0)
+        if sketch.count:
+            sketch.min, sketch.max = data["min"], data["max"]
+        return sketch
+
+    def __len__(self):
+        return self.count
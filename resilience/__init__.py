@@ -53,9 +53,18 @@ class PersistentQueue:
                     last_attempt TEXT,
                     synced_at TEXT,
                     tx_hash TEXT,
-                    error TEXT
+                    error TEXT,
+                    next_attempt_at REAL,
+                    claimed_by TEXT,
+                    lease_expires_at REAL
                 )
             """)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(queue)")}
+            if "next_attempt_at" not in columns:  # queues created before retry scheduling
+                conn.execute("ALTER TABLE queue ADD COLUMN next_attempt_at REAL")
+            if "claimed_by" not in columns:  # queues created before leased claims
+                conn.execute("ALTER TABLE queue ADD COLUMN claimed_by TEXT")
+                conn.execute("ALTER TABLE queue ADD COLUMN lease_expires_at REAL")
             conn.execute("""
                 CREATE INDEX IF NOT EXISTS idx_queue_status ON queue(status)
             """)
@@ -98,6 +107,58 @@ class PersistentQueue:
             ).fetchall()
             return [dict(row) for row in rows]
 
+    def claim_pending(self, limit: int = 1, owner: str = None, lease_seconds: float = None) -> list:
+        """Atomically move up to `limit` pending records to 'in_flight' and return them.
+
+        Unlike get_pending(), two workers calling this concurrently — in this
+        or another process sharing the database — never receive the same row.
+        Records rescheduled with mark_retry() are skipped until their next
+        attempt is due.
+
+        With lease_seconds the claim is a lease held by `owner`: an in-flight
+        record whose lease has expired (its worker died) is claimable again,
+        while records leased to a live worker are left alone.
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        clock = time.time()
+        lease_expires_at = clock + lease_seconds if lease_seconds else None
+        with self._lock:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            try:
+                conn.row_factory = sqlite3.Row
+                conn.execute("BEGIN IMMEDIATE")
+                rows = conn.execute(
+                    """SELECT * FROM queue
+                       WHERE (status = 'pending' AND (next_attempt_at IS NULL OR next_attempt_at <= ?))
+                          OR (status = 'in_flight' AND lease_expires_at IS NOT NULL AND lease_expires_at <= ?)
+                       ORDER BY created_at ASC, id ASC LIMIT ?""",
+                    (clock, clock, limit),
+                ).fetchall()
+                conn.executemany(
+                    """UPDATE queue SET status = 'in_flight', last_attempt = ?,
+                       claimed_by = ?, lease_expires_at = ? WHERE id = ?""",
+                    [(now, owner, lease_expires_at, row["id"]) for row in rows],
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+        return [dict(row, status="in_flight", last_attempt=now, claimed_by=owner,
+                     lease_expires_at=lease_expires_at) for row in rows]
+
+    def requeue_in_flight(self) -> int:
+        """Return records left 'in_flight' by a crashed worker to 'pending'."""
+        with self._lock:
+            with sqlite3.connect(self.db_path) as conn:
+                cursor = conn.execute(
+                    "UPDATE queue SET status = 'pending' WHERE status = 'in_flight'"
+                )
+                conn.commit()
+                return cursor.rowcount
+
     def mark_synced(self, queue_id: int, tx_hash: str):
         """Mark a record as successfully synced."""
         now = datetime.now(timezone.utc).isoformat()
@@ -123,6 +184,42 @@ class PersistentQueue:
                 )
                 conn.commit()
 
+    def mark_retry(self, queue_id: int, error: str, delay: float, count_attempt: bool = True):
+        """Return a record to 'pending', claimable again after `delay` seconds.
+
+        With count_attempt=False the record is only postponed (e.g. while a
+        circuit breaker is open) and sync_attempts is left unchanged.
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute(
+                    """UPDATE queue SET status = 'pending', last_attempt = ?,
+                       sync_attempts = sync_attempts + ?, error = ?,
+                       next_attempt_at = ?, claimed_by = NULL, lease_expires_at = NULL
+                       WHERE id = ?""",
+                    (now, int(count_attempt), error[:500], time.time() + delay, queue_id),
+                )
+                conn.commit()
+
+    def update_payload(self, queue_id: int, payload: dict):
+        """Replace a record's payload, e.g. to carry progress into its next attempt."""
+        with self._lock:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute("UPDATE queue SET payload_json = ? WHERE id = ?", (json.dumps(payload), queue_id))
+                conn.commit()
+
+    def next_due_in(self) -> float:
+        """Seconds until the earliest pending record is due (0 if one is due now, None if none)."""
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute(
+                """SELECT COUNT(*), MIN(COALESCE(next_attempt_at, 0))
+                   FROM queue WHERE status = 'pending'"""
+            ).fetchone()
+        if not row[0]:
+            return None
+        return max(0.0, row[1] - time.time())
+
     def retry_failed(self, max_attempts: int = 5) -> int:
         """Re-queue failed records that haven't exceeded max attempts."""
         with self._lock:
@@ -139,7 +236,7 @@ class PersistentQueue:
         """Get queue statistics."""
         with sqlite3.connect(self.db_path) as conn:
             stats = {}
-            for status in ["pending", "synced", "failed"]:
+            for status in ["pending", "in_flight", "synced", "failed"]:
                 count = conn.execute(
                     "SELECT COUNT(*) FROM queue WHERE status = ?", (status,)
                 ).fetchone()[0]
@@ -10,6 +10,7 @@ import base64
 import os
 from datetime import datetime, timezone
 
+from s4_canonical import canonical_json, canonical_sha256
 from s4_sdk import S4SDK
 
 BACKUP_VERSION = "2.0"
@@ -32,7 +33,7 @@ class S4LedgerBackup:
             "metadata": metadata or {},
             "records": records,
         }
-        raw_json = json.dumps(payload, sort_keys=True, default=str)
+        raw_json = canonical_json(payload, default=str)
         content_hash = hashlib.sha256(raw_json.encode()).hexdigest()
 
         if encrypt and self.sdk.cipher:
@@ -83,10 +84,35 @@ class S4LedgerBackup:
             "version": payload.get("version"),
         }
 
-    def verify_against_xrpl(self, record: dict, tx_hash: str) -> dict:
-        """Verify a record's hash matches what was anchored on XRPL."""
+    def verify_against_xrpl(self, record: dict, tx_hash: str, merkle_proof: list | dict | None = None) -> dict:
+        """Verify a record's hash matches what was anchored on XRPL.
+
+        Uses the SDK's memo index when one is attached and knows tx_hash;
+        otherwise falls back to the public explorer API. A BATCH_ANCHOR
+        transaction holds a Merkle root, which needs merkle_proof to check.
+        """
+        content_hash = canonical_sha256(record, default=str)
+        memo_index = getattr(self.sdk, "memo_index", None)
+        anchors = memo_index.lookup_tx(tx_hash) if memo_index is not None else []
+        anchored = [a["hash"] for a in anchors]
+        roots = [a["hash"] for a in anchors if a.get("record_type") == "BATCH_ANCHOR"]
+        if roots and content_hash not in anchored:
+            result = {"record_hash": content_hash, "xrpl_memo": roots[0], "merkle_root": roots[0],
+                      "tx_hash": tx_hash, "source": "memo_index"}
+            if not merkle_proof:
+                result.update(match=None, status="BATCH_ROOT_PROOF_REQUIRED")
+            else:
+                result["match"] = self.sdk.verify_inclusion(content_hash, merkle_proof, roots[0])
+            return result
+        if anchored:
+            return {
+                "record_hash": content_hash,
+                "xrpl_memo": content_hash if content_hash in anchored else anchored[0],
+                "match": content_hash in anchored,
+                "tx_hash": tx_hash,
+                "source": "memo_index",
+            }
         import requests
-        content_hash = hashlib.sha256(json.dumps(record, sort_keys=True, default=str).encode()).hexdigest()
         try:
             url = f"https://{'s.altnet.rippletest.net' if True else 'xrplcluster.com'}/api/v1/transactions/{tx_hash}"
             resp = requests.get(url, timeout=10)
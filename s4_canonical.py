@@ -0,0 +1,216 @@
+"""
+S4 Ledger — Canonical Record Hashing
+The one canonical form used for record hashes across the SDK, DLRS, backups,
+messaging, interop and the API: the exact bytes of
+json.dumps(obj, sort_keys=True) (optionally with default= / ensure_ascii=),
+UTF-8 encoded and SHA-256 hashed.
+
+The encoder writes into the hash object in blocks instead of building the
+whole document, and remembers the sorted key order and encoded key prefixes
+of each dict layout it sees, so repeated record schemas are not re-sorted.
+
+Usage:
+    from s4_canonical import canonical_json, canonical_sha256
+    canonical_sha256(row)                      # == sha256(json.dumps(row, sort_keys=True).encode())
+    canonical_sha256(snapshot, default=str)
+    canonical_json(message)                    # the text itself, when it must be stored or sent
+"""
+
+import hashlib
+import json
+from json.encoder import c_make_encoder, encode_basestring, encode_basestring_ascii
+
+STREAM_MIN = 64             # containers at least this long are streamed element by element
+LIST_BATCH = 256            # small list items / dict entries encoded together in one C call
+FLUSH_BYTES = 1 << 16       # buffered characters before writing to the hasher
+MAX_SCHEMAS = 4096          # cached dict layouts per encoder
+
+
+def _float_repr(o):
+    if o != o:
+        return "NaN"
+    if o == float("inf"):
+        return "Infinity"
+    if o == -float("inf"):
+        return "-Infinity"
+    return float.__repr__(o)
+
+
+def _key_text(key):
+    """A dict key as json.dumps writes it (before quoting)."""
+    if isinstance(key, str):
+        return key
+    if key is True:
+        return "true"
+    if key is False:
+        return "false"
+    if key is None:
+        return "null"
+    if isinstance(key, int):
+        return int.__repr__(key)
+    if isinstance(key, float):
+        return _float_repr(key)
+    raise TypeError(f"keys must be str, int, float, bool or None, not {key.__class__.__name__}")
+
+
+_CONTAINERS = frozenset((list, tuple, dict))
+
+
+def _is_large(o):
+    return isinstance(o, (list, tuple, dict)) and len(o) >= STREAM_MIN
+
+
+def _any_large(items):
+    """Whether any of items is a list, tuple or dict of STREAM_MIN or more entries."""
+    types = set(map(type, items))
+    if _CONTAINERS.isdisjoint(types):
+        return False
+    if _CONTAINERS.issuperset(types):
+        return max(map(len, items)) >= STREAM_MIN
+    return any(map(_is_large, items))
+
+
+def _streams(o):
+    """Whether o is worth walking here rather than encoding in one shot."""
+    if isinstance(o, dict):
+        return _any_large(o.values()) or (len(o) >= STREAM_MIN and not _CONTAINERS.isdisjoint(map(type, o.values())))
+    return isinstance(o, (list, tuple)) and len(o) >= STREAM_MIN
+
+
+def _one_shot_encoder(ensure_ascii, default):
+    """A reusable encode(obj) -> str equal to json.dumps(obj, sort_keys=True, ...)."""
+    base = json.JSONEncoder(sort_keys=True, ensure_ascii=ensure_ascii, default=default)
+    if c_make_encoder is None:
+        return base.encode
+    encode_str = encode_basestring_ascii if ensure_ascii else encode_basestring
+    # Built once instead of per call as JSONEncoder.encode does; without a
+    # markers dict a self-referencing object raises RecursionError rather
+    # than ValueError.
+    encode = c_make_encoder(None, base.default, encode_str, None, ": ", ", ", True, False, True)
+    return lambda o: "".join(encode(o, 0))
+
+
+class CanonicalEncoder:
+    """Writes the sort_keys JSON form of an object to a sink in blocks.
+
+    Output is byte-identical to json.dumps(obj, sort_keys=True,
+    ensure_ascii=..., default=...) with the default separators. Small
+    values go through one reusable C encoder; large lists and dicts (and
+    dicts holding them) are walked here, their small items encoded
+    LIST_BATCH at a time, so no single string holds the whole document.
+    The sorted key order and encoded "key": prefixes of each walked dict
+    layout are cached.
+    """
+
+    def __init__(self, ensure_ascii=True, default=None):
+        self._encode_str = encode_basestring_ascii if ensure_ascii else encode_basestring
+        self._encode_small = _one_shot_encoder(ensure_ascii, default)
+        self._default = default
+        self._schemas = {}      # tuple(dict keys, insertion order) -> [(key, '"key": '), ...] sorted
+
+    def _schema(self, keys):
+        schema = self._schemas.get(keys)
+        if schema is None:
+            if len(self._schemas) >= MAX_SCHEMAS:
+                self._schemas.clear()
+            schema = self._schemas[keys] = [(k, self._encode_str(k) + ": ") for k in sorted(keys)]
+        return schema
+
+    def _entries(self, o):
+        """(key, '"key": ', value) in sorted key order."""
+        keys = tuple(o)
+        if all(type(k) is str for k in keys):
+            return [(k, prefix, o[k]) for k, prefix in self._schema(keys)]
+        return [(k, self._encode_str(_key_text(k)) + ": ", v) for k, v in sorted(o.items())]
+
+    def encode(self, obj):
+        """The canonical text of obj."""
+        if not _streams(obj):
+            return self._encode_small(obj)
+        parts = []
+        self.encode_into(obj, parts.append)
+        return "".join(parts)
+
+    def encode_into(self, obj, write):
+        """Call write(str) with successive blocks of the canonical text."""
+        buf = []
+        size = 0
+        encode_small = self._encode_small
+
+        def emit(text):
+            nonlocal size
+            buf.append(text)
+            size += len(text)
+            if size >= FLUSH_BYTES:
+                write("".join(buf))
+                buf.clear()
+                size = 0
+
+        def encode(o):
+            if isinstance(o, (list, tuple)) and len(o) >= STREAM_MIN:
+                emit("[")
+                for start in range(0, len(o), LIST_BATCH):
+                    if start:
+                        emit(", ")
+                    batch = o[start:start + LIST_BATCH]
+                    if _any_large(batch):
+                        for i, item in enumerate(batch):
+                            if i:
+                                emit(", ")
+                            encode(item)
+                    else:
+                        emit(encode_small(list(batch))[1:-1])
+                emit("]")
+            elif isinstance(o, dict) and _streams(o):
+                emit("{")
+                entries = self._entries(o)
+                for start in range(0, len(entries), LIST_BATCH):
+                    if start:
+                        emit(", ")
+                    batch = entries[start:start + LIST_BATCH]
+                    if _any_large([value for _, _, value in batch]):
+                        for i, (_, prefix, value) in enumerate(batch):
+                            emit(", " + prefix if i else prefix)
+                            encode(value)
+                    else:
+                        emit(encode_small({key: value for key, _, value in batch})[1:-1])
+                emit("}")
+            elif self._default is not None and not isinstance(o, (str, int, float, list, tuple, dict, type(None))):
+                encode(self._default(o))
+            else:
+                emit(encode_small(o))
+
+        encode(obj)
+        if buf:
+            write("".join(buf))
+
+
+_encoders = {}
+
+
+def _encoder(default, ensure_ascii):
+    key = (default, bool(ensure_ascii))
+    encoder = _encoders.get(key)
+    if encoder is None:
+        encoder = _encoders[key] = CanonicalEncoder(ensure_ascii=ensure_ascii, default=default)
+    return encoder
+
+
+def canonical_json(obj, default=None, ensure_ascii=True):
+    """The canonical text: json.dumps(obj, sort_keys=True, ...)."""
+    return _encoder(default, ensure_ascii).encode(obj)
+
+
+def canonical_hash(obj, default=None, ensure_ascii=True, hasher=None):
+    """Feed the canonical UTF-8 bytes of obj into hasher (a new sha256 by default) and return it."""
+    hasher = hasher if hasher is not None else hashlib.sha256()
+    update = hasher.update
+    _encoder(default, ensure_ascii).encode_into(obj, lambda text: update(text.encode("utf-8")))
+    return hasher
+
+
+def canonical_sha256(obj, default=None, ensure_ascii=True):
+    """Hex SHA-256 of the canonical form of obj."""
+    if _streams(obj):
+        return canonical_hash(obj, default, ensure_ascii).hexdigest()
+    return hashlib.sha256(_encoder(default, ensure_ascii)._encode_small(obj).encode("utf-8")).hexdigest()
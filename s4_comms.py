@@ -8,6 +8,7 @@ import json
 import time
 import uuid
 from datetime import datetime, timezone
+from s4_canonical import canonical_json
 from s4_sdk import S4SDK
 
 # ─── Message Types ────────────────────────────────────────────────────────────
@@ -50,12 +51,12 @@ class S4LedgerMessenger:
             raise ValueError(f"Invalid priority: {priority}")
 
         msg_id = f"MSG-{uuid.uuid4().hex[:12].upper()}"
-        content = json.dumps({
+        content = canonical_json({
             "id": msg_id, "type": message_type, "subject": subject,
             "body": body, "sender": sender, "recipients": recipients,
             "priority": priority, "classification": classification,
             "reference": reference,
-        }, sort_keys=True)
+        })
 
         msg_hash = hashlib.sha256(content.encode()).hexdigest()
         tx_hash = None
@@ -10,6 +10,7 @@ import time
 import uuid
 from datetime import datetime, timezone
 
+from s4_canonical import canonical_sha256
 from s4_sdk import S4SDK
 
 # ─── Defense Record Types ─────────────────────────────────────────────────────
@@ -262,7 +263,7 @@ class S4LedgerDLRS:
                 "record_count": len(recs),
                 "latest_hash": recs[-1]["hash"] if recs else None,
             }
-        baseline_hash = hashlib.sha256(json.dumps(snapshot, sort_keys=True, default=str).encode()).hexdigest()
+        baseline_hash = canonical_sha256(snapshot, default=str)
         self.baselines[bl_id] = {
             "baseline_id": bl_id,
             "name": name,
@@ -279,7 +280,7 @@ class S4LedgerDLRS:
         bl = self.baselines.get(baseline_id)
         if not bl:
             raise DLRSRecordNotFound(f"Baseline not found: {baseline_id}")
-        current_hash = hashlib.sha256(json.dumps(bl["snapshot"], sort_keys=True, default=str).encode()).hexdigest()
+        current_hash = canonical_sha256(bl["snapshot"], default=str)
         return {"match": current_hash == bl["hash"], "stored": bl["hash"], "current": current_hash}
 
     # ── Integrity Verification ─────────────────────────────────────────────────
@@ -0,0 +1,210 @@
+"""
+S4 Ledger — XRPL Anchor Memo Index
+Local SQLite index of the `s4/anchor` memos written by the issuer account, so
+records can be verified against the chain without an explorer round-trip.
+
+Usage:
+    index = S4MemoIndex("anchors.db", account="r95GyZac4butvVcsTWUPpxzekmyzaHsTA5",
+                        rpc_url="https://s.altnet.rippletest.net:51234/")
+    index.refresh()                      # pages account_tx from the last indexed ledger
+    index.lookup_hash(record_hash)       # -> [{tx_hash, ledger_index, ...}]
+    index.lookup_tx(tx_hash)             # -> [{hash, record_type, ...}]
+"""
+
+import json
+import sqlite3
+import threading
+import urllib.request
+from datetime import datetime, timezone
+
+ANCHOR_MEMO_TYPE = "s4/anchor"
+
+
+def decode_anchor_memos(tx: dict) -> list[dict]:
+    """Return the decoded `s4/anchor` memo payloads of a transaction.
+
+    Memo fields are hex-encoded; the anchor payload is the JSON written by the
+    API ({"hash", "type", "branch", "platform", "ts"}). Memos of other types
+    and payloads that cannot be decoded are skipped.
+    """
+    anchors = []
+    for wrapper in tx.get("Memos") or []:
+        memo = wrapper.get("Memo", {})
+        try:
+            memo_type = bytes.fromhex(memo.get("MemoType", "")).decode("utf-8")
+            if memo_type != ANCHOR_MEMO_TYPE:
+                continue
+            payload = json.loads(bytes.fromhex(memo.get("MemoData", "")).decode("utf-8"))
+        except (ValueError, UnicodeDecodeError):
+            continue
+        if isinstance(payload, dict) and payload.get("hash"):
+            anchors.append(payload)
+    return anchors
+
+
+class S4MemoIndex:
+    """SQLite index of on-chain anchors, keyed by record hash and tx hash."""
+
+    def __init__(self, db_path: str, account: str, rpc_url: str = "https://s1.ripple.com:51234/",
+                 page_size: int = 200, timeout: float = 20):
+        self.db_path = db_path
+        self.account = account
+        self.rpc_url = rpc_url
+        self.page_size = page_size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._init_db()
+
+    def _init_db(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS anchors (
+                    tx_hash TEXT NOT NULL,
+                    hash TEXT NOT NULL,
+                    account TEXT NOT NULL,
+                    ledger_index INTEGER NOT NULL,
+                    record_type TEXT,
+                    branch TEXT,
+                    anchored_at TEXT,
+                    PRIMARY KEY (tx_hash, hash)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_anchors_hash ON anchors(hash)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS index_state (
+                    account TEXT PRIMARY KEY,
+                    last_ledger INTEGER NOT NULL,
+                    refreshed_at TEXT
+                )
+            """)
+            conn.commit()
+
+    # ── JSON-RPC ────────────────────────────────────────────────────
+
+    def _rpc(self, method: str, params: dict) -> dict:
+        body = json.dumps({"method": method, "params": [params]}).encode()
+        req = urllib.request.Request(self.rpc_url, data=body, method="POST",
+                                     headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            result = json.loads(resp.read()).get("result", {})
+        if result.get("status") == "error":
+            raise RuntimeError(f"{method} failed: {result.get('error_message') or result.get('error')}")
+        return result
+
+    # ── Indexing ────────────────────────────────────────────────────
+
+    def last_ledger(self) -> int | None:
+        """Highest ledger index fully scanned for this account, or None before the first refresh."""
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute("SELECT last_ledger FROM index_state WHERE account = ?",
+                               (self.account,)).fetchone()
+        return row[0] if row else None
+
+    def refresh(self, max_pages: int | None = None) -> dict:
+        """Index anchors validated since the last refresh.
+
+        Pages through account_tx (oldest first) from the ledger after the last
+        one scanned. Each page is written in one transaction and the marker is
+        followed until the server stops returning one; only then does the
+        checkpoint advance, so an interrupted refresh is simply repeated.
+        """
+        last = self.last_ledger()
+        params = {
+            "account": self.account,
+            "ledger_index_min": -1 if last is None else last + 1,
+            "ledger_index_max": -1,
+            "forward": True,
+            "limit": self.page_size,
+        }
+        stats = {"pages": 0, "transactions": 0, "anchors": 0, "from_ledger": params["ledger_index_min"]}
+        scanned_to = last
+        while True:
+            result = self._rpc("account_tx", params)
+            stats["pages"] += 1
+            rows = []
+            for entry in result.get("transactions", []):
+                if not entry.get("validated", True):
+                    continue
+                stats["transactions"] += 1
+                rows.extend(self._anchor_rows(entry))
+                tx = entry.get("tx") or entry.get("tx_json") or {}
+                ledger_index = tx.get("ledger_index") or entry.get("ledger_index")
+                if ledger_index:
+                    scanned_to = max(scanned_to or 0, ledger_index)
+            self._store(rows)
+            stats["anchors"] += len(rows)
+            if result.get("ledger_index_max") is not None:
+                scanned_to = max(scanned_to or 0, result["ledger_index_max"])
+            marker = result.get("marker")
+            if marker is None:
+                break
+            if max_pages is not None and stats["pages"] >= max_pages:
+                stats["complete"] = False
+                return stats
+            params["marker"] = marker
+        if scanned_to is not None:
+            self._checkpoint(scanned_to)
+        stats["complete"] = True
+        stats["last_ledger"] = scanned_to
+        return stats
+
+    def _anchor_rows(self, entry: dict) -> list[tuple]:
+        # API v1 nests the transaction under "tx"; API v2 uses "tx_json" with hash/ledger_index beside it
+        tx = entry.get("tx") or entry.get("tx_json") or {}
+        meta = entry.get("meta") or {}
+        if isinstance(meta, dict) and meta.get("TransactionResult", "tesSUCCESS") != "tesSUCCESS":
+            return []
+        tx_hash = tx.get("hash") or entry.get("hash")
+        ledger_index = tx.get("ledger_index") or entry.get("ledger_index") or 0
+        account = tx.get("Account", self.account)
+        return [(tx_hash.upper(), memo["hash"].lower(), account, ledger_index,
+                 memo.get("type", ""), memo.get("branch", ""), memo.get("ts"))
+                for memo in decode_anchor_memos(tx) if tx_hash]
+
+    def _store(self, rows: list[tuple]):
+        if not rows:
+            return
+        with self._lock:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.executemany(
+                    """INSERT OR IGNORE INTO anchors
+                       (tx_hash, hash, account, ledger_index, record_type, branch, anchored_at)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                    rows,
+                )
+                conn.commit()
+
+    def _checkpoint(self, ledger_index: int):
+        now = datetime.now(timezone.utc).isoformat()
+        with self._lock:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute(
+                    """INSERT INTO index_state (account, last_ledger, refreshed_at) VALUES (?, ?, ?)
+                       ON CONFLICT(account) DO UPDATE SET last_ledger = excluded.last_ledger,
+                       refreshed_at = excluded.refreshed_at""",
+                    (self.account, ledger_index, now),
+                )
+                conn.commit()
+
+    # ── Lookups ─────────────────────────────────────────────────────
+
+    def _query(self, where: str, value: str) -> list[dict]:
+        with sqlite3.connect(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute(
+                f"SELECT * FROM anchors WHERE {where} = ? ORDER BY ledger_index ASC", (value,)
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def lookup_hash(self, record_hash: str) -> list[dict]:
+        """Every indexed anchor of a record hash, oldest first."""
+        return self._query("hash", record_hash.lower())
+
+    def lookup_tx(self, tx_hash: str) -> list[dict]:
+        """The anchors carried by one transaction (usually exactly one)."""
+        return self._query("tx_hash", tx_hash.upper())
+
+    def get_stats(self) -> dict:
+        with sqlite3.connect(self.db_path) as conn:
+            anchors, txs = conn.execute("SELECT COUNT(*), COUNT(DISTINCT tx_hash) FROM anchors").fetchone()
+        return {"account": self.account, "anchors": anchors, "transactions": txs, "last_ledger": self.last_ledger()}
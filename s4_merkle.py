@@ -0,0 +1,88 @@
+"""
+S4 Ledger — Merkle Trees and Chunked Digests
+The one tree layout used by the API's batch anchors, the SDK's batch imports
+and chunked file hashing: leaves and nodes are hex SHA-256 strings, a parent
+is sha256(left_hex + right_hex), and an odd layer duplicates its last node.
+A proof is the sibling path from a leaf to the root, each step
+{"hash": sibling_hex, "position": "left" | "right"} (the sibling's side).
+
+Usage:
+    from s4_merkle import merkle_levels, merkle_proof, verify_proof, digest_blocks
+    levels = merkle_levels(leaf_hashes)        # leaves first, [root] last
+    proof = merkle_proof(levels, 3)
+    verify_proof(leaf_hashes[3], proof, levels[-1][0])
+    file_hash, size, leaves = digest_blocks(blocks, chunk_size=1 << 20)
+"""
+
+import hashlib
+import hmac
+
+EMPTY_ROOT = hashlib.sha256(b"empty").hexdigest()   # root of a tree with no leaves
+
+
+def merkle_levels(hashes):
+    """Every layer of the tree, leaves first and [root] last."""
+    if not hashes:
+        return [[EMPTY_ROOT]]
+    levels = [list(hashes)]
+    while len(levels[-1]) > 1:
+        layer = levels[-1]
+        if len(layer) % 2 == 1:
+            layer = layer + [layer[-1]]  # Duplicate last for odd count
+        levels.append([hashlib.sha256((layer[i] + layer[i + 1]).encode()).hexdigest()
+                       for i in range(0, len(layer), 2)])
+    return levels
+
+
+def merkle_root(hashes):
+    """Merkle root of a list of hex hashes."""
+    return merkle_levels(hashes)[-1][0]
+
+
+def merkle_proof(levels, index):
+    """Sibling path for leaf `index` of merkle_levels() output."""
+    proof = []
+    for layer in levels[:-1]:
+        sibling = index ^ 1
+        sibling_hash = layer[sibling] if sibling < len(layer) else layer[index]
+        proof.append({"hash": sibling_hash, "position": "right" if index % 2 == 0 else "left"})
+        index //= 2
+    return proof
+
+
+def verify_proof(leaf, proof, root):
+    """True if walking `proof` up from `leaf` recomputes `root`; a step with
+    an unknown position fails the proof."""
+    node = leaf
+    for step in proof:
+        if step.get("position") == "left":
+            node = hashlib.sha256((step["hash"] + node).encode()).hexdigest()
+        elif step.get("position") == "right":
+            node = hashlib.sha256((node + step["hash"]).encode()).hexdigest()
+        else:
+            return False
+    return hmac.compare_digest(node, root)
+
+
+def digest_blocks(blocks, chunk_size=0):
+    """(hex SHA-256, size, chunk leaf hashes) over byte blocks. With a
+    chunk_size, every chunk_size bytes are also hashed on their own to give
+    the leaves of a chunk-level Merkle tree."""
+    digest = hashlib.sha256()
+    size = 0
+    leaves = []
+    chunk, fill = hashlib.sha256(), 0
+    for block in blocks:
+        digest.update(block)
+        size += len(block)
+        while chunk_size and block:
+            take = min(chunk_size - fill, len(block))
+            chunk.update(block[:take])
+            fill += take
+            block = block[take:]
+            if fill == chunk_size:
+                leaves.append(chunk.hexdigest())
+                chunk, fill = hashlib.sha256(), 0
+    if fill:
+        leaves.append(chunk.hexdigest())
+    return digest.hexdigest(), size, leaves
@@ -1,6 +1,19 @@
 import hashlib
+import hmac
+import io
 import json
+import mmap
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
 from datetime import datetime, timezone
+
+from s4_canonical import canonical_json, canonical_sha256
+# Batch-import trees and chunked file hashing use the API's layout (one shared module)
+from s4_merkle import (digest_blocks as _digest_blocks, merkle_levels as _merkle_levels,
+                       merkle_proof as _merkle_proof, verify_proof)
 try:
     from cryptography.fernet import Fernet
 except Exception:
@@ -78,6 +91,240 @@ def real_fiat_to_sls_conversion(client, wallet, usd_amount, sls_issuer, gateway_
     response = submit_and_wait(payment_tx, client, wallet)
     return response.result
 
+# Streaming import sources: file paths, binary streams or text streams
+@contextmanager
+def _open_import_source(source, binary=False, encoding="utf-8"):
+    """Yield a file object for `source` without loading it. Paths are opened
+    (and closed) here; caller-owned streams are left open."""
+    if isinstance(source, (str, bytes, os.PathLike)):
+        fp = open(source, "rb") if binary else open(source, "r", encoding=encoding, newline="")
+        with fp:
+            yield fp
+        return
+    is_binary = isinstance(source.read(0), bytes)
+    if binary or not is_binary:
+        yield source
+        return
+    wrapper = io.TextIOWrapper(source, encoding=encoding, newline="")
+    try:
+        yield wrapper
+    finally:
+        wrapper.detach()
+
+
+class _JSONStream:
+    """Incremental reader over a text stream of JSON: decodes one value at a
+    time with raw_decode, refilling a bounded buffer as needed."""
+
+    def __init__(self, fp, chunk_size=1 << 16):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        if self.pos > self.chunk_size:
+            self.buf, self.pos = self.buf[self.pos:], 0
+        data = self.fp.read(self.chunk_size)
+        if not data:
+            self.eof = True
+        self.buf += data
+        return bool(data)
+
+    def peek(self):
+        """Next non-whitespace character ('' at end of input)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf) or not self._fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f"Malformed JSON: expected {char!r} at offset {self.pos}")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete JSON value."""
+        self.peek()
+        decoder = json.JSONDecoder()
+        while True:
+            try:
+                obj, end = decoder.raw_decode(self.buf, self.pos)
+                # A number may continue past the buffer ("12" of "123")
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def items(self):
+        """Yield the elements of the array starting at the cursor."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            sep = self.peek()
+            self.pos += 1
+            if sep == "]":
+                return
+            if sep != ",":
+                raise ValueError(f"Malformed JSON array at offset {self.pos}")
+
+
+def _iter_xml_rows(fp, row_tag=None):
+    """Yield the field dict of each row element, pruning the tree behind it.
+
+    Without row_tag the row tag is the first tag that repeats among the
+    root's children, so leading header elements are skipped; the children
+    read before the repeat are held until then. A root with one child
+    yields that child, and several children that never repeat a tag raise
+    ValueError rather than guess.
+    """
+    import xml.etree.ElementTree as ET
+
+    def fields(row):
+        return {child.tag: child.text or "" for child in row} or dict(row.attrib)
+
+    stack = []
+    open_rows = 0
+    elem = None
+    seen = set()
+    for event, elem in ET.iterparse(fp, events=("start", "end")):
+        if event == "start":
+            if row_tag is None and len(stack) == 1:
+                if elem.tag in seen:
+                    row_tag = elem.tag
+                    # Every child before this one is complete: emit the rows, drop the rest.
+                    # (Parser read-ahead may already have attached later children.)
+                    for held in list(stack[0]):
+                        if held is elem:
+                            break
+                        if held.tag == row_tag:
+                            yield fields(held)
+                        stack[0].remove(held)
+                seen.add(elem.tag)
+            if elem.tag == row_tag:
+                open_rows += 1
+            stack.append(elem)
+            continue
+        stack.pop()
+        if not stack:
+            break
+        if row_tag is None:
+            continue  # still inferring the row tag: keep the root's children intact
+        if elem.tag == row_tag:
+            open_rows -= 1
+            yield fields(elem)
+        if not open_rows:
+            # Finished rows and the elements between them are not needed again
+            stack[-1].remove(elem)
+    if row_tag is None and elem is not None:
+        children = list(elem)
+        if len(children) > 1:
+            raise ValueError(f"Cannot infer the XML row tag: no tag repeats under <{elem.tag}>; pass row_tag")
+        # One child is the record; no child elements: the root itself is the record
+        yield fields(children[0]) if children else dict(elem.attrib)
+
+
+def _iter_json_items(stream, records_key=None):
+    """Yield the records of a JSON document read through a _JSONStream."""
+    if stream.peek() == "[":
+        yield from stream.items()
+        return
+    if stream.peek() != "{":
+        yield stream.value()
+        return
+    stream.expect("{")
+    fields = {}
+    found = False
+    while stream.peek() not in ("}", ""):
+        key = stream.value()
+        stream.expect(":")
+        wanted = key == records_key if records_key else not found
+        if wanted and stream.peek() == "[":
+            fields[key] = []
+            for item in stream.items():
+                found = True
+                yield item
+        elif records_key:
+            stream.value()
+        else:
+            fields[key] = stream.value()
+        if stream.peek() == ",":
+            stream.pos += 1
+    stream.expect("}")
+    if records_key and records_key not in fields:
+        raise ValueError(f"Records key not found: {records_key}")
+    if not found and not records_key:
+        yield fields
+
+
+# Parallel record hashing (import workers=)
+def _hash_row_chunk(rows):
+    """Record hashes for a chunk of rows; runs in a worker process or thread."""
+    return [canonical_sha256(row) for row in rows]
+
+
+def _parallel_row_hashes(rows, workers, pool="process", chunk_size=2000):
+    """Yield (row, hash) in input order, hashing chunks on a pool of workers.
+    At most 2 * workers chunks are in flight, so a streamed source is still
+    read incrementally."""
+    if pool not in ("process", "thread"):
+        raise ValueError("pool must be 'process' or 'thread'")
+    executor_cls = ProcessPoolExecutor if pool == "process" else ThreadPoolExecutor
+    rows = iter(rows)
+    in_flight = deque()
+    with executor_cls(max_workers=workers) as executor:
+        while True:
+            while len(in_flight) < workers * 2:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+                in_flight.append((chunk, executor.submit(_hash_row_chunk, chunk)))
+            if not in_flight:
+                return
+            chunk, future = in_flight.popleft()
+            yield from zip(chunk, future.result())
+
+
+# Local file hashing (hash_path) — block and chunk layout of POST /api/hash/file
+@contextmanager
+def _file_blocks(source, block_size):
+    """Byte blocks of a file: memoryview slices of an mmap for a non-empty
+    regular file path, otherwise views of one reusable readinto() buffer
+    (pipes, empty files, binary file objects read from their position)."""
+    if not isinstance(source, (str, bytes, os.PathLike)):
+        yield _readinto_blocks(source, block_size)
+        return
+    with open(source, "rb") as fp:
+        try:
+            mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):       # empty file, pipe, special file
+            yield _readinto_blocks(fp, block_size)
+            return
+        view = memoryview(mm)
+        try:
+            yield (view[i:i + block_size] for i in range(0, len(view), block_size))
+        finally:
+            view.release()
+            mm.close()
+
+
+def _readinto_blocks(fp, block_size):
+    view = memoryview(bytearray(block_size))
+    while True:
+        n = fp.readinto(view)
+        if not n:
+            return
+        yield view[:n]
+
+
 class S4SDK:
     def encrypt(self, data):
         """Encrypt data using the SDK's encryption key."""
@@ -87,18 +334,21 @@ class S4SDK:
         """Decrypt data using the SDK's encryption key."""
         return self.decrypt_data(encrypted_data)
 
-    def __init__(self, xrpl_rpc_url=None, sls_issuer="r95GyZac4butvVcsTWUPpxzekmyzaHsTA5", encryption_key=None, api_key=None, wallet_seed=None, testnet=False, treasury_account="rMLmkrxpadq5z6oTDmq8GhQj9LKjf1KLqJ"):
+    def __init__(self, xrpl_rpc_url=None, sls_issuer="r95GyZac4butvVcsTWUPpxzekmyzaHsTA5", encryption_key=None, api_key=None, wallet_seed=None, testnet=False, treasury_account="rMLmkrxpadq5z6oTDmq8GhQj9LKjf1KLqJ", memo_index=None):
         """
         Initialize the SDK.
         - xrpl_rpc_url: XRPL testnet/mainnet URL.
         - sls_issuer: Your $SLS issuer account.
         - encryption_key: Secret key for encrypting sensitive data.
         - api_key: Provider's subscription API key (for USD-based access).
+        - memo_index: Optional S4MemoIndex used by verify_against_chain() for local lookups.
         """
         # Choose default URL based on testnet flag when not explicitly provided
         if xrpl_rpc_url is None:
             xrpl_rpc_url = "https://s.altnet.rippletest.net:51234/" if testnet else "https://s1.ripple.com:51234/"
         self.client = JsonRpcClient(xrpl_rpc_url)
+        self.xrpl_rpc_url = xrpl_rpc_url
+        self.memo_index = memo_index
         self.sls_issuer = sls_issuer
         self.treasury_account = treasury_account
         self.api_key = api_key  # For subscription validation
@@ -442,20 +692,39 @@ class S4SDK:
     #  RECORD VERIFICATION — Compare current data against on-chain hash
     # ═══════════════════════════════════════════════════════════════════
 
-    def verify_against_chain(self, record_text, tx_hash=None, expected_hash=None):
+    def open_memo_index(self, db_path, account=None, refresh=True):
+        """Attach a local S4MemoIndex of the issuer's anchors (optionally refreshing it).
+
+        Once attached, verify_against_chain() resolves tx hashes and record
+        hashes from the SQLite index instead of returning NOT_FOUND.
+        """
+        from s4_memo_index import S4MemoIndex
+        self.memo_index = S4MemoIndex(db_path, account=account or self.sls_issuer, rpc_url=self.xrpl_rpc_url)
+        if refresh:
+            self.memo_index.refresh()
+        return self.memo_index
+
+    def verify_against_chain(self, record_text, tx_hash=None, expected_hash=None, merkle_proof=None):
         """Verify record integrity against on-chain XRPL hash.
 
         Recomputes SHA-256 of record_text and compares against the hash stored
         in the XRPL transaction memo. Returns structured verification result.
+        With a memo index attached (see open_memo_index), tx_hash is resolved
+        locally, and a record without tx_hash is looked up by its hash.
+        When tx_hash is a BATCH_ANCHOR its memo holds a Merkle root, so the
+        record is checked with merkle_proof instead of compared directly.
 
         Args:
             record_text: The current record content to verify
             tx_hash: XRPL transaction hash to look up (optional)
             expected_hash: Direct hash to compare against (optional)
+            merkle_proof: Sibling path (or get_batch_proof() response) for a
+                          record anchored through a batch (optional)
 
         Returns:
-            dict with verified (bool), status (MATCH/MISMATCH/NOT_FOUND),
-            computed_hash, chain_hash, tamper_detected, etc.
+            dict with verified (bool), status (MATCH/MISMATCH/NOT_FOUND/
+            BATCH_ROOT_PROOF_REQUIRED), computed_hash, chain_hash,
+            tamper_detected, etc.
         """
         computed_hash = self.create_record_hash(record_text)
         now = datetime.now(timezone.utc).isoformat()
@@ -466,10 +735,20 @@ class S4SDK:
         if expected_hash:
             chain_hash = expected_hash
         elif tx_hash:
-            # In production: query XRPL node for tx memo data
-            # xrpl.models.requests.Tx(transaction=tx_hash)
-            # Parse memo_data field → hex_decode → extract hash
-            chain_hash = None  # Would be populated from XRPL lookup
+            if self.memo_index is not None:
+                anchors = self.memo_index.lookup_tx(tx_hash)
+                chain_hashes = [a["hash"] for a in anchors]
+                roots = [a["hash"] for a in anchors if a.get("record_type") == "BATCH_ANCHOR"]
+                if computed_hash in chain_hashes:
+                    chain_hash = computed_hash
+                elif roots:
+                    return self._verify_batch_member(computed_hash, roots[0], merkle_proof, tx_hash, now)
+                elif chain_hashes:
+                    chain_hash = chain_hashes[0]
+        elif self.memo_index is not None:
+            anchors = self.memo_index.lookup_hash(computed_hash)
+            if anchors:
+                chain_hash, tx_hash = computed_hash, anchors[0]["tx_hash"]
 
         if chain_hash is None and tx_hash:
             return {
@@ -491,7 +770,8 @@ class S4SDK:
                 "chain_hash": None,
                 "verified_at": now,
                 "tamper_detected": False,
-                "message": "No chain_hash or expected_hash provided for comparison.",
+                "message": "No anchor for this record in the local memo index." if self.memo_index is not None
+                           else "No chain_hash or expected_hash provided for comparison.",
             }
 
         match = computed_hash == chain_hash
@@ -508,6 +788,31 @@ class S4SDK:
                        else f"TAMPER DETECTED: computed {computed_hash[:16]}... ≠ chain {chain_hash[:16]}...",
         }
 
+    def _verify_batch_member(self, computed_hash, merkle_root, merkle_proof, tx_hash, now):
+        """Verify a record against the Merkle root anchored by a BATCH_ANCHOR transaction."""
+        result = {
+            "computed_hash": computed_hash,
+            "chain_hash": merkle_root,
+            "merkle_root": merkle_root,
+            "tx_hash": tx_hash,
+            "verified_at": now,
+            "explorer_url": f"https://livenet.xrpl.org/transactions/{tx_hash}",
+        }
+        if not merkle_proof:
+            result.update(
+                verified=False, status="BATCH_ROOT_PROOF_REQUIRED", tamper_detected=False,
+                message=f"Transaction {tx_hash} anchors a batch Merkle root. "
+                        "Pass merkle_proof (see get_batch_proof) to verify the record.",
+            )
+            return result
+        included = self.verify_inclusion(computed_hash, merkle_proof, merkle_root)
+        result.update(
+            verified=included, status="MATCH" if included else "MISMATCH", tamper_detected=not included,
+            message="Record integrity confirmed — included under the anchored batch root." if included
+                    else f"TAMPER DETECTED: {computed_hash[:16]}... is not included under root {merkle_root[:16]}...",
+        )
+        return result
+
     def correct_record(self, corrected_text, original_tx_hash, wallet_seed=None,
                         reason="", record_type=None):
         """Re-anchor a corrected record with a link to the original (supersedes).
@@ -760,7 +1065,7 @@ class S4SDK:
             "total": len(self.DOD_SYSTEMS),
         }
 
-    def import_csv(self, csv_text, source_system, record_type=None, delimiter=","):
+    def import_csv(self, csv_text, source_system, record_type=None, delimiter=",", workers=None, pool="process"):
         """Import records from CSV data exported from a DoD system.
 
         Args:
@@ -768,6 +1073,8 @@ class S4SDK:
             source_system: Key from DOD_SYSTEMS (e.g., 'nserc_ide', 'cdmd_oa')
             record_type: Override record type (auto-detected from source if omitted)
             delimiter: CSV delimiter (default comma)
+            workers: Hash rows on this many processes (or threads, see pool); serial if omitted
+            pool: 'process' (default) or 'thread' — threads only pay off for very large rows
 
         Returns:
             dict with imported records count, hashes, and mapping summary
@@ -783,18 +1090,8 @@ class S4SDK:
             record_type = sys_info["record_types"][0] if sys_info.get("record_types") else "IMPORTED_RECORD"
 
         reader = csv.DictReader(io.StringIO(csv_text), delimiter=delimiter)
-        records = []
-        for row in reader:
-            record_json = json.dumps(row, sort_keys=True)
-            record_hash = self.create_record_hash(record_json)
-            records.append({
-                "data": dict(row),
-                "hash": record_hash,
-                "record_type": record_type,
-                "source_system": source_system,
-                "source_name": sys_info["name"],
-                "import_timestamp": datetime.now(timezone.utc).isoformat(),
-            })
+        records = [self._imported_record(row, record_hash, record_type, source_system, sys_info)
+                   for row, record_hash in self._hash_rows(reader, workers, pool)]
 
         return {
             "imported": len(records),
@@ -805,7 +1102,7 @@ class S4SDK:
             "fields_mapped": list(reader.fieldnames) if reader.fieldnames else [],
         }
 
-    def import_xml(self, xml_text, source_system, record_type=None, row_tag=None):
+    def import_xml(self, xml_text, source_system, record_type=None, row_tag=None, workers=None, pool="process"):
         """Import records from XML data exported from a DoD system.
 
         Args:
@@ -813,6 +1110,8 @@ class S4SDK:
             source_system: Key from DOD_SYSTEMS
             record_type: Override record type
             row_tag: XML tag name for each record element (auto-detected if omitted)
+            workers: Parallel hashing workers (see import_csv)
+            pool: 'process' or 'thread'
 
         Returns:
             dict with imported records count, hashes, and mapping summary
@@ -842,7 +1141,7 @@ class S4SDK:
             else:
                 elements = [root]
 
-        records = []
+        rows = []
         for elem in elements:
             row_data = {}
             for child in elem:
@@ -850,16 +1149,9 @@ class S4SDK:
             if not row_data:
                 # Handle attributes
                 row_data = dict(elem.attrib)
-            record_json = json.dumps(row_data, sort_keys=True)
-            record_hash = self.create_record_hash(record_json)
-            records.append({
-                "data": row_data,
-                "hash": record_hash,
-                "record_type": record_type,
-                "source_system": source_system,
-                "source_name": sys_info["name"],
-                "import_timestamp": datetime.now(timezone.utc).isoformat(),
-            })
+            rows.append(row_data)
+        records = [self._imported_record(row, record_hash, record_type, source_system, sys_info)
+                   for row, record_hash in self._hash_rows(rows, workers, pool)]
 
         return {
             "imported": len(records),
@@ -869,7 +1161,7 @@ class S4SDK:
             "records": records,
         }
 
-    def import_json(self, json_text, source_system, record_type=None, records_key=None):
+    def import_json(self, json_text, source_system, record_type=None, records_key=None, workers=None, pool="process"):
         """Import records from JSON data exported from a DoD system.
 
         Args:
@@ -877,6 +1169,8 @@ class S4SDK:
             source_system: Key from DOD_SYSTEMS
             record_type: Override record type
             records_key: JSON key containing the array of records (auto-detected if omitted)
+            workers: Parallel hashing workers (see import_csv)
+            pool: 'process' or 'thread'
 
         Returns:
             dict with imported records count, hashes, and mapping summary
@@ -905,18 +1199,8 @@ class S4SDK:
             if items is None:
                 items = [data]  # Treat whole object as single record
 
-        records = []
-        for item in items:
-            record_json = json.dumps(item, sort_keys=True)
-            record_hash = self.create_record_hash(record_json)
-            records.append({
-                "data": item,
-                "hash": record_hash,
-                "record_type": record_type,
-                "source_system": source_system,
-                "source_name": sys_info["name"],
-                "import_timestamp": datetime.now(timezone.utc).isoformat(),
-            })
+        records = [self._imported_record(item, record_hash, record_type, source_system, sys_info)
+                   for item, record_hash in self._hash_rows(items, workers, pool)]
 
         return {
             "imported": len(records),
@@ -926,11 +1210,122 @@ class S4SDK:
             "records": records,
         }
 
+    def _hash_rows(self, rows, workers=None, pool="process"):
+        """Yield (row, record hash) in input order, hashing the canonical JSON
+        of each row on the calling thread or, with workers > 1, in a pool."""
+        if not workers or workers <= 1:
+            for row in rows:
+                yield row, canonical_sha256(row)
+            return
+        yield from _parallel_row_hashes(rows, workers, pool)
+
+    def _imported_record(self, data, record_hash, record_type, source_system, sys_info):
+        return {
+            "data": data,
+            "hash": record_hash,
+            "record_type": record_type,
+            "source_system": source_system,
+            "source_name": sys_info["name"],
+            "import_timestamp": datetime.now(timezone.utc).isoformat(),
+        }
+
+    def _import_target(self, source_system, record_type):
+        sys_info = self.DOD_SYSTEMS.get(source_system, {})
+        if not sys_info:
+            raise ValueError(f"Unknown source system: {source_system}. Use list_dod_systems() to see supported systems.")
+        if record_type is None:
+            record_type = sys_info["record_types"][0] if sys_info.get("record_types") else "IMPORTED_RECORD"
+        return sys_info, record_type
+
+    # ── Streaming importers ─────────────────────────────────────────
+    # Same records and hashes as import_csv/xml/json, one at a time, from a
+    # file path or a binary/text stream; memory stays bounded by one row
+    # (or by the in-flight chunks when hashing with workers).
+
+    def iter_import_csv(self, source, source_system, record_type=None, delimiter=",", encoding="utf-8",
+                        workers=None, pool="process"):
+        """Yield imported CSV records one at a time.
+
+        Args:
+            source: Path to the CSV file, or an open binary/text stream
+            source_system: Key from DOD_SYSTEMS
+            record_type: Override record type
+            delimiter: CSV delimiter (default comma)
+            encoding: Text encoding for paths and binary streams
+            workers: Parallel hashing workers (see import_csv)
+            pool: 'process' or 'thread'
+
+        Yields:
+            Record dicts as in import_csv()["records"]
+        """
+        import csv
+
+        sys_info, record_type = self._import_target(source_system, record_type)
+        with _open_import_source(source, encoding=encoding) as fp:
+            rows = csv.DictReader(fp, delimiter=delimiter)
+            for row, record_hash in self._hash_rows(rows, workers, pool):
+                yield self._imported_record(row, record_hash, record_type, source_system, sys_info)
+
+    def iter_import_xml(self, source, source_system, record_type=None, row_tag=None, workers=None, pool="process"):
+        """Yield imported XML records one at a time using iterparse.
+
+        Each row element is dropped from the tree once read. Without
+        row_tag the first tag that repeats among the root's children is used,
+        so a leading header element is skipped (import_xml picks the most
+        common tag, which needs the whole document); ValueError if no tag
+        repeats among several children.
+
+        Args:
+            source: Path to the XML file, or an open binary stream
+            source_system: Key from DOD_SYSTEMS
+            record_type: Override record type
+            row_tag: XML tag name for each record element (auto-detected if omitted)
+            workers: Parallel hashing workers (see import_csv)
+            pool: 'process' or 'thread'
+
+        Yields:
+            Record dicts as in import_xml()["records"]
+        """
+        sys_info, record_type = self._import_target(source_system, record_type)
+        with _open_import_source(source, binary=True) as fp:
+            for row, record_hash in self._hash_rows(_iter_xml_rows(fp, row_tag), workers, pool):
+                yield self._imported_record(row, record_hash, record_type, source_system, sys_info)
+
+    def iter_import_json(self, source, source_system, record_type=None, records_key=None, encoding="utf-8",
+                         workers=None, pool="process"):
+        """Yield imported JSON records one at a time with an incremental parser.
+
+        Reads a top-level array, or the array under records_key (or, if
+        omitted, the first non-empty array) of a top-level object. An object
+        without any array is imported as a single record.
+
+        Args:
+            source: Path to the JSON file, or an open binary/text stream
+            source_system: Key from DOD_SYSTEMS
+            record_type: Override record type
+            records_key: JSON key containing the array of records (auto-detected if omitted)
+            encoding: Text encoding for paths and binary streams
+            workers: Parallel hashing workers (see import_csv)
+            pool: 'process' or 'thread'
+
+        Yields:
+            Record dicts as in import_json()["records"]
+        """
+        sys_info, record_type = self._import_target(source_system, record_type)
+        with _open_import_source(source, encoding=encoding) as fp:
+            items = _iter_json_items(_JSONStream(fp), records_key)
+            for item, record_hash in self._hash_rows(items, workers, pool):
+                yield self._imported_record(item, record_hash, record_type, source_system, sys_info)
+
     def import_and_anchor(self, file_text, source_system, file_format="csv",
-                          wallet_seed=None, record_type=None, anchor=True):
+                          wallet_seed=None, record_type=None, anchor=True, workers=None, batch=False):
         """Full import-and-anchor workflow: parse file → hash each record → optionally anchor to XRPL.
 
         Supports CSV, XML, and JSON formats from any registered DoD system.
+        With batch=True the record hashes become the leaves of a Merkle tree
+        built locally and only the root is anchored — one XRPL transaction
+        for the whole file. Each record then carries its merkle_root,
+        leaf_index and merkle_proof, checkable with verify_inclusion().
 
         Args:
             file_text: Raw file content
@@ -939,17 +1334,20 @@ class S4SDK:
             wallet_seed: XRPL wallet seed (required if anchor=True)
             record_type: Override record type
             anchor: If True, anchor each record hash to XRPL
+            workers: Hash records on this many processes (see import_csv)
+            batch: If True (with anchor), anchor one Merkle root instead of one tx per record
 
         Returns:
             Summary with imported count, anchored count, and record details
+            (plus a 'batch' summary with the anchored root when batch=True)
         """
         # Parse the file
         if file_format == "csv":
-            result = self.import_csv(file_text, source_system, record_type=record_type)
+            result = self.import_csv(file_text, source_system, record_type=record_type, workers=workers)
         elif file_format == "xml":
-            result = self.import_xml(file_text, source_system, record_type=record_type)
+            result = self.import_xml(file_text, source_system, record_type=record_type, workers=workers)
         elif file_format == "json":
-            result = self.import_json(file_text, source_system, record_type=record_type)
+            result = self.import_json(file_text, source_system, record_type=record_type, workers=workers)
         else:
             raise ValueError(f"Unsupported format: {file_format}. Use csv, xml, or json.")
 
@@ -958,25 +1356,53 @@ class S4SDK:
             wallet_seed = wallet_seed or self.wallet_seed
             if not wallet_seed:
                 raise ValueError("wallet_seed required for anchoring imported records")
-            for rec in result["records"]:
-                try:
-                    tx = self.anchor_record(
-                        record_text=json.dumps(rec["data"], sort_keys=True),
-                        wallet_seed=wallet_seed,
-                        record_type=rec["record_type"],
-                    )
-                    rec["tx_hash"] = tx.get("hash", "")
-                    rec["anchored"] = True
-                    anchored_count += 1
-                except Exception as e:
-                    rec["tx_hash"] = None
-                    rec["anchored"] = False
-                    rec["anchor_error"] = str(e)
+            if batch:
+                anchored_count = self._anchor_import_batch(result, wallet_seed)
+            else:
+                for rec in result["records"]:
+                    try:
+                        tx = self.anchor_record(
+                            record_text=canonical_json(rec["data"]),
+                            wallet_seed=wallet_seed,
+                            record_type=rec["record_type"],
+                        )
+                        rec["tx_hash"] = tx.get("hash", "")
+                        rec["anchored"] = True
+                        anchored_count += 1
+                    except Exception as e:
+                        rec["tx_hash"] = None
+                        rec["anchored"] = False
+                        rec["anchor_error"] = str(e)
 
         result["anchored"] = anchored_count
         result["anchor_enabled"] = anchor
         return result
 
+    def _anchor_import_batch(self, result, wallet_seed):
+        """Anchor the Merkle root of an import's record hashes and attach each
+        record's inclusion proof. Returns the number of records anchored."""
+        records = result["records"]
+        levels = _merkle_levels([rec["hash"] for rec in records])
+        root = levels[-1][0]
+        try:
+            tx_results = self.store_hash_with_sls_fee(root, wallet_seed, record_type="BATCH_ANCHOR")
+            tx_hash = (tx_results.get("fee_tx") or {}).get("hash", "")
+            error = None
+        except Exception as e:
+            tx_hash, error = None, str(e)
+        for i, rec in enumerate(records):
+            rec["tx_hash"] = tx_hash
+            rec["anchored"] = error is None
+            rec["merkle_root"] = root
+            rec["leaf_index"] = i
+            rec["merkle_proof"] = _merkle_proof(levels, i)
+            if error:
+                rec["anchor_error"] = error
+        result["batch"] = {"merkle_root": root, "tx_hash": tx_hash, "record_count": len(records)}
+        if error:
+            result["batch"]["anchor_error"] = error
+        return 0 if error else len(records)
+
     # ═══════════════════════════════════════════════════════════════════
     #  HarborLink Integration Methods
     # ═══════════════════════════════════════════════════════════════════
@@ -1105,6 +1531,52 @@ class S4SDK:
         resp = urllib.request.urlopen(req, timeout=60)
         return json.loads(resp.read())
 
+    def get_batch_proof(self, batch_id, leaf=None, index=None, api_base="https://s4ledger.com"):
+        """Fetch the Merkle inclusion proof for one record of a batch anchor.
+
+        Args:
+            batch_id: Batch ID returned by anchor_batch (e.g. 'BATCH-1A2B3C4D5E6F')
+            leaf: The record's leaf hash
+            index: Alternatively, the record's position in the batch
+
+        Returns:
+            dict with leaf, leaf_index, merkle_root, proof (sibling path), tx_hash
+        """
+        import urllib.request
+        from urllib.parse import urlencode
+        params = {"batch_id": batch_id}
+        if leaf is not None:
+            params["leaf"] = leaf
+        if index is not None:
+            params["index"] = index
+        req = urllib.request.Request(
+            f"{api_base}/api/batch/proof?{urlencode(params)}",
+            headers={"X-API-Key": self.api_key or ""},
+        )
+        resp = urllib.request.urlopen(req, timeout=15)
+        return json.loads(resp.read())
+
+    @staticmethod
+    def verify_inclusion(leaf, proof, merkle_root):
+        """Check offline that a leaf hash is included under an anchored Merkle root.
+
+        Walks the sibling path in O(log n) — no need to fetch the other leaves.
+        Parents are sha256(left_hex + right_hex), matching the server's batch trees.
+
+        Args:
+            leaf: Leaf hash (hex SHA-256 of the record)
+            proof: Sibling path — list of {'hash', 'position'} where position
+                   ('left'/'right') is the sibling's side — or the full
+                   get_batch_proof() response
+            merkle_root: Root anchored on XRPL for the batch
+
+        Returns:
+            True if the proof recomputes merkle_root, False otherwise
+        """
+        if isinstance(proof, dict):
+            proof = proof.get("proof", [])
+        return verify_proof(leaf, proof, merkle_root)
+
     def transfer_custody(self, record_id, from_entity, to_entity,
                          location="", condition="serviceable", notes="",
                          user_email="", api_base="https://s4ledger.com"):
@@ -1186,28 +1658,41 @@ class S4SDK:
         resp = urllib.request.urlopen(req, timeout=15)
         return json.loads(resp.read())
 
-    def hash_file(self, content, encoding="utf-8", filename="",
+    def hash_file(self, content, encoding="utf-8", filename="", chunk_size=None,
                   api_base="https://s4ledger.com"):
         """Hash a file's binary content via the API.
 
-        For local hashing without API call, use:
-            hashlib.sha256(open('file','rb').read()).hexdigest()
+        For local hashing without an API call, use hash_path().
 
         Args:
-            content: File content (UTF-8 text or base64-encoded binary)
-            encoding: 'utf-8' for text, 'base64' for binary
+            content: File content — UTF-8 text or base64-encoded binary sent as
+                     JSON, or bytes / a binary file object streamed as
+                     application/octet-stream
+            encoding: 'utf-8' for text, 'base64' for binary (JSON content only)
             filename: Optional filename for reference
+            chunk_size: Optional chunk length for chunk hashes and their Merkle
+                        root (streamed content only, >= 65536)
 
         Returns:
             SHA-256 hash and file size
         """
         import urllib.request
-        payload = {"content": content, "encoding": encoding, "filename": filename}
+        from urllib.parse import urlencode
+        if isinstance(content, (bytes, bytearray)) or hasattr(content, "read"):
+            query = {"filename": filename}
+            if chunk_size:
+                query["chunk_size"] = chunk_size
+            url = f"{api_base}/api/hash/file?{urlencode(query)}"
+            data, content_type = content, "application/octet-stream"
+        else:
+            url = f"{api_base}/api/hash/file"
+            data = json.dumps({"content": content, "encoding": encoding, "filename": filename}).encode()
+            content_type = "application/json"
         req = urllib.request.Request(
-            f"{api_base}/api/hash/file",
-            data=json.dumps(payload).encode(),
+            url,
+            data=data,
             headers={
-                "Content-Type": "application/json",
+                "Content-Type": content_type,
                 "X-API-Key": self.api_key or "",
             },
             method="POST",
@@ -1215,6 +1700,75 @@ class S4SDK:
         resp = urllib.request.urlopen(req, timeout=15)
         return json.loads(resp.read())
 
+    def hash_path(self, path, chunk_size=None, block_size=1 << 20):
+        """Hash a local file without reading it into memory (no API call).
+
+        Regular files are memory-mapped; pipes, empty files and binary file
+        objects are read with readinto() into one reusable buffer. The hash
+        equals hashlib.sha256(<file bytes>) and POST /api/hash/file.
+
+        Args:
+            path: File path, or a binary file object
+            chunk_size: Optional chunk length in bytes. Every chunk is also
+                        hashed on its own and the chunk hashes are rolled into
+                        a Merkle root (the batch-anchor tree layout), so a
+                        large technical data package can later be re-checked
+                        a chunk at a time with verify_path_chunks()
+            block_size: Bytes hashed per step
+
+        Returns:
+            hash, algorithm, size_bytes, filename, and with chunk_size also
+            chunk_size, chunk_count, chunk_hashes and merkle_root
+        """
+        if chunk_size is not None and chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+        with _file_blocks(path, block_size) as blocks:
+            file_hash, size, leaves = _digest_blocks(blocks, chunk_size or 0)
+        result = {
+            "hash": file_hash,
+            "algorithm": "SHA-256",
+            "size_bytes": size,
+            "filename": os.path.basename(os.fsdecode(path)) if isinstance(path, (str, bytes, os.PathLike)) else "",
+        }
+        if chunk_size:
+            result.update({
+                "chunk_size": chunk_size,
+                "chunk_count": len(leaves),
+                "chunk_hashes": leaves,
+                "merkle_root": _merkle_levels(leaves)[-1][0],
+            })
+        return result
+
+    def verify_path_chunks(self, path, chunk_hashes, chunk_size, indexes=None, block_size=1 << 20):
+        """Re-hash chunks of a file against hash_path(chunk_size=...) output,
+        reading only the chunks asked for.
+
+        Args:
+            path: File path
+            chunk_hashes: The chunk_hashes recorded by hash_path()
+            chunk_size: The chunk_size they were computed with
+            indexes: Chunk indexes to check (default: all)
+
+        Returns:
+            Indexes of the chunks whose content no longer matches
+        """
+        view = memoryview(bytearray(min(chunk_size, block_size)))
+        changed = []
+        with open(path, "rb") as fp:
+            for i in range(len(chunk_hashes)) if indexes is None else indexes:
+                fp.seek(i * chunk_size)
+                digest = hashlib.sha256()
+                left = chunk_size
+                while left:
+                    n = fp.readinto(view[:min(left, len(view))])
+                    if not n:
+                        break
+                    digest.update(view[:n])
+                    left -= n
+                if not hmac.compare_digest(digest.hexdigest(), chunk_hashes[i]):
+                    changed.append(i)
+        return changed
+
     def verify_batch(self, records, operator="sdk", api_base="https://s4ledger.com"):
         """Verify multiple records against the chain in a single call.
 
@@ -0,0 +1,26 @@
+-- =========================================================================
+--  013 — Merkle Batches
+--  Persists batch-anchor trees so inclusion proofs survive cold starts.
+--  `tree` holds the internal levels (above the leaves), one hex string of
+--  concatenated 32-byte SHA-256 nodes per level, root level last.
+-- =========================================================================
+
+CREATE TABLE IF NOT EXISTS merkle_batches (
+    id              UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    batch_id        TEXT UNIQUE NOT NULL,             -- e.g. "BATCH-1A2B3C4D5E6F"
+    merkle_root     TEXT NOT NULL,
+    leaf_hashes     JSONB NOT NULL DEFAULT '[]',
+    tree            JSONB NOT NULL DEFAULT '[]',
+    record_count    INT NOT NULL DEFAULT 0,
+    tx_hash         TEXT,
+    network         TEXT DEFAULT 'Simulated',
+    explorer_url    TEXT,
+    org_id          TEXT DEFAULT '',
+    timestamp       TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+ALTER TABLE merkle_batches ENABLE ROW LEVEL SECURITY;
+CREATE POLICY "merkle_batches_service_full_access" ON merkle_batches
+    FOR ALL USING (true) WITH CHECK (true);
+
+CREATE INDEX IF NOT EXISTS idx_merkle_batches_tx_hash ON merkle_batches (tx_hash);
@@ -0,0 +1,10 @@
+-- =========================================================================
+--  014 — Keyset Hydration Indexes
+--  Cold-start hydration pages through these tables ordered by
+--  (timestamp, id), resuming after the last row of the previous page.
+--  A matching composite index keeps every page an index range scan.
+-- =========================================================================
+
+CREATE INDEX IF NOT EXISTS idx_records_timestamp_id ON records (timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_proof_chains_timestamp_id ON proof_chains (timestamp, id);
+CREATE INDEX IF NOT EXISTS idx_custody_transfers_timestamp_id ON custody_transfers (timestamp, id);
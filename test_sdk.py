@@ -41,3 +41,19 @@ def test_anchor_failure():
     bad_sdk = S4SDK(wallet_seed="invalid_seed", testnet=True)
     with pytest.raises(Exception):
         bad_sdk.anchor_record(record_text="fail", encrypt_first=True, fiat_mode=False)
+
+def test_verify_inclusion_roundtrip(sdk):
+    import hashlib
+    leaves = [hashlib.sha256(f"rec-{i}".encode()).hexdigest() for i in range(5)]
+    # Tree: parents are sha256(left_hex + right_hex), odd layers duplicate the last node
+    h = lambda a, b: hashlib.sha256((a + b).encode()).hexdigest()
+    l1 = [h(leaves[0], leaves[1]), h(leaves[2], leaves[3]), h(leaves[4], leaves[4])]
+    l2 = [h(l1[0], l1[1]), h(l1[2], l1[2])]
+    root = h(l2[0], l2[1])
+    proof = [{"hash": leaves[3], "position": "right"},
+             {"hash": l1[0], "position": "left"},
+             {"hash": l2[1], "position": "right"}]
+    assert sdk.verify_inclusion(leaves[2], proof, root)
+    assert sdk.verify_inclusion(leaves[2], {"proof": proof}, root)
+    assert not sdk.verify_inclusion(leaves[1], proof, root)
+    assert not sdk.verify_inclusion(leaves[2], proof[:2], root)
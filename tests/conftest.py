@@ -31,3 +31,95 @@ def api_path():
 def demo_app_path():
     """Return path to demo-app/index.html."""
     return os.path.join(PROJECT_ROOT, "demo-app", "index.html")
+
+
+@pytest.fixture(scope="session")
+def api_module():
+    """Import api/index.py once as a module (it is not a package)."""
+    import importlib.util
+    spec = importlib.util.spec_from_file_location("s4_api_index", os.path.join(PROJECT_ROOT, "api", "index.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def record_store(api_module, monkeypatch):
+    """Give a test an empty, isolated in-memory record store."""
+    monkeypatch.setattr(api_module, "_live_records", [])
+    monkeypatch.setattr(api_module, "_record_index", {f: {} for f in api_module._RECORD_INDEX_FIELDS})
+    monkeypatch.setattr(api_module, "_record_positions", {})
+    monkeypatch.setattr(api_module, "_metrics_aggregator", api_module._MetricsAggregator())
+    return api_module
+
+
+@pytest.fixture
+def api_call(api_module, monkeypatch):
+    """Invoke the API handler in-process: api_call("POST", "/api/anchor", body) -> (status, json).
+    A bytes body is sent as-is (set Content-Type in headers); a dict is sent as JSON.
+    With text=True the response body is returned as bytes instead of parsed JSON."""
+    import io
+    import json
+    from email.message import Message
+
+    monkeypatch.setattr(api_module, "_rate_limiter", api_module._MemoryRateLimitBackend())
+
+    def call(method, path, body=None, headers=None, text=False):
+        if isinstance(body, bytes):
+            raw = body
+        else:
+            raw = json.dumps(body).encode() if body is not None else b""
+        msg = Message()
+        for k, v in (headers or {}).items():
+            msg[k] = v
+        if raw and "Transfer-Encoding" not in msg:
+            msg["Content-Length"] = str(len(raw))
+        if raw and "Content-Type" not in msg:
+            msg["Content-Type"] = "application/json"
+        h = api_module.handler.__new__(api_module.handler)
+        h.rfile, h.wfile = io.BytesIO(raw), io.BytesIO()
+        h.headers, h.path, h.command = msg, path, method
+        h.client_address, h.request_version = ("127.0.0.1", 0), "HTTP/1.1"
+        h.requestline = f"{method} {path} HTTP/1.1"
+        h.log_message = lambda *a, **k: None
+        getattr(h, f"do_{method}")()
+        head, _, payload = h.wfile.getvalue().partition(b"\r\n\r\n")
+        status = int(head.split(b" ", 2)[1])
+        if text:
+            return status, payload
+        return status, json.loads(payload) if payload else None
+
+    return call
+
+
+@pytest.fixture
+def anchor_pipeline(record_store, monkeypatch, tmp_path):
+    """Run the async anchor pipeline against a throwaway queue database."""
+    api = record_store
+    monkeypatch.setattr(api, "ANCHOR_ASYNC", True)
+    monkeypatch.setattr(api, "ANCHOR_QUEUE_DB", str(tmp_path / "anchor_queue.db"))
+    monkeypatch.setattr(api, "ANCHOR_RETRY_INTERVAL", 0.05)
+    monkeypatch.setattr(api, "_anchor_queue", None)
+    monkeypatch.setattr(api, "_anchor_jobs", {})
+    monkeypatch.setattr(api, "_proof_chain_store", {})
+    monkeypatch.setattr(api, "_batch_store", {})
+    yield api
+    api._stop_anchor_workers()
+
+
+@pytest.fixture
+def webhook_outbox(api_module, monkeypatch, tmp_path):
+    """Run webhook delivery against a throwaway outbox with fast retries."""
+    api = api_module
+    monkeypatch.setattr(api, "WEBHOOK_ASYNC", True)
+    monkeypatch.setattr(api, "WEBHOOK_OUTBOX_DB", str(tmp_path / "webhook_outbox.db"))
+    monkeypatch.setattr(api, "WEBHOOK_BACKOFF_BASE", 0.02)
+    monkeypatch.setattr(api, "WEBHOOK_POLL_INTERVAL", 0.05)
+    monkeypatch.setattr(api, "_webhook_outbox", None)
+    monkeypatch.setattr(api, "_webhook_breakers", {})
+    monkeypatch.setattr(api, "_webhook_store", {})
+    monkeypatch.setattr(api, "_webhook_index", {})
+    monkeypatch.setattr(api, "_webhook_delivery_log", [])
+    monkeypatch.setattr(api, "_webhook_deliveries_by_id", {})
+    yield api
+    api._stop_webhook_workers()
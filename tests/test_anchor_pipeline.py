@@ -0,0 +1,381 @@
+"""
+S4 Ledger Async Anchor Pipeline Tests
+=====================================
+Tests for the PersistentQueue-backed anchor workers behind POST /api/anchor.
+Run: pytest tests/ -v
+"""
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from resilience import PersistentQueue
+from s4_merkle import verify_proof
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Queue Claim Semantics
+# ═══════════════════════════════════════════════════════════════════
+
+class TestQueueClaim:
+    """claim_pending must hand each job to exactly one worker."""
+
+    def test_concurrent_claims_are_disjoint(self, tmp_path):
+        """Jobs claimed from several threads should never overlap."""
+        q = PersistentQueue(db_path=str(tmp_path / "q.db"))
+        for i in range(200):
+            q.enqueue(f"hash-{i}", "TEST")
+        claimed, lock = [], threading.Lock()
+
+        def worker():
+            while True:
+                jobs = q.claim_pending(limit=3)
+                if not jobs:
+                    return
+                with lock:
+                    claimed.extend(j["id"] for j in jobs)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert sorted(claimed) == list(range(1, 201))
+        assert q.get_stats()["in_flight"] == 200
+
+    def test_requeue_in_flight(self, tmp_path):
+        """Jobs abandoned mid-flight should return to pending."""
+        q = PersistentQueue(db_path=str(tmp_path / "q.db"))
+        q.enqueue("h1", "TEST")
+        q.enqueue("h2", "TEST")
+        assert len(q.claim_pending(limit=5)) == 2
+        assert q.claim_pending() == []
+        assert q.requeue_in_flight() == 2
+        assert [j["record_hash"] for j in q.claim_pending(limit=5)] == ["h1", "h2"]
+
+    def test_claims_are_disjoint_across_processes(self, tmp_path):
+        """Two queue instances on one database (two processes) never share a job."""
+        path = str(tmp_path / "q.db")
+        queues = [PersistentQueue(db_path=path), PersistentQueue(db_path=path)]
+        for i in range(200):
+            queues[0].enqueue(f"hash-{i}", "TEST")
+        claimed, lock = [], threading.Lock()
+
+        def worker(q, owner):
+            while True:
+                jobs = q.claim_pending(limit=3, owner=owner, lease_seconds=60)
+                if not jobs:
+                    return
+                with lock:
+                    claimed.extend(j["id"] for j in jobs)
+
+        threads = [threading.Thread(target=worker, args=(queues[i % 2], f"w{i}")) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert sorted(claimed) == list(range(1, 201))
+
+    def test_leases_expire_instead_of_requeue_on_open(self, tmp_path):
+        """A live worker's job stays its own; a dead worker's job is reclaimed after its lease."""
+        path = str(tmp_path / "q.db")
+        PersistentQueue(db_path=path).enqueue("h1", "TEST")
+        PersistentQueue(db_path=path).enqueue("h2", "TEST")
+        first = PersistentQueue(db_path=path)
+        assert [j["claimed_by"] for j in first.claim_pending(limit=1, owner="live", lease_seconds=60)] == ["live"]
+        assert len(first.claim_pending(limit=1, owner="dying", lease_seconds=0.05)) == 1
+
+        second = PersistentQueue(db_path=path)
+        assert second.claim_pending(limit=5, owner="new", lease_seconds=60) == []
+        time.sleep(0.1)
+        reclaimed = second.claim_pending(limit=5, owner="new", lease_seconds=60)
+        assert [j["record_hash"] for j in reclaimed] == ["h2"]
+
+    def test_mark_retry_defers_claim(self, tmp_path):
+        """A rescheduled job is not claimable until its delay has passed."""
+        q = PersistentQueue(db_path=str(tmp_path / "q.db"))
+        q.enqueue("h1", "TEST")
+        job = q.claim_pending()[0]
+        q.mark_retry(job["id"], "boom", delay=60)
+        assert q.claim_pending() == []
+        assert 59 < q.next_due_in() <= 60
+        q.mark_retry(job["id"], "circuit open", delay=0, count_attempt=False)
+        retried = q.claim_pending()[0]
+        assert retried["sync_attempts"] == 1 and retried["error"] == "circuit open"
+        assert q.next_due_in() is None
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  POST /api/anchor Pipeline
+# ═══════════════════════════════════════════════════════════════════
+
+class TestAsyncAnchor:
+    """POST /api/anchor returns pending immediately and workers finish the job."""
+
+    def test_anchor_returns_pending_then_anchors(self, anchor_pipeline, api_call):
+        """The record should be accepted as pending and later anchored with a proof event."""
+        api = anchor_pipeline
+        status, body = api_call("POST", "/api/anchor", {"hash": "ab" * 32, "record_type": "USN_SUPPLY_RECEIPT"})
+        assert status == 202
+        assert body["status"] == "pending"
+        rid = body["record_id"]
+        assert body["status_url"].endswith(rid)
+
+        assert _wait_for(lambda: api._anchor_job_status(rid)["status"] == "anchored")
+        record = api._first_record(rid, "record_id")
+        assert record["network"] == "Simulated"
+        assert record["anchor_status"] == "anchored"
+        assert api._first_record(record["tx_hash"], "tx_hash") is record
+        assert [e["event_type"] for e in api._proof_chain_store[rid]] == ["anchor.created"]
+
+        status, body = api_call("GET", f"/api/anchor/status?record_id={rid}")
+        assert status == 200
+        assert body["status"] == "anchored"
+        assert body["record"]["tx_hash"] == record["tx_hash"]
+
+    def test_async_is_opt_in(self, record_store, api_call, monkeypatch):
+        """Without S4_ANCHOR_ASYNC=1 /api/anchor answers synchronously with a tx_hash."""
+        monkeypatch.delenv("S4_ANCHOR_ASYNC", raising=False)
+        import importlib.util
+        spec = importlib.util.spec_from_file_location("s4_api_default", record_store.__file__)
+        fresh = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(fresh)
+        assert fresh.ANCHOR_ASYNC is False
+        monkeypatch.setattr(record_store, "ANCHOR_ASYNC", False)
+        status, body = api_call("POST", "/api/anchor", {"hash": "ef" * 32})
+        assert status == 200 and body["record"]["tx_hash"]
+
+    def test_wait_flag_anchors_synchronously(self, anchor_pipeline, api_call):
+        """wait=true keeps the blocking behaviour and returns the final record."""
+        status, body = api_call("POST", "/api/anchor", {"hash": "cd" * 32, "wait": True})
+        assert status == 200
+        assert body["status"] == "anchored"
+        assert body["record"]["tx_hash"]
+        assert anchor_pipeline._anchor_jobs == {}
+
+    def test_failed_submission_is_retried(self, anchor_pipeline, api_call, monkeypatch):
+        """An XRPL failure should be retried by the pipeline until it succeeds."""
+        api = anchor_pipeline
+        calls = []
+
+        def flaky_anchor(hash_value, record_type="", branch="", user_email=None):
+            calls.append(hash_value)
+            if len(calls) == 1:
+                return None
+            return {"tx_hash": "F" * 64, "explorer_url": "https://testnet.xrpl.org/transactions/" + "F" * 64}
+
+        monkeypatch.setattr(api, "_anchor_xrpl", flaky_anchor)
+        monkeypatch.setattr(api, "_xrpl_live", lambda: True)
+        status, body = api_call("POST", "/api/anchor", {"hash": "ef" * 32})
+        assert status == 202
+        rid = body["record_id"]
+        assert _wait_for(lambda: api._anchor_job_status(rid)["status"] == "anchored")
+        assert len(calls) == 2
+        assert api._anchor_jobs[rid]["attempts"] == 2
+        assert api._first_record(rid, "record_id")["tx_hash"] == "F" * 64
+
+    def test_queued_jobs_resume_after_restart(self, anchor_pipeline, api_call, monkeypatch):
+        """Jobs left in the queue by a previous process are worked off on the next request."""
+        api = anchor_pipeline
+        real_start = api._start_anchor_workers
+        monkeypatch.setattr(api, "_start_anchor_workers", lambda: None)   # process dies before working
+        rid = api_call("POST", "/api/anchor", {"hash": "9a" * 32})[1]["record_id"]
+        monkeypatch.setattr(api, "_start_anchor_workers", real_start)
+        monkeypatch.setattr(api, "_anchor_queue", None)                  # restart
+        assert api._anchor_workers == []
+        assert api_call("GET", "/api/health")[0] == 200
+        assert _wait_for(lambda: api._first_record(rid, "record_id")["anchor_status"] == "anchored")
+
+    def test_status_unknown_record(self, anchor_pipeline, api_call):
+        """Unknown record ids should 404 and a missing id should 400."""
+        assert api_call("GET", "/api/anchor/status?record_id=REC-NOPE")[0] == 404
+        assert api_call("GET", "/api/anchor/status")[0] == 400
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Merkle Micro-Batching
+# ═══════════════════════════════════════════════════════════════════
+
+class TestMerkleHelpers:
+    """Module-level Merkle helpers used by batch and coalesced anchoring."""
+
+    @staticmethod
+    def _reference_root(hashes):
+        """The original nested merkle_root() from the anchor_batch handler."""
+        import hashlib
+        if not hashes:
+            return hashlib.sha256(b"empty").hexdigest()
+        layer = list(hashes)
+        while len(layer) > 1:
+            if len(layer) % 2 == 1:
+                layer.append(layer[-1])
+            layer = [hashlib.sha256((layer[i] + layer[i + 1]).encode()).hexdigest()
+                     for i in range(0, len(layer), 2)]
+        return layer[0]
+
+    @pytest.mark.parametrize("n", [0, 1, 2, 3, 5, 8, 13, 17])
+    def test_root_and_proofs(self, api_module, n):
+        """Roots must match the original algorithm and every leaf proof must verify."""
+        import hashlib
+        leaves = [hashlib.sha256(str(i).encode()).hexdigest() for i in range(n)]
+        levels = api_module._merkle_levels(leaves)
+        root = api_module._merkle_root(leaves)
+        assert root == self._reference_root(leaves)
+        for i, leaf in enumerate(leaves):
+            proof = api_module._merkle_proof(levels, i)
+            assert verify_proof(leaf, proof, root)
+            assert not verify_proof("0" * 64, proof, root)
+
+
+class TestAnchorCoalescing:
+    """Single anchors arriving together should share one Merkle-root transaction."""
+
+    def test_concurrent_anchors_share_a_batch(self, anchor_pipeline, api_call, monkeypatch):
+        """Anchors within the window get one tx, one batch_id and their own proofs."""
+        api = anchor_pipeline
+        monkeypatch.setattr(api, "ANCHOR_BATCH_WINDOW", 0.5)
+        submitted = []
+        real_anchor = api._anchor_xrpl
+        monkeypatch.setattr(api, "_anchor_xrpl", lambda h, *a, **k: submitted.append(h) or real_anchor(h, *a, **k))
+
+        rids = []
+        for i in range(12):
+            status, body = api_call("POST", "/api/anchor", {"hash": f"{i:064x}"})
+            assert status == 202
+            rids.append(body["record_id"])
+        assert _wait_for(lambda: all(api._anchor_job_status(r)["status"] == "anchored" for r in rids))
+
+        records = [api._first_record(r, "record_id") for r in rids]
+        assert len(submitted) == 1
+        assert len({r["tx_hash"] for r in records}) == 1
+        batch_id = records[0]["batch_id"]
+        root = api._batch_store[batch_id]["merkle_root"]
+        assert submitted == [root]
+        for rec in records:
+            assert rec["batch_id"] == batch_id
+            assert verify_proof(rec["hash"], rec["merkle_proof"], root)
+        assert api._anchor_jobs[rids[3]]["merkle_proof"] == records[3]["merkle_proof"]
+
+        # Verifying any member by the shared tx_hash should resolve to that member
+        tx = records[0]["tx_hash"]
+        assert api._record_for_tx(tx, records[5]["hash"]) is records[5]
+
+    def test_failed_member_is_retried_alone(self, anchor_pipeline, api_call, monkeypatch):
+        """A record that fails after the root is submitted is finalized again against that root.
+
+        The retry must not submit a second transaction or charge the fee twice.
+        """
+        api = anchor_pipeline
+        monkeypatch.setattr(api, "ANCHOR_BATCH_WINDOW", 0.5)
+        submitted, charged = [], []
+        real_finalize = api._finalize_anchor
+
+        def anchor(hash_value, *args, **kwargs):
+            submitted.append(hash_value)
+            return {"tx_hash": f"TX{len(submitted):062X}", "network": "XRPL Testnet", "explorer_url": ""}
+
+        def charge(user_email, anchor_tx, ref=None):
+            charged.append(ref)
+            return {"sls_fee": api.SLS_ANCHOR_FEE}
+
+        flaky = f"{203:064x}"
+        failures = []
+
+        def finalize(record, *args, **kwargs):
+            if record["hash"] == flaky and not failures:
+                failures.append(record["record_id"])
+                raise RuntimeError("proof chain write failed")
+            return real_finalize(record, *args, **kwargs)
+
+        monkeypatch.setattr(api, "_anchor_xrpl", anchor)
+        monkeypatch.setattr(api, "_charge_anchor_fee", charge)
+        monkeypatch.setattr(api, "_finalize_anchor", finalize)
+        rids = [api_call("POST", "/api/anchor", {"hash": f"{i + 200:064x}", "user_email": "ops@example.mil"})[1]["record_id"]
+                for i in range(6)]
+        assert _wait_for(lambda: all(api._anchor_job_status(r)["status"] == "anchored" for r in rids))
+
+        assert failures == [rids[3]] and len(submitted) == 1
+        assert sorted(charged) == sorted(rids)
+        retried = api._first_record(rids[3], "record_id")
+        batch_id = api._first_record(rids[0], "record_id")["batch_id"]
+        assert retried["tx_hash"] == f"TX{1:062X}"
+        assert retried["batch_id"] == batch_id and retried["leaf_index"] == 3
+        assert api._anchor_jobs[rids[3]]["attempts"] == 2
+        assert all(api._anchor_jobs[r]["attempts"] == 1 for r in rids if r != rids[3])
+
+    def test_zero_window_disables_coalescing(self, anchor_pipeline, api_call, monkeypatch):
+        """With the window set to 0 every anchor is submitted on its own."""
+        api = anchor_pipeline
+        monkeypatch.setattr(api, "ANCHOR_BATCH_WINDOW", 0)
+        rids = [api_call("POST", "/api/anchor", {"hash": f"{i + 100:064x}"})[1]["record_id"] for i in range(4)]
+        assert _wait_for(lambda: all(api._anchor_job_status(r)["status"] == "anchored" for r in rids))
+        assert all("batch_id" not in api._first_record(r, "record_id") for r in rids)
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Batch Inclusion Proofs
+# ═══════════════════════════════════════════════════════════════════
+
+class TestBatchProof:
+    """GET /api/batch/proof serves sibling paths from the packed tree."""
+
+    def test_proofs_for_every_leaf(self, anchor_pipeline, api_call):
+        """Each leaf of an anchored batch should get a proof that recomputes the root."""
+        import hashlib
+        from s4_sdk import S4SDK
+        api = anchor_pipeline
+        records = [{"record_text": f"NSN 5340-01-{i:03d}"} for i in range(11)]
+        status, batch = api_call("POST", "/api/anchor/batch", {"records": records})
+        assert status == 200
+        leaves = api._batch_store[batch["batch_id"]]["leaf_hashes"]
+        assert len(api._batch_store[batch["batch_id"]]["tree"]) == 4  # 11 → 6 → 3 → 2 → 1
+
+        for i, leaf in enumerate(leaves):
+            status, body = api_call("GET", f"/api/batch/proof?batch_id={batch['batch_id']}&leaf={leaf}")
+            assert status == 200
+            assert body["leaf_index"] == i
+            assert body["merkle_root"] == batch["merkle_root"]
+            assert body["proof"] == api._merkle_proof(api._merkle_levels(leaves), i)
+            assert S4SDK.verify_inclusion(leaf, body, batch["merkle_root"])
+        status, body = api_call("GET", batch["proof_url"] + "&index=4")
+        assert status == 200 and body["leaf"] == leaves[4]
+        assert hashlib.sha256(records[4]["record_text"].encode()).hexdigest() == leaves[4]
+
+    def test_proof_for_legacy_batch_without_tree(self, anchor_pipeline, api_call):
+        """Batches stored before trees were kept should still serve proofs."""
+        api = anchor_pipeline
+        leaves = [f"{i:064x}" for i in range(3)]
+        api._batch_store["BATCH-LEGACY"] = {"merkle_root": api._merkle_root(leaves), "leaf_hashes": leaves}
+        status, body = api_call("GET", f"/api/batch/proof?batch_id=BATCH-LEGACY&leaf={leaves[2]}")
+        assert status == 200
+        assert verify_proof(leaves[2], body["proof"], body["merkle_root"])
+
+    def test_proof_errors(self, anchor_pipeline, api_call):
+        """Missing parameters, unknown batches and unknown leaves are reported."""
+        api_call("POST", "/api/anchor/batch", {"records": [{"hash": "a" * 64}, {"hash": "b" * 64}]})
+        batch_id = next(iter(anchor_pipeline._batch_store))
+        assert api_call("GET", "/api/batch/proof?batch_id=" + batch_id)[0] == 400
+        assert api_call("GET", "/api/batch/proof?batch_id=BATCH-NOPE&leaf=" + "a" * 64)[0] == 404
+        assert api_call("GET", f"/api/batch/proof?batch_id={batch_id}&leaf={'c' * 64}")[0] == 404
+        assert api_call("GET", f"/api/batch/proof?batch_id={batch_id}&index=2")[0] == 404
+
+    def test_batch_id_is_escaped_in_supabase_filter(self, anchor_pipeline, monkeypatch):
+        """A batch_id from the query string cannot add PostgREST filters."""
+        api = anchor_pipeline
+        queries = []
+        monkeypatch.setattr(api, "_sb_select", lambda table, query_params="", **kw: queries.append(query_params) or [])
+        assert api._load_batch_from_supabase("B&or=(tx_hash.neq.x),") is None
+        assert queries == ["batch_id=eq.B%26or%3D%28tx_hash.neq.x%29%2C"]
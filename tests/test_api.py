@@ -240,6 +240,49 @@ class TestRouteResolution:
         assert "health" in source
 
 
+class TestRouter:
+    """The (method, path) dispatch table and its middleware."""
+
+    def test_every_handler_is_registered(self, api_module):
+        """Each _handle_<method>_<route> method should be reachable by some path."""
+        registered = {(m, r) for m, _, r in api_module._router.routes()}
+        handlers = {(name.split("_")[2].upper(), name.split("_", 3)[3])
+                    for name in dir(api_module.handler) if name.startswith(("_handle_get_", "_handle_post_"))}
+        assert handlers == registered
+        assert {p for _, p, _ in api_module._router.routes()} == set(api_module._ROUTE_NAMES)
+
+    def test_resolve(self, api_module):
+        """Trailing slashes are ignored and unknown paths fall through to not-found."""
+        assert api_module._router.resolve("GET", "/api/health/")[0] == "health"
+        assert api_module._router.resolve("POST", "/api/anchor")[0] == "anchor"
+        assert api_module._router.resolve("GET", "/api/anchor")[0] is None
+        assert api_module._router.resolve("GET", "/api/nope")[0] is None
+
+    def test_unknown_path_is_404(self, api_call):
+        assert api_call("GET", "/api/nope")[0] == 404
+        assert api_call("POST", "/api/nope", {})[0] == 404
+        assert api_call("GET", "/api/anchor")[0] == 404  # POST-only route
+
+    def test_api_key_middleware(self, api_module, api_call, monkeypatch):
+        """Routes with the api-key middleware reject unknown keys before running."""
+        monkeypatch.setattr(api_module, "API_MASTER_KEY", "master")
+        assert api_call("GET", "/api/webhooks/list")[0] == 401
+        assert api_call("GET", "/api/webhooks/list", headers={"X-API-Key": "wrong"})[0] == 401
+        entry = api_module._request_log[-1]
+        assert entry["route"] == "webhook-list" and entry["status"] == 401 and entry["ms"] >= 0
+        status, body = api_call("GET", "/api/webhooks/list", headers={"X-API-Key": "master"})
+        assert status == 200 and body["total"] == 0
+
+    def test_rate_limit_middleware(self, api_module, api_call, monkeypatch):
+        monkeypatch.setattr(api_module, "RATE_LIMIT_MAX", 2)
+        assert [api_call("GET", "/api/health")[0] for _ in range(3)] == [200, 200, 429]
+
+    def test_timing_middleware_records_ms(self, api_module, api_call):
+        api_call("GET", "/api/health")
+        entry = api_module._request_log[-1]
+        assert entry["route"] == "health" and entry["ms"] >= 0
+
+
 # ═══════════════════════════════════════════════════════════════════
 #  Security Tests
 # ═══════════════════════════════════════════════════════════════════
@@ -293,5 +336,98 @@ class TestSecurity:
         assert "SUPABASE_JWT_SECRET" in content
 
 
+
+# ═══════════════════════════════════════════════════════════════════
+#  Record Store Index Tests
+# ═══════════════════════════════════════════════════════════════════
+
+class TestRecordIndex:
+    """Test the secondary indexes maintained over _live_records."""
+
+    def test_lookup_by_each_indexed_field(self, record_store):
+        """Every indexed field should resolve to its record."""
+        rec = {"hash": "h1", "tx_hash": "TX1", "record_id": "REC-1", "org_id": "acme", "batch_id": "BATCH-1"}
+        record_store._append_record(rec)
+        for field in record_store._RECORD_INDEX_FIELDS:
+            assert record_store._first_record(rec[field], field) is rec
+        assert record_store._live_records == [rec]
+
+    def test_first_record_matches_linear_scan(self, record_store):
+        """Multi-field lookups should return the same record a list scan would."""
+        record_store._append_record({"hash": "aaa", "tx_hash": "TX-A"})
+        record_store._append_record({"hash": "TX-B", "tx_hash": "TX-C"})
+        record_store._append_record({"hash": "bbb", "tx_hash": "TX-B"})
+        for key in ("TX-A", "TX-B", "TX-C", "aaa", "missing"):
+            expected = next((r for r in record_store._live_records
+                             if r.get("tx_hash") == key or r.get("hash") == key), None)
+            assert record_store._first_record(key, "tx_hash", "hash") is expected
+
+    def test_records_by_org_preserves_order(self, record_store):
+        """Org lookups across several keys should keep insertion order without duplicates."""
+        for i in range(6):
+            record_store._append_record({"hash": f"h{i}", "org_id": "key-1" if i % 2 else "Acme"})
+        record_store._append_record({"hash": "other", "org_id": "someone-else"})
+        found = record_store._records_by("org_id", "key-1", "Acme", "Acme")
+        assert [r["hash"] for r in found] == [f"h{i}" for i in range(6)]
+
+    def test_empty_values_are_not_indexed(self, record_store):
+        """Records without a value for a field should not be reachable via an empty key."""
+        record_store._append_record({"hash": "h1", "tx_hash": "", "org_id": None})
+        assert record_store._first_record("", "tx_hash") is None
+        assert record_store._records_by("org_id", "", None) == []
+
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Metrics Aggregator Tests
+# ═══════════════════════════════════════════════════════════════════
+
+class TestMetricsAggregator:
+    """The rolling aggregator must match a full _aggregate_metrics() pass."""
+
+    @staticmethod
+    def _random_record(rng, now):
+        from datetime import timedelta
+        rec = {"hash": "%064x" % rng.getrandbits(256)}
+        if rng.random() < 0.8:
+            rec["record_type"] = rng.choice(["USN_SUPPLY_RECEIPT", "USA_MAINTENANCE", "JOINT_CONTRACT"])
+        if rng.random() < 0.5:
+            rec["record_label"] = rng.choice(["Supply Receipt", "Maintenance", ""])
+        if rng.random() < 0.7:
+            rec["branch"] = rng.choice(["USN", "USA", "USAF", "JOINT"])
+        if rng.random() < 0.3:
+            rec["data_source"] = rng.choice(["csv", "api"])
+        elif rng.random() < 0.5:
+            rec["system"] = rng.choice(["NAVSUP", "GCSS-Army"])
+        if rng.random() < 0.6:
+            rec["fee"] = rng.choice([0.01, 0.005, round(0.01 / 7, 6), 0.0])
+        roll = rng.random()
+        if roll < 0.05:
+            rec["timestamp"] = "not-a-timestamp"
+        elif roll < 0.1:
+            pass  # no timestamp at all
+        else:
+            ts = now - timedelta(seconds=rng.randint(0, 400 * 86400))
+            iso = ts.isoformat()
+            rec["timestamp"] = iso.replace("+00:00", "Z") if rng.random() < 0.5 else iso
+        return rec
+
+    @pytest.mark.parametrize("seed", range(10))
+    def test_matches_full_aggregation(self, record_store, seed):
+        """Snapshot output should equal _aggregate_metrics over the same records."""
+        import random
+        from datetime import datetime, timezone
+        rng = random.Random(seed)
+        now = datetime.now(timezone.utc)
+        for _ in range(rng.randint(0, 600)):
+            record_store._append_record(self._random_record(rng, now))
+        expected = record_store._aggregate_metrics(record_store._get_all_records())
+        actual = record_store._metrics_aggregator.snapshot(record_store._live_records)
+        expected.pop("generated_at")
+        actual.pop("generated_at")
+        assert actual == expected
+        assert list(actual["records_by_type"]) == list(expected["records_by_type"])
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -0,0 +1,122 @@
+"""
+S4 Ledger Canonical Hashing Tests
+=================================
+Tests for s4_canonical: byte-identical output to
+json.dumps(sort_keys=True) across value types and options, block-wise
+hashing of large documents, the dict layout cache, and the modules that
+hash through it.
+Run: pytest tests/ -v
+"""
+import enum
+import hashlib
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+import s4_canonical
+from s4_canonical import CanonicalEncoder, canonical_hash, canonical_json, canonical_sha256
+
+
+class Level(enum.IntEnum):
+    HIGH = 3
+
+
+def _reference(obj, **kwargs):
+    return json.dumps(obj, sort_keys=True, **kwargs)
+
+
+DOCS = [
+    {"b": 1, "a": [1, 2.5, None, True, False, "é\n\"\\"], "c": {"y": -0.0, "x": 1e300}},
+    {"nan": float("nan"), "inf": float("inf"), "ninf": float("-inf"), "big": 12345678901234567890},
+    {10: "int keys", 2: "sort as ints", -1: ""},
+    {2.5: "float keys", float("inf"): [0] * 70, 0.1: None},
+    [Level.HIGH, (1, 2), {}, [], ""],
+    "just a string   \U0001f680",
+    42,
+    None,
+    {"records": [{"nsn": f"5340-01-{i:06d}", "qty": i, "tags": ["a"] * (i % 3)} for i in range(700)],
+     "meta": {str(i): i for i in range(100)}},
+    {"by_id": {f"R{i:04d}": {"qty": i, "lots": list(range(i % 5))} for i in range(300)}},
+    [[i, {"z": list(range(80)), "a": "x"}] for i in range(70)],
+]
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Parity with json.dumps(sort_keys=True)
+# ═══════════════════════════════════════════════════════════════════
+
+class TestParity:
+    """Text and hashes match the json.dumps form byte for byte."""
+
+    @pytest.mark.parametrize("doc", DOCS)
+    @pytest.mark.parametrize("ensure_ascii", [True, False])
+    def test_text_and_hash(self, doc, ensure_ascii):
+        expected = _reference(doc, ensure_ascii=ensure_ascii)
+        assert canonical_json(doc, ensure_ascii=ensure_ascii) == expected
+        assert canonical_sha256(doc, ensure_ascii=ensure_ascii) == hashlib.sha256(expected.encode()).hexdigest()
+
+    def test_default_str(self):
+        when = datetime(2026, 1, 2, tzinfo=timezone.utc)
+        doc = {"created": when, "rows": [{"at": when, "i": i} for i in range(200)], "top": [when] * 70}
+        assert canonical_json(doc, default=str) == _reference(doc, default=str)
+        assert canonical_sha256(when, default=str) == hashlib.sha256(_reference(when, default=str).encode()).hexdigest()
+
+    def test_unserializable_raises_like_json(self):
+        with pytest.raises(TypeError):
+            canonical_sha256({"x": object()})
+        with pytest.raises(TypeError):
+            canonical_json({"rows": [object()] * 100})
+        with pytest.raises(TypeError):
+            canonical_json({1: "a", "b": 2, "c": [0] * 100})      # mixed keys cannot be sorted
+
+    def test_hasher_argument(self):
+        doc = DOCS[8]
+        hasher = canonical_hash(doc, hasher=hashlib.blake2b())
+        assert hasher.hexdigest() == hashlib.blake2b(_reference(doc).encode()).hexdigest()
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Block-wise hashing and the layout cache
+# ═══════════════════════════════════════════════════════════════════
+
+class TestStreaming:
+    """Large documents reach the hasher in bounded blocks."""
+
+    def test_blocks_are_bounded(self):
+        doc = {"records": [{"nsn": f"5340-01-{i:06d}", "remarks": "x" * 40} for i in range(20000)]}
+        blocks = []
+        CanonicalEncoder().encode_into(doc, blocks.append)
+        assert "".join(blocks) == _reference(doc)
+        assert len(blocks) > 10
+        assert max(map(len, blocks)) < s4_canonical.FLUSH_BYTES + 64 * 1024
+
+    def test_schema_cache(self, monkeypatch):
+        encoder = CanonicalEncoder()
+        doc = {"b": [0] * 70, "a": {f"R{i}": [i] for i in range(100)}}
+        assert encoder.encode(doc) == _reference(doc)
+        assert set(encoder._schemas) == {("b", "a"), tuple(doc["a"])}
+        assert encoder._schemas[("b", "a")] == [("a", '"a": '), ("b", '"b": ')]
+
+        monkeypatch.setattr(s4_canonical, "MAX_SCHEMAS", 2)
+        encoder.encode({"z": [0] * 70})
+        assert list(encoder._schemas) == [("z",)]
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Call sites
+# ═══════════════════════════════════════════════════════════════════
+
+class TestCallSites:
+    """Modules that hash records produce the same hashes as before."""
+
+    def test_sdk_import_hashes(self):
+        from s4_sdk import S4SDK
+        rec = S4SDK(testnet=True).import_csv("NSN,Qty\n5340-01-234-5678,50\n", "cdmd_oa")["records"][0]
+        assert rec["hash"] == hashlib.sha256(_reference({"NSN": "5340-01-234-5678", "Qty": "50"}).encode()).hexdigest()
+
+    def test_lsar_xml_hash(self):
+        from interop import MILStdXMLParser
+        record = {"LCN": "A01", "NSN": "5340-01-234-5678"}
+        xml = MILStdXMLParser.generate_lsar_xml([record])
+        assert hashlib.sha256(_reference(record).encode()).hexdigest() in xml
@@ -0,0 +1,225 @@
+"""
+S4 Ledger Fee Ledger Tests
+==========================
+Tests for batched anchor fee settlement: local debits on the anchor path,
+one aggregated Payment per user, leased claims and look-up of signed
+Payments before any re-pay, and the treasury reconciliation report.
+Run: pytest tests/ -v
+"""
+import json
+
+import pytest
+
+
+@pytest.fixture
+def fees(api_module, monkeypatch, tmp_path):
+    """A throwaway fee ledger with XRPL Payments captured instead of sent."""
+    api = api_module
+    payments = []
+    on_ledger = {}   # signed tx hash -> "settled" / "failed" / "unknown"
+
+    def pay(user_email=None, user_address=None, amount=None, memo=None, on_signed=None):
+        payments.append({"user": user_email, "amount": amount, "memo": json.loads(json.dumps(memo))})
+        tx_hash = f"FEE{len(payments):061d}"
+        on_signed(tx_hash, 1000)
+        if user_email == "broke@example.mil":
+            on_ledger[tx_hash] = "failed"
+            return {"error": "tecPATH_PARTIAL", "hint": "Insufficient SLS balance."}
+        if user_email == "slow@example.mil":
+            on_ledger[tx_hash] = "unknown"
+            return {"error": "timed out waiting for validation"}
+        on_ledger[tx_hash] = "settled"
+        return {"success": True, "fee_tx": tx_hash, "fee_amount": amount}
+
+    monkeypatch.setattr(api, "FEE_BATCHING", True)
+    monkeypatch.setattr(api, "FEE_LEDGER_DB", str(tmp_path / "fee_ledger.db"))
+    monkeypatch.setattr(api, "_fee_ledger", None)
+    monkeypatch.setattr(api, "_start_fee_settler", lambda: None)
+    monkeypatch.setattr(api, "_init_xrpl", lambda: None)
+    monkeypatch.setattr(api, "_xrpl_client", object())
+    monkeypatch.setattr(api, "_deduct_anchor_fee", pay)
+    monkeypatch.setattr(api, "_fee_payment_status", lambda tx_hash, last_ledger: on_ledger.get(tx_hash, "unknown"))
+    api.payments, api.on_ledger = payments, on_ledger
+    yield api
+    del api.payments, api.on_ledger
+
+
+def _anchor_tx(n):
+    return f"{n:064X}"
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Accrual
+# ═══════════════════════════════════════════════════════════════════
+
+class TestAccrual:
+    """The anchor path only records a debit."""
+
+    def test_charge_records_debit_without_payment(self, fees):
+        result = fees._charge_anchor_fee("ops@example.mil", _anchor_tx(1))
+        assert result["fee_status"] == "accrued" and result["sls_fee"] == "0.01"
+        assert result["fee_debit_id"] and fees.payments == []
+        assert fees._get_fee_ledger().reconcile()["users"]["ops@example.mil"]["outstanding"] == "0.01"
+
+    def test_same_anchor_is_debited_once(self, fees):
+        first = fees._charge_anchor_fee("ops@example.mil", _anchor_tx(1))
+        again = fees._charge_anchor_fee("ops@example.mil", _anchor_tx(1))
+        assert first["fee_debit_id"] == again["fee_debit_id"]
+        assert fees._get_fee_ledger().reconcile()["totals"]["anchors"] == 1
+
+    def test_batch_records_sharing_a_tx_are_debited_separately(self, fees):
+        for rid in ("REC-1", "REC-2", "REC-3"):
+            fees._charge_anchor_fee("ops@example.mil", _anchor_tx(9), ref=rid)
+        assert fees._get_fee_ledger().reconcile()["users"]["ops@example.mil"]["accrued"] == "0.03"
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Settlement
+# ═══════════════════════════════════════════════════════════════════
+
+class TestSettlement:
+    """Open debits are paid as one Payment per user, with the anchors in the memo."""
+
+    def test_one_payment_per_user(self, fees):
+        for n in range(7):
+            fees._charge_anchor_fee("ops@example.mil", _anchor_tx(n))
+        for n in range(7, 10):
+            fees._charge_anchor_fee("lead@example.mil", _anchor_tx(n))
+        summary = fees._settle_anchor_fees()
+        assert summary["settled"] == 2 and summary["failed"] == 0
+        by_user = {p["user"]: p for p in fees.payments}
+        assert by_user["ops@example.mil"]["amount"] == "0.07"
+        assert by_user["lead@example.mil"]["amount"] == "0.03"
+        memo = by_user["ops@example.mil"]["memo"]
+        assert memo["type"] == "anchor_fee_batch" and memo["count"] == 7
+        assert memo["anchors"] == [_anchor_tx(n)[:16] for n in range(7)]
+        assert fees._settle_anchor_fees()["payments"] == []   # nothing left open
+
+    def test_large_backlog_is_split(self, fees, monkeypatch):
+        monkeypatch.setattr(fees, "FEE_SETTLE_MAX_ANCHORS", 4)
+        for n in range(10):
+            fees._charge_anchor_fee("ops@example.mil", _anchor_tx(n))
+        fees._settle_anchor_fees()
+        assert [p["amount"] for p in fees.payments] == ["0.04", "0.04", "0.02"]
+
+    def test_failed_payment_is_retried_next_pass(self, fees):
+        fees._charge_anchor_fee("broke@example.mil", _anchor_tx(1))
+        fees._charge_anchor_fee("broke@example.mil", _anchor_tx(2))
+        summary = fees._settle_anchor_fees()
+        assert summary["failed"] == 1 and summary["payments"][0]["error"] == "tecPATH_PARTIAL"
+        report = fees._get_fee_ledger().reconcile()
+        assert report["users"]["broke@example.mil"]["outstanding"] == "0.02"
+        fees._settle_anchor_fees()
+        assert [p["amount"] for p in fees.payments] == ["0.02", "0.02"]
+
+    def test_interrupted_settlement_is_resumed(self, fees):
+        fees._charge_anchor_fee("ops@example.mil", _anchor_tx(1))
+        claimed = fees._get_fee_ledger().claim(owner="dead", lease_seconds=0)   # pass dies before paying
+        fees._charge_anchor_fee("ops@example.mil", _anchor_tx(2))
+        fees._settle_anchor_fees()
+        paid = [p["memo"]["settlement"] for p in fees.payments]
+        assert claimed[0]["settlement_id"] in paid and len(paid) == 2
+        assert [p["amount"] for p in fees.payments] == ["0.01", "0.01"]
+        assert fees._get_fee_ledger().reconcile()["users"]["ops@example.mil"]["settled"] == "0.02"
+
+    def test_signed_settlement_is_looked_up_not_repaid(self, fees):
+        fees._charge_anchor_fee("ops@example.mil", _anchor_tx(1))
+        ledger = fees._get_fee_ledger()
+        claimed = ledger.claim(owner="dead", lease_seconds=0)
+        ledger.mark_signed(claimed[0]["settlement_id"], "F" * 64, 1000)   # crashed after submitting
+        fees.on_ledger["F" * 64] = "settled"
+        summary = fees._settle_anchor_fees()
+        assert fees.payments == [] and summary["settled"] == 1
+        assert ledger.settlements(status="settled")[0]["tx_hash"] == "F" * 64
+
+    def test_signed_settlement_that_expired_is_repaid(self, fees):
+        fees._charge_anchor_fee("ops@example.mil", _anchor_tx(1))
+        ledger = fees._get_fee_ledger()
+        claimed = ledger.claim(owner="dead", lease_seconds=0)
+        ledger.mark_signed(claimed[0]["settlement_id"], "F" * 64, 1000)
+        fees.on_ledger["F" * 64] = "failed"
+        assert fees._settle_anchor_fees()["failed"] == 1
+        fees._settle_anchor_fees()
+        assert [p["amount"] for p in fees.payments] == ["0.01"]
+        assert ledger.reconcile()["users"]["ops@example.mil"]["settled"] == "0.01"
+
+    def test_unconfirmed_payment_keeps_its_debits(self, fees):
+        fees._charge_anchor_fee("slow@example.mil", _anchor_tx(1))
+        summary = fees._settle_anchor_fees()
+        assert summary["pending"] == 1 and summary["payments"][0]["unconfirmed"] is True
+        ledger = fees._get_fee_ledger()
+        assert ledger.reconcile()["users"]["slow@example.mil"]["pending"] == "0.01"
+        fees._settle_anchor_fees()                         # still in flight: no second Payment
+        assert len(fees.payments) == 1
+        fees.on_ledger[f"FEE{1:061d}"] = "settled"
+        assert fees._settle_anchor_fees()["settled"] == 1 and len(fees.payments) == 1
+        assert ledger.reconcile()["users"]["slow@example.mil"]["settled"] == "0.01"
+
+    def test_leased_settlement_is_left_to_its_owner(self, fees):
+        fees._charge_anchor_fee("ops@example.mil", _anchor_tx(1))
+        fees._get_fee_ledger().claim(owner="other-instance", lease_seconds=300)
+        assert fees._settle_anchor_fees()["payments"] == [] and fees.payments == []
+
+    def test_skipped_without_xrpl(self, fees, monkeypatch):
+        monkeypatch.setattr(fees, "_xrpl_client", None)
+        fees._charge_anchor_fee("ops@example.mil", _anchor_tx(1))
+        assert fees._settle_anchor_fees()["skipped"]
+        assert fees._get_fee_ledger().reconcile()["users"]["ops@example.mil"]["outstanding"] == "0.01"
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Durability
+# ═══════════════════════════════════════════════════════════════════
+
+class TestDurability:
+    """Batching needs a ledger file that outlives the instance."""
+
+    def test_temp_dir_ledger_is_not_durable(self, api_module, tmp_path):
+        assert api_module._is_durable_path("") is False
+        assert api_module._is_durable_path(str(tmp_path / "fee_ledger.db")) is False
+        assert api_module._is_durable_path("/var/lib/s4/fee_ledger.db") is True
+
+    def test_batching_is_off_without_a_durable_ledger(self, api_module):
+        if not api_module._is_durable_path(api_module.FEE_LEDGER_DB):
+            assert api_module.FEE_BATCHING is False
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Reconciliation
+# ═══════════════════════════════════════════════════════════════════
+
+class TestReconciliation:
+    """Treasury receipts equal the settled debits exactly."""
+
+    def test_report_balances(self, fees):
+        for n in range(30):
+            fees._charge_anchor_fee(f"user{n % 3}@example.mil", _anchor_tx(n))
+        fees._charge_anchor_fee("broke@example.mil", _anchor_tx(99))
+        fees._settle_anchor_fees()
+        fees._charge_anchor_fee("user0@example.mil", _anchor_tx(100))
+        report = fees._get_fee_ledger().reconcile()
+        assert report["balanced"] is True and report["mismatches"] == []
+        assert report["totals"]["accrued"] == "0.32"
+        assert report["totals"]["settled"] == report["totals"]["paid"] == "0.30"
+        assert report["totals"]["outstanding"] == "0.02" and report["totals"]["payments"] == 3
+        assert report["users"]["user0@example.mil"] == {
+            "anchors": 11, "accrued": "0.11", "settled": "0.10", "pending": "0", "outstanding": "0.01"}
+
+    def test_tampered_settlement_is_flagged(self, fees):
+        fees._charge_anchor_fee("ops@example.mil", _anchor_tx(1))
+        fees._settle_anchor_fees()
+        ledger = fees._get_fee_ledger()
+        ledger._conn().execute("UPDATE fee_settlements SET amount = '0.02'")
+        report = ledger.reconcile()
+        assert report["balanced"] is False
+        assert report["mismatches"][0]["amount"] == "0.02" and report["mismatches"][0]["debit_total"] == "0.01"
+
+    def test_endpoints_require_master_key(self, fees, api_call):
+        fees._charge_anchor_fee("ops@example.mil", _anchor_tx(1))
+        status, _ = api_call("GET", "/api/fees/reconciliation", headers={"X-API-Key": "nope"})
+        assert status == 403
+        key = {"X-API-Key": fees.API_MASTER_KEY}
+        status, body = api_call("POST", "/api/fees/settle", {}, headers=key)
+        assert status == 200 and body["settled"] == 1
+        status, body = api_call("GET", "/api/fees/reconciliation", headers=key)
+        assert status == 200 and body["balanced"] is True and body["totals"]["paid"] == "0.01"
@@ -0,0 +1,138 @@
+"""
+S4 Ledger File Hashing Tests
+============================
+Tests for POST /api/hash/file with JSON (utf-8 / base64) and streamed
+application/octet-stream bodies (Content-Length and chunked), chunk-level
+Merkle roots, and the SDK's local hash_path() / verify_path_chunks().
+Run: pytest tests/ -v
+"""
+import base64
+import hashlib
+import io
+import os
+
+import pytest
+
+import s4_sdk
+from s4_sdk import S4SDK
+
+OCTET = {"Content-Type": "application/octet-stream"}
+CHUNK = 1 << 16
+
+
+@pytest.fixture
+def sdk():
+    return S4SDK(testnet=True)
+
+
+@pytest.fixture
+def payload():
+    return os.urandom(3 * CHUNK + 1234)
+
+
+def _chunked(data, piece=50000):
+    """data in Transfer-Encoding: chunked framing."""
+    out = b"".join(b"%x;ext=1\r\n%s\r\n" % (len(data[i:i + piece]), data[i:i + piece])
+                   for i in range(0, len(data), piece))
+    return out + b"0\r\nX-Trailer: 1\r\n\r\n"
+
+
+def _proof(leaves, index):
+    return s4_sdk._merkle_proof(s4_sdk._merkle_levels(leaves), index)
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  POST /api/hash/file
+# ═══════════════════════════════════════════════════════════════════
+
+class TestHashFileEndpoint:
+    """JSON and raw uploads hash to sha256 of the file bytes."""
+
+    def test_json_base64_unchanged(self, api_call, payload):
+        status, body = api_call("POST", "/api/hash/file",
+                                {"content": base64.b64encode(payload).decode(), "encoding": "base64"})
+        assert status == 200 and body["hash"] == hashlib.sha256(payload).hexdigest()
+        assert body["size_bytes"] == len(payload)
+
+    def test_octet_stream(self, api_call, api_module, payload, monkeypatch):
+        monkeypatch.setattr(api_module, "HASH_FILE_BLOCK_BYTES", 4096)
+        status, body = api_call("POST", "/api/hash/file?filename=tdp.zip", payload, headers=OCTET)
+        assert status == 200
+        assert body["hash"] == hashlib.sha256(payload).hexdigest() and body["size_bytes"] == len(payload)
+        assert body["filename"] == "tdp.zip" and "merkle_root" not in body
+
+    def test_chunked_transfer_encoding(self, api_call, payload):
+        status, body = api_call("POST", "/api/hash/file", _chunked(payload),
+                                headers=dict(OCTET, **{"Transfer-Encoding": "chunked"}))
+        assert status == 200 and body["hash"] == hashlib.sha256(payload).hexdigest()
+
+    def test_chunk_merkle_root_matches_sdk(self, api_call, sdk, payload):
+        status, body = api_call("POST", f"/api/hash/file?chunk_size={CHUNK}", payload, headers=OCTET)
+        local = sdk.hash_path(io.BytesIO(payload), chunk_size=CHUNK)
+        assert status == 200 and body["chunk_count"] == 4
+        assert body["chunk_hashes"][1] == hashlib.sha256(payload[CHUNK:2 * CHUNK]).hexdigest()
+        assert body["chunk_hashes"] == local["chunk_hashes"] and body["merkle_root"] == local["merkle_root"]
+
+    def test_sdk_and_api_share_one_implementation(self, api_module):
+        """Digests, trees and proofs come from s4_merkle on both sides, so they cannot drift."""
+        import s4_merkle
+        for name in ("digest_blocks", "merkle_levels", "merkle_proof"):
+            assert getattr(api_module, "_" + name) is getattr(s4_sdk, "_" + name) is getattr(s4_merkle, name)
+
+    @pytest.mark.parametrize("query", ["chunk_size=100", "chunk_size=abc"])
+    def test_bad_chunk_size(self, api_call, query):
+        status, body = api_call("POST", f"/api/hash/file?{query}", b"data", headers=OCTET)
+        assert status == 400 and "chunk_size" in body["error"]
+
+    def test_too_large(self, api_call, api_module, monkeypatch):
+        monkeypatch.setattr(api_module, "HASH_FILE_MAX_BYTES", 10)
+        assert api_call("POST", "/api/hash/file", b"x" * 11, headers=OCTET)[0] == 413
+        chunked = dict(OCTET, **{"Transfer-Encoding": "chunked"})
+        assert api_call("POST", "/api/hash/file", _chunked(b"x" * 11, piece=4), headers=chunked)[0] == 413
+
+    def test_malformed_and_short_bodies(self, api_call):
+        chunked = dict(OCTET, **{"Transfer-Encoding": "chunked"})
+        assert api_call("POST", "/api/hash/file", b"zz\r\nabc\r\n0\r\n\r\n", headers=chunked)[0] == 400
+        assert api_call("POST", "/api/hash/file", b"abc", headers=dict(OCTET, **{"Content-Length": "10"}))[0] == 400
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  SDK hash_path / verify_path_chunks
+# ═══════════════════════════════════════════════════════════════════
+
+class TestHashPath:
+    """Local hashing by mmap or readinto, with chunk re-verification."""
+
+    def test_mmap_and_readinto_agree(self, sdk, payload, tmp_path):
+        path = tmp_path / "tdp.bin"
+        path.write_bytes(payload)
+        mapped = sdk.hash_path(str(path), chunk_size=CHUNK, block_size=5000)
+        with open(path, "rb") as fp:
+            streamed = sdk.hash_path(fp, chunk_size=CHUNK, block_size=7000)
+        assert mapped["hash"] == hashlib.sha256(payload).hexdigest() and mapped["filename"] == "tdp.bin"
+        assert {k: v for k, v in streamed.items() if k != "filename"} == \
+            {k: v for k, v in mapped.items() if k != "filename"}
+        assert S4SDK.verify_inclusion(mapped["chunk_hashes"][3], _proof(mapped["chunk_hashes"], 3),
+                                      mapped["merkle_root"])
+
+    def test_empty_file(self, sdk, tmp_path):
+        path = tmp_path / "empty"
+        path.write_bytes(b"")
+        result = sdk.hash_path(path, chunk_size=CHUNK)
+        assert result["hash"] == hashlib.sha256(b"").hexdigest() and result["chunk_count"] == 0
+
+    def test_verify_path_chunks(self, sdk, payload, tmp_path):
+        path = tmp_path / "tdp.bin"
+        path.write_bytes(payload)
+        recorded = sdk.hash_path(path, chunk_size=CHUNK)["chunk_hashes"]
+        assert sdk.verify_path_chunks(path, recorded, CHUNK) == []
+
+        tampered = bytearray(payload)
+        tampered[2 * CHUNK + 5] ^= 0xFF
+        path.write_bytes(bytes(tampered[:-10]))
+        assert sdk.verify_path_chunks(path, recorded, CHUNK) == [2, 3]
+        assert sdk.verify_path_chunks(path, recorded, CHUNK, indexes=[0, 1]) == []
+
+    def test_bad_chunk_size(self, sdk, tmp_path):
+        with pytest.raises(ValueError):
+            sdk.hash_path(io.BytesIO(b"x"), chunk_size=0)
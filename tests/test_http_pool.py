@@ -0,0 +1,169 @@
+"""
+S4 Ledger Shared HTTP Client Tests
+==================================
+Tests for the keep-alive connection pool used for all outbound API calls,
+run against a local HTTP/1.1 server.
+Run: pytest tests/ -v
+"""
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, payload, close=False):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if close:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        srv = self.server
+        with srv.lock:
+            srv.connections.add(id(self.connection))
+            srv.in_flight += 1
+            srv.peak = max(srv.peak, srv.in_flight)
+            srv.hits[self.path] = srv.hits.get(self.path, 0) + 1
+            hits = srv.hits[self.path]
+        try:
+            if self.path == "/slow":
+                time.sleep(0.05)
+            if self.path == "/flaky" and hits == 1:
+                self._reply(503, {"error": "busy"})
+            elif self.path == "/missing":
+                self._reply(404, {"error": "nope"})
+            else:
+                self._reply(200, {"path": self.path, "hits": hits}, close=self.path == "/close")
+                if self.path == "/drop":
+                    self.close_connection = True  # hang up without announcing it
+        finally:
+            with srv.lock:
+                srv.in_flight -= 1
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        data = json.loads(self.rfile.read(length) or b"{}")
+        with self.server.lock:
+            self.server.connections.add(id(self.connection))
+            self.server.hits[self.path] = self.server.hits.get(self.path, 0) + 1
+        if self.path == "/hangup":
+            self.close_connection = True  # processed, but the reply never arrives
+            return
+        self._reply(201, {"echo": data, "ua": self.headers.get("User-Agent")})
+
+
+@pytest.fixture
+def stub_server():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    srv.daemon_threads = True
+    srv.lock = threading.Lock()
+    srv.connections, srv.hits = set(), {}
+    srv.in_flight = srv.peak = 0
+    threading.Thread(target=srv.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    yield srv, f"http://127.0.0.1:{srv.server_address[1]}"
+    srv.shutdown()
+    srv.server_close()
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Connection Reuse
+# ═══════════════════════════════════════════════════════════════════
+
+class TestHTTPPool:
+    """The pool should reuse keep-alive connections and behave like urlopen."""
+
+    def test_keep_alive_reuse(self, api_module, stub_server):
+        """Sequential requests to one host should share a single connection."""
+        srv, base = stub_server
+        pool = api_module._HTTPPool()
+        for i in range(10):
+            with pool.urlopen(urllib.request.Request(f"{base}/r{i}"), timeout=5) as resp:
+                assert resp.status == 200
+                assert json.loads(resp.read())["path"] == f"/r{i}"
+        assert pool.stats["connections_opened"] == 1
+        assert pool.stats["connections_reused"] == 9
+        assert len(srv.connections) == 1
+        pool.close()
+
+    def test_post_body_and_headers(self, api_module, stub_server):
+        """POST bodies and headers should be sent as with urllib.request."""
+        _, base = stub_server
+        pool = api_module._HTTPPool()
+        req = urllib.request.Request(f"{base}/rows", data=json.dumps({"a": 1}).encode(),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+        resp = pool.urlopen(req, timeout=5)
+        assert resp.status == 201
+        assert json.loads(resp.read()) == {"echo": {"a": 1}, "ua": "S4-Ledger-API"}
+
+    def test_http_error_raises_httperror(self, api_module, stub_server):
+        """4xx responses should raise urllib.error.HTTPError with a readable body."""
+        _, base = stub_server
+        pool = api_module._HTTPPool()
+        with pytest.raises(urllib.error.HTTPError) as exc:
+            pool.urlopen(f"{base}/missing", timeout=5)
+        assert exc.value.code == 404
+        assert json.loads(exc.value.read()) == {"error": "nope"}
+
+    def test_retry_on_503_for_idempotent_requests(self, api_module, stub_server):
+        """A transient 503 on GET should be retried with backoff."""
+        srv, base = stub_server
+        pool = api_module._HTTPPool(backoff=0.01)
+        resp = pool.urlopen(f"{base}/flaky", timeout=5)
+        assert resp.status == 200
+        assert srv.hits["/flaky"] == 2
+        assert pool.stats["retries"] == 1
+
+    def test_server_closed_connection_is_not_reused(self, api_module, stub_server):
+        """Responses with Connection: close should not park the socket."""
+        _, base = stub_server
+        pool = api_module._HTTPPool()
+        pool.urlopen(f"{base}/close", timeout=5)
+        pool.urlopen(f"{base}/close", timeout=5)
+        assert pool.stats["connections_opened"] == 2
+
+    def test_stale_connection_is_replaced(self, api_module, stub_server):
+        """A parked connection the server has dropped should be retried on a fresh socket."""
+        _, base = stub_server
+        pool = api_module._HTTPPool()
+        pool.urlopen(f"{base}/drop", timeout=5)
+        time.sleep(0.05)
+        resp = pool.urlopen(urllib.request.Request(f"{base}/b", data=b"{}", method="POST"), timeout=5)
+        assert resp.status == 201
+        assert pool.stats["connections_opened"] == 2
+
+    def test_post_is_not_resent_after_it_was_sent(self, api_module, stub_server):
+        """A POST that reached the server is not resent when the reply is lost."""
+        srv, base = stub_server
+        pool = api_module._HTTPPool()
+        pool.urlopen(f"{base}/warm", timeout=5)
+        req = urllib.request.Request(f"{base}/hangup", data=b"{}", method="POST")
+        with pytest.raises(urllib.error.URLError):
+            pool.urlopen(req, timeout=5)
+        assert srv.hits["/hangup"] == 1 and pool.stats["connections_reused"] == 1
+
+    def test_per_host_concurrency_limit(self, api_module, stub_server):
+        """No more than max_per_host requests should be in flight to one host."""
+        srv, base = stub_server
+        pool = api_module._HTTPPool(max_per_host=2)
+        threads = [threading.Thread(target=pool.urlopen, args=(f"{base}/slow",), kwargs={"timeout": 5})
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert srv.hits["/slow"] == 8
+        assert srv.peak <= 2
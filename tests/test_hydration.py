@@ -0,0 +1,160 @@
+"""
+S4 Ledger Cold-Start Hydration Tests
+====================================
+Tests for keyset-paginated, concurrent Supabase hydration and the lazy mode.
+Run: pytest tests/ -v
+"""
+import hashlib
+import re
+import threading
+from urllib.parse import parse_qs
+
+import pytest
+
+
+class _FakeTables:
+    """Serves GET requests from in-memory tables the way PostgREST pages them."""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.requests = []
+        self.fail_after = None     # fail every request after this many
+        self.gate = None           # threading.Event every request waits on
+        self.barrier = None        # threading.Barrier every first page waits on
+
+    def __call__(self, table, *, method="GET", data=None, query_params="", select="*",
+                 prefer="return=representation", timeout=10, errors=None):
+        if method != "GET":
+            return []
+        params = {k: v[0] for k, v in parse_qs(query_params).items()}
+        first_page = "or" not in params and not params.get("id", "").startswith("gt.")
+        self.requests.append((table, params))
+        if self.barrier is not None and first_page:
+            self.barrier.wait()
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.fail_after is not None and len(self.requests) > self.fail_after:
+            return None
+        keys = [o.rsplit(".", 1)[0] for o in params.get("order", "id.asc").split(",")]
+        rows = sorted(self.tables.get(table, []), key=lambda r: [r[k] for k in keys])
+        if "or" in params:
+            ts, rid = re.findall(r'"([^"]*)"', params["or"])[1:]
+            rows = [r for r in rows if (r["timestamp"], r["id"]) > (ts, rid)]
+        elif params.get("id", "").startswith("gt."):
+            rows = [r for r in rows if r["id"] > params["id"][3:]]
+        return rows[:int(params.get("limit", len(rows)))]
+
+
+def _record_rows(n):
+    # Several rows share each timestamp so paging has to break ties on id
+    return [{"id": f"{i:08d}", "record_id": f"REC-{i:06d}", "hash": hashlib.sha256(str(i).encode()).hexdigest(),
+             "timestamp": f"2025-01-01T00:{i // 420:02d}:{i // 7 % 60:02d}+00:00", "record_type": "TEST"}
+            for i in range(n)]
+
+
+@pytest.fixture
+def hydration(record_store, monkeypatch):
+    """Fresh hydration state pointed at a fake, paginating Supabase."""
+    api = record_store
+    fake = _FakeTables({"records": _record_rows(1050),
+                        "proof_chains": [{"id": f"{i:04d}", "record_id": "REC-000001", "timestamp": f"t{i:04d}",
+                                          "event_type": "anchor.created"} for i in range(30)],
+                        "custody_transfers": [],
+                        "webhook_registrations": [{"id": "w1", "org_key": "org", "url": "https://x", "events": ["anchor.confirmed"]}],
+                        "api_keys": [{"id": f"k{i:03d}", "key_hash": f"h{i}"} for i in range(120)],
+                        "verify_audit_log": []})
+    monkeypatch.setattr(api, "SUPABASE_URL", "https://example.supabase.co")
+    monkeypatch.setattr(api, "SUPABASE_SERVICE_KEY", "service-key")
+    monkeypatch.setattr(api, "_supabase_request", fake)
+    monkeypatch.setattr(api, "SB_PAGE_SIZE", 100)
+    monkeypatch.setattr(api, "HYDRATE_LAZY", False)
+    monkeypatch.setattr(api, "_hydrated", False)
+    monkeypatch.setattr(api, "_records_loaded", False)
+    monkeypatch.setattr(api, "_hydration_stats", {"status": "idle", "mode": None, "total_ms": None, "phases": {}})
+    monkeypatch.setattr(api, "_hydration_done", {name: threading.Event() for name, _ in api._HYDRATION_PHASES})
+    monkeypatch.setattr(api, "_proof_chain_store", {})
+    monkeypatch.setattr(api, "_custody_chain_store", {})
+    monkeypatch.setattr(api, "_webhook_store", {})
+    monkeypatch.setattr(api, "_webhook_index", {})
+    monkeypatch.setattr(api, "_verify_audit_log", [])
+    monkeypatch.setattr(api, "API_KEYS_STORE", {})
+    monkeypatch.setattr(api.time, "sleep", lambda s: None)
+    return api, fake
+
+
+class TestKeysetHydration:
+    """Every row is loaded page by page; nothing is capped."""
+
+    def test_loads_all_rows_across_pages(self, hydration):
+        api, fake = hydration
+        api._hydrate_from_supabase()
+        assert [r["record_id"] for r in api._live_records] == [f"REC-{i:06d}" for i in range(1050)]
+        assert len(api._proof_chain_store["REC-000001"]) == 30
+        assert sum(1 for k in api.API_KEYS_STORE if k.startswith("__hash__")) == 120
+        assert [h["url"] for h in api._webhook_index["anchor.confirmed"]["org"]] == ["https://x"]
+        phases = api._hydration_stats["phases"]
+        assert phases["records"]["pages"] == 11 and phases["records"]["rows"] == 1050
+        assert phases["records"]["status"] == "complete"
+        assert all(p["ms"] >= 0 for p in phases.values())
+        assert api._hydration_stats["status"] == "complete" and api._hydration_stats["total_ms"] is not None
+        assert all(int(p["limit"]) == 100 for t, p in fake.requests if t == "records")
+
+    def test_failed_page_is_reported_as_partial(self, hydration, monkeypatch):
+        api, fake = hydration
+        monkeypatch.setattr(api, "_HYDRATION_PHASES", (("records", api._load_records_from_supabase),))
+        fake.fail_after = 3
+        api._hydrate_from_supabase()
+        assert len(api._live_records) == 300
+        assert api._hydration_stats["phases"]["records"]["status"] == "partial"
+
+    def test_records_already_in_memory_are_skipped(self, hydration):
+        api, fake = hydration
+        api._append_record({"record_id": "REC-000005", "hash": "live", "tx_hash": ""})
+        api._hydrate_from_supabase()
+        assert len(api._live_records) == 1050
+        assert api._first_record("REC-000005", "record_id")["hash"] == "live"
+
+    def test_loaders_run_concurrently(self, hydration):
+        api, fake = hydration
+        fake.barrier = threading.Barrier(len(api._HYDRATION_PHASES), timeout=5)
+        api._hydrate_from_supabase()
+        assert not fake.barrier.broken
+        assert api._hydration_stats["status"] == "complete"
+
+
+class TestLazyHydration:
+    """Lazy mode answers at once and fills stores in the background."""
+
+    def test_lazy_mode_returns_before_loading(self, hydration, api_call, monkeypatch):
+        api, fake = hydration
+        monkeypatch.setattr(api, "HYDRATE_LAZY", True)
+        fake.gate = threading.Event()
+        api._hydrate_from_supabase()
+        assert api._hydration_stats["mode"] == "lazy"
+        assert api._hydration_stats["status"] == "running"
+        assert api._live_records == []
+
+        status, body = api_call("GET", "/api/status")
+        assert status == 200 and body["hydration"]["status"] == "running"
+
+        threading.Timer(0.1, fake.gate.set).start()
+        status, body = api_call("POST", "/api/verify", {"record_text": "7"})
+        assert status == 200
+        assert body["status"] == "MATCH"
+        assert api._await_hydration("api_keys", timeout=5)
+
+    def test_live_records_stay_in_time_order(self, hydration, monkeypatch):
+        """A record anchored during a lazy hydration ends up after the older hydrated rows."""
+        api, fake = hydration
+        monkeypatch.setattr(api, "HYDRATE_LAZY", True)
+        fake.gate = threading.Event()
+        api._hydrate_from_supabase()
+        live = api._append_record({"record_id": "REC-LIVE", "hash": "ab" * 32, "tx_hash": "TXLIVE",
+                                   "timestamp": "2026-06-01T00:00:00+00:00"})
+        fake.gate.set()
+        assert api._await_hydration("records", timeout=5)
+        stamps = [r["timestamp"] for r in api._live_records]
+        assert stamps == sorted(stamps) and api._live_records[-1] is live
+        assert api._first_record("REC-LIVE", "record_id") is live
+        assert api._first_record("REC-000500", "record_id")["record_id"] == "REC-000500"
+        assert [r["record_id"] for r in api._records_by("tx_hash", "TXLIVE")] == ["REC-LIVE"]
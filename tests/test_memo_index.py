@@ -0,0 +1,226 @@
+"""
+S4 Ledger Memo Index Tests
+==========================
+Tests for the XRPL anchor memo indexer and local chain verification, run
+against a stub rippled JSON-RPC server.
+Run: pytest tests/ -v
+"""
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from s4_memo_index import S4MemoIndex, decode_anchor_memos
+
+ISSUER = "rIssuerAccountXXXXXXXXXXXXXXXXXXXX"
+
+
+def _hex(text):
+    return text.encode("utf-8").hex().upper()
+
+
+def _anchor_tx(seq, record_hash, ledger_index, result="tesSUCCESS", memo_type="s4/anchor", record_type="MAINTENANCE_3M"):
+    memo = json.dumps({"hash": record_hash, "type": record_type, "branch": "NAVY",
+                       "platform": "S4 Ledger", "ts": "2026-01-01T00:00:00+00:00"})
+    return {
+        "tx": {"TransactionType": "AccountSet", "Account": ISSUER, "Sequence": seq,
+               "hash": f"{seq:064X}", "ledger_index": ledger_index,
+               "Memos": [{"Memo": {"MemoType": _hex(memo_type), "MemoData": _hex(memo)}}]},
+        "meta": {"TransactionResult": result},
+        "validated": True,
+    }
+
+
+class _StubRippled(BaseHTTPRequestHandler):
+    """Serves account_tx from server.ledger, oldest first, `limit` per page with an index marker."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        srv = self.server
+        params = body["params"][0]
+        srv.calls.append((body["method"], params))
+        if body["method"] != "account_tx" or params["account"] != ISSUER:
+            result = {"status": "error", "error": "actNotFound"}
+        else:
+            lo = params["ledger_index_min"] if params["ledger_index_min"] != -1 else 0
+            txs = [t for t in srv.ledger if t["tx"]["ledger_index"] >= lo]
+            start = params.get("marker", {}).get("seq", 0)
+            page = txs[start:start + params["limit"]]
+            result = {"status": "success", "account": ISSUER, "transactions": page,
+                      "ledger_index_min": lo, "ledger_index_max": srv.validated_ledger}
+            if start + params["limit"] < len(txs):
+                result["marker"] = {"seq": start + params["limit"]}
+        payload = json.dumps({"result": result}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+@pytest.fixture
+def rippled():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _StubRippled)
+    srv.daemon_threads = True
+    srv.calls = []
+    srv.ledger = [_anchor_tx(i + 1, hashlib.sha256(f"record-{i}".encode()).hexdigest(), 1000 + i // 3)
+                  for i in range(25)]
+    srv.validated_ledger = 1010
+    threading.Thread(target=srv.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    yield srv, f"http://127.0.0.1:{srv.server_address[1]}/"
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def index(rippled, tmp_path):
+    srv, url = rippled
+    return S4MemoIndex(str(tmp_path / "anchors.db"), account=ISSUER, rpc_url=url, page_size=10)
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Memo Decoding
+# ═══════════════════════════════════════════════════════════════════
+
+class TestDecode:
+    """Only well-formed s4/anchor memos are indexed."""
+
+    def test_decodes_anchor_memo(self):
+        memos = decode_anchor_memos(_anchor_tx(1, "ab" * 32, 5)["tx"])
+        assert memos[0]["hash"] == "ab" * 32 and memos[0]["branch"] == "NAVY"
+
+    def test_skips_other_memos(self):
+        assert decode_anchor_memos(_anchor_tx(1, "ab" * 32, 5, memo_type="s4/anchor-fee")["tx"]) == []
+        assert decode_anchor_memos({"Memos": [{"Memo": {"MemoType": _hex("s4/anchor"), "MemoData": "zz"}}]}) == []
+        assert decode_anchor_memos({"TransactionType": "AccountSet"}) == []
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Indexing
+# ═══════════════════════════════════════════════════════════════════
+
+class TestRefresh:
+    """account_tx is paged into SQLite and refreshed from the last ledger."""
+
+    def test_full_refresh_pages_through_marker(self, rippled, index):
+        srv, _ = rippled
+        stats = index.refresh()
+        assert stats == {"pages": 3, "transactions": 25, "anchors": 25, "from_ledger": -1,
+                         "complete": True, "last_ledger": 1010}
+        assert [p.get("marker") for _, p in srv.calls] == [None, {"seq": 10}, {"seq": 20}]
+        h = hashlib.sha256(b"record-7").hexdigest()
+        assert index.lookup_hash(h)[0]["tx_hash"] == f"{8:064X}"
+        assert index.lookup_tx(f"{8:064x}")[0]["hash"] == h
+        assert index.get_stats()["anchors"] == 25
+
+    def test_incremental_refresh_starts_after_last_ledger(self, rippled, index):
+        srv, _ = rippled
+        index.refresh()
+        srv.ledger.append(_anchor_tx(26, "cd" * 32, 1011))
+        srv.ledger.append(_anchor_tx(27, "ef" * 32, 1011, result="tecNO_PERMISSION"))
+        srv.validated_ledger = 1012
+        srv.calls.clear()
+        stats = index.refresh()
+        assert srv.calls[0][1]["ledger_index_min"] == 1011
+        assert stats["transactions"] == 2 and stats["anchors"] == 1
+        assert index.lookup_hash("CD" * 32)[0]["ledger_index"] == 1011
+        assert index.lookup_hash("ef" * 32) == []
+        assert index.last_ledger() == 1012
+
+    def test_interrupted_refresh_keeps_checkpoint(self, index):
+        stats = index.refresh(max_pages=1)
+        assert stats["complete"] is False
+        assert index.last_ledger() is None
+        assert index.refresh()["complete"] is True
+        assert index.get_stats()["anchors"] == 25   # replayed page is not duplicated
+
+    def test_rpc_error_raises(self, rippled, tmp_path):
+        srv, url = rippled
+        other = S4MemoIndex(str(tmp_path / "other.db"), account="rSomeoneElse", rpc_url=url)
+        with pytest.raises(RuntimeError, match="actNotFound"):
+            other.refresh()
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Local Verification
+# ═══════════════════════════════════════════════════════════════════
+
+class TestLocalVerification:
+    """SDK and backup verification resolve anchors from the index."""
+
+    @pytest.fixture
+    def sdk(self, rippled, tmp_path):
+        from s4_sdk import S4SDK
+        srv, url = rippled
+        sdk = S4SDK(xrpl_rpc_url=url, sls_issuer=ISSUER)
+        sdk.open_memo_index(str(tmp_path / "sdk.db"))
+        return sdk
+
+    def test_verify_by_tx_hash(self, sdk):
+        result = sdk.verify_against_chain("record-3", tx_hash=f"{4:064X}")
+        assert result["status"] == "MATCH" and result["verified"] is True
+        tampered = sdk.verify_against_chain("record-3 (edited)", tx_hash=f"{4:064X}")
+        assert tampered["status"] == "MISMATCH" and tampered["tamper_detected"] is True
+        assert sdk.verify_against_chain("record-3", tx_hash="F" * 64)["status"] == "NOT_FOUND"
+
+    def test_verify_by_record_hash_alone(self, sdk):
+        result = sdk.verify_against_chain("record-12")
+        assert result["status"] == "MATCH" and result["tx_hash"] == f"{13:064X}"
+        assert sdk.verify_against_chain("never anchored")["status"] == "NOT_FOUND"
+
+    @pytest.fixture
+    def batch(self, rippled, sdk):
+        """Anchor a two-leaf batch root; returns (tx_hash, leaf hashes, root)."""
+        srv, _ = rippled
+        leaves = [sdk.create_record_hash("batched-0"), sdk.create_record_hash("batched-1")]
+        root = hashlib.sha256((leaves[0] + leaves[1]).encode()).hexdigest()
+        srv.ledger.append(_anchor_tx(31, root, 1011, record_type="BATCH_ANCHOR"))
+        srv.validated_ledger = 1011
+        sdk.memo_index.refresh()
+        return f"{31:064X}", leaves, root
+
+    def test_batch_member_needs_proof_not_tamper(self, sdk, batch):
+        """A record anchored through a batch root is never reported as tampered without its proof."""
+        tx_hash, leaves, root = batch
+        result = sdk.verify_against_chain("batched-0", tx_hash=tx_hash)
+        assert result["status"] == "BATCH_ROOT_PROOF_REQUIRED"
+        assert result["tamper_detected"] is False and result["merkle_root"] == root
+
+    def test_batch_member_verified_with_proof(self, sdk, batch):
+        tx_hash, leaves, root = batch
+        proof = [{"hash": leaves[1], "position": "right"}]
+        result = sdk.verify_against_chain("batched-0", tx_hash=tx_hash, merkle_proof=proof)
+        assert result["status"] == "MATCH" and result["verified"] is True
+        tampered = sdk.verify_against_chain("batched-0 (edited)", tx_hash=tx_hash, merkle_proof=proof)
+        assert tampered["status"] == "MISMATCH" and tampered["tamper_detected"] is True
+
+    def test_backup_batch_member(self, rippled, sdk):
+        from s4_backup import S4LedgerBackup
+        srv, _ = rippled
+        record = {"nsn": "5340-01-234-5678", "qty": 3}
+        leaf = hashlib.sha256(json.dumps(record, sort_keys=True).encode()).hexdigest()
+        sibling = sdk.create_record_hash("batched-1")
+        srv.ledger.append(_anchor_tx(32, hashlib.sha256((leaf + sibling).encode()).hexdigest(), 1011,
+                                     record_type="BATCH_ANCHOR"))
+        srv.validated_ledger = 1011
+        sdk.memo_index.refresh()
+        backup = S4LedgerBackup(sdk=sdk)
+        assert backup.verify_against_xrpl(record, f"{32:064X}")["status"] == "BATCH_ROOT_PROOF_REQUIRED"
+        proof = [{"hash": sibling, "position": "right"}]
+        assert backup.verify_against_xrpl(record, f"{32:064X}", merkle_proof=proof)["match"] is True
+
+    def test_backup_verification_is_local(self, rippled, sdk):
+        from s4_backup import S4LedgerBackup
+        srv, _ = rippled
+        record = {"nsn": "5340-01-234-5678", "qty": 2}
+        content_hash = hashlib.sha256(json.dumps(record, sort_keys=True).encode()).hexdigest()
+        srv.ledger.append(_anchor_tx(30, content_hash, 1011))
+        srv.validated_ledger = 1011
+        sdk.memo_index.refresh()
+        result = S4LedgerBackup(sdk=sdk).verify_against_xrpl(record, f"{30:064X}")
+        assert result["match"] is True and result["source"] == "memo_index"
@@ -0,0 +1,289 @@
+"""
+S4 Ledger Metrics Tests
+=======================
+Tests for the S4Metrics collector and its wiring into the API: request
+timing middleware, dependency spans, the Prometheus exposition endpoint and
+the DDSketch quantile sketches behind /api/metrics/performance.
+Run: pytest tests/ -v
+"""
+import json
+import random
+import re
+import threading
+
+import pytest
+
+from monitoring import DDSketch, S4Metrics
+
+
+def _sample(text, series):
+    """Value of one exposition line, or None if the series is absent."""
+    match = re.search(rf"^{re.escape(series)} (\S+)$", text, re.M)
+    return float(match.group(1)) if match else None
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Exposition Format
+# ═══════════════════════════════════════════════════════════════════
+
+class TestExposition:
+    """export_prometheus() emits valid, cumulative series."""
+
+    def test_histogram_buckets_are_cumulative_once(self):
+        m = S4Metrics()
+        for value in (0.02, 0.2, 0.2, 20):
+            m.observe("s4_http_request_seconds", value, labels={"method": "GET"})
+        text = m.export_prometheus()
+        assert _sample(text, 's4_http_request_seconds_bucket{method="GET",le="0.01"}') == 0
+        assert _sample(text, 's4_http_request_seconds_bucket{method="GET",le="0.05"}') == 1
+        assert _sample(text, 's4_http_request_seconds_bucket{method="GET",le="0.25"}') == 3
+        assert _sample(text, 's4_http_request_seconds_bucket{method="GET",le="10"}') == 3
+        assert _sample(text, 's4_http_request_seconds_bucket{method="GET",le="+Inf"}') == 4
+        assert _sample(text, 's4_http_request_seconds_count{method="GET"}') == 4
+
+    def test_type_lines_and_label_escaping(self):
+        m = S4Metrics()
+        m.inc("s4_webhooks_total", labels={"event": 'say "hi"\\n'})
+        m.set_gauge("s4_anchor_queue_depth", 3)
+        text = m.export_prometheus()
+        assert "# TYPE s4_webhooks_total counter" in text
+        assert "# TYPE s4_anchor_queue_depth gauge" in text
+        assert 's4_webhooks_total{event="say \\"hi\\"\\\\n"} 1' in text
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Series Storage
+# ═══════════════════════════════════════════════════════════════════
+
+class TestCardinality:
+    """Label sets are interned per family and capped with an overflow series."""
+
+    def test_label_order_and_types_share_a_series(self):
+        m = S4Metrics()
+        m.inc("s4_http_errors_total", labels={"method": "GET", "status": 404})
+        m.inc("s4_http_errors_total", labels={"status": "404", "method": "GET"})
+        assert m.export_json()["counters"] == {'s4_http_errors_total{method="GET",status="404"}': 2}
+
+    def test_family_cap_folds_into_overflow(self):
+        m = S4Metrics(max_series=3)
+        for i in range(10):
+            m.inc("s4_webhooks_total", labels={"event": f"evt-{i}"})
+        m.inc("s4_webhooks_total", labels={"event": "evt-0"})
+        counters = m.export_json()["counters"]
+        assert counters['s4_webhooks_total{event="evt-0"}'] == 2
+        assert counters['s4_webhooks_total{event="__overflow__"}'] == 7
+        assert counters['s4_metrics_series_overflow_total{family="s4_webhooks_total"}'] == 7
+        assert sum(1 for k in counters if k.startswith("s4_webhooks_total")) == 4
+
+    def test_overflowed_histograms_keep_observations(self):
+        m = S4Metrics(max_series=1)
+        for endpoint in ("a", "b", "c"):
+            m.observe("s4_http_request_seconds", 0.2, labels={"endpoint": endpoint})
+        hists = m.export_json()["histograms"]
+        assert hists['s4_http_request_seconds{endpoint="__overflow__"}']["count"] == 2
+        assert m.sketch("s4_http_request_seconds").count == 3
+
+    def test_unregistered_family_is_admitted(self):
+        m = S4Metrics()
+        m.observe("s4_custom_seconds", 3.0)
+        m.inc("s4_custom_total")
+        text = m.export_prometheus()
+        assert "# TYPE s4_custom_total counter" in text
+        assert _sample(text, 's4_custom_seconds_bucket{le="+Inf"}') == 1
+
+
+class TestConcurrency:
+    """Striped recording stays exact; scrapes run alongside writers."""
+
+    def test_parallel_writers_and_scrapes(self):
+        m = S4Metrics()
+        stop = threading.Event()
+        scrapes = []
+
+        def writer(n):
+            for i in range(2000):
+                m.http_request("GET", f"route{i % 20}", 200, 0.01 * (n + 1))
+
+        def scraper():
+            while not stop.is_set():
+                scrapes.append(m.export_prometheus())
+
+        reader = threading.Thread(target=scraper)
+        reader.start()
+        writers = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+        for t in writers:
+            t.start()
+        for t in writers:
+            t.join()
+        stop.set()
+        reader.join()
+        counters = m.export_json()["counters"]
+        assert sum(v for k, v in counters.items() if k.startswith("s4_http_requests_total")) == 16000
+        assert scrapes and sum(m.sketch("s4_http_request_seconds").bins.values()) == 16000
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Quantile Sketches
+# ═══════════════════════════════════════════════════════════════════
+
+def _exact(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+class TestSketch:
+    """DDSketch quantiles stay within the relative accuracy in bounded memory."""
+
+    def test_quantiles_within_relative_accuracy(self):
+        rng = random.Random(7)
+        values = [rng.lognormvariate(-3, 1.5) for _ in range(50000)]
+        sketch = DDSketch(relative_accuracy=0.01)
+        for v in values:
+            sketch.add(v)
+        for q in (0.5, 0.9, 0.99, 0.999):
+            assert sketch.quantile(q) == pytest.approx(_exact(values, q), rel=0.01)
+        assert sketch.count == 50000 and sketch.quantile(1) == max(values)
+
+    def test_merge_matches_single_stream(self):
+        rng = random.Random(11)
+        values = [rng.expovariate(4) for _ in range(20000)]
+        whole, left, right = DDSketch(), DDSketch(), DDSketch()
+        for i, v in enumerate(values):
+            whole.add(v)
+            (left if i % 2 else right).add(v)
+        merged = left.merge(DDSketch.from_dict(right.to_dict()))
+        assert merged.count == whole.count and merged.bins == whole.bins
+        assert merged.quantile(0.99) == whole.quantile(0.99)
+
+    def test_bins_are_bounded(self):
+        sketch = DDSketch(relative_accuracy=0.01, max_bins=64)
+        values = [10.0 ** (exp / 10) for exp in range(-300, 300)]
+        for v in values:
+            sketch.add(v)
+        assert len(sketch.bins) <= 64
+        assert sketch.quantile(0.999) == pytest.approx(_exact(values, 0.999), rel=0.01)
+
+    def test_zero_and_mismatched_accuracy(self):
+        sketch = DDSketch()
+        for v in (0, 0, 0, 0, 0, 5, 5, 5, 5, 5):
+            sketch.add(v)
+        assert sketch.quantile(0.4) == 0 and sketch.quantile(0.9) == pytest.approx(5, rel=0.01)
+        assert DDSketch().quantile(0.5) is None
+        with pytest.raises(ValueError):
+            sketch.merge(DDSketch(relative_accuracy=0.05))
+
+
+class TestCollectorQuantiles:
+    """S4Metrics keeps one sketch per histogram series and merges across workers."""
+
+    def test_quantiles_merge_label_sets(self):
+        m = S4Metrics()
+        for i in range(1, 1001):
+            m.observe("s4_http_request_seconds", i / 1000, labels={"endpoint": "a" if i % 2 else "b"})
+        overall = m.quantiles("s4_http_request_seconds")
+        assert set(overall) == {"p50", "p90", "p99", "p99.9"}
+        assert overall["p99"] == pytest.approx(0.99, rel=0.01)
+        only_b = m.quantiles("s4_http_request_seconds", labels={"endpoint": "b"})
+        assert only_b["p50"] == pytest.approx(0.5, rel=0.01)
+        assert m.quantiles("s4_verify_duration_seconds")["p50"] is None
+
+    def test_cross_process_merge(self):
+        worker, parent = S4Metrics(), S4Metrics()
+        for i in range(100):
+            worker.observe("s4_anchor_duration_seconds", 10.0)
+            parent.observe("s4_anchor_duration_seconds", 0.1)
+        parent.merge_sketches(json.loads(json.dumps(worker.export_sketches())))
+        q = parent.quantiles("s4_anchor_duration_seconds")
+        assert q["p50"] == pytest.approx(0.1, rel=0.01) and q["p90"] == pytest.approx(10.0, rel=0.01)
+
+    def test_exported_as_gauges(self):
+        m = S4Metrics()
+        m.observe("s4_ai_response_seconds", 2.0)
+        text = m.export_prometheus()
+        assert "# TYPE s4_ai_response_seconds_quantiles gauge" in text
+        assert _sample(text, 's4_ai_response_seconds_quantiles{quantile="0.999"}') == pytest.approx(2.0, rel=0.01)
+        assert m.export_json()["quantiles"]["s4_ai_response_seconds"]["p50"] == pytest.approx(2.0, rel=0.01)
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  API Wiring
+# ═══════════════════════════════════════════════════════════════════
+
+@pytest.fixture
+def metrics(api_module):
+    if not api_module.MONITORING_AVAILABLE:
+        pytest.skip("monitoring module not importable")
+    return api_module._metrics
+
+
+class TestRequestMetrics:
+    """Every routed request is timed by route name, method and status."""
+
+    def test_requests_are_counted_by_route(self, api_call, metrics):
+        series = 's4_http_requests_total{endpoint="health",method="GET",status="200"}'
+        before = metrics.export_json()["counters"].get(series, 0)
+        api_call("GET", "/api/health")
+        api_call("GET", "/api/health")
+        assert metrics.export_json()["counters"][series] == before + 2
+        assert metrics.export_json()["histograms"]['s4_http_request_seconds{endpoint="health",method="GET"}']["count"] >= 2
+
+    def test_unknown_paths_share_one_series(self, api_call, metrics):
+        api_call("GET", "/api/does-not-exist/123")
+        api_call("GET", "/api/does-not-exist/456")
+        counters = metrics.export_json()["counters"]
+        assert counters['s4_http_errors_total{endpoint="not_found",method="GET",status="404"}'] >= 2
+        assert not any("does-not-exist" in key for key in counters)
+
+    def test_rejected_requests_keep_their_status(self, api_module, api_call, metrics):
+        api_call("GET", "/api/webhooks/list", headers={"X-API-Key": "not-a-key"})
+        counters = metrics.export_json()["counters"]
+        assert counters['s4_http_errors_total{endpoint="webhook_list",method="GET",status="401"}'] >= 1
+        status, _ = api_call("POST", "/api/verify", {"record_text": ""})
+        entry = api_module._request_log[-1]
+        assert status == 400 and entry["route"] == "verify"
+        assert entry["status"] == 400 and entry["ms"] >= 0
+
+    def test_prometheus_endpoint(self, api_call, metrics):
+        api_call("GET", "/api/health")
+        status, body = api_call("GET", "/api/metrics/prometheus", text=True)
+        text = body.decode()
+        assert status == 200
+        assert "# TYPE s4_http_requests_total counter" in text
+        assert 's4_http_requests_total{endpoint="health",method="GET",status="200"}' in text
+
+
+class TestSpans:
+    """Calls to Supabase, XRPL and AI providers are timed as dependency spans."""
+
+    def test_span_records_success_and_failure(self, api_module, metrics):
+        with api_module._span("xrpl", "ledger_current"):
+            pass
+        with pytest.raises(RuntimeError):
+            with api_module._span("xrpl", "ledger_current"):
+                raise RuntimeError("down")
+        exported = metrics.export_json()
+        labels = '{dependency="xrpl",operation="ledger_current"}'
+        assert exported["histograms"]["s4_dependency_seconds" + labels]["count"] >= 2
+        assert exported["counters"]["s4_dependency_errors_total" + labels] >= 1
+
+    def test_swallowed_supabase_error_counts_as_failure(self, api_module, metrics, monkeypatch):
+        monkeypatch.setattr(api_module, "SUPABASE_URL", "http://127.0.0.1:9")
+        monkeypatch.setattr(api_module, "SUPABASE_SERVICE_KEY", "test-key")
+        series = 's4_dependency_errors_total{dependency="supabase",operation="GET metrics_probe"}'
+        before = metrics.export_json()["counters"].get(series, 0)
+        assert api_module._supabase_request("metrics_probe", timeout=1) is None
+        assert metrics.export_json()["counters"][series] == before + 1
+
+
+class TestPerformanceEndpoint:
+    """/api/metrics/performance reports sketch-based tail latency."""
+
+    def test_tail_latency_from_sketches(self, api_call, metrics):
+        metrics.anchor_started()
+        metrics.anchor_completed(0.5)
+        api_call("GET", "/api/health")
+        status, body = api_call("GET", "/api/metrics/performance")
+        perf = body["performance"]
+        assert status == 200 and perf["anchor_latency_ms"]["count"] >= 1
+        assert set(perf["request_latency_ms"]) >= {"p50_ms", "p90_ms", "p99_ms", "p99_9_ms"}
+        assert perf["p95_anchor_time_ms"] == perf["anchor_latency_ms"]["p95_ms"]
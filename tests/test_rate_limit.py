@@ -0,0 +1,120 @@
+"""
+S4 Ledger Rate Limiter Tests
+============================
+Tests for the token-bucket limiter, its LRU bound, the SQLite backend and
+per-API-key subscription tiers.
+Run: pytest tests/ -v
+"""
+import hashlib
+import threading
+
+import pytest
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(api_module, request, tmp_path):
+    if request.param == "sqlite":
+        return api_module._SQLiteRateLimitBackend(str(tmp_path / "rl.db"))
+    return api_module._MemoryRateLimitBackend()
+
+
+class TestTokenBucket:
+    """Both backends implement the same bucket arithmetic."""
+
+    def test_burst_then_refill(self, backend):
+        results = [backend.take("ip:a", 3, 1.0, 100.0) for _ in range(4)]
+        assert [r[0] for r in results] == [True, True, True, False]
+        assert [r[1] for r in results[:3]] == [2, 1, 0]
+        assert results[3][2] == 1  # one token comes back after a second
+        assert backend.take("ip:a", 3, 1.0, 100.5)[0] is False
+        assert backend.take("ip:a", 3, 1.0, 101.0)[0] is True
+        # Refill never exceeds capacity
+        assert backend.take("ip:a", 3, 1.0, 1000.0) == (True, 2, 0)
+
+    def test_clients_are_independent(self, backend):
+        assert backend.take("ip:a", 1, 0.1, 0.0)[0]
+        assert not backend.take("ip:a", 1, 0.1, 0.0)[0]
+        assert backend.take("ip:b", 1, 0.1, 0.0)[0]
+
+
+class TestMemoryBackend:
+    """The in-process backend stays bounded without scanning."""
+
+    def test_lru_eviction(self, api_module):
+        rl = api_module._MemoryRateLimitBackend(max_keys=3)
+        for key in ("a", "b", "c"):
+            rl.take(key, 1, 0.01, 0.0)
+        rl.take("a", 1, 0.01, 0.0)          # a is now most recent (and empty)
+        rl.take("d", 1, 0.01, 0.0)          # evicts b, the least recent
+        assert len(rl) == 3
+        assert list(rl._buckets) == ["c", "a", "d"]
+        assert rl.take("a", 1, 0.01, 0.0)[0] is False   # a kept its state
+        assert rl.take("b", 1, 0.01, 0.0)[0] is True    # b starts fresh
+
+    def test_concurrent_takes_never_overspend(self, api_module):
+        rl = api_module._MemoryRateLimitBackend()
+        allowed = []
+
+        def worker():
+            for _ in range(50):
+                allowed.append(rl.take("ip:x", 100, 0.0001, 0.0)[0])
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert sum(allowed) == 100
+
+
+class TestSQLiteBackend:
+    """Buckets in the SQLite file are shared by every worker that opens it."""
+
+    def test_shared_between_instances(self, api_module, tmp_path):
+        path = str(tmp_path / "rl.db")
+        worker_a = api_module._SQLiteRateLimitBackend(path)
+        worker_b = api_module._SQLiteRateLimitBackend(path)
+        assert worker_a.take("ip:z", 2, 0.01, 0.0)[0]
+        assert worker_b.take("ip:z", 2, 0.01, 0.0)[0]
+        assert not worker_a.take("ip:z", 2, 0.01, 0.0)[0]
+
+    def test_idle_buckets_are_swept(self, api_module, tmp_path):
+        rl = api_module._SQLiteRateLimitBackend(str(tmp_path / "rl.db"), idle_ttl=10, sweep_every=5)
+        for i in range(4):
+            rl.take(f"ip:{i}", 5, 1.0, 0.0)
+        rl.take("ip:late", 5, 1.0, 100.0)
+        assert len(rl) == 1
+
+
+class TestTiers:
+    """API keys are limited by their SUBSCRIPTION_TIERS rpm, others per IP."""
+
+    def test_limits_by_key(self, api_module, monkeypatch):
+        monkeypatch.setitem(api_module.API_KEYS_STORE, "pro-key", {"org": "o", "role": "analyst", "tier": "professional"})
+        monkeypatch.setitem(api_module.API_KEYS_STORE, "untiered", {"org": "o", "role": "viewer"})
+        assert api_module._rate_limit_for("pro-key")[1] == api_module.SUBSCRIPTION_TIERS["professional"]["rpm"]
+        assert api_module._rate_limit_for(api_module.API_MASTER_KEY)[1] == api_module.SUBSCRIPTION_TIERS["enterprise"]["rpm"]
+        assert api_module._rate_limit_for("nope") == (None, api_module.RATE_LIMIT_MAX)
+        assert api_module._rate_limit_for("untiered") == (None, api_module.RATE_LIMIT_MAX)
+        assert api_module._rate_limit_for("")[0] is None
+
+    def test_tier_lookup_has_no_side_effects(self, api_module, monkeypatch):
+        """A hydrated (hash-only) key is tiered without caching its plaintext or calling Supabase."""
+        key_hash = hashlib.sha256(b"hydrated-key").hexdigest()
+        monkeypatch.setitem(api_module.API_KEYS_STORE, f"__hash__{key_hash}", {"org": "o", "tier": "professional"})
+        requests = []
+        monkeypatch.setattr(api_module, "_supabase_request", lambda *a, **k: requests.append(a))
+        assert api_module._rate_limit_for("hydrated-key")[1] == api_module.SUBSCRIPTION_TIERS["professional"]["rpm"]
+        assert "hydrated-key" not in api_module.API_KEYS_STORE and requests == []
+
+    def test_keyed_client_not_limited_by_ip_allowance(self, api_module, api_call, monkeypatch):
+        monkeypatch.setattr(api_module, "RATE_LIMIT_MAX", 2)
+        monkeypatch.setitem(api_module.API_KEYS_STORE, "starter-key", {"org": "o", "tier": "starter"})
+        anon = [api_call("GET", "/api/health")[0] for _ in range(3)]
+        keyed = [api_call("GET", "/api/health", headers={"X-API-Key": "starter-key"})[0] for _ in range(3)]
+        other_ip = api_call("GET", "/api/health", headers={"X-Forwarded-For": "10.0.0.9"})[0]
+        assert anon == [200, 200, 429]
+        assert keyed == [200, 200, 200]
+        assert other_ip == 200
+        status, body = api_call("GET", "/api/health")
+        assert status == 429 and body["retry_after"] >= 1
@@ -0,0 +1,239 @@
+"""
+S4 Ledger SDK Streaming Import Tests
+====================================
+Tests for the iter_import_csv / iter_import_xml / iter_import_json
+generators: same records and hashes as the in-memory importers, from paths
+and streams, without holding the parsed document; parallel hashing with
+workers=; and Merkle batch anchoring in import_and_anchor(batch=True).
+Run: pytest tests/ -v
+"""
+import io
+import json
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import s4_sdk
+from s4_sdk import S4SDK
+
+CSV_TEXT = "NSN,Qty,Depot\n5340-01-234-5678,50,NNSY\n2835-01-448-9022,\"1,200\",FRC East\n"
+XML_TEXT = (
+    "<Export><Header><Run>7</Run></Header>"
+    "<WorkOrder><JCN>A1</JCN><Status>OPEN</Status></WorkOrder>"
+    "<WorkOrder><JCN>A2</JCN><Status></Status></WorkOrder>"
+    "<WorkOrder><JCN>A3</JCN><Status>CLOSED</Status></WorkOrder></Export>"
+)
+JSON_ROWS = [{"uic": "N00024", "qty": 12345678901234567890, "tags": ["a", {"b": None}]},
+             {"uic": "N00104", "qty": -1.5e-7, "note": "quote \" and \\u00e9"}]
+
+
+@pytest.fixture
+def sdk():
+    return S4SDK(testnet=True)
+
+
+def _hashes(records):
+    return [(r["hash"], r["data"]) for r in records]
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Parity with the in-memory importers
+# ═══════════════════════════════════════════════════════════════════
+
+class TestParity:
+    """Streaming importers yield the same data and hashes."""
+
+    def test_csv_from_path_and_streams(self, sdk, tmp_path):
+        path = tmp_path / "cdmd.csv"
+        path.write_text(CSV_TEXT, encoding="utf-8")
+        expected = _hashes(sdk.import_csv(CSV_TEXT, "cdmd_oa")["records"])
+        assert _hashes(sdk.iter_import_csv(str(path), "cdmd_oa")) == expected
+        assert _hashes(sdk.iter_import_csv(io.BytesIO(CSV_TEXT.encode()), "cdmd_oa")) == expected
+        assert _hashes(sdk.iter_import_csv(io.StringIO(CSV_TEXT), "cdmd_oa")) == expected
+
+    def test_xml_with_row_tag(self, sdk):
+        expected = _hashes(sdk.import_xml(XML_TEXT, "cdmd_oa", row_tag="WorkOrder")["records"])
+        streamed = _hashes(sdk.iter_import_xml(io.BytesIO(XML_TEXT.encode()), "cdmd_oa", row_tag="WorkOrder"))
+        assert streamed == expected and len(streamed) == 3
+
+    def test_xml_attribute_rows_and_bare_root(self, sdk):
+        xml = '<Items><Item nsn="1" qty="2"/><Item nsn="3" qty="4"/></Items>'
+        assert _hashes(sdk.iter_import_xml(io.BytesIO(xml.encode()), "cdmd_oa")) == \
+            _hashes(sdk.import_xml(xml, "cdmd_oa")["records"])
+        bare = '<Item nsn="9"/>'
+        assert _hashes(sdk.iter_import_xml(io.BytesIO(bare.encode()), "cdmd_oa")) == \
+            _hashes(sdk.import_xml(bare, "cdmd_oa")["records"])
+
+    def test_xml_header_first_infers_row_tag(self, sdk):
+        """A leading header element is not mistaken for the row tag."""
+        expected = _hashes(sdk.import_xml(XML_TEXT, "cdmd_oa")["records"])
+        streamed = _hashes(sdk.iter_import_xml(io.BytesIO(XML_TEXT.encode()), "cdmd_oa"))
+        assert streamed == expected and [d["JCN"] for _, d in streamed] == ["A1", "A2", "A3"]
+
+    def test_xml_ambiguous_row_tag_raises(self, sdk):
+        xml = "<Export><Header><Run>7</Run></Header><WorkOrder><JCN>A1</JCN></WorkOrder></Export>"
+        with pytest.raises(ValueError, match="row_tag"):
+            list(sdk.iter_import_xml(io.BytesIO(xml.encode()), "cdmd_oa"))
+        single = "<Export><WorkOrder><JCN>A1</JCN></WorkOrder></Export>"
+        assert [d for _, d in _hashes(sdk.iter_import_xml(io.BytesIO(single.encode()), "cdmd_oa"))] == [{"JCN": "A1"}]
+
+    @pytest.mark.parametrize("doc", [
+        JSON_ROWS,
+        {"meta": {"run": 7}, "empty": [], "records": JSON_ROWS, "after": [1]},
+        {"uic": "N00024", "qty": 3},
+    ])
+    def test_json_shapes(self, sdk, doc):
+        text = json.dumps(doc)
+        expected = _hashes(sdk.import_json(text, "cdmd_oa")["records"])
+        assert _hashes(sdk.iter_import_json(io.StringIO(text), "cdmd_oa")) == expected
+
+    def test_json_records_key(self, sdk):
+        text = json.dumps({"first": [{"x": 1}], "records": JSON_ROWS})
+        expected = _hashes(sdk.import_json(text, "cdmd_oa", records_key="records")["records"])
+        assert _hashes(sdk.iter_import_json(io.StringIO(text), "cdmd_oa", records_key="records")) == expected
+        with pytest.raises(ValueError):
+            list(sdk.iter_import_json(io.StringIO(text), "cdmd_oa", records_key="missing"))
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Incremental parsing
+# ═══════════════════════════════════════════════════════════════════
+
+class TestIncremental:
+    """Values split across reads decode correctly; the tree is pruned as rows go."""
+
+    def test_json_values_split_across_chunks(self, sdk, monkeypatch):
+        original = s4_sdk._JSONStream.__init__
+        monkeypatch.setattr(s4_sdk._JSONStream, "__init__",
+                            lambda self, fp, chunk_size=3: original(self, fp, chunk_size))
+        text = json.dumps(JSON_ROWS + [123456789, "x" * 50], indent=2)
+        streamed = [r["data"] for r in sdk.iter_import_json(io.StringIO(text), "cdmd_oa")]
+        assert streamed == json.loads(text)
+
+    def test_malformed_json_raises(self, sdk):
+        with pytest.raises(ValueError):
+            list(sdk.iter_import_json(io.StringIO('[{"a": 1} {"b": 2}]'), "cdmd_oa"))
+
+    def test_xml_rows_are_released(self, sdk, monkeypatch):
+        roots = []
+        real_iterparse = ET.iterparse
+
+        def spy(source, events=None):
+            for event, elem in real_iterparse(source, events=events):
+                if not roots:
+                    roots.append(elem)
+                yield event, elem
+
+        monkeypatch.setattr(ET, "iterparse", spy)
+        rows = "".join(f"<Row><N>{i}</N></Row>" for i in range(20000))
+        peak = 0
+        for i, rec in enumerate(sdk.iter_import_xml(io.BytesIO(f"<Root>{rows}</Root>".encode()), "cdmd_oa")):
+            assert rec["data"] == {"N": str(i)}
+            peak = max(peak, len(roots[0]))
+        assert i == 19999 and peak < 2000      # one parser read-ahead, not the document
+
+    def test_generator_is_lazy(self, sdk):
+        stream = io.StringIO("NSN\n" + "".join(f"{i}\n" for i in range(10000)))
+        first = next(sdk.iter_import_csv(stream, "cdmd_oa"))
+        assert first["data"] == {"NSN": "0"} and stream.tell() < len(stream.getvalue())
+
+    def test_unknown_system(self, sdk):
+        with pytest.raises(ValueError):
+            next(sdk.iter_import_csv(io.StringIO(CSV_TEXT), "no_such_system"))
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Parallel hashing
+# ═══════════════════════════════════════════════════════════════════
+
+class TestWorkers:
+    """workers= hashes on a pool with the same hashes in the same order."""
+
+    @pytest.fixture
+    def big_csv(self):
+        return "NSN,Qty\n" + "".join(f"5340-01-{i:06d},{i % 97}\n" for i in range(5000))
+
+    @pytest.mark.parametrize("pool", ["process", "thread"])
+    def test_import_csv_matches_serial(self, sdk, big_csv, pool):
+        serial = _hashes(sdk.import_csv(big_csv, "cdmd_oa")["records"])
+        assert _hashes(sdk.import_csv(big_csv, "cdmd_oa", workers=3, pool=pool)["records"]) == serial
+
+    def test_streaming_json_with_workers(self, sdk, monkeypatch):
+        monkeypatch.setattr(s4_sdk, "_parallel_row_hashes", _small_chunks(s4_sdk._parallel_row_hashes))
+        rows = [{"i": i, "nested": {"z": i, "a": [i]}} for i in range(1000)]
+        text = json.dumps({"records": rows})
+        serial = _hashes(sdk.iter_import_json(io.StringIO(text), "cdmd_oa"))
+        parallel = _hashes(sdk.iter_import_json(io.StringIO(text), "cdmd_oa", workers=2, pool="thread"))
+        assert parallel == serial and [d for _, d in parallel] == rows
+
+    def test_in_flight_chunks_are_bounded(self, monkeypatch):
+        pulled = []
+
+        def rows():
+            for i in range(100000):
+                pulled.append(i)
+                yield {"i": i}
+
+        first = next(s4_sdk._parallel_row_hashes(rows(), workers=2, pool="thread", chunk_size=100))
+        assert first[0] == {"i": 0} and len(pulled) <= 2 * 2 * 100 + 1
+
+    def test_import_and_anchor_passes_workers(self, sdk, big_csv):
+        result = sdk.import_and_anchor(big_csv, "cdmd_oa", anchor=False, workers=2)
+        assert result["imported"] == 5000
+        assert result["records"][0]["hash"] == sdk.create_record_hash(json.dumps({"NSN": "5340-01-000000", "Qty": "0"}, sort_keys=True))
+
+    def test_unknown_pool(self, sdk, big_csv):
+        with pytest.raises(ValueError):
+            sdk.import_csv(big_csv, "cdmd_oa", workers=2, pool="gpu")
+
+
+def _small_chunks(fn):
+    return lambda rows, workers, pool="process": fn(rows, workers, pool, chunk_size=64)
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Batch anchoring
+# ═══════════════════════════════════════════════════════════════════
+
+@pytest.fixture
+def submitted(sdk, monkeypatch):
+    """XRPL submissions captured instead of sent."""
+    calls = []
+
+    def store(hash_value, wallet_seed, record_type=None, **kwargs):
+        calls.append((hash_value, record_type))
+        return {"fee_tx": {"hash": f"TX{len(calls):062d}"}, "rebate": {}}
+
+    monkeypatch.setattr(sdk, "store_hash_with_sls_fee", store)
+    return calls
+
+
+class TestBatchAnchor:
+    """batch=True anchors one Merkle root and proves every record under it."""
+
+    @pytest.mark.parametrize("rows", [1, 2, 7, 64])
+    def test_one_transaction_with_valid_proofs(self, sdk, submitted, rows):
+        csv_text = "NSN,Qty\n" + "".join(f"5340-01-{i:06d},{i}\n" for i in range(rows))
+        result = sdk.import_and_anchor(csv_text, "cdmd_oa", wallet_seed="sTest", batch=True)
+        root = result["batch"]["merkle_root"]
+        assert submitted == [(root, "BATCH_ANCHOR")]
+        assert result["anchored"] == rows and result["batch"]["tx_hash"] == "TX" + "0" * 61 + "1"
+        for i, rec in enumerate(result["records"]):
+            assert rec["leaf_index"] == i and rec["merkle_root"] == root and rec["anchored"]
+            assert S4SDK.verify_inclusion(rec["hash"], rec["merkle_proof"], root)
+        assert not S4SDK.verify_inclusion("0" * 64, result["records"][0]["merkle_proof"], root)
+
+    def test_root_matches_api_batch_tree(self, sdk, submitted, api_module):
+        records = sdk.import_and_anchor(CSV_TEXT, "cdmd_oa", wallet_seed="sTest", batch=True)["records"]
+        leaves = [rec["hash"] for rec in records]
+        assert records[0]["merkle_root"] == api_module._merkle_root(leaves)
+        assert records[1]["merkle_proof"] == api_module._merkle_proof(api_module._merkle_levels(leaves), 1)
+
+    def test_failed_submission_marks_records(self, sdk, monkeypatch):
+        def fail(*args, **kwargs):
+            raise RuntimeError("tecUNFUNDED_PAYMENT")
+
+        monkeypatch.setattr(sdk, "store_hash_with_sls_fee", fail)
+        result = sdk.import_and_anchor(CSV_TEXT, "cdmd_oa", wallet_seed="sTest", batch=True)
+        assert result["anchored"] == 0 and result["batch"]["anchor_error"] == "tecUNFUNDED_PAYMENT"
+        assert all(not rec["anchored"] and rec["merkle_proof"] is not None for rec in result["records"])
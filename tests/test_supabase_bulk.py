@@ -0,0 +1,167 @@
+"""
+S4 Ledger Supabase Bulk Write Tests
+===================================
+Tests for _sb_bulk_upsert and the handlers that persist through it.
+Run: pytest tests/ -v
+"""
+import time
+
+import pytest
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class _FakePostgREST:
+    """Stands in for _supabase_request: records calls, rejects rows marked bad,
+    and keeps upserted rows by their on_conflict key."""
+
+    def __init__(self, down=False):
+        self.calls = []
+        self.down = down
+        self.tables = {}
+
+    def __call__(self, table, *, method="GET", data=None, query_params="", select="*",
+                 prefer="return=representation", timeout=10, errors=None):
+        if method != "POST":
+            return []
+        self.calls.append({"table": table, "rows": data, "query": query_params, "prefer": prefer})
+        if self.down:
+            if errors is not None:
+                errors.append((None, "connection refused"))
+            return None
+        rows = data if isinstance(data, list) else [data]
+        if len({tuple(sorted(r)) for r in rows}) > 1:
+            if errors is not None:
+                errors.append((400, "All object keys must match"))
+            return None
+        if any(r.get("bad") for r in rows):
+            if errors is not None:
+                errors.append((409, "duplicate key value violates unique constraint"))
+            return None
+        if not query_params.startswith("on_conflict="):
+            return []
+        key, stored, written = query_params.split("=", 1)[1], self.tables.setdefault(table, {}), []
+        for row in rows:
+            k = tuple(row.get(c) for c in key.split(","))
+            if k in stored and "resolution=ignore-duplicates" in prefer:
+                continue
+            stored[k] = {**stored.get(k, {}), **row}
+            written.append(row)
+        return written if "return=representation" in prefer else []
+
+
+@pytest.fixture
+def postgrest(api_module, monkeypatch):
+    fake = _FakePostgREST()
+    monkeypatch.setattr(api_module, "SUPABASE_URL", "https://example.supabase.co")
+    monkeypatch.setattr(api_module, "SUPABASE_SERVICE_KEY", "service-key")
+    monkeypatch.setattr(api_module, "_supabase_request", fake)
+    return fake
+
+
+class TestBulkUpsert:
+    """_sb_bulk_upsert groups rows into a few requests and reports bad rows."""
+
+    def test_chunks_rows_into_few_requests(self, api_module, postgrest):
+        rows = [{"record_id": f"REC-{i}", "hash": f"{i:064x}"} for i in range(1000)]
+        report = api_module._sb_bulk_upsert("records", rows, chunk_size=250, on_conflict="record_id")
+        assert report == {"written": 1000, "failed": [], "requests": 4}
+        assert [len(c["rows"]) for c in postgrest.calls] == [250] * 4
+        assert all(c["query"] == "on_conflict=record_id" for c in postgrest.calls)
+        assert "resolution=merge-duplicates" in postgrest.calls[0]["prefer"]
+
+    def test_rows_with_different_keys_are_sent_separately(self, api_module, postgrest):
+        rows = [{"a": 1}, {"a": 2, "b": 3}, {"a": 4}]
+        report = api_module._sb_bulk_upsert("t", rows)
+        assert report["written"] == 3 and report["requests"] == 2
+
+    def test_bad_rows_are_isolated(self, api_module, postgrest):
+        rows = [{"k": i, "bad": i in (3, 17)} for i in range(32)]
+        report = api_module._sb_bulk_upsert("t", rows, chunk_size=32)
+        assert report["written"] == 30
+        assert [f["index"] for f in report["failed"]] == [3, 17]
+        assert report["failed"][0]["status"] == 409
+        assert report["requests"] < 32
+
+    def test_transport_failure_fails_chunk_without_bisecting(self, api_module, postgrest):
+        postgrest.down = True
+        report = api_module._sb_bulk_upsert("t", [{"k": i} for i in range(10)], chunk_size=5)
+        assert report["requests"] == 2
+        assert len(report["failed"]) == 10 and report["failed"][0]["status"] is None
+
+    def test_unconfigured_supabase_reports_every_row(self, api_module, monkeypatch):
+        monkeypatch.setattr(api_module, "SUPABASE_URL", "")
+        report = api_module._sb_bulk_upsert("t", [{"k": 1}, {"k": 2}])
+        assert report["requests"] == 0 and len(report["failed"]) == 2
+
+    def test_single_upsert_passes_on_conflict(self, api_module, postgrest):
+        api_module._sb_upsert("merkle_batches", {"batch_id": "B"}, on_conflict="batch_id")
+        assert postgrest.calls[0]["query"] == "on_conflict=batch_id"
+
+
+class TestBulkCallers:
+    """Batch anchoring and user-state saves write in a handful of round-trips."""
+
+    def test_anchor_batch_persists_in_bulk(self, anchor_pipeline, api_call, postgrest):
+        records = [{"hash": f"{i:064x}"} for i in range(600)]
+        status, body = api_call("POST", "/api/anchor/batch", {"records": records})
+        assert status == 200
+        record_calls = [c for c in postgrest.calls if c["table"] == "records"]
+        assert len(record_calls) == 2
+        assert sum(len(c["rows"]) for c in record_calls) == 600
+        assert body["persisted"] == 600 and body["persist_failed"] == []
+
+    def test_anchor_batch_reports_failed_records(self, anchor_pipeline, api_call, postgrest, monkeypatch):
+        api = anchor_pipeline
+        real_row = api._record_row
+        monkeypatch.setattr(api, "_record_row",
+                            lambda r: {**real_row(r), "bad": r["leaf_index"] == 2})
+        status, body = api_call("POST", "/api/anchor/batch",
+                                {"records": [{"hash": f"{i:02x}" * 32} for i in range(4)]})
+        assert status == 200
+        assert body["persisted"] == 3
+        assert body["persist_failed"] == ["REC-020202020202"]
+
+    def test_user_state_saved_in_one_request(self, api_module, api_call, postgrest):
+        entries = [{"key": f"k{i}", "value": str(i)} for i in range(40)] + [{"key": "k0", "value": "last"}]
+        status, body = api_call("POST", "/api/state/save", {"session_id": "s1", "entries": entries})
+        assert status == 200
+        assert body["saved"] == 40 and body["failed"] == []
+        state_calls = [c for c in postgrest.calls if c["table"] == "user_state"]
+        assert len(state_calls) == 1
+        assert state_calls[0]["query"] == "on_conflict=org_id,session_id,state_key"
+        assert {r["state_key"]: r["state_value"] for r in state_calls[0]["rows"]}["k0"] == "last"
+
+
+class TestRecordImmutability:
+    """A reused record_id never overwrites a record already in the ledger."""
+
+    def test_reused_record_id_keeps_anchored_row(self, api_module, api_call, postgrest):
+        api_call("POST", "/api/anchor", {"hash": "aa" * 32, "record_id": "REC-DUP"})
+        api_call("POST", "/api/anchor", {"hash": "bb" * 32, "record_id": "REC-DUP"})
+        assert postgrest.tables["records"][("REC-DUP",)]["hash"] == "aa" * 32
+        record_calls = [c for c in postgrest.calls if c["table"] == "records"]
+        assert all("resolution=ignore-duplicates" in c["prefer"] for c in record_calls)
+
+    def test_async_anchor_updates_its_pending_row(self, anchor_pipeline, api_call, postgrest):
+        api = anchor_pipeline
+        status, body = api_call("POST", "/api/anchor", {"hash": "cc" * 32, "record_id": "REC-ASYNC"})
+        assert status == 202
+        assert _wait_for(lambda: api._anchor_job_status("REC-ASYNC")["status"] == "anchored")
+        row = postgrest.tables["records"][("REC-ASYNC",)]
+        assert row["network"] != "Pending" and row["tx_hash"]
+
+    def test_async_anchor_rejects_reused_record_id(self, anchor_pipeline, api_call, postgrest):
+        api = anchor_pipeline
+        api_call("POST", "/api/anchor", {"hash": "dd" * 32, "record_id": "REC-TAKEN", "wait": True})
+        status, body = api_call("POST", "/api/anchor", {"hash": "ee" * 32, "record_id": "REC-TAKEN"})
+        assert status == 409
+        assert api._get_anchor_queue().get_stats()["pending"] == 0
+        assert postgrest.tables["records"][("REC-TAKEN",)]["hash"] == "dd" * 32
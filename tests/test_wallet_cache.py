@@ -0,0 +1,159 @@
+"""
+S4 Ledger Wallet Cache Tests
+============================
+Tests for the custodial wallet cache: derivation on miss only, TTL and
+capacity eviction, key clearing, invalidation on re-provision and the
+hit-rate metrics.
+Run: pytest tests/ -v
+"""
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+
+class _FakeWallet:
+    derived = 0
+
+    def __init__(self, seed):
+        self.seed = seed
+        self.private_key = "priv-" + seed
+        self.address = "r" + seed
+
+    @classmethod
+    def from_seed(cls, seed, algorithm=None):
+        cls.derived += 1
+        return cls(seed)
+
+
+@pytest.fixture
+def cache(api_module, monkeypatch):
+    """A fresh _WalletCache over a counting seed lookup and fake key derivation."""
+    api = api_module
+    lookups = []
+    seeds = {"ops@example.mil": "sOps", "lead@example.mil": "sLead"}
+
+    def get_seed(email=None, address=None):
+        lookups.append(email or address)
+        if address:
+            return next((s for s in seeds.values() if "r" + s == address), None)
+        return seeds.get(email)
+
+    _FakeWallet.derived = 0
+    monkeypatch.setattr(api, "_get_wallet_seed", get_seed)
+    monkeypatch.setattr(api, "Wallet", _FakeWallet, raising=False)
+    monkeypatch.setattr(api, "CryptoAlgorithm", SimpleNamespace(SECP256K1="secp256k1"), raising=False)
+    cache = api._WalletCache(ttl=60, max_entries=4)
+    monkeypatch.setattr(api, "_wallet_cache", cache)
+    cache.lookups, cache.seeds = lookups, seeds
+    return cache
+
+
+def _address(cache, email):
+    with cache.lease(email=email) as wallet:
+        return wallet.address if wallet else None
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Lookups
+# ═══════════════════════════════════════════════════════════════════
+
+class TestLookup:
+    """A wallet is derived once and then served from memory."""
+
+    def test_second_lease_is_a_hit(self, cache):
+        assert _address(cache, "ops@example.mil") == "rsOps"
+        assert _address(cache, "ops@example.mil") == "rsOps"
+        assert cache.lookups == ["ops@example.mil"] and _FakeWallet.derived == 1
+        assert cache.get_stats()["hit_rate"] == 0.5
+
+    def test_email_and_address_share_an_entry(self, cache):
+        _address(cache, "ops@example.mil")
+        with cache.lease(address="rsOps") as wallet:
+            assert wallet.seed == "sOps"
+        assert cache.get_stats()["hits"] == 1 and cache.get_stats()["entries"] == 1
+
+    def test_unknown_user_is_not_cached(self, cache):
+        assert _address(cache, "nobody@example.mil") is None
+        assert _address(cache, "nobody@example.mil") is None
+        assert cache.get_stats()["entries"] == 0 and cache.get_stats()["misses"] == 2
+
+    def test_concurrent_leases_share_one_wallet(self, cache):
+        seen = []
+        barrier = threading.Barrier(8)
+
+        def worker():
+            barrier.wait()
+            with cache.lease(email="ops@example.mil") as wallet:
+                seen.append(wallet)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len({id(w) for w in seen}) == 1 and cache.get_stats()["entries"] == 1
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Eviction
+# ═══════════════════════════════════════════════════════════════════
+
+class TestEviction:
+    """Expired, surplus and invalidated wallets are dropped and cleared."""
+
+    def test_ttl_expiry_rederives_and_clears(self, cache, monkeypatch, api_module):
+        now = [1000.0]
+        monkeypatch.setattr(api_module.time, "monotonic", lambda: now[0])
+        with cache.lease(email="ops@example.mil") as first:
+            pass
+        now[0] += 61
+        with cache.lease(email="ops@example.mil") as second:
+            assert second is not first and second.seed == "sOps"
+        assert first.seed is None and first.private_key is None
+        assert _FakeWallet.derived == 2
+
+    def test_capacity_evicts_least_recently_used(self, cache):
+        for i in range(5):
+            cache.seeds[f"u{i}@example.mil"] = f"s{i}"
+        with cache.lease(email="u0@example.mil") as oldest:
+            pass
+        for i in range(1, 5):
+            _address(cache, f"u{i}@example.mil")
+        assert cache.get_stats()["entries"] == 4 and cache.get_stats()["evictions"] == 1
+        assert oldest.private_key is None
+
+    def test_leased_wallet_is_cleared_after_release(self, cache):
+        with cache.lease(email="ops@example.mil") as wallet:
+            cache.invalidate(email="ops@example.mil")
+            assert wallet.private_key == "priv-sOps"   # still signing
+        assert wallet.private_key is None
+
+    def test_reprovision_invalidates(self, cache, api_module, monkeypatch):
+        monkeypatch.setattr(api_module, "_wallet_store", {})
+        monkeypatch.setattr(api_module, "_sb_upsert", lambda *a, **k: None)
+        assert _address(cache, "ops@example.mil") == "rsOps"
+        cache.seeds["ops@example.mil"] = "sOpsNew"
+        api_module._store_wallet("ops@example.mil", "rsOpsNew", "sOpsNew", "starter")
+        assert _address(cache, "ops@example.mil") == "rsOpsNew"
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Metrics
+# ═══════════════════════════════════════════════════════════════════
+
+class TestMetrics:
+    """Lookups and evictions are reported to S4Metrics."""
+
+    def test_hit_rate_exported(self, cache, api_module):
+        if not api_module.MONITORING_AVAILABLE:
+            pytest.skip("monitoring module not importable")
+        before = api_module._metrics.export_json()["counters"].get(
+            's4_wallet_cache_lookups_total{result="hit"}', 0)
+        _address(cache, "lead@example.mil")
+        _address(cache, "lead@example.mil")
+        cache.invalidate(email="lead@example.mil")
+        exported = api_module._metrics.export_json()
+        assert exported["counters"]['s4_wallet_cache_lookups_total{result="hit"}'] == before + 1
+        assert exported["gauges"]["s4_wallet_cache_hit_ratio"] == 0.5
+        assert exported["counters"]['s4_wallet_cache_evictions_total{reason="invalidated"}'] >= 1
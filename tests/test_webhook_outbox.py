@@ -0,0 +1,287 @@
+"""
+S4 Ledger Webhook Outbox Tests
+==============================
+Tests for background webhook delivery: the durable outbox, retries with
+backoff, per-endpoint circuit breakers and the delivery-latency histogram,
+run against a local subscriber.
+Run: pytest tests/ -v
+"""
+import hashlib
+import hmac
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class _Subscriber(BaseHTTPRequestHandler):
+    """/ok accepts, /slow accepts after a delay, /flaky fails once, /down always fails."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        srv = self.server
+        with srv.lock:
+            srv.hits[self.path] = srv.hits.get(self.path, 0) + 1
+            hits = srv.hits[self.path]
+            srv.received.append((self.path, self.headers, body))
+        if self.path == "/slow":
+            time.sleep(1.0)
+        status = 200
+        if self.path == "/down" or (self.path == "/flaky" and hits == 1):
+            status = 503
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+
+@pytest.fixture
+def subscriber():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Subscriber)
+    srv.daemon_threads = True
+    srv.lock = threading.Lock()
+    srv.hits, srv.received = {}, []
+    threading.Thread(target=srv.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    yield srv, f"http://127.0.0.1:{srv.server_address[1]}"
+    srv.shutdown()
+    srv.server_close()
+
+
+def _subscribe(api, url, events=("anchor.confirmed",), secret="whsec_test"):
+    api._add_webhook("org", {"url": url, "events": list(events), "active": True, "secret": secret})
+
+
+def _deliveries(api):
+    return {d["url"].rsplit("/", 1)[1]: d for d in api._webhook_delivery_log}
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Background Delivery
+# ═══════════════════════════════════════════════════════════════════
+
+class TestOutboxDelivery:
+    """Handlers enqueue deliveries; workers POST them."""
+
+    def test_slow_subscriber_does_not_block_handler(self, webhook_outbox, subscriber, api_call, record_store):
+        api = webhook_outbox
+        srv, base = subscriber
+        _subscribe(api, base + "/slow", events=["verify.completed"])
+        started = time.monotonic()
+        status, _ = api_call("POST", "/api/verify", {"record_text": "hello"})
+        assert status == 200
+        assert time.monotonic() - started < 0.5
+        assert _deliveries(api)["slow"]["status"] == "pending"
+        assert _wait_for(lambda: _deliveries(api)["slow"]["status"] == "delivered")
+
+    def test_delivery_is_signed(self, webhook_outbox, subscriber):
+        api = webhook_outbox
+        srv, base = subscriber
+        _subscribe(api, base + "/ok", secret="whsec_abc")
+        api._deliver_webhook("anchor.confirmed", {"hash": "ab" * 32})
+        assert _wait_for(lambda: _deliveries(api)["ok"]["status"] == "delivered")
+        _, headers, body = srv.received[0]
+        assert headers["X-S4-Signature"] == hmac.new(b"whsec_abc", body, hashlib.sha256).hexdigest()
+        assert headers["X-S4-Delivery"] == _deliveries(api)["ok"]["id"]
+        assert json.loads(body)["data"] == {"hash": "ab" * 32}
+
+    def test_failed_delivery_is_retried(self, webhook_outbox, subscriber):
+        api = webhook_outbox
+        srv, base = subscriber
+        _subscribe(api, base + "/flaky")
+        api._deliver_webhook("anchor.confirmed", {})
+        assert _wait_for(lambda: _deliveries(api)["flaky"]["status"] == "delivered")
+        record = _deliveries(api)["flaky"]
+        assert record["attempts"] == 2 and record["http_status"] == 200
+        assert srv.hits["/flaky"] == 2
+        assert api._webhook_outbox.get_stats()["synced"] == 1
+
+    def test_gives_up_after_max_attempts(self, webhook_outbox, subscriber, monkeypatch):
+        api = webhook_outbox
+        monkeypatch.setattr(api, "WEBHOOK_MAX_ATTEMPTS", 3)
+        srv, base = subscriber
+        _subscribe(api, base + "/down")
+        api._deliver_webhook("anchor.confirmed", {})
+        assert _wait_for(lambda: _deliveries(api)["down"]["status"] == "failed")
+        assert _deliveries(api)["down"]["attempts"] == 3
+        assert _deliveries(api)["down"]["http_status"] == 503
+        time.sleep(0.2)
+        assert srv.hits["/down"] == 3
+
+    def test_backoff_grows_and_is_capped(self, api_module, monkeypatch):
+        monkeypatch.setattr(api_module, "WEBHOOK_BACKOFF_BASE", 1.0)
+        monkeypatch.setattr(api_module, "WEBHOOK_BACKOFF_MAX", 8.0)
+        for attempt, ceiling in ((1, 1.0), (2, 2.0), (3, 4.0), (4, 8.0), (10, 8.0)):
+            delays = [api_module._webhook_backoff(attempt) for _ in range(50)]
+            assert all(ceiling / 2 <= d <= ceiling for d in delays)
+
+    def test_interrupted_deliveries_survive_restart(self, webhook_outbox, subscriber):
+        api = webhook_outbox
+        srv, base = subscriber
+        job = {"delivery_id": "whd_restart", "org": "org", "url": base + "/ok", "event": "anchor.confirmed",
+               "signature": "sig", "timestamp": "2026-01-01T00:00:00+00:00", "payload_json": "{}"}
+        api._get_webhook_outbox().enqueue(job["delivery_id"], job["event"], job)
+        api._get_webhook_outbox().claim_pending(owner="dead", lease_seconds=0.05)   # worker died mid-delivery
+        api._webhook_outbox = None                         # process restart
+        api._start_webhook_workers()
+        assert _wait_for(lambda: api._webhook_deliveries_by_id.get("whd_restart", {}).get("status") == "delivered")
+
+    def test_outbox_resumes_on_first_request(self, webhook_outbox, subscriber, api_call):
+        """Deliveries queued before a restart go out without waiting for a new webhook."""
+        from resilience import PersistentQueue
+        api = webhook_outbox
+        srv, base = subscriber
+        job = {"delivery_id": "whd_resume", "org": "org", "url": base + "/ok", "event": "anchor.confirmed",
+               "signature": "sig", "timestamp": "2026-01-01T00:00:00+00:00", "payload_json": "{}"}
+        PersistentQueue(db_path=api.WEBHOOK_OUTBOX_DB).enqueue(job["delivery_id"], job["event"], job)
+        assert api._webhook_workers == []
+        assert api_call("GET", "/api/health")[0] == 200
+        assert _wait_for(lambda: api._webhook_deliveries_by_id.get("whd_resume", {}).get("status") == "delivered")
+
+    def test_live_lease_is_not_redelivered(self, webhook_outbox, subscriber):
+        """A delivery another process is still sending is left to that process."""
+        api = webhook_outbox
+        srv, base = subscriber
+        job = {"delivery_id": "whd_leased", "org": "org", "url": base + "/ok", "event": "anchor.confirmed",
+               "signature": "sig", "timestamp": "2026-01-01T00:00:00+00:00", "payload_json": "{}"}
+        api._get_webhook_outbox().enqueue(job["delivery_id"], job["event"], job)
+        api._get_webhook_outbox().claim_pending(owner="other-instance", lease_seconds=60)
+        api._webhook_outbox = None
+        api._start_webhook_workers()
+        time.sleep(0.3)
+        assert srv.hits == {} and api._get_webhook_outbox().get_stats()["in_flight"] == 1
+
+    def test_async_is_opt_in(self, api_module, monkeypatch):
+        """Without S4_WEBHOOK_ASYNC=1 deliveries are sent inline."""
+        monkeypatch.delenv("S4_WEBHOOK_ASYNC", raising=False)
+        import importlib.util
+        spec = importlib.util.spec_from_file_location("s4_api_default", api_module.__file__)
+        fresh = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(fresh)
+        assert fresh.WEBHOOK_ASYNC is False
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Circuit Breakers & Metrics
+# ═══════════════════════════════════════════════════════════════════
+
+class TestEndpointHealth:
+    """A dead endpoint is skipped; healthy ones keep flowing."""
+
+    def test_breaker_opens_per_endpoint(self, webhook_outbox, subscriber, monkeypatch):
+        api = webhook_outbox
+        monkeypatch.setattr(api, "WEBHOOK_BREAKER_THRESHOLD", 2)
+        monkeypatch.setattr(api, "WEBHOOK_BACKOFF_BASE", 0.01)
+        srv, base = subscriber
+        _subscribe(api, base + "/down")
+        _subscribe(api, base + "/ok")
+        api._deliver_webhook("anchor.confirmed", {})
+        assert _wait_for(lambda: _deliveries(api)["down"]["status"] == "circuit_open")
+        assert _wait_for(lambda: _deliveries(api)["ok"]["status"] == "delivered")
+        assert srv.hits["/down"] == 2
+        assert api._webhook_breakers[base + "/down"].get_status()["state"] == "open"
+        assert api._webhook_breakers[base + "/ok"].get_status()["state"] == "closed"
+        # Postponed while open, without spending attempts
+        assert _deliveries(api)["down"]["attempts"] == 2
+
+    def test_deliveries_endpoint_reports_outbox(self, webhook_outbox, subscriber, api_call):
+        api = webhook_outbox
+        srv, base = subscriber
+        api._add_webhook("master", {"url": base + "/ok", "events": ["anchor.confirmed"], "active": True})
+        api._deliver_webhook("anchor.confirmed", {}, org_key="master")
+        assert _wait_for(lambda: _deliveries(api)["ok"]["status"] == "delivered")
+        status, body = api_call("GET", "/api/webhooks/deliveries", headers={"X-API-Key": api.API_MASTER_KEY})
+        assert status == 200
+        outbox = body["outbox"]
+        assert outbox["async"] is True and outbox["queue"]["synced"] == 1
+        assert outbox["breakers"][0]["state"] == "closed"
+        latency = outbox["latency"]['s4_webhook_delivery_seconds{event="anchor.confirmed"}']
+        assert latency["count"] >= 1 and latency["sum"] >= 0
+
+    def test_deliveries_endpoint_scopes_breakers_to_org(self, webhook_outbox, subscriber, api_call, monkeypatch):
+        api = webhook_outbox
+        srv, base = subscriber
+        monkeypatch.setitem(api.API_KEYS_STORE, "org-a-key", {"org": "A"})
+        api._add_webhook("org-a-key", {"url": base + "/ok", "events": ["anchor.confirmed"], "active": True})
+        api._add_webhook("org-b-key", {"url": base + "/flaky", "events": ["anchor.confirmed"], "active": True})
+        api._deliver_webhook("anchor.confirmed", {})
+        assert _wait_for(lambda: _deliveries(api)["ok"]["status"] == "delivered")
+        assert _wait_for(lambda: base + "/flaky" in api._webhook_breakers)
+        status, body = api_call("GET", "/api/webhooks/deliveries", headers={"X-API-Key": "org-a-key"})
+        assert status == 200
+        outbox = body["outbox"]
+        assert [b["name"] for b in outbox["breakers"]] == [f"webhook:{base}/ok"]
+        assert "queue" not in outbox and "latency" not in outbox
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Subscription Index
+# ═══════════════════════════════════════════════════════════════════
+
+class TestSubscriptionIndex:
+    """Fan-out only touches hooks subscribed to the event; each secret signs once."""
+
+    @pytest.fixture
+    def queued(self, webhook_outbox, monkeypatch):
+        api = webhook_outbox
+        jobs, signed = [], []
+        real_sign = api._sign_webhook_payload
+        monkeypatch.setattr(api, "_enqueue_webhook", jobs.append)
+        monkeypatch.setattr(api, "_sign_webhook_payload",
+                            lambda payload, secret: signed.append(secret) or real_sign(payload, secret))
+        return api, jobs, signed
+
+    def test_only_matching_hooks_receive_event(self, queued):
+        api, jobs, signed = queued
+        for i in range(50):
+            api._add_webhook(f"org{i}", {"url": f"https://h{i}", "events": ["verify.completed"], "secret": "s"})
+        api._add_webhook("org7", {"url": "https://anchor", "events": ["anchor.confirmed"], "secret": "s"})
+        api._add_webhook("org8", {"url": "https://off", "events": ["anchor.confirmed"], "active": False})
+        api._deliver_webhook("anchor.confirmed", {})
+        assert [j["url"] for j in jobs] == ["https://anchor"]
+        assert "org8" not in api._webhook_index["anchor.confirmed"]
+        api._deliver_webhook("custody.transferred", {})
+        assert len(jobs) == 1 and len(signed) == 1
+
+    def test_org_scoped_delivery(self, queued):
+        api, jobs, _ = queued
+        api._add_webhook("a", {"url": "https://a", "events": ["batch.completed"]})
+        api._add_webhook("b", {"url": "https://b", "events": ["batch.completed"]})
+        api._deliver_webhook("batch.completed", {}, org_key="b")
+        assert [j["url"] for j in jobs] == ["https://b"]
+        api._deliver_webhook("batch.completed", {}, org_key="nobody")
+        assert len(jobs) == 1
+
+    def test_one_signature_per_distinct_secret(self, queued):
+        api, jobs, signed = queued
+        for i in range(6):
+            api._add_webhook(f"org{i}", {"url": f"https://h{i}", "events": ["anchor.confirmed"],
+                                         "secret": "shared" if i < 4 else f"own{i}"})
+        api._deliver_webhook("anchor.confirmed", {"n": 1})
+        assert len(jobs) == 6
+        assert sorted(signed) == ["own4", "own5", "shared"]
+        assert len({j["payload_json"] for j in jobs}) == 1
+        assert len({j["delivery_id"] for j in jobs}) == 6
+
+    def test_register_endpoint_indexes_hook(self, queued, api_call):
+        api, jobs, _ = queued
+        headers = {"X-API-Key": api.API_MASTER_KEY}
+        status, _ = api_call("POST", "/api/webhooks/register",
+                             {"url": "https://reg", "events": ["tamper.detected"]}, headers=headers)
+        assert status == 200
+        assert api_call("POST", "/api/webhooks/register", {"url": "https://reg"}, headers=headers)[0] == 409
+        assert [h["url"] for h in api._webhook_index["tamper.detected"][api.API_MASTER_KEY]] == ["https://reg"]
+        api._deliver_webhook("tamper.detected", {})
+        assert [j["url"] for j in jobs] == ["https://reg"]
@@ -0,0 +1,458 @@
+"""
+S4 Ledger XRPL Submission Pipeline Tests
+========================================
+Tests for local Sequence allocation, LastLedgerSequence expiry,
+re-sequencing and ticket leasing in _XRPLSubmitter, run against a stub
+rippled JSON-RPC server.
+Run: pytest tests/ -v
+"""
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+from s4_memo_index import decode_anchor_memos
+
+ACCOUNT = "rIssuerAccountXXXXXXXXXXXXXXXXXXXX"
+
+
+def _tx_hash(tx):
+    return hashlib.sha256(json.dumps(tx, sort_keys=True).encode()).hexdigest().upper()
+
+
+def _stub_sign(tx):
+    """Stand-in for _sign_xrpl_tx: the 'blob' is the hex-encoded JSON."""
+    return json.dumps(tx, sort_keys=True).encode().hex(), _tx_hash(tx)
+
+
+class _Rippled:
+    """Just enough of rippled's account/sequence/ledger rules to exercise the submitter."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sequence = 1          # next Sequence the validated ledger expects
+        self.open_sequence = 1     # ... and the open ledger
+        self.current = 100         # open ledger index
+        self.validated = 99
+        self.open, self.held = {}, {}
+        self.tickets = set()       # validated Tickets
+        self.open_tickets = {}     # TicketSequence -> tx spending it in the open ledger
+        self.txs = {}              # hash -> (tx, ledger_index or None)
+        self.drop_next = 0         # accept, then silently lose this many submissions
+        self.open_fee = 10         # reported by the fee RPC
+        self.required_fee = 10     # enforced on submit (raise it to model a fee spike)
+        self.results = []          # engine results in submission order
+
+    def _apply(self, tx):
+        self.open[tx["Sequence"]] = tx
+        self.open_sequence = tx["Sequence"] + 1 + tx.get("TicketCount", 0)
+
+    def submit(self, tx):
+        seq = tx["Sequence"]
+        if tx["TransactionType"] == "Bogus":
+            return "temMALFORMED"
+        if tx["LastLedgerSequence"] < self.current:
+            return "tefMAX_LEDGER"
+        if int(tx["Fee"]) < self.required_fee:
+            return "telINSUF_FEE_P"
+        if seq == 0:
+            ticket = tx["TicketSequence"]
+            if ticket not in self.tickets or ticket in self.open_tickets:
+                return "tefNO_TICKET"
+            if self.drop_next:
+                self.drop_next -= 1
+                return "tesSUCCESS"
+            self.txs[_tx_hash(tx)] = (tx, None)
+            self.open_tickets[ticket] = tx
+            return "tesSUCCESS"
+        if seq < self.open_sequence:
+            return "tefPAST_SEQ"
+        if self.drop_next:
+            self.drop_next -= 1
+            return "tesSUCCESS"
+        self.txs[_tx_hash(tx)] = (tx, None)
+        if seq != self.open_sequence:
+            self.held[seq] = tx
+            return "terPRE_SEQ"
+        self._apply(tx)
+        while self.open_sequence in self.held:
+            self._apply(self.held.pop(self.open_sequence))
+        return "tesSUCCESS"
+
+    def close(self):
+        with self.lock:
+            for seq in sorted(self.open):
+                tx = self.open[seq]
+                self.txs[_tx_hash(tx)] = (tx, self.current)
+                self.tickets.update(range(seq + 1, seq + 1 + tx.get("TicketCount", 0)))
+            for ticket, tx in self.open_tickets.items():
+                self.txs[_tx_hash(tx)] = (tx, self.current)
+                self.tickets.discard(ticket)
+            self.open_tickets.clear()
+            self.sequence = self.open_sequence
+            self.open.clear()
+            self.validated = self.current
+            self.current += 1
+            self.held = {s: t for s, t in self.held.items() if t["LastLedgerSequence"] >= self.current}
+
+    def handle(self, method, params):
+        with self.lock:
+            if method == "account_info":
+                return {"account_data": {"Account": ACCOUNT, "Sequence": self.open_sequence}, "status": "success"}
+            if method == "account_objects":
+                objects = [{"LedgerEntryType": "Ticket", "TicketSequence": t} for t in sorted(self.tickets)]
+                return {"account_objects": objects, "status": "success"}
+            if method == "ledger_current":
+                return {"ledger_current_index": self.current, "status": "success"}
+            if method == "ledger":
+                return {"ledger_index": self.validated, "validated": True, "status": "success"}
+            if method == "fee":
+                return {"drops": {"base_fee": "10", "open_ledger_fee": str(self.open_fee)},
+                        "ledger_current_index": self.current, "status": "success"}
+            if method == "submit":
+                engine = self.submit(json.loads(bytes.fromhex(params["tx_blob"])))
+                self.results.append(engine)
+                return {"engine_result": engine, "status": "success"}
+            if method == "tx":
+                tx, ledger_index = self.txs.get(params["transaction"], (None, None))
+                if ledger_index is None:
+                    return {"error": "txnNotFound", "status": "error"}
+                return {**tx, "hash": params["transaction"], "ledger_index": ledger_index, "validated": True,
+                        "meta": {"TransactionResult": "tesSUCCESS"}, "status": "success"}
+        return {"error": "unknownCmd", "status": "error"}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128   # many submitter threads connect at once
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        payload = json.dumps({"result": self.server.rippled.handle(body["method"], body["params"][0])}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+@pytest.fixture
+def rippled():
+    """Stub rippled that closes a ledger every 50 ms."""
+    srv = _Server(("127.0.0.1", 0), _Handler)
+    srv.rippled = _Rippled()
+    stop = threading.Event()
+
+    def closer():
+        while not stop.wait(0.05):
+            srv.rippled.close()
+
+    threading.Thread(target=srv.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    threading.Thread(target=closer, daemon=True).start()
+    yield srv.rippled, f"http://127.0.0.1:{srv.server_address[1]}/"
+    stop.set()
+    srv.shutdown()
+    srv.server_close()
+
+
+@pytest.fixture
+def submitter(api_module, rippled):
+    _, url = rippled
+    return api_module._XRPLSubmitter(url, ACCOUNT, _stub_sign, max_in_flight=16,
+                                     ledger_window=4, poll_interval=0.01, ledger_ttl=0.02)
+
+
+def _account_set(n=0):
+    return {"TransactionType": "AccountSet", "Memos": [{"Memo": {"MemoData": f"{n:04x}"}}]}
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Pipelining
+# ═══════════════════════════════════════════════════════════════════
+
+class TestPipelining:
+    """Many transactions from one account are in flight at once."""
+
+    def test_concurrent_submissions_share_ledgers(self, rippled, submitter):
+        chain, _ = rippled
+        futures = [submitter.submit(_account_set(i)) for i in range(12)]
+        results = [f.result(timeout=10) for f in futures]
+        assert sorted(r["Sequence"] for r in results) == list(range(1, 13))
+        assert len({r["ledger_index"] for r in results}) <= 3
+        assert all(r["LastLedgerSequence"] <= r["ledger_index"] + 4 for r in results)
+        assert submitter.get_status()["validated"] == 12
+        assert submitter.get_status()["in_flight"] == 0
+        assert set(chain.results) <= {"tesSUCCESS", "terPRE_SEQ"}   # submits may arrive out of order
+        assert submitter.get_status()["resequenced"] == 0
+
+    def test_rpcs_run_outside_the_sequence_lock(self, rippled, submitter, monkeypatch):
+        """Slow submit RPCs overlap instead of queueing behind the Sequence lock."""
+        real_rpc, active, peak = submitter._rpc, [0], [0]
+
+        def slow_rpc(method, params):
+            if method != "submit":
+                return real_rpc(method, params)
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            try:
+                return real_rpc(method, params)
+            finally:
+                active[0] -= 1
+
+        monkeypatch.setattr(submitter, "_rpc", slow_rpc)
+        results = [f.result(timeout=10) for f in [submitter.submit(_account_set(i)) for i in range(6)]]
+        assert sorted(r["Sequence"] for r in results) == list(range(1, 7))
+        assert peak[0] > 1
+
+    def test_sequence_is_allocated_locally(self, rippled, submitter, monkeypatch):
+        calls = []
+        real_rpc = submitter._rpc
+        monkeypatch.setattr(submitter, "_rpc", lambda m, p: calls.append(m) or real_rpc(m, p))
+        for f in [submitter.submit(_account_set(i)) for i in range(5)]:
+            f.result(timeout=10)
+        assert calls.count("account_info") == 1
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Re-sequencing & Expiry
+# ═══════════════════════════════════════════════════════════════════
+
+class TestResequencing:
+    """Sequence drift and lost transactions are repaired without caller help."""
+
+    def test_past_sequence_is_resynced(self, rippled, submitter):
+        chain, _ = rippled
+        submitter.submit_and_wait(_account_set(0), timeout=10)
+        with chain.lock:
+            chain.open_sequence += 5   # another signer used the account meanwhile
+        result = submitter.submit_and_wait(_account_set(1), timeout=10)
+        assert result["Sequence"] == 7
+        assert chain.results == ["tesSUCCESS", "tefPAST_SEQ", "tesSUCCESS"]
+        assert submitter.get_status()["resequenced"] == 1
+
+    def test_lost_transaction_expires_and_is_resubmitted(self, rippled, submitter):
+        chain, _ = rippled
+        chain.drop_next = 1
+        futures = [submitter.submit(_account_set(i)) for i in range(3)]
+        results = [f.result(timeout=10) for f in futures]
+        assert sorted(r["Sequence"] for r in results) == [1, 2, 3]
+        # Successors held behind the lost Sequence may expire with it; each is re-sent once
+        assert 1 <= submitter.get_status()["expired"] <= 3
+        assert submitter.get_status()["validated"] == 3 and submitter.get_status()["failed"] == 0
+
+    def test_malformed_transaction_raises(self, api_module, rippled, submitter):
+        with pytest.raises(api_module._XRPLSubmitError) as exc:
+            submitter.submit_and_wait({"TransactionType": "Bogus"}, timeout=10)
+        assert exc.value.engine_result == "temMALFORMED"
+        # The unused Sequence is reclaimed by the next transaction
+        assert submitter.submit_and_wait(_account_set(), timeout=10)["Sequence"] == 1
+        assert submitter.get_status()["failed"] == 1
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Fees
+# ═══════════════════════════════════════════════════════════════════
+
+class TestFees:
+    """The Fee tracks the open ledger, within the configured cap."""
+
+    def test_fee_follows_open_ledger(self, rippled, submitter):
+        chain, _ = rippled
+        chain.open_fee = chain.required_fee = 40
+        results = [f.result(timeout=10) for f in [submitter.submit(_account_set(i)) for i in range(6)]]
+        assert all(r["Fee"] == "40" for r in results)
+
+    def test_fee_is_fetched_once_per_ledger(self, rippled, submitter, monkeypatch):
+        chain, _ = rippled
+        calls, ledger = [], [500]
+        real_rpc = submitter._rpc
+        monkeypatch.setattr(submitter, "_rpc", lambda m, p: calls.append(m) or real_rpc(m, p))
+        monkeypatch.setattr(submitter, "_current_ledger", lambda: ledger[0])
+        assert [submitter._fee() for _ in range(3)] == [12, 12, 12]   # open fee 10, floor 12
+        chain.open_fee = 30
+        ledger[0] += 1
+        assert submitter._fee() == 30 and calls.count("fee") == 2
+
+    def test_insufficient_fee_is_escalated(self, rippled, submitter):
+        chain, _ = rippled
+        chain.required_fee = 45   # the open-ledger fee rose after it was reported
+        result = submitter.submit_and_wait(_account_set(), timeout=10)
+        assert int(result["Fee"]) >= 45 and "telINSUF_FEE_P" in chain.results
+        assert submitter.get_status()["fee_escalations"] >= 1
+
+    def test_fee_cap_is_never_exceeded(self, api_module, rippled, submitter):
+        chain, _ = rippled
+        chain.open_fee = chain.required_fee = 5000
+        submitter.max_fee_drops = 100
+        with pytest.raises(api_module._XRPLSubmitError) as exc:
+            submitter.submit_and_wait(_account_set(), timeout=10)
+        assert exc.value.engine_result == "telINSUF_FEE_P"
+        assert chain.txs == {}
+        # The refused Sequence is reused once fees come back down
+        chain.open_fee = chain.required_fee = 10
+        assert submitter.submit_and_wait(_account_set(), timeout=10)["Sequence"] == 1
+
+    def test_ticketed_submission_escalates_fee(self, rippled, ticketed):
+        chain, _ = rippled
+        submitter, _ = ticketed
+        submitter.submit_and_wait(_account_set(0), timeout=10)
+        assert _wait_for(lambda: submitter.tickets.get_status()["available"] > 0)
+        chain.required_fee = 30
+        result = submitter.submit_and_wait(_account_set(1), timeout=10)
+        assert result["Sequence"] == 0 and int(result["Fee"]) >= 30
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Anchor Integration
+# ═══════════════════════════════════════════════════════════════════
+
+class TestAnchorXRPL:
+    """_anchor_xrpl submits its AccountSet memo through the pipeline."""
+
+    def test_anchor_goes_through_submitter(self, api_module, rippled, submitter, monkeypatch):
+        chain, url = rippled
+        monkeypatch.setattr(api_module, "_init_xrpl", lambda: None)
+        monkeypatch.setattr(api_module, "_xrpl_client", SimpleNamespace(url=url))
+        monkeypatch.setattr(api_module, "_xrpl_wallet", SimpleNamespace(address=ACCOUNT))
+        monkeypatch.setattr(api_module, "_xrpl_submitter", submitter)
+        monkeypatch.setattr(api_module, "XRPL_PIPELINE", True)
+        result = api_module._anchor_xrpl("ab" * 32, "MAINTENANCE_3M", "NAVY")
+        assert result["ledger_index"] >= 100 and result["account"] == ACCOUNT
+        tx, _ = chain.txs[result["tx_hash"]]
+        assert decode_anchor_memos(tx)[0]["hash"] == "ab" * 32
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  Ticket Pool
+# ═══════════════════════════════════════════════════════════════════
+
+@pytest.fixture
+def ticketed(api_module, rippled, submitter):
+    """Submitter with a ticket pool whose depth changes are recorded."""
+    depths = []
+    submitter.tickets = api_module._TicketPool(submitter, low_water=3, batch=8,
+                                               on_depth=lambda a, l: depths.append((a, l)))
+    return submitter, depths
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class TestTicketPool:
+    """Tickets let issuer transactions validate without sequence ordering."""
+
+    def test_empty_pool_falls_back_and_refills(self, rippled, ticketed):
+        chain, _ = rippled
+        submitter, depths = ticketed
+        result = submitter.submit_and_wait(_account_set(), timeout=10)
+        assert result["Sequence"] > 0 and "TicketSequence" not in result
+        assert _wait_for(lambda: submitter.tickets.get_status()["available"] == 8)
+        assert submitter.tickets.refills == 1
+        assert depths[-1] == (8, 0)
+        # The TicketCreate and the fallback race for Sequence 1; the tickets follow the
+        # TicketCreate and the local counter skips past them either way
+        ticket_create_seq = min(chain.tickets) - 1
+        assert sorted(chain.tickets) == list(range(ticket_create_seq + 1, ticket_create_seq + 9))
+        assert result["Sequence"] == (10 if ticket_create_seq == 1 else 1)
+        assert submitter.submit_and_wait(_account_set(), timeout=10, use_ticket=False)["Sequence"] == 11
+
+    def test_concurrent_ticketed_submissions(self, rippled, ticketed):
+        chain, _ = rippled
+        submitter, depths = ticketed
+        chain.tickets.update(range(50, 70))
+        results = [f.result(timeout=10) for f in [submitter.submit(_account_set(i)) for i in range(10)]]
+        assert all(r["Sequence"] == 0 for r in results)
+        assert sorted(r["TicketSequence"] for r in results) == list(range(50, 60))
+        assert chain.sequence == 1                  # account Sequence untouched
+        assert submitter.tickets.get_status() == {"available": 10, "leased": 0, "refilling": False,
+                                                  "refills": 0, "low_water": 3}
+        assert max(l for _, l in depths) > 1
+
+    def test_expired_ticket_is_reused(self, rippled, ticketed):
+        chain, _ = rippled
+        submitter, _ = ticketed
+        chain.tickets.update(range(50, 60))
+        chain.drop_next = 1
+        result = submitter.submit_and_wait(_account_set(), timeout=10)
+        assert result["TicketSequence"] == 50
+        assert submitter.get_status()["expired"] == 1
+
+    def test_spent_ticket_is_dropped(self, rippled, ticketed):
+        chain, _ = rippled
+        submitter, _ = ticketed
+        chain.tickets.update(range(50, 60))
+        submitter.tickets.load()
+        chain.tickets.discard(50)                   # used by another process
+        result = submitter.submit_and_wait(_account_set(), timeout=10)
+        assert result["TicketSequence"] == 51
+        assert "tefNO_TICKET" in chain.results
+        assert 50 not in submitter.tickets._available
+
+    def test_stale_ledger_gives_up(self, api_module, rippled, ticketed, monkeypatch):
+        chain, _ = rippled
+        submitter, _ = ticketed
+        chain.tickets.update(range(50, 60))
+        monkeypatch.setattr(submitter, "_current_ledger", lambda: 0)   # every tx is already too late
+        with pytest.raises(api_module._XRPLSubmitError):
+            submitter.submit_and_wait(_account_set(), timeout=10)
+        assert chain.results == ["tefMAX_LEDGER"] * (submitter.max_resubmits + 1)
+        assert submitter.tickets.get_status()["leased"] == 0
+
+    def test_ticket_survives_validation_rpc_error(self, rippled, ticketed, monkeypatch):
+        """A lost validation poll does not leak the lease; the ledger decides the ticket's fate."""
+        chain, _ = rippled
+        submitter, _ = ticketed
+        chain.tickets.update(range(50, 60))
+        real_await = submitter._await_validation
+        failures = []
+
+        def flaky_await(tx_hash, last_ledger):
+            if not failures:
+                failures.append(tx_hash)
+                raise ConnectionError("rippled went away")
+            return real_await(tx_hash, last_ledger)
+
+        monkeypatch.setattr(submitter, "_await_validation", flaky_await)
+        with pytest.raises(ConnectionError):
+            submitter.submit_and_wait(_account_set(0), timeout=10)
+        status = submitter.tickets.get_status()
+        assert status["leased"] == 0 and 50 not in submitter.tickets._available
+        assert submitter.submit_and_wait(_account_set(1), timeout=10)["TicketSequence"] == 51
+        assert _wait_for(lambda: 50 not in chain.tickets)   # the first tx did validate
+
+    def test_ticket_is_released_when_signing_fails(self, rippled, ticketed):
+        chain, _ = rippled
+        submitter, _ = ticketed
+        chain.tickets.update(range(50, 60))
+
+        def broken_sign(tx):
+            raise ValueError("signer unavailable")
+
+        submitter.sign = broken_sign
+        with pytest.raises(ValueError):
+            submitter.submit_and_wait(_account_set(), timeout=10)
+        assert submitter.tickets.get_status()["leased"] == 0
+        assert 50 in submitter.tickets._available
+
+    def test_pool_depth_gauge(self):
+        from monitoring import S4Metrics
+        m = S4Metrics()
+        m.record_ticket_pool(7, 2)
+        text = m.export_prometheus()
+        assert "s4_xrpl_ticket_pool_depth 7" in text and "s4_xrpl_tickets_leased 2" in text